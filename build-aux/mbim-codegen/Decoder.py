@@ -0,0 +1,716 @@
+# -*- Mode: python; tab-width: 4; indent-tabs-mode: nil -*-
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation; either version 2 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright (C) 2013 - 2018 Aleksander Morgado <aleksander@aleksander.es>
+#
+
+import struct
+
+import utils
+
+
+"""
+Common code of the decoder module: message and capture file framing, fragment
+reassembly and the helpers used by the per-message decoders
+"""
+RUNTIME = '''
+import collections
+import mmap
+import socket
+import struct
+
+MESSAGE_TYPE_OPEN            = 0x00000001
+MESSAGE_TYPE_CLOSE           = 0x00000002
+MESSAGE_TYPE_COMMAND         = 0x00000003
+MESSAGE_TYPE_HOST_ERROR      = 0x00000004
+MESSAGE_TYPE_OPEN_DONE       = 0x80000001
+MESSAGE_TYPE_CLOSE_DONE      = 0x80000002
+MESSAGE_TYPE_COMMAND_DONE    = 0x80000003
+MESSAGE_TYPE_FUNCTION_ERROR  = 0x80000004
+MESSAGE_TYPE_INDICATE_STATUS = 0x80000007
+
+COMMAND_TYPE_QUERY = 0
+COMMAND_TYPE_SET   = 1
+
+CAPTURE_DIRECTION_FROM_CLIENT = 0
+CAPTURE_DIRECTION_TO_CLIENT   = 1
+
+
+class DecodeError(ValueError):
+    """Raised when the contents of a message exceed its buffers."""
+
+
+Message = collections.namedtuple('Message', [
+    # Offset of the (first fragment of the) message in the capture
+    'offset',
+    'message_type',
+    'transaction_id',
+    # Service nickname, or printable UUID if unknown; None if not applicable
+    'service',
+    # Command ID and its nickname, if known
+    'cid',
+    'command',
+    # Only in command messages
+    'command_type',
+    # Status code in responses, or error status code in error messages
+    'status',
+    # Dictionary of decoded fields, keyed by field name; None if the command
+    # is unknown or the message could not be decoded
+    'fields',
+    # Reason why the fields could not be decoded, if any
+    'error',
+])
+
+CaptureRecord = collections.namedtuple('CaptureRecord', [
+    # Monotonic timestamp of the proxy, in microseconds
+    'timestamp',
+    'client_id',
+    # CAPTURE_DIRECTION_FROM_CLIENT or CAPTURE_DIRECTION_TO_CLIENT
+    'direction',
+    # Path of the device used by the client, None if unknown
+    'device_path',
+    # Length of the message before it was truncated in the capture; greater
+    # than the captured length if it was
+    'original_length',
+    'message',
+])
+
+_header = struct.Struct('<III')
+_fragment_header = struct.Struct('<II')
+_command = struct.Struct('<16sIII')
+_indicate_status = struct.Struct('<16sII')
+_guint32 = struct.Struct('<I')
+_capture_file_header = struct.Struct('<8sII')
+_capture_record_header = struct.Struct('<QIBBHII')
+
+_HEADER_SIZE = 12
+_FRAGMENT_HEADER_SIZE = 20
+_COMMAND_BUFFER_OFFSET = 48
+_INDICATE_STATUS_BUFFER_OFFSET = 44
+
+_MESSAGE_TYPES_FRAGMENTED = (MESSAGE_TYPE_COMMAND,
+                             MESSAGE_TYPE_COMMAND_DONE,
+                             MESSAGE_TYPE_INDICATE_STATUS)
+
+_CAPTURE_MAGIC = b'MBIMCAP\\0'
+_CAPTURE_VERSION = 1
+
+
+def _uuid(data):
+    h = data.hex()
+    return '%s-%s-%s-%s-%s' % (h[0:8], h[8:12], h[12:16], h[16:20], h[20:32])
+
+
+def _ipv4(data):
+    return socket.inet_ntop(socket.AF_INET, data)
+
+
+def _ipv6(data):
+    return socket.inet_ntop(socket.AF_INET6, data)
+
+
+def _bytes(data, offset, size, end):
+    if offset + size > end:
+        raise DecodeError('byte array exceeds the information buffer')
+    return bytes(data[offset:offset + size])
+
+
+def _string(data, offset, size, end):
+    if not size:
+        return None
+    if offset + size > end:
+        raise DecodeError('string exceeds the information buffer')
+    return bytes(data[offset:offset + size]).decode('utf-16-le', 'replace')
+
+
+def _string_array(data, base, offset, n, end):
+    if offset + 8 * n > end:
+        raise DecodeError('string array exceeds the information buffer')
+    pairs = struct.unpack_from('<%dI' % (2 * n), data, offset)
+    return [_string(data, base + pairs[i], pairs[i + 1], end) for i in range(0, 2 * n, 2)]
+
+
+def _ref_address(data, ib, offset, size, end):
+    if not offset:
+        return None
+    return _bytes(data, ib + offset, size, end)
+
+
+def _ipv4_array(data, offset, n, end):
+    raw = _bytes(data, offset, 4 * n, end)
+    return [_ipv4(raw[i:i + 4]) for i in range(0, 4 * n, 4)]
+
+
+def _ipv6_array(data, offset, n, end):
+    raw = _bytes(data, offset, 16 * n, end)
+    return [_ipv6(raw[i:i + 16]) for i in range(0, 16 * n, 16)]
+
+
+def _ref_struct_offsets(data, offset, n, end):
+    if offset + 8 * n > end:
+        raise DecodeError('struct array exceeds the information buffer')
+    return struct.unpack_from('<%dI' % (2 * n), data, offset)[0::2]
+'''
+
+"""
+Message decoding entry points, emitted after the per-message decoders and the
+command registry
+"""
+RUNTIME_ENTRY_POINTS = '''
+
+def _decode_fields(decoder, data, ib, end):
+    try:
+        return (decoder(data, ib, end), None)
+    except (DecodeError, struct.error, IndexError) as e:
+        return (None, str(e))
+
+
+def _error_message(offset, message_type, transaction_id, error):
+    return Message(offset, message_type, transaction_id, None, None, None, None, None, None, error)
+
+
+def _decode(data, offset, message_type, end, transaction_id):
+    service = None
+    cid = None
+    command = None
+    command_type = None
+    status = None
+    fields = None
+    error = None
+
+    if message_type in (MESSAGE_TYPE_COMMAND, MESSAGE_TYPE_COMMAND_DONE):
+        if offset + _COMMAND_BUFFER_OFFSET > end:
+            return _error_message(offset, message_type, transaction_id, 'command header exceeds the message')
+        (service_id, cid, value, _) = _command.unpack_from(data, offset + _FRAGMENT_HEADER_SIZE)
+        ib = offset + _COMMAND_BUFFER_OFFSET
+        if message_type == MESSAGE_TYPE_COMMAND:
+            command_type = value
+            index = {COMMAND_TYPE_QUERY: 0, COMMAND_TYPE_SET: 1}.get(value)
+        else:
+            status = value
+            index = 2
+    elif message_type == MESSAGE_TYPE_INDICATE_STATUS:
+        if offset + _INDICATE_STATUS_BUFFER_OFFSET > end:
+            return _error_message(offset, message_type, transaction_id, 'indication header exceeds the message')
+        (service_id, cid, _) = _indicate_status.unpack_from(data, offset + _FRAGMENT_HEADER_SIZE)
+        ib = offset + _INDICATE_STATUS_BUFFER_OFFSET
+        index = 3
+    else:
+        if message_type in (MESSAGE_TYPE_OPEN_DONE, MESSAGE_TYPE_CLOSE_DONE,
+                            MESSAGE_TYPE_HOST_ERROR, MESSAGE_TYPE_FUNCTION_ERROR):
+            if offset + _HEADER_SIZE + 4 > end:
+                return _error_message(offset, message_type, transaction_id, 'status exceeds the message')
+            (status, ) = _guint32.unpack_from(data, offset + _HEADER_SIZE)
+        return Message(offset, message_type, transaction_id, None, None, None, None, status, None, None)
+
+    service = SERVICES.get(service_id)
+    if service is None:
+        service = _uuid(service_id)
+    entry = COMMANDS.get((service_id, cid))
+    if entry is not None:
+        command = entry[0]
+        decoder = entry[1 + index] if index is not None else None
+        # Responses with errors carry no fields. Same as in the library, the
+        # information buffer is assumed to extend until the end of the message.
+        if decoder is not None and not status:
+            (fields, error) = _decode_fields(decoder, data, ib, end)
+
+    return Message(offset, message_type, transaction_id, service, cid, command, command_type, status, fields, error)
+
+
+def _feed(fragments, key, data, offset, length, end, message_type, transaction_id):
+    """
+    Decode the message of the given length found at offset, of which only the
+    bytes until end are available. Fragments are kept in fragments, indexed by
+    key and message type and transaction ID, until the last one is found; None
+    is returned until then.
+    """
+    if message_type in _MESSAGE_TYPES_FRAGMENTED and offset + _FRAGMENT_HEADER_SIZE <= end:
+        (total, current) = _fragment_header.unpack_from(data, offset + _HEADER_SIZE)
+        if total > 1:
+            key = key + (message_type, transaction_id)
+            if end < offset + length:
+                fragments.pop(key, None)
+                return _error_message(offset, message_type, transaction_id, 'fragment exceeds the captured data')
+            if current == 0:
+                fragments[key] = (offset, [data[offset:end]])
+            elif key in fragments:
+                fragments[key][1].append(data[offset + _FRAGMENT_HEADER_SIZE:end])
+            if current != total - 1 or key not in fragments:
+                return None
+            (first_offset, chunks) = fragments.pop(key)
+            reassembled = b''.join(chunks)
+            message = _decode(reassembled, 0, message_type, len(reassembled), transaction_id)
+            return message._replace(offset=first_offset)
+
+    return _decode(data, offset, message_type, end, transaction_id)
+
+
+def decode(data):
+    """
+    Decode a single complete message, given as bytes. Any data after the
+    length given in the message header is ignored.
+    """
+    if len(data) < _HEADER_SIZE:
+        raise DecodeError('truncated message header')
+    (message_type, length, transaction_id) = _header.unpack_from(data, 0)
+    if length < _HEADER_SIZE or length > len(data):
+        raise DecodeError('truncated message')
+    return _decode(data, 0, message_type, length, transaction_id)
+
+
+def iter_messages(data, offset=0):
+    """
+    Decode all the messages found one after the other in data, which may be
+    bytes or a mmap object, starting at the given offset. Fragmented messages
+    are reassembled, and yielded once the last fragment is found.
+    """
+    fragments = {}
+    size = len(data)
+
+    while offset < size:
+        if offset + _HEADER_SIZE > size:
+            raise DecodeError('truncated message header at offset %d' % offset)
+        (message_type, length, transaction_id) = _header.unpack_from(data, offset)
+        if length < _HEADER_SIZE or offset + length > size:
+            raise DecodeError('truncated message at offset %d' % offset)
+
+        message = _feed(fragments, (), data, offset, length, offset + length, message_type, transaction_id)
+        if message is not None:
+            yield message
+        offset += length
+
+
+def iter_capture_records(data):
+    """
+    Decode all the records of a capture file dumped by the proxy, given as bytes
+    or a mmap object. Fragmented messages are reassembled per client and
+    direction, and yielded along with the record of their last fragment.
+    """
+    size = len(data)
+    if size < _capture_file_header.size:
+        raise DecodeError('truncated capture file header')
+    (magic, version, n_records) = _capture_file_header.unpack_from(data, 0)
+    if magic != _CAPTURE_MAGIC:
+        raise DecodeError('not a capture file')
+    if version != _CAPTURE_VERSION:
+        raise DecodeError('unsupported capture file version %d' % version)
+
+    fragments = {}
+    offset = _capture_file_header.size
+
+    for _ in range(n_records):
+        if offset + _capture_record_header.size > size:
+            raise DecodeError('truncated capture record at offset %d' % offset)
+        (timestamp, client_id, direction, _, path_length, captured_length, original_length) = \\
+            _capture_record_header.unpack_from(data, offset)
+        if offset + _capture_record_header.size + path_length + captured_length > size:
+            raise DecodeError('truncated capture record at offset %d' % offset)
+        offset += _capture_record_header.size
+        device_path = bytes(data[offset:offset + path_length]).decode('utf-8', 'replace') or None
+        offset += path_length
+        end = offset + captured_length
+
+        if captured_length < _HEADER_SIZE:
+            message = _error_message(offset, None, None, 'message header exceeds the captured data')
+        else:
+            (message_type, length, transaction_id) = _header.unpack_from(data, offset)
+            if length < _HEADER_SIZE:
+                message = _error_message(offset, message_type, transaction_id, 'invalid message length')
+            else:
+                message = _feed(fragments, (client_id, direction), data, offset, length, end, message_type, transaction_id)
+        if message is not None:
+            yield CaptureRecord(timestamp, client_id, direction, device_path, original_length, message)
+        offset = end
+
+
+def _iter_mapped(path, iterator):
+    with open(path, 'rb') as f:
+        if not f.seek(0, 2):
+            return
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for item in iterator(mapped):
+                yield item
+        finally:
+            mapped.close()
+
+
+def _iter_any_messages(data):
+    if data[:len(_CAPTURE_MAGIC)] == _CAPTURE_MAGIC:
+        return (record.message for record in iter_capture_records(data))
+    return iter_messages(data)
+
+
+def iter_file(path):
+    """
+    Decode all the messages in the given file, mapped in memory. Both raw
+    captures and capture files dumped by the proxy are supported.
+    """
+    return _iter_mapped(path, _iter_any_messages)
+
+
+def iter_capture(path):
+    """
+    Decode all the records of the given capture file dumped by the proxy,
+    mapped in memory.
+    """
+    return _iter_mapped(path, iter_capture_records)
+
+
+def iter_batches(path, batch_size=4096):
+    """
+    Decode all the messages in the given file, yielding lists of up to
+    batch_size messages.
+    """
+    batch = []
+    for message in iter_file(path):
+        batch.append(message)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+'''
+
+
+"""
+Static formats of the fields whose size in the static part of the buffer does
+not depend on other fields, as struct module format codes and the suffixes of
+the variables holding each unpacked value
+"""
+def static_format(field, in_struct):
+    field_format = field['format']
+    if field_format in ['guint32', 'ref-ipv4', 'ref-ipv6', 'ipv4-array', 'ipv6-array', 'struct-array']:
+        return ('I', [''])
+    if field_format == 'guint64':
+        return ('Q', [''])
+    if field_format in ['uuid', 'ipv6']:
+        return ('16s', [''])
+    if field_format == 'ipv4':
+        return ('4s', [''])
+    if field_format == 'byte-array':
+        return ('%ds' % int(field['array-size']), [''])
+    if field_format == 'string':
+        return ('II', ['_offset', '_size'])
+    if field_format == 'ref-byte-array':
+        if in_struct and 'array-size-field' in field:
+            return ('I', ['_offset'])
+        return ('II', ['_offset', '_size'])
+    if field_format == 'ref-byte-array-no-offset' and not (in_struct and 'array-size-field' in field):
+        return ('I', ['_size'])
+    return None
+
+
+"""
+The Decoder class emits a pure Python module decoding the raw messages of the
+given services, with no dependency on the library
+"""
+class Decoder:
+
+    """
+    Constructor
+    """
+    def __init__(self, object_lists, symbols):
+        self.object_lists = object_lists
+        (self.values, self.uuids) = symbols
+
+        # Precompiled struct formats, emitted before the decoders using them,
+        # and the number of formats registered by each decoder
+        self.formats = []
+        self.n_formats = {}
+
+
+    """
+    Get the value of the given C symbol or number
+    """
+    def _value(self, symbol):
+        if symbol.isdigit():
+            return int(symbol)
+        if symbol.startswith('0x'):
+            return int(symbol, 16)
+        if symbol not in self.values:
+            raise ValueError('Couldn\'t find the value of \'%s\'' % symbol)
+        return self.values[symbol]
+
+
+    """
+    Register a precompiled struct format, returning its variable name
+    """
+    def _add_format(self, prefix, codes):
+        index = self.n_formats.get(prefix, 0)
+        self.n_formats[prefix] = index + 1
+        name = '_%s_%d' % (prefix, index)
+        self.formats.append((name, '<' + codes))
+        return name
+
+
+    """
+    Build the statements reading a run of consecutive fields with static formats
+    with a single precompiled struct, plus the statements building their values
+    """
+    def _build_run(self, prefix, fields, indexes, run, in_struct, indent):
+        codes = ''
+        names = []
+        offsets = []
+        size = 0
+        for i in run:
+            (field_codes, suffixes) = static_format(fields[i], in_struct)
+            offsets.append(size)
+            size += struct.calcsize('<' + field_codes)
+            codes += field_codes
+            names += ['v%d%s' % (i, suffix) for suffix in suffixes]
+
+        lines = [ 'if o + %d > end:' % size,
+                  '    raise DecodeError(%r)' % ('field \'%s\' exceeds the information buffer' % fields[run[0]]['name']),
+                  '(%s, ) = %s.unpack_from(data, o)' % (', '.join(names), self._add_format(prefix, codes)) ]
+        for (i, field_offset) in zip(run, offsets):
+            lines += self._build_static_value(fields, indexes, i, field_offset, in_struct)
+        lines.append('o += %d' % size)
+        return [indent + line for line in lines]
+
+
+    """
+    Build the statement storing the value of a field read within a run
+    """
+    def _build_static_value(self, fields, indexes, i, field_offset, in_struct):
+        field = fields[i]
+        field_format = field['format']
+        base = 's' if in_struct else 'ib'
+        v = 'v%d' % i
+        if field_format in ['guint32', 'guint64', 'byte-array']:
+            value = v
+        elif field_format == 'uuid':
+            value = '_uuid(%s)' % v
+        elif field_format == 'ipv4':
+            value = '_ipv4(%s)' % v
+        elif field_format == 'ipv6':
+            value = '_ipv6(%s)' % v
+        elif field_format == 'ref-ipv4':
+            return [ '%s = _ref_address(data, ib, %s, 4, end)' % (v, v),
+                     'r[%r] = _ipv4(%s) if %s else None' % (field['name'], v, v) ]
+        elif field_format == 'ref-ipv6':
+            return [ '%s = _ref_address(data, ib, %s, 16, end)' % (v, v),
+                     'r[%r] = _ipv6(%s) if %s else None' % (field['name'], v, v) ]
+        elif field_format == 'ipv4-array':
+            value = '_ipv4_array(data, ib + %s, v%d, end)' % (v, indexes[field['array-size-field']])
+        elif field_format == 'ipv6-array':
+            value = '_ipv6_array(data, ib + %s, v%d, end)' % (v, indexes[field['array-size-field']])
+        elif field_format == 'string':
+            value = '_string(data, %s + %s_offset, %s_size, end)' % (base, v, v)
+        elif field_format == 'ref-byte-array':
+            if in_struct and 'array-size-field' in field:
+                value = '_bytes(data, s + %s_offset, v%d, end)' % (v, indexes[field['array-size-field']])
+            else:
+                value = '_bytes(data, %s + %s_offset, %s_size, end)' % (base, v, v)
+        elif field_format == 'ref-byte-array-no-offset':
+            value = '_bytes(data, o + %d, %s_size, end)' % (field_offset + 4, v)
+        elif field_format == 'struct-array':
+            struct = self.structs[field['struct-type']]
+            if not struct.size:
+                raise ValueError('Struct \'%s\' must be fixed-sized in struct arrays' % struct.name)
+            value = ('[_read_%s(data, ib, ib + %s + %d * k, end)[0] for k in range(v%d)]' %
+                     (utils.build_underscore_name_from_camelcase(struct.name), v, struct.size, indexes[field['array-size-field']]))
+        else:
+            raise ValueError('Cannot handle field type \'%s\'' % field_format)
+        return [ 'r[%r] = %s' % (field['name'], value) ]
+
+
+    """
+    Build the statements reading a field whose size in the static part of the
+    buffer depends on other fields
+    """
+    def _build_variable(self, fields, indexes, i, in_struct, indent):
+        field = fields[i]
+        field_format = field['format']
+        base = 's' if in_struct else 'ib'
+        name = repr(field['name'])
+        if 'array-size-field' in field:
+            n = 'v%d' % indexes[field['array-size-field']]
+        if field_format == 'guint32-array':
+            lines = [ 'if o + 4 * %s > end:' % n,
+                      '    raise DecodeError(%r)' % ('field \'%s\' exceeds the information buffer' % field['name']),
+                      'r[%s] = list(struct.unpack_from(\'<%%dI\' %% %s, data, o))' % (name, n),
+                      'o += 4 * %s' % n ]
+        elif field_format == 'string-array':
+            lines = [ 'r[%s] = _string_array(data, %s, o, %s, end)' % (name, base, n),
+                      'o += 8 * %s' % n ]
+        elif field_format == 'ref-struct-array':
+            lines = [ 'r[%s] = [_read_%s(data, ib, ib + k, end)[0] for k in _ref_struct_offsets(data, o, %s, end)]' %
+                      (name, utils.build_underscore_name_from_camelcase(field['struct-type']), n),
+                      'o += 8 * %s' % n ]
+        elif field_format == 'struct':
+            lines = [ '(r[%s], o) = _read_%s(data, ib, o, end)' %
+                      (name, utils.build_underscore_name_from_camelcase(field['struct-type'])) ]
+        elif field_format == 'unsized-byte-array':
+            # Until the end of the buffer, this should be the last field
+            lines = [ 'if o > end:',
+                      '    raise DecodeError(%r)' % ('field \'%s\' exceeds the information buffer' % field['name']),
+                      'r[%s] = bytes(data[o:end])' % name ]
+        elif field_format == 'ref-byte-array-no-offset':
+            lines = [ 'r[%s] = _bytes(data, o, %s, end)' % (name, n),
+                      'o += 4' ]
+        else:
+            raise ValueError('Cannot handle field type \'%s\'' % field_format)
+        return [indent + line for line in lines]
+
+
+    """
+    Build the body of the decoder of the given list of fields
+    """
+    def _build_body(self, prefix, fields, in_struct):
+        operations = [ '==', '!=', '<', '<=', '>', '>=' ]
+
+        indexes = {}
+        for i in range(len(fields)):
+            indexes[fields[i]['name']] = i
+
+        lines = [ 'r = {}' ]
+        run = []
+        for i in range(len(fields)):
+            field = fields[i]
+            static = static_format(field, in_struct) is not None
+            if static and 'available-if' not in field:
+                run.append(i)
+                continue
+
+            if run:
+                lines += self._build_run(prefix, fields, indexes, run, in_struct, '')
+                run = []
+
+            indent = ''
+            if 'available-if' in field:
+                condition = field['available-if']
+                if condition['operation'] not in operations:
+                    raise ValueError('Cannot handle condition operation \'%s\'' % condition['operation'])
+                if field['format'] == 'guint32':
+                    lines.append('v%d = 0' % i)
+                lines.append('if v%d %s %d:' % (indexes[condition['field']], condition['operation'], self._value(condition['value'])))
+                indent = '    '
+
+            if static:
+                lines += self._build_run(prefix, fields, indexes, [i], in_struct, indent)
+            else:
+                lines += self._build_variable(fields, indexes, i, in_struct, indent)
+
+        if run:
+            lines += self._build_run(prefix, fields, indexes, run, in_struct, '')
+        return lines
+
+
+    """
+    Build the decoder of the given struct
+    """
+    def _build_struct_decoder(self, struct):
+        name = utils.build_underscore_name_from_camelcase(struct.name)
+        lines = [ 'def _read_%s(data, ib, o, end):' % name,
+                  '    s = o' ]
+        lines += ['    ' + line for line in self._build_body(name, struct.contents, True)]
+        lines.append('    return (r, o)')
+        return lines
+
+
+    """
+    Build the decoder of the given message
+    """
+    def _build_message_decoder(self, message, message_type, fields):
+        name = utils.build_underscore_name(message.fullname) + '_' + message_type
+        lines = [ 'def _decode_%s(data, ib, end):' % name,
+                  '    o = ib' ]
+        lines += ['    ' + line for line in self._build_body(name, fields, False)]
+        lines.append('    return r')
+        return lines
+
+
+    """
+    Emit the decoder module
+    """
+    def emit(self, f):
+        self.structs = {}
+        for object_list in self.object_lists:
+            for struct in object_list.struct_list:
+                self.structs[struct.name] = struct
+
+        decoders = []
+        services = []
+        commands = []
+        for object_list in self.object_lists:
+            service_enum_name = 'MBIM_SERVICE_' + utils.build_underscore_name(object_list.service).upper()
+            if service_enum_name not in self.uuids:
+                raise ValueError('Couldn\'t find the UUID of service \'%s\'' % object_list.service)
+            service_id = 'bytes.fromhex(\'%s\')' % self.uuids[service_enum_name]
+            services.append('    %s: %r,' % (service_id, utils.build_underscore_name(object_list.service).replace('_', '-')))
+
+            for struct in object_list.struct_list:
+                decoders += [''] + self._build_struct_decoder(struct) + ['']
+
+            for message in object_list.command_list:
+                entry = [ repr(message.cid_printable) ]
+                for (message_type, has_message_type, fields) in [ ('query',        message.has_query,        message.query),
+                                                                  ('set',          message.has_set,          message.set),
+                                                                  ('response',     message.has_response,     message.response),
+                                                                  ('notification', message.has_notification, message.notification) ]:
+                    if not has_message_type:
+                        entry.append('None')
+                        continue
+                    decoders += [''] + self._build_message_decoder(message, message_type, fields) + ['']
+                    entry.append('_decode_%s_%s' % (utils.build_underscore_name(message.fullname), message_type))
+                commands.append('    (%s, %d): (%s),' % (service_id, self._value(message.cid_enum_name), ', '.join(entry)))
+
+        f.write(
+            '# GENERATED CODE... DO NOT EDIT\n'
+            '#\n'
+            '# This library is free software; you can redistribute it and/or\n'
+            '# modify it under the terms of the GNU Lesser General Public\n'
+            '# License as published by the Free Software Foundation; either\n'
+            '# version 2 of the License, or (at your option) any later version.\n'
+            '#\n'
+            '# This library is distributed in the hope that it will be useful,\n'
+            '# but WITHOUT ANY WARRANTY; without even the implied warranty of\n'
+            '# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU\n'
+            '# Lesser General Public License for more details.\n'
+            '#\n'
+            '# You should have received a copy of the GNU Lesser General Public\n'
+            '# License along with this library; if not, write to the\n'
+            '# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor,\n'
+            '# Boston, MA 02110-1301 USA.\n'
+            '#\n'
+            '# Copyright (C) 2013 - 2018 Aleksander Morgado <aleksander@aleksander.es>\n'
+            '#\n'
+            '\n'
+            '"""\n'
+            'Offline decoder of raw MBIM messages, generated from the service definitions\n'
+            'of libmbim-glib. Use iter_file() or iter_batches() to decode capture files\n'
+            'holding messages one after the other, or decode() for single messages.\n'
+            '"""\n')
+        f.write(RUNTIME)
+        f.write('\n')
+        for (name, codes) in self.formats:
+            f.write('%s = struct.Struct(%r)\n' % (name, codes))
+        f.write('\n'.join(decoders))
+        f.write('\n\n'
+                '# Service nicknames, by service UUID\n'
+                'SERVICES = {\n' +
+                '\n'.join(services) + '\n'
+                '}\n'
+                '\n'
+                '# Command nicknames, and query, set, response and notification decoders,\n'
+                '# by service UUID and command ID\n'
+                'COMMANDS = {\n' +
+                '\n'.join(commands) + '\n'
+                '}\n')
+        f.write(RUNTIME_ENTRY_POINTS)
+
@@ -22,23 +22,27 @@ import utils
 
 
 """
-Flag the values which always need to be read
+Flag the values which always need to be read, given the fields indexed by name
 """
 def flag_always_read_field(fields, field_name):
-    for field in fields:
-        if field['name'] == field_name:
-            if field['format'] != 'guint32':
-                    raise ValueError('Fields to always read \'%s\' must be a guint32' % field_name)
-            field['always-read'] = True
-            return
-    raise ValueError('Couldn\'t find field to always read \'%s\'' % field_name)
+    if field_name not in fields:
+        raise ValueError('Couldn\'t find field to always read \'%s\'' % field_name)
+    field = fields[field_name]
+    if field['format'] != 'guint32':
+        raise ValueError('Fields to always read \'%s\' must be a guint32' % field_name)
+    field['always-read'] = True
 
 
 """
 Validate fields in the dictionary
 """
-def validate_fields(fields):
-    for field in fields:
+def validate_fields(field_list):
+    # Index by name; the first field given wins, as when looking them up in order
+    fields = {}
+    for field in reversed(field_list):
+        fields[field['name']] = field
+
+    for field in field_list:
         # Look for condition fields, which need to be always read
         if 'available-if' in field:
             condition = field['available-if']
@@ -100,10 +104,15 @@ class Message:
     """
     Constructor
     """
-    def __init__(self, dictionary):
+    def __init__(self, dictionary, backend = 'unrolled'):
         # The message service, e.g. "Basic Connect"
         self.service = dictionary['service']
 
+        # Either 'unrolled', emitting per-message parsers, builders, printers
+        # and JSON encoders, or 'table', emitting field tables to be run by the
+        # generic field interpreter
+        self.backend = backend
+
         # The name of the specific message, e.g. "Something"
         self.name = dictionary['name']
 
@@ -135,6 +144,14 @@ class Message:
             self.has_response = False
             self.response = []
 
+        # Response builder, only needed for messages replied by ourselves
+        if 'response-builder' in dictionary and dictionary['response-builder'] == 'yes':
+            if not self.has_response:
+                raise ValueError('Response builder requested in \'%s\' but no response given' % self.name)
+            self.has_response_builder = True
+        else:
+            self.has_response_builder = False
+
         # Notification
         if 'notification' in dictionary:
             self.has_notification = True
@@ -144,6 +161,20 @@ class Message:
             self.has_notification = False
             self.notification = []
 
+        # Capabilities, by default the ones implied by the messages given; may be
+        # overriden e.g. for commands the device supports but we don't implement
+        if 'capabilities' in dictionary:
+            for capability in dictionary['capabilities']:
+                if capability not in [ 'set', 'query', 'notify' ]:
+                    raise ValueError('Cannot handle capability \'%s\' in \'%s\'' % (capability, self.name))
+            self.can_set = 'set' in dictionary['capabilities']
+            self.can_query = 'query' in dictionary['capabilities']
+            self.can_notify = 'notify' in dictionary['capabilities']
+        else:
+            self.can_set = self.has_set
+            self.can_query = self.has_query
+            self.can_notify = self.has_notification
+
         # Build Fullname
         if self.service == 'Basic Connect':
             self.fullname = 'MBIM Message ' + self.name
@@ -158,6 +189,13 @@ class Message:
             self.cid_enum_name += (' ' + self.name)
         self.cid_enum_name = utils.build_underscore_name(self.cid_enum_name).upper()
 
+        # Build CID printable, same as the nickname given to the CID enum value
+        if self.name != "":
+            cid_enum_prefix = 'MBIM_CID_' + utils.build_underscore_name(self.service).upper() + '_'
+        else:
+            cid_enum_prefix = 'MBIM_CID_'
+        self.cid_printable = utils.remove_prefix(self.cid_enum_name, cid_enum_prefix).lower().replace('_', '-')
+
 
     """
     Emit the message handling implementation
@@ -166,26 +204,106 @@ class Message:
         if self.has_query:
             utils.add_separator(hfile, 'Message (Query)', self.fullname);
             utils.add_separator(cfile, 'Message (Query)', self.fullname);
+            self._emit_message_fields(cfile, 'query', self.query)
             self._emit_message_creator(hfile, cfile, 'query', self.query)
             self._emit_message_printable(cfile, 'query', self.query)
+            self._emit_message_json(cfile, 'query', self.query)
 
         if self.has_set:
             utils.add_separator(hfile, 'Message (Set)', self.fullname);
             utils.add_separator(cfile, 'Message (Set)', self.fullname);
+            self._emit_message_fields(cfile, 'set', self.set)
             self._emit_message_creator(hfile, cfile, 'set', self.set)
             self._emit_message_printable(cfile, 'set', self.set)
+            self._emit_message_json(cfile, 'set', self.set)
 
         if self.has_response:
             utils.add_separator(hfile, 'Message (Response)', self.fullname);
             utils.add_separator(cfile, 'Message (Response)', self.fullname);
+            self._emit_message_fields(cfile, 'response', self.response)
             self._emit_message_parser(hfile, cfile, 'response', self.response)
             self._emit_message_printable(cfile, 'response', self.response)
+            self._emit_message_json(cfile, 'response', self.response)
+            if self.has_response_builder:
+                self._emit_message_creator(hfile, cfile, 'response', self.response)
 
         if self.has_notification:
             utils.add_separator(hfile, 'Message (Notification)', self.fullname);
             utils.add_separator(cfile, 'Message (Notification)', self.fullname);
+            self._emit_message_fields(cfile, 'notification', self.notification)
             self._emit_message_parser(hfile, cfile, 'notification', self.notification)
             self._emit_message_printable(cfile, 'notification', self.notification)
+            self._emit_message_json(cfile, 'notification', self.notification)
+
+
+    """
+    Emit the field table describing the message contents
+    """
+    def _emit_message_fields(self, cfile, message_type, fields):
+        translations = { 'underscore'               : utils.build_underscore_name (self.fullname),
+                         'message_type'             : message_type,
+                         'service_underscore_upper' : utils.build_underscore_name (self.service).upper(),
+                         'cid_enum_name'            : self.cid_enum_name,
+                         'field_table'              : utils.build_field_table(fields) }
+
+        if message_type == 'response':
+            translations['message_type_enum'] = 'MBIM_MESSAGE_TYPE_COMMAND_DONE'
+            translations['command_type_enum'] = 'MBIM_MESSAGE_COMMAND_TYPE_UNKNOWN'
+        elif message_type == 'notification':
+            translations['message_type_enum'] = 'MBIM_MESSAGE_TYPE_INDICATE_STATUS'
+            translations['command_type_enum'] = 'MBIM_MESSAGE_COMMAND_TYPE_UNKNOWN'
+        else:
+            translations['message_type_enum'] = 'MBIM_MESSAGE_TYPE_COMMAND'
+            translations['command_type_enum'] = 'MBIM_MESSAGE_COMMAND_TYPE_' + message_type.upper()
+
+        template = ''
+        if fields != []:
+            template += (
+                '\n'
+                'static const MbimField ${underscore}_${message_type}_field_list[] = {\n'
+                '${field_table}'
+                '};\n')
+
+        template += (
+            '\n'
+            'static const MbimMessageFields ${underscore}_${message_type}_fields = {\n'
+            '    .service = MBIM_SERVICE_${service_underscore_upper},\n'
+            '    .cid = ${cid_enum_name},\n'
+            '    .message_type = ${message_type_enum},\n'
+            '    .command_type = ${command_type_enum},\n')
+
+        if fields != []:
+            template += (
+                '    .fields = ${underscore}_${message_type}_field_list,\n'
+                '    .n_fields = G_N_ELEMENTS (${underscore}_${message_type}_field_list),\n')
+
+        template += (
+            '};\n')
+        cfile.write(string.Template(template).substitute(translations))
+
+
+    """
+    Build the body of the message creator or parser in the table backend, just
+    handing over all arguments to the generic field interpreter
+    """
+    def _build_fields_call(self, method, message_type, fields, first_args):
+        translations = { 'underscore'   : utils.build_underscore_name (self.fullname),
+                         'message_type' : message_type }
+
+        call = '    return _mbim_message_fields_' + method + ' ('
+        args = first_args + [ string.Template('&${underscore}_${message_type}_fields').substitute(translations) ]
+        if method == 'parse':
+            args.append('error')
+
+        for field in fields:
+            field_underscore = utils.build_underscore_name_from_camelcase(field['name'])
+            if field['format'] in [ 'unsized-byte-array', 'ref-byte-array', 'ref-byte-array-no-offset' ]:
+                if method == 'parse' and field['format'] == 'ref-byte-array-no-offset':
+                    raise ValueError('Cannot handle field type \'%s\' when parsing' % field['format'])
+                args.append(field_underscore + '_size')
+            args.append(field_underscore)
+
+        return call + (',\n' + ' ' * len(call)).join(args) + ');\n'
 
 
     """
@@ -198,6 +316,7 @@ class Message:
                          'message_type'             : message_type,
                          'message_type_upper'       : message_type.upper(),
                          'service_underscore_upper' : utils.build_underscore_name (self.service).upper(),
+                         'message_kind'             : 'response' if message_type == 'response' else 'request',
                          'cid_enum_name'            : self.cid_enum_name }
         template = (
             '\n'
@@ -303,7 +422,7 @@ class Message:
         template += (
             ' * @error: return location for error or %NULL.\n'
             ' *\n'
-            ' * Create a new request for the \'${message}\' ${message_type} command in the \'${service}\' service.\n'
+            ' * Create a new ${message_kind} for the \'${message}\' ${message_type} command in the \'${service}\' service.\n'
             ' *\n'
             ' * Returns: a newly allocated #MbimMessage, which should be freed with mbim_message_unref().\n'
             ' */\n'
@@ -354,15 +473,33 @@ class Message:
 
             template += (string.Template(inner_template).substitute(translations))
 
+        if self.backend == 'table':
+            template += (
+                '    GError **error)\n'
+                '{\n' +
+                self._build_fields_call('new', message_type, fields, []) +
+                '}\n')
+            cfile.write(string.Template(template).substitute(translations))
+            return
+
         template += (
             '    GError **error)\n'
             '{\n'
             '    MbimMessageCommandBuilder *builder;\n'
-            '\n'
-            '    builder = _mbim_message_command_builder_new (0,\n'
-            '                                                 MBIM_SERVICE_${service_underscore_upper},\n'
-            '                                                 ${cid_enum_name},\n'
-            '                                                 MBIM_MESSAGE_COMMAND_TYPE_${message_type_upper});\n')
+            '\n')
+
+        if message_type == 'response':
+            template += (
+                '    builder = _mbim_message_command_done_builder_new (0,\n'
+                '                                                      MBIM_SERVICE_${service_underscore_upper},\n'
+                '                                                      ${cid_enum_name},\n'
+                '                                                      MBIM_STATUS_ERROR_NONE);\n')
+        else:
+            template += (
+                '    builder = _mbim_message_command_builder_new (0,\n'
+                '                                                 MBIM_SERVICE_${service_underscore_upper},\n'
+                '                                                 ${cid_enum_name},\n'
+                '                                                 MBIM_MESSAGE_COMMAND_TYPE_${message_type_upper});\n')
 
         for field in fields:
             translations['field'] = utils.build_underscore_name_from_camelcase(field['name'])
@@ -597,6 +734,15 @@ class Message:
 
             template += (string.Template(inner_template).substitute(translations))
 
+        if self.backend == 'table':
+            template += (
+                '    GError **error)\n'
+                '{\n' +
+                self._build_fields_call('parse', message_type, fields, [ 'message' ]) +
+                '}\n')
+            cfile.write(string.Template(template).substitute(translations))
+            return
+
         template += (
             '    GError **error)\n'
             '{\n')
@@ -813,11 +959,13 @@ class Message:
 
 
     """
-    Emit message printable
+    Emit message printer, reading the fields directly from the message
     """
     def _emit_message_printable(self, cfile, message_type, fields):
+        if self.backend == 'table':
+            return
+
         translations = { 'message'                  : self.name,
-                         'underscore'               : utils.build_underscore_name(self.name),
                          'service'                  : self.service,
                          'underscore'               : utils.build_underscore_name (self.fullname),
                          'message_type'             : message_type,
@@ -825,13 +973,12 @@ class Message:
                          'service_underscore_upper' : utils.build_underscore_name (self.service).upper() }
         template = (
             '\n'
-            'static gchar *\n'
-            '${underscore}_${message_type}_get_printable (\n'
+            'static void\n'
+            '${underscore}_${message_type}_print (\n'
             '    const MbimMessage *message,\n'
-            '    const gchar *line_prefix,\n'
-            '    GError **error)\n'
-            '{\n'
-            '    GString *str;\n')
+            '    MbimPrinter *printer,\n'
+            '    const gchar *line_prefix)\n'
+            '{\n')
 
         if fields != []:
             template += (
@@ -847,11 +994,13 @@ class Message:
             template += (
                 '\n'
                 '    if (!mbim_message_response_get_result (message, MBIM_MESSAGE_TYPE_COMMAND_DONE, NULL))\n'
-                '        return NULL;\n')
+                '        return;\n')
 
-        template += (
-            '\n'
-            '    str = g_string_new ("");\n')
+        if fields != []:
+            template += (
+                '\n'
+                '    _mbim_printer_append_prefix (printer, line_prefix, 0);\n'
+                '    _mbim_printer_append (printer, "Fields:\\n");\n')
 
         for field in fields:
             translations['field']                   = utils.build_underscore_name_from_camelcase(field['name'])
@@ -868,7 +1017,8 @@ class Message:
 
             inner_template = (
                 '\n'
-                '    g_string_append_printf (str, "%s  ${field_name} = ", line_prefix);\n')
+                '    _mbim_printer_append_prefix (printer, line_prefix, 0);\n'
+                '    _mbim_printer_append (printer, "  ${field_name} = ");\n')
 
             if 'available-if' in field:
                 condition = field['available-if']
@@ -885,14 +1035,13 @@ class Message:
                 inner_template += (
                     '        _${field} = _mbim_message_read_guint32 (message, offset);\n'
                     '        offset += 4;\n'
-                    '        g_string_append_printf (str, "\'%" G_GUINT32_FORMAT "\'", _${field});\n')
+                    '        _mbim_printer_append_printf (printer, "\'%" G_GUINT32_FORMAT "\'", _${field});\n')
 
             elif field['format'] == 'byte-array' or \
                  field['format'] == 'unsized-byte-array' or \
                  field['format'] == 'ref-byte-array' or \
                  field['format'] == 'ref-byte-array-no-offset':
                 inner_template += (
-                    '        guint i;\n'
                     '        const guint8 *tmp;\n'
                     '        guint32 tmpsize;\n'
                     '\n')
@@ -917,21 +1066,16 @@ class Message:
                         '        offset += 4;\n')
 
                 inner_template += (
-                    '        g_string_append (str, "\'");\n'
-                    '        for (i = 0; i  < tmpsize; i++)\n'
-                    '            g_string_append_printf (str, "%02x%s", tmp[i], (i == (tmpsize - 1)) ? "" : ":" );\n'
-                    '        g_string_append (str, "\'");\n')
+                    '        _mbim_printer_append (printer, "\'");\n'
+                    '        _mbim_printer_append_hex (printer, tmp, tmpsize, \':\');\n'
+                    '        _mbim_printer_append (printer, "\'");\n')
 
             elif field['format'] == 'uuid':
                 inner_template += (
-                    '        const MbimUuid *tmp;\n'
-                    '        gchar *tmpstr;\n'
-                    '\n'
-                    '        tmp = _mbim_message_read_uuid (message, offset);\n'
-                    '        offset += 16;\n'
-                    '        tmpstr = mbim_uuid_get_printable (tmp);\n'
-                    '        g_string_append_printf (str, "\'%s\'", tmpstr);\n'
-                    '        g_free (tmpstr);\n')
+                    '        _mbim_printer_append (printer, "\'");\n'
+                    '        _mbim_printer_append_uuid (printer, _mbim_message_read_uuid (message, offset));\n'
+                    '        _mbim_printer_append (printer, "\'");\n'
+                    '        offset += 16;\n')
 
             elif field['format'] == 'guint32' or \
                  field['format'] == 'guint64':
@@ -950,13 +1094,13 @@ class Message:
                 if 'public-format' in field:
                     inner_template += (
                         '#if defined __${public_underscore_upper}_IS_ENUM__\n'
-                        '        g_string_append_printf (str, "\'%s\'", ${public_underscore}_get_string (tmp));\n'
+                        '        _mbim_printer_append_printf (printer, "\'%s\'", ${public_underscore}_get_string (tmp));\n'
                         '#elif defined __${public_underscore_upper}_IS_FLAGS__\n'
                         '        {\n'
                         '            gchar *tmpstr;\n'
                         '\n'
                         '            tmpstr = ${public_underscore}_build_string_from_mask (tmp);\n'
-                        '            g_string_append_printf (str, "\'%s\'", tmpstr);\n'
+                        '            _mbim_printer_append_printf (printer, "\'%s\'", tmpstr);\n'
                         '            g_free (tmpstr);\n'
                         '        }\n'
                         '#else\n'
@@ -965,10 +1109,10 @@ class Message:
                         '\n')
                 elif field['format'] == 'guint32':
                     inner_template += (
-                        '        g_string_append_printf (str, "\'%" G_GUINT32_FORMAT "\'", tmp);\n')
+                        '        _mbim_printer_append_printf (printer, "\'%" G_GUINT32_FORMAT "\'", tmp);\n')
                 elif field['format'] == 'guint64':
                     inner_template += (
-                        '        g_string_append_printf (str, "\'%" G_GUINT64_FORMAT "\'", tmp);\n')
+                        '        _mbim_printer_append_printf (printer, "\'%" G_GUINT64_FORMAT "\'", tmp);\n')
 
             elif field['format'] == 'string':
                 inner_template += (
@@ -976,189 +1120,377 @@ class Message:
                     '\n'
                     '        tmp = _mbim_message_read_string (message, 0, offset);\n'
                     '        offset += 8;\n'
-                    '        g_string_append_printf (str, "\'%s\'", tmp);\n'
+                    '        _mbim_printer_append_printf (printer, "\'%s\'", tmp);\n'
                     '        g_free (tmp);\n')
 
             elif field['format'] == 'string-array':
                 inner_template += (
-                    '        gchar **tmp;\n'
                     '        guint i;\n'
                     '\n'
-                    '        tmp = _mbim_message_read_string_array (message, _${array_size_field}, 0, offset);\n'
-                    '        offset += (8 * _${array_size_field});\n'
-                    '\n'
-                    '        g_string_append (str, "\'");\n'
+                    '        _mbim_printer_append (printer, "\'");\n'
                     '        for (i = 0; i < _${array_size_field}; i++) {\n'
-                    '            g_string_append (str, tmp[i]);\n'
+                    '            gchar *tmp;\n'
+                    '\n'
+                    '            tmp = _mbim_message_read_string (message, 0, offset + (8 * i));\n'
+                    '            _mbim_printer_append (printer, tmp);\n'
+                    '            g_free (tmp);\n'
                     '            if (i < (_${array_size_field} - 1))\n'
-                    '                g_string_append (str, ", ");\n'
+                    '                _mbim_printer_append (printer, ", ");\n'
                     '        }\n'
-                    '        g_string_append (str, "\'");\n'
-                    '        g_strfreev (tmp);\n')
+                    '        _mbim_printer_append (printer, "\'");\n'
+                    '        offset += (8 * _${array_size_field});\n')
 
             elif field['format'] == 'struct':
                 inner_template += (
-                    '        ${struct_type} *tmp;\n'
                     '        guint32 bytes_read = 0;\n'
-                    '        gchar *new_line_prefix;\n'
-                    '        gchar *struct_str;\n'
                     '\n'
-                    '        tmp = _mbim_message_read_${struct_name}_struct (message, offset, &bytes_read);\n'
+                    '        _mbim_printer_append (printer, "{\\n");\n'
+                    '        _mbim_message_print_${struct_name}_struct (message, offset, &bytes_read, printer, line_prefix, 4);\n'
                     '        offset += bytes_read;\n'
-                    '\n'
-                    '        g_string_append (str, "{\\n");\n'
-                    '        new_line_prefix = g_strdup_printf ("%s    ", line_prefix);\n'
-                    '        struct_str = _mbim_message_print_${struct_name}_struct (tmp, new_line_prefix);\n'
-                    '        g_string_append (str, struct_str);\n'
-                    '        g_free (struct_str);\n'
-                    '        g_string_append_printf (str, "%s  }\\n", line_prefix);\n'
-                    '        g_free (new_line_prefix);\n'
-                    '        _${struct_name}_free (tmp);\n')
+                    '        _mbim_printer_append_prefix (printer, line_prefix, 0);\n'
+                    '        _mbim_printer_append (printer, "  }\\n");\n')
 
             elif field['format'] == 'struct-array' or field['format'] == 'ref-struct-array':
+                translations['refs'] = 'TRUE' if field['format'] == 'ref-struct-array' else 'FALSE'
                 inner_template += (
-                    '        ${struct_type} **tmp;\n'
-                    '        gchar *new_line_prefix;\n'
-                    '        guint i;\n'
-                    '\n')
+                    '        _mbim_printer_append (printer, "\'{\\n");\n'
+                    '        _mbim_message_print_${struct_name}_struct_array (message, _${array_size_field}, offset, ${refs}, printer, line_prefix);\n')
 
                 if field['format'] == 'struct-array':
                     inner_template += (
-                    '        tmp = _mbim_message_read_${struct_name}_struct_array (message, _${array_size_field}, offset, FALSE);\n'
                     '        offset += 4;\n')
                 elif field['format'] == 'ref-struct-array':
                     inner_template += (
-                    '        tmp = _mbim_message_read_${struct_name}_struct_array (message, _${array_size_field}, offset, TRUE);\n'
                     '        offset += (8 * _${array_size_field});\n')
 
                 inner_template += (
-                    '        new_line_prefix = g_strdup_printf ("%s        ", line_prefix);\n'
-                    '        g_string_append (str, "\'{\\n");\n'
-                    '        for (i = 0; i < _${array_size_field}; i++) {\n'
-                    '            gchar *struct_str;\n'
-                    '\n'
-                    '            g_string_append_printf (str, "%s    [%u] = {\\n", line_prefix, i);\n'
-                    '            struct_str = _mbim_message_print_${struct_name}_struct (tmp[i], new_line_prefix);\n'
-                    '            g_string_append (str, struct_str);\n'
-                    '            g_free (struct_str);\n'
-                    '            g_string_append_printf (str, "%s    },\\n", line_prefix);\n'
-                    '        }\n'
-                    '        g_string_append_printf (str, "%s  }\'", line_prefix);\n'
-                    '        g_free (new_line_prefix);\n'
-                    '        ${struct_name}_array_free (tmp);\n')
+                    '        _mbim_printer_append_prefix (printer, line_prefix, 0);\n'
+                    '        _mbim_printer_append (printer, "  }\'");\n')
 
             elif field['format'] == 'ipv4' or \
                  field['format'] == 'ref-ipv4' or \
-                 field['format'] == 'ipv4-array' or \
                  field['format'] == 'ipv6' or \
-                 field['format'] == 'ref-ipv6' or \
-                 field['format'] == 'ipv6-array':
+                 field['format'] == 'ref-ipv6':
+                translations['ref'] = 'TRUE' if field['format'].startswith('ref-') else 'FALSE'
                 if field['format'] == 'ipv4' or \
                    field['format'] == 'ref-ipv4':
+                    translations['type'] = 'MbimIPv4'
+                    translations['read'] = 'ipv4'
+                    translations['is_ipv6'] = 'FALSE'
+                    translations['size'] = '4'
+                else:
+                    translations['type'] = 'MbimIPv6'
+                    translations['read'] = 'ipv6'
+                    translations['is_ipv6'] = 'TRUE'
+                    translations['size'] = '4' if field['format'] == 'ref-ipv6' else '16'
+
+                inner_template += (
+                    '        const ${type} *tmp;\n'
+                    '\n'
+                    '        tmp = _mbim_message_read_${read} (message, offset, ${ref});\n'
+                    '        offset += ${size};\n'
+                    '        _mbim_printer_append (printer, "\'");\n'
+                    '        if (tmp)\n'
+                    '            _mbim_printer_append_ip (printer, tmp->addr, ${is_ipv6});\n'
+                    '        _mbim_printer_append (printer, "\'");\n')
+
+            elif field['format'] == 'ipv4-array' or \
+                 field['format'] == 'ipv6-array':
+                if field['format'] == 'ipv4-array':
+                    translations['read'] = 'ipv4'
+                    translations['is_ipv6'] = 'FALSE'
+                    translations['size'] = '4'
+                else:
+                    translations['read'] = 'ipv6'
+                    translations['is_ipv6'] = 'TRUE'
+                    translations['size'] = '16'
+
+                inner_template += (
+                    '        guint32 array_offset;\n'
+                    '        guint i;\n'
+                    '\n'
+                    '        array_offset = _mbim_message_read_guint32 (message, offset);\n'
+                    '        offset += 4;\n'
+                    '        _mbim_printer_append (printer, "\'");\n'
+                    '        for (i = 0; i < _${array_size_field}; i++) {\n'
+                    '            _mbim_printer_append_ip (printer, _mbim_message_read_${read} (message, array_offset + (${size} * i), FALSE)->addr, ${is_ipv6});\n'
+                    '            if (i < (_${array_size_field} - 1))\n'
+                    '                _mbim_printer_append (printer, ", ");\n'
+                    '        }\n'
+                    '        _mbim_printer_append (printer, "\'");\n')
+
+            else:
+                raise ValueError('Field format \'%s\' not printable' % field['format'])
+
+            inner_template += (
+                '    }\n'
+                '    _mbim_printer_append (printer, "\\n");\n')
+
+            template += (string.Template(inner_template).substitute(translations))
+
+        template += (
+            '}\n')
+        cfile.write(string.Template(template).substitute(translations))
+
+
+    """
+    Emit message JSON encoder, reading the fields directly from the message
+    """
+    def _emit_message_json(self, cfile, message_type, fields):
+        if self.backend == 'table':
+            return
+
+        translations = { 'underscore'   : utils.build_underscore_name (self.fullname),
+                         'message_type' : message_type }
+        template = (
+            '\n'
+            'static void\n'
+            '${underscore}_${message_type}_json (\n'
+            '    const MbimMessage *message,\n'
+            '    MbimPrinter *printer)\n'
+            '{\n')
+
+        if fields != []:
+            template += (
+                '    guint32 offset = 0;\n'
+                '    guint n_members = 0;\n')
+
+        for field in fields:
+            if 'always-read' in field:
+                translations['field'] = utils.build_underscore_name_from_camelcase(field['name'])
+                inner_template = ('    guint32 _${field};\n')
+                template += (string.Template(inner_template).substitute(translations))
+
+        if fields != []:
+            template += (
+                '\n')
+
+        template += (
+            '    _mbim_printer_append (printer, "{");\n')
+
+        for field in fields:
+            translations['field']                   = utils.build_underscore_name_from_camelcase(field['name'])
+            translations['public']                  = field['public-format'] if 'public-format' in field else field['format']
+            translations['public_underscore']       = utils.build_underscore_name_from_camelcase(field['public-format']) if 'public-format' in field else ''
+            translations['public_underscore_upper'] = utils.build_underscore_name_from_camelcase(field['public-format']).upper() if 'public-format' in field else ''
+            translations['field_name']              = field['name']
+            translations['array_size_field']        = utils.build_underscore_name_from_camelcase(field['array-size-field']) if 'array-size-field' in field else ''
+            translations['struct_name']             = utils.build_underscore_name_from_camelcase(field['struct-type']) if 'struct-type' in field else ''
+            translations['array_size']              = field['array-size'] if 'array-size' in field else ''
+
+            # The key goes right after the declarations of the value block
+            inner_template = ''
+
+            if 'always-read' in field:
+                inner_template += (
+                    '        _${field} = _mbim_message_read_guint32 (message, offset);\n'
+                    '        offset += 4;\n'
+                    '        _mbim_printer_append_printf (printer, "%" G_GUINT32_FORMAT, _${field});\n')
+
+            elif field['format'] == 'byte-array' or \
+                 field['format'] == 'unsized-byte-array' or \
+                 field['format'] == 'ref-byte-array' or \
+                 field['format'] == 'ref-byte-array-no-offset':
+                inner_template += (
+                    '        const guint8 *tmp;\n'
+                    '        guint32 tmpsize;\n'
+                    '\n')
+                if field['format'] == 'byte-array':
                     inner_template += (
-                        '        const MbimIPv4 *tmp;\n')
-                elif field['format'] == 'ipv4-array':
+                        '        tmp = _mbim_message_read_byte_array (message, 0, offset, FALSE, FALSE, NULL);\n'
+                        '        tmpsize = ${array_size};\n'
+                        '        offset += ${array_size};\n')
+                elif field['format'] == 'unsized-byte-array':
                     inner_template += (
-                        '        MbimIPv4 *tmp;\n')
-                elif field['format'] == 'ipv6' or \
-                     field['format'] == 'ref-ipv6':
+                        '        tmp = _mbim_message_read_byte_array (message, 0, offset, FALSE, FALSE, &tmpsize);\n'
+                        '        offset += tmpsize;\n')
+                elif field['format'] == 'ref-byte-array':
                     inner_template += (
-                        '        const MbimIPv6 *tmp;\n')
-                elif field['format'] == 'ipv6-array':
+                        '        tmp = _mbim_message_read_byte_array (message, 0, offset, TRUE, TRUE, &tmpsize);\n'
+                        '        offset += 8;\n')
+                elif field['format'] == 'ref-byte-array-no-offset':
                     inner_template += (
-                        '        MbimIPv6 *tmp;\n')
+                        '        tmp = _mbim_message_read_byte_array (message, 0, offset, FALSE, TRUE, &tmpsize);\n'
+                        '        offset += 4;\n')
 
                 inner_template += (
-                    '        guint array_size;\n'
-                    '        guint i;\n'
-                    '\n')
+                    '        _mbim_printer_append (printer, "\\"");\n'
+                    '        _mbim_printer_append_hex (printer, tmp, tmpsize, \':\');\n'
+                    '        _mbim_printer_append (printer, "\\"");\n')
+
+            elif field['format'] == 'uuid':
+                inner_template += (
+                    '        _mbim_printer_append (printer, "\\"");\n'
+                    '        _mbim_printer_append_uuid (printer, _mbim_message_read_uuid (message, offset));\n'
+                    '        _mbim_printer_append (printer, "\\"");\n'
+                    '        offset += 16;\n')
 
-                if field['format'] == 'ipv4':
+            elif field['format'] == 'guint32' or \
+                 field['format'] == 'guint64':
+                inner_template += (
+                    '        ${public} tmp;\n'
+                    '\n')
+                if field['format'] == 'guint32' :
                     inner_template += (
-                        '        array_size = 1;\n'
-                        '        tmp = _mbim_message_read_ipv4 (message, offset, FALSE);\n'
+                        '        tmp = (${public}) _mbim_message_read_guint32 (message, offset);\n'
                         '        offset += 4;\n')
-                elif field['format'] == 'ref-ipv4':
+                elif field['format'] == 'guint64' :
                     inner_template += (
-                        '        array_size = 1;\n'
-                        '        tmp = _mbim_message_read_ipv4 (message, offset, TRUE);\n'
-                        '        offset += 4;\n')
-                elif field['format'] == 'ipv4-array':
+                        '        tmp = (${public}) _mbim_message_read_guint64 (message, offset);\n'
+                        '        offset += 8;\n')
+
+                if 'public-format' in field:
+                    inner_template += utils.json_enum_or_flags_template('tmp', '        ')
+                elif field['format'] == 'guint32':
                     inner_template += (
-                        '        array_size = _${array_size_field};\n'
-                        '        tmp = _mbim_message_read_ipv4_array (message, _${array_size_field}, offset);\n'
-                        '        offset += 4;\n')
-                elif field['format'] == 'ipv6':
+                        '        _mbim_printer_append_printf (printer, "%" G_GUINT32_FORMAT, tmp);\n')
+                elif field['format'] == 'guint64':
                     inner_template += (
-                        '        array_size = 1;\n'
-                        '        tmp = _mbim_message_read_ipv6 (message, offset, FALSE);\n'
-                        '        offset += 16;\n')
-                elif field['format'] == 'ref-ipv6':
+                        '        _mbim_printer_append_printf (printer, "%" G_GUINT64_FORMAT, tmp);\n')
+
+            elif field['format'] == 'string':
+                inner_template += (
+                    '        gchar *tmp;\n'
+                    '\n'
+                    '        tmp = _mbim_message_read_string (message, 0, offset);\n'
+                    '        offset += 8;\n'
+                    '        _mbim_printer_append_json_string (printer, tmp);\n'
+                    '        g_free (tmp);\n')
+
+            elif field['format'] == 'string-array':
+                inner_template += (
+                    '        guint i;\n'
+                    '\n'
+                    '        _mbim_printer_append (printer, "[");\n'
+                    '        for (i = 0; i < _${array_size_field}; i++) {\n'
+                    '            gchar *tmp;\n'
+                    '\n'
+                    '            tmp = _mbim_message_read_string (message, 0, offset + (8 * i));\n'
+                    '            if (i > 0)\n'
+                    '                _mbim_printer_append (printer, ",");\n'
+                    '            _mbim_printer_append_json_string (printer, tmp);\n'
+                    '            g_free (tmp);\n'
+                    '        }\n'
+                    '        _mbim_printer_append (printer, "]");\n'
+                    '        offset += (8 * _${array_size_field});\n')
+
+            elif field['format'] == 'struct':
+                inner_template += (
+                    '        guint32 bytes_read = 0;\n'
+                    '\n'
+                    '        _mbim_message_json_${struct_name}_struct (message, offset, &bytes_read, printer);\n'
+                    '        offset += bytes_read;\n')
+
+            elif field['format'] == 'struct-array' or field['format'] == 'ref-struct-array':
+                translations['refs'] = 'TRUE' if field['format'] == 'ref-struct-array' else 'FALSE'
+                inner_template += (
+                    '        _mbim_message_json_${struct_name}_struct_array (message, _${array_size_field}, offset, ${refs}, printer);\n')
+
+                if field['format'] == 'struct-array':
                     inner_template += (
-                        '        array_size = 1;\n'
-                        '        tmp = _mbim_message_read_ipv6 (message, offset, TRUE);\n'
-                        '        offset += 4;\n')
-                elif field['format'] == 'ipv6-array':
+                    '        offset += 4;\n')
+                elif field['format'] == 'ref-struct-array':
                     inner_template += (
-                        '        array_size = _${array_size_field};\n'
-                        '        tmp = _mbim_message_read_ipv6_array (message, _${array_size_field}, offset);\n'
-                        '        offset += 4;\n')
+                    '        offset += (8 * _${array_size_field});\n')
+
+            elif field['format'] == 'ipv4' or \
+                 field['format'] == 'ref-ipv4' or \
+                 field['format'] == 'ipv6' or \
+                 field['format'] == 'ref-ipv6':
+                translations['ref'] = 'TRUE' if field['format'].startswith('ref-') else 'FALSE'
+                if field['format'] == 'ipv4' or \
+                   field['format'] == 'ref-ipv4':
+                    translations['type'] = 'MbimIPv4'
+                    translations['read'] = 'ipv4'
+                    translations['is_ipv6'] = 'FALSE'
+                    translations['size'] = '4'
+                else:
+                    translations['type'] = 'MbimIPv6'
+                    translations['read'] = 'ipv6'
+                    translations['is_ipv6'] = 'TRUE'
+                    translations['size'] = '4' if field['format'] == 'ref-ipv6' else '16'
 
                 inner_template += (
-                    '        g_string_append (str, "\'");\n'
+                    '        const ${type} *tmp;\n'
+                    '\n'
+                    '        tmp = _mbim_message_read_${read} (message, offset, ${ref});\n'
+                    '        offset += ${size};\n'
                     '        if (tmp) {\n'
-                    '            for (i = 0; i < array_size; i++) {\n'
-                    '                GInetAddress *addr;\n'
-                    '                gchar *tmpstr;\n'
-                    '\n')
+                    '            _mbim_printer_append (printer, "\\"");\n'
+                    '            _mbim_printer_append_ip (printer, tmp->addr, ${is_ipv6});\n'
+                    '            _mbim_printer_append (printer, "\\"");\n'
+                    '        } else\n'
+                    '            _mbim_printer_append (printer, "null");\n')
 
-                if field['format'] == 'ipv4' or \
-                   field['format'] == 'ref-ipv4' or \
-                   field['format'] == 'ipv4-array':
-                    inner_template += (
-                        '                addr = g_inet_address_new_from_bytes ((guint8 *)&(tmp[i].addr), G_SOCKET_FAMILY_IPV4);\n')
-                elif field['format'] == 'ipv6' or \
-                     field['format'] == 'ref-ipv6' or \
-                     field['format'] == 'ipv6-array':
-                    inner_template += (
-                        '                addr = g_inet_address_new_from_bytes ((guint8 *)&(tmp[i].addr), G_SOCKET_FAMILY_IPV6);\n')
+            elif field['format'] == 'ipv4-array' or \
+                 field['format'] == 'ipv6-array':
+                if field['format'] == 'ipv4-array':
+                    translations['read'] = 'ipv4'
+                    translations['is_ipv6'] = 'FALSE'
+                    translations['size'] = '4'
+                else:
+                    translations['read'] = 'ipv6'
+                    translations['is_ipv6'] = 'TRUE'
+                    translations['size'] = '16'
 
                 inner_template += (
-                    '                tmpstr = g_inet_address_to_string (addr);\n'
-                    '                g_string_append_printf (str, "%s", tmpstr);\n'
-                    '                g_free (tmpstr);\n'
-                    '                g_object_unref (addr);\n'
-                    '                if (i < (array_size - 1))\n'
-                    '                    g_string_append (str, ", ");\n'
-                    '            }\n'
+                    '        guint32 array_offset;\n'
+                    '        guint i;\n'
+                    '\n'
+                    '        array_offset = _mbim_message_read_guint32 (message, offset);\n'
+                    '        offset += 4;\n'
+                    '        _mbim_printer_append (printer, "[");\n'
+                    '        for (i = 0; i < _${array_size_field}; i++) {\n'
+                    '            _mbim_printer_append (printer, i > 0 ? ",\\"" : "\\"");\n'
+                    '            _mbim_printer_append_ip (printer, _mbim_message_read_${read} (message, array_offset + (${size} * i), FALSE)->addr, ${is_ipv6});\n'
+                    '            _mbim_printer_append (printer, "\\"");\n'
                     '        }\n'
-                    '        g_string_append (str, "\'");\n')
+                    '        _mbim_printer_append (printer, "]");\n')
 
-                if field['format'] == 'ipv4-array' or \
-                   field['format'] == 'ipv6-array':
-                    inner_template += (
-                        '        g_free (tmp);\n')
+            else:
+                raise ValueError('Field format \'%s\' not encodable as JSON' % field['format'])
+
+            (declarations, separator, statements) = inner_template.partition(';\n\n')
+            if not separator:
+                (declarations, statements) = ('', inner_template)
+            inner_template = (declarations + separator +
+                              '        _mbim_printer_append_json_key (printer, &n_members, "${field_name}");\n' +
+                              statements)
 
+            if 'available-if' in field:
+                condition = field['available-if']
+                translations['condition_field'] = utils.build_underscore_name_from_camelcase(condition['field'])
+                translations['condition_operation'] = condition['operation']
+                translations['condition_value'] = condition['value']
+                inner_template = (
+                    '\n'
+                    '    if (_${condition_field} ${condition_operation} ${condition_value}) {\n' +
+                    inner_template)
             else:
-                raise ValueError('Field format \'%s\' not printable' % field['format'])
+                inner_template = (
+                    '\n'
+                    '    {\n' +
+                    inner_template)
 
             inner_template += (
-                '    }\n'
-                '    g_string_append (str, "\\n");\n')
+                '    }\n')
 
             template += (string.Template(inner_template).substitute(translations))
 
         template += (
             '\n'
-            '    return g_string_free (str, FALSE);\n'
+            '    _mbim_printer_append (printer, "}");\n'
             '}\n')
         cfile.write(string.Template(template).substitute(translations))
 
-
     """
     Emit the section content
     """
     def emit_section_content(self, sfile):
+        # Commands only given to declare capabilities have no API
+        if not self.has_query and not self.has_set and not self.has_response and not self.has_notification:
+            return
+
         translations = { 'name_dashed' : utils.build_dashed_name(self.name),
                          'underscore'  : utils.build_underscore_name(self.fullname) }
 
@@ -1182,6 +1514,11 @@ class Message:
                 '${underscore}_response_parse\n')
             sfile.write(string.Template(template).substitute(translations))
 
+        if self.has_response_builder:
+            template = (
+                '${underscore}_response_new\n')
+            sfile.write(string.Template(template).substitute(translations))
+
         if self.has_notification:
             template = (
                 '${underscore}_notification_parse\n')
@@ -17,7 +17,14 @@
 # Copyright (C) 2013 - 2018 Aleksander Morgado <aleksander@aleksander.es>
 #
 
+import errno
+import glob
+import hashlib
+import json
+import os
+import pickle
 import string
+import tempfile
 
 from Message import Message
 from Struct import Struct
@@ -48,17 +55,18 @@ class ObjectList:
     """
     Constructor
     """
-    def __init__(self, objects_dictionary):
+    def __init__(self, objects_dictionary, backend = 'unrolled'):
         self.command_list = []
         self.struct_list = []
         self.service = ''
+        self.backend = backend
 
         # Loop items in the list, creating Message objects for the messages
         for object_dictionary in objects_dictionary:
             if object_dictionary['type'] == 'Command':
-                self.command_list.append(Message(object_dictionary))
+                self.command_list.append(Message(object_dictionary, backend))
             elif object_dictionary['type'] == 'Struct':
-                self.struct_list.append(Struct(object_dictionary))
+                self.struct_list.append(Struct(object_dictionary, backend))
             elif object_dictionary['type'] == 'Service':
                 self.service = object_dictionary['name']
             else:
@@ -88,58 +96,63 @@ class ObjectList:
 
 
     """
-    Emit support for printing messages in this service
+    Emit the CID table of this service, with capabilities, printable names,
+    print and JSON callbacks (or field tables), indexed by CID
     """
-    def emit_printable(self, hfile, cfile):
+    def emit_cid_table(self, hfile, cfile):
         translations = { 'service_underscore' : utils.build_underscore_name(self.service),
                          'service'            : self.service }
 
-
         template = (
             '\n'
             '/*****************************************************************************/\n'
-            '/* Service helper for printable fields */\n'
+            '/* Service CID table */\n'
             '\n'
             '#if defined (LIBMBIM_GLIB_COMPILATION)\n'
             '\n'
+            '#include "mbim-cid-private.h"\n'
+            '\n'
             'G_GNUC_INTERNAL\n'
-            'gchar *\n'
-            '__mbim_message_${service_underscore}_get_printable_fields (\n'
-            '    const MbimMessage *message,\n'
-            '    const gchar *line_prefix,\n'
-            '    GError **error);\n'
+            'extern const MbimCidTable __mbim_${service_underscore}_cid_table;\n'
             '\n'
             '#endif\n')
         hfile.write(string.Template(template).substitute(translations))
 
         template = (
             '\n'
-            'typedef struct {\n'
-            '  gchar * (* query_cb)        (const MbimMessage *message, const gchar *line_prefix, GError **error);\n'
-            '  gchar * (* set_cb)          (const MbimMessage *message, const gchar *line_prefix, GError **error);\n'
-            '  gchar * (* response_cb)     (const MbimMessage *message, const gchar *line_prefix, GError **error);\n'
-            '  gchar * (* notification_cb) (const MbimMessage *message, const gchar *line_prefix, GError **error);\n'
-            '} GetPrintableCallbacks;\n'
+            '/*****************************************************************************/\n'
+            '/* Service CID table */\n'
             '\n'
-            'static const GetPrintableCallbacks get_printable_callbacks[] = {\n')
+            'static const MbimCidEntry cid_entries[] = {\n')
 
         for item in self.command_list:
-            translations['message'] = utils.build_underscore_name (item.fullname)
-            translations['cid']     = item.cid_enum_name
+            translations['message']   = utils.build_underscore_name (item.fullname)
+            translations['cid']       = item.cid_enum_name
+            translations['printable'] = item.cid_printable
             inner_template = (
-                '    [${cid}] = {\n')
-            if item.has_query:
+                '    [${cid}] = {\n'
+                '        .printable = "${printable}",\n')
+            if item.can_set:
                 inner_template += (
-                    '        .query_cb = ${message}_query_get_printable,\n')
-            if item.has_set:
+                    '        .can_set = TRUE,\n')
+            if item.can_query:
                 inner_template += (
-                    '        .set_cb = ${message}_set_get_printable,\n')
-            if item.has_response:
+                    '        .can_query = TRUE,\n')
+            if item.can_notify:
                 inner_template += (
-                    '        .response_cb = ${message}_response_get_printable,\n')
-            if item.has_notification:
+                    '        .can_notify = TRUE,\n')
+            for (message_type, has_message_type) in [ ('query',        item.has_query),
+                                                      ('set',          item.has_set),
+                                                      ('response',     item.has_response),
+                                                      ('notification', item.has_notification) ]:
+                if not has_message_type:
+                    continue
                 inner_template += (
-                    '        .notification_cb = ${message}_notification_get_printable,\n')
+                    '        .' + message_type + '_fields = &${message}_' + message_type + '_fields,\n')
+                if self.backend != 'table':
+                    inner_template += (
+                        '        .' + message_type + '_print = ${message}_' + message_type + '_print,\n'
+                        '        .' + message_type + '_json = ${message}_' + message_type + '_json,\n')
             inner_template += (
                 '    },\n')
             template += (string.Template(inner_template).substitute(translations))
@@ -147,68 +160,10 @@ class ObjectList:
         template += (
             '};\n'
             '\n'
-            'gchar *\n'
-            '__mbim_message_${service_underscore}_get_printable_fields (\n'
-            '    const MbimMessage *message,\n'
-            '    const gchar *line_prefix,\n'
-            '    GError **error)\n'
-            '{\n'
-            '    guint32 cid;\n'
-            '\n'
-            '    switch (mbim_message_get_message_type (message)) {\n'
-            '        case MBIM_MESSAGE_TYPE_COMMAND: {\n'
-            '            cid = mbim_message_command_get_cid (message);\n'
-            '            if (cid < G_N_ELEMENTS (get_printable_callbacks)) {\n'
-            '                switch (mbim_message_command_get_command_type (message)) {\n'
-            '                    case MBIM_MESSAGE_COMMAND_TYPE_QUERY:\n'
-            '                        if (get_printable_callbacks[cid].query_cb)\n'
-            '                            return get_printable_callbacks[cid].query_cb (message, line_prefix, error);\n'
-            '                        break;\n'
-            '                    case MBIM_MESSAGE_COMMAND_TYPE_SET:\n'
-            '                        if (get_printable_callbacks[cid].set_cb)\n'
-            '                            return get_printable_callbacks[cid].set_cb (message, line_prefix, error);\n'
-            '                        break;\n'
-            '                    default:\n'
-            '                        g_set_error (error,\n'
-            '                                     MBIM_CORE_ERROR,\n'
-            '                                     MBIM_CORE_ERROR_INVALID_MESSAGE,\n'
-            '                                     \"Invalid command type\");\n'
-            '                        return NULL;\n'
-            '                }\n'
-            '            }\n'
-            '            break;\n'
-            '        }\n'
-            '\n'
-            '        case MBIM_MESSAGE_TYPE_COMMAND_DONE:\n'
-            '            cid = mbim_message_command_done_get_cid (message);\n'
-            '            if (cid < G_N_ELEMENTS (get_printable_callbacks)) {\n'
-            '                if (get_printable_callbacks[cid].response_cb)\n'
-            '                    return get_printable_callbacks[cid].response_cb (message, line_prefix, error);\n'
-            '            }\n'
-            '            break;\n'
-            '\n'
-            '        case MBIM_MESSAGE_TYPE_INDICATE_STATUS:\n'
-            '            cid = mbim_message_indicate_status_get_cid (message);\n'
-            '            if (cid < G_N_ELEMENTS (get_printable_callbacks)) {\n'
-            '                if (get_printable_callbacks[cid].notification_cb)\n'
-            '                    return get_printable_callbacks[cid].notification_cb (message, line_prefix, error);\n'
-            '            }\n'
-            '            break;\n'
-            '\n'
-            '        default:\n'
-            '            g_set_error (error,\n'
-            '                         MBIM_CORE_ERROR,\n'
-            '                         MBIM_CORE_ERROR_INVALID_MESSAGE,\n'
-            '                         \"No contents expected in this message type\");\n'
-            '            return NULL;\n'
-            '    }\n'
-            '\n'
-            '    g_set_error (error,\n'
-            '                 MBIM_CORE_ERROR,\n'
-            '                 MBIM_CORE_ERROR_INVALID_MESSAGE,\n'
-            '                 \"Unknown contents\");\n'
-            '    return NULL;\n'
-            '}\n')
+            'const MbimCidTable __mbim_${service_underscore}_cid_table = {\n'
+            '    .entries   = cid_entries,\n'
+            '    .n_entries = G_N_ELEMENTS (cid_entries),\n'
+            '};\n')
 
         cfile.write(string.Template(template).substitute(translations))
 
@@ -238,3 +193,62 @@ class ObjectList:
 
         sfile.write(
             '</SECTION>\n')
+
+
+"""
+Load the ObjectList of the given service database. If a cache directory is
+given, the validated model is stored there, and reused as long as neither the
+database, the backend nor the codegen itself change.
+"""
+def load_object_list(path, backend = 'unrolled', cache_dir = None):
+    if cache_dir is None:
+        return ObjectList(json.loads(utils.read_json_file(path)), backend)
+
+    digest = hashlib.sha1()
+    digest.update(backend.encode('utf-8'))
+    codegen_dir = os.path.dirname(os.path.abspath(__file__))
+    for source in [path] + sorted(glob.glob(os.path.join(codegen_dir, '*.py'))):
+        f = open(source, 'rb')
+        digest.update(f.read())
+        f.close()
+
+    cache_prefix = os.path.join(cache_dir, os.path.basename(path) + '-' + backend + '-')
+    cache_path = cache_prefix + digest.hexdigest() + '.pickle'
+    if os.path.exists(cache_path):
+        try:
+            f = open(cache_path, 'rb')
+            object_list = pickle.load(f)
+            f.close()
+            return object_list
+        except Exception:
+            # Just regenerate broken cache entries
+            pass
+
+    object_list = ObjectList(json.loads(utils.read_json_file(path)), backend)
+
+    try:
+        os.makedirs(cache_dir)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+    # Remove stale entries of the same database and backend; a parallel build
+    # may be removing them as well
+    for stale_path in glob.glob(cache_prefix + '*.pickle'):
+        if stale_path == cache_path:
+            continue
+        try:
+            os.remove(stale_path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+    # Write atomically, so that parallel builds never read partial entries
+    (fd, tmp_path) = tempfile.mkstemp(dir=cache_dir, prefix=os.path.basename(cache_path) + '.')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(object_list, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_path, cache_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+    return object_list
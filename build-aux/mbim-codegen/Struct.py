@@ -29,10 +29,15 @@ class Struct:
     """
     Constructor
     """
-    def __init__(self, dictionary):
+    def __init__(self, dictionary, backend = 'unrolled'):
         self.name = dictionary['name']
         self.contents = dictionary['contents']
 
+        # Either 'unrolled', emitting the per-struct read, print, JSON and
+        # append methods, or 'table', emitting a field table to be run by the
+        # generic field interpreter
+        self.backend = backend
+
         # Whether the struct is used as a single field, or as an array of
         # fields. Will be updated after having created the object.
         self.single_member = False
@@ -177,52 +182,62 @@ class Struct:
             hfile.write(string.Template(template).substitute(translations))
 
 
-        template = (
-            '\n'
-            'static void\n'
-            '_${name_underscore}_free (${name} *var)\n'
-            '{\n'
-            '    if (!var)\n'
-            '        return;\n'
-            '\n')
+        if self.backend == 'table':
+            template = (
+                '\n'
+                'static void\n'
+                '_${name_underscore}_free (${name} *var)\n'
+                '{\n'
+                '    _mbim_struct_fields_free (&${name_underscore}_struct_fields, var);\n'
+                '}\n')
+            cfile.write(string.Template(template).substitute(translations))
+        else:
+            template = (
+                '\n'
+                'static void\n'
+                '_${name_underscore}_free (${name} *var)\n'
+                '{\n'
+                '    if (!var)\n'
+                '        return;\n'
+                '\n')
 
-        for field in self.contents:
-            translations['field_name_underscore'] = utils.build_underscore_name_from_camelcase(field['name'])
-            inner_template = ''
-            if field['format'] == 'uuid':
-                pass
-            elif field['format'] in ['unsized-byte-array', 'ref-byte-array', 'ref-byte-array-no-offset']:
-                inner_template += (
-                    '    g_free (var->${field_name_underscore});\n')
-            elif field['format'] == 'guint32':
-                pass
-            elif field['format'] == 'guint32-array':
-                inner_template += (
-                    '    g_free (var->${field_name_underscore});\n')
-            elif field['format'] == 'guint64':
-                pass
-            elif field['format'] == 'string':
-                inner_template += (
-                    '    g_free (var->${field_name_underscore});\n')
-            elif field['format'] == 'string-array':
-                inner_template += (
-                    '    g_strfreev (var->${field_name_underscore});\n')
-            elif field['format'] == 'ipv4':
-                pass
-            elif field['format'] == 'ref-ipv4':
-                pass
-            elif field['format'] == 'ipv6':
-                pass
-            elif field['format'] == 'ref-ipv6':
-                pass
-            else:
-                raise ValueError('Cannot handle format \'%s\' in struct clear' % field['format'])
-            template += string.Template(inner_template).substitute(translations)
+            for field in self.contents:
+                translations['field_name_underscore'] = utils.build_underscore_name_from_camelcase(field['name'])
+                inner_template = ''
+                if field['format'] == 'uuid':
+                    pass
+                elif field['format'] in ['unsized-byte-array', 'ref-byte-array', 'ref-byte-array-no-offset']:
+                    inner_template += (
+                        '    g_free (var->${field_name_underscore});\n')
+                elif field['format'] == 'guint32':
+                    pass
+                elif field['format'] == 'guint32-array':
+                    inner_template += (
+                        '    g_free (var->${field_name_underscore});\n')
+                elif field['format'] == 'guint64':
+                    pass
+                elif field['format'] == 'string':
+                    inner_template += (
+                        '    g_free (var->${field_name_underscore});\n')
+                elif field['format'] == 'string-array':
+                    inner_template += (
+                        '    g_strfreev (var->${field_name_underscore});\n')
+                elif field['format'] == 'ipv4':
+                    pass
+                elif field['format'] == 'ref-ipv4':
+                    pass
+                elif field['format'] == 'ipv6':
+                    pass
+                elif field['format'] == 'ref-ipv6':
+                    pass
+                else:
+                    raise ValueError('Cannot handle format \'%s\' in struct clear' % field['format'])
+                template += string.Template(inner_template).substitute(translations)
 
-        template += (
-            '    g_free (var);\n'
-            '}\n')
-        cfile.write(string.Template(template).substitute(translations))
+            template += (
+                '    g_free (var);\n'
+                '}\n')
+            cfile.write(string.Template(template).substitute(translations))
 
         if self.single_member == True:
             template = (
@@ -269,7 +284,7 @@ class Struct:
             cfile.write(string.Template(template).substitute(translations))
 
     """
-    Emit the type's print methods
+    Emit the type's print methods, reading the fields directly from the message
     """
     def _emit_print(self, cfile):
         translations = { 'name'            : self.name,
@@ -278,122 +293,421 @@ class Struct:
 
         template = (
             '\n'
-            'static gchar *\n'
+            'static void\n'
             '_mbim_message_print_${name_underscore}_struct (\n'
-            '    const ${name} *self,\n'
-            '    const gchar *line_prefix)\n'
+            '    const MbimMessage *self,\n'
+            '    guint32 relative_offset,\n'
+            '    guint32 *bytes_read,\n'
+            '    MbimPrinter *printer,\n'
+            '    const gchar *line_prefix,\n'
+            '    guint indent)\n'
             '{\n'
-            '    GString *str;\n'
-            '\n'
-            '    str = g_string_new ("");\n'
-            '\n')
+            '    guint32 offset = relative_offset;\n')
+
+        # Fields giving array sizes are kept while printing
+        size_fields = [field['array-size-field'] for field in self.contents if 'array-size-field' in field]
+        for field in self.contents:
+            if field['name'] in size_fields:
+                translations['field_name_underscore'] = utils.build_underscore_name_from_camelcase(field['name'])
+                template += string.Template('    guint32 _${field_name_underscore};\n').substitute(translations)
 
         for field in self.contents:
             translations['field_name'] = field['name']
             translations['field_name_underscore'] = utils.build_underscore_name_from_camelcase(field['name'])
 
             inner_template = (
-                '    g_string_append_printf (str, "%s  ${field_name} = ", line_prefix);\n'
+                '\n'
+                '    _mbim_printer_append_prefix (printer, line_prefix, indent);\n'
+                '    _mbim_printer_append (printer, "  ${field_name} = ");\n'
                 '    {\n')
 
             if field['format'] == 'uuid':
                 inner_template += (
-                    '        gchar *tmpstr;\n'
-                    '\n'
-                    '        tmpstr = mbim_uuid_get_printable (&(self->${field_name_underscore}));\n'
-                    '        g_string_append_printf (str, "\'%s\'", tmpstr);\n'
-                    '        g_free (tmpstr);\n')
+                    '        _mbim_printer_append (printer, "\'");\n'
+                    '        _mbim_printer_append_uuid (printer, _mbim_message_read_uuid (self, offset));\n'
+                    '        _mbim_printer_append (printer, "\'");\n'
+                    '        offset += 16;\n')
 
             elif field['format'] in ['byte-array', 'ref-byte-array', 'ref-byte-array-no-offset', 'unsized-byte-array']:
                 inner_template += (
-                    '        guint i;\n'
-                    '        guint array_size;\n'
+                    '        const guint8 *tmp;\n'
+                    '        guint32 tmpsize;\n'
                     '\n')
 
                 if field['format'] == 'byte-array':
                     translations['array_size'] = field['array-size']
                     inner_template += (
-                        '        array_size = ${array_size};\n')
-                elif 'array-size-field' in field:
-                    translations['array_size_field_name_underscore'] = utils.build_underscore_name_from_camelcase(field['array-size-field'])
+                        '        tmp = _mbim_message_read_byte_array (self, relative_offset, offset, FALSE, FALSE, NULL);\n'
+                        '        tmpsize = ${array_size};\n'
+                        '        offset += ${array_size};\n')
+                elif field['format'] == 'unsized-byte-array':
                     inner_template += (
-                        '        array_size = self->${array_size_field_name_underscore};\n')
+                        '        tmp = _mbim_message_read_byte_array (self, relative_offset, offset, FALSE, FALSE, &tmpsize);\n'
+                        '        /* no offset update expected, this should be the last field */\n')
                 else:
-                    inner_template += (
-                        '        array_size = self->${field_name_underscore}_size;\n')
+                    translations['has_offset'] = 'TRUE' if field['format'] == 'ref-byte-array' else 'FALSE'
+                    if 'array-size-field' in field:
+                        translations['array_size_field_name_underscore'] = utils.build_underscore_name_from_camelcase(field['array-size-field'])
+                        inner_template += (
+                            '        tmp = _mbim_message_read_byte_array (self, relative_offset, offset, ${has_offset}, FALSE, NULL);\n'
+                            '        tmpsize = _${array_size_field_name_underscore};\n'
+                            '        offset += 4;\n')
+                    else:
+                        inner_template += (
+                            '        tmp = _mbim_message_read_byte_array (self, relative_offset, offset, ${has_offset}, TRUE, &tmpsize);\n'
+                            '        offset += 8;\n')
 
                 inner_template += (
-                    '        g_string_append (str, "\'");\n'
-                    '        for (i = 0; i < array_size; i++)\n'
-                    '            g_string_append_printf (str, "%02x%s", self->${field_name_underscore}[i], (i == (array_size - 1)) ? "" : ":" );\n'
-                    '        g_string_append (str, "\'");\n')
+                    '        _mbim_printer_append (printer, "\'");\n'
+                    '        _mbim_printer_append_hex (printer, tmp, tmpsize, \':\');\n'
+                    '        _mbim_printer_append (printer, "\'");\n')
 
             elif field['format'] == 'guint32':
-                inner_template += (
-                    '        g_string_append_printf (str, "\'%" G_GUINT32_FORMAT "\'", self->${field_name_underscore});\n')
+                if field['name'] in size_fields:
+                    inner_template += (
+                        '        _${field_name_underscore} = _mbim_message_read_guint32 (self, offset);\n'
+                        '        _mbim_printer_append_printf (printer, "\'%" G_GUINT32_FORMAT "\'", _${field_name_underscore});\n'
+                        '        offset += 4;\n')
+                else:
+                    inner_template += (
+                        '        _mbim_printer_append_printf (printer, "\'%" G_GUINT32_FORMAT "\'", _mbim_message_read_guint32 (self, offset));\n'
+                        '        offset += 4;\n')
 
             elif field['format'] == 'guint64':
                 inner_template += (
-                    '        g_string_append_printf (str, "\'%" G_GUINT64_FORMAT "\'", self->${field_name_underscore});\n')
+                    '        _mbim_printer_append_printf (printer, "\'%" G_GUINT64_FORMAT "\'", _mbim_message_read_guint64 (self, offset));\n'
+                    '        offset += 8;\n')
 
             elif field['format'] == 'guint32-array':
                 translations['array_size_field_name_underscore'] = utils.build_underscore_name_from_camelcase(field['array-size-field'])
                 inner_template += (
                     '        guint i;\n'
                     '\n'
-                    '        g_string_append (str, "\'");\n'
-                    '        for (i = 0; i < self->${array_size_field_name_underscore}; i++)\n'
-                    '            g_string_append_printf (str, "%" G_GUINT32_FORMAT "%s", self->${field_name_underscore}[i], (i == (self->${array_size_field_name_underscore} - 1)) ? "" : "," );\n'
-                    '        g_string_append (str, "\'");\n')
+                    '        _mbim_printer_append (printer, "\'");\n'
+                    '        for (i = 0; i < _${array_size_field_name_underscore}; i++)\n'
+                    '            _mbim_printer_append_printf (printer, "%" G_GUINT32_FORMAT "%s", _mbim_message_read_guint32 (self, offset + (4 * i)), (i == (_${array_size_field_name_underscore} - 1)) ? "" : "," );\n'
+                    '        _mbim_printer_append (printer, "\'");\n'
+                    '        offset += (4 * _${array_size_field_name_underscore});\n')
 
             elif field['format'] == 'string':
                 inner_template += (
-                    '        g_string_append_printf (str, "\'%s\'", self->${field_name_underscore});\n')
+                    '        gchar *tmp;\n'
+                    '\n'
+                    '        tmp = _mbim_message_read_string (self, relative_offset, offset);\n'
+                    '        _mbim_printer_append_printf (printer, "\'%s\'", tmp);\n'
+                    '        g_free (tmp);\n'
+                    '        offset += 8;\n')
 
             elif field['format'] == 'string-array':
                 translations['array_size_field_name_underscore'] = utils.build_underscore_name_from_camelcase(field['array-size-field'])
                 inner_template += (
                     '        guint i;\n'
                     '\n'
-                    '        g_string_append (str, "\'");\n'
-                    '        for (i = 0; i < self->${array_size_field_name_underscore}; i++)\n'
-                    '            g_string_append_printf (str, "%s%s", self->${field_name_underscore}[i], (i == (self->${array_size_field_name_underscore} - 1)) ? "" : "," );\n'
-                    '        g_string_append (str, "\'");\n')
+                    '        _mbim_printer_append (printer, "\'");\n'
+                    '        for (i = 0; i < _${array_size_field_name_underscore}; i++) {\n'
+                    '            gchar *tmp;\n'
+                    '\n'
+                    '            tmp = _mbim_message_read_string (self, relative_offset, offset + (8 * i));\n'
+                    '            _mbim_printer_append_printf (printer, "%s%s", tmp, (i == (_${array_size_field_name_underscore} - 1)) ? "" : "," );\n'
+                    '            g_free (tmp);\n'
+                    '        }\n'
+                    '        _mbim_printer_append (printer, "\'");\n'
+                    '        offset += (8 * _${array_size_field_name_underscore});\n')
 
             elif field['format'] == 'ipv4' or \
                  field['format'] == 'ref-ipv4' or \
                  field['format'] == 'ipv6' or \
                  field['format'] == 'ref-ipv6':
+                translations['ref'] = 'TRUE' if field['format'].startswith('ref-') else 'FALSE'
+                if field['format'] == 'ipv4' or \
+                   field['format'] == 'ref-ipv4':
+                    inner_template += (
+                        '        const MbimIPv4 *tmp;\n'
+                        '\n'
+                        '        tmp = _mbim_message_read_ipv4 (self, offset, ${ref});\n'
+                        '        _mbim_printer_append (printer, "\'");\n'
+                        '        if (tmp)\n'
+                        '            _mbim_printer_append_ip (printer, tmp->addr, FALSE);\n'
+                        '        _mbim_printer_append (printer, "\'");\n'
+                        '        offset += 4;\n')
+                else:
+                    translations['size'] = '4' if field['format'] == 'ref-ipv6' else '16'
+                    inner_template += (
+                        '        const MbimIPv6 *tmp;\n'
+                        '\n'
+                        '        tmp = _mbim_message_read_ipv6 (self, offset, ${ref});\n'
+                        '        _mbim_printer_append (printer, "\'");\n'
+                        '        if (tmp)\n'
+                        '            _mbim_printer_append_ip (printer, tmp->addr, TRUE);\n'
+                        '        _mbim_printer_append (printer, "\'");\n'
+                        '        offset += ${size};\n')
+
+            else:
+                raise ValueError('Cannot handle format \'%s\' in struct' % field['format'])
+
+            inner_template += (
+                '    }\n'
+                '    _mbim_printer_append (printer, "\\n");\n')
+            template += (string.Template(inner_template).substitute(translations))
+
+        template += (
+            '\n'
+            '    if (bytes_read)\n'
+            '        *bytes_read = (offset - relative_offset);\n'
+            '}\n')
+        cfile.write(string.Template(template).substitute(translations))
+
+        if not self.array_member:
+            return
+
+        template = (
+            '\n'
+            'static void\n'
+            '_mbim_message_print_${name_underscore}_struct_array (\n'
+            '    const MbimMessage *self,\n'
+            '    guint32 array_size,\n'
+            '    guint32 relative_offset_array_start,\n'
+            '    gboolean refs,\n'
+            '    MbimPrinter *printer,\n'
+            '    const gchar *line_prefix)\n'
+            '{\n'
+            '    guint32 i;\n'
+            '    guint32 offset;\n'
+            '\n'
+            '    offset = refs ? relative_offset_array_start : _mbim_message_read_guint32 (self, relative_offset_array_start);\n'
+            '    for (i = 0; i < array_size; i++) {\n'
+            '        _mbim_printer_append_prefix (printer, line_prefix, 0);\n'
+            '        _mbim_printer_append_printf (printer, "    [%u] = {\\n", i);\n'
+            '        if (!refs) {\n'
+            '            _mbim_message_print_${name_underscore}_struct (self, offset, NULL, printer, line_prefix, 8);\n'
+            '            offset += ${struct_size};\n'
+            '        } else {\n'
+            '            _mbim_message_print_${name_underscore}_struct (self, _mbim_message_read_guint32 (self, offset), NULL, printer, line_prefix, 8);\n'
+            '            offset += 8;\n'
+            '        }\n'
+            '        _mbim_printer_append_prefix (printer, line_prefix, 0);\n'
+            '        _mbim_printer_append (printer, "    },\\n");\n'
+            '    }\n'
+            '}\n')
+        cfile.write(string.Template(template).substitute(translations))
+
+    """
+    Emit the type's JSON encoder methods, reading the fields directly from the message
+    """
+    def _emit_json(self, cfile):
+        translations = { 'name_underscore' : utils.build_underscore_name_from_camelcase(self.name),
+                         'struct_size'     : self.size }
+
+        template = (
+            '\n'
+            'static void\n'
+            '_mbim_message_json_${name_underscore}_struct (\n'
+            '    const MbimMessage *self,\n'
+            '    guint32 relative_offset,\n'
+            '    guint32 *bytes_read,\n'
+            '    MbimPrinter *printer)\n'
+            '{\n'
+            '    guint32 offset = relative_offset;\n'
+            '    guint n_members = 0;\n')
+
+        # Fields giving array sizes are kept while encoding
+        size_fields = [field['array-size-field'] for field in self.contents if 'array-size-field' in field]
+        for field in self.contents:
+            if field['name'] in size_fields:
+                translations['field_name_underscore'] = utils.build_underscore_name_from_camelcase(field['name'])
+                template += string.Template('    guint32 _${field_name_underscore};\n').substitute(translations)
+
+        template += (
+            '\n'
+            '    _mbim_printer_append (printer, "{");\n')
+
+        for field in self.contents:
+            translations['field_name'] = field['name']
+            translations['field_name_underscore'] = utils.build_underscore_name_from_camelcase(field['name'])
+            translations['public_underscore'] = utils.build_underscore_name_from_camelcase(field['public-format']) if 'public-format' in field else ''
+            translations['public_underscore_upper'] = utils.build_underscore_name_from_camelcase(field['public-format']).upper() if 'public-format' in field else ''
+
+            inner_template = (
+                '\n'
+                '    _mbim_printer_append_json_key (printer, &n_members, "${field_name}");\n'
+                '    {\n')
+
+            if field['format'] == 'uuid':
+                inner_template += (
+                    '        _mbim_printer_append (printer, "\\"");\n'
+                    '        _mbim_printer_append_uuid (printer, _mbim_message_read_uuid (self, offset));\n'
+                    '        _mbim_printer_append (printer, "\\"");\n'
+                    '        offset += 16;\n')
+
+            elif field['format'] in ['byte-array', 'ref-byte-array', 'ref-byte-array-no-offset', 'unsized-byte-array']:
                 inner_template += (
-                    '        GInetAddress *addr;\n'
-                    '        gchar *tmpstr;\n'
+                    '        const guint8 *tmp;\n'
+                    '        guint32 tmpsize;\n'
                     '\n')
 
-                if field['format'] == 'ipv4' or \
-                   field['format'] == 'ref-ipv4':
+                if field['format'] == 'byte-array':
+                    translations['array_size'] = field['array-size']
+                    inner_template += (
+                        '        tmp = _mbim_message_read_byte_array (self, relative_offset, offset, FALSE, FALSE, NULL);\n'
+                        '        tmpsize = ${array_size};\n'
+                        '        offset += ${array_size};\n')
+                elif field['format'] == 'unsized-byte-array':
+                    inner_template += (
+                        '        tmp = _mbim_message_read_byte_array (self, relative_offset, offset, FALSE, FALSE, &tmpsize);\n'
+                        '        /* no offset update expected, this should be the last field */\n')
+                else:
+                    translations['has_offset'] = 'TRUE' if field['format'] == 'ref-byte-array' else 'FALSE'
+                    if 'array-size-field' in field:
+                        translations['array_size_field_name_underscore'] = utils.build_underscore_name_from_camelcase(field['array-size-field'])
+                        inner_template += (
+                            '        tmp = _mbim_message_read_byte_array (self, relative_offset, offset, ${has_offset}, FALSE, NULL);\n'
+                            '        tmpsize = _${array_size_field_name_underscore};\n'
+                            '        offset += 4;\n')
+                    else:
+                        inner_template += (
+                            '        tmp = _mbim_message_read_byte_array (self, relative_offset, offset, ${has_offset}, TRUE, &tmpsize);\n'
+                            '        offset += 8;\n')
+
+                inner_template += (
+                    '        _mbim_printer_append (printer, "\\"");\n'
+                    '        _mbim_printer_append_hex (printer, tmp, tmpsize, \':\');\n'
+                    '        _mbim_printer_append (printer, "\\"");\n')
+
+            elif field['format'] == 'guint32':
+                if field['name'] in size_fields:
+                    inner_template += (
+                        '        _${field_name_underscore} = _mbim_message_read_guint32 (self, offset);\n'
+                        '        _mbim_printer_append_printf (printer, "%" G_GUINT32_FORMAT, _${field_name_underscore});\n'
+                        '        offset += 4;\n')
+                elif 'public-format' in field:
                     inner_template += (
-                        '        addr = g_inet_address_new_from_bytes ((guint8 *)&(self->${field_name_underscore}.addr), G_SOCKET_FAMILY_IPV4);\n')
-                elif field['format'] == 'ipv6' or \
-                   field['format'] == 'ref-ipv6':
+                        '        guint32 tmp;\n'
+                        '\n'
+                        '        tmp = _mbim_message_read_guint32 (self, offset);\n'
+                        '        offset += 4;\n')
+                    inner_template += utils.json_enum_or_flags_template('tmp', '        ')
+                else:
                     inner_template += (
-                        '        addr = g_inet_address_new_from_bytes ((guint8 *)&(self->${field_name_underscore}.addr), G_SOCKET_FAMILY_IPV6);\n')
+                        '        _mbim_printer_append_printf (printer, "%" G_GUINT32_FORMAT, _mbim_message_read_guint32 (self, offset));\n'
+                        '        offset += 4;\n')
+
+            elif field['format'] == 'guint64':
+                inner_template += (
+                    '        _mbim_printer_append_printf (printer, "%" G_GUINT64_FORMAT, _mbim_message_read_guint64 (self, offset));\n'
+                    '        offset += 8;\n')
+
+            elif field['format'] == 'guint32-array':
+                translations['array_size_field_name_underscore'] = utils.build_underscore_name_from_camelcase(field['array-size-field'])
+                inner_template += (
+                    '        guint i;\n'
+                    '\n'
+                    '        _mbim_printer_append (printer, "[");\n'
+                    '        for (i = 0; i < _${array_size_field_name_underscore}; i++)\n'
+                    '            _mbim_printer_append_printf (printer, "%s%" G_GUINT32_FORMAT, (i > 0) ? "," : "", _mbim_message_read_guint32 (self, offset + (4 * i)));\n'
+                    '        _mbim_printer_append (printer, "]");\n'
+                    '        offset += (4 * _${array_size_field_name_underscore});\n')
+
+            elif field['format'] == 'string':
+                inner_template += (
+                    '        gchar *tmp;\n'
+                    '\n'
+                    '        tmp = _mbim_message_read_string (self, relative_offset, offset);\n'
+                    '        _mbim_printer_append_json_string (printer, tmp);\n'
+                    '        g_free (tmp);\n'
+                    '        offset += 8;\n')
 
+            elif field['format'] == 'string-array':
+                translations['array_size_field_name_underscore'] = utils.build_underscore_name_from_camelcase(field['array-size-field'])
                 inner_template += (
-                    '        tmpstr = g_inet_address_to_string (addr);\n'
-                    '        g_string_append_printf (str, "\'%s\'", tmpstr);\n'
-                    '        g_free (tmpstr);\n'
-                    '        g_object_unref (addr);\n')
+                    '        guint i;\n'
+                    '\n'
+                    '        _mbim_printer_append (printer, "[");\n'
+                    '        for (i = 0; i < _${array_size_field_name_underscore}; i++) {\n'
+                    '            gchar *tmp;\n'
+                    '\n'
+                    '            tmp = _mbim_message_read_string (self, relative_offset, offset + (8 * i));\n'
+                    '            if (i > 0)\n'
+                    '                _mbim_printer_append (printer, ",");\n'
+                    '            _mbim_printer_append_json_string (printer, tmp);\n'
+                    '            g_free (tmp);\n'
+                    '        }\n'
+                    '        _mbim_printer_append (printer, "]");\n'
+                    '        offset += (8 * _${array_size_field_name_underscore});\n')
+
+            elif field['format'] == 'ipv4' or \
+                 field['format'] == 'ref-ipv4' or \
+                 field['format'] == 'ipv6' or \
+                 field['format'] == 'ref-ipv6':
+                translations['ref'] = 'TRUE' if field['format'].startswith('ref-') else 'FALSE'
+                if field['format'] == 'ipv4' or \
+                   field['format'] == 'ref-ipv4':
+                    translations['type'] = 'MbimIPv4'
+                    translations['read'] = 'ipv4'
+                    translations['is_ipv6'] = 'FALSE'
+                    translations['size'] = '4'
+                else:
+                    translations['type'] = 'MbimIPv6'
+                    translations['read'] = 'ipv6'
+                    translations['is_ipv6'] = 'TRUE'
+                    translations['size'] = '4' if field['format'] == 'ref-ipv6' else '16'
+                inner_template += (
+                    '        const ${type} *tmp;\n'
+                    '\n'
+                    '        tmp = _mbim_message_read_${read} (self, offset, ${ref});\n'
+                    '        if (tmp) {\n'
+                    '            _mbim_printer_append (printer, "\\"");\n'
+                    '            _mbim_printer_append_ip (printer, tmp->addr, ${is_ipv6});\n'
+                    '            _mbim_printer_append (printer, "\\"");\n'
+                    '        } else\n'
+                    '            _mbim_printer_append (printer, "null");\n'
+                    '        offset += ${size};\n')
 
             else:
                 raise ValueError('Cannot handle format \'%s\' in struct' % field['format'])
 
             inner_template += (
-                '    }\n'
-                '    g_string_append (str, "\\n");\n')
+                '    }\n')
             template += (string.Template(inner_template).substitute(translations))
 
         template += (
-            '    return g_string_free (str, FALSE);\n'
+            '\n'
+            '    _mbim_printer_append (printer, "}");\n'
+            '\n'
+            '    if (bytes_read)\n'
+            '        *bytes_read = (offset - relative_offset);\n'
+            '}\n')
+        cfile.write(string.Template(template).substitute(translations))
+
+        if not self.array_member:
+            return
+
+        template = (
+            '\n'
+            'static void\n'
+            '_mbim_message_json_${name_underscore}_struct_array (\n'
+            '    const MbimMessage *self,\n'
+            '    guint32 array_size,\n'
+            '    guint32 relative_offset_array_start,\n'
+            '    gboolean refs,\n'
+            '    MbimPrinter *printer)\n'
+            '{\n'
+            '    guint32 i;\n'
+            '    guint32 offset;\n'
+            '\n'
+            '    _mbim_printer_append (printer, "[");\n'
+            '    offset = refs ? relative_offset_array_start : _mbim_message_read_guint32 (self, relative_offset_array_start);\n'
+            '    for (i = 0; i < array_size; i++) {\n'
+            '        if (i > 0)\n'
+            '            _mbim_printer_append (printer, ",");\n'
+            '        if (!refs) {\n'
+            '            _mbim_message_json_${name_underscore}_struct (self, offset, NULL, printer);\n'
+            '            offset += ${struct_size};\n'
+            '        } else {\n'
+            '            _mbim_message_json_${name_underscore}_struct (self, _mbim_message_read_guint32 (self, offset), NULL, printer);\n'
+            '            offset += 8;\n'
+            '        }\n'
+            '    }\n'
+            '    _mbim_printer_append (printer, "]");\n'
             '}\n')
         cfile.write(string.Template(template).substitute(translations))
 
@@ -749,6 +1063,31 @@ class Struct:
         cfile.write(string.Template(template).substitute(translations))
 
 
+    """
+    Emit the field table describing the struct contents
+    """
+    def _emit_field_table(self, cfile):
+        translations = { 'name'            : self.name,
+                         'name_underscore' : utils.build_underscore_name_from_camelcase(self.name),
+                         'struct_size'     : self.size,
+                         'field_table'     : utils.build_field_table(self.contents, self.name) }
+
+        template = (
+            '\n'
+            'static const MbimField ${name_underscore}_field_list[] = {\n'
+            '${field_table}'
+            '};\n'
+            '\n'
+            'static const MbimStructFields ${name_underscore}_struct_fields = {\n'
+            '    .name = "${name}",\n'
+            '    .size = sizeof (${name}),\n'
+            '    .wire_size = ${struct_size},\n'
+            '    .fields = ${name_underscore}_field_list,\n'
+            '    .n_fields = G_N_ELEMENTS (${name_underscore}_field_list),\n'
+            '};\n')
+        cfile.write(string.Template(template).substitute(translations))
+
+
     """
     Emit the struct handling implementation
     """
@@ -758,12 +1097,23 @@ class Struct:
 
         # Emit type
         self._emit_type(hfile)
+
+        # Emit type's field table
+        self._emit_field_table(cfile)
+
+        if self.backend == 'table':
+            # Emit type's free, running on the field table
+            self._emit_free(hfile, cfile)
+            return
+
         # Emit type's free
         self._emit_free(hfile, cfile)
         # Emit type's read
         self._emit_read(cfile)
         # Emit type's print
         self._emit_print(cfile)
+        # Emit type's JSON encoder
+        self._emit_json(cfile)
         # Emit type's append
         self._emit_append(cfile)
 
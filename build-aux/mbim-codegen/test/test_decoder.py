@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# -*- Mode: python; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*-
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation; either version 2 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright (C) 2026 The libmbim authors
+#
+
+import importlib.util
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import unittest
+
+CODEGEN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TOP_SRCDIR = os.path.dirname(os.path.dirname(CODEGEN_DIR))
+
+SERVICES = [ 'basic-connect', 'sms', 'ussd', 'auth', 'phonebook', 'stk', 'dss',
+             'ms-firmware-id', 'ms-host-shutdown', 'proxy-control', 'qmi', 'atds',
+             'intel-firmware-update', 'ms-basic-connect-extensions' ]
+
+SYMBOLS = [ 'mbim-uuid.c', 'mbim-cid.h', 'mbim-enums.h' ]
+
+BASIC_CONNECT = bytes.fromhex('a289cc33bcbb8b4fb6b0133ec2aae6df')
+CID_RADIO_STATE = 3
+
+MESSAGE_TYPE_COMMAND = 0x00000003
+MESSAGE_TYPE_COMMAND_DONE = 0x80000003
+
+
+"""
+Build a command message, as a single fragment unless fragment is given
+"""
+def command_message(message_type, transaction_id, value, information_buffer, fragment = (1, 0)):
+    body = (struct.pack('<II', *fragment) +
+            BASIC_CONNECT +
+            struct.pack('<III', CID_RADIO_STATE, value, len(information_buffer)) +
+            information_buffer)
+    return struct.pack('<III', message_type, 12 + len(body), transaction_id) + body
+
+
+def radio_state_response(transaction_id, hw = 1, sw = 0):
+    return command_message(MESSAGE_TYPE_COMMAND_DONE, transaction_id, 0, struct.pack('<II', hw, sw))
+
+
+"""
+Build a capture file as dumped by the proxy, given (client id, direction,
+message, original length) tuples
+"""
+def capture_file(records, device_path = b'/dev/cdc-wdm0'):
+    contents = b'MBIMCAP\0' + struct.pack('<II', 1, len(records))
+    for (i, (client_id, direction, message, original_length)) in enumerate(records):
+        contents += struct.pack('<QIBBHII', 1000 * i, client_id, direction, 0,
+                                len(device_path), len(message), original_length)
+        contents += device_path + message
+    return contents
+
+
+class TestDecoder(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.mkdtemp()
+        output = os.path.join(cls.tmpdir, 'mbim_decoder.py')
+        args = [ sys.executable, os.path.join(CODEGEN_DIR, 'mbim-codegen'), '--python-output', output ]
+        for symbols in SYMBOLS:
+            args += [ '--symbols', os.path.join(TOP_SRCDIR, 'src', 'libmbim-glib', symbols) ]
+        for service in SERVICES:
+            args += [ '--input', os.path.join(TOP_SRCDIR, 'data', 'mbim-service-%s.json' % service) ]
+        subprocess.check_call(args)
+
+        spec = importlib.util.spec_from_file_location('mbim_decoder', output)
+        cls.decoder = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(cls.decoder)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmpdir)
+
+    def write_file(self, contents):
+        path = os.path.join(self.tmpdir, self.id())
+        with open(path, 'wb') as f:
+            f.write(contents)
+        return path
+
+    def test_decode(self):
+        message = self.decoder.decode(radio_state_response(5, hw = 1, sw = 0))
+        self.assertEqual(message.transaction_id, 5)
+        self.assertEqual(message.service, 'basic-connect')
+        self.assertEqual(message.command, 'radio-state')
+        self.assertEqual(message.status, 0)
+        self.assertEqual(message.fields, { 'HwRadioState': 1, 'SwRadioState': 0 })
+        self.assertIsNone(message.error)
+
+    def test_decode_query(self):
+        message = self.decoder.decode(command_message(MESSAGE_TYPE_COMMAND, 3, 0, b''))
+        self.assertEqual(message.command_type, self.decoder.COMMAND_TYPE_QUERY)
+        self.assertEqual(message.fields, {})
+
+    def test_truncated_information_buffer(self):
+        message = self.decoder.decode(command_message(MESSAGE_TYPE_COMMAND_DONE, 5, 0, struct.pack('<I', 1)))
+        self.assertIsNone(message.fields)
+        self.assertIn('HwRadioState', message.error)
+
+    def test_truncated_command_header(self):
+        data = struct.pack('<IIIII', MESSAGE_TYPE_COMMAND_DONE, 20, 5, 1, 0)
+        message = self.decoder.decode(data)
+        self.assertIsNone(message.service)
+        self.assertIsNotNone(message.error)
+
+    def test_truncated_message(self):
+        data = radio_state_response(5)
+        self.assertRaises(self.decoder.DecodeError, self.decoder.decode, data[:-1])
+        self.assertRaises(self.decoder.DecodeError, self.decoder.decode, data[:8])
+        self.assertRaises(self.decoder.DecodeError, list, self.decoder.iter_messages(data[:-1]))
+        self.assertRaises(self.decoder.DecodeError, list, self.decoder.iter_messages(data + data[:5]))
+
+    def test_concatenated(self):
+        # The first response is short of one field, which must not be read
+        # from the message following it
+        short = command_message(MESSAGE_TYPE_COMMAND_DONE, 1, 0, struct.pack('<I', 1))
+        data = (short +
+                radio_state_response(2, hw = 0, sw = 1) +
+                command_message(MESSAGE_TYPE_COMMAND, 3, 0, b''))
+        messages = list(self.decoder.iter_messages(data))
+        self.assertEqual([m.transaction_id for m in messages], [1, 2, 3])
+        self.assertIsNone(messages[0].fields)
+        self.assertIsNotNone(messages[0].error)
+        self.assertEqual(messages[1].fields, { 'HwRadioState': 0, 'SwRadioState': 1 })
+        self.assertEqual(messages[1].offset, len(short))
+        self.assertEqual(messages[2].fields, {})
+
+    def test_fragments(self):
+        information_buffer = struct.pack('<II', 1, 1)
+        # First fragment with the command header and half of the buffer,
+        # second fragment with the rest
+        first = command_message(MESSAGE_TYPE_COMMAND_DONE, 7, 0, information_buffer, fragment = (2, 0))[:-4]
+        first = struct.pack('<III', MESSAGE_TYPE_COMMAND_DONE, len(first), 7) + first[12:]
+        second = struct.pack('<IIIII', MESSAGE_TYPE_COMMAND_DONE, 24, 7, 2, 1) + information_buffer[4:]
+        messages = list(self.decoder.iter_messages(first + second))
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(messages[0].offset, 0)
+        self.assertEqual(messages[0].fields, { 'HwRadioState': 1, 'SwRadioState': 1 })
+
+    def test_iter_file(self):
+        data = radio_state_response(1) + radio_state_response(2)
+        messages = list(self.decoder.iter_file(self.write_file(data)))
+        self.assertEqual([m.transaction_id for m in messages], [1, 2])
+        self.assertEqual(list(self.decoder.iter_file(self.write_file(b''))), [])
+
+    def test_capture(self):
+        query = command_message(MESSAGE_TYPE_COMMAND, 9, 0, b'')
+        response = radio_state_response(9)
+        path = self.write_file(capture_file([ (1, 0, query, len(query)),
+                                              (1, 1, response, len(response)) ]))
+
+        records = list(self.decoder.iter_capture(path))
+        self.assertEqual(len(records), 2)
+        self.assertEqual([r.direction for r in records],
+                         [self.decoder.CAPTURE_DIRECTION_FROM_CLIENT, self.decoder.CAPTURE_DIRECTION_TO_CLIENT])
+        self.assertEqual([r.timestamp for r in records], [0, 1000])
+        self.assertEqual(records[0].client_id, 1)
+        self.assertEqual(records[0].device_path, '/dev/cdc-wdm0')
+        self.assertEqual(records[1].message.fields, { 'HwRadioState': 1, 'SwRadioState': 0 })
+
+        # Capture files are detected when reading plain messages too
+        messages = list(self.decoder.iter_file(path))
+        self.assertEqual([m.message_type for m in messages], [MESSAGE_TYPE_COMMAND, MESSAGE_TYPE_COMMAND_DONE])
+
+    def test_capture_truncated_record(self):
+        response = radio_state_response(9)
+        # Message truncated by the proxy when it was recorded
+        path = self.write_file(capture_file([ (1, 1, response[:-4], len(response)) ]))
+        records = list(self.decoder.iter_capture(path))
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0].original_length, len(response))
+        self.assertIsNone(records[0].message.fields)
+        self.assertIsNotNone(records[0].message.error)
+
+    def test_capture_truncated_file(self):
+        response = radio_state_response(9)
+        contents = capture_file([ (1, 1, response, len(response)) ])
+        for size in [ 4, 20, len(contents) - 1 ]:
+            self.assertRaises(self.decoder.DecodeError, list, self.decoder.iter_capture(self.write_file(contents[:size])))
+        self.assertRaises(self.decoder.DecodeError, list,
+                          self.decoder.iter_capture(self.write_file(b'MBIMCAP\0' + struct.pack('<II', 2, 0))))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- Mode: python; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*-
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation; either version 2 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright (C) 2026 The libmbim authors
+#
+
+import errno
+import glob
+import io
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+CODEGEN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TOP_SRCDIR = os.path.dirname(os.path.dirname(CODEGEN_DIR))
+
+sys.path.insert(0, CODEGEN_DIR)
+import ObjectList
+from ObjectList import load_object_list
+
+SERVICE_JSON = os.path.join(TOP_SRCDIR, 'data', 'mbim-service-sms.json')
+
+
+"""
+Emit the C code of the given ObjectList, as a single string
+"""
+def emit(object_list):
+    h = io.StringIO()
+    c = io.StringIO()
+    object_list.emit(h, c)
+    return h.getvalue() + c.getvalue()
+
+
+class TestObjectListCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        # Not created yet
+        self.cache_dir = os.path.join(self.tmpdir, 'a', 'codegen-cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def cache_entries(self):
+        return sorted(os.listdir(self.cache_dir))
+
+    def test_cache(self):
+        uncached = emit(load_object_list(SERVICE_JSON))
+
+        self.assertEqual(emit(load_object_list(SERVICE_JSON, cache_dir = self.cache_dir)), uncached)
+        entries = self.cache_entries()
+        self.assertEqual(len(entries), 1)
+        self.assertTrue(entries[0].endswith('.pickle'))
+
+        # Reused, without building the model again
+        with mock.patch.object(ObjectList.utils, 'read_json_file', side_effect = AssertionError('not cached')):
+            self.assertEqual(emit(load_object_list(SERVICE_JSON, cache_dir = self.cache_dir)), uncached)
+        self.assertEqual(self.cache_entries(), entries)
+
+    def test_backends(self):
+        load_object_list(SERVICE_JSON, 'unrolled', self.cache_dir)
+        load_object_list(SERVICE_JSON, 'table', self.cache_dir)
+        self.assertEqual(len(self.cache_entries()), 2)
+
+    def test_broken_entry(self):
+        load_object_list(SERVICE_JSON, cache_dir = self.cache_dir)
+        (entry, ) = self.cache_entries()
+        with open(os.path.join(self.cache_dir, entry), 'wb') as f:
+            f.write(b'broken')
+
+        uncached = emit(load_object_list(SERVICE_JSON))
+        self.assertEqual(emit(load_object_list(SERVICE_JSON, cache_dir = self.cache_dir)), uncached)
+        self.assertEqual(self.cache_entries(), [entry])
+        # Rewritten
+        with mock.patch.object(ObjectList.utils, 'read_json_file', side_effect = AssertionError('not cached')):
+            load_object_list(SERVICE_JSON, cache_dir = self.cache_dir)
+
+    def test_stale_entries(self):
+        os.makedirs(self.cache_dir)
+        stale_path = os.path.join(self.cache_dir, os.path.basename(SERVICE_JSON) + '-unrolled-0123.pickle')
+        other_path = os.path.join(self.cache_dir, os.path.basename(SERVICE_JSON) + '-table-0123.pickle')
+        for path in [ stale_path, other_path ]:
+            with open(path, 'wb') as f:
+                f.write(b'stale')
+
+        load_object_list(SERVICE_JSON, 'unrolled', self.cache_dir)
+        entries = self.cache_entries()
+        self.assertEqual(len(entries), 2)
+        self.assertNotIn(os.path.basename(stale_path), entries)
+        self.assertIn(os.path.basename(other_path), entries)
+
+    def test_stale_entry_removed_concurrently(self):
+        os.makedirs(self.cache_dir)
+        stale_path = os.path.join(self.cache_dir, os.path.basename(SERVICE_JSON) + '-unrolled-0123.pickle')
+        with open(stale_path, 'wb') as f:
+            f.write(b'stale')
+
+        # Removed by someone else in the meantime
+        with mock.patch.object(ObjectList.os, 'remove', side_effect = OSError(errno.ENOENT, 'No such file or directory', stale_path)):
+            load_object_list(SERVICE_JSON, cache_dir = self.cache_dir)
+        self.assertEqual(len(self.cache_entries()), 2)
+
+    def test_failed_write(self):
+        with mock.patch.object(ObjectList.pickle, 'dump', side_effect = IOError('no space left')):
+            self.assertRaises(IOError, load_object_list, SERVICE_JSON, cache_dir = self.cache_dir)
+        # No partial entries nor temporary files left behind
+        self.assertEqual(self.cache_entries(), [])
+
+    def test_parallel(self):
+        errors = []
+
+        def load():
+            try:
+                load_object_list(SERVICE_JSON, cache_dir = self.cache_dir)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [ threading.Thread(target = load) for _ in range(8) ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(glob.glob(os.path.join(self.cache_dir, '*.pickle'))), 1)
+        self.assertEqual(len(self.cache_entries()), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
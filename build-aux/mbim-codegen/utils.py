@@ -23,6 +23,22 @@
 import string
 import re
 
+
+"""
+Cache the results of the given single-argument function, used for the name
+builders called for every field by every emitter
+"""
+def memoize(function):
+    results = {}
+    def memoized(argument):
+        try:
+            return results[argument]
+        except KeyError:
+            result = function(argument)
+            results[argument] = result
+            return result
+    return memoized
+
 """
 Add the common copyright header to the given file
 """
@@ -142,10 +158,14 @@ def build_underscore_uppercase_name(name):
 Build an underscore name from the given camelcase name
 e.g.: "ThisIsAMessage" --> "this_is_a_message"
 """
+camelcase_word_regex = re.compile('(.)([A-Z][a-z]+)')
+camelcase_boundary_regex = re.compile('([a-z0-9])([A-Z])')
+
+@memoize
 def build_underscore_name_from_camelcase(camelcase):
     s0 = camelcase.replace('IP','Ip')
-    s1 = re.sub('(.)([A-Z][a-z]+)', r'\1_\2', s0)
-    return re.sub('([a-z0-9])([A-Z])', r'\1_\2', s1).lower()
+    s1 = camelcase_word_regex.sub(r'\1_\2', s0)
+    return camelcase_boundary_regex.sub(r'\1_\2', s1).lower()
 
 
 
@@ -153,6 +173,7 @@ def build_underscore_name_from_camelcase(camelcase):
 Build a camelcase name from the given full name
 e.g.: "This is a message" --> "ThisIsAMessage"
 """
+@memoize
 def build_camelcase_name(name):
     return string.capwords(name).replace(' ', '')
 
@@ -165,6 +186,136 @@ def build_dashed_name(name):
     return name.lower().replace(' ', '-')
 
 
+"""
+Build the template encoding as JSON the given variable of an enum or flags
+public format; enums go as their nickname if known, flags as the string of
+nicknames, the value is given as number otherwise. Needs 'public_underscore'
+and 'public_underscore_upper' in the translations.
+"""
+def json_enum_or_flags_template(variable, indent):
+    template = (
+        '#if defined __${public_underscore_upper}_IS_ENUM__\n'
+        '{\n'
+        '    const gchar *tmpstr;\n'
+        '\n'
+        '    tmpstr = ${public_underscore}_get_string (' + variable + ');\n'
+        '    if (tmpstr)\n'
+        '        _mbim_printer_append_json_string (printer, tmpstr);\n'
+        '    else\n'
+        '        _mbim_printer_append_printf (printer, "%u", (guint) ' + variable + ');\n'
+        '}\n'
+        '#elif defined __${public_underscore_upper}_IS_FLAGS__\n'
+        '{\n'
+        '    gchar *tmpstr;\n'
+        '\n'
+        '    tmpstr = ${public_underscore}_build_string_from_mask (' + variable + ');\n'
+        '    _mbim_printer_append_json_string (printer, tmpstr);\n'
+        '    g_free (tmpstr);\n'
+        '}\n'
+        '#else\n'
+        '# error neither enum nor flags\n'
+        '#endif\n')
+    return ''.join([(indent + line if line and not line.startswith('#') else line) + '\n' for line in template.split('\n')[:-1]])
+
+
+"""
+Build the C initializer of the field table describing the given list of fields,
+as exposed in the schema API and run by the generic field interpreter of the
+table backend. If the fields are
+the contents of a struct, its type name is given, so that the offsets of the
+members can be computed.
+"""
+def build_field_table(fields, struct_name = None):
+    operations = { '==' : 'EQUAL',
+                   '!=' : 'NOT_EQUAL',
+                   '<'  : 'LESS',
+                   '<=' : 'LESS_EQUAL',
+                   '>'  : 'GREATER',
+                   '>=' : 'GREATER_EQUAL' }
+
+    def field_index(field_name):
+        for i in range(len(fields)):
+            if fields[i]['name'] == field_name:
+                if fields[i]['format'] != 'guint32':
+                    raise ValueError('Field \'%s\' must be a guint32' % field_name)
+                if i > 255:
+                    raise ValueError('Field \'%s\' out of the field table bounds' % field_name)
+                return str(i)
+        raise ValueError('Couldn\'t find field \'%s\'' % field_name)
+
+    referenced = set()
+    for field in fields:
+        if 'array-size-field' in field:
+            referenced.add(field['array-size-field'])
+        if 'available-if' in field:
+            referenced.add(field['available-if']['field'])
+
+    out = ''
+    for field in fields:
+        translations = { 'name'   : field['name'],
+                         'format' : build_underscore_uppercase_name(field['format']) }
+        template = (
+            '    {\n'
+            '        .name = "${name}",\n'
+            '        .format = MBIM_FIELD_FORMAT_${format},\n')
+
+        if 'public-format' in field:
+            translations['public_underscore'] = build_underscore_name_from_camelcase(field['public-format'])
+            template += (
+                '        .public_get_type = ${public_underscore}_get_type,\n')
+
+        if 'array-size' in field:
+            translations['array_size'] = field['array-size']
+            template += (
+                '        .array_size = ${array_size},\n')
+
+        if 'array-size-field' in field:
+            translations['array_size_field'] = field_index(field['array-size-field'])
+            template += (
+                '        .array_size_field = ${array_size_field},\n'
+                '        .has_array_size_field = TRUE,\n')
+
+        if 'available-if' in field:
+            condition = field['available-if']
+            if condition['operation'] not in operations:
+                raise ValueError('Cannot handle condition operation \'%s\'' % condition['operation'])
+            translations['condition_field'] = field_index(condition['field'])
+            translations['condition'] = operations[condition['operation']]
+            translations['condition_value'] = condition['value']
+            template += (
+                '        .condition_field = ${condition_field},\n'
+                '        .condition = MBIM_FIELD_CONDITION_${condition},\n'
+                '        .condition_value = ${condition_value},\n')
+
+        if struct_name:
+            translations['struct_name'] = struct_name
+            translations['member'] = build_underscore_name_from_camelcase(field['name'])
+            template += (
+                '        .member_offset = G_STRUCT_OFFSET (${struct_name}, ${member}),\n')
+            if field['format'] in ['unsized-byte-array', 'ref-byte-array', 'ref-byte-array-no-offset'] and 'array-size-field' not in field:
+                template += (
+                    '        .member_size_offset = G_STRUCT_OFFSET (${struct_name}, ${member}_size),\n')
+
+        if 'struct-type' in field:
+            translations['struct_underscore'] = build_underscore_name_from_camelcase(field['struct-type'])
+            template += (
+                '        .struct_fields = &${struct_underscore}_struct_fields,\n')
+
+        if field['name'] in referenced or 'always-read' in field:
+            template += (
+                '        .referenced = TRUE,\n')
+
+        if 'pad-array' in field and field['pad-array'] == 'FALSE':
+            template += (
+                '        .unpadded = TRUE,\n')
+
+        template += (
+            '    },\n')
+        out += string.Template(template).substitute(translations)
+
+    return out
+
+
 """
 Remove the given prefix from the string
 """
@@ -178,14 +329,43 @@ considered comments.
 """
 def read_json_file(path):
     f = open(path)
-    out = ''
-    for line in f.readlines():
-        stripped = line.strip()
-        if stripped.startswith('//'):
+    out = []
+    for line in f:
+        if line.lstrip().startswith('//'):
             # Skip this line
             # We add an empty line instead so that errors when parsing the JSON
             # report the proper line number
-            out += "\n"
+            out.append("\n")
         else:
-            out += line
-    return out
+            out.append(line)
+    f.close()
+    return ''.join(out)
+
+
+"""
+Read the values of the enums and the service UUIDs defined in the given C
+sources of the library, i.e. 'MBIM_CID_SMS_READ = 2,' entries in the headers and
+the MbimUuid definitions referenced by the service table in mbim-uuid.c. Service
+UUIDs are given as hex strings, keyed by the service enum name.
+"""
+def read_c_symbols(paths):
+    values = {}
+    uuid_definitions = {}
+    uuid_references = {}
+    for path in paths:
+        f = open(path)
+        contents = f.read()
+        f.close()
+        for match in re.finditer(r'^\s*([A-Z][A-Z0-9_]*)\s*=\s*(0x[0-9a-fA-F]+|[0-9]+)\s*,?\s*$', contents, re.MULTILINE):
+            values[match.group(1)] = int(match.group(2), 0)
+        for match in re.finditer(r'static const MbimUuid (\w+) = \{(.*?)\};', contents, re.DOTALL):
+            uuid_definitions[match.group(1)] = re.findall(r'0x([0-9a-fA-F]{2})', match.group(2))
+        for match in re.finditer(r'\[(MBIM_SERVICE_\w+)\]\s*=\s*&(\w+)', contents):
+            uuid_references[match.group(1)] = match.group(2)
+
+    uuids = {}
+    for (service, definition) in uuid_references.items():
+        if definition not in uuid_definitions or len(uuid_definitions[definition]) != 16:
+            raise ValueError('Couldn\'t find the UUID of service \'%s\'' % service)
+        uuids[service] = ''.join(uuid_definitions[definition])
+    return (values, uuids)
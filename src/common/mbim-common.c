@@ -59,3 +59,88 @@ mbim_common_str_hex (gconstpointer mem,
     /* Set output string */
     return new_str;
 }
+
+/*****************************************************************************/
+
+/* Quoted JSON string */
+void
+mbim_common_json_append_string (const gchar          *str,
+                                MbimCommonAppendFunc  append_func,
+                                gpointer              user_data)
+{
+    const gchar *start;
+    const gchar *p;
+
+    append_func ("\"", 1, user_data);
+    for (start = p = (str ? str : ""); *p; p++) {
+        guchar c = (guchar) *p;
+        gchar  escaped[7];
+
+        if (c >= 0x20 && c != '"' && c != '\\')
+            continue;
+
+        /* Flush the run of characters not needing escaping */
+        if (p > start)
+            append_func (start, p - start, user_data);
+        start = p + 1;
+
+        switch (c) {
+        case '"':
+            append_func ("\\\"", 2, user_data);
+            break;
+        case '\\':
+            append_func ("\\\\", 2, user_data);
+            break;
+        case '\n':
+            append_func ("\\n", 2, user_data);
+            break;
+        case '\r':
+            append_func ("\\r", 2, user_data);
+            break;
+        case '\t':
+            append_func ("\\t", 2, user_data);
+            break;
+        default:
+            g_snprintf (escaped, sizeof (escaped), "\\u%04x", c);
+            append_func (escaped, 6, user_data);
+            break;
+        }
+    }
+    if (p > start)
+        append_func (start, p - start, user_data);
+    append_func ("\"", 1, user_data);
+}
+
+/* Value of a key=value line; only line breaks and backslashes are escaped, so
+ * that every value takes exactly one line */
+void
+mbim_common_keyvalue_append_string (const gchar          *str,
+                                    MbimCommonAppendFunc  append_func,
+                                    gpointer              user_data)
+{
+    const gchar *start;
+    const gchar *p;
+
+    for (start = p = (str ? str : ""); *p; p++) {
+        if (*p != '\n' && *p != '\r' && *p != '\\')
+            continue;
+
+        if (p > start)
+            append_func (start, p - start, user_data);
+        start = p + 1;
+
+        switch (*p) {
+        case '\n':
+            append_func ("\\n", 2, user_data);
+            break;
+        case '\r':
+            append_func ("\\r", 2, user_data);
+            break;
+        default:
+            append_func ("\\\\", 2, user_data);
+            break;
+        }
+    }
+    if (p > start)
+        append_func (start, p - start, user_data);
+}
@@ -28,4 +28,16 @@ gchar *mbim_common_str_hex (gconstpointer mem,
                             gsize         size,
                             gchar         delimiter);
 
+/* Escaped output of strings, handed over in chunks to the given function */
+typedef void (* MbimCommonAppendFunc) (const gchar *str,
+                                       gsize        len,
+                                       gpointer     user_data);
+
+void mbim_common_json_append_string     (const gchar          *str,
+                                         MbimCommonAppendFunc  append_func,
+                                         gpointer              user_data);
+void mbim_common_keyvalue_append_string (const gchar          *str,
+                                         MbimCommonAppendFunc  append_func,
+                                         gpointer              user_data);
+
 #endif /* _COMMON_MBIM_COMMON_H_ */
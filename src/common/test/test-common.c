@@ -42,6 +42,60 @@ test_common_str_hex (void)
     g_free (str);
 }
 
+static void
+string_append_func (const gchar *str,
+                    gsize        len,
+                    gpointer     user_data)
+{
+    g_assert_cmpuint (len, >, 0);
+    g_string_append_len ((GString *) user_data, str, len);
+}
+
+static void
+test_common_json_append_string (void)
+{
+    GString *out;
+
+    out = g_string_new (NULL);
+
+    mbim_common_json_append_string ("", string_append_func, out);
+    g_assert_cmpstr (out->str, ==, "\"\"");
+
+    g_string_truncate (out, 0);
+    mbim_common_json_append_string (NULL, string_append_func, out);
+    g_assert_cmpstr (out->str, ==, "\"\"");
+
+    g_string_truncate (out, 0);
+    mbim_common_json_append_string ("cdc-wdm0", string_append_func, out);
+    g_assert_cmpstr (out->str, ==, "\"cdc-wdm0\"");
+
+    g_string_truncate (out, 0);
+    mbim_common_json_append_string ("a\"b\\c\nd\re\tf\001", string_append_func, out);
+    g_assert_cmpstr (out->str, ==, "\"a\\\"b\\\\c\\nd\\re\\tf\\u0001\"");
+
+    g_string_free (out, TRUE);
+}
+
+static void
+test_common_keyvalue_append_string (void)
+{
+    GString *out;
+
+    out = g_string_new (NULL);
+
+    mbim_common_keyvalue_append_string ("", string_append_func, out);
+    g_assert_cmpstr (out->str, ==, "");
+
+    mbim_common_keyvalue_append_string ("a \"b\"=c", string_append_func, out);
+    g_assert_cmpstr (out->str, ==, "a \"b\"=c");
+
+    g_string_truncate (out, 0);
+    mbim_common_keyvalue_append_string ("line1\nline2\r\\", string_append_func, out);
+    g_assert_cmpstr (out->str, ==, "line1\\nline2\\r\\\\");
+
+    g_string_free (out, TRUE);
+}
+
 /*****************************************************************************/
 
 int main (int argc, char **argv)
@@ -49,6 +103,8 @@ int main (int argc, char **argv)
     g_test_init (&argc, &argv, NULL);
 
     g_test_add_func ("/common/str_hex", test_common_str_hex);
+    g_test_add_func ("/common/json_append_string", test_common_json_append_string);
+    g_test_add_func ("/common/keyvalue_append_string", test_common_keyvalue_append_string);
 
     return g_test_run ();
 }
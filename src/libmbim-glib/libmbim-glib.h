@@ -32,7 +32,10 @@
 #include "mbim-uuid.h"
 #include "mbim-cid.h"
 #include "mbim-message.h"
+#include "mbim-schema.h"
 #include "mbim-device.h"
+#include "mbim-trace.h"
+#include "mbim-probe.h"
 #include "mbim-enums.h"
 #include "mbim-proxy.h"
 
@@ -48,6 +51,7 @@
 #include "mbim-dss.h"
 #include "mbim-ms-firmware-id.h"
 #include "mbim-ms-host-shutdown.h"
+#include "mbim-proxy-control.h"
 #include "mbim-qmi.h"
 #include "mbim-atds.h"
 #include "mbim-intel-firmware-update.h"
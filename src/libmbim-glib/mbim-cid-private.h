@@ -0,0 +1,87 @@
+/* -*- Mode: C; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*- */
+
+/*
+ * libmbim-glib -- GLib/GIO based library to control MBIM devices
+ *
+ * This library is free software; you can redistribute it and/or
+ * modify it under the terms of the GNU Lesser General Public
+ * License as published by the Free Software Foundation; either
+ * version 2 of the License, or (at your option) any later version.
+ *
+ * This library is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ * Lesser General Public License for more details.
+ *
+ * You should have received a copy of the GNU Lesser General Public
+ * License along with this library; if not, write to the
+ * Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor,
+ * Boston, MA 02110-1301 USA.
+ *
+ * Copyright (C) 2026 The libmbim authors
+ *
+ * This is a private non-installed header
+ */
+
+#ifndef _LIBMBIM_GLIB_MBIM_CID_PRIVATE_H_
+#define _LIBMBIM_GLIB_MBIM_CID_PRIVATE_H_
+
+#if !defined (LIBMBIM_GLIB_COMPILATION)
+#error "This is a private header!!"
+#endif
+
+#include <glib.h>
+
+#include "mbim-uuid.h"
+#include "mbim-message.h"
+#include "mbim-message-private.h"
+
+G_BEGIN_DECLS
+
+/*****************************************************************************/
+/* CID tables, emitted by the codegen for each known service and indexed by
+ * CID; entries without printable are holes in the table */
+
+typedef void (* MbimCidPrintFunc) (const MbimMessage *message,
+                                   MbimPrinter       *printer,
+                                   const gchar       *line_prefix);
+
+typedef void (* MbimCidJsonFunc) (const MbimMessage *message,
+                                  MbimPrinter       *printer);
+
+typedef struct {
+    const gchar             *printable;
+    guint                    can_set    : 1;
+    guint                    can_query  : 1;
+    guint                    can_notify : 1;
+    MbimCidPrintFunc         query_print;
+    MbimCidPrintFunc         set_print;
+    MbimCidPrintFunc         response_print;
+    MbimCidPrintFunc         notification_print;
+    MbimCidJsonFunc          query_json;
+    MbimCidJsonFunc          set_json;
+    MbimCidJsonFunc          response_json;
+    MbimCidJsonFunc          notification_json;
+    /* Field tables, emitted by both codegen backends; the print and JSON
+     * functions above are only emitted by the unrolled one */
+    const MbimMessageFields *query_fields;
+    const MbimMessageFields *set_fields;
+    const MbimMessageFields *response_fields;
+    const MbimMessageFields *notification_fields;
+} MbimCidEntry;
+
+typedef struct {
+    const MbimCidEntry *entries;
+    guint               n_entries;
+} MbimCidTable;
+
+/* Returns NULL if the service or CID are unknown */
+const MbimCidEntry *_mbim_cid_lookup (MbimService service,
+                                      guint       cid);
+
+/* Drops the CIDs registered for a custom service being unregistered */
+void _mbim_cid_unregister_custom_service (guint service);
+
+G_END_DECLS
+
+#endif /* _LIBMBIM_GLIB_MBIM_CID_PRIVATE_H_ */
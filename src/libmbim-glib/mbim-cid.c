@@ -24,6 +24,21 @@
 #include "mbim-cid.h"
 #include "mbim-uuid.h"
 #include "mbim-enum-types.h"
+#include "mbim-cid-private.h"
+#include "mbim-basic-connect.h"
+#include "mbim-sms.h"
+#include "mbim-ussd.h"
+#include "mbim-phonebook.h"
+#include "mbim-stk.h"
+#include "mbim-auth.h"
+#include "mbim-dss.h"
+#include "mbim-ms-firmware-id.h"
+#include "mbim-ms-host-shutdown.h"
+#include "mbim-proxy-control.h"
+#include "mbim-qmi.h"
+#include "mbim-atds.h"
+#include "mbim-intel-firmware-update.h"
+#include "mbim-ms-basic-connect-extensions.h"
 
 /**
  * SECTION: mbim-cid
@@ -33,150 +48,328 @@
  * This section defines the interface of the known command IDs.
  */
 
-typedef struct {
-    gboolean set;
-    gboolean query;
-    gboolean notify;
-} CidConfig;
-
-#define NO_SET    FALSE
-#define NO_QUERY  FALSE
-#define NO_NOTIFY FALSE
-
-#define SET    TRUE
-#define QUERY  TRUE
-#define NOTIFY TRUE
-
-/* Note: index of the array is CID-1 */
-#define MBIM_CID_BASIC_CONNECT_LAST MBIM_CID_BASIC_CONNECT_MULTICARRIER_PROVIDERS
-static const CidConfig cid_basic_connect_config [MBIM_CID_BASIC_CONNECT_LAST] = {
-    { NO_SET, QUERY,    NO_NOTIFY }, /* MBIM_CID_BASIC_CONNECT_DEVICE_CAPS */
-    { NO_SET, QUERY,    NOTIFY    }, /* MBIM_CID_BASIC_CONNECT_SUBSCRIBER_READY_STATUS */
-    { SET,    QUERY,    NOTIFY    }, /* MBIM_CID_BASIC_CONNECT_RADIO_STATE */
-    { SET,    QUERY,    NO_NOTIFY }, /* MBIM_CID_BASIC_CONNECT_PIN */
-    { NO_SET, QUERY,    NO_NOTIFY }, /* MBIM_CID_BASIC_CONNECT_PIN_LIST */
-    { SET,    QUERY,    NO_NOTIFY }, /* MBIM_CID_BASIC_CONNECT_HOME_PROVIDER */
-    { SET,    QUERY,    NOTIFY    }, /* MBIM_CID_BASIC_CONNECT_PREFERRED_PROVIDERS */
-    { NO_SET, QUERY,    NO_NOTIFY }, /* MBIM_CID_BASIC_CONNECT_VISIBLE_PROVIDERS */
-    { SET,    QUERY,    NOTIFY    }, /* MBIM_CID_BASIC_CONNECT_REGISTER_STATE */
-    { SET,    QUERY,    NOTIFY    }, /* MBIM_CID_BASIC_CONNECT_PACKET_SERVICE */
-    { SET,    QUERY,    NOTIFY    }, /* MBIM_CID_BASIC_CONNECT_SIGNAL_STATE */
-    { SET,    QUERY,    NOTIFY    }, /* MBIM_CID_BASIC_CONNECT_CONNECT */
-    { SET,    QUERY,    NOTIFY    }, /* MBIM_CID_BASIC_CONNECT_PROVISIONED_CONTEXTS */
-    { SET,    NO_QUERY, NO_NOTIFY }, /* MBIM_CID_BASIC_CONNECT_SERVICE_ACTIVATION */
-    { NO_SET, QUERY,    NOTIFY    }, /* MBIM_CID_BASIC_CONNECT_IP_CONFIGURATION */
-    { NO_SET, QUERY,    NO_NOTIFY }, /* MBIM_CID_BASIC_CONNECT_DEVICE_SERVICES */
-    { NO_SET, NO_QUERY, NO_NOTIFY }, /* 17 reserved */
-    { NO_SET, NO_QUERY, NO_NOTIFY }, /* 18 reserved */
-    { SET,    NO_QUERY, NO_NOTIFY }, /* MBIM_CID_BASIC_CONNECT_DEVICE_SERVICE_SUBSCRIBE_LIST */
-    { NO_SET, QUERY,    NO_NOTIFY }, /* MBIM_CID_BASIC_CONNECT_PACKET_STATISTICS */
-    { SET,    QUERY,    NO_NOTIFY }, /* MBIM_CID_BASIC_CONNECT_NETWORK_IDLE_HINT */
-    { NO_SET, QUERY,    NOTIFY    }, /* MBIM_CID_BASIC_CONNECT_EMERGENCY_MODE */
-    { SET,    QUERY,    NO_NOTIFY }, /* MBIM_CID_BASIC_CONNECT_IP_PACKET_FILTERS */
-    { SET,    QUERY,    NOTIFY    }, /* MBIM_CID_BASIC_CONNECT_MULTICARRIER_PROVIDERS */
-};
+/*****************************************************************************/
+/* CID tables */
 
-/* Note: index of the array is CID-1 */
-#define MBIM_CID_SMS_LAST MBIM_CID_SMS_MESSAGE_STORE_STATUS
-static const CidConfig cid_sms_config [MBIM_CID_SMS_LAST] = {
-    { SET,    QUERY,    NOTIFY    }, /* MBIM_CID_SMS_CONFIGURATION */
-    { NO_SET, QUERY,    NOTIFY    }, /* MBIM_CID_SMS_READ */
-    { SET,    NO_QUERY, NO_NOTIFY }, /* MBIM_CID_SMS_SEND */
-    { SET,    NO_QUERY, NO_NOTIFY }, /* MBIM_CID_SMS_DELETE */
-    { NO_SET, QUERY,    NOTIFY    }, /* MBIM_CID_SMS_MESSAGE_STORE_STATUS */
+/* Two-level table: the service table is indexed by service, each of the
+ * codegen-emitted CID tables is indexed by CID */
+static const MbimCidTable *cid_tables[MBIM_SERVICE_LAST] = {
+    [MBIM_SERVICE_BASIC_CONNECT]               = &__mbim_basic_connect_cid_table,
+    [MBIM_SERVICE_SMS]                         = &__mbim_sms_cid_table,
+    [MBIM_SERVICE_USSD]                        = &__mbim_ussd_cid_table,
+    [MBIM_SERVICE_PHONEBOOK]                   = &__mbim_phonebook_cid_table,
+    [MBIM_SERVICE_STK]                         = &__mbim_stk_cid_table,
+    [MBIM_SERVICE_AUTH]                        = &__mbim_auth_cid_table,
+    [MBIM_SERVICE_DSS]                         = &__mbim_dss_cid_table,
+    [MBIM_SERVICE_MS_FIRMWARE_ID]              = &__mbim_ms_firmware_id_cid_table,
+    [MBIM_SERVICE_MS_HOST_SHUTDOWN]            = &__mbim_ms_host_shutdown_cid_table,
+    [MBIM_SERVICE_PROXY_CONTROL]               = &__mbim_proxy_control_cid_table,
+    [MBIM_SERVICE_QMI]                         = &__mbim_qmi_cid_table,
+    [MBIM_SERVICE_ATDS]                        = &__mbim_atds_cid_table,
+    [MBIM_SERVICE_INTEL_FIRMWARE_UPDATE]       = &__mbim_intel_firmware_update_cid_table,
+    [MBIM_SERVICE_MS_BASIC_CONNECT_EXTENSIONS] = &__mbim_ms_basic_connect_extensions_cid_table,
 };
 
-/* Note: index of the array is CID-1 */
-#define MBIM_CID_USSD_LAST MBIM_CID_USSD
-static const CidConfig cid_ussd_config [MBIM_CID_USSD_LAST] = {
-    { SET, NO_QUERY, NOTIFY }, /* MBIM_CID_USSD */
-};
+/* Custom CID entries, interned by printable and capabilities, so that the
+ * entries returned by _mbim_cid_lookup() stay valid whatever happens to the
+ * tables referring to them. Only accessed with the registry lock held. */
+static GHashTable *custom_cid_entries;
 
-/* Note: index of the array is CID-1 */
-#define MBIM_CID_PHONEBOOK_LAST MBIM_CID_PHONEBOOK_WRITE
-static const CidConfig cid_phonebook_config [MBIM_CID_PHONEBOOK_LAST] = {
-    { NO_SET, QUERY,    NOTIFY    }, /* MBIM_CID_PHONEBOOK_CONFIGURATION */
-    { NO_SET, QUERY,    NO_NOTIFY }, /* MBIM_CID_PHONEBOOK_READ */
-    { SET,    NO_QUERY, NO_NOTIFY }, /* MBIM_CID_PHONEBOOK_DELETE */
-    { SET,    NO_QUERY, NO_NOTIFY }, /* MBIM_CID_PHONEBOOK_WRITE */
-};
+static guint
+custom_cid_entry_hash (gconstpointer v)
+{
+    const MbimCidEntry *entry = v;
 
-/* Note: index of the array is CID-1 */
-#define MBIM_CID_STK_LAST MBIM_CID_STK_ENVELOPE
-static const CidConfig cid_stk_config [MBIM_CID_STK_LAST] = {
-    { SET, QUERY,    NOTIFY    }, /* MBIM_CID_STK_PAC */
-    { SET, NO_QUERY, NO_NOTIFY }, /* MBIM_CID_STK_TERMINAL_RESPONSE */
-    { SET, QUERY,    NO_NOTIFY }, /* MBIM_CID_STK_ENVELOPE */
-};
+    return (g_direct_hash (entry->printable) ^
+            (entry->can_set << 0) ^ (entry->can_query << 1) ^ (entry->can_notify << 2));
+}
 
-/* Note: index of the array is CID-1 */
-#define MBIM_CID_AUTH_LAST MBIM_CID_AUTH_SIM
-static const CidConfig cid_auth_config [MBIM_CID_AUTH_LAST] = {
-    { NO_SET, QUERY, NO_NOTIFY }, /* MBIM_CID_AUTH_AKA */
-    { NO_SET, QUERY, NO_NOTIFY }, /* MBIM_CID_AUTH_AKAP */
-    { NO_SET, QUERY, NO_NOTIFY }, /* MBIM_CID_AUTH_SIM */
-};
+static gboolean
+custom_cid_entry_equal (gconstpointer a,
+                        gconstpointer b)
+{
+    const MbimCidEntry *entry_a = a;
+    const MbimCidEntry *entry_b = b;
 
-/* Note: index of the array is CID-1 */
-#define MBIM_CID_DSS_LAST MBIM_CID_DSS_CONNECT
-static const CidConfig cid_dss_config [MBIM_CID_DSS_LAST] = {
-    { SET, NO_QUERY, NO_NOTIFY }, /* MBIM_CID_DSS_CONNECT */
-};
+    return (entry_a->printable  == entry_b->printable &&
+            entry_a->can_set    == entry_b->can_set &&
+            entry_a->can_query  == entry_b->can_query &&
+            entry_a->can_notify == entry_b->can_notify);
+}
 
-/* Note: index of the array is CID-1 */
-#define MBIM_CID_MS_FIRMWARE_ID_LAST MBIM_CID_MS_FIRMWARE_ID_GET
-static const CidConfig cid_ms_firmware_id_config [MBIM_CID_MS_FIRMWARE_ID_LAST] = {
-    { NO_SET, QUERY, NO_NOTIFY }, /* MBIM_CID_MS_FIRMWARE_ID_GET */
-};
+/* Must be called with the registry lock held */
+static const MbimCidEntry *
+custom_cid_entry_intern (const gchar *nickname,
+                         gboolean     can_set,
+                         gboolean     can_query,
+                         gboolean     can_notify)
+{
+    MbimCidEntry  key = { 0 };
+    MbimCidEntry *entry;
 
-/* Note: index of the array is CID-1 */
-#define MBIM_CID_MS_HOST_SHUTDOWN_LAST MBIM_CID_MS_HOST_SHUTDOWN_NOTIFY
-static const CidConfig cid_ms_host_shutdown_config [MBIM_CID_MS_HOST_SHUTDOWN_LAST] = {
-    { SET, NO_QUERY, NO_NOTIFY }, /* MBIM_CID_MS_HOST_SHUTDOWN_NOTIFY */
-};
+    key.printable  = g_intern_string (nickname);
+    key.can_set    = !!can_set;
+    key.can_query  = !!can_query;
+    key.can_notify = !!can_notify;
 
-/* Note: index of the array is CID-1 */
-#define MBIM_CID_PROXY_CONTROL_LAST MBIM_CID_PROXY_CONTROL_CONFIGURATION
-static const CidConfig cid_proxy_control_config [MBIM_CID_PROXY_CONTROL_LAST] = {
-    { SET, NO_QUERY, NO_NOTIFY }, /* MBIM_CID_PROXY_CONTROL_CONFIGURATION */
-};
+    if (!custom_cid_entries)
+        custom_cid_entries = g_hash_table_new (custom_cid_entry_hash, custom_cid_entry_equal);
 
-/* Note: index of the array is CID-1 */
-#define MBIM_CID_QMI_LAST MBIM_CID_QMI_MSG
-static const CidConfig cid_qmi_config [MBIM_CID_QMI_LAST] = {
-    { SET, NO_QUERY, NOTIFY }, /* MBIM_CID_QMI_MSG */
-};
+    entry = g_hash_table_lookup (custom_cid_entries, &key);
+    if (!entry) {
+        entry = g_slice_dup (MbimCidEntry, &key);
+        g_hash_table_add (custom_cid_entries, entry);
+    }
+    return entry;
+}
 
-/* Note: index of the array is CID-1 */
-#define MBIM_CID_ATDS_LAST MBIM_CID_ATDS_REGISTER_STATE
-static const CidConfig cid_atds_config [MBIM_CID_ATDS_LAST] = {
-    { NO_SET, QUERY, NO_NOTIFY }, /* MBIM_CID_ATDS_SIGNAL */
-    { NO_SET, QUERY, NO_NOTIFY }, /* MBIM_CID_ATDS_LOCATION */
-    { SET,    QUERY, NO_NOTIFY }, /* MBIM_CID_ATDS_OPERATORS */
-    { SET,    QUERY, NO_NOTIFY }, /* MBIM_CID_ATDS_RAT */
-    { NO_SET, QUERY, NO_NOTIFY }, /* MBIM_CID_ATDS_REGISTER_STATE */
-};
+/* Custom service id -> GPtrArray of interned MbimCidEntry, indexed by CID.
+ *
+ * Writers are serialized with the registry lock and publish a modified copy of
+ * the tables as a new snapshot. Readers take a reference on the current
+ * snapshot, so that replaced ones are freed as soon as their last reader is
+ * done. The CID arrays are refcounted as well, so that snapshots share the
+ * ones of the services not being modified. */
 
-/* Note: index of the array is CID-1 */
-#define MBIM_CID_INTEL_FIRMWARE_UPDATE_LAST MBIM_CID_INTEL_FIRMWARE_UPDATE_MODEM_REBOOT
-static const CidConfig cid_intel_firmware_update_config [MBIM_CID_INTEL_FIRMWARE_UPDATE_LAST] = {
-    { SET, NO_QUERY, NO_NOTIFY }, /* MBIM_CID_INTEL_FIRMWARE_UPDATE_MODEM_REBOOT */
-};
+typedef struct {
+    volatile gint  ref_count;
+    GHashTable    *tables;
+} CustomCidSnapshot;
 
-/* Note: index of the array is CID-1 */
-#define MBIM_CID_MS_BASIC_CONNECT_EXTENSIONS_LAST MBIM_CID_MS_BASIC_CONNECT_EXTENSIONS_DEVICE_RESET
-static const CidConfig cid_ms_basic_connect_extensions_config [MBIM_CID_MS_BASIC_CONNECT_EXTENSIONS_LAST] = {
-    { SET,    QUERY,    NOTIFY    }, /* MBIM_CID_MS_BASIC_CONNECT_EXTENSIONS_PROVISIONED_CONTEXTS */
-    { SET,    QUERY,    NOTIFY    }, /* MBIM_CID_MS_BASIC_CONNECT_EXTENSIONS_NETWORK_BLACKLIST */
-    { SET,    QUERY,    NOTIFY    }, /* MBIM_CID_MS_BASIC_CONNECT_EXTENSIONS_LTE_ATTACH_CONFIG */
-    { SET,    QUERY,    NOTIFY    }, /* MBIM_CID_MS_BASIC_CONNECT_EXTENSIONS_LTE_ATTACH_STATUS */
-    { NO_SET, QUERY,    NO_NOTIFY }, /* MBIM_CID_MS_BASIC_CONNECT_EXTENSIONS_SYS_CAPS */
-    { NO_SET, QUERY,    NO_NOTIFY }, /* MBIM_CID_MS_BASIC_CONNECT_EXTENSIONS_DEVICE_CAPS */
-    { SET,    QUERY,    NO_NOTIFY }, /* MBIM_CID_MS_BASIC_CONNECT_EXTENSIONS_DEVICE_SLOT_MAPPINGS */
-    { NO_SET, QUERY,    NOTIFY    }, /* MBIM_CID_MS_BASIC_CONNECT_EXTENSIONS_SLOT_INFO_STATUS */
-    { NO_SET, QUERY,    NOTIFY    }, /* MBIM_CID_MS_BASIC_CONNECT_EXTENSIONS_PCO */
-    { SET,    NO_QUERY, NO_NOTIFY }, /* MBIM_CID_MS_BASIC_CONNECT_EXTENSIONS_DEVICE_RESET */
-};
+static GMutex             custom_cid_tables_lock;
+static GMutex             custom_cid_snapshot_lock;
+static CustomCidSnapshot *custom_cid_snapshot;
+
+static CustomCidSnapshot *
+custom_cid_snapshot_ref (CustomCidSnapshot *snapshot)
+{
+    g_atomic_int_inc (&snapshot->ref_count);
+    return snapshot;
+}
+
+static void
+custom_cid_snapshot_unref (CustomCidSnapshot *snapshot)
+{
+    if (g_atomic_int_dec_and_test (&snapshot->ref_count)) {
+        g_hash_table_unref (snapshot->tables);
+        g_slice_free (CustomCidSnapshot, snapshot);
+    }
+}
+
+static CustomCidSnapshot *
+custom_cid_snapshot_get (void)
+{
+    CustomCidSnapshot *snapshot = NULL;
+
+    /* Don't even lock until some custom CID is registered */
+    if (!g_atomic_pointer_get (&custom_cid_snapshot))
+        return NULL;
+
+    g_mutex_lock (&custom_cid_snapshot_lock);
+    if (custom_cid_snapshot)
+        snapshot = custom_cid_snapshot_ref (custom_cid_snapshot);
+    g_mutex_unlock (&custom_cid_snapshot_lock);
+
+    return snapshot;
+}
+
+/* Must be called with the registry lock held */
+static GPtrArray *
+custom_cid_tables_peek (guint service)
+{
+    return (custom_cid_snapshot ?
+            g_hash_table_lookup (custom_cid_snapshot->tables, GUINT_TO_POINTER (service)) :
+            NULL);
+}
+
+/* Must be called with the registry lock held. The array of @service is
+ * replaced with @array, or removed if %NULL. */
+static void
+custom_cid_tables_publish (guint      service,
+                           GPtrArray *array)
+{
+    CustomCidSnapshot *snapshot;
+    CustomCidSnapshot *old_snapshot;
+    GHashTableIter     iter;
+    gpointer           key;
+    gpointer           value;
+
+    snapshot = g_slice_new (CustomCidSnapshot);
+    snapshot->ref_count = 1;
+    snapshot->tables = g_hash_table_new_full (g_direct_hash, g_direct_equal, NULL, (GDestroyNotify) g_ptr_array_unref);
+    if (custom_cid_snapshot) {
+        g_hash_table_iter_init (&iter, custom_cid_snapshot->tables);
+        while (g_hash_table_iter_next (&iter, &key, &value)) {
+            if (GPOINTER_TO_UINT (key) != service)
+                g_hash_table_insert (snapshot->tables, key, g_ptr_array_ref (value));
+        }
+    }
+    if (array)
+        g_hash_table_insert (snapshot->tables, GUINT_TO_POINTER (service), array);
+
+    g_mutex_lock (&custom_cid_snapshot_lock);
+    old_snapshot = custom_cid_snapshot;
+    g_atomic_pointer_set (&custom_cid_snapshot, snapshot);
+    g_mutex_unlock (&custom_cid_snapshot_lock);
+
+    if (old_snapshot)
+        custom_cid_snapshot_unref (old_snapshot);
+}
+
+const MbimCidEntry *
+_mbim_cid_lookup (MbimService service,
+                  guint       cid)
+{
+    const MbimCidEntry *entry;
+
+    if (G_LIKELY (service < MBIM_SERVICE_LAST)) {
+        const MbimCidTable *table;
+
+        table = cid_tables[service];
+        if (!table || cid >= table->n_entries)
+            return NULL;
+        entry = &table->entries[cid];
+    } else {
+        CustomCidSnapshot *snapshot;
+        GPtrArray         *array;
+
+        snapshot = custom_cid_snapshot_get ();
+        if (!snapshot)
+            return NULL;
+        array = g_hash_table_lookup (snapshot->tables, GUINT_TO_POINTER (service));
+        entry = (array && cid < array->len) ? g_ptr_array_index (array, cid) : NULL;
+        /* Interned entries outlive the snapshot */
+        custom_cid_snapshot_unref (snapshot);
+        if (!entry)
+            return NULL;
+    }
+
+    return entry->printable ? entry : NULL;
+}
+
+void
+_mbim_cid_unregister_custom_service (guint service)
+{
+    g_mutex_lock (&custom_cid_tables_lock);
+    if (custom_cid_tables_peek (service))
+        custom_cid_tables_publish (service, NULL);
+    g_mutex_unlock (&custom_cid_tables_lock);
+}
+
+/**
+ * mbim_cid_register_custom_entries:
+ * @service: a custom service, as returned by mbim_register_custom_service().
+ * @entries: (array length=n_entries): the #MbimCidCustomEntry commands to register.
+ * @n_entries: the number of elements in @entries.
+ *
+ * Registers several commands of a custom service at once, as
+ * mbim_cid_register_custom() does for each of them, but updating the
+ * registry just once.
+ *
+ * This method may be called from any thread.
+ *
+ * Returns: %TRUE if the commands have been registered, %FALSE if @service
+ * isn't a custom service.
+ */
+gboolean
+mbim_cid_register_custom_entries (guint                     service,
+                                  const MbimCidCustomEntry *entries,
+                                  guint                     n_entries)
+{
+    GPtrArray *array;
+    GPtrArray *new_array;
+    guint      len;
+    guint      i;
+
+    g_return_val_if_fail (entries != NULL || n_entries == 0, FALSE);
+    for (i = 0; i < n_entries; i++) {
+        /* CID = 0 is never a valid command */
+        g_return_val_if_fail (entries[i].cid > 0, FALSE);
+        g_return_val_if_fail (entries[i].nickname != NULL, FALSE);
+    }
+
+    g_mutex_lock (&custom_cid_tables_lock);
+
+    /* Checked with the lock held: the service is unregistered before its
+     * tables are removed, which also takes the lock, so the tables of an
+     * unregistered service are never left behind */
+    if (!mbim_service_id_is_custom (service)) {
+        g_mutex_unlock (&custom_cid_tables_lock);
+        return FALSE;
+    }
+
+    array = custom_cid_tables_peek (service);
+
+    len = array ? array->len : 0;
+    for (i = 0; i < n_entries; i++)
+        len = MAX (len, entries[i].cid + 1);
+
+    new_array = g_ptr_array_sized_new (len);
+    if (array) {
+        for (i = 0; i < array->len; i++)
+            g_ptr_array_add (new_array, g_ptr_array_index (array, i));
+    }
+    g_ptr_array_set_size (new_array, len);
+
+    for (i = 0; i < n_entries; i++)
+        g_ptr_array_index (new_array, entries[i].cid) = (gpointer) custom_cid_entry_intern (entries[i].nickname,
+                                                                                             entries[i].can_set,
+                                                                                             entries[i].can_query,
+                                                                                             entries[i].can_notify);
+
+    custom_cid_tables_publish (service, new_array);
+
+    g_mutex_unlock (&custom_cid_tables_lock);
+    return TRUE;
+}
+
+/**
+ * mbim_cid_register_custom:
+ * @service: a custom service, as returned by mbim_register_custom_service().
+ * @cid: a command ID.
+ * @nickname: a printable name for the command.
+ * @can_set: whether the command allows setting.
+ * @can_query: whether the command allows querying.
+ * @can_notify: whether the command allows notifying.
+ *
+ * Registers a command of a custom service, so that its capabilities and
+ * printable name are known by mbim_cid_can_set(), mbim_cid_can_query(),
+ * mbim_cid_can_notify() and mbim_cid_get_printable(). Registering the same
+ * command again overwrites the previous information.
+ *
+ * Each call updates the whole registry of the service, so use
+ * mbim_cid_register_custom_entries() to register many commands at once.
+ *
+ * The commands are automatically unregistered when the custom service is
+ * unregistered with mbim_unregister_custom_service().
+ *
+ * This method may be called from any thread.
+ *
+ * Returns: %TRUE if the command has been registered, %FALSE if @service isn't
+ * a custom service.
+ */
+gboolean
+mbim_cid_register_custom (guint        service,
+                          guint        cid,
+                          const gchar *nickname,
+                          gboolean     can_set,
+                          gboolean     can_query,
+                          gboolean     can_notify)
+{
+    MbimCidCustomEntry entry;
+
+    /* CID = 0 is never a valid command */
+    g_return_val_if_fail (cid > 0, FALSE);
+    g_return_val_if_fail (nickname != NULL, FALSE);
+
+    entry.cid        = cid;
+    entry.nickname   = nickname;
+    entry.can_set    = can_set;
+    entry.can_query  = can_query;
+    entry.can_notify = can_notify;
+
+    return mbim_cid_register_custom_entries (service, &entry, 1);
+}
 
 /**
  * mbim_cid_can_set:
@@ -191,45 +384,15 @@ gboolean
 mbim_cid_can_set (MbimService service,
                   guint       cid)
 {
+    const MbimCidEntry *entry;
+
     /* CID = 0 is never a valid command */
     g_return_val_if_fail (cid > 0, FALSE);
-    /* Known service required */
+    /* Known or custom service required */
     g_return_val_if_fail (service > MBIM_SERVICE_INVALID, FALSE);
-    g_return_val_if_fail (service < MBIM_SERVICE_LAST, FALSE);
-
-    switch (service) {
-    case MBIM_SERVICE_BASIC_CONNECT:
-        return cid_basic_connect_config[cid - 1].set;
-    case MBIM_SERVICE_SMS:
-        return cid_sms_config[cid - 1].set;
-    case MBIM_SERVICE_USSD:
-        return cid_ussd_config[cid - 1].set;
-    case MBIM_SERVICE_PHONEBOOK:
-        return cid_phonebook_config[cid - 1].set;
-    case MBIM_SERVICE_STK:
-        return cid_stk_config[cid - 1].set;
-    case MBIM_SERVICE_AUTH:
-        return cid_auth_config[cid - 1].set;
-    case MBIM_SERVICE_DSS:
-        return cid_dss_config[cid - 1].set;
-    case MBIM_SERVICE_MS_FIRMWARE_ID:
-        return cid_ms_firmware_id_config[cid - 1].set;
-    case MBIM_SERVICE_MS_HOST_SHUTDOWN:
-        return cid_ms_host_shutdown_config[cid - 1].set;
-    case MBIM_SERVICE_PROXY_CONTROL:
-        return cid_proxy_control_config[cid - 1].set;
-    case MBIM_SERVICE_QMI:
-        return cid_qmi_config[cid - 1].set;
-    case MBIM_SERVICE_ATDS:
-        return cid_atds_config[cid - 1].set;
-    case MBIM_SERVICE_INTEL_FIRMWARE_UPDATE:
-        return cid_intel_firmware_update_config[cid - 1].set;
-    case MBIM_SERVICE_MS_BASIC_CONNECT_EXTENSIONS:
-        return cid_ms_basic_connect_extensions_config[cid - 1].set;
-    default:
-        g_assert_not_reached ();
-        return FALSE;
-    }
+
+    entry = _mbim_cid_lookup (service, cid);
+    return entry ? entry->can_set : FALSE;
 }
 
 /**
@@ -245,45 +408,15 @@ gboolean
 mbim_cid_can_query (MbimService service,
                     guint       cid)
 {
+    const MbimCidEntry *entry;
+
     /* CID = 0 is never a valid command */
     g_return_val_if_fail (cid > 0, FALSE);
-    /* Known service required */
+    /* Known or custom service required */
     g_return_val_if_fail (service > MBIM_SERVICE_INVALID, FALSE);
-    g_return_val_if_fail (service < MBIM_SERVICE_LAST, FALSE);
-
-    switch (service) {
-    case MBIM_SERVICE_BASIC_CONNECT:
-        return cid_basic_connect_config[cid - 1].query;
-    case MBIM_SERVICE_SMS:
-        return cid_sms_config[cid - 1].query;
-    case MBIM_SERVICE_USSD:
-        return cid_ussd_config[cid - 1].query;
-    case MBIM_SERVICE_PHONEBOOK:
-        return cid_phonebook_config[cid - 1].query;
-    case MBIM_SERVICE_STK:
-        return cid_stk_config[cid - 1].query;
-    case MBIM_SERVICE_AUTH:
-        return cid_auth_config[cid - 1].query;
-    case MBIM_SERVICE_DSS:
-        return cid_dss_config[cid - 1].query;
-    case MBIM_SERVICE_MS_FIRMWARE_ID:
-        return cid_ms_firmware_id_config[cid - 1].query;
-    case MBIM_SERVICE_MS_HOST_SHUTDOWN:
-        return cid_ms_host_shutdown_config[cid - 1].query;
-    case MBIM_SERVICE_PROXY_CONTROL:
-        return cid_proxy_control_config[cid - 1].query;
-    case MBIM_SERVICE_QMI:
-        return cid_qmi_config[cid - 1].query;
-    case MBIM_SERVICE_ATDS:
-        return cid_atds_config[cid - 1].query;
-    case MBIM_SERVICE_INTEL_FIRMWARE_UPDATE:
-        return cid_intel_firmware_update_config[cid - 1].query;
-    case MBIM_SERVICE_MS_BASIC_CONNECT_EXTENSIONS:
-        return cid_ms_basic_connect_extensions_config[cid - 1].query;
-    default:
-        g_assert_not_reached ();
-        return FALSE;
-    }
+
+    entry = _mbim_cid_lookup (service, cid);
+    return entry ? entry->can_query : FALSE;
 }
 
 /**
@@ -299,45 +432,15 @@ gboolean
 mbim_cid_can_notify (MbimService service,
                      guint       cid)
 {
+    const MbimCidEntry *entry;
+
     /* CID = 0 is never a valid command */
     g_return_val_if_fail (cid > 0, FALSE);
-    /* Known service required */
+    /* Known or custom service required */
     g_return_val_if_fail (service > MBIM_SERVICE_INVALID, FALSE);
-    g_return_val_if_fail (service < MBIM_SERVICE_LAST, FALSE);
-
-    switch (service) {
-    case MBIM_SERVICE_BASIC_CONNECT:
-        return cid_basic_connect_config[cid - 1].notify;
-    case MBIM_SERVICE_SMS:
-        return cid_sms_config[cid - 1].notify;
-    case MBIM_SERVICE_USSD:
-        return cid_ussd_config[cid - 1].notify;
-    case MBIM_SERVICE_PHONEBOOK:
-        return cid_phonebook_config[cid - 1].notify;
-    case MBIM_SERVICE_STK:
-        return cid_stk_config[cid - 1].notify;
-    case MBIM_SERVICE_AUTH:
-        return cid_auth_config[cid - 1].notify;
-    case MBIM_SERVICE_DSS:
-        return cid_dss_config[cid - 1].notify;
-    case MBIM_SERVICE_MS_FIRMWARE_ID:
-        return cid_ms_firmware_id_config[cid - 1].notify;
-    case MBIM_SERVICE_MS_HOST_SHUTDOWN:
-        return cid_ms_host_shutdown_config[cid - 1].notify;
-    case MBIM_SERVICE_PROXY_CONTROL:
-        return cid_proxy_control_config[cid - 1].notify;
-    case MBIM_SERVICE_QMI:
-        return cid_qmi_config[cid - 1].notify;
-    case MBIM_SERVICE_ATDS:
-        return cid_atds_config[cid - 1].notify;
-    case MBIM_SERVICE_INTEL_FIRMWARE_UPDATE:
-        return cid_intel_firmware_update_config[cid - 1].notify;
-    case MBIM_SERVICE_MS_BASIC_CONNECT_EXTENSIONS:
-        return cid_ms_basic_connect_extensions_config[cid - 1].notify;
-    default:
-        g_assert_not_reached ();
-        return FALSE;
-    }
+
+    entry = _mbim_cid_lookup (service, cid);
+    return entry ? entry->can_notify : FALSE;
 }
 
 /**
@@ -348,50 +451,20 @@ mbim_cid_can_notify (MbimService service,
  * Gets a printable string for the command specified by the @service and the
  * @cid.
  *
- * Returns: (transfer none): a constant string.
+ * Returns: (transfer none): a constant string, or %NULL if the command is unknown.
  */
 const gchar *
 mbim_cid_get_printable (MbimService service,
                         guint       cid)
 {
+    const MbimCidEntry *entry;
+
     /* CID = 0 is never a valid command */
     g_return_val_if_fail (cid > 0, NULL);
-    /* Known service required */
-    g_return_val_if_fail (service < MBIM_SERVICE_LAST, NULL);
 
-    switch (service) {
-    case MBIM_SERVICE_INVALID:
+    if (service == MBIM_SERVICE_INVALID)
         return "invalid";
-    case MBIM_SERVICE_BASIC_CONNECT:
-        return mbim_cid_basic_connect_get_string (cid);
-    case MBIM_SERVICE_SMS:
-        return mbim_cid_sms_get_string (cid);
-    case MBIM_SERVICE_USSD:
-        return mbim_cid_ussd_get_string (cid);
-    case MBIM_SERVICE_PHONEBOOK:
-        return mbim_cid_phonebook_get_string (cid);
-    case MBIM_SERVICE_STK:
-        return mbim_cid_stk_get_string (cid);
-    case MBIM_SERVICE_AUTH:
-        return mbim_cid_auth_get_string (cid);
-    case MBIM_SERVICE_DSS:
-        return mbim_cid_dss_get_string (cid);
-    case MBIM_SERVICE_MS_FIRMWARE_ID:
-        return mbim_cid_ms_firmware_id_get_string (cid);
-    case MBIM_SERVICE_MS_HOST_SHUTDOWN:
-        return mbim_cid_ms_host_shutdown_get_string (cid);
-    case MBIM_SERVICE_PROXY_CONTROL:
-        return mbim_cid_proxy_control_get_string (cid);
-    case MBIM_SERVICE_QMI:
-        return mbim_cid_qmi_get_string (cid);
-    case MBIM_SERVICE_ATDS:
-        return mbim_cid_atds_get_string (cid);
-    case MBIM_SERVICE_INTEL_FIRMWARE_UPDATE:
-        return mbim_cid_intel_firmware_update_get_string (cid);
-    case MBIM_SERVICE_MS_BASIC_CONNECT_EXTENSIONS:
-        return mbim_cid_ms_basic_connect_extensions_get_string (cid);
-    default:
-        g_assert_not_reached ();
-        return NULL;
-    }
+
+    entry = _mbim_cid_lookup (service, cid);
+    return entry ? entry->printable : NULL;
 }
@@ -211,12 +211,14 @@ typedef enum {
  * MbimCidProxyControl:
  * @MBIM_CID_PROXY_CONTROL_UNKNOWN: Unknown command.
  * @MBIM_CID_PROXY_CONTROL_CONFIGURATION: Configuration.
+ * @MBIM_CID_PROXY_CONTROL_STATISTICS: Statistics.
  *
  * MBIM commands in the %MBIM_SERVICE_PROXY_CONTROL service.
  */
 typedef enum {
     MBIM_CID_PROXY_CONTROL_UNKNOWN       = 0,
-    MBIM_CID_PROXY_CONTROL_CONFIGURATION = 1
+    MBIM_CID_PROXY_CONTROL_CONFIGURATION = 1,
+    MBIM_CID_PROXY_CONTROL_STATISTICS    = 2
 } MbimCidProxyControl;
 
 /**
@@ -304,6 +306,35 @@ gboolean     mbim_cid_can_notify    (MbimService service,
 const gchar *mbim_cid_get_printable (MbimService service,
                                      guint       cid);
 
+gboolean     mbim_cid_register_custom (guint        service,
+                                       guint        cid,
+                                       const gchar *nickname,
+                                       gboolean     can_set,
+                                       gboolean     can_query,
+                                       gboolean     can_notify);
+
+/**
+ * MbimCidCustomEntry:
+ * @cid: a command ID.
+ * @nickname: a printable name for the command.
+ * @can_set: whether the command allows setting.
+ * @can_query: whether the command allows querying.
+ * @can_notify: whether the command allows notifying.
+ *
+ * A command of a custom service, as given to mbim_cid_register_custom_entries().
+ */
+typedef struct {
+    guint        cid;
+    const gchar *nickname;
+    gboolean     can_set;
+    gboolean     can_query;
+    gboolean     can_notify;
+} MbimCidCustomEntry;
+
+gboolean     mbim_cid_register_custom_entries (guint                     service,
+                                               const MbimCidCustomEntry *entries,
+                                               guint                     n_entries);
+
 G_END_DECLS
 
 #endif /* _LIBMBIM_GLIB_MBIM_CID_H_ */
@@ -0,0 +1,374 @@
+/* -*- Mode: C; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*- */
+
+/*
+ * libmbim-glib -- GLib/GIO based library to control MBIM devices
+ *
+ * This library is free software; you can redistribute it and/or
+ * modify it under the terms of the GNU Lesser General Public
+ * License as published by the Free Software Foundation; either
+ * version 2 of the License, or (at your option) any later version.
+ *
+ * This library is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ * Lesser General Public License for more details.
+ *
+ * You should have received a copy of the GNU Lesser General Public
+ * License along with this library; if not, write to the
+ * Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor,
+ * Boston, MA 02110-1301 USA.
+ *
+ * Copyright (C) 2026 The libmbim authors
+ */
+
+#include <string.h>
+
+#include "mbim-device-stats.h"
+#include "mbim-message-private.h"
+#include "mbim-errors.h"
+#include "mbim-error-types.h"
+#include "mbim-uuid.h"
+
+/*****************************************************************************/
+/* Latency histograms
+ *
+ * Histograms are log-linear (HDR-style): every power of two range is split
+ * in 8 linear sub-buckets, so recording is constant time and reported values
+ * are within 12.5% of the real ones.
+ */
+
+#define LATENCY_SUB_BUCKET_BITS 3
+#define LATENCY_SUB_BUCKETS     (1 << LATENCY_SUB_BUCKET_BITS)
+#define LATENCY_MAX_EXPONENT    31
+#define LATENCY_N_BUCKETS       ((LATENCY_MAX_EXPONENT - LATENCY_SUB_BUCKET_BITS + 2) * LATENCY_SUB_BUCKETS)
+
+typedef struct {
+    guint64 count;
+    guint64 max;
+    guint32 buckets[LATENCY_N_BUCKETS];
+} LatencyHistogram;
+
+static guint
+latency_histogram_bucket (guint64 value)
+{
+    guint exponent;
+
+    if (value < LATENCY_SUB_BUCKETS)
+        return (guint) value;
+
+    if (value > G_MAXUINT32)
+        return LATENCY_N_BUCKETS - 1;
+
+    exponent = g_bit_storage ((gulong) value) - 1;
+
+    return ((exponent - LATENCY_SUB_BUCKET_BITS + 1) * LATENCY_SUB_BUCKETS +
+            ((value >> (exponent - LATENCY_SUB_BUCKET_BITS)) & (LATENCY_SUB_BUCKETS - 1)));
+}
+
+static guint64
+latency_histogram_bucket_upper_bound (guint bucket)
+{
+    guint   exponent;
+    guint64 lower;
+
+    if (bucket < LATENCY_SUB_BUCKETS)
+        return bucket;
+
+    exponent = bucket / LATENCY_SUB_BUCKETS + LATENCY_SUB_BUCKET_BITS - 1;
+    lower = ((guint64) (LATENCY_SUB_BUCKETS + bucket % LATENCY_SUB_BUCKETS)) << (exponent - LATENCY_SUB_BUCKET_BITS);
+    return lower + (G_GUINT64_CONSTANT (1) << (exponent - LATENCY_SUB_BUCKET_BITS)) - 1;
+}
+
+static void
+latency_histogram_record (LatencyHistogram *histogram,
+                          guint64           value)
+{
+    guint bucket;
+
+    bucket = latency_histogram_bucket (value);
+    if (histogram->buckets[bucket] == G_MAXUINT32)
+        return;
+
+    histogram->buckets[bucket]++;
+    histogram->count++;
+    histogram->max = MAX (histogram->max, value);
+}
+
+static guint64
+latency_histogram_percentile (const LatencyHistogram *histogram,
+                              guint                   percentile)
+{
+    guint64 target;
+    guint64 accumulated = 0;
+    guint   i;
+
+    if (!histogram->count)
+        return 0;
+
+    target = (histogram->count * percentile + 99) / 100;
+    for (i = 0; i < LATENCY_N_BUCKETS; i++) {
+        accumulated += histogram->buckets[i];
+        if (accumulated >= target)
+            return MIN (latency_histogram_bucket_upper_bound (i), histogram->max);
+    }
+    return histogram->max;
+}
+
+static GVariant *
+latency_histogram_build_variant (const LatencyHistogram *histogram)
+{
+    GVariantBuilder builder;
+    guint           i;
+
+    /* Sparse list of (bucket upper bound, count) */
+    g_variant_builder_init (&builder, G_VARIANT_TYPE ("a(tu)"));
+    for (i = 0; i < LATENCY_N_BUCKETS; i++) {
+        if (histogram->buckets[i])
+            g_variant_builder_add (&builder, "(tu)",
+                                   latency_histogram_bucket_upper_bound (i),
+                                   histogram->buckets[i]);
+    }
+    return g_variant_builder_end (&builder);
+}
+
+/*****************************************************************************/
+/* Entries */
+
+struct _MbimDeviceStatsEntry {
+    /* Key */
+    MbimMessageType        message_type;
+    MbimUuid               service_id;
+    guint32                cid;
+    MbimMessageCommandType command_type;
+
+    /* Counters */
+    guint64 count;
+    guint64 completed;
+    guint64 errors;
+    guint64 timeouts;
+    guint64 aborts;
+    guint64 fragments_in;
+    guint64 bytes_in;
+    guint64 bytes_out;
+
+    /* Microseconds since the request was sent */
+    LatencyHistogram first_fragment_latency;
+    LatencyHistogram complete_latency;
+};
+
+static guint
+stats_entry_hash (gconstpointer v)
+{
+    const MbimDeviceStatsEntry *entry = v;
+
+    return (_mbim_uuid_hash (&entry->service_id) ^
+            entry->cid ^
+            ((guint) entry->command_type << 24) ^
+            entry->message_type);
+}
+
+static gboolean
+stats_entry_equal (gconstpointer a,
+                   gconstpointer b)
+{
+    const MbimDeviceStatsEntry *entry_a = a;
+    const MbimDeviceStatsEntry *entry_b = b;
+
+    return (entry_a->message_type == entry_b->message_type &&
+            entry_a->cid == entry_b->cid &&
+            entry_a->command_type == entry_b->command_type &&
+            _mbim_uuid_equal (&entry_a->service_id, &entry_b->service_id));
+}
+
+static void
+stats_entry_free (MbimDeviceStatsEntry *entry)
+{
+    g_slice_free (MbimDeviceStatsEntry, entry);
+}
+
+static GVariant *
+stats_entry_build_variant (const MbimDeviceStatsEntry *entry)
+{
+    GVariantBuilder  builder;
+    gchar           *service;
+
+    service = mbim_uuid_get_printable (&entry->service_id);
+
+    g_variant_builder_init (&builder, G_VARIANT_TYPE ("a{sv}"));
+    g_variant_builder_add (&builder, "{sv}", "message-type", g_variant_new_uint32 (entry->message_type));
+    g_variant_builder_add (&builder, "{sv}", "service", g_variant_new_string (service));
+    g_variant_builder_add (&builder, "{sv}", "cid", g_variant_new_uint32 (entry->cid));
+    g_variant_builder_add (&builder, "{sv}", "command-type", g_variant_new_uint32 (entry->command_type));
+    g_variant_builder_add (&builder, "{sv}", "count", g_variant_new_uint64 (entry->count));
+    g_variant_builder_add (&builder, "{sv}", "completed", g_variant_new_uint64 (entry->completed));
+    g_variant_builder_add (&builder, "{sv}", "errors", g_variant_new_uint64 (entry->errors));
+    g_variant_builder_add (&builder, "{sv}", "timeouts", g_variant_new_uint64 (entry->timeouts));
+    g_variant_builder_add (&builder, "{sv}", "aborts", g_variant_new_uint64 (entry->aborts));
+    g_variant_builder_add (&builder, "{sv}", "fragments-in", g_variant_new_uint64 (entry->fragments_in));
+    g_variant_builder_add (&builder, "{sv}", "bytes-in", g_variant_new_uint64 (entry->bytes_in));
+    g_variant_builder_add (&builder, "{sv}", "bytes-out", g_variant_new_uint64 (entry->bytes_out));
+    g_variant_builder_add (&builder, "{sv}", "first-fragment-latency",
+                           latency_histogram_build_variant (&entry->first_fragment_latency));
+    g_variant_builder_add (&builder, "{sv}", "complete-latency",
+                           latency_histogram_build_variant (&entry->complete_latency));
+    g_variant_builder_add (&builder, "{sv}", "complete-latency-p50",
+                           g_variant_new_uint64 (latency_histogram_percentile (&entry->complete_latency, 50)));
+    g_variant_builder_add (&builder, "{sv}", "complete-latency-p99",
+                           g_variant_new_uint64 (latency_histogram_percentile (&entry->complete_latency, 99)));
+    g_variant_builder_add (&builder, "{sv}", "complete-latency-max",
+                           g_variant_new_uint64 (entry->complete_latency.max));
+
+    g_free (service);
+    return g_variant_builder_end (&builder);
+}
+
+void
+_mbim_device_stats_entry_transaction (MbimDeviceStatsEntry *entry,
+                                      guint32               bytes_out)
+{
+    entry->count++;
+    entry->bytes_out += bytes_out;
+}
+
+void
+_mbim_device_stats_entry_first_fragment (MbimDeviceStatsEntry *entry,
+                                         guint64               latency_usecs)
+{
+    latency_histogram_record (&entry->first_fragment_latency, latency_usecs);
+}
+
+void
+_mbim_device_stats_entry_complete (MbimDeviceStatsEntry *entry,
+                                   guint                 fragments_in,
+                                   guint64               bytes_in,
+                                   gint64                latency_usecs,
+                                   const GError         *error)
+{
+    entry->fragments_in += fragments_in;
+    entry->bytes_in += bytes_in;
+
+    if (!error) {
+        entry->completed++;
+        if (latency_usecs >= 0)
+            latency_histogram_record (&entry->complete_latency, (guint64) latency_usecs);
+    } else if (g_error_matches (error, MBIM_CORE_ERROR, MBIM_CORE_ERROR_TIMEOUT))
+        entry->timeouts++;
+    else if (g_error_matches (error, MBIM_CORE_ERROR, MBIM_CORE_ERROR_ABORTED))
+        entry->aborts++;
+    else
+        entry->errors++;
+}
+
+/*****************************************************************************/
+
+struct _MbimDeviceStats {
+    /* MbimDeviceStatsEntry -> MbimDeviceStatsEntry */
+    GHashTable *entries;
+    /* MbimDeviceStatsEntry items, in the order they were added */
+    GPtrArray  *order;
+
+    /* Device-wide counters */
+    guint64     messages_in;
+    guint64     messages_out;
+    guint64     bytes_in;
+    guint64     bytes_out;
+    guint64     unmatched;
+};
+
+MbimDeviceStats *
+_mbim_device_stats_new (void)
+{
+    MbimDeviceStats *stats;
+
+    stats = g_slice_new0 (MbimDeviceStats);
+    stats->entries = g_hash_table_new (stats_entry_hash, stats_entry_equal);
+    stats->order = g_ptr_array_new_with_free_func ((GDestroyNotify) stats_entry_free);
+    return stats;
+}
+
+void
+_mbim_device_stats_free (MbimDeviceStats *stats)
+{
+    g_hash_table_unref (stats->entries);
+    g_ptr_array_unref (stats->order);
+    g_slice_free (MbimDeviceStats, stats);
+}
+
+void
+_mbim_device_stats_message_in (MbimDeviceStats *stats,
+                               guint32          length)
+{
+    stats->messages_in++;
+    stats->bytes_in += length;
+}
+
+void
+_mbim_device_stats_message_out (MbimDeviceStats *stats,
+                                guint32          length)
+{
+    stats->messages_out++;
+    stats->bytes_out += length;
+}
+
+void
+_mbim_device_stats_unmatched (MbimDeviceStats *stats)
+{
+    stats->unmatched++;
+}
+
+MbimDeviceStatsEntry *
+_mbim_device_stats_get_entry (MbimDeviceStats   *stats,
+                              const MbimMessage *message)
+{
+    MbimDeviceStatsEntry  lookup = { 0 };
+    MbimDeviceStatsEntry *entry;
+
+    lookup.message_type = MBIM_MESSAGE_GET_MESSAGE_TYPE (message);
+    switch (lookup.message_type) {
+    case MBIM_MESSAGE_TYPE_COMMAND:
+        memcpy (&lookup.service_id, mbim_message_command_get_service_id (message), sizeof (MbimUuid));
+        lookup.cid = mbim_message_command_get_cid (message);
+        lookup.command_type = mbim_message_command_get_command_type (message);
+        break;
+    case MBIM_MESSAGE_TYPE_INDICATE_STATUS:
+        memcpy (&lookup.service_id, mbim_message_indicate_status_get_service_id (message), sizeof (MbimUuid));
+        lookup.cid = mbim_message_indicate_status_get_cid (message);
+        lookup.command_type = MBIM_MESSAGE_COMMAND_TYPE_UNKNOWN;
+        break;
+    default:
+        memcpy (&lookup.service_id, MBIM_UUID_INVALID, sizeof (MbimUuid));
+        lookup.command_type = MBIM_MESSAGE_COMMAND_TYPE_UNKNOWN;
+        break;
+    }
+
+    entry = g_hash_table_lookup (stats->entries, &lookup);
+    if (!entry) {
+        entry = g_slice_dup (MbimDeviceStatsEntry, &lookup);
+        g_hash_table_insert (stats->entries, entry, entry);
+        g_ptr_array_add (stats->order, entry);
+    }
+    return entry;
+}
+
+GVariant *
+_mbim_device_stats_build_variant (MbimDeviceStats *stats)
+{
+    GVariantBuilder builder;
+    GVariantBuilder transactions;
+    guint           i;
+
+    g_variant_builder_init (&transactions, G_VARIANT_TYPE ("aa{sv}"));
+    for (i = 0; i < stats->order->len; i++)
+        g_variant_builder_add_value (&transactions,
+                                     stats_entry_build_variant (g_ptr_array_index (stats->order, i)));
+
+    g_variant_builder_init (&builder, G_VARIANT_TYPE ("a{sv}"));
+    g_variant_builder_add (&builder, "{sv}", "messages-in", g_variant_new_uint64 (stats->messages_in));
+    g_variant_builder_add (&builder, "{sv}", "messages-out", g_variant_new_uint64 (stats->messages_out));
+    g_variant_builder_add (&builder, "{sv}", "bytes-in", g_variant_new_uint64 (stats->bytes_in));
+    g_variant_builder_add (&builder, "{sv}", "bytes-out", g_variant_new_uint64 (stats->bytes_out));
+    g_variant_builder_add (&builder, "{sv}", "unmatched", g_variant_new_uint64 (stats->unmatched));
+    g_variant_builder_add (&builder, "{sv}", "transactions", g_variant_builder_end (&transactions));
+
+    return g_variant_ref_sink (g_variant_builder_end (&builder));
+}
@@ -0,0 +1,67 @@
+/* -*- Mode: C; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*- */
+
+/*
+ * libmbim-glib -- GLib/GIO based library to control MBIM devices
+ *
+ * This library is free software; you can redistribute it and/or
+ * modify it under the terms of the GNU Lesser General Public
+ * License as published by the Free Software Foundation; either
+ * version 2 of the License, or (at your option) any later version.
+ *
+ * This library is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ * Lesser General Public License for more details.
+ *
+ * You should have received a copy of the GNU Lesser General Public
+ * License along with this library; if not, write to the
+ * Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor,
+ * Boston, MA 02110-1301 USA.
+ *
+ * Copyright (C) 2026 The libmbim authors
+ *
+ * This is a private non-installed header
+ */
+
+#ifndef _LIBMBIM_GLIB_MBIM_DEVICE_STATS_H_
+#define _LIBMBIM_GLIB_MBIM_DEVICE_STATS_H_
+
+#if !defined (LIBMBIM_GLIB_COMPILATION)
+#error "This is a private header!!"
+#endif
+
+#include <glib.h>
+
+#include "mbim-message.h"
+
+G_BEGIN_DECLS
+
+typedef struct _MbimDeviceStats      MbimDeviceStats;
+typedef struct _MbimDeviceStatsEntry MbimDeviceStatsEntry;
+
+MbimDeviceStats      *_mbim_device_stats_new                  (void);
+void                  _mbim_device_stats_free                 (MbimDeviceStats      *stats);
+void                  _mbim_device_stats_message_in           (MbimDeviceStats      *stats,
+                                                               guint32               length);
+void                  _mbim_device_stats_message_out          (MbimDeviceStats      *stats,
+                                                               guint32               length);
+void                  _mbim_device_stats_unmatched            (MbimDeviceStats      *stats);
+GVariant             *_mbim_device_stats_build_variant        (MbimDeviceStats      *stats);
+
+/* Entries are kept per message type, service, CID and command type */
+MbimDeviceStatsEntry *_mbim_device_stats_get_entry            (MbimDeviceStats      *stats,
+                                                               const MbimMessage    *message);
+void                  _mbim_device_stats_entry_transaction    (MbimDeviceStatsEntry *entry,
+                                                               guint32               bytes_out);
+void                  _mbim_device_stats_entry_first_fragment (MbimDeviceStatsEntry *entry,
+                                                               guint64               latency_usecs);
+/* A negative latency is given for transactions without request, i.e. indications */
+void                  _mbim_device_stats_entry_complete       (MbimDeviceStatsEntry *entry,
+                                                               guint                 fragments_in,
+                                                               guint64               bytes_in,
+                                                               gint64                latency_usecs,
+                                                               const GError         *error);
+
+G_END_DECLS
+
+#endif /* _LIBMBIM_GLIB_MBIM_DEVICE_STATS_H_ */
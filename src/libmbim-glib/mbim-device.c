@@ -35,19 +35,24 @@
 #include <unistd.h>
 #include <gio/gio.h>
 #include <gio/gunixsocketaddress.h>
+#include <glib-unix.h>
 #include <sys/ioctl.h>
+#include <sys/stat.h>
 #define IOCTL_WDM_MAX_COMMAND _IOR('H', 0xA0, guint16)
 
-#define OPEN_RETRY_TIMEOUT_SECS 5
+#define OPEN_RETRY_TIMEOUT_MIN_SECS 1
+#define OPEN_RETRY_TIMEOUT_MAX_SECS 8
 #define OPEN_CLOSE_TIMEOUT_SECS 2
 
 #if defined WITH_UDEV
 # include <gudev/gudev.h>
 #endif
 
-#include "mbim-common.h"
 #include "mbim-utils.h"
+#include "mbim-trace.h"
+#include "mbim-probe.h"
 #include "mbim-device.h"
+#include "mbim-device-stats.h"
 #include "mbim-message.h"
 #include "mbim-message-private.h"
 #include "mbim-error-types.h"
@@ -76,6 +81,10 @@ enum {
     PROP_FILE,
     PROP_TRANSACTION_ID,
     PROP_IN_SESSION,
+    PROP_MAX_CONTROL_MESSAGE,
+    PROP_MAX_SEGMENT_SIZE,
+    PROP_NETWORK_CAPABILITIES,
+    PROP_STATISTICS,
     PROP_LAST
 };
 
@@ -111,6 +120,7 @@ struct _MbimDevicePrivate {
     /* I/O channel, set when the file is open */
     GIOChannel *iochannel;
     GSource *iochannel_source;
+    GMainContext *main_context;
     GByteArray *response;
     OpenStatus open_status;
     guint32 open_transaction_id;
@@ -128,14 +138,32 @@ struct _MbimDevicePrivate {
     /* Transaction ID in the device */
     guint32 transaction_id;
 
+    /* Protects main_context and transaction_id, which may be used from any
+     * thread issuing synchronous commands, and the functional descriptor
+     * fields, which may be read from any thread */
+    GMutex lock;
+
     /* Flag to specify whether we're in a session */
     gboolean in_session;
 
     /* message size */
     guint16 max_control_transfer;
+
+    /* MBIM functional descriptor, 0 if unknown */
+    guint16  max_control_message;
+    guint16  max_segment_size;
+    guint8   network_capabilities;
+
+    /* Statistics */
+    MbimDeviceStats *stats;
+
+    /* Probes, NULL if none */
+    MbimProbeList *probes;
 };
 
 #define MAX_SPAWN_RETRIES             10
+#define SPAWN_RETRY_TIMEOUT_MS        100
+#define PROXY_READY_TIMEOUT_SECS      5
 #define MAX_CONTROL_TRANSFER          4096
 #define MAX_TIME_BETWEEN_FRAGMENTS_MS 1250
 
@@ -160,6 +188,12 @@ typedef struct {
     GCancellable           *cancellable;
     gulong                  cancellable_id;
     TransactionWaitContext *wait_ctx;
+
+    /* Statistics; the entry is set only for host transactions */
+    MbimDeviceStatsEntry   *stats_entry;
+    gint64                  send_time;
+    guint                   n_fragments;
+    guint64                 bytes_in;
 } TransactionContext;
 
 static void
@@ -229,6 +263,50 @@ transaction_task_new (MbimDevice          *self,
     return task;
 }
 
+static void
+transaction_task_received (GTask             *task,
+                           const MbimMessage *message)
+{
+    TransactionContext *ctx;
+
+    ctx = g_task_get_task_data (task);
+
+    ctx->n_fragments++;
+    ctx->bytes_in += mbim_message_get_message_length (message);
+
+    if (ctx->n_fragments == 1 && ctx->stats_entry)
+        _mbim_device_stats_entry_first_fragment (ctx->stats_entry,
+                                                 g_get_monotonic_time () - ctx->send_time);
+}
+
+static void
+transaction_task_stats (GTask        *task,
+                        const GError *error)
+{
+    MbimDevice           *self;
+    TransactionContext   *ctx;
+    MbimDeviceStatsEntry *entry;
+
+    self = g_task_get_source_object (task);
+    ctx = g_task_get_task_data (task);
+
+    if (!ctx->stats_entry) {
+        /* Indications are accounted once fully received */
+        if (error || ctx->type != MBIM_MESSAGE_TYPE_INDICATE_STATUS || !ctx->fragments)
+            return;
+        entry = _mbim_device_stats_get_entry (self->priv->stats, ctx->fragments);
+        _mbim_device_stats_entry_transaction (entry, 0);
+        _mbim_device_stats_entry_complete (entry, ctx->n_fragments, ctx->bytes_in, -1, NULL);
+        return;
+    }
+
+    _mbim_device_stats_entry_complete (ctx->stats_entry,
+                                       ctx->n_fragments,
+                                       ctx->bytes_in,
+                                       g_get_monotonic_time () - ctx->send_time,
+                                       error);
+}
+
 static void
 transaction_task_complete_and_free (GTask        *task,
                                     const GError *error)
@@ -237,6 +315,8 @@ transaction_task_complete_and_free (GTask        *task,
 
     ctx = g_task_get_task_data (task);
 
+    transaction_task_stats (task, error);
+
     if (error) {
         transaction_task_trace (task, "complete: error");
         g_task_return_error (task, g_error_copy (error));
@@ -506,6 +586,8 @@ indication_ready (MbimDevice   *self,
         return;
     }
 
+    _mbim_probe (self->priv->probes, MBIM_PROBE_POINT_INDICATION_DISPATCHED,
+                 ((const GByteArray *) indication)->data, ((const GByteArray *) indication)->len);
     g_signal_emit (self, signals[SIGNAL_INDICATE_STATUS], 0, indication);
     mbim_message_unref (indication);
 }
@@ -546,30 +628,16 @@ process_message (MbimDevice        *self,
     is_partial_fragment = (_mbim_message_is_fragment (message) &&
                            _mbim_message_fragment_get_total (message) > 1);
 
-    if (mbim_utils_get_traces_enabled ()) {
-        gchar *printable;
+    _mbim_device_stats_message_in (self->priv->stats, mbim_message_get_message_length (message));
 
-        printable = mbim_common_str_hex (((GByteArray *)message)->data,
-                                         ((GByteArray *)message)->len,
-                                         ':');
-        g_debug ("[%s] Received message...%s\n"
-                 ">>>>>> RAW:\n"
-                 ">>>>>>   length = %u\n"
-                 ">>>>>>   data   = %s\n",
-                 self->priv->path_display,
-                 is_partial_fragment ? " (partial fragment)" : "",
-                 ((GByteArray *)message)->len,
-                 printable);
-        g_free (printable);
-
-        if (is_partial_fragment) {
-            printable = mbim_message_get_printable (message, ">>>>>> ", TRUE);
-            g_debug ("[%s] Received message fragment (translated)...\n%s",
+    _mbim_probe (self->priv->probes, MBIM_PROBE_POINT_MESSAGE_RECEIVED,
+                 ((const GByteArray *) message)->data, mbim_message_get_message_length (message));
+
+    if (_mbim_trace_enabled (self->priv->path, message))
+        _mbim_trace (MBIM_TRACE_EVENT_TYPE_RECEIVED,
+                     self->priv->path,
                      self->priv->path_display,
-                     printable);
-            g_free (printable);
-        }
-    }
+                     message);
 
     switch (MBIM_MESSAGE_GET_MESSAGE_TYPE (message)) {
     case MBIM_MESSAGE_TYPE_OPEN_DONE:
@@ -595,6 +663,8 @@ process_message (MbimDevice        *self,
                                              NULL, /* no cancellable */
                                              (GAsyncReadyCallback) indication_ready,
                                              NULL);
+
+            transaction_task_received (task, message);
         } else {
             /* Grab transaction. This is a _DONE message, so look for the request
              * that generated the _DONE */
@@ -605,6 +675,7 @@ process_message (MbimDevice        *self,
             if (!task) {
                 gchar *printable;
 
+                _mbim_device_stats_unmatched (self->priv->stats);
                 g_debug ("[%s] No transaction matched in received message",
                          self->priv->path_display);
                 /* Attempt to print a user friendly dump of the packet anyway */
@@ -626,11 +697,17 @@ process_message (MbimDevice        *self,
                 return;
             }
 
+            _mbim_probe (self->priv->probes, MBIM_PROBE_POINT_TRANSACTION_MATCHED,
+                         ((const GByteArray *) message)->data, mbim_message_get_message_length (message));
+            transaction_task_received (task, message);
+
             /* If the message doesn't have fragments, we're done */
             if (!_mbim_message_is_fragment (message)) {
                 ctx = g_task_get_task_data (task);
                 g_assert (ctx->fragments == NULL);
                 ctx->fragments = mbim_message_dup (message);
+                _mbim_probe (self->priv->probes, MBIM_PROBE_POINT_MESSAGE_COMPLETED,
+                             ((const GByteArray *) message)->data, mbim_message_get_message_length (message));
                 transaction_task_complete_and_free (task, NULL);
                 return;
             }
@@ -650,18 +727,20 @@ process_message (MbimDevice        *self,
             return;
         }
 
+        _mbim_probe (self->priv->probes, MBIM_PROBE_POINT_FRAGMENT_ADDED,
+                     ((const GByteArray *) message)->data, mbim_message_get_message_length (message));
+
         /* Did we get all needed fragments? */
         if (_mbim_message_fragment_collector_complete (ctx->fragments)) {
-            /* Now, translate the whole message */
-            if (mbim_utils_get_traces_enabled ()) {
-                gchar *printable;
+            _mbim_probe (self->priv->probes, MBIM_PROBE_POINT_MESSAGE_COMPLETED,
+                         ((const GByteArray *) ctx->fragments)->data, ((const GByteArray *) ctx->fragments)->len);
 
-                printable = mbim_message_get_printable (ctx->fragments, ">>>>>> ", FALSE);
-                g_debug ("[%s] Received message (translated)...\n%s",
-                         self->priv->path_display,
-                         printable);
-                g_free (printable);
-            }
+            /* Now, translate the whole message */
+            if (_mbim_trace_enabled (self->priv->path, ctx->fragments))
+                _mbim_trace (MBIM_TRACE_EVENT_TYPE_RECEIVED_COMPLETE,
+                             self->priv->path,
+                             self->priv->path_display,
+                             ctx->fragments);
 
             transaction_task_complete_and_free (task, NULL);
             return;
@@ -686,19 +765,24 @@ process_message (MbimDevice        *self,
                                            MBIM_MESSAGE_TYPE_INVALID,
                                            mbim_message_get_transaction_id (message));
 
-        if (!task)
+        if (!task) {
+            _mbim_device_stats_unmatched (self->priv->stats);
             g_debug ("[%s] No transaction matched in received function error message",
                      self->priv->path_display);
+        } else {
+            _mbim_probe (self->priv->probes, MBIM_PROBE_POINT_TRANSACTION_MATCHED,
+                         ((const GByteArray *) message)->data, mbim_message_get_message_length (message));
+            transaction_task_received (task, message);
+        }
 
-        if (mbim_utils_get_traces_enabled ()) {
-            gchar *printable;
+        _mbim_probe (self->priv->probes, MBIM_PROBE_POINT_MESSAGE_COMPLETED,
+                     ((const GByteArray *) message)->data, mbim_message_get_message_length (message));
 
-            printable = mbim_message_get_printable (message, ">>>>>> ", FALSE);
-            g_debug ("[%s] Received message (translated)...\n%s",
-                     self->priv->path_display,
-                     printable);
-            g_free (printable);
-        }
+        if (_mbim_trace_enabled (self->priv->path, message))
+            _mbim_trace (MBIM_TRACE_EVENT_TYPE_RECEIVED_COMPLETE,
+                         self->priv->path,
+                         self->priv->path_display,
+                         message);
 
         /* Signals are emitted regardless of whether the transaction matched or not */
         error_indication = mbim_message_error_get_error (message);
@@ -856,7 +940,8 @@ struct usb_cdc_mbim_desc {
 #if defined WITH_UDEV
 
 static gchar *
-get_descriptors_filepath (MbimDevice *self)
+get_descriptors_filepath (const gchar *path,
+                          const gchar *path_display)
 {
     GUdevClient *client;
     GUdevDevice *device = NULL;
@@ -868,7 +953,7 @@ get_descriptors_filepath (MbimDevice *self)
     client = g_udev_client_new (NULL);
     if (!G_UDEV_IS_CLIENT (client)) {
         g_warning ("[%s] Couldn't get udev client",
-                   self->priv->path_display);
+                   path_display);
         goto out;
     }
 
@@ -884,13 +969,13 @@ get_descriptors_filepath (MbimDevice *self)
      *   Which is the one with the descriptors file.
      */
 
-    device_basename = g_path_get_basename (self->priv->path);
+    device_basename = g_path_get_basename (path);
     device = g_udev_client_query_by_subsystem_and_name (client, "usb", device_basename);
     if (!device) {
         device = g_udev_client_query_by_subsystem_and_name (client, "usbmisc", device_basename);
         if (!device) {
             g_warning ("[%s] Couldn't find udev device",
-                       self->priv->path_display);
+                       path_display);
             goto out;
         }
     }
@@ -898,14 +983,14 @@ get_descriptors_filepath (MbimDevice *self)
     parent_device = g_udev_device_get_parent (device);
     if (!parent_device) {
         g_warning ("[%s] Couldn't find parent udev device",
-                   self->priv->path_display);
+                   path_display);
         goto out;
     }
 
     grandparent_device = g_udev_device_get_parent (parent_device);
     if (!grandparent_device) {
         g_warning ("[%s] Couldn't find grandparent udev device",
-                   self->priv->path_display);
+                   path_display);
         goto out;
     }
 
@@ -931,18 +1016,19 @@ out:
 #else
 
 static gchar *
-get_descriptors_filepath (MbimDevice *self)
+get_descriptors_filepath (const gchar *path,
+                          const gchar *path_display)
 {
     static const gchar *subsystems[] = { "usbmisc", "usb" };
     guint i;
     gchar *device_basename;
     gchar *descriptors_path = NULL;
 
-    device_basename = g_path_get_basename (self->priv->path);
+    device_basename = g_path_get_basename (path);
 
     for (i = 0; !descriptors_path && i < G_N_ELEMENTS (subsystems); i++) {
         gchar *tmp;
-        gchar *path;
+        gchar *real_path;
 
         /* parent sysfs can be built directly using subsystem and name; e.g. for subsystem
          * usbmisc and name cdc-wdm0:
@@ -950,28 +1036,28 @@ get_descriptors_filepath (MbimDevice *self)
          *    /sys/devices/pci0000:00/0000:00:1d.0/usb2/2-1/2-1.5/2-1.5:2.0
          */
         tmp = g_strdup_printf ("/sys/class/%s/%s/device", subsystems[i], device_basename);
-        path = realpath (tmp, NULL);
+        real_path = realpath (tmp, NULL);
         g_free (tmp);
 
-        if (g_file_test (path, G_FILE_TEST_EXISTS)) {
+        if (real_path && g_file_test (real_path, G_FILE_TEST_EXISTS)) {
             /* Now look for the parent dir with descriptors file. */
             gchar *dirname;
 
-            dirname = g_path_get_dirname (path);
+            dirname = g_path_get_dirname (real_path);
             descriptors_path = g_build_path (G_DIR_SEPARATOR_S,
                                              dirname,
                                              "descriptors",
                                              NULL);
             g_free (dirname);
         }
-        g_free (path);
+        g_free (real_path);
     }
 
     g_free (device_basename);
 
     if (descriptors_path && !g_file_test (descriptors_path, G_FILE_TEST_EXISTS)) {
         g_warning ("[%s] Descriptors file doesn't exist",
-                   self->priv->path_display);
+                   path_display);
         g_free (descriptors_path);
         descriptors_path = NULL;
     }
@@ -981,70 +1067,319 @@ get_descriptors_filepath (MbimDevice *self)
 
 #endif
 
-static guint16
-read_max_control_transfer (MbimDevice *self)
+typedef struct {
+    guint16 max_control_message;
+    guint16 max_segment_size;
+    guint8  network_capabilities;
+} FunctionalDescriptor;
+
+gboolean
+_mbim_device_read_functional_descriptor (const gchar  *descriptors_path,
+                                         const gchar  *path_display,
+                                         guint16      *max_control_message,
+                                         guint16      *max_segment_size,
+                                         guint8       *network_capabilities,
+                                         GError      **error)
 {
     static const guint8 mbim_signature[4] = { 0x0c, 0x24, 0x1b, 0x00 };
-    guint16 max = MAX_CONTROL_TRANSFER;
-    gchar *descriptors_path = NULL;
-    GError *error = NULL;
     gchar *contents = NULL;
     gsize length = 0;
-    guint i;
-
-    /* Build descriptors filepath */
-    descriptors_path = get_descriptors_filepath (self);
-    if (!descriptors_path) {
-        g_warning ("[%s] Couldn't get descriptors file path",
-                   self->priv->path_display);
-        goto out;
-    }
+    gsize i;
 
-    if (!g_file_get_contents (descriptors_path,
-                              &contents,
-                              &length,
-                              &error)) {
-        g_warning ("[%s] Couldn't read descriptors file: %s",
-                   self->priv->path_display,
-                   error->message);
-        g_error_free (error);
-        goto out;
+    if (!g_file_get_contents (descriptors_path, &contents, &length, error)) {
+        g_prefix_error (error, "Couldn't read descriptors file: ");
+        return FALSE;
     }
 
     i = 0;
-    while (i <= (length - sizeof (struct usb_cdc_mbim_desc))) {
+    while (length >= sizeof (struct usb_cdc_mbim_desc) &&
+           i <= (length - sizeof (struct usb_cdc_mbim_desc))) {
         /* Try to match the MBIM descriptor signature */
         if ((memcmp (&contents[i], mbim_signature, sizeof (mbim_signature)) == 0)) {
+            const struct usb_cdc_mbim_desc *desc;
+
             /* Found! */
-            max = GUINT16_FROM_LE (((struct usb_cdc_mbim_desc *)&contents[i])->wMaxControlMessage);
+            desc = (const struct usb_cdc_mbim_desc *)&contents[i];
+            *max_control_message = GUINT16_FROM_LE (desc->wMaxControlMessage);
+            *max_segment_size = GUINT16_FROM_LE (desc->wMaxSegmentSize);
+            *network_capabilities = desc->bmNetworkCapabilities;
             g_debug ("[%s] Read max control message size from descriptors file: %" G_GUINT16_FORMAT,
-                     self->priv->path_display,
-                     max);
-            goto out;
+                     path_display,
+                     *max_control_message);
+            g_free (contents);
+            return TRUE;
         }
 
         /* The first byte of the descriptor info is the length; so keep on
          * skipping descriptors until we match the MBIM one */
-        i += contents[i];
+        if (!contents[i])
+            break;
+        i += (guint8) contents[i];
     }
 
-    g_warning ("[%s] Couldn't find MBIM signature in descriptors file",
-               self->priv->path_display);
+    g_free (contents);
+    g_set_error (error,
+                 MBIM_CORE_ERROR,
+                 MBIM_CORE_ERROR_FAILED,
+                 "Couldn't find MBIM signature in descriptors file");
+    return FALSE;
+}
+
+/*****************************************************************************/
+/* Process-wide cache of functional descriptors
+ *
+ * Resolving the descriptors file through udev and parsing it is slow, and
+ * needed on every open. Entries are keyed by device path, and are only
+ * valid while both the device node and the sysfs descriptors file are the
+ * same ones (inode and mtime) seen when the entry was added, so a device
+ * re-enumerated under the same name is probed again. */
+
+typedef struct {
+    gchar                *descriptors_path;
+    dev_t                 device_rdev;
+    ino_t                 device_ino;
+    ino_t                 descriptors_ino;
+    time_t                descriptors_mtime;
+    FunctionalDescriptor  functional;
+} DescriptorsCacheEntry;
+
+G_LOCK_DEFINE_STATIC (descriptors_cache);
+static GHashTable *descriptors_cache;
+
+static void
+descriptors_cache_entry_free (DescriptorsCacheEntry *entry)
+{
+    g_free (entry->descriptors_path);
+    g_slice_free (DescriptorsCacheEntry, entry);
+}
+
+static gboolean
+descriptors_cache_lookup (const gchar          *path,
+                          FunctionalDescriptor *functional)
+{
+    DescriptorsCacheEntry *entry;
+    struct stat device_st;
+    struct stat descriptors_st;
+    gboolean found = FALSE;
+
+    G_LOCK (descriptors_cache);
+
+    if (!descriptors_cache)
+        goto out;
+
+    entry = g_hash_table_lookup (descriptors_cache, path);
+    if (!entry)
+        goto out;
+
+    if (stat (path, &device_st) == 0 &&
+        stat (entry->descriptors_path, &descriptors_st) == 0 &&
+        device_st.st_rdev == entry->device_rdev &&
+        device_st.st_ino == entry->device_ino &&
+        descriptors_st.st_ino == entry->descriptors_ino &&
+        descriptors_st.st_mtime == entry->descriptors_mtime) {
+        *functional = entry->functional;
+        found = TRUE;
+    } else
+        g_hash_table_remove (descriptors_cache, path);
 
 out:
-    g_free (contents);
+    G_UNLOCK (descriptors_cache);
+    return found;
+}
+
+static void
+descriptors_cache_add (const gchar                *path,
+                       const gchar                *descriptors_path,
+                       const struct stat          *device_st,
+                       const struct stat          *descriptors_st,
+                       const FunctionalDescriptor *functional)
+{
+    DescriptorsCacheEntry *entry;
+
+    entry = g_slice_new (DescriptorsCacheEntry);
+    entry->descriptors_path = g_strdup (descriptors_path);
+    entry->device_rdev = device_st->st_rdev;
+    entry->device_ino = device_st->st_ino;
+    entry->descriptors_ino = descriptors_st->st_ino;
+    entry->descriptors_mtime = descriptors_st->st_mtime;
+    entry->functional = *functional;
+
+    G_LOCK (descriptors_cache);
+    if (!descriptors_cache)
+        descriptors_cache = g_hash_table_new_full (g_str_hash,
+                                                   g_str_equal,
+                                                   g_free,
+                                                   (GDestroyNotify)descriptors_cache_entry_free);
+    g_hash_table_replace (descriptors_cache, g_strdup (path), entry);
+    G_UNLOCK (descriptors_cache);
+}
+
+/*****************************************************************************/
+/* Functional descriptor probing
+ *
+ * udev queries and sysfs reads may block, so they run in a worker thread
+ * and never in the main loop. */
+
+typedef struct {
+    gchar *path;
+    gchar *path_display;
+} ProbeDescriptorsContext;
+
+static void
+probe_descriptors_context_free (ProbeDescriptorsContext *ctx)
+{
+    g_free (ctx->path);
+    g_free (ctx->path_display);
+    g_slice_free (ProbeDescriptorsContext, ctx);
+}
+
+static void
+probe_descriptors_thread (GTask                   *task,
+                          gpointer                 source_object,
+                          ProbeDescriptorsContext *ctx,
+                          GCancellable            *cancellable)
+{
+    FunctionalDescriptor *functional;
+    gchar *descriptors_path;
+    struct stat device_st;
+    struct stat descriptors_st;
+    GError *error = NULL;
+
+    functional = g_new0 (FunctionalDescriptor, 1);
+    if (descriptors_cache_lookup (ctx->path, functional)) {
+        g_debug ("[%s] Using cached functional descriptor", ctx->path_display);
+        g_task_return_pointer (task, functional, g_free);
+        return;
+    }
+
+    /* Build descriptors filepath */
+    descriptors_path = get_descriptors_filepath (ctx->path, ctx->path_display);
+    if (!descriptors_path) {
+        g_free (functional);
+        g_task_return_new_error (task,
+                                 MBIM_CORE_ERROR,
+                                 MBIM_CORE_ERROR_FAILED,
+                                 "Couldn't get descriptors file path");
+        return;
+    }
+
+    /* Stat before reading, so that a file updated meanwhile is never cached
+     * with stale contents */
+    if (stat (ctx->path, &device_st) < 0 || stat (descriptors_path, &descriptors_st) < 0) {
+        g_free (functional);
+        g_task_return_new_error (task,
+                                 MBIM_CORE_ERROR,
+                                 MBIM_CORE_ERROR_FAILED,
+                                 "Couldn't stat descriptors file: %s",
+                                 g_strerror (errno));
+        g_free (descriptors_path);
+        return;
+    }
+
+    if (!_mbim_device_read_functional_descriptor (descriptors_path,
+                                                  ctx->path_display,
+                                                  &functional->max_control_message,
+                                                  &functional->max_segment_size,
+                                                  &functional->network_capabilities,
+                                                  &error)) {
+        g_free (functional);
+        g_task_return_error (task, error);
+        g_free (descriptors_path);
+        return;
+    }
+
+    descriptors_cache_add (ctx->path, descriptors_path, &device_st, &descriptors_st, functional);
     g_free (descriptors_path);
+    g_task_return_pointer (task, functional, g_free);
+}
+
+static gboolean
+probe_descriptors_finish (MbimDevice    *self,
+                          GAsyncResult  *res,
+                          GError       **error)
+{
+    FunctionalDescriptor *functional;
+
+    gboolean max_control_message_changed;
+    gboolean max_segment_size_changed;
+    gboolean network_capabilities_changed;
+
+    functional = g_task_propagate_pointer (G_TASK (res), error);
+    if (!functional)
+        return FALSE;
 
-    return max;
+    g_mutex_lock (&self->priv->lock);
+    max_control_message_changed = (self->priv->max_control_message != functional->max_control_message);
+    self->priv->max_control_message = functional->max_control_message;
+    max_segment_size_changed = (self->priv->max_segment_size != functional->max_segment_size);
+    self->priv->max_segment_size = functional->max_segment_size;
+    network_capabilities_changed = (self->priv->network_capabilities != functional->network_capabilities);
+    self->priv->network_capabilities = functional->network_capabilities;
+    g_mutex_unlock (&self->priv->lock);
+
+    /* Notified without the lock held, handlers may read the properties */
+    g_object_freeze_notify (G_OBJECT (self));
+    if (max_control_message_changed)
+        g_object_notify_by_pspec (G_OBJECT (self), properties[PROP_MAX_CONTROL_MESSAGE]);
+    if (max_segment_size_changed)
+        g_object_notify_by_pspec (G_OBJECT (self), properties[PROP_MAX_SEGMENT_SIZE]);
+    if (network_capabilities_changed)
+        g_object_notify_by_pspec (G_OBJECT (self), properties[PROP_NETWORK_CAPABILITIES]);
+    g_object_thaw_notify (G_OBJECT (self));
+
+    g_free (functional);
+    return TRUE;
+}
+
+static void
+probe_descriptors (MbimDevice          *self,
+                   GAsyncReadyCallback  callback,
+                   gpointer             user_data)
+{
+    ProbeDescriptorsContext *ctx;
+    GTask *task;
+
+    ctx = g_slice_new (ProbeDescriptorsContext);
+    ctx->path = g_strdup (self->priv->path);
+    ctx->path_display = g_strdup (self->priv->path_display);
+
+    task = g_task_new (self, NULL, callback, user_data);
+    g_task_set_task_data (task, ctx, (GDestroyNotify)probe_descriptors_context_free);
+    g_task_run_in_thread (task, (GTaskThreadFunc)probe_descriptors_thread);
+    g_object_unref (task);
 }
 
 typedef struct {
-    guint spawn_retries;
+    guint    spawn_retries;
+    /* Readiness notification from a spawned mbim-proxy */
+    gint     ready_fd;
+    GSource *ready_source;
+    GSource *ready_timeout_source;
 } CreateIoChannelContext;
 
+static void
+create_iochannel_context_stop_waiting_ready (CreateIoChannelContext *ctx)
+{
+    if (ctx->ready_source) {
+        g_source_destroy (ctx->ready_source);
+        g_source_unref (ctx->ready_source);
+        ctx->ready_source = NULL;
+    }
+    if (ctx->ready_timeout_source) {
+        g_source_destroy (ctx->ready_timeout_source);
+        g_source_unref (ctx->ready_timeout_source);
+        ctx->ready_timeout_source = NULL;
+    }
+    if (ctx->ready_fd >= 0) {
+        close (ctx->ready_fd);
+        ctx->ready_fd = -1;
+    }
+}
+
 static void
 create_iochannel_context_free (CreateIoChannelContext *ctx)
 {
+    create_iochannel_context_stop_waiting_ready (ctx);
     g_slice_free (CreateIoChannelContext, ctx);
 }
 
@@ -1095,10 +1430,42 @@ setup_iochannel (GTask *task)
                            NULL);
     g_source_attach (self->priv->iochannel_source, g_main_context_get_thread_default ());
 
+    /* Keep track of the context processing the device, synchronous commands
+     * from other threads are scheduled in it */
+    g_mutex_lock (&self->priv->lock);
+    if (self->priv->main_context)
+        g_main_context_unref (self->priv->main_context);
+    self->priv->main_context = g_main_context_ref_thread_default ();
+    g_mutex_unlock (&self->priv->lock);
+
     g_task_return_boolean (task, TRUE);
     g_object_unref (task);
 }
 
+static void
+iochannel_probe_descriptors_ready (MbimDevice   *self,
+                                   GAsyncResult *res,
+                                   GTask        *task)
+{
+    GError *error = NULL;
+
+    if (!probe_descriptors_finish (self, res, &error)) {
+        /* Only a problem if the message size wasn't queried some other way */
+        if (!self->priv->max_control_transfer)
+            g_warning ("[%s] %s", self->priv->path_display, error->message);
+        else
+            g_debug ("[%s] %s", self->priv->path_display, error->message);
+        g_error_free (error);
+    }
+
+    if (!self->priv->max_control_transfer)
+        self->priv->max_control_transfer = (self->priv->max_control_message ?
+                                            self->priv->max_control_message :
+                                            MAX_CONTROL_TRANSFER);
+
+    setup_iochannel (task);
+}
+
 static void
 create_iochannel_with_fd (GTask *task)
 {
@@ -1120,25 +1487,27 @@ create_iochannel_with_fd (GTask *task)
         return;
     }
 
+    /* Create new GIOChannel */
+    self->priv->iochannel = g_io_channel_unix_new (fd);
+
     /* Query message size */
     if (ioctl (fd, IOCTL_WDM_MAX_COMMAND, &max) < 0) {
         g_debug ("[%s] Couldn't query maximum message size: "
                  "IOCTL_WDM_MAX_COMMAND failed: %s",
                  self->priv->path_display,
                  strerror (errno));
-        /* Fallback, try to read the descriptor file */
-        max = read_max_control_transfer (self);
+        /* Fallback to the one in the descriptor file */
+        self->priv->max_control_transfer = 0;
     } else {
         g_debug ("[%s] Queried max control message size: %" G_GUINT16_FORMAT,
                  self->priv->path_display,
                  max);
+        self->priv->max_control_transfer = max;
     }
-    self->priv->max_control_transfer = max;
-
-    /* Create new GIOChannel */
-    self->priv->iochannel = g_io_channel_unix_new (fd);
 
-    setup_iochannel (task);
+    /* Load the functional descriptor before the device is reported open, so
+     * that its properties are already known by then */
+    probe_descriptors (self, (GAsyncReadyCallback)iochannel_probe_descriptors_ready, task);
 }
 
 static void create_iochannel_with_socket (GTask *task);
@@ -1151,117 +1520,217 @@ wait_for_proxy_cb (GTask *task)
 }
 
 static void
-spawn_child_setup (void)
+wait_for_proxy (GTask *task)
 {
-    if (setpgid (0, 0) < 0)
-        g_warning ("couldn't setup proxy specific process group");
+    GSource *source;
+
+    source = g_timeout_source_new (SPAWN_RETRY_TIMEOUT_MS);
+    g_source_set_callback (source, (GSourceFunc)wait_for_proxy_cb, task, NULL);
+    g_source_attach (source, g_main_context_get_thread_default ());
+    g_source_unref (source);
 }
 
-static void
-create_iochannel_with_socket (GTask *task)
+static gboolean
+proxy_ready_timeout_cb (GTask *task)
 {
-    MbimDevice *self;
     CreateIoChannelContext *ctx;
-    GSocketAddress *socket_address;
-    GError *error = NULL;
 
-    self = g_task_get_source_object (task);
     ctx = g_task_get_task_data (task);
+    create_iochannel_context_stop_waiting_ready (ctx);
 
-    /* Create socket client */
-    if (self->priv->socket_client)
-        g_object_unref (self->priv->socket_client);
-    self->priv->socket_client = g_socket_client_new ();
-    g_socket_client_set_family (self->priv->socket_client, G_SOCKET_FAMILY_UNIX);
-    g_socket_client_set_socket_type (self->priv->socket_client, G_SOCKET_TYPE_STREAM);
-    g_socket_client_set_protocol (self->priv->socket_client, G_SOCKET_PROTOCOL_DEFAULT);
-
-    /* Setup socket address */
-    socket_address = (g_unix_socket_address_new_with_type (
-                          MBIM_PROXY_SOCKET_PATH,
-                          -1,
-                          G_UNIX_SOCKET_ADDRESS_ABSTRACT));
-
-    /* Connect to address */
-    if (self->priv->socket_connection)
-        g_object_unref (self->priv->socket_connection);
-    self->priv->socket_connection = (g_socket_client_connect (
-                                              self->priv->socket_client,
-                                              G_SOCKET_CONNECTABLE (socket_address),
-                                              NULL,
-                                              &error));
-    g_object_unref (socket_address);
+    /* Try to connect anyway, a new proxy is spawned if that fails */
+    g_debug ("timed out waiting for mbim-proxy to be ready");
+    create_iochannel_with_socket (task);
+    return FALSE;
+}
 
-    if (!self->priv->socket_connection) {
-        gchar **argc;
-        GSource *source;
+static gboolean
+proxy_ready_cb (gint          fd,
+                GIOCondition  condition,
+                GTask        *task)
+{
+    CreateIoChannelContext *ctx;
+    gchar                   byte;
+    gssize                  n_read;
 
-        g_debug ("cannot connect to proxy: %s", error->message);
-        g_clear_error (&error);
-        g_clear_object (&self->priv->socket_client);
+    ctx = g_task_get_task_data (task);
 
-        /* Don't retry forever */
-        ctx->spawn_retries++;
-        if (ctx->spawn_retries > MAX_SPAWN_RETRIES) {
-            g_task_return_new_error (task,
-                                     MBIM_CORE_ERROR,
-                                     MBIM_CORE_ERROR_FAILED,
-                                     "Couldn't spawn the mbim-proxy");
-            g_object_unref (task);
-            return;
-        }
+    do {
+        n_read = read (fd, &byte, 1);
+    } while (n_read < 0 && errno == EINTR);
 
-        g_debug ("spawning new mbim-proxy (try %u)...", ctx->spawn_retries);
-
-        argc = g_new0 (gchar *, 2);
-        argc[0] = g_strdup (LIBEXEC_PATH "/mbim-proxy");
-        if (!g_spawn_async (NULL, /* working directory */
-                            argc,
-                            NULL, /* envp */
-                            G_SPAWN_STDOUT_TO_DEV_NULL | G_SPAWN_STDERR_TO_DEV_NULL,
-                            (GSpawnChildSetupFunc) spawn_child_setup,
-                            NULL, /* child_setup_user_data */
-                            NULL,
-                            &error)) {
-            g_debug ("error spawning mbim-proxy: %s", error->message);
-            g_clear_error (&error);
-        }
-        g_strfreev (argc);
+    create_iochannel_context_stop_waiting_ready (ctx);
 
-        /* Wait some ms and retry */
-        source = g_timeout_source_new (100);
-        g_source_set_callback (source, (GSourceFunc)wait_for_proxy_cb, task, NULL);
-        g_source_attach (source, g_main_context_get_thread_default ());
-        g_source_unref (source);
-        return;
+    if (n_read == 1) {
+        g_debug ("mbim-proxy is ready");
+        create_iochannel_with_socket (task);
+        return FALSE;
     }
 
-    self->priv->iochannel = g_io_channel_unix_new (
-                                     g_socket_get_fd (
-                                         g_socket_connection_get_socket (self->priv->socket_connection)));
+    /* The proxy exited without reporting readiness, e.g. because another
+     * instance already owns the socket and may still be starting up */
+    g_debug ("mbim-proxy exited before being ready");
+    wait_for_proxy (task);
+    return FALSE;
+}
 
-    /* try to read the descriptor file */
-    self->priv->max_control_transfer = read_max_control_transfer (self);
+static void
+spawn_child_setup (gpointer user_data)
+{
+    if (setpgid (0, 0) < 0)
+        g_warning ("couldn't setup proxy specific process group");
 
-    setup_iochannel (task);
+    /* Let the proxy inherit the write end of the readiness pipe */
+    fcntl (GPOINTER_TO_INT (user_data), F_SETFD, 0);
 }
 
 static void
-create_iochannel (MbimDevice           *self,
-                  gboolean              proxy,
-                  GAsyncReadyCallback   callback,
-                  gpointer              user_data)
+spawn_proxy (GTask *task)
 {
     CreateIoChannelContext *ctx;
-    GTask *task;
-
-    ctx = g_slice_new (CreateIoChannelContext);
-    ctx->spawn_retries = 0;
+    gchar **argv;
+    gint fds[2];
+    GError *error = NULL;
 
-    task = g_task_new (self, NULL, callback, user_data);
-    g_task_set_task_data (task, ctx, (GDestroyNotify)create_iochannel_context_free);
+    ctx = g_task_get_task_data (task);
 
-    if (self->priv->iochannel) {
+    /* Don't retry forever */
+    ctx->spawn_retries++;
+    if (ctx->spawn_retries > MAX_SPAWN_RETRIES) {
+        g_task_return_new_error (task,
+                                 MBIM_CORE_ERROR,
+                                 MBIM_CORE_ERROR_FAILED,
+                                 "Couldn't spawn the mbim-proxy");
+        g_object_unref (task);
+        return;
+    }
+
+    /* The proxy writes to this pipe as soon as it accepts connections */
+    if (!g_unix_open_pipe (fds, FD_CLOEXEC, &error)) {
+        g_task_return_new_error (task,
+                                 MBIM_CORE_ERROR,
+                                 MBIM_CORE_ERROR_FAILED,
+                                 "Couldn't create mbim-proxy readiness pipe: %s",
+                                 error->message);
+        g_error_free (error);
+        g_object_unref (task);
+        return;
+    }
+
+    g_debug ("spawning new mbim-proxy (try %u)...", ctx->spawn_retries);
+
+    argv = g_new0 (gchar *, 3);
+    argv[0] = g_strdup (LIBEXEC_PATH "/mbim-proxy");
+    argv[1] = g_strdup_printf ("--ready-fd=%d", fds[1]);
+    if (!g_spawn_async (NULL, /* working directory */
+                        argv,
+                        NULL, /* envp */
+                        G_SPAWN_STDOUT_TO_DEV_NULL | G_SPAWN_STDERR_TO_DEV_NULL,
+                        (GSpawnChildSetupFunc) spawn_child_setup,
+                        GINT_TO_POINTER (fds[1]),
+                        NULL,
+                        &error)) {
+        g_debug ("error spawning mbim-proxy: %s", error->message);
+        g_clear_error (&error);
+        g_strfreev (argv);
+        close (fds[0]);
+        close (fds[1]);
+
+        /* Wait some ms and retry */
+        wait_for_proxy (task);
+        return;
+    }
+    g_strfreev (argv);
+
+    /* Only the proxy keeps the write end open, so we get EOF if it exits */
+    close (fds[1]);
+
+    ctx->ready_fd = fds[0];
+    ctx->ready_source = g_unix_fd_source_new (ctx->ready_fd, G_IO_IN | G_IO_ERR | G_IO_HUP);
+    g_source_set_callback (ctx->ready_source, (GSourceFunc)proxy_ready_cb, task, NULL);
+    g_source_attach (ctx->ready_source, g_main_context_get_thread_default ());
+
+    ctx->ready_timeout_source = g_timeout_source_new_seconds (PROXY_READY_TIMEOUT_SECS);
+    g_source_set_callback (ctx->ready_timeout_source, (GSourceFunc)proxy_ready_timeout_cb, task, NULL);
+    g_source_attach (ctx->ready_timeout_source, g_main_context_get_thread_default ());
+}
+
+static void
+socket_connect_ready (GSocketClient *client,
+                      GAsyncResult  *res,
+                      GTask         *task)
+{
+    MbimDevice *self;
+    GError *error = NULL;
+
+    self = g_task_get_source_object (task);
+
+    self->priv->socket_connection = g_socket_client_connect_finish (client, res, &error);
+    if (!self->priv->socket_connection) {
+        g_debug ("cannot connect to proxy: %s", error->message);
+        g_clear_error (&error);
+        g_clear_object (&self->priv->socket_client);
+        spawn_proxy (task);
+        return;
+    }
+
+    self->priv->iochannel = g_io_channel_unix_new (
+                                     g_socket_get_fd (
+                                         g_socket_connection_get_socket (self->priv->socket_connection)));
+
+    /* try to read the descriptor file */
+    self->priv->max_control_transfer = 0;
+    probe_descriptors (self, (GAsyncReadyCallback)iochannel_probe_descriptors_ready, task);
+}
+
+static void
+create_iochannel_with_socket (GTask *task)
+{
+    MbimDevice *self;
+    GSocketAddress *socket_address;
+
+    self = g_task_get_source_object (task);
+
+    /* Create socket client */
+    if (self->priv->socket_client)
+        g_object_unref (self->priv->socket_client);
+    self->priv->socket_client = g_socket_client_new ();
+    g_socket_client_set_family (self->priv->socket_client, G_SOCKET_FAMILY_UNIX);
+    g_socket_client_set_socket_type (self->priv->socket_client, G_SOCKET_TYPE_STREAM);
+    g_socket_client_set_protocol (self->priv->socket_client, G_SOCKET_PROTOCOL_DEFAULT);
+
+    /* Setup socket address */
+    socket_address = (g_unix_socket_address_new_with_type (
+                          MBIM_PROXY_SOCKET_PATH,
+                          -1,
+                          G_UNIX_SOCKET_ADDRESS_ABSTRACT));
+
+    /* Connect to address */
+    g_clear_object (&self->priv->socket_connection);
+    g_socket_client_connect_async (self->priv->socket_client,
+                                   G_SOCKET_CONNECTABLE (socket_address),
+                                   NULL,
+                                   (GAsyncReadyCallback)socket_connect_ready,
+                                   task);
+    g_object_unref (socket_address);
+}
+
+static void
+create_iochannel (MbimDevice           *self,
+                  gboolean              proxy,
+                  GAsyncReadyCallback   callback,
+                  gpointer              user_data)
+{
+    CreateIoChannelContext *ctx;
+    GTask *task;
+
+    ctx = g_slice_new0 (CreateIoChannelContext);
+    ctx->ready_fd = -1;
+
+    task = g_task_new (self, NULL, callback, user_data);
+    g_task_set_task_data (task, ctx, (GDestroyNotify)create_iochannel_context_free);
+
+    if (self->priv->iochannel) {
         g_task_return_new_error (task,
                                  MBIM_CORE_ERROR,
                                  MBIM_CORE_ERROR_WRONG_STATE,
@@ -1294,6 +1763,7 @@ typedef struct {
     guint                  timeout;
     GTimer                *timer;
     gboolean               close_before_open;
+    guint                  open_attempts;
 } DeviceOpenContext;
 
 static void
@@ -1397,21 +1867,43 @@ open_message_ready (MbimDevice   *self,
     device_open_context_step (task);
 }
 
+/* Devices that are already up reply right away, so start with a short
+ * timeout and double it on every retry, without going past the time left
+ * for the whole open operation. */
+static guint
+open_message_timeout (DeviceOpenContext *ctx)
+{
+    guint   timeout;
+    gdouble left;
+
+    timeout = OPEN_RETRY_TIMEOUT_MIN_SECS << MIN (ctx->open_attempts - 1, 8);
+    timeout = MIN (timeout, OPEN_RETRY_TIMEOUT_MAX_SECS);
+
+    left = ctx->timeout - g_timer_elapsed (ctx->timer, NULL);
+    if (left < timeout)
+        timeout = MAX (1, (guint) (left + 0.999));
+
+    return timeout;
+}
+
 static void
 open_message (GTask *task)
 {
     MbimDevice *self;
+    DeviceOpenContext *ctx;
     MbimMessage *request;
 
     self = g_task_get_source_object (task);
+    ctx = g_task_get_task_data (task);
 
     /* Launch 'Open' command */
+    ctx->open_attempts++;
     self->priv->open_transaction_id = mbim_device_get_next_transaction_id (self);
     request = mbim_message_open_new (self->priv->open_transaction_id,
                                      self->priv->max_control_transfer);
     mbim_device_command (self,
                          request,
-                         OPEN_RETRY_TIMEOUT_SECS,
+                         open_message_timeout (ctx),
                          g_task_get_cancellable (task),
                          (GAsyncReadyCallback)open_message_ready,
                          task);
@@ -1706,166 +2198,537 @@ mbim_device_open (MbimDevice          *self,
 }
 
 /*****************************************************************************/
-/* Close channel */
+/* Batch open */
 
-static gboolean
-destroy_iochannel (MbimDevice  *self,
-                   GError     **error)
-{
-    GError *inner_error = NULL;
-
-    self->priv->open_status = OPEN_STATUS_CLOSED;
+#define BATCH_OPEN_BACKOFF_INITIAL_MS 100
+#define BATCH_OPEN_BACKOFF_MAX_MS     5000
 
-    /* Already closed? */
-    if (!self->priv->iochannel && !self->priv->socket_connection && !self->priv->socket_client)
-        return TRUE;
+struct _MbimDeviceOpenResult {
+    gchar      *path;
+    MbimDevice *device;
+    GError     *error;
+    guint       attempts;
+    gdouble     time_to_open;
+};
 
-    g_debug ("[%s] channel destroyed", self->priv->path_display);
+static MbimDeviceOpenResult *
+device_open_result_new (const gchar *path)
+{
+    MbimDeviceOpenResult *self;
 
-    if (self->priv->iochannel) {
-        g_io_channel_shutdown (self->priv->iochannel, TRUE, &inner_error);
-        g_io_channel_unref (self->priv->iochannel);
-        self->priv->iochannel = NULL;
-    }
+    self = g_slice_new0 (MbimDeviceOpenResult);
+    self->path = g_strdup (path);
+    return self;
+}
 
-    /* Failures when closing still make the device to get closed */
-    g_clear_object (&self->priv->socket_connection);
-    g_clear_object (&self->priv->socket_client);
+static void
+device_open_result_free (MbimDeviceOpenResult *self)
+{
+    g_free (self->path);
+    if (self->device)
+        g_object_unref (self->device);
+    if (self->error)
+        g_error_free (self->error);
+    g_slice_free (MbimDeviceOpenResult, self);
+}
 
-    if (self->priv->iochannel_source) {
-        g_source_destroy (self->priv->iochannel_source);
-        g_source_unref (self->priv->iochannel_source);
-        self->priv->iochannel_source = NULL;
-    }
+/**
+ * mbim_device_open_result_get_path:
+ * @self: a #MbimDeviceOpenResult.
+ *
+ * Gets the path of the device this result refers to.
+ *
+ * Returns: (transfer none): the device path.
+ */
+const gchar *
+mbim_device_open_result_get_path (const MbimDeviceOpenResult *self)
+{
+    g_return_val_if_fail (self != NULL, NULL);
 
-    if (self->priv->response) {
-        g_byte_array_unref (self->priv->response);
-        self->priv->response = NULL;
-    }
+    return self->path;
+}
 
-    if (inner_error) {
-        g_propagate_error (error, inner_error);
-        return FALSE;
-    }
+/**
+ * mbim_device_open_result_get_device:
+ * @self: a #MbimDeviceOpenResult.
+ *
+ * Gets the #MbimDevice, if it was successfully opened.
+ *
+ * Returns: (transfer full): a #MbimDevice that should be freed with g_object_unref(), or %NULL if the device couldn't be opened.
+ */
+MbimDevice *
+mbim_device_open_result_get_device (const MbimDeviceOpenResult *self)
+{
+    g_return_val_if_fail (self != NULL, NULL);
 
-    return TRUE;
+    return self->device ? g_object_ref (self->device) : NULL;
 }
 
 /**
- * mbim_device_close_force:
- * @self: a #MbimDevice.
- * @error: Return location for error or %NULL.
+ * mbim_device_open_result_get_error:
+ * @self: a #MbimDeviceOpenResult.
  *
- * Forces the #MbimDevice to be closed.
+ * Gets the error reported by the last open attempt, if the device couldn't be
+ * opened.
  *
- * Returns: %TRUE if @self if no error happens, otherwise %FALSE and @error is set.
+ * Returns: (transfer none): a #GError, or %NULL if the device was opened.
  */
-gboolean
-mbim_device_close_force (MbimDevice *self,
-                         GError **error)
+const GError *
+mbim_device_open_result_get_error (const MbimDeviceOpenResult *self)
 {
-    g_return_val_if_fail (MBIM_IS_DEVICE (self), FALSE);
+    g_return_val_if_fail (self != NULL, NULL);
 
-    return destroy_iochannel (self, error);
+    return self->error;
 }
 
-typedef struct {
-    guint timeout;
-} DeviceCloseContext;
-
-static void
-device_close_context_free (DeviceCloseContext *ctx)
+/**
+ * mbim_device_open_result_get_attempts:
+ * @self: a #MbimDeviceOpenResult.
+ *
+ * Gets how many times the device was tried to be opened.
+ *
+ * Returns: the number of open attempts.
+ */
+guint
+mbim_device_open_result_get_attempts (const MbimDeviceOpenResult *self)
 {
-    g_slice_free (DeviceCloseContext, ctx);
+    g_return_val_if_fail (self != NULL, 0);
+
+    return self->attempts;
 }
 
 /**
- * mbim_device_close_finish:
- * @self: a #MbimDevice.
- * @res: a #GAsyncResult.
- * @error: Return location for error or %NULL.
+ * mbim_device_open_result_get_time_to_open:
+ * @self: a #MbimDeviceOpenResult.
  *
- * Finishes an asynchronous close operation started with mbim_device_close().
+ * Gets the time elapsed since the first open attempt until the device was
+ * opened, or until it was given up. Time waiting for a free slot in the batch
+ * is not included.
  *
- * Returns: %TRUE if successful, %FALSE if @error is set.
+ * Returns: the elapsed time, in seconds.
  */
-gboolean
-mbim_device_close_finish (MbimDevice    *self,
-                          GAsyncResult  *res,
-                          GError       **error)
+gdouble
+mbim_device_open_result_get_time_to_open (const MbimDeviceOpenResult *self)
 {
-    return g_task_propagate_boolean (G_TASK (res), error);
+    g_return_val_if_fail (self != NULL, 0.0);
+
+    return self->time_to_open;
 }
 
+typedef struct {
+    GPtrArray           *results;
+    MbimDeviceOpenFlags  flags;
+    guint                timeout;
+    guint                max_concurrent;
+    guint                next;
+    guint                n_running;
+} BatchOpenContext;
+
 static void
-close_message_ready (MbimDevice   *self,
-                     GAsyncResult *res,
-                     GTask        *task)
+batch_open_context_free (BatchOpenContext *ctx)
 {
-    MbimMessage *response;
-    GError *error = NULL;
+    g_ptr_array_unref (ctx->results);
+    g_slice_free (BatchOpenContext, ctx);
+}
 
-    response = mbim_device_command_finish (self, res, &error);
-    if (!response)
-        g_task_return_error (task, error);
-    else if (!mbim_message_response_get_result (response, MBIM_MESSAGE_TYPE_CLOSE_DONE, &error))
-        g_task_return_error (task, error);
-    else if (!destroy_iochannel (self, &error))
-        g_task_return_error (task, error);
-    else
-        g_task_return_boolean (task, TRUE);
+typedef struct {
+    GTask                *task;
+    MbimDeviceOpenResult *result;
+    GTimer               *timer;
+} BatchOpenItem;
 
-    if (response)
-        mbim_message_unref (response);
+static void batch_open_launch (GTask *task);
+static void batch_open_item_attempt (BatchOpenItem *item);
 
-    g_object_unref (task);
+static void
+batch_open_item_complete (BatchOpenItem *item)
+{
+    BatchOpenContext *ctx;
+    GTask *task;
+
+    task = item->task;
+    ctx = g_task_get_task_data (task);
+
+    item->result->time_to_open = g_timer_elapsed (item->timer, NULL);
+    g_timer_destroy (item->timer);
+    g_slice_free (BatchOpenItem, item);
+
+    g_assert (ctx->n_running > 0);
+    ctx->n_running--;
+    batch_open_launch (task);
 }
 
-/**
- * mbim_device_close:
- * @self: a #MbimDevice.
- * @timeout: maximum time, in seconds, to wait for the device to be closed.
- * @cancellable: optional #GCancellable object, #NULL to ignore.
- * @callback: a #GAsyncReadyCallback to call when the operation is finished.
- * @user_data: the data to pass to callback function.
- *
- * Asynchronously closes a #MbimDevice for I/O.
- *
- * When the operation is finished @callback will be called. You can then call
- * mbim_device_close_finish() to get the result of the operation.
- */
-void
-mbim_device_close (MbimDevice          *self,
-                   guint                timeout,
-                   GCancellable        *cancellable,
-                   GAsyncReadyCallback  callback,
-                   gpointer             user_data)
+/* Exponential backoff with jitter, so that devices failing at the same
+ * time don't retry in lockstep */
+static guint
+batch_open_backoff_ms (guint attempts)
 {
-    MbimMessage *request;
-    DeviceCloseContext *ctx;
-    GTask *task;
+    guint delay;
+    guint i;
 
-    g_return_if_fail (MBIM_IS_DEVICE (self));
+    delay = BATCH_OPEN_BACKOFF_INITIAL_MS;
+    for (i = 1; i < attempts && delay < BATCH_OPEN_BACKOFF_MAX_MS; i++)
+        delay *= 2;
+    delay = MIN (delay, BATCH_OPEN_BACKOFF_MAX_MS);
 
-    ctx = g_slice_new (DeviceCloseContext);
-    ctx->timeout = timeout;
+    return (guint) g_random_int_range (delay / 2, delay + 1);
+}
 
-    task = g_task_new (self, cancellable, callback, user_data);
-    g_task_set_task_data (task, ctx, (GDestroyNotify)device_close_context_free);
+static gboolean
+batch_open_item_retry_cb (BatchOpenItem *item)
+{
+    batch_open_item_attempt (item);
+    return FALSE;
+}
 
-    /* Already closed? */
-    if (!self->priv->iochannel) {
-        g_task_return_boolean (task, TRUE);
-        g_object_unref (task);
+static void
+batch_open_item_failed (BatchOpenItem *item,
+                        GError        *error)
+{
+    BatchOpenContext *ctx;
+    GSource *source;
+    guint delay_ms;
+
+    ctx = g_task_get_task_data (item->task);
+
+    /* Don't retry if the operation was cancelled, if the device is already
+     * being managed, or if there is no time left */
+    delay_ms = batch_open_backoff_ms (item->result->attempts);
+    if (g_error_matches (error, G_IO_ERROR, G_IO_ERROR_CANCELLED) ||
+        g_error_matches (error, MBIM_CORE_ERROR, MBIM_CORE_ERROR_WRONG_STATE) ||
+        g_cancellable_is_cancelled (g_task_get_cancellable (item->task)) ||
+        g_timer_elapsed (item->timer, NULL) + (delay_ms / 1000.0) >= ctx->timeout) {
+        g_debug ("[%s] giving up opening device after %u attempts: %s",
+                 item->result->path, item->result->attempts, error->message);
+        item->result->error = error;
+        batch_open_item_complete (item);
         return;
     }
 
-    /* If the device is in-session, avoid the close message */
-    if (self->priv->in_session) {
-        GError *error = NULL;
+    g_debug ("[%s] couldn't open device (attempt %u): %s; retrying in %u ms",
+             item->result->path, item->result->attempts, error->message, delay_ms);
+    g_error_free (error);
 
-        if (!destroy_iochannel (self, &error))
-            g_task_return_error (task, error);
+    source = g_timeout_source_new (delay_ms);
+    g_source_set_callback (source, (GSourceFunc)batch_open_item_retry_cb, item, NULL);
+    g_source_attach (source, g_main_context_get_thread_default ());
+    g_source_unref (source);
+}
+
+static void
+batch_open_device_open_ready (MbimDevice    *device,
+                              GAsyncResult  *res,
+                              BatchOpenItem *item)
+{
+    GError *error = NULL;
+
+    if (!mbim_device_open_full_finish (device, res, &error)) {
+        g_clear_object (&item->result->device);
+        batch_open_item_failed (item, error);
+        return;
+    }
+
+    batch_open_item_complete (item);
+}
+
+static void
+batch_open_device_new_ready (GObject       *source,
+                             GAsyncResult  *res,
+                             BatchOpenItem *item)
+{
+    BatchOpenContext *ctx;
+    gdouble left;
+    GError *error = NULL;
+
+    ctx = g_task_get_task_data (item->task);
+
+    item->result->device = mbim_device_new_finish (res, &error);
+    if (!item->result->device) {
+        batch_open_item_failed (item, error);
+        return;
+    }
+
+    /* Each attempt may use all the time left */
+    left = ctx->timeout - g_timer_elapsed (item->timer, NULL);
+    mbim_device_open_full (item->result->device,
+                           ctx->flags,
+                           MAX (1, (guint) (left + 0.999)),
+                           g_task_get_cancellable (item->task),
+                           (GAsyncReadyCallback)batch_open_device_open_ready,
+                           item);
+}
+
+static void
+batch_open_item_attempt (BatchOpenItem *item)
+{
+    GFile *file;
+
+    item->result->attempts++;
+
+    file = g_file_new_for_path (item->result->path);
+    mbim_device_new (file,
+                     g_task_get_cancellable (item->task),
+                     (GAsyncReadyCallback)batch_open_device_new_ready,
+                     item);
+    g_object_unref (file);
+}
+
+static void
+batch_open_launch (GTask *task)
+{
+    BatchOpenContext *ctx;
+
+    ctx = g_task_get_task_data (task);
+
+    while (ctx->next < ctx->results->len &&
+           (!ctx->max_concurrent || ctx->n_running < ctx->max_concurrent)) {
+        BatchOpenItem *item;
+
+        item = g_slice_new (BatchOpenItem);
+        item->task = task;
+        item->result = g_ptr_array_index (ctx->results, ctx->next++);
+        item->timer = g_timer_new ();
+        ctx->n_running++;
+        batch_open_item_attempt (item);
+    }
+
+    if (ctx->n_running == 0) {
+        g_task_return_pointer (task,
+                               g_ptr_array_ref (ctx->results),
+                               (GDestroyNotify)g_ptr_array_unref);
+        g_object_unref (task);
+    }
+}
+
+/**
+ * mbim_device_open_batch_finish:
+ * @res: a #GAsyncResult.
+ * @error: Return location for error or %NULL.
+ *
+ * Finishes an operation started with mbim_device_open_batch().
+ *
+ * Devices that couldn't be opened don't make the whole operation fail; the
+ * per-device result includes the error reported.
+ *
+ * Returns: (transfer full) (element-type MbimDeviceOpenResult): a #GPtrArray of #MbimDeviceOpenResult, in the same order as the paths given, or %NULL if @error is set. The returned value should be freed with g_ptr_array_unref().
+ */
+GPtrArray *
+mbim_device_open_batch_finish (GAsyncResult  *res,
+                               GError       **error)
+{
+    return g_task_propagate_pointer (G_TASK (res), error);
+}
+
+/**
+ * mbim_device_open_batch:
+ * @paths: a %NULL-terminated array of device paths.
+ * @flags: a set of #MbimDeviceOpenFlags.
+ * @timeout: maximum time, in seconds, to wait for each device to be opened.
+ * @max_concurrent: maximum number of devices being opened at the same time, or 0 for no limit.
+ * @cancellable: optional #GCancellable object, #NULL to ignore.
+ * @callback: a #GAsyncReadyCallback to call when the operation is finished.
+ * @user_data: the data to pass to callback function.
+ *
+ * Asynchronously creates and opens a #MbimDevice for each of the given
+ * @paths, running at most @max_concurrent of them at the same time.
+ *
+ * Devices failing to be created or opened are retried with an exponential
+ * backoff with jitter, until they're opened or @timeout is reached.
+ *
+ * When the operation is finished @callback will be called. You can then call
+ * mbim_device_open_batch_finish() to get the result of the operation.
+ */
+void
+mbim_device_open_batch (const gchar * const *paths,
+                        MbimDeviceOpenFlags  flags,
+                        guint                timeout,
+                        guint                max_concurrent,
+                        GCancellable        *cancellable,
+                        GAsyncReadyCallback  callback,
+                        gpointer             user_data)
+{
+    BatchOpenContext *ctx;
+    GTask *task;
+    guint i;
+
+    g_return_if_fail (paths != NULL);
+    g_return_if_fail (timeout > 0);
+
+    ctx = g_slice_new0 (BatchOpenContext);
+    ctx->results = g_ptr_array_new_with_free_func ((GDestroyNotify)device_open_result_free);
+    for (i = 0; paths[i]; i++)
+        g_ptr_array_add (ctx->results, device_open_result_new (paths[i]));
+    ctx->flags = flags;
+    ctx->timeout = timeout;
+    ctx->max_concurrent = max_concurrent;
+
+    task = g_task_new (NULL, cancellable, callback, user_data);
+    g_task_set_task_data (task, ctx, (GDestroyNotify)batch_open_context_free);
+
+    batch_open_launch (task);
+}
+
+/*****************************************************************************/
+/* Close channel */
+
+static gboolean
+destroy_iochannel (MbimDevice  *self,
+                   GError     **error)
+{
+    GError *inner_error = NULL;
+
+    self->priv->open_status = OPEN_STATUS_CLOSED;
+
+    /* Already closed? */
+    if (!self->priv->iochannel && !self->priv->socket_connection && !self->priv->socket_client)
+        return TRUE;
+
+    g_debug ("[%s] channel destroyed", self->priv->path_display);
+
+    if (self->priv->iochannel) {
+        g_io_channel_shutdown (self->priv->iochannel, TRUE, &inner_error);
+        g_io_channel_unref (self->priv->iochannel);
+        self->priv->iochannel = NULL;
+    }
+
+    /* Failures when closing still make the device to get closed */
+    g_clear_object (&self->priv->socket_connection);
+    g_clear_object (&self->priv->socket_client);
+
+    if (self->priv->iochannel_source) {
+        g_source_destroy (self->priv->iochannel_source);
+        g_source_unref (self->priv->iochannel_source);
+        self->priv->iochannel_source = NULL;
+    }
+
+    if (self->priv->response) {
+        g_byte_array_unref (self->priv->response);
+        self->priv->response = NULL;
+    }
+
+    if (inner_error) {
+        g_propagate_error (error, inner_error);
+        return FALSE;
+    }
+
+    return TRUE;
+}
+
+/**
+ * mbim_device_close_force:
+ * @self: a #MbimDevice.
+ * @error: Return location for error or %NULL.
+ *
+ * Forces the #MbimDevice to be closed.
+ *
+ * Returns: %TRUE if @self if no error happens, otherwise %FALSE and @error is set.
+ */
+gboolean
+mbim_device_close_force (MbimDevice *self,
+                         GError **error)
+{
+    g_return_val_if_fail (MBIM_IS_DEVICE (self), FALSE);
+
+    return destroy_iochannel (self, error);
+}
+
+typedef struct {
+    guint timeout;
+} DeviceCloseContext;
+
+static void
+device_close_context_free (DeviceCloseContext *ctx)
+{
+    g_slice_free (DeviceCloseContext, ctx);
+}
+
+/**
+ * mbim_device_close_finish:
+ * @self: a #MbimDevice.
+ * @res: a #GAsyncResult.
+ * @error: Return location for error or %NULL.
+ *
+ * Finishes an asynchronous close operation started with mbim_device_close().
+ *
+ * Returns: %TRUE if successful, %FALSE if @error is set.
+ */
+gboolean
+mbim_device_close_finish (MbimDevice    *self,
+                          GAsyncResult  *res,
+                          GError       **error)
+{
+    return g_task_propagate_boolean (G_TASK (res), error);
+}
+
+static void
+close_message_ready (MbimDevice   *self,
+                     GAsyncResult *res,
+                     GTask        *task)
+{
+    MbimMessage *response;
+    GError *error = NULL;
+
+    response = mbim_device_command_finish (self, res, &error);
+    if (!response)
+        g_task_return_error (task, error);
+    else if (!mbim_message_response_get_result (response, MBIM_MESSAGE_TYPE_CLOSE_DONE, &error))
+        g_task_return_error (task, error);
+    else if (!destroy_iochannel (self, &error))
+        g_task_return_error (task, error);
+    else
+        g_task_return_boolean (task, TRUE);
+
+    if (response)
+        mbim_message_unref (response);
+
+    g_object_unref (task);
+}
+
+/**
+ * mbim_device_close:
+ * @self: a #MbimDevice.
+ * @timeout: maximum time, in seconds, to wait for the device to be closed.
+ * @cancellable: optional #GCancellable object, #NULL to ignore.
+ * @callback: a #GAsyncReadyCallback to call when the operation is finished.
+ * @user_data: the data to pass to callback function.
+ *
+ * Asynchronously closes a #MbimDevice for I/O.
+ *
+ * When the operation is finished @callback will be called. You can then call
+ * mbim_device_close_finish() to get the result of the operation.
+ */
+void
+mbim_device_close (MbimDevice          *self,
+                   guint                timeout,
+                   GCancellable        *cancellable,
+                   GAsyncReadyCallback  callback,
+                   gpointer             user_data)
+{
+    MbimMessage *request;
+    DeviceCloseContext *ctx;
+    GTask *task;
+
+    g_return_if_fail (MBIM_IS_DEVICE (self));
+
+    ctx = g_slice_new (DeviceCloseContext);
+    ctx->timeout = timeout;
+
+    task = g_task_new (self, cancellable, callback, user_data);
+    g_task_set_task_data (task, ctx, (GDestroyNotify)device_close_context_free);
+
+    /* Already closed? */
+    if (!self->priv->iochannel) {
+        g_task_return_boolean (task, TRUE);
+        g_object_unref (task);
+        return;
+    }
+
+    /* If the device is in-session, avoid the close message */
+    if (self->priv->in_session) {
+        GError *error = NULL;
+
+        if (!destroy_iochannel (self, &error))
+            g_task_return_error (task, error);
         else
             g_task_return_boolean (task, TRUE);
         g_object_unref (task);
@@ -1892,6 +2755,10 @@ mbim_device_close (MbimDevice          *self,
  * Acquire the next transaction ID of this #MbimDevice.
  * The internal transaction ID gets incremented.
  *
+ * This method is thread-safe, so that messages given to
+ * mbim_device_command_sync() from other threads may also be built with an
+ * explicit transaction ID; alternatively, use 0 and let the device assign one.
+ *
  * Returns: the next transaction ID.
  */
 guint32
@@ -1901,6 +2768,8 @@ mbim_device_get_next_transaction_id (MbimDevice *self)
 
     g_return_val_if_fail (MBIM_IS_DEVICE (self), 0);
 
+    g_mutex_lock (&self->priv->lock);
+
     next = self->priv->transaction_id;
 
     /* Don't go further than 8bits in the CTL service */
@@ -1910,6 +2779,8 @@ mbim_device_get_next_transaction_id (MbimDevice *self)
     else
         self->priv->transaction_id++;
 
+    g_mutex_unlock (&self->priv->lock);
+
     return next;
 }
 
@@ -1921,298 +2792,1212 @@ device_write (MbimDevice    *self,
               guint32        data_length,
               GError       **error)
 {
-    gsize written;
-    GIOStatus write_status;
+    gsize written;
+    GIOStatus write_status;
+
+    written = 0;
+    write_status = G_IO_STATUS_AGAIN;
+    while (write_status == G_IO_STATUS_AGAIN) {
+        write_status = g_io_channel_write_chars (self->priv->iochannel,
+                                                 (gconstpointer)data,
+                                                 (gssize)data_length,
+                                                 &written,
+                                                 error);
+        switch (write_status) {
+        case G_IO_STATUS_ERROR:
+            g_prefix_error (error, "Cannot write message: ");
+            return FALSE;
+
+        case G_IO_STATUS_EOF:
+            /* We shouldn't get EOF when writing */
+            g_assert_not_reached ();
+            break;
+
+        case G_IO_STATUS_NORMAL:
+            /* All good, we'll exit the loop now */
+            break;
+
+        case G_IO_STATUS_AGAIN:
+            /* We're in a non-blocking channel and therefore we're up to receive
+             * EAGAIN; just retry in this case. TODO: in an idle? */
+            break;
+        }
+    }
+
+    return TRUE;
+}
+
+static gboolean
+device_send (MbimDevice   *self,
+             MbimMessage  *message,
+             GError      **error)
+{
+    const guint8 *raw_message;
+    guint32 raw_message_len;
+    struct fragment_info *fragments;
+    guint n_fragments;
+    guint i;
+    gboolean trace;
+
+    raw_message = mbim_message_get_raw (message, &raw_message_len, NULL);
+    g_assert (raw_message);
+
+    _mbim_device_stats_message_out (self->priv->stats, raw_message_len);
+
+    trace = _mbim_trace_enabled (self->priv->path, message);
+    if (trace)
+        _mbim_trace (MBIM_TRACE_EVENT_TYPE_SENT,
+                     self->priv->path,
+                     self->priv->path_display,
+                     message);
+
+    /* Single fragment? Send it! */
+    if (raw_message_len <= MAX_CONTROL_TRANSFER) {
+        if (!device_write (self, raw_message, raw_message_len, error))
+            return FALSE;
+        _mbim_probe (self->priv->probes, MBIM_PROBE_POINT_MESSAGE_WRITTEN, raw_message, raw_message_len);
+        return TRUE;
+    }
+
+    /* The message to send must be able to handle fragments */
+    g_assert (_mbim_message_is_fragment (message));
+
+    fragments = _mbim_message_split_fragments (message,
+                                               MAX_CONTROL_TRANSFER,
+                                               &n_fragments);
+    for (i = 0; i < n_fragments; i++) {
+        if (trace) {
+            GByteArray *bytearray;
+
+            /* Dummy message for trace purposes only */
+            bytearray = g_byte_array_new ();
+            g_byte_array_append (bytearray, (guint8 *)&fragments[i].header, sizeof (fragments[i].header));
+            g_byte_array_append (bytearray, (guint8 *)&fragments[i].fragment_header, sizeof (fragments[i].fragment_header));
+            g_byte_array_append (bytearray, fragments[i].data, fragments[i].data_length);
+            _mbim_trace (MBIM_TRACE_EVENT_TYPE_SENT_FRAGMENT,
+                         self->priv->path,
+                         self->priv->path_display,
+                         (MbimMessage *)bytearray);
+            g_byte_array_unref (bytearray);
+        }
+
+        /* Write fragment headers */
+        if (!device_write (self,
+                           (guint8 *)&fragments[i].header,
+                           sizeof (fragments[i].header),
+                           error))
+            return FALSE;
+
+        if (!device_write (self,
+                           (guint8 *)&fragments[i].fragment_header,
+                           sizeof (fragments[i].fragment_header),
+                           error))
+            return FALSE;
+
+        /* Write fragment data */
+        if (!device_write (self,
+                           fragments[i].data,
+                           fragments[i].data_length,
+                           error))
+            return FALSE;
+    }
+    g_free (fragments);
+
+    _mbim_probe (self->priv->probes, MBIM_PROBE_POINT_MESSAGE_WRITTEN, raw_message, raw_message_len);
+    return TRUE;
+}
+
+/*****************************************************************************/
+/* Statistics */
+
+/**
+ * mbim_device_get_statistics:
+ * @self: a #MbimDevice.
+ *
+ * Gets a snapshot of the message statistics collected by @self since it was
+ * created.
+ *
+ * The snapshot is a dictionary (type "a{sv}") with the following keys:
+ * "messages-in", "messages-out", "bytes-in", "bytes-out" (all "t") for the
+ * whole device, "unmatched" ("t") for received messages without a matching
+ * transaction, and "transactions" ("aa{sv}").
+ *
+ * Each of the "transactions" dictionaries refers to one message type
+ * ("message-type", "u"), service ("service", "s"), CID ("cid", "u") and
+ * command type ("command-type", "u"), and includes these counters ("t"):
+ * "count" (requests sent, or indications received), "completed", "errors",
+ * "timeouts", "aborts", "fragments-in", "bytes-in" and "bytes-out".
+ *
+ * Latencies are given in microseconds since the request was sent:
+ * "first-fragment-latency" and "complete-latency" are histograms ("a(tu)"),
+ * listing the upper bound of each non-empty bucket and its count, and
+ * "complete-latency-p50", "complete-latency-p99" and
+ * "complete-latency-max" ("t") summarize the latter.
+ *
+ * Returns: (transfer full): a #GVariant that should be freed with g_variant_unref().
+ */
+GVariant *
+mbim_device_get_statistics (MbimDevice *self)
+{
+    g_return_val_if_fail (MBIM_IS_DEVICE (self), NULL);
+
+    return _mbim_device_stats_build_variant (self->priv->stats);
+}
+
+/*****************************************************************************/
+/* Probes */
+
+/**
+ * mbim_device_add_probe:
+ * @self: a #MbimDevice.
+ * @points: a mask of #MbimProbePoint values.
+ * @func: a #MbimProbeFunc.
+ * @user_data: the data to pass to @func.
+ * @user_data_free: (allow-none): a #GDestroyNotify for @user_data, or %NULL.
+ *
+ * Attaches a probe called every time @self reaches one of the given @points.
+ *
+ * Returns: an identifier for the probe, to be given to mbim_device_remove_probe().
+ */
+guint
+mbim_device_add_probe (MbimDevice     *self,
+                       MbimProbePoint  points,
+                       MbimProbeFunc   func,
+                       gpointer        user_data,
+                       GDestroyNotify  user_data_free)
+{
+    g_return_val_if_fail (MBIM_IS_DEVICE (self), 0);
+    g_return_val_if_fail (func != NULL, 0);
+
+    return _mbim_probe_list_add (&self->priv->probes, points, func, user_data, user_data_free);
+}
+
+/**
+ * mbim_device_remove_probe:
+ * @self: a #MbimDevice.
+ * @probe_id: an identifier given by mbim_device_add_probe().
+ *
+ * Removes a probe from @self.
+ */
+void
+mbim_device_remove_probe (MbimDevice *self,
+                          guint       probe_id)
+{
+    g_return_if_fail (MBIM_IS_DEVICE (self));
+
+    if (!_mbim_probe_list_remove (&self->priv->probes, probe_id))
+        g_warning ("[%s] No probe with id %u", self->priv->path_display, probe_id);
+}
+
+/*****************************************************************************/
+/* Report error */
+
+typedef struct {
+    MbimDevice  *self;
+    MbimMessage *message;
+} ReportErrorContext;
+
+static void
+device_report_error_context_free (ReportErrorContext *ctx)
+{
+    mbim_message_unref (ctx->message);
+    g_object_unref (ctx->self);
+    g_slice_free (ReportErrorContext, ctx);
+}
+
+static gboolean
+device_report_error_in_idle (ReportErrorContext *ctx)
+{
+    /* Device must be open */
+    if (ctx->self->priv->iochannel) {
+        GError *error = NULL;
+
+        if (!device_send (ctx->self, ctx->message, &error)) {
+            g_warning ("[%s] Couldn't send host error message: %s",
+                       ctx->self->priv->path_display,
+                       error->message);
+            g_error_free (error);
+        }
+    }
+
+    device_report_error_context_free (ctx);
+    return FALSE;
+}
+
+static void
+device_report_error (MbimDevice   *self,
+                     guint32       transaction_id,
+                     const GError *error)
+{
+    ReportErrorContext *ctx;
+    GSource *source;
+
+    /* Only protocol errors to be reported to the modem */
+    if (error->domain != MBIM_PROTOCOL_ERROR)
+        return;
+
+    ctx = g_slice_new (ReportErrorContext);
+    ctx->self = g_object_ref (self);
+    ctx->message = mbim_message_error_new (transaction_id, error->code);
+
+    source = g_idle_source_new ();
+    g_source_set_callback (source, (GSourceFunc)device_report_error_in_idle, ctx, NULL);
+    g_source_attach (source, g_main_context_get_thread_default ());
+    g_source_unref (source);
+}
+
+/*****************************************************************************/
+/* Command */
+
+/**
+ * mbim_device_command_finish:
+ * @self: a #MbimDevice.
+ * @res: a #GAsyncResult.
+ * @error: Return location for error or %NULL.
+ *
+ * Finishes an operation started with mbim_device_command().
+ *
+ * Returns: a #MbimMessage response, or #NULL if @error is set. The returned value should be freed with mbim_message_unref().
+ */
+MbimMessage *
+mbim_device_command_finish (MbimDevice    *self,
+                            GAsyncResult  *res,
+                            GError       **error)
+{
+    return g_task_propagate_pointer (G_TASK (res), error);
+}
+
+/**
+ * mbim_device_command:
+ * @self: a #MbimDevice.
+ * @message: the message to send.
+ * @timeout: maximum time, in seconds, to wait for the response.
+ * @cancellable: a #GCancellable, or %NULL.
+ * @callback: a #GAsyncReadyCallback to call when the operation is finished.
+ * @user_data: the data to pass to callback function.
+ *
+ * Asynchronously sends a #MbimMessage to the device.
+ *
+ * When the operation is finished @callback will be called. You can then call
+ * mbim_device_command_finish() to get the result of the operation.
+ */
+void
+mbim_device_command (MbimDevice          *self,
+                     MbimMessage         *message,
+                     guint                timeout,
+                     GCancellable        *cancellable,
+                     GAsyncReadyCallback  callback,
+                     gpointer             user_data)
+{
+    GError  *error = NULL;
+    GTask   *task;
+    guint32  transaction_id;
+
+    g_return_if_fail (MBIM_IS_DEVICE (self));
+    g_return_if_fail (message != NULL);
+
+    /* If the message comes without a explicit transaction ID, add one
+     * ourselves */
+    transaction_id = mbim_message_get_transaction_id (message);
+    if (!transaction_id) {
+        transaction_id = mbim_device_get_next_transaction_id (self);
+        mbim_message_set_transaction_id (message, transaction_id);
+    }
+
+    task = transaction_task_new (self,
+                                 MBIM_MESSAGE_GET_MESSAGE_TYPE (message),
+                                 transaction_id,
+                                 cancellable,
+                                 callback,
+                                 user_data);
+
+    /* Device must be open */
+    if (!self->priv->iochannel) {
+        error = g_error_new (MBIM_CORE_ERROR,
+                             MBIM_CORE_ERROR_WRONG_STATE,
+                             "Device must be open to send commands");
+        transaction_task_complete_and_free (task, error);
+        g_error_free (error);
+        return;
+    }
+
+    /* Setup context to match response */
+    if (!device_store_transaction (self, TRANSACTION_TYPE_HOST, task, timeout * 1000, &error)) {
+        g_prefix_error (&error, "Cannot store transaction: ");
+        transaction_task_complete_and_free (task, error);
+        g_error_free (error);
+        return;
+    }
+
+    /* Account the request before sending, so that a response processed
+     * right away already finds it */
+    {
+        TransactionContext *ctx;
+
+        ctx = g_task_get_task_data (task);
+        ctx->stats_entry = _mbim_device_stats_get_entry (self->priv->stats, message);
+        _mbim_device_stats_entry_transaction (ctx->stats_entry, mbim_message_get_message_length (message));
+        ctx->send_time = g_get_monotonic_time ();
+    }
+
+    if (!device_send (self, message, &error)) {
+        /* Match transaction so that we remove it from our tracking table */
+        task = device_release_transaction (self,
+                                           TRANSACTION_TYPE_HOST,
+                                           MBIM_MESSAGE_GET_MESSAGE_TYPE (message),
+                                           mbim_message_get_transaction_id (message));
+        transaction_task_complete_and_free (task, error);
+        g_error_free (error);
+        return;
+    }
+
+    /* Just return, we'll get response asynchronously */
+}
+
+/*****************************************************************************/
+/* Synchronous command
+ *
+ * The device is not thread-safe: transactions are always stored, matched and
+ * completed in the main context where the device was opened. Synchronous
+ * commands issued from other threads are scheduled in that context and the
+ * caller just blocks on a condition until the response arrives, so there is
+ * no main context iteration per call and any number of threads may wait at
+ * the same time on the same device.
+ */
+
+/* Extra time given to the device context before giving up on it, in case
+ * it isn't being iterated at all */
+#define SYNC_COMMAND_GRACE_SECS 5
+
+typedef struct {
+    volatile gint  ref_count;
+    MbimDevice    *self;
+    GMainContext  *main_context;
+    MbimMessage   *message;
+    guint          timeout;
+    /* Only used within the device context */
+    GCancellable  *cancellable;
+    /* Protected by the mutex */
+    GMutex         mutex;
+    GCond          cond;
+    gboolean       done;
+    MbimMessage   *response;
+    GError        *error;
+} SyncCommandContext;
+
+static SyncCommandContext *
+sync_command_context_ref (SyncCommandContext *ctx)
+{
+    g_atomic_int_inc (&ctx->ref_count);
+    return ctx;
+}
+
+static void
+sync_command_context_unref (SyncCommandContext *ctx)
+{
+    if (!g_atomic_int_dec_and_test (&ctx->ref_count))
+        return;
+
+    if (ctx->response)
+        mbim_message_unref (ctx->response);
+    if (ctx->error)
+        g_error_free (ctx->error);
+    g_mutex_clear (&ctx->mutex);
+    g_cond_clear (&ctx->cond);
+    g_object_unref (ctx->cancellable);
+    mbim_message_unref (ctx->message);
+    g_main_context_unref (ctx->main_context);
+    g_object_unref (ctx->self);
+    g_slice_free (SyncCommandContext, ctx);
+}
+
+static void
+sync_command_ready (MbimDevice         *self,
+                    GAsyncResult       *res,
+                    SyncCommandContext *ctx)
+{
+    MbimMessage *response;
+    GError      *error = NULL;
+
+    response = mbim_device_command_finish (self, res, &error);
+
+    g_mutex_lock (&ctx->mutex);
+    ctx->response = response;
+    ctx->error = error;
+    ctx->done = TRUE;
+    g_cond_signal (&ctx->cond);
+    g_mutex_unlock (&ctx->mutex);
+
+    sync_command_context_unref (ctx);
+}
+
+static gboolean
+sync_command_start (SyncCommandContext *ctx)
+{
+    /* Running in the device context; the scheduled reference is passed to
+     * the command */
+    mbim_device_command (ctx->self,
+                         ctx->message,
+                         ctx->timeout,
+                         ctx->cancellable,
+                         (GAsyncReadyCallback)sync_command_ready,
+                         ctx);
+    return G_SOURCE_REMOVE;
+}
+
+static gboolean
+sync_command_cancel (SyncCommandContext *ctx)
+{
+    /* Running in the device context, so the transaction is aborted in the
+     * same thread that manages it */
+    g_cancellable_cancel (ctx->cancellable);
+    return G_SOURCE_REMOVE;
+}
+
+static void
+sync_command_cancelled (GCancellable       *cancellable,
+                        SyncCommandContext *ctx)
+{
+    g_main_context_invoke_full (ctx->main_context,
+                                G_PRIORITY_DEFAULT,
+                                (GSourceFunc)sync_command_cancel,
+                                sync_command_context_ref (ctx),
+                                (GDestroyNotify)sync_command_context_unref);
+}
+
+static MbimMessage *
+sync_command_in_owner_context (MbimDevice    *self,
+                               GMainContext  *main_context,
+                               MbimMessage   *message,
+                               guint          timeout,
+                               GCancellable  *cancellable,
+                               GError       **error)
+{
+    SyncCommandContext *ctx;
+    MbimMessage        *response;
+
+    /* Called from the thread running the device context itself, so there is
+     * nobody else to process the response: iterate the context until done */
+    ctx = g_slice_new0 (SyncCommandContext);
+    ctx->ref_count = 2;
+    ctx->self = g_object_ref (self);
+    ctx->main_context = g_main_context_ref (main_context);
+    ctx->message = mbim_message_ref (message);
+    ctx->timeout = timeout;
+    ctx->cancellable = (cancellable ? g_object_ref (cancellable) : g_cancellable_new ());
+    g_mutex_init (&ctx->mutex);
+    g_cond_init (&ctx->cond);
+
+    sync_command_start (ctx);
+    while (!ctx->done)
+        g_main_context_iteration (ctx->main_context, TRUE);
+
+    response = ctx->response;
+    ctx->response = NULL;
+    if (ctx->error) {
+        g_propagate_error (error, ctx->error);
+        ctx->error = NULL;
+    }
+
+    sync_command_context_unref (ctx);
+    return response;
+}
+
+/**
+ * mbim_device_command_sync:
+ * @self: a #MbimDevice.
+ * @message: the message to send.
+ * @timeout: maximum time, in seconds, to wait for the response.
+ * @cancellable: a #GCancellable, or %NULL.
+ * @error: Return location for error or %NULL.
+ *
+ * Synchronously sends a #MbimMessage to the device, blocking the calling
+ * thread until the response is received, @timeout expires or @cancellable
+ * is cancelled.
+ *
+ * This method is thread-safe and is meant to be used from worker threads:
+ * the request is scheduled in the main context where @self was opened, which
+ * must be running in a different thread, and only the calling thread blocks.
+ * Several threads may issue commands on the same device at the same time.
+ * Messages sent from other threads should either use 0 as transaction ID, so
+ * that one is assigned in the device context, or one acquired with
+ * mbim_device_get_next_transaction_id().
+ * If called from the thread owning the device main context, that context is
+ * iterated until the operation finishes.
+ *
+ * Returns: a #MbimMessage response, or #NULL if @error is set. The returned value should be freed with mbim_message_unref().
+ */
+MbimMessage *
+mbim_device_command_sync (MbimDevice    *self,
+                          MbimMessage   *message,
+                          guint          timeout,
+                          GCancellable  *cancellable,
+                          GError       **error)
+{
+    SyncCommandContext *ctx;
+    MbimMessage        *response = NULL;
+    GMainContext       *main_context;
+    gulong              cancellable_id = 0;
+    gint64              deadline;
+    gboolean            done;
+
+    g_return_val_if_fail (MBIM_IS_DEVICE (self), NULL);
+    g_return_val_if_fail (message != NULL, NULL);
+
+    /* The device may be reopened in its own thread meanwhile, which replaces
+     * the context */
+    g_mutex_lock (&self->priv->lock);
+    main_context = (self->priv->main_context ? g_main_context_ref (self->priv->main_context) : NULL);
+    g_mutex_unlock (&self->priv->lock);
+
+    if (!main_context) {
+        g_set_error (error,
+                     MBIM_CORE_ERROR,
+                     MBIM_CORE_ERROR_WRONG_STATE,
+                     "Device must be open to send commands");
+        return NULL;
+    }
+
+    if (g_main_context_is_owner (main_context)) {
+        response = sync_command_in_owner_context (self, main_context, message, timeout, cancellable, error);
+        g_main_context_unref (main_context);
+        return response;
+    }
+
+    /* One reference for the caller, one for the scheduled command; the
+     * context reference is passed to it */
+    ctx = g_slice_new0 (SyncCommandContext);
+    ctx->ref_count = 2;
+    ctx->self = g_object_ref (self);
+    ctx->main_context = main_context;
+    ctx->message = mbim_message_ref (message);
+    ctx->timeout = timeout;
+    ctx->cancellable = g_cancellable_new ();
+    g_mutex_init (&ctx->mutex);
+    g_cond_init (&ctx->cond);
+
+    g_main_context_invoke_full (ctx->main_context,
+                                G_PRIORITY_DEFAULT,
+                                (GSourceFunc)sync_command_start,
+                                ctx,
+                                NULL);
+
+    /* The user cancellable may be cancelled from any thread, so the actual
+     * abort is always scheduled in the device context */
+    if (cancellable)
+        cancellable_id = g_cancellable_connect (cancellable,
+                                                G_CALLBACK (sync_command_cancelled),
+                                                sync_command_context_ref (ctx),
+                                                (GDestroyNotify)sync_command_context_unref);
+
+    /* The command itself times out in the device context; the deadline here
+     * only protects against a device context which is not running */
+    deadline = g_get_monotonic_time () + (gint64)(timeout + SYNC_COMMAND_GRACE_SECS) * G_TIME_SPAN_SECOND;
+
+    g_mutex_lock (&ctx->mutex);
+    while (!ctx->done) {
+        if (!g_cond_wait_until (&ctx->cond, &ctx->mutex, deadline))
+            break;
+    }
+    done = ctx->done;
+    if (done) {
+        response = ctx->response;
+        ctx->response = NULL;
+        if (ctx->error) {
+            g_propagate_error (error, ctx->error);
+            ctx->error = NULL;
+        }
+    }
+    g_mutex_unlock (&ctx->mutex);
+
+    if (cancellable_id)
+        g_cancellable_disconnect (cancellable, cancellable_id);
+
+    if (!done)
+        g_set_error (error,
+                     MBIM_CORE_ERROR,
+                     MBIM_CORE_ERROR_TIMEOUT,
+                     "Transaction timed out: device context not running");
+
+    sync_command_context_unref (ctx);
+    return response;
+}
+
+/*****************************************************************************/
+/* Command batch
+ *
+ * Commands in a batch are sent as soon as their dependencies are completed,
+ * keeping at most a given number of them pending in the device at the same
+ * time. Each command is still a regular host transaction, matched in the same
+ * transaction table as any other command.
+ */
+
+typedef struct {
+    MbimMessage *message;
+    guint        timeout;
+    GArray      *depends_on;
+} BatchCommand;
+
+struct _MbimDeviceCommandBatch {
+    volatile gint  ref_count;
+    GPtrArray     *commands;
+};
+
+static void
+batch_command_free (BatchCommand *command)
+{
+    mbim_message_unref (command->message);
+    if (command->depends_on)
+        g_array_unref (command->depends_on);
+    g_slice_free (BatchCommand, command);
+}
+
+/**
+ * mbim_device_command_batch_new:
+ *
+ * Create a new empty #MbimDeviceCommandBatch.
+ *
+ * Returns: (transfer full): a newly created #MbimDeviceCommandBatch, which should be freed with mbim_device_command_batch_unref().
+ */
+MbimDeviceCommandBatch *
+mbim_device_command_batch_new (void)
+{
+    MbimDeviceCommandBatch *self;
+
+    self = g_slice_new (MbimDeviceCommandBatch);
+    self->ref_count = 1;
+    self->commands = g_ptr_array_new_with_free_func ((GDestroyNotify)batch_command_free);
+    return self;
+}
+
+/**
+ * mbim_device_command_batch_ref:
+ * @self: a #MbimDeviceCommandBatch.
+ *
+ * Atomically increments the reference count of @self by one.
+ *
+ * Returns: (transfer full): the new reference to @self.
+ */
+MbimDeviceCommandBatch *
+mbim_device_command_batch_ref (MbimDeviceCommandBatch *self)
+{
+    g_return_val_if_fail (self != NULL, NULL);
+
+    g_atomic_int_inc (&self->ref_count);
+    return self;
+}
+
+/**
+ * mbim_device_command_batch_unref:
+ * @self: a #MbimDeviceCommandBatch.
+ *
+ * Atomically decrements the reference count of @self by one.
+ * If the reference count drops to 0, @self is completely disposed.
+ */
+void
+mbim_device_command_batch_unref (MbimDeviceCommandBatch *self)
+{
+    g_return_if_fail (self != NULL);
+
+    if (g_atomic_int_dec_and_test (&self->ref_count)) {
+        g_ptr_array_unref (self->commands);
+        g_slice_free (MbimDeviceCommandBatch, self);
+    }
+}
+
+/**
+ * mbim_device_command_batch_add:
+ * @self: a #MbimDeviceCommandBatch.
+ * @message: the message to send.
+ * @timeout: maximum time, in seconds, to wait for the response.
+ *
+ * Appends a command to the batch.
+ *
+ * If @message doesn't have an explicit transaction ID, one will be assigned
+ * when the batch is sent. @message itself is never modified: a copy of it is
+ * sent, which is given in the #MbimDeviceCommandResult, so the same batch may
+ * be sent several times.
+ *
+ * Returns: the index of the command within the batch.
+ */
+guint
+mbim_device_command_batch_add (MbimDeviceCommandBatch *self,
+                               MbimMessage            *message,
+                               guint                   timeout)
+{
+    BatchCommand *command;
+
+    g_return_val_if_fail (self != NULL, 0);
+    g_return_val_if_fail (message != NULL, 0);
+    g_return_val_if_fail (MBIM_MESSAGE_GET_MESSAGE_TYPE (message) == MBIM_MESSAGE_TYPE_COMMAND, 0);
+
+    command = g_slice_new0 (BatchCommand);
+    command->message = mbim_message_ref (message);
+    command->timeout = timeout;
+    g_ptr_array_add (self->commands, command);
+
+    return self->commands->len - 1;
+}
+
+/**
+ * mbim_device_command_batch_add_dependency:
+ * @self: a #MbimDeviceCommandBatch.
+ * @index: the index of a command in the batch.
+ * @depends_on: the index of a previous command in the batch.
+ *
+ * Makes the command at @index be sent only after the command at @depends_on
+ * has successfully completed. If the command at @depends_on fails, the one at
+ * @index is not sent, and it is reported with a %MBIM_CORE_ERROR_ABORTED
+ * error.
+ */
+void
+mbim_device_command_batch_add_dependency (MbimDeviceCommandBatch *self,
+                                          guint                   index,
+                                          guint                   depends_on)
+{
+    BatchCommand *command;
+
+    g_return_if_fail (self != NULL);
+    g_return_if_fail (index < self->commands->len);
+    g_return_if_fail (depends_on < index);
+
+    command = g_ptr_array_index (self->commands, index);
+    if (!command->depends_on)
+        command->depends_on = g_array_new (FALSE, FALSE, sizeof (guint));
+    g_array_append_val (command->depends_on, depends_on);
+}
+
+struct _MbimDeviceCommandResult {
+    MbimMessage *request;
+    MbimMessage *response;
+    GError      *error;
+    gdouble      time;
+};
+
+static MbimDeviceCommandResult *
+device_command_result_new (MbimMessage *request)
+{
+    MbimDeviceCommandResult *self;
+
+    /* Transaction IDs are set in the copy, never in the caller's message */
+    self = g_slice_new0 (MbimDeviceCommandResult);
+    self->request = mbim_message_dup (request);
+    return self;
+}
+
+static void
+device_command_result_free (MbimDeviceCommandResult *self)
+{
+    mbim_message_unref (self->request);
+    if (self->response)
+        mbim_message_unref (self->response);
+    if (self->error)
+        g_error_free (self->error);
+    g_slice_free (MbimDeviceCommandResult, self);
+}
+
+/**
+ * mbim_device_command_result_get_request:
+ * @self: a #MbimDeviceCommandResult.
+ *
+ * Gets the request message this result refers to, as sent to the device,
+ * including the transaction ID it was given.
+ *
+ * Returns: (transfer none): the request #MbimMessage.
+ */
+MbimMessage *
+mbim_device_command_result_get_request (const MbimDeviceCommandResult *self)
+{
+    g_return_val_if_fail (self != NULL, NULL);
+
+    return self->request;
+}
+
+/**
+ * mbim_device_command_result_get_response:
+ * @self: a #MbimDeviceCommandResult.
+ *
+ * Gets the response received for the command, if any. A response is given
+ * also when the device reported a failed status for the command.
+ *
+ * Returns: (transfer full): a #MbimMessage that should be freed with mbim_message_unref(), or %NULL if no response was received.
+ */
+MbimMessage *
+mbim_device_command_result_get_response (const MbimDeviceCommandResult *self)
+{
+    g_return_val_if_fail (self != NULL, NULL);
 
-    written = 0;
-    write_status = G_IO_STATUS_AGAIN;
-    while (write_status == G_IO_STATUS_AGAIN) {
-        write_status = g_io_channel_write_chars (self->priv->iochannel,
-                                                 (gconstpointer)data,
-                                                 (gssize)data_length,
-                                                 &written,
-                                                 error);
-        switch (write_status) {
-        case G_IO_STATUS_ERROR:
-            g_prefix_error (error, "Cannot write message: ");
-            return FALSE;
+    return self->response ? mbim_message_ref (self->response) : NULL;
+}
 
-        case G_IO_STATUS_EOF:
-            /* We shouldn't get EOF when writing */
-            g_assert_not_reached ();
-            break;
+/**
+ * mbim_device_command_result_get_error:
+ * @self: a #MbimDeviceCommandResult.
+ *
+ * Gets the error reported for the command, if it failed, if the device
+ * reported a failed status, or if it wasn't sent at all.
+ *
+ * Returns: (transfer none): a #GError, or %NULL if the command succeeded.
+ */
+const GError *
+mbim_device_command_result_get_error (const MbimDeviceCommandResult *self)
+{
+    g_return_val_if_fail (self != NULL, NULL);
 
-        case G_IO_STATUS_NORMAL:
-            /* All good, we'll exit the loop now */
-            break;
+    return self->error;
+}
 
-        case G_IO_STATUS_AGAIN:
-            /* We're in a non-blocking channel and therefore we're up to receive
-             * EAGAIN; just retry in this case. TODO: in an idle? */
-            break;
-        }
-    }
+/**
+ * mbim_device_command_result_get_time:
+ * @self: a #MbimDeviceCommandResult.
+ *
+ * Gets the time elapsed since the command was sent until it was completed.
+ *
+ * Returns: the elapsed time, in seconds, or 0 if the command wasn't sent.
+ */
+gdouble
+mbim_device_command_result_get_time (const MbimDeviceCommandResult *self)
+{
+    g_return_val_if_fail (self != NULL, 0.0);
 
-    return TRUE;
+    return self->time;
 }
 
-static gboolean
-device_send (MbimDevice   *self,
-             MbimMessage  *message,
-             GError      **error)
-{
-    const guint8 *raw_message;
-    guint32 raw_message_len;
-    struct fragment_info *fragments;
-    guint n_fragments;
-    guint i;
+typedef enum {
+    BATCH_COMMAND_STATE_WAITING,
+    BATCH_COMMAND_STATE_PENDING,
+    BATCH_COMMAND_STATE_SUCCEEDED,
+    BATCH_COMMAND_STATE_FAILED,
+} BatchCommandState;
 
-    raw_message = mbim_message_get_raw (message, &raw_message_len, NULL);
-    g_assert (raw_message);
+typedef struct {
+    MbimDeviceCommandBatch      *batch;
+    MbimDeviceCommandBatchFlags  flags;
+    GPtrArray                   *results;
+    BatchCommandState           *states;
+    guint                        max_pending;
+    guint                        n_pending;
+    guint                        next;
+    gboolean                     stopped;
+    gboolean                     launching;
+    gboolean                     relaunch;
+    GTimer                      *timer;
+} CommandBatchContext;
 
-    if (mbim_utils_get_traces_enabled ()) {
-        gchar *printable;
+static void
+command_batch_context_free (CommandBatchContext *ctx)
+{
+    g_timer_destroy (ctx->timer);
+    g_free (ctx->states);
+    g_ptr_array_unref (ctx->results);
+    mbim_device_command_batch_unref (ctx->batch);
+    g_slice_free (CommandBatchContext, ctx);
+}
 
-        printable = mbim_common_str_hex (raw_message, raw_message_len, ':');
-        g_debug ("[%s] Sent message...\n"
-                 "<<<<<< RAW:\n"
-                 "<<<<<<   length = %u\n"
-                 "<<<<<<   data   = %s\n",
-                 self->priv->path_display,
-                 ((GByteArray *)message)->len,
-                 printable);
-        g_free (printable);
+typedef struct {
+    GTask  *task;
+    guint   index;
+    GTimer *timer;
+} CommandBatchItem;
 
-        printable = mbim_message_get_printable (message, "<<<<<< ", FALSE);
-        g_debug ("[%s] Sent message (translated)...\n%s",
-                 self->priv->path_display,
-                 printable);
-        g_free (printable);
-    }
+static void command_batch_launch (GTask *task);
 
-    /* Single fragment? Send it! */
-    if (raw_message_len <= MAX_CONTROL_TRANSFER)
-        return device_write (self, raw_message, raw_message_len, error);
+static void
+command_batch_item_ready (MbimDevice       *self,
+                          GAsyncResult     *res,
+                          CommandBatchItem *item)
+{
+    CommandBatchContext     *ctx;
+    MbimDeviceCommandResult *result;
+    GTask                   *task;
 
-    /* The message to send must be able to handle fragments */
-    g_assert (_mbim_message_is_fragment (message));
+    task = item->task;
+    ctx = g_task_get_task_data (task);
+    result = g_ptr_array_index (ctx->results, item->index);
+
+    result->time = g_timer_elapsed (item->timer, NULL);
+    result->response = mbim_device_command_finish (self, res, &result->error);
+    if (result->response)
+        mbim_message_response_get_result (result->response, MBIM_MESSAGE_TYPE_COMMAND_DONE, &result->error);
+
+    if (result->error) {
+        g_debug ("[%s] batch command %u failed: %s",
+                 self->priv->path_display, item->index, result->error->message);
+        ctx->states[item->index] = BATCH_COMMAND_STATE_FAILED;
+        if (ctx->flags & MBIM_DEVICE_COMMAND_BATCH_FLAGS_STOP_ON_ERROR)
+            ctx->stopped = TRUE;
+    } else
+        ctx->states[item->index] = BATCH_COMMAND_STATE_SUCCEEDED;
+
+    g_timer_destroy (item->timer);
+    g_slice_free (CommandBatchItem, item);
+
+    g_assert (ctx->n_pending > 0);
+    ctx->n_pending--;
+    command_batch_launch (task);
+}
 
-    fragments = _mbim_message_split_fragments (message,
-                                               MAX_CONTROL_TRANSFER,
-                                               &n_fragments);
-    for (i = 0; i < n_fragments; i++) {
-        if (mbim_utils_get_traces_enabled ()) {
-            GByteArray *bytearray;
-            gchar *printable;
-            gchar *printable_h;
-            gchar *printable_fh;
-            gchar *printable_d;
-
-            printable_h  = mbim_common_str_hex (&fragments[i].header, sizeof (fragments[i].header), ':');
-            printable_fh = mbim_common_str_hex (&fragments[i].fragment_header, sizeof (fragments[i].fragment_header), ':');
-            printable_d  = mbim_common_str_hex (fragments[i].data, fragments[i].data_length, ':');
-            g_debug ("[%s] Sent fragment (%u)...\n"
-                     "<<<<<< RAW:\n"
-                     "<<<<<<   length = %u\n"
-                     "<<<<<<   data   = %s%s%s\n",
-                     self->priv->path_display, i,
-                     (guint)(sizeof (fragments[i].header) +
-                             sizeof (fragments[i].fragment_header) +
-                             fragments[i].data_length),
-                     printable_h, printable_fh, printable_d);
-            g_free (printable_h);
-            g_free (printable_fh);
-            g_free (printable_d);
-
-            /* Dummy message for printable purposes only */
-            bytearray = g_byte_array_new ();
-            g_byte_array_append (bytearray, (guint8 *)&fragments[i].header, sizeof (fragments[i].header));
-            g_byte_array_append (bytearray, (guint8 *)&fragments[i].fragment_header, sizeof (fragments[i].fragment_header));
-            printable = mbim_message_get_printable ((MbimMessage *)bytearray, "<<<<<< ", TRUE);
-            g_debug ("[%s] Sent fragment (translated)...\n%s",
-                     self->priv->path_display,
-                     printable);
-            g_free (printable);
-            g_byte_array_unref (bytearray);
+/* Returns FALSE if the command must wait for another one still running; if
+ * it must not be sent at all, @error is set */
+static gboolean
+command_batch_check_dependencies (CommandBatchContext  *ctx,
+                                  guint                 index,
+                                  GError              **error)
+{
+    BatchCommand *command;
+    guint         i;
+
+    /* In sequential batches every command depends on the previous one */
+    if ((ctx->flags & MBIM_DEVICE_COMMAND_BATCH_FLAGS_SEQUENTIAL) && index > 0) {
+        if (ctx->states[index - 1] == BATCH_COMMAND_STATE_FAILED) {
+            g_set_error (error, MBIM_CORE_ERROR, MBIM_CORE_ERROR_ABORTED,
+                         "Previous command %u failed", index - 1);
+            return FALSE;
         }
-
-        /* Write fragment headers */
-        if (!device_write (self,
-                           (guint8 *)&fragments[i].header,
-                           sizeof (fragments[i].header),
-                           error))
+        if (ctx->states[index - 1] != BATCH_COMMAND_STATE_SUCCEEDED)
             return FALSE;
+    }
 
-        if (!device_write (self,
-                           (guint8 *)&fragments[i].fragment_header,
-                           sizeof (fragments[i].fragment_header),
-                           error))
-            return FALSE;
+    command = g_ptr_array_index (ctx->batch->commands, index);
+    if (!command->depends_on)
+        return TRUE;
 
-        /* Write fragment data */
-        if (!device_write (self,
-                           fragments[i].data,
-                           fragments[i].data_length,
-                           error))
+    for (i = 0; i < command->depends_on->len; i++) {
+        guint depends_on;
+
+        depends_on = g_array_index (command->depends_on, guint, i);
+        if (ctx->states[depends_on] == BATCH_COMMAND_STATE_FAILED) {
+            g_set_error (error, MBIM_CORE_ERROR, MBIM_CORE_ERROR_ABORTED,
+                         "Command %u depends on failed command %u", index, depends_on);
+            return FALSE;
+        }
+        if (ctx->states[depends_on] != BATCH_COMMAND_STATE_SUCCEEDED)
             return FALSE;
     }
-    g_free (fragments);
 
     return TRUE;
 }
 
-/*****************************************************************************/
-/* Report error */
-
-typedef struct {
-    MbimDevice  *self;
-    MbimMessage *message;
-} ReportErrorContext;
-
 static void
-device_report_error_context_free (ReportErrorContext *ctx)
+command_batch_launch_pass (GTask *task)
 {
-    mbim_message_unref (ctx->message);
-    g_object_unref (ctx->self);
-    g_slice_free (ReportErrorContext, ctx);
-}
+    MbimDevice          *self;
+    CommandBatchContext *ctx;
+    guint                i;
 
-static gboolean
-device_report_error_in_idle (ReportErrorContext *ctx)
-{
-    /* Device must be open */
-    if (ctx->self->priv->iochannel) {
-        GError *error = NULL;
+    self = g_task_get_source_object (task);
+    ctx = g_task_get_task_data (task);
 
-        if (!device_send (ctx->self, ctx->message, &error)) {
-            g_warning ("[%s] Couldn't send host error message: %s",
-                       ctx->self->priv->path_display,
-                       error->message);
-            g_error_free (error);
+    for (i = ctx->next;
+         i < ctx->results->len && (!ctx->max_pending || ctx->n_pending < ctx->max_pending);
+         i++) {
+        MbimDeviceCommandResult *result;
+        BatchCommand            *command;
+        CommandBatchItem        *item;
+        GError                  *error = NULL;
+
+        if (ctx->states[i] != BATCH_COMMAND_STATE_WAITING)
+            continue;
+
+        result = g_ptr_array_index (ctx->results, i);
+
+        if (g_cancellable_is_cancelled (g_task_get_cancellable (task)))
+            error = g_error_new (G_IO_ERROR, G_IO_ERROR_CANCELLED,
+                                 "Operation was cancelled");
+        else if (ctx->stopped)
+            error = g_error_new (MBIM_CORE_ERROR, MBIM_CORE_ERROR_ABORTED,
+                                 "Batch stopped after a failed command");
+        else if (!command_batch_check_dependencies (ctx, i, &error) && !error)
+            continue;
+
+        if (error) {
+            result->error = error;
+            ctx->states[i] = BATCH_COMMAND_STATE_FAILED;
+            continue;
         }
+
+        command = g_ptr_array_index (ctx->batch->commands, i);
+
+        item = g_slice_new (CommandBatchItem);
+        item->task = task;
+        item->index = i;
+        item->timer = g_timer_new ();
+
+        ctx->states[i] = BATCH_COMMAND_STATE_PENDING;
+        ctx->n_pending++;
+        mbim_device_command (self,
+                             result->request,
+                             command->timeout,
+                             g_task_get_cancellable (task),
+                             (GAsyncReadyCallback)command_batch_item_ready,
+                             item);
     }
 
-    device_report_error_context_free (ctx);
-    return FALSE;
+    /* Skip everything already started or completed */
+    while (ctx->next < ctx->results->len && ctx->states[ctx->next] != BATCH_COMMAND_STATE_WAITING)
+        ctx->next++;
 }
 
 static void
-device_report_error (MbimDevice   *self,
-                     guint32       transaction_id,
-                     const GError *error)
+command_batch_launch (GTask *task)
 {
-    ReportErrorContext *ctx;
-    GSource *source;
+    CommandBatchContext *ctx;
 
-    /* Only protocol errors to be reported to the modem */
-    if (error->domain != MBIM_PROTOCOL_ERROR)
-        return;
+    ctx = g_task_get_task_data (task);
 
-    ctx = g_slice_new (ReportErrorContext);
-    ctx->self = g_object_ref (self);
-    ctx->message = mbim_message_error_new (transaction_id, error->code);
+    /* Commands may complete right away while being launched */
+    if (ctx->launching) {
+        ctx->relaunch = TRUE;
+        return;
+    }
 
-    source = g_idle_source_new ();
-    g_source_set_callback (source, (GSourceFunc)device_report_error_in_idle, ctx, NULL);
-    g_source_attach (source, g_main_context_get_thread_default ());
-    g_source_unref (source);
+    ctx->launching = TRUE;
+    do {
+        ctx->relaunch = FALSE;
+        command_batch_launch_pass (task);
+    } while (ctx->relaunch);
+    ctx->launching = FALSE;
+
+    if (ctx->n_pending == 0 && ctx->next == ctx->results->len) {
+        g_timer_stop (ctx->timer);
+        g_task_return_pointer (task,
+                               g_ptr_array_ref (ctx->results),
+                               (GDestroyNotify)g_ptr_array_unref);
+        g_object_unref (task);
+    }
 }
 
-/*****************************************************************************/
-/* Command */
-
 /**
- * mbim_device_command_finish:
+ * mbim_device_command_batch_finish:
  * @self: a #MbimDevice.
  * @res: a #GAsyncResult.
+ * @elapsed: (out) (allow-none): return location for the time, in seconds, taken by the whole batch, or %NULL.
  * @error: Return location for error or %NULL.
  *
- * Finishes an operation started with mbim_device_command().
+ * Finishes an operation started with mbim_device_command_batch().
  *
- * Returns: a #MbimMessage response, or #NULL if @error is set. The returned value should be freed with mbim_message_unref().
+ * Commands that failed don't make the whole operation fail; the per-command
+ * result includes the error reported.
+ *
+ * Returns: (transfer full) (element-type MbimDeviceCommandResult): a #GPtrArray of #MbimDeviceCommandResult, in the same order as the commands in the batch, or %NULL if @error is set. The returned value should be freed with g_ptr_array_unref().
  */
-MbimMessage *
-mbim_device_command_finish (MbimDevice    *self,
-                            GAsyncResult  *res,
-                            GError       **error)
+GPtrArray *
+mbim_device_command_batch_finish (MbimDevice    *self,
+                                  GAsyncResult  *res,
+                                  gdouble       *elapsed,
+                                  GError       **error)
 {
-    return g_task_propagate_pointer (G_TASK (res), error);
+    GPtrArray *results;
+
+    results = g_task_propagate_pointer (G_TASK (res), error);
+    if (results && elapsed) {
+        CommandBatchContext *ctx;
+
+        ctx = g_task_get_task_data (G_TASK (res));
+        *elapsed = g_timer_elapsed (ctx->timer, NULL);
+    }
+    return results;
+}
+
+/* Reserves a block of consecutive transaction IDs, returning the first one */
+static guint32
+device_reserve_transaction_ids (MbimDevice *self,
+                                guint       n)
+{
+    guint32 first;
+
+    g_assert (n > 0);
+
+    g_mutex_lock (&self->priv->lock);
+
+    /* Keep the block contiguous, restarting if it would wrap around */
+    if (G_MAXUINT32 - self->priv->transaction_id < n - 1)
+        self->priv->transaction_id = 0x01;
+
+    first = self->priv->transaction_id;
+    if (G_MAXUINT32 - first == n - 1)
+        self->priv->transaction_id = 0x01;
+    else
+        self->priv->transaction_id = first + n;
+
+    g_mutex_unlock (&self->priv->lock);
+
+    return first;
 }
 
 /**
- * mbim_device_command:
+ * mbim_device_command_batch:
  * @self: a #MbimDevice.
- * @message: the message to send.
- * @timeout: maximum time, in seconds, to wait for the response.
+ * @batch: a #MbimDeviceCommandBatch.
+ * @flags: a set of #MbimDeviceCommandBatchFlags.
+ * @max_pending: maximum number of commands waiting for a response at the same time, or 0 for no limit.
  * @cancellable: a #GCancellable, or %NULL.
  * @callback: a #GAsyncReadyCallback to call when the operation is finished.
  * @user_data: the data to pass to callback function.
  *
- * Asynchronously sends a #MbimMessage to the device.
+ * Asynchronously sends all the commands in @batch to the device.
+ *
+ * Commands are sent in order, without waiting for the previous responses,
+ * unless they depend on a command not yet completed or @max_pending commands
+ * are already waiting for a response. Commands without an explicit
+ * transaction ID get consecutive ones, allocated in a single block.
+ *
+ * @batch must not be modified until the operation is finished.
  *
  * When the operation is finished @callback will be called. You can then call
- * mbim_device_command_finish() to get the result of the operation.
+ * mbim_device_command_batch_finish() to get the result of the operation.
  */
 void
-mbim_device_command (MbimDevice          *self,
-                     MbimMessage         *message,
-                     guint                timeout,
-                     GCancellable        *cancellable,
-                     GAsyncReadyCallback  callback,
-                     gpointer             user_data)
+mbim_device_command_batch (MbimDevice                  *self,
+                           MbimDeviceCommandBatch      *batch,
+                           MbimDeviceCommandBatchFlags  flags,
+                           guint                        max_pending,
+                           GCancellable                *cancellable,
+                           GAsyncReadyCallback          callback,
+                           gpointer                     user_data)
 {
-    GError  *error = NULL;
-    GTask   *task;
-    guint32  transaction_id;
+    CommandBatchContext *ctx;
+    GTask               *task;
+    guint                n_without_id = 0;
+    guint32              transaction_id = 0;
+    guint                i;
 
     g_return_if_fail (MBIM_IS_DEVICE (self));
-    g_return_if_fail (message != NULL);
+    g_return_if_fail (batch != NULL);
 
-    /* If the message comes without a explicit transaction ID, add one
-     * ourselves */
-    transaction_id = mbim_message_get_transaction_id (message);
-    if (!transaction_id) {
-        transaction_id = mbim_device_get_next_transaction_id (self);
-        mbim_message_set_transaction_id (message, transaction_id);
-    }
+    ctx = g_slice_new0 (CommandBatchContext);
+    ctx->batch = mbim_device_command_batch_ref (batch);
+    ctx->flags = flags;
+    ctx->max_pending = max_pending;
+    ctx->results = g_ptr_array_new_full (batch->commands->len, (GDestroyNotify)device_command_result_free);
+    ctx->states = g_new0 (BatchCommandState, batch->commands->len);
+    ctx->timer = g_timer_new ();
 
-    task = transaction_task_new (self,
-                                 MBIM_MESSAGE_GET_MESSAGE_TYPE (message),
-                                 transaction_id,
-                                 cancellable,
-                                 callback,
-                                 user_data);
+    for (i = 0; i < batch->commands->len; i++) {
+        BatchCommand *command;
 
-    /* Device must be open */
-    if (!self->priv->iochannel) {
-        error = g_error_new (MBIM_CORE_ERROR,
-                             MBIM_CORE_ERROR_WRONG_STATE,
-                             "Device must be open to send commands");
-        transaction_task_complete_and_free (task, error);
-        g_error_free (error);
-        return;
+        command = g_ptr_array_index (batch->commands, i);
+        if (!mbim_message_get_transaction_id (command->message))
+            n_without_id++;
+        g_ptr_array_add (ctx->results, device_command_result_new (command->message));
     }
 
-    /* Setup context to match response */
-    if (!device_store_transaction (self, TRANSACTION_TYPE_HOST, task, timeout * 1000, &error)) {
-        g_prefix_error (&error, "Cannot store transaction: ");
-        transaction_task_complete_and_free (task, error);
-        g_error_free (error);
-        return;
-    }
+    if (n_without_id)
+        transaction_id = device_reserve_transaction_ids (self, n_without_id);
+    for (i = 0; i < ctx->results->len && n_without_id; i++) {
+        MbimDeviceCommandResult *result;
 
-    if (!device_send (self, message, &error)) {
-        /* Match transaction so that we remove it from our tracking table */
-        task = device_release_transaction (self,
-                                           TRANSACTION_TYPE_HOST,
-                                           MBIM_MESSAGE_GET_MESSAGE_TYPE (message),
-                                           mbim_message_get_transaction_id (message));
-        transaction_task_complete_and_free (task, error);
-        g_error_free (error);
-        return;
+        result = g_ptr_array_index (ctx->results, i);
+        if (!mbim_message_get_transaction_id (result->request)) {
+            mbim_message_set_transaction_id (result->request, transaction_id++);
+            n_without_id--;
+        }
     }
 
-    /* Just return, we'll get response asynchronously */
+    task = g_task_new (self, cancellable, callback, user_data);
+    g_task_set_task_data (task, ctx, (GDestroyNotify)command_batch_context_free);
+
+    command_batch_launch (task);
 }
 
 /*****************************************************************************/
@@ -2364,7 +4149,9 @@ set_property (GObject      *object,
         self->priv->path_display = g_filename_display_name (self->priv->path);
         break;
     case PROP_TRANSACTION_ID:
+        g_mutex_lock (&self->priv->lock);
         self->priv->transaction_id = g_value_get_uint (value);
+        g_mutex_unlock (&self->priv->lock);
         break;
     case PROP_IN_SESSION:
         self->priv->in_session = g_value_get_boolean (value);
@@ -2388,11 +4175,31 @@ get_property (GObject    *object,
         g_value_set_object (value, self->priv->file);
         break;
     case PROP_TRANSACTION_ID:
+        g_mutex_lock (&self->priv->lock);
         g_value_set_uint (value, self->priv->transaction_id);
+        g_mutex_unlock (&self->priv->lock);
         break;
     case PROP_IN_SESSION:
         g_value_set_boolean (value, self->priv->in_session);
         break;
+    case PROP_MAX_CONTROL_MESSAGE:
+        g_mutex_lock (&self->priv->lock);
+        g_value_set_uint (value, self->priv->max_control_message);
+        g_mutex_unlock (&self->priv->lock);
+        break;
+    case PROP_MAX_SEGMENT_SIZE:
+        g_mutex_lock (&self->priv->lock);
+        g_value_set_uint (value, self->priv->max_segment_size);
+        g_mutex_unlock (&self->priv->lock);
+        break;
+    case PROP_NETWORK_CAPABILITIES:
+        g_mutex_lock (&self->priv->lock);
+        g_value_set_uint (value, self->priv->network_capabilities);
+        g_mutex_unlock (&self->priv->lock);
+        break;
+    case PROP_STATISTICS:
+        g_value_take_variant (value, mbim_device_get_statistics (self));
+        break;
     default:
         G_OBJECT_WARN_INVALID_PROPERTY_ID (object, prop_id, pspec);
         break;
@@ -2409,6 +4216,8 @@ mbim_device_init (MbimDevice *self)
     /* Initialize transaction ID */
     self->priv->transaction_id = 0x01;
     self->priv->open_status = OPEN_STATUS_CLOSED;
+    self->priv->stats = _mbim_device_stats_new ();
+    g_mutex_init (&self->priv->lock);
 }
 
 static void
@@ -2439,6 +4248,14 @@ finalize (GObject *object)
         }
     }
 
+    _mbim_device_stats_free (self->priv->stats);
+
+    _mbim_probe_list_free (self->priv->probes);
+
+    if (self->priv->main_context)
+        g_main_context_unref (self->priv->main_context);
+    g_mutex_clear (&self->priv->lock);
+
     g_free (self->priv->path);
     g_free (self->priv->path_display);
 
@@ -2490,6 +4307,45 @@ mbim_device_class_init (MbimDeviceClass *klass)
                               G_PARAM_READWRITE);
     g_object_class_install_property (object_class, PROP_IN_SESSION, properties[PROP_IN_SESSION]);
 
+    properties[PROP_MAX_CONTROL_MESSAGE] =
+        g_param_spec_uint (MBIM_DEVICE_MAX_CONTROL_MESSAGE,
+                           "Max control message",
+                           "wMaxControlMessage in the MBIM functional descriptor, 0 if unknown",
+                           0,
+                           G_MAXUINT16,
+                           0,
+                           G_PARAM_READABLE);
+    g_object_class_install_property (object_class, PROP_MAX_CONTROL_MESSAGE, properties[PROP_MAX_CONTROL_MESSAGE]);
+
+    properties[PROP_MAX_SEGMENT_SIZE] =
+        g_param_spec_uint (MBIM_DEVICE_MAX_SEGMENT_SIZE,
+                           "Max segment size",
+                           "wMaxSegmentSize in the MBIM functional descriptor, 0 if unknown",
+                           0,
+                           G_MAXUINT16,
+                           0,
+                           G_PARAM_READABLE);
+    g_object_class_install_property (object_class, PROP_MAX_SEGMENT_SIZE, properties[PROP_MAX_SEGMENT_SIZE]);
+
+    properties[PROP_NETWORK_CAPABILITIES] =
+        g_param_spec_uint (MBIM_DEVICE_NETWORK_CAPABILITIES,
+                           "Network capabilities",
+                           "bmNetworkCapabilities in the MBIM functional descriptor, 0 if unknown",
+                           0,
+                           G_MAXUINT8,
+                           0,
+                           G_PARAM_READABLE);
+    g_object_class_install_property (object_class, PROP_NETWORK_CAPABILITIES, properties[PROP_NETWORK_CAPABILITIES]);
+
+    properties[PROP_STATISTICS] =
+        g_param_spec_variant (MBIM_DEVICE_STATISTICS,
+                              "Statistics",
+                              "Snapshot of the message statistics, as given by mbim_device_get_statistics()",
+                              G_VARIANT_TYPE ("a{sv}"),
+                              NULL,
+                              G_PARAM_READABLE);
+    g_object_class_install_property (object_class, PROP_STATISTICS, properties[PROP_STATISTICS]);
+
   /**
    * MbimDevice::device-indicate-status:
    * @self: the #MbimDevice
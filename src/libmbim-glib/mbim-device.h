@@ -31,6 +31,7 @@
 #include <gio/gio.h>
 
 #include "mbim-message.h"
+#include "mbim-probe.h"
 
 G_BEGIN_DECLS
 
@@ -45,9 +46,13 @@ typedef struct _MbimDevice MbimDevice;
 typedef struct _MbimDeviceClass MbimDeviceClass;
 typedef struct _MbimDevicePrivate MbimDevicePrivate;
 
-#define MBIM_DEVICE_FILE           "device-file"
-#define MBIM_DEVICE_TRANSACTION_ID "device-transaction-id"
-#define MBIM_DEVICE_IN_SESSION     "device-in-session"
+#define MBIM_DEVICE_FILE                 "device-file"
+#define MBIM_DEVICE_TRANSACTION_ID       "device-transaction-id"
+#define MBIM_DEVICE_IN_SESSION           "device-in-session"
+#define MBIM_DEVICE_MAX_CONTROL_MESSAGE  "device-max-control-message"
+#define MBIM_DEVICE_MAX_SEGMENT_SIZE     "device-max-segment-size"
+#define MBIM_DEVICE_NETWORK_CAPABILITIES "device-network-capabilities"
+#define MBIM_DEVICE_STATISTICS           "device-statistics"
 
 #define MBIM_DEVICE_SIGNAL_INDICATE_STATUS "device-indicate-status"
 #define MBIM_DEVICE_SIGNAL_ERROR           "device-error"
@@ -116,6 +121,30 @@ gboolean mbim_device_open_finish (MbimDevice           *self,
                                   GAsyncResult         *res,
                                   GError              **error);
 
+/**
+ * MbimDeviceOpenResult:
+ *
+ * An opaque type representing the result of opening one of the devices given
+ * to mbim_device_open_batch().
+ */
+typedef struct _MbimDeviceOpenResult MbimDeviceOpenResult;
+
+const gchar  *mbim_device_open_result_get_path         (const MbimDeviceOpenResult *self);
+MbimDevice   *mbim_device_open_result_get_device       (const MbimDeviceOpenResult *self);
+const GError *mbim_device_open_result_get_error        (const MbimDeviceOpenResult *self);
+guint         mbim_device_open_result_get_attempts     (const MbimDeviceOpenResult *self);
+gdouble       mbim_device_open_result_get_time_to_open (const MbimDeviceOpenResult *self);
+
+void       mbim_device_open_batch        (const gchar * const   *paths,
+                                          MbimDeviceOpenFlags    flags,
+                                          guint                  timeout,
+                                          guint                  max_concurrent,
+                                          GCancellable          *cancellable,
+                                          GAsyncReadyCallback    callback,
+                                          gpointer               user_data);
+GPtrArray *mbim_device_open_batch_finish (GAsyncResult          *res,
+                                          GError               **error);
+
 void     mbim_device_close        (MbimDevice           *self,
                                    guint                 timeout,
                                    GCancellable         *cancellable,
@@ -130,6 +159,16 @@ gboolean mbim_device_close_force (MbimDevice *self,
 
 guint32 mbim_device_get_next_transaction_id (MbimDevice *self);
 
+GVariant *mbim_device_get_statistics (MbimDevice *self);
+
+guint mbim_device_add_probe    (MbimDevice     *self,
+                                MbimProbePoint  points,
+                                MbimProbeFunc   func,
+                                gpointer        user_data,
+                                GDestroyNotify  user_data_free);
+void  mbim_device_remove_probe (MbimDevice     *self,
+                                guint           probe_id);
+
 void         mbim_device_command        (MbimDevice           *self,
                                          MbimMessage          *message,
                                          guint                 timeout,
@@ -139,6 +178,80 @@ void         mbim_device_command        (MbimDevice           *self,
 MbimMessage *mbim_device_command_finish (MbimDevice           *self,
                                          GAsyncResult         *res,
                                          GError              **error);
+MbimMessage *mbim_device_command_sync   (MbimDevice           *self,
+                                         MbimMessage          *message,
+                                         guint                 timeout,
+                                         GCancellable         *cancellable,
+                                         GError              **error);
+
+/**
+ * MbimDeviceCommandBatch:
+ *
+ * An opaque type representing a list of commands to be sent with
+ * mbim_device_command_batch().
+ */
+typedef struct _MbimDeviceCommandBatch MbimDeviceCommandBatch;
+
+MbimDeviceCommandBatch *mbim_device_command_batch_new            (void);
+MbimDeviceCommandBatch *mbim_device_command_batch_ref            (MbimDeviceCommandBatch *self);
+void                    mbim_device_command_batch_unref          (MbimDeviceCommandBatch *self);
+guint                   mbim_device_command_batch_add            (MbimDeviceCommandBatch *self,
+                                                                  MbimMessage            *message,
+                                                                  guint                   timeout);
+void                    mbim_device_command_batch_add_dependency (MbimDeviceCommandBatch *self,
+                                                                  guint                   index,
+                                                                  guint                   depends_on);
+
+/**
+ * MbimDeviceCommandResult:
+ *
+ * An opaque type representing the result of one of the commands sent with
+ * mbim_device_command_batch().
+ */
+typedef struct _MbimDeviceCommandResult MbimDeviceCommandResult;
+
+MbimMessage  *mbim_device_command_result_get_request  (const MbimDeviceCommandResult *self);
+MbimMessage  *mbim_device_command_result_get_response (const MbimDeviceCommandResult *self);
+const GError *mbim_device_command_result_get_error    (const MbimDeviceCommandResult *self);
+gdouble       mbim_device_command_result_get_time     (const MbimDeviceCommandResult *self);
+
+/**
+ * MbimDeviceCommandBatchFlags:
+ * @MBIM_DEVICE_COMMAND_BATCH_FLAGS_NONE: None.
+ * @MBIM_DEVICE_COMMAND_BATCH_FLAGS_SEQUENTIAL: Each command depends on the previous one.
+ * @MBIM_DEVICE_COMMAND_BATCH_FLAGS_STOP_ON_ERROR: Don't send any more commands once one has failed.
+ *
+ * Flags to specify how the commands in a batch are sent.
+ */
+typedef enum {
+    MBIM_DEVICE_COMMAND_BATCH_FLAGS_NONE          = 0,
+    MBIM_DEVICE_COMMAND_BATCH_FLAGS_SEQUENTIAL    = 1 << 0,
+    MBIM_DEVICE_COMMAND_BATCH_FLAGS_STOP_ON_ERROR = 1 << 1
+} MbimDeviceCommandBatchFlags;
+
+void       mbim_device_command_batch        (MbimDevice                   *self,
+                                             MbimDeviceCommandBatch       *batch,
+                                             MbimDeviceCommandBatchFlags   flags,
+                                             guint                         max_pending,
+                                             GCancellable                 *cancellable,
+                                             GAsyncReadyCallback           callback,
+                                             gpointer                      user_data);
+GPtrArray *mbim_device_command_batch_finish (MbimDevice                   *self,
+                                             GAsyncResult                 *res,
+                                             gdouble                      *elapsed,
+                                             GError                      **error);
+
+/*****************************************************************************/
+/* Private methods */
+
+#if defined (LIBMBIM_GLIB_COMPILATION)
+gboolean _mbim_device_read_functional_descriptor (const gchar  *descriptors_path,
+                                                  const gchar  *path_display,
+                                                  guint16      *max_control_message,
+                                                  guint16      *max_segment_size,
+                                                  guint8       *network_capabilities,
+                                                  GError      **error);
+#endif
 
 G_END_DECLS
 
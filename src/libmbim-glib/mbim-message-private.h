@@ -33,6 +33,7 @@
 #include <glib.h>
 
 #include "mbim-message.h"
+#include "mbim-schema.h"
 
 G_BEGIN_DECLS
 
@@ -163,6 +164,67 @@ struct fragment_info *_mbim_message_split_fragments (const MbimMessage *self,
                                                      guint32            max_fragment_size,
                                                      guint             *n_fragments);
 
+/*****************************************************************************/
+/* Printer
+ *
+ * Writes printable output into a fixed size buffer, handed over to the
+ * printer callback when full or when flushed.
+ *
+ * In key-value mode, the JSON written by the message walk is turned into
+ * key=value lines as it goes: keys given to _mbim_printer_append_json_key()
+ * and array indices are joined with dots into the key of every value. */
+
+#define MBIM_PRINTER_BUFFER_SIZE 1024
+
+typedef struct {
+    MbimMessagePrinterFunc  func;
+    gpointer                user_data;
+    gsize                   len;
+    gchar                   buffer[MBIM_PRINTER_BUFFER_SIZE];
+    /* Key-value mode only */
+    GString                *key;
+    GArray                 *key_levels;
+    gboolean                in_value;
+} MbimPrinter;
+
+void _mbim_printer_init          (MbimPrinter            *printer,
+                                  MbimMessagePrinterFunc  func,
+                                  gpointer                user_data);
+void _mbim_printer_init_keyvalue (MbimPrinter            *printer,
+                                  const gchar            *key_prefix,
+                                  MbimMessagePrinterFunc  func,
+                                  gpointer                user_data);
+void _mbim_printer_clear         (MbimPrinter            *printer);
+void _mbim_printer_flush         (MbimPrinter            *printer);
+void _mbim_printer_append_len    (MbimPrinter            *printer,
+                                  const gchar            *str,
+                                  gsize                   len);
+void _mbim_printer_append        (MbimPrinter            *printer,
+                                  const gchar            *str);
+void _mbim_printer_append_printf (MbimPrinter            *printer,
+                                  const gchar            *format,
+                                  ...) G_GNUC_PRINTF (2, 3);
+void _mbim_printer_append_prefix (MbimPrinter            *printer,
+                                  const gchar            *line_prefix,
+                                  guint                   indent);
+void _mbim_printer_append_hex    (MbimPrinter            *printer,
+                                  const guint8           *data,
+                                  gsize                   len,
+                                  gchar                   separator);
+void _mbim_printer_append_uuid   (MbimPrinter            *printer,
+                                  const MbimUuid         *uuid);
+void _mbim_printer_append_ip     (MbimPrinter            *printer,
+                                  const guint8           *addr,
+                                  gboolean                ipv6);
+
+/* JSON output; keys are preceded by a comma unless they're the first member
+ * of the object, as counted in n_members */
+void _mbim_printer_append_json_string (MbimPrinter *printer,
+                                       const gchar *str);
+void _mbim_printer_append_json_key    (MbimPrinter *printer,
+                                       guint       *n_members,
+                                       const gchar *key);
+
 /*****************************************************************************/
 /* Struct builder */
 
@@ -219,6 +281,10 @@ MbimMessageCommandBuilder *_mbim_message_command_builder_new                  (g
                                                                                MbimService                service,
                                                                                guint32                    cid,
                                                                                MbimMessageCommandType     command_type);
+MbimMessageCommandBuilder *_mbim_message_command_done_builder_new             (guint32                    transaction_id,
+                                                                               MbimService                service,
+                                                                               guint32                    cid,
+                                                                               MbimStatusError            status);
 MbimMessage               *_mbim_message_command_builder_complete             (MbimMessageCommandBuilder *builder);
 void                       _mbim_message_command_builder_append_byte_array    (MbimMessageCommandBuilder *builder,
                                                                                gboolean                   with_offset,
@@ -291,6 +357,88 @@ MbimIPv6        *_mbim_message_read_ipv6_array    (const MbimMessage *self,
                                                    guint32            array_size,
                                                    guint32            relative_offset_array_start);
 
+/*****************************************************************************/
+/* Field tables
+ *
+ * The codegen describes the contents of each message and struct with these
+ * tables, exposed read-only in the public schema API. The table backend also
+ * relies on them instead of emitting unrolled parsers, builders, printers and
+ * JSON encoders; a generic interpreter runs on them. */
+
+struct _MbimField {
+    const gchar            *name;
+    MbimFieldFormat         format;
+    /* Enum or flags type given in the public API, if any */
+    GType                 (* public_get_type) (void);
+    /* Number of elements in byte-array fields */
+    guint32                 array_size;
+    /* Index of the guint32 field giving the number of elements, valid only if
+     * has_array_size_field is set */
+    guint8                  array_size_field;
+    /* Index of the guint32 field the availability depends on, valid only if
+     * condition is not NONE */
+    guint8                  condition_field;
+    MbimFieldCondition      condition;
+    guint32                 condition_value;
+    /* Offsets of the member, and of its size companion in unsized byte
+     * arrays, in the C struct; only in struct fields */
+    guint16                 member_offset;
+    guint16                 member_size_offset;
+    /* Struct type in struct and struct array fields */
+    const MbimStructFields *struct_fields;
+    guint                   has_array_size_field : 1;
+    /* Set in guint32 fields used as array size or condition by others */
+    guint                   referenced           : 1;
+    /* Set in byte arrays not padded to 4 bytes when building */
+    guint                   unpadded             : 1;
+};
+
+struct _MbimStructFields {
+    const gchar     *name;
+    /* Size of the C struct */
+    gsize            size;
+    /* Size in the message, if fixed; 0 otherwise */
+    guint32          wire_size;
+    const MbimField *fields;
+    guint            n_fields;
+};
+
+struct _MbimMessageFields {
+    MbimService             service;
+    guint32                 cid;
+    MbimMessageType         message_type;
+    /* Only in MBIM_MESSAGE_TYPE_COMMAND messages */
+    MbimMessageCommandType  command_type;
+    const MbimField        *fields;
+    guint                   n_fields;
+};
+
+/* Field arguments are given in the same order as in the public methods; i.e.
+ * values for guint32 and guint64 fields, size and pointer for unsized and
+ * referenced byte arrays, and pointer for all the others. Output arguments
+ * may be NULL. */
+MbimMessage *_mbim_message_fields_new      (const MbimMessageFields  *fields,
+                                            ...);
+gboolean     _mbim_message_fields_parse    (const MbimMessage        *self,
+                                            const MbimMessageFields  *fields,
+                                            GError                  **error,
+                                            ...);
+gboolean     _mbim_message_fields_validate (const MbimMessage        *self,
+                                            const MbimMessageFields  *fields,
+                                            GError                  **error);
+void         _mbim_message_fields_print    (const MbimMessage        *self,
+                                            const MbimMessageFields  *fields,
+                                            MbimPrinter              *printer,
+                                            const gchar              *line_prefix);
+void         _mbim_message_fields_json     (const MbimMessage        *self,
+                                            const MbimMessageFields  *fields,
+                                            MbimPrinter              *printer);
+
+void _mbim_struct_fields_free       (const MbimStructFields *struct_fields,
+                                     gpointer                var);
+void _mbim_struct_fields_array_free (const MbimStructFields *struct_fields,
+                                     gpointer               *array);
+
 G_END_DECLS
 
 #endif /* _LIBMBIM_GLIB_MBIM_MESSAGE_PRIVATE_H_ */
@@ -26,9 +26,12 @@
 #include <stdio.h>
 #include <string.h>
 #include <endian.h>
+#include <arpa/inet.h>
 
+#include "mbim-common.h"
 #include "mbim-message.h"
 #include "mbim-message-private.h"
+#include "mbim-cid-private.h"
 #include "mbim-error-types.h"
 #include "mbim-enum-types.h"
 
@@ -846,6 +849,34 @@ _mbim_message_command_builder_new (guint32                transaction_id,
     return builder;
 }
 
+MbimMessageCommandBuilder *
+_mbim_message_command_done_builder_new (guint32         transaction_id,
+                                        MbimService     service,
+                                        guint32         cid,
+                                        MbimStatusError status)
+{
+    MbimMessageCommandBuilder *builder;
+    struct command_done_message *command_done;
+    GByteArray *self;
+
+    self = _mbim_message_allocate (MBIM_MESSAGE_TYPE_COMMAND_DONE,
+                                   transaction_id,
+                                   sizeof (struct command_done_message));
+
+    command_done = &(((struct full_message *)(self->data))->message.command_done);
+    command_done->fragment_header.total   = GUINT32_TO_LE (1);
+    command_done->fragment_header.current = 0;
+    memcpy (command_done->service_id, mbim_uuid_from_service (service), sizeof (MbimUuid));
+    command_done->command_id    = GUINT32_TO_LE (cid);
+    command_done->status_code   = GUINT32_TO_LE (status);
+    command_done->buffer_length = 0;
+
+    builder = g_slice_new (MbimMessageCommandBuilder);
+    builder->message = (MbimMessage *)self;
+    builder->contents_builder = _mbim_struct_builder_new ();
+    return builder;
+}
+
 MbimMessage *
 _mbim_message_command_builder_complete (MbimMessageCommandBuilder *builder)
 {
@@ -856,9 +887,16 @@ _mbim_message_command_builder_complete (MbimMessageCommandBuilder *builder)
     contents = _mbim_struct_builder_complete (builder->contents_builder);
 
     /* Merge both buffers */
-    mbim_message_command_append (builder->message,
-                                 (const guint8 *)contents->data,
-                                 (guint32)contents->len);
+    if (MBIM_MESSAGE_GET_MESSAGE_TYPE (builder->message) == MBIM_MESSAGE_TYPE_COMMAND_DONE) {
+        g_byte_array_append ((GByteArray *)builder->message, contents->data, contents->len);
+        ((struct header *)(builder->message->data))->length =
+            GUINT32_TO_LE (MBIM_MESSAGE_GET_MESSAGE_LENGTH (builder->message) + contents->len);
+        ((struct full_message *)(builder->message->data))->message.command_done.buffer_length =
+            GUINT32_TO_LE (contents->len);
+    } else
+        mbim_message_command_append (builder->message,
+                                     (const guint8 *)contents->data,
+                                     (guint32)contents->len);
     g_byte_array_unref (contents);
 
     /* Steal the message to return */
@@ -1124,40 +1162,482 @@ mbim_message_get_raw (const MbimMessage  *self,
     return self->data;
 }
 
-/**
- * mbim_message_get_printable:
- * @self: a #MbimMessage.
- * @line_prefix: prefix string to use in each new generated line.
- * @headers_only: %TRUE if only basic headers should be printed.
- *
- * Gets a printable string with the contents of the whole MBIM message.
- *
- * Returns: (transfer full): a newly allocated string, which should be freed with g_free().
- */
-gchar *
-mbim_message_get_printable (const MbimMessage *self,
-                            const gchar       *line_prefix,
-                            gboolean           headers_only)
+/*****************************************************************************/
+/* Printer */
+
+/* Each object or array being written in key-value mode */
+typedef struct {
+    gsize key_len;
+    /* Index of the current element, -1 in objects */
+    gint  index;
+} KeyLevel;
+
+void
+_mbim_printer_init (MbimPrinter            *printer,
+                    MbimMessagePrinterFunc  func,
+                    gpointer                user_data)
 {
-    GString *printable;
-    MbimService service_read_fields = MBIM_SERVICE_INVALID;
+    printer->func = func;
+    printer->user_data = user_data;
+    printer->len = 0;
+    printer->key = NULL;
+    printer->key_levels = NULL;
+    printer->in_value = FALSE;
+}
 
-    g_return_val_if_fail (self != NULL, NULL);
-    g_return_val_if_fail (line_prefix != NULL, NULL);
+void
+_mbim_printer_init_keyvalue (MbimPrinter            *printer,
+                             const gchar            *key_prefix,
+                             MbimMessagePrinterFunc  func,
+                             gpointer                user_data)
+{
+    _mbim_printer_init (printer, func, user_data);
+    printer->key = g_string_new (key_prefix);
+    printer->key_levels = g_array_new (FALSE, FALSE, sizeof (KeyLevel));
+}
 
-    if (!line_prefix)
-        line_prefix = "";
+void
+_mbim_printer_clear (MbimPrinter *printer)
+{
+    if (printer->key) {
+        g_string_free (printer->key, TRUE);
+        printer->key = NULL;
+    }
+    if (printer->key_levels) {
+        g_array_unref (printer->key_levels);
+        printer->key_levels = NULL;
+    }
+}
 
-    printable = g_string_new ("");
-    g_string_append_printf (printable,
-                            "%sHeader:\n"
-                            "%s  length      = %u\n"
-                            "%s  type        = %s (0x%08x)\n"
-                            "%s  transaction = %u\n",
-                            line_prefix,
-                            line_prefix, MBIM_MESSAGE_GET_MESSAGE_LENGTH (self),
-                            line_prefix, mbim_message_type_get_string (MBIM_MESSAGE_GET_MESSAGE_TYPE (self)), MBIM_MESSAGE_GET_MESSAGE_TYPE (self),
-                            line_prefix, MBIM_MESSAGE_GET_TRANSACTION_ID (self));
+void
+_mbim_printer_flush (MbimPrinter *printer)
+{
+    if (printer->len) {
+        printer->func (printer->buffer, printer->len, printer->user_data);
+        printer->len = 0;
+    }
+}
+
+static void
+printer_write (MbimPrinter *printer,
+               const gchar *str,
+               gsize        len)
+{
+    if (len > (sizeof (printer->buffer) - printer->len)) {
+        _mbim_printer_flush (printer);
+        /* Too long to be buffered, send right away */
+        if (len > sizeof (printer->buffer)) {
+            printer->func (str, len, printer->user_data);
+            return;
+        }
+    }
+
+    memcpy (&printer->buffer[printer->len], str, len);
+    printer->len += len;
+}
+
+static void
+printer_write_func (const gchar *str,
+                    gsize        len,
+                    gpointer     user_data)
+{
+    printer_write ((MbimPrinter *) user_data, str, len);
+}
+
+static KeyLevel *
+keyvalue_current_level (MbimPrinter *printer)
+{
+    if (!printer->key_levels->len)
+        return NULL;
+    return &g_array_index (printer->key_levels, KeyLevel, printer->key_levels->len - 1);
+}
+
+/* Replaces the last component of the key at the current level */
+static void
+keyvalue_set_key_component (MbimPrinter *printer,
+                            const gchar *component)
+{
+    KeyLevel *level;
+
+    level = keyvalue_current_level (printer);
+    if (level)
+        g_string_truncate (printer->key, level->key_len);
+    if (printer->key->len)
+        g_string_append_c (printer->key, '.');
+    g_string_append (printer->key, component);
+}
+
+static void
+keyvalue_begin_value (MbimPrinter *printer)
+{
+    if (printer->in_value)
+        return;
+    printer_write (printer, printer->key->str, printer->key->len);
+    printer_write (printer, "=", 1);
+    printer->in_value = TRUE;
+}
+
+static void
+keyvalue_end_value (MbimPrinter *printer)
+{
+    if (!printer->in_value)
+        return;
+    printer_write (printer, "\n", 1);
+    printer->in_value = FALSE;
+}
+
+static void
+keyvalue_push_level (MbimPrinter *printer,
+                     gboolean     array)
+{
+    KeyLevel level;
+
+    level.key_len = printer->key->len;
+    level.index = array ? 0 : -1;
+    g_array_append_val (printer->key_levels, level);
+    if (array)
+        keyvalue_set_key_component (printer, "0");
+}
+
+static void
+keyvalue_next_element (MbimPrinter *printer)
+{
+    KeyLevel *level;
+    gchar     index[12];
+
+    /* Members of objects get their key from _mbim_printer_append_json_key() */
+    level = keyvalue_current_level (printer);
+    if (!level || level->index < 0)
+        return;
+
+    g_snprintf (index, sizeof (index), "%d", ++level->index);
+    keyvalue_set_key_component (printer, index);
+}
+
+static void
+keyvalue_pop_level (MbimPrinter *printer)
+{
+    KeyLevel *level;
+
+    level = keyvalue_current_level (printer);
+    if (!level)
+        return;
+    g_string_truncate (printer->key, level->key_len);
+    g_array_set_size (printer->key_levels, printer->key_levels->len - 1);
+}
+
+static gboolean
+keyvalue_is_structural (gchar c)
+{
+    switch (c) {
+    case '{':
+    case '}':
+    case '[':
+    case ']':
+    case ',':
+    case '"':
+        return TRUE;
+    default:
+        return FALSE;
+    }
+}
+
+/* Strings and keys are given explicitly by the walk, so everything else
+ * written is either structure or the text of a number, literal or quoted
+ * hexadecimal string, none of which contain the structural characters */
+static void
+keyvalue_write (MbimPrinter *printer,
+                const gchar *str,
+                gsize        len)
+{
+    const gchar *start;
+    const gchar *end;
+    const gchar *p;
+
+    end = str + len;
+    for (start = p = str; p < end; p++) {
+        if (!keyvalue_is_structural (*p))
+            continue;
+
+        if (p > start) {
+            keyvalue_begin_value (printer);
+            printer_write (printer, start, p - start);
+        }
+        start = p + 1;
+
+        switch (*p) {
+        case '"':
+            /* Quotes of strings written piecewise, e.g. hexadecimal */
+            keyvalue_begin_value (printer);
+            break;
+        case '{':
+        case '[':
+            keyvalue_push_level (printer, *p == '[');
+            break;
+        case ',':
+            keyvalue_end_value (printer);
+            keyvalue_next_element (printer);
+            break;
+        default:
+            keyvalue_end_value (printer);
+            keyvalue_pop_level (printer);
+            break;
+        }
+    }
+
+    if (p > start) {
+        keyvalue_begin_value (printer);
+        printer_write (printer, start, p - start);
+    }
+}
+
+void
+_mbim_printer_append_len (MbimPrinter *printer,
+                          const gchar *str,
+                          gsize        len)
+{
+    if (printer->key)
+        keyvalue_write (printer, str, len);
+    else
+        printer_write (printer, str, len);
+}
+
+void
+_mbim_printer_append (MbimPrinter *printer,
+                      const gchar *str)
+{
+    if (str)
+        _mbim_printer_append_len (printer, str, strlen (str));
+}
+
+void
+_mbim_printer_append_printf (MbimPrinter *printer,
+                             const gchar *format,
+                             ...)
+{
+    va_list  args;
+    gint     n;
+    gchar   *str;
+
+    /* Key-value output needs to go through the filter */
+    if (printer->key) {
+        va_start (args, format);
+        str = g_strdup_vprintf (format, args);
+        va_end (args);
+        keyvalue_write (printer, str, strlen (str));
+        g_free (str);
+        return;
+    }
+
+    /* Try to print right into the buffer */
+    va_start (args, format);
+    n = g_vsnprintf (&printer->buffer[printer->len], sizeof (printer->buffer) - printer->len, format, args);
+    va_end (args);
+    if (n < 0)
+        return;
+    if ((gsize) n < (sizeof (printer->buffer) - printer->len)) {
+        printer->len += n;
+        return;
+    }
+
+    /* Didn't fit, retry in the empty buffer */
+    _mbim_printer_flush (printer);
+    if ((gsize) n < sizeof (printer->buffer)) {
+        va_start (args, format);
+        n = g_vsnprintf (printer->buffer, sizeof (printer->buffer), format, args);
+        va_end (args);
+        printer->len = n;
+        return;
+    }
+
+    /* Too long to be buffered */
+    va_start (args, format);
+    str = g_strdup_vprintf (format, args);
+    va_end (args);
+    printer->func (str, n, printer->user_data);
+    g_free (str);
+}
+
+void
+_mbim_printer_append_prefix (MbimPrinter *printer,
+                             const gchar *line_prefix,
+                             guint        indent)
+{
+    static const gchar spaces[] = "                ";
+
+    _mbim_printer_append (printer, line_prefix);
+    while (indent > 0) {
+        guint n;
+
+        n = MIN (indent, sizeof (spaces) - 1);
+        _mbim_printer_append_len (printer, spaces, n);
+        indent -= n;
+    }
+}
+
+void
+_mbim_printer_append_hex (MbimPrinter  *printer,
+                          const guint8 *data,
+                          gsize         len,
+                          gchar         separator)
+{
+    static const gchar hex[] = "0123456789abcdef";
+    gsize i;
+
+    for (i = 0; i < len; i++) {
+        gchar str[3];
+        guint n = 0;
+
+        str[n++] = hex[data[i] >> 4];
+        str[n++] = hex[data[i] & 0x0F];
+        if (separator && i < (len - 1))
+            str[n++] = separator;
+        _mbim_printer_append_len (printer, str, n);
+    }
+}
+
+void
+_mbim_printer_append_uuid (MbimPrinter    *printer,
+                           const MbimUuid *uuid)
+{
+    _mbim_printer_append_hex (printer, uuid->a, sizeof (uuid->a), '\0');
+    _mbim_printer_append_len (printer, "-", 1);
+    _mbim_printer_append_hex (printer, uuid->b, sizeof (uuid->b), '\0');
+    _mbim_printer_append_len (printer, "-", 1);
+    _mbim_printer_append_hex (printer, uuid->c, sizeof (uuid->c), '\0');
+    _mbim_printer_append_len (printer, "-", 1);
+    _mbim_printer_append_hex (printer, uuid->d, sizeof (uuid->d), '\0');
+    _mbim_printer_append_len (printer, "-", 1);
+    _mbim_printer_append_hex (printer, uuid->e, sizeof (uuid->e), '\0');
+}
+
+void
+_mbim_printer_append_ip (MbimPrinter  *printer,
+                         const guint8 *addr,
+                         gboolean      ipv6)
+{
+    gchar str[INET6_ADDRSTRLEN];
+
+    if (inet_ntop (ipv6 ? AF_INET6 : AF_INET, addr, str, sizeof (str)))
+        _mbim_printer_append (printer, str);
+}
+
+void
+_mbim_printer_append_json_string (MbimPrinter *printer,
+                                  const gchar *str)
+{
+    if (printer->key) {
+        keyvalue_begin_value (printer);
+        mbim_common_keyvalue_append_string (str, printer_write_func, printer);
+    } else
+        mbim_common_json_append_string (str, printer_write_func, printer);
+}
+
+void
+_mbim_printer_append_json_key (MbimPrinter *printer,
+                               guint       *n_members,
+                               const gchar *key)
+{
+    if (printer->key) {
+        /* The key replaces the one of the previous member */
+        keyvalue_end_value (printer);
+        keyvalue_set_key_component (printer, key);
+        (*n_members)++;
+        return;
+    }
+
+    if ((*n_members)++ > 0)
+        printer_write (printer, ",", 1);
+    mbim_common_json_append_string (key, printer_write_func, printer);
+    printer_write (printer, ":", 1);
+}
+
+/*****************************************************************************/
+
+static void
+message_print_fields (const MbimMessage *self,
+                      MbimService        service,
+                      MbimPrinter       *printer,
+                      const gchar       *line_prefix)
+{
+    const MbimCidEntry      *entry;
+    MbimCidPrintFunc         print_func = NULL;
+    const MbimMessageFields *fields = NULL;
+    const gchar             *error = NULL;
+
+    switch (MBIM_MESSAGE_GET_MESSAGE_TYPE (self)) {
+    case MBIM_MESSAGE_TYPE_COMMAND:
+        entry = _mbim_cid_lookup (service, mbim_message_command_get_cid (self));
+        if (!entry)
+            break;
+        switch (mbim_message_command_get_command_type (self)) {
+        case MBIM_MESSAGE_COMMAND_TYPE_QUERY:
+            print_func = entry->query_print;
+            fields = entry->query_fields;
+            break;
+        case MBIM_MESSAGE_COMMAND_TYPE_SET:
+            print_func = entry->set_print;
+            fields = entry->set_fields;
+            break;
+        default:
+            error = "Invalid command type";
+            break;
+        }
+        break;
+
+    case MBIM_MESSAGE_TYPE_COMMAND_DONE:
+        entry = _mbim_cid_lookup (service, mbim_message_command_done_get_cid (self));
+        if (entry) {
+            print_func = entry->response_print;
+            fields = entry->response_fields;
+        }
+        break;
+
+    case MBIM_MESSAGE_TYPE_INDICATE_STATUS:
+        entry = _mbim_cid_lookup (service, mbim_message_indicate_status_get_cid (self));
+        if (entry) {
+            print_func = entry->notification_print;
+            fields = entry->notification_fields;
+        }
+        break;
+
+    default:
+        error = "No contents expected in this message type";
+        break;
+    }
+
+    if (print_func) {
+        print_func (self, printer, line_prefix);
+        return;
+    }
+
+    if (fields) {
+        _mbim_message_fields_print (self, fields, printer, line_prefix);
+        return;
+    }
+
+    _mbim_printer_append_printf (printer,
+                                 "%sFields: %s\n",
+                                 line_prefix, error ? error : "Unknown contents");
+}
+
+static void
+message_print (const MbimMessage *self,
+               MbimPrinter       *printer,
+               const gchar       *line_prefix,
+               gboolean           headers_only)
+{
+    MbimService service_read_fields = MBIM_SERVICE_INVALID;
+
+    _mbim_printer_append_printf (printer,
+                                 "%sHeader:\n"
+                                 "%s  length      = %u\n"
+                                 "%s  type        = %s (0x%08x)\n"
+                                 "%s  transaction = %u\n",
+                                 line_prefix,
+                                 line_prefix, MBIM_MESSAGE_GET_MESSAGE_LENGTH (self),
+                                 line_prefix, mbim_message_type_get_string (MBIM_MESSAGE_GET_MESSAGE_TYPE (self)), MBIM_MESSAGE_GET_MESSAGE_TYPE (self),
+                                 line_prefix, MBIM_MESSAGE_GET_TRANSACTION_ID (self));
 
     switch (MBIM_MESSAGE_GET_MESSAGE_TYPE (self)) {
     case MBIM_MESSAGE_TYPE_INVALID:
@@ -1166,11 +1646,11 @@ mbim_message_get_printable (const MbimMessage *self,
 
     case MBIM_MESSAGE_TYPE_OPEN:
         if (!headers_only)
-            g_string_append_printf (printable,
-                                    "%sContents:\n"
-                                    "%s  max control transfer = %u\n",
-                                    line_prefix,
-                                    line_prefix, mbim_message_open_get_max_control_transfer (self));
+            _mbim_printer_append_printf (printer,
+                                         "%sContents:\n"
+                                         "%s  max control transfer = %u\n",
+                                         line_prefix,
+                                         line_prefix, mbim_message_open_get_max_control_transfer (self));
         break;
 
     case MBIM_MESSAGE_TYPE_CLOSE:
@@ -1181,11 +1661,11 @@ mbim_message_get_printable (const MbimMessage *self,
             MbimStatusError status;
 
             status = mbim_message_open_done_get_status_code (self);
-            g_string_append_printf (printable,
-                                    "%sContents:\n"
-                                    "%s  status error = '%s' (0x%08x)\n",
-                                    line_prefix,
-                                    line_prefix, mbim_status_error_get_string (status), status);
+            _mbim_printer_append_printf (printer,
+                                         "%sContents:\n"
+                                         "%s  status error = '%s' (0x%08x)\n",
+                                         line_prefix,
+                                         line_prefix, mbim_status_error_get_string (status), status);
         }
         break;
 
@@ -1194,11 +1674,11 @@ mbim_message_get_printable (const MbimMessage *self,
             MbimStatusError status;
 
             status = mbim_message_close_done_get_status_code (self);
-            g_string_append_printf (printable,
-                                    "%sContents:\n"
-                                    "%s  status error = '%s' (0x%08x)\n",
-                                    line_prefix,
-                                    line_prefix, mbim_status_error_get_string (status), status);
+            _mbim_printer_append_printf (printer,
+                                         "%sContents:\n"
+                                         "%s  status error = '%s' (0x%08x)\n",
+                                         line_prefix,
+                                         line_prefix, mbim_status_error_get_string (status), status);
         }
         break;
 
@@ -1208,22 +1688,22 @@ mbim_message_get_printable (const MbimMessage *self,
             MbimProtocolError error;
 
             error = mbim_message_error_get_error_status_code (self);
-            g_string_append_printf (printable,
-                                    "%sContents:\n"
-                                    "%s  error = '%s' (0x%08x)\n",
-                                    line_prefix,
-                                    line_prefix, mbim_protocol_error_get_string (error), error);
+            _mbim_printer_append_printf (printer,
+                                         "%sContents:\n"
+                                         "%s  error = '%s' (0x%08x)\n",
+                                         line_prefix,
+                                         line_prefix, mbim_protocol_error_get_string (error), error);
         }
         break;
 
     case MBIM_MESSAGE_TYPE_COMMAND:
-        g_string_append_printf (printable,
-                                "%sFragment header:\n"
-                                "%s  total   = %u\n"
-                                "%s  current = %u\n",
-                                line_prefix,
-                                line_prefix, _mbim_message_fragment_get_total (self),
-                                line_prefix, _mbim_message_fragment_get_current (self));
+        _mbim_printer_append_printf (printer,
+                                     "%sFragment header:\n"
+                                     "%s  total   = %u\n"
+                                     "%s  current = %u\n",
+                                     line_prefix,
+                                     line_prefix, _mbim_message_fragment_get_total (self),
+                                     line_prefix, _mbim_message_fragment_get_current (self));
         if (!headers_only) {
             gchar *uuid_printable;
             const gchar *cid_printable;
@@ -1233,27 +1713,27 @@ mbim_message_get_printable (const MbimMessage *self,
             uuid_printable = mbim_uuid_get_printable (mbim_message_command_get_service_id (self));
             cid_printable = mbim_cid_get_printable (mbim_message_command_get_service (self),
                                                     mbim_message_command_get_cid (self));
-            g_string_append_printf (printable,
-                                    "%sContents:\n"
-                                    "%s  service = '%s' (%s)\n"
-                                    "%s  cid     = '%s' (0x%08x)\n"
-                                    "%s  type    = '%s' (0x%08x)\n",
-                                    line_prefix,
-                                    line_prefix, mbim_service_lookup_name (mbim_message_command_get_service (self)), uuid_printable,
-                                    line_prefix, cid_printable, mbim_message_command_get_cid (self),
-                                    line_prefix, mbim_message_command_type_get_string (mbim_message_command_get_command_type (self)), mbim_message_command_get_command_type (self));
+            _mbim_printer_append_printf (printer,
+                                         "%sContents:\n"
+                                         "%s  service = '%s' (%s)\n"
+                                         "%s  cid     = '%s' (0x%08x)\n"
+                                         "%s  type    = '%s' (0x%08x)\n",
+                                         line_prefix,
+                                         line_prefix, mbim_service_lookup_name (mbim_message_command_get_service (self)), uuid_printable,
+                                         line_prefix, cid_printable, mbim_message_command_get_cid (self),
+                                         line_prefix, mbim_message_command_type_get_string (mbim_message_command_get_command_type (self)), mbim_message_command_get_command_type (self));
             g_free (uuid_printable);
         }
         break;
 
     case MBIM_MESSAGE_TYPE_COMMAND_DONE:
-        g_string_append_printf (printable,
-                                "%sFragment header:\n"
-                                "%s  total   = %u\n"
-                                "%s  current = %u\n",
-                                line_prefix,
-                                line_prefix, _mbim_message_fragment_get_total (self),
-                                line_prefix, _mbim_message_fragment_get_current (self));
+        _mbim_printer_append_printf (printer,
+                                     "%sFragment header:\n"
+                                     "%s  total   = %u\n"
+                                     "%s  current = %u\n",
+                                     line_prefix,
+                                     line_prefix, _mbim_message_fragment_get_total (self),
+                                     line_prefix, _mbim_message_fragment_get_current (self));
         if (!headers_only) {
             gchar *uuid_printable;
             MbimStatusError status;
@@ -1265,27 +1745,27 @@ mbim_message_get_printable (const MbimMessage *self,
             uuid_printable = mbim_uuid_get_printable (mbim_message_command_done_get_service_id (self));
             cid_printable = mbim_cid_get_printable (mbim_message_command_done_get_service (self),
                                                     mbim_message_command_done_get_cid (self));
-            g_string_append_printf (printable,
-                                    "%sContents:\n"
-                                    "%s  status error = '%s' (0x%08x)\n"
-                                    "%s  service      = '%s' (%s)\n"
-                                    "%s  cid          = '%s' (0x%08x)\n",
-                                    line_prefix,
-                                    line_prefix, mbim_status_error_get_string (status), status,
-                                    line_prefix, mbim_service_lookup_name (mbim_message_command_done_get_service (self)), uuid_printable,
-                                    line_prefix, cid_printable, mbim_message_command_done_get_cid (self));
+            _mbim_printer_append_printf (printer,
+                                         "%sContents:\n"
+                                         "%s  status error = '%s' (0x%08x)\n"
+                                         "%s  service      = '%s' (%s)\n"
+                                         "%s  cid          = '%s' (0x%08x)\n",
+                                         line_prefix,
+                                         line_prefix, mbim_status_error_get_string (status), status,
+                                         line_prefix, mbim_service_lookup_name (mbim_message_command_done_get_service (self)), uuid_printable,
+                                         line_prefix, cid_printable, mbim_message_command_done_get_cid (self));
             g_free (uuid_printable);
         }
         break;
 
     case MBIM_MESSAGE_TYPE_INDICATE_STATUS:
-        g_string_append_printf (printable,
-                                "%sFragment header:\n"
-                                "%s  total   = %u\n"
-                                "%s  current = %u\n",
-                                line_prefix,
-                                line_prefix, _mbim_message_fragment_get_total (self),
-                                line_prefix, _mbim_message_fragment_get_current (self));
+        _mbim_printer_append_printf (printer,
+                                     "%sFragment header:\n"
+                                     "%s  total   = %u\n"
+                                     "%s  current = %u\n",
+                                     line_prefix,
+                                     line_prefix, _mbim_message_fragment_get_total (self),
+                                     line_prefix, _mbim_message_fragment_get_current (self));
         if (!headers_only) {
             gchar *uuid_printable;
             const gchar *cid_printable;
@@ -1295,85 +1775,2191 @@ mbim_message_get_printable (const MbimMessage *self,
             uuid_printable = mbim_uuid_get_printable (mbim_message_indicate_status_get_service_id (self));
             cid_printable = mbim_cid_get_printable (mbim_message_indicate_status_get_service (self),
                                                     mbim_message_indicate_status_get_cid (self));
-            g_string_append_printf (printable,
-                                    "%sContents:\n"
-                                    "%s  service = '%s' (%s)\n"
-                                    "%s  cid     = '%s' (0x%08x)\n",
-                                    line_prefix,
-                                    line_prefix, mbim_service_lookup_name (mbim_message_indicate_status_get_service (self)), uuid_printable,
-                                    line_prefix, cid_printable, mbim_message_indicate_status_get_cid (self));
+            _mbim_printer_append_printf (printer,
+                                         "%sContents:\n"
+                                         "%s  service = '%s' (%s)\n"
+                                         "%s  cid     = '%s' (0x%08x)\n",
+                                         line_prefix,
+                                         line_prefix, mbim_service_lookup_name (mbim_message_indicate_status_get_service (self)), uuid_printable,
+                                         line_prefix, cid_printable, mbim_message_indicate_status_get_cid (self));
             g_free (uuid_printable);
         }
         break;
     }
 
-    if (service_read_fields != MBIM_SERVICE_INVALID) {
-        gchar *fields_printable = NULL;
-        GError *error = NULL;
+    /* Only known services have printable fields */
+    if (service_read_fields != MBIM_SERVICE_INVALID && service_read_fields < MBIM_SERVICE_LAST)
+        message_print_fields (self, service_read_fields, printer, line_prefix);
+}
 
-        switch (service_read_fields) {
-        case MBIM_SERVICE_BASIC_CONNECT:
-            fields_printable = __mbim_message_basic_connect_get_printable_fields (self, line_prefix, &error);
-            break;
-        case MBIM_SERVICE_SMS:
-            fields_printable = __mbim_message_sms_get_printable_fields (self, line_prefix, &error);
-            break;
-        case MBIM_SERVICE_USSD:
-            fields_printable = __mbim_message_ussd_get_printable_fields (self, line_prefix, &error);
-            break;
-        case MBIM_SERVICE_PHONEBOOK:
-            fields_printable = __mbim_message_phonebook_get_printable_fields (self, line_prefix, &error);
-            break;
-        case MBIM_SERVICE_STK:
-            fields_printable = __mbim_message_stk_get_printable_fields (self, line_prefix, &error);
-            break;
-        case MBIM_SERVICE_AUTH:
-            fields_printable = __mbim_message_auth_get_printable_fields (self, line_prefix, &error);
-            break;
-        case MBIM_SERVICE_DSS:
-            fields_printable = __mbim_message_dss_get_printable_fields (self, line_prefix, &error);
-            break;
-        case MBIM_SERVICE_MS_FIRMWARE_ID:
-            fields_printable = __mbim_message_ms_firmware_id_get_printable_fields (self, line_prefix, &error);
-            break;
-        case MBIM_SERVICE_MS_HOST_SHUTDOWN:
-            fields_printable = __mbim_message_ms_host_shutdown_get_printable_fields (self, line_prefix, &error);
-            break;
-        case MBIM_SERVICE_PROXY_CONTROL:
-            fields_printable = __mbim_message_proxy_control_get_printable_fields (self, line_prefix, &error);
-            break;
-        case MBIM_SERVICE_QMI:
-            fields_printable = __mbim_message_qmi_get_printable_fields (self, line_prefix, &error);
-            break;
-        case MBIM_SERVICE_ATDS:
-            fields_printable = __mbim_message_atds_get_printable_fields (self, line_prefix, &error);
-            break;
-        case MBIM_SERVICE_INTEL_FIRMWARE_UPDATE:
-            fields_printable = __mbim_message_intel_firmware_update_get_printable_fields (self, line_prefix, &error);
-            break;
-        case MBIM_SERVICE_MS_BASIC_CONNECT_EXTENSIONS:
-            fields_printable = __mbim_message_ms_basic_connect_extensions_get_printable_fields (self, line_prefix, &error);
-            break;
-        default:
-            break;
-        }
+/**
+ * mbim_message_print:
+ * @self: a #MbimMessage.
+ * @line_prefix: prefix string to use in each new generated line.
+ * @headers_only: %TRUE if only basic headers should be printed.
+ * @printer_func: a #MbimMessagePrinterFunc.
+ * @user_data: data to pass to @printer_func.
+ *
+ * Prints the contents of the whole MBIM message, same as
+ * mbim_message_get_printable(), but handing the output over to @printer_func
+ * in chunks as it gets generated, instead of building a string.
+ *
+ * The message fields are printed right from the message contents.
+ */
+void
+mbim_message_print (const MbimMessage      *self,
+                    const gchar            *line_prefix,
+                    gboolean                headers_only,
+                    MbimMessagePrinterFunc  printer_func,
+                    gpointer                user_data)
+{
+    MbimPrinter printer;
 
-        if (error) {
-            g_string_append_printf (printable,
-                                    "%sFields: %s\n",
-                                    line_prefix, error->message);
-            g_error_free (error);
-        } else if (fields_printable) {
-            if (fields_printable[0])
-                g_string_append_printf (printable,
-                                        "%sFields:\n"
-                                        "%s",
-                                        line_prefix, fields_printable);
-            g_free (fields_printable);
-        }
-    }
+    g_return_if_fail (self != NULL);
+    g_return_if_fail (line_prefix != NULL);
+    g_return_if_fail (printer_func != NULL);
 
-    return g_string_free (printable, FALSE);
+    _mbim_printer_init (&printer, printer_func, user_data);
+    message_print (self, &printer, line_prefix, headers_only);
+    _mbim_printer_flush (&printer);
+}
+
+static void
+string_printer_func (const gchar *str,
+                     gsize        len,
+                     gpointer     user_data)
+{
+    g_string_append_len ((GString *) user_data, str, len);
+}
+
+/**
+ * mbim_message_get_printable:
+ * @self: a #MbimMessage.
+ * @line_prefix: prefix string to use in each new generated line.
+ * @headers_only: %TRUE if only basic headers should be printed.
+ *
+ * Gets a printable string with the contents of the whole MBIM message.
+ *
+ * Returns: (transfer full): a newly allocated string, which should be freed with g_free().
+ */
+gchar *
+mbim_message_get_printable (const MbimMessage *self,
+                            const gchar       *line_prefix,
+                            gboolean           headers_only)
+{
+    GString *printable;
+
+    g_return_val_if_fail (self != NULL, NULL);
+    g_return_val_if_fail (line_prefix != NULL, NULL);
+
+    printable = g_string_new ("");
+    mbim_message_print (self, line_prefix, headers_only, string_printer_func, printable);
+    return g_string_free (printable, FALSE);
+}
+
+/*****************************************************************************/
+/* JSON interface */
+
+static gboolean
+message_get_json_func (const MbimMessage        *self,
+                       MbimService               service,
+                       guint32                   cid,
+                       MbimCidJsonFunc          *json_func,
+                       const MbimMessageFields **fields)
+{
+    const MbimCidEntry *entry;
+
+    *json_func = NULL;
+    *fields = NULL;
+
+    /* Only known services have encodable fields */
+    if (service == MBIM_SERVICE_INVALID || service >= MBIM_SERVICE_LAST)
+        return FALSE;
+
+    entry = _mbim_cid_lookup (service, cid);
+    if (!entry)
+        return FALSE;
+
+    switch (MBIM_MESSAGE_GET_MESSAGE_TYPE (self)) {
+    case MBIM_MESSAGE_TYPE_COMMAND:
+        switch (mbim_message_command_get_command_type (self)) {
+        case MBIM_MESSAGE_COMMAND_TYPE_QUERY:
+            *json_func = entry->query_json;
+            *fields = entry->query_fields;
+            break;
+        case MBIM_MESSAGE_COMMAND_TYPE_SET:
+            *json_func = entry->set_json;
+            *fields = entry->set_fields;
+            break;
+        default:
+            break;
+        }
+        break;
+    case MBIM_MESSAGE_TYPE_COMMAND_DONE:
+        /* Responses with errors carry no fields */
+        if (mbim_message_command_done_get_status_code (self) != MBIM_STATUS_ERROR_NONE)
+            break;
+        *json_func = entry->response_json;
+        *fields = entry->response_fields;
+        break;
+    case MBIM_MESSAGE_TYPE_INDICATE_STATUS:
+        *json_func = entry->notification_json;
+        *fields = entry->notification_fields;
+        break;
+    default:
+        break;
+    }
+
+    return (*json_func || *fields);
+}
+
+static void
+message_print_json_string_or_number (MbimPrinter *printer,
+                                     guint       *n_members,
+                                     const gchar *key,
+                                     const gchar *str,
+                                     guint32      value)
+{
+    _mbim_printer_append_json_key (printer, n_members, key);
+    if (str)
+        _mbim_printer_append_json_string (printer, str);
+    else
+        _mbim_printer_append_printf (printer, "%u", value);
+}
+
+static void
+message_print_json (const MbimMessage *self,
+                    MbimPrinter       *printer)
+{
+    MbimMessageType          message_type;
+    MbimService              service;
+    const MbimUuid          *service_id;
+    guint32                  cid;
+    guint                    n_members = 0;
+    MbimCidJsonFunc          json_func;
+    const MbimMessageFields *fields;
+
+    message_type = MBIM_MESSAGE_GET_MESSAGE_TYPE (self);
+
+    _mbim_printer_append_len (printer, "{", 1);
+    message_print_json_string_or_number (printer, &n_members, "type", mbim_message_type_get_string (message_type), message_type);
+    _mbim_printer_append_json_key (printer, &n_members, "transaction");
+    _mbim_printer_append_printf (printer, "%u", MBIM_MESSAGE_GET_TRANSACTION_ID (self));
+
+    switch (message_type) {
+    case MBIM_MESSAGE_TYPE_OPEN:
+        _mbim_printer_append_json_key (printer, &n_members, "max-control-transfer");
+        _mbim_printer_append_printf (printer, "%u", mbim_message_open_get_max_control_transfer (self));
+        break;
+
+    case MBIM_MESSAGE_TYPE_OPEN_DONE:
+    case MBIM_MESSAGE_TYPE_CLOSE_DONE: {
+        MbimStatusError status;
+
+        status = (message_type == MBIM_MESSAGE_TYPE_OPEN_DONE ?
+                  mbim_message_open_done_get_status_code (self) :
+                  mbim_message_close_done_get_status_code (self));
+        message_print_json_string_or_number (printer, &n_members, "status", mbim_status_error_get_string (status), status);
+        break;
+    }
+
+    case MBIM_MESSAGE_TYPE_HOST_ERROR:
+    case MBIM_MESSAGE_TYPE_FUNCTION_ERROR: {
+        MbimProtocolError error;
+
+        error = mbim_message_error_get_error_status_code (self);
+        message_print_json_string_or_number (printer, &n_members, "error", mbim_protocol_error_get_string (error), error);
+        break;
+    }
+
+    case MBIM_MESSAGE_TYPE_COMMAND:
+    case MBIM_MESSAGE_TYPE_COMMAND_DONE:
+    case MBIM_MESSAGE_TYPE_INDICATE_STATUS:
+        /* Partial fragments only have headers */
+        if (_mbim_message_fragment_get_total (self) > 1) {
+            guint n_fragment_members = 0;
+
+            _mbim_printer_append_json_key (printer, &n_members, "fragment");
+            _mbim_printer_append_len (printer, "{", 1);
+            _mbim_printer_append_json_key (printer, &n_fragment_members, "total");
+            _mbim_printer_append_printf (printer, "%u", _mbim_message_fragment_get_total (self));
+            _mbim_printer_append_json_key (printer, &n_fragment_members, "current");
+            _mbim_printer_append_printf (printer, "%u", _mbim_message_fragment_get_current (self));
+            _mbim_printer_append_len (printer, "}", 1);
+            break;
+        }
+
+        if (message_type == MBIM_MESSAGE_TYPE_COMMAND) {
+            service = mbim_message_command_get_service (self);
+            service_id = mbim_message_command_get_service_id (self);
+            cid = mbim_message_command_get_cid (self);
+        } else if (message_type == MBIM_MESSAGE_TYPE_COMMAND_DONE) {
+            service = mbim_message_command_done_get_service (self);
+            service_id = mbim_message_command_done_get_service_id (self);
+            cid = mbim_message_command_done_get_cid (self);
+        } else {
+            service = mbim_message_indicate_status_get_service (self);
+            service_id = mbim_message_indicate_status_get_service_id (self);
+            cid = mbim_message_indicate_status_get_cid (self);
+        }
+
+        _mbim_printer_append_json_key (printer, &n_members, "service");
+        if (mbim_service_lookup_name (service))
+            _mbim_printer_append_json_string (printer, mbim_service_lookup_name (service));
+        else {
+            _mbim_printer_append_len (printer, "\"", 1);
+            _mbim_printer_append_uuid (printer, service_id);
+            _mbim_printer_append_len (printer, "\"", 1);
+        }
+        message_print_json_string_or_number (printer, &n_members, "cid", mbim_cid_get_printable (service, cid), cid);
+
+        if (message_type == MBIM_MESSAGE_TYPE_COMMAND) {
+            MbimMessageCommandType command_type;
+
+            command_type = mbim_message_command_get_command_type (self);
+            message_print_json_string_or_number (printer, &n_members, "command-type", mbim_message_command_type_get_string (command_type), command_type);
+        } else if (message_type == MBIM_MESSAGE_TYPE_COMMAND_DONE) {
+            MbimStatusError status;
+
+            status = mbim_message_command_done_get_status_code (self);
+            message_print_json_string_or_number (printer, &n_members, "status", mbim_status_error_get_string (status), status);
+        }
+
+        if (message_get_json_func (self, service, cid, &json_func, &fields)) {
+            _mbim_printer_append_json_key (printer, &n_members, "fields");
+            if (json_func)
+                json_func (self, printer);
+            else
+                _mbim_message_fields_json (self, fields, printer);
+        }
+        break;
+
+    case MBIM_MESSAGE_TYPE_CLOSE:
+    case MBIM_MESSAGE_TYPE_INVALID:
+    default:
+        break;
+    }
+
+    _mbim_printer_append_len (printer, "}", 1);
+}
+
+/**
+ * mbim_message_print_json:
+ * @self: a #MbimMessage.
+ * @printer_func: a #MbimMessagePrinterFunc.
+ * @user_data: data to pass to @printer_func.
+ *
+ * Encodes the whole MBIM message as a single line JSON object, handing the
+ * output over to @printer_func in chunks as it gets generated.
+ *
+ * The object contains the message "type" and "transaction", the
+ * type-specific header contents (e.g. "service", "cid" and "status" in
+ * command responses) and, for messages of known services, the message
+ * "fields", keyed by the field names given in the service definitions.
+ * Enumerations are given as nickname strings, and binary data as
+ * hexadecimal strings.
+ */
+void
+mbim_message_print_json (const MbimMessage      *self,
+                         MbimMessagePrinterFunc  printer_func,
+                         gpointer                user_data)
+{
+    MbimPrinter printer;
+
+    g_return_if_fail (self != NULL);
+    g_return_if_fail (printer_func != NULL);
+
+    _mbim_printer_init (&printer, printer_func, user_data);
+    message_print_json (self, &printer);
+    _mbim_printer_flush (&printer);
+}
+
+/**
+ * mbim_message_print_keyvalue:
+ * @self: a #MbimMessage.
+ * @key_prefix: (allow-none): prefix of all the keys, or %NULL.
+ * @printer_func: a #MbimMessagePrinterFunc.
+ * @user_data: data to pass to @printer_func.
+ *
+ * Encodes the whole MBIM message as key=value lines, one for each value in
+ * the JSON object given by mbim_message_print_json(), handing the output over
+ * to @printer_func in chunks as it gets generated.
+ *
+ * Keys are built joining @key_prefix, the names of the members and the
+ * indices of the arrays with dots, e.g. "response.fields.DeviceId" given
+ * "response" as @key_prefix. Values are given unquoted, with line breaks and
+ * backslashes escaped.
+ */
+void
+mbim_message_print_keyvalue (const MbimMessage      *self,
+                             const gchar            *key_prefix,
+                             MbimMessagePrinterFunc  printer_func,
+                             gpointer                user_data)
+{
+    MbimPrinter printer;
+
+    g_return_if_fail (self != NULL);
+    g_return_if_fail (printer_func != NULL);
+
+    _mbim_printer_init_keyvalue (&printer, key_prefix, printer_func, user_data);
+    message_print_json (self, &printer);
+    _mbim_printer_flush (&printer);
+    _mbim_printer_clear (&printer);
+}
+
+/**
+ * mbim_message_get_json:
+ * @self: a #MbimMessage.
+ *
+ * Encodes the whole MBIM message as a single line JSON object, see
+ * mbim_message_print_json().
+ *
+ * Returns: (transfer full): a newly allocated string, which should be freed with g_free().
+ */
+gchar *
+mbim_message_get_json (const MbimMessage *self)
+{
+    GString *json;
+
+    g_return_val_if_fail (self != NULL, NULL);
+
+    json = g_string_new ("");
+    mbim_message_print_json (self, string_printer_func, json);
+    return g_string_free (json, FALSE);
+}
+
+typedef struct {
+    gchar *buffer;
+    gsize  buffer_size;
+    gsize  len;
+} WriteJsonContext;
+
+static void
+write_json_printer_func (const gchar *str,
+                         gsize        len,
+                         gpointer     user_data)
+{
+    WriteJsonContext *ctx = user_data;
+
+    /* Always leave room for the trailing NUL byte */
+    if (ctx->len < ctx->buffer_size - 1)
+        memcpy (&ctx->buffer[ctx->len], str, MIN (len, ctx->buffer_size - 1 - ctx->len));
+    ctx->len += len;
+}
+
+/**
+ * mbim_message_write_json:
+ * @self: a #MbimMessage.
+ * @buffer: (allow-none): buffer where to write the JSON object.
+ * @buffer_size: size of @buffer.
+ *
+ * Encodes the whole MBIM message as a single line JSON object, see
+ * mbim_message_print_json(), writing it straight into @buffer.
+ *
+ * As with snprintf(), the output is truncated if @buffer is not big enough,
+ * and always NUL-terminated if @buffer_size is greater than 0.
+ *
+ * Returns: the length of the whole JSON object, not including the trailing
+ * NUL byte. If greater than or equal to @buffer_size, the output was truncated.
+ */
+gsize
+mbim_message_write_json (const MbimMessage *self,
+                         gchar             *buffer,
+                         gsize              buffer_size)
+{
+    WriteJsonContext ctx;
+
+    g_return_val_if_fail (self != NULL, 0);
+    g_return_val_if_fail (buffer != NULL || buffer_size == 0, 0);
+
+    ctx.buffer = buffer;
+    ctx.buffer_size = buffer_size;
+    ctx.len = 0;
+
+    if (buffer_size == 0) {
+        /* Just compute the length */
+        ctx.buffer_size = 1;
+        ctx.buffer = NULL;
+    }
+
+    mbim_message_print_json (self, write_json_printer_func, &ctx);
+
+    if (buffer_size > 0)
+        buffer[MIN (ctx.len, buffer_size - 1)] = '\0';
+
+    return ctx.len;
+}
+
+/*****************************************************************************/
+/* Field tables interpreter */
+
+static gboolean
+field_is_available (const MbimField *field,
+                    const guint32   *values)
+{
+    guint32 value;
+
+    if (field->condition == MBIM_FIELD_CONDITION_NONE)
+        return TRUE;
+
+    value = values[field->condition_field];
+    switch (field->condition) {
+    case MBIM_FIELD_CONDITION_EQUAL:
+        return value == field->condition_value;
+    case MBIM_FIELD_CONDITION_NOT_EQUAL:
+        return value != field->condition_value;
+    case MBIM_FIELD_CONDITION_LESS:
+        return value < field->condition_value;
+    case MBIM_FIELD_CONDITION_LESS_EQUAL:
+        return value <= field->condition_value;
+    case MBIM_FIELD_CONDITION_GREATER:
+        return value > field->condition_value;
+    case MBIM_FIELD_CONDITION_GREATER_EQUAL:
+        return value >= field->condition_value;
+    case MBIM_FIELD_CONDITION_NONE:
+    default:
+        g_assert_not_reached ();
+        return FALSE;
+    }
+}
+
+static guint32
+field_get_array_size (const MbimField *field,
+                      const guint32   *values)
+{
+    return field->has_array_size_field ? values[field->array_size_field] : 0;
+}
+
+/* Same output as the <enum>_get_string() and <flags>_build_string_from_mask()
+ * methods, found through the type of the field in the public API */
+static gchar *
+field_build_public_string (const MbimField *field,
+                           guint32          value)
+{
+    GType  type;
+    gchar *str = NULL;
+
+    type = field->public_get_type ();
+
+    if (G_TYPE_IS_FLAGS (type)) {
+        GFlagsClass *flags_class;
+        GString     *built = NULL;
+        guint        i;
+
+        flags_class = (GFlagsClass *) g_type_class_ref (type);
+        for (i = 0; i < flags_class->n_values; i++) {
+            const GFlagsValue *flags_value = &flags_class->values[i];
+
+            /* We also look for exact matches */
+            if (value == flags_value->value) {
+                if (built)
+                    g_string_free (built, TRUE);
+                built = NULL;
+                str = g_strdup (flags_value->value_nick);
+                break;
+            }
+
+            /* Build list with single-bit masks */
+            if ((value & flags_value->value) && !(flags_value->value & (flags_value->value - 1))) {
+                if (!built)
+                    built = g_string_new (flags_value->value_nick);
+                else
+                    g_string_append_printf (built, ", %s", flags_value->value_nick);
+            }
+        }
+        if (built)
+            str = g_string_free (built, FALSE);
+        g_type_class_unref (flags_class);
+    } else {
+        GEnumClass *enum_class;
+        GEnumValue *enum_value;
+
+        enum_class = (GEnumClass *) g_type_class_ref (type);
+        enum_value = g_enum_get_value (enum_class, (gint) value);
+        if (enum_value)
+            str = g_strdup (enum_value->value_nick);
+        g_type_class_unref (enum_class);
+    }
+
+    return str;
+}
+
+static void
+field_print_public (const MbimField *field,
+                    guint32          value,
+                    MbimPrinter     *printer)
+{
+    gchar *str;
+
+    str = field_build_public_string (field, value);
+    _mbim_printer_append_printf (printer, "'%s'", str ? str : "(null)");
+    g_free (str);
+}
+
+static void
+field_json_public (const MbimField *field,
+                   guint32          value,
+                   MbimPrinter     *printer)
+{
+    gchar *str;
+
+    str = field_build_public_string (field, value);
+    /* Unknown enum values are given as numbers, empty flags as empty strings */
+    if (str || G_TYPE_IS_FLAGS (field->public_get_type ()))
+        _mbim_printer_append_json_string (printer, str);
+    else
+        _mbim_printer_append_printf (printer, "%u", (guint) value);
+    g_free (str);
+}
+
+/*****************************************************************************/
+/* Validation, making sure all fields can be read within the information
+ * buffer before actually reading them */
+
+static gboolean
+buffer_has_range (guint32 buffer_length,
+                  guint64 offset,
+                  guint64 size)
+{
+    return (offset + size) <= buffer_length;
+}
+
+static gboolean fields_validate (const MbimMessage *self,
+                                 const MbimField   *fields,
+                                 guint              n_fields,
+                                 gboolean           in_struct,
+                                 guint32            relative_offset,
+                                 guint32            buffer_length,
+                                 guint32           *bytes_read);
+
+static gboolean
+struct_fields_validate (const MbimMessage      *self,
+                        const MbimStructFields *struct_fields,
+                        guint32                 relative_offset,
+                        guint32                 buffer_length,
+                        guint32                *bytes_read)
+{
+    return fields_validate (self,
+                            struct_fields->fields,
+                            struct_fields->n_fields,
+                            TRUE,
+                            relative_offset,
+                            buffer_length,
+                            bytes_read);
+}
+
+static gboolean
+fields_validate (const MbimMessage *self,
+                 const MbimField   *fields,
+                 guint              n_fields,
+                 gboolean           in_struct,
+                 guint32            relative_offset,
+                 guint32            buffer_length,
+                 guint32           *bytes_read)
+{
+    guint32 *values;
+    guint32  offset = relative_offset;
+    guint32  struct_start = in_struct ? relative_offset : 0;
+    guint    i;
+
+    values = g_newa (guint32, n_fields + 1);
+
+    for (i = 0; i < n_fields; i++) {
+        const MbimField *field = &fields[i];
+        guint32          n;
+        guint32          j;
+
+        values[i] = 0;
+        if (!field_is_available (field, values))
+            continue;
+
+        n = field_get_array_size (field, values);
+
+        switch (field->format) {
+        case MBIM_FIELD_FORMAT_GUINT32:
+            if (!buffer_has_range (buffer_length, offset, 4))
+                return FALSE;
+            values[i] = _mbim_message_read_guint32 (self, offset);
+            offset += 4;
+            break;
+
+        case MBIM_FIELD_FORMAT_GUINT32_ARRAY:
+            if (!buffer_has_range (buffer_length, offset, 4 * (guint64) n))
+                return FALSE;
+            offset += (4 * n);
+            break;
+
+        case MBIM_FIELD_FORMAT_GUINT64:
+            if (!buffer_has_range (buffer_length, offset, 8))
+                return FALSE;
+            offset += 8;
+            break;
+
+        case MBIM_FIELD_FORMAT_UUID:
+        case MBIM_FIELD_FORMAT_IPV6:
+            if (!buffer_has_range (buffer_length, offset, 16))
+                return FALSE;
+            offset += 16;
+            break;
+
+        case MBIM_FIELD_FORMAT_IPV4:
+            if (!buffer_has_range (buffer_length, offset, 4))
+                return FALSE;
+            offset += 4;
+            break;
+
+        case MBIM_FIELD_FORMAT_BYTE_ARRAY:
+            if (!buffer_has_range (buffer_length, offset, field->array_size))
+                return FALSE;
+            offset += field->array_size;
+            break;
+
+        case MBIM_FIELD_FORMAT_UNSIZED_BYTE_ARRAY:
+            /* Until the end of the buffer, this should be the last field */
+            if (offset > buffer_length)
+                return FALSE;
+            if (!in_struct)
+                offset = buffer_length;
+            break;
+
+        case MBIM_FIELD_FORMAT_REF_BYTE_ARRAY:
+        case MBIM_FIELD_FORMAT_REF_BYTE_ARRAY_NO_OFFSET: {
+            gboolean has_offset;
+
+            has_offset = (field->format == MBIM_FIELD_FORMAT_REF_BYTE_ARRAY);
+            if (in_struct && field->has_array_size_field) {
+                /* Size given in another field */
+                if (!buffer_has_range (buffer_length, offset, 4))
+                    return FALSE;
+                if (has_offset) {
+                    if (!buffer_has_range (buffer_length, (guint64) struct_start + _mbim_message_read_guint32 (self, offset), n))
+                        return FALSE;
+                } else if (!buffer_has_range (buffer_length, offset, n))
+                    return FALSE;
+                offset += 4;
+            } else if (has_offset) {
+                /* Offset and length */
+                if (!buffer_has_range (buffer_length, offset, 8) ||
+                    !buffer_has_range (buffer_length,
+                                       (guint64) struct_start + _mbim_message_read_guint32 (self, offset),
+                                       _mbim_message_read_guint32 (self, offset + 4)))
+                    return FALSE;
+                offset += 8;
+            } else {
+                /* Length, data just afterwards */
+                if (!buffer_has_range (buffer_length, offset, 4) ||
+                    !buffer_has_range (buffer_length, (guint64) offset + 4, _mbim_message_read_guint32 (self, offset)))
+                    return FALSE;
+                offset += 4;
+            }
+            break;
+        }
+
+        case MBIM_FIELD_FORMAT_STRING:
+            n = 1;
+            /* fall through */
+        case MBIM_FIELD_FORMAT_STRING_ARRAY:
+            if (!buffer_has_range (buffer_length, offset, 8 * (guint64) n))
+                return FALSE;
+            for (j = 0; j < n; j++, offset += 8) {
+                if (!buffer_has_range (buffer_length,
+                                       (guint64) struct_start + _mbim_message_read_guint32 (self, offset),
+                                       _mbim_message_read_guint32 (self, offset + 4)))
+                    return FALSE;
+            }
+            break;
+
+        case MBIM_FIELD_FORMAT_STRUCT: {
+            guint32 struct_bytes_read = 0;
+
+            if (!struct_fields_validate (self, field->struct_fields, offset, buffer_length, &struct_bytes_read))
+                return FALSE;
+            offset += struct_bytes_read;
+            break;
+        }
+
+        case MBIM_FIELD_FORMAT_STRUCT_ARRAY: {
+            guint32 array_offset;
+            guint32 wire_size;
+
+            if (!buffer_has_range (buffer_length, offset, 4))
+                return FALSE;
+            array_offset = _mbim_message_read_guint32 (self, offset);
+            wire_size = field->struct_fields->wire_size;
+            if (!buffer_has_range (buffer_length, array_offset, (guint64) wire_size * n))
+                return FALSE;
+            for (j = 0; j < n; j++) {
+                if (!struct_fields_validate (self, field->struct_fields, array_offset + (wire_size * j), buffer_length, NULL))
+                    return FALSE;
+            }
+            offset += 4;
+            break;
+        }
+
+        case MBIM_FIELD_FORMAT_REF_STRUCT_ARRAY:
+            if (!buffer_has_range (buffer_length, offset, 8 * (guint64) n))
+                return FALSE;
+            for (j = 0; j < n; j++, offset += 8) {
+                if (!struct_fields_validate (self, field->struct_fields, _mbim_message_read_guint32 (self, offset), buffer_length, NULL))
+                    return FALSE;
+            }
+            break;
+
+        case MBIM_FIELD_FORMAT_REF_IPV4:
+        case MBIM_FIELD_FORMAT_REF_IPV6: {
+            guint32 address_offset;
+
+            if (!buffer_has_range (buffer_length, offset, 4))
+                return FALSE;
+            address_offset = _mbim_message_read_guint32 (self, offset);
+            if (address_offset &&
+                !buffer_has_range (buffer_length, address_offset, field->format == MBIM_FIELD_FORMAT_REF_IPV4 ? 4 : 16))
+                return FALSE;
+            offset += 4;
+            break;
+        }
+
+        case MBIM_FIELD_FORMAT_IPV4_ARRAY:
+        case MBIM_FIELD_FORMAT_IPV6_ARRAY:
+            if (!buffer_has_range (buffer_length, offset, 4) ||
+                !buffer_has_range (buffer_length,
+                                   _mbim_message_read_guint32 (self, offset),
+                                   (guint64) n * (field->format == MBIM_FIELD_FORMAT_IPV4_ARRAY ? 4 : 16)))
+                return FALSE;
+            offset += 4;
+            break;
+
+        default:
+            g_assert_not_reached ();
+        }
+    }
+
+    if (bytes_read)
+        *bytes_read = (offset - relative_offset);
+
+    return TRUE;
+}
+
+gboolean
+_mbim_message_fields_validate (const MbimMessage        *self,
+                               const MbimMessageFields  *fields,
+                               GError                  **error)
+{
+    guint32 information_buffer_offset;
+
+    information_buffer_offset = _mbim_message_get_information_buffer_offset (self);
+    if (self->len < information_buffer_offset ||
+        !fields_validate (self,
+                          fields->fields,
+                          fields->n_fields,
+                          FALSE,
+                          0,
+                          self->len - information_buffer_offset,
+                          NULL)) {
+        g_set_error (error,
+                     MBIM_CORE_ERROR,
+                     MBIM_CORE_ERROR_INVALID_MESSAGE,
+                     "Message contents exceed the information buffer");
+        return FALSE;
+    }
+
+    return TRUE;
+}
+
+/*****************************************************************************/
+/* Struct free and read */
+
+void
+_mbim_struct_fields_free (const MbimStructFields *struct_fields,
+                          gpointer                var)
+{
+    guint i;
+
+    if (!var)
+        return;
+
+    for (i = 0; i < struct_fields->n_fields; i++) {
+        const MbimField *field = &struct_fields->fields[i];
+
+        switch (field->format) {
+        case MBIM_FIELD_FORMAT_UNSIZED_BYTE_ARRAY:
+        case MBIM_FIELD_FORMAT_REF_BYTE_ARRAY:
+        case MBIM_FIELD_FORMAT_REF_BYTE_ARRAY_NO_OFFSET:
+        case MBIM_FIELD_FORMAT_GUINT32_ARRAY:
+        case MBIM_FIELD_FORMAT_STRING:
+            g_free (G_STRUCT_MEMBER (gpointer, var, field->member_offset));
+            break;
+        case MBIM_FIELD_FORMAT_STRING_ARRAY:
+            g_strfreev (G_STRUCT_MEMBER (gchar **, var, field->member_offset));
+            break;
+        default:
+            break;
+        }
+    }
+
+    g_free (var);
+}
+
+void
+_mbim_struct_fields_array_free (const MbimStructFields *struct_fields,
+                                gpointer               *array)
+{
+    guint32 i;
+
+    if (!array)
+        return;
+
+    for (i = 0; array[i]; i++)
+        _mbim_struct_fields_free (struct_fields, array[i]);
+    g_free (array);
+}
+
+static guint8 *
+byte_array_dup (const guint8 *data,
+                guint32       size)
+{
+    guint8 *out;
+
+    out = g_malloc (size);
+    memcpy (out, data, size);
+    return out;
+}
+
+static gpointer
+struct_fields_read (const MbimMessage      *self,
+                    const MbimStructFields *struct_fields,
+                    guint32                 relative_offset,
+                    guint32                *bytes_read)
+{
+    guint8  *out;
+    guint32 *values;
+    guint32  offset = relative_offset;
+    guint    i;
+
+    out = g_malloc0 (struct_fields->size);
+    values = g_newa (guint32, struct_fields->n_fields + 1);
+
+    for (i = 0; i < struct_fields->n_fields; i++) {
+        const MbimField *field = &struct_fields->fields[i];
+        gpointer         member = out + field->member_offset;
+        guint32          n;
+
+        values[i] = 0;
+        n = field_get_array_size (field, values);
+
+        switch (field->format) {
+        case MBIM_FIELD_FORMAT_UUID:
+            memcpy (member, _mbim_message_read_uuid (self, offset), 16);
+            offset += 16;
+            break;
+
+        case MBIM_FIELD_FORMAT_REF_BYTE_ARRAY:
+        case MBIM_FIELD_FORMAT_REF_BYTE_ARRAY_NO_OFFSET: {
+            const guint8 *tmp;
+            gboolean      has_offset;
+
+            has_offset = (field->format == MBIM_FIELD_FORMAT_REF_BYTE_ARRAY);
+            if (field->has_array_size_field) {
+                tmp = _mbim_message_read_byte_array (self, relative_offset, offset, has_offset, FALSE, NULL);
+                *((guint8 **) member) = byte_array_dup (tmp, n);
+                offset += 4;
+            } else {
+                guint32 *size = (guint32 *) (out + field->member_size_offset);
+
+                tmp = _mbim_message_read_byte_array (self, relative_offset, offset, has_offset, TRUE, size);
+                *((guint8 **) member) = byte_array_dup (tmp, *size);
+                offset += 8;
+            }
+            break;
+        }
+
+        case MBIM_FIELD_FORMAT_UNSIZED_BYTE_ARRAY: {
+            const guint8 *tmp;
+            guint32      *size = (guint32 *) (out + field->member_size_offset);
+
+            tmp = _mbim_message_read_byte_array (self, relative_offset, offset, FALSE, FALSE, size);
+            *((guint8 **) member) = byte_array_dup (tmp, *size);
+            /* no offset update expected, this should be the last field */
+            break;
+        }
+
+        case MBIM_FIELD_FORMAT_BYTE_ARRAY:
+            memcpy (member,
+                    _mbim_message_read_byte_array (self, relative_offset, offset, FALSE, FALSE, NULL),
+                    field->array_size);
+            offset += field->array_size;
+            break;
+
+        case MBIM_FIELD_FORMAT_GUINT32:
+            values[i] = _mbim_message_read_guint32 (self, offset);
+            *((guint32 *) member) = values[i];
+            offset += 4;
+            break;
+
+        case MBIM_FIELD_FORMAT_GUINT32_ARRAY:
+            *((guint32 **) member) = _mbim_message_read_guint32_array (self, n, offset);
+            offset += (4 * n);
+            break;
+
+        case MBIM_FIELD_FORMAT_GUINT64:
+            *((guint64 *) member) = _mbim_message_read_guint64 (self, offset);
+            offset += 8;
+            break;
+
+        case MBIM_FIELD_FORMAT_STRING:
+            *((gchar **) member) = _mbim_message_read_string (self, relative_offset, offset);
+            offset += 8;
+            break;
+
+        case MBIM_FIELD_FORMAT_STRING_ARRAY:
+            *((gchar ***) member) = _mbim_message_read_string_array (self, n, relative_offset, offset);
+            offset += (8 * n);
+            break;
+
+        case MBIM_FIELD_FORMAT_IPV4:
+        case MBIM_FIELD_FORMAT_REF_IPV4: {
+            const MbimIPv4 *tmp;
+
+            tmp = _mbim_message_read_ipv4 (self, offset, field->format == MBIM_FIELD_FORMAT_REF_IPV4);
+            if (tmp)
+                memcpy (member, tmp, 4);
+            offset += 4;
+            break;
+        }
+
+        case MBIM_FIELD_FORMAT_IPV6:
+        case MBIM_FIELD_FORMAT_REF_IPV6: {
+            const MbimIPv6 *tmp;
+
+            tmp = _mbim_message_read_ipv6 (self, offset, field->format == MBIM_FIELD_FORMAT_REF_IPV6);
+            if (tmp)
+                memcpy (member, tmp, 16);
+            offset += (field->format == MBIM_FIELD_FORMAT_REF_IPV6 ? 4 : 16);
+            break;
+        }
+
+        default:
+            g_assert_not_reached ();
+        }
+    }
+
+    if (bytes_read)
+        *bytes_read = (offset - relative_offset);
+
+    return out;
+}
+
+static gpointer *
+struct_fields_read_array (const MbimMessage      *self,
+                          const MbimStructFields *struct_fields,
+                          guint32                 array_size,
+                          guint32                 relative_offset_array_start,
+                          gboolean                refs)
+{
+    gpointer *out;
+    guint32   i;
+    guint32   offset;
+
+    if (!array_size)
+        return NULL;
+
+    out = g_new (gpointer, array_size + 1);
+
+    if (!refs) {
+        offset = _mbim_message_read_guint32 (self, relative_offset_array_start);
+        for (i = 0; i < array_size; i++, offset += struct_fields->wire_size)
+            out[i] = struct_fields_read (self, struct_fields, offset, NULL);
+    } else {
+        offset = relative_offset_array_start;
+        for (i = 0; i < array_size; i++, offset += 8)
+            out[i] = struct_fields_read (self, struct_fields, _mbim_message_read_guint32 (self, offset), NULL);
+    }
+    out[array_size] = NULL;
+
+    return out;
+}
+
+/*****************************************************************************/
+/* Message parser */
+
+gboolean
+_mbim_message_fields_parse (const MbimMessage        *self,
+                            const MbimMessageFields  *fields,
+                            GError                  **error,
+                            ...)
+{
+    va_list   args;
+    guint32  *values;
+    guint32   offset = 0;
+    guint     i;
+
+    if (mbim_message_get_message_type (self) != fields->message_type) {
+        g_set_error (error,
+                     MBIM_CORE_ERROR,
+                     MBIM_CORE_ERROR_INVALID_MESSAGE,
+                     fields->message_type == MBIM_MESSAGE_TYPE_COMMAND_DONE ?
+                     "Message is not a response" :
+                     "Message is not a notification");
+        return FALSE;
+    }
+
+    if (!_mbim_message_fields_validate (self, fields, error))
+        return FALSE;
+
+    values = g_newa (guint32, fields->n_fields + 1);
+
+    va_start (args, error);
+    for (i = 0; i < fields->n_fields; i++) {
+        const MbimField *field = &fields->fields[i];
+        guint32         *out_size = NULL;
+        gpointer         out;
+        guint32          n;
+
+        if (field->format == MBIM_FIELD_FORMAT_UNSIZED_BYTE_ARRAY ||
+            field->format == MBIM_FIELD_FORMAT_REF_BYTE_ARRAY)
+            out_size = va_arg (args, guint32 *);
+        out = va_arg (args, gpointer);
+
+        values[i] = 0;
+        if (!field_is_available (field, values)) {
+            if (out_size)
+                *out_size = 0;
+            if (!out)
+                continue;
+            if (field->format == MBIM_FIELD_FORMAT_GUINT32)
+                *((guint32 *) out) = 0;
+            else if (field->format == MBIM_FIELD_FORMAT_GUINT64)
+                *((guint64 *) out) = 0;
+            else
+                *((gpointer *) out) = NULL;
+            continue;
+        }
+
+        n = field_get_array_size (field, values);
+
+        switch (field->format) {
+        case MBIM_FIELD_FORMAT_GUINT32:
+            values[i] = _mbim_message_read_guint32 (self, offset);
+            if (out)
+                *((guint32 *) out) = values[i];
+            offset += 4;
+            break;
+
+        case MBIM_FIELD_FORMAT_GUINT32_ARRAY:
+            if (out)
+                *((guint32 **) out) = _mbim_message_read_guint32_array (self, n, offset);
+            offset += (4 * n);
+            break;
+
+        case MBIM_FIELD_FORMAT_GUINT64:
+            if (out)
+                *((guint64 *) out) = _mbim_message_read_guint64 (self, offset);
+            offset += 8;
+            break;
+
+        case MBIM_FIELD_FORMAT_UUID:
+            if (out)
+                *((const MbimUuid **) out) = _mbim_message_read_uuid (self, offset);
+            offset += 16;
+            break;
+
+        case MBIM_FIELD_FORMAT_BYTE_ARRAY:
+            if (out)
+                *((const guint8 **) out) = _mbim_message_read_byte_array (self, 0, offset, FALSE, FALSE, NULL);
+            offset += field->array_size;
+            break;
+
+        case MBIM_FIELD_FORMAT_UNSIZED_BYTE_ARRAY:
+        case MBIM_FIELD_FORMAT_REF_BYTE_ARRAY: {
+            const guint8 *tmp;
+            guint32       tmpsize;
+            gboolean      ref;
+
+            ref = (field->format == MBIM_FIELD_FORMAT_REF_BYTE_ARRAY);
+            tmp = _mbim_message_read_byte_array (self, 0, offset, ref, ref, &tmpsize);
+            if (out)
+                *((const guint8 **) out) = tmp;
+            if (out_size)
+                *out_size = tmpsize;
+            offset += (ref ? 8 : tmpsize);
+            break;
+        }
+
+        case MBIM_FIELD_FORMAT_STRING:
+            if (out)
+                *((gchar **) out) = _mbim_message_read_string (self, 0, offset);
+            offset += 8;
+            break;
+
+        case MBIM_FIELD_FORMAT_STRING_ARRAY:
+            if (out)
+                *((gchar ***) out) = _mbim_message_read_string_array (self, n, 0, offset);
+            offset += (8 * n);
+            break;
+
+        case MBIM_FIELD_FORMAT_STRUCT: {
+            gpointer tmp;
+            guint32  bytes_read = 0;
+
+            tmp = struct_fields_read (self, field->struct_fields, offset, &bytes_read);
+            if (out)
+                *((gpointer *) out) = tmp;
+            else
+                _mbim_struct_fields_free (field->struct_fields, tmp);
+            offset += bytes_read;
+            break;
+        }
+
+        case MBIM_FIELD_FORMAT_STRUCT_ARRAY:
+            if (out)
+                *((gpointer **) out) = struct_fields_read_array (self, field->struct_fields, n, offset, FALSE);
+            offset += 4;
+            break;
+
+        case MBIM_FIELD_FORMAT_REF_STRUCT_ARRAY:
+            if (out)
+                *((gpointer **) out) = struct_fields_read_array (self, field->struct_fields, n, offset, TRUE);
+            offset += (8 * n);
+            break;
+
+        case MBIM_FIELD_FORMAT_IPV4:
+        case MBIM_FIELD_FORMAT_REF_IPV4:
+            if (out)
+                *((const MbimIPv4 **) out) = _mbim_message_read_ipv4 (self, offset, field->format == MBIM_FIELD_FORMAT_REF_IPV4);
+            offset += 4;
+            break;
+
+        case MBIM_FIELD_FORMAT_IPV4_ARRAY:
+            if (out)
+                *((MbimIPv4 **) out) = _mbim_message_read_ipv4_array (self, n, offset);
+            offset += 4;
+            break;
+
+        case MBIM_FIELD_FORMAT_IPV6:
+        case MBIM_FIELD_FORMAT_REF_IPV6:
+            if (out)
+                *((const MbimIPv6 **) out) = _mbim_message_read_ipv6 (self, offset, field->format == MBIM_FIELD_FORMAT_REF_IPV6);
+            offset += (field->format == MBIM_FIELD_FORMAT_REF_IPV6 ? 4 : 16);
+            break;
+
+        case MBIM_FIELD_FORMAT_IPV6_ARRAY:
+            if (out)
+                *((MbimIPv6 **) out) = _mbim_message_read_ipv6_array (self, n, offset);
+            offset += 4;
+            break;
+
+        case MBIM_FIELD_FORMAT_REF_BYTE_ARRAY_NO_OFFSET:
+        default:
+            g_assert_not_reached ();
+        }
+    }
+    va_end (args);
+
+    return TRUE;
+}
+
+/*****************************************************************************/
+/* Message and struct builders */
+
+static GByteArray *
+struct_fields_build (const MbimStructFields *struct_fields,
+                     gconstpointer           value)
+{
+    MbimStructBuilder *builder;
+    guint              i;
+
+    g_assert (value != NULL);
+
+    builder = _mbim_struct_builder_new ();
+
+    for (i = 0; i < struct_fields->n_fields; i++) {
+        const MbimField *field = &struct_fields->fields[i];
+        gconstpointer    member = (const guint8 *) value + field->member_offset;
+        guint32          n = 0;
+
+        if (field->has_array_size_field)
+            n = G_STRUCT_MEMBER (guint32, value, struct_fields->fields[field->array_size_field].member_offset);
+
+        switch (field->format) {
+        case MBIM_FIELD_FORMAT_UUID:
+            _mbim_struct_builder_append_uuid (builder, (const MbimUuid *) member);
+            break;
+        case MBIM_FIELD_FORMAT_BYTE_ARRAY:
+            _mbim_struct_builder_append_byte_array (builder, FALSE, FALSE, !field->unpadded, (const guint8 *) member, field->array_size);
+            break;
+        case MBIM_FIELD_FORMAT_UNSIZED_BYTE_ARRAY:
+            _mbim_struct_builder_append_byte_array (builder, FALSE, FALSE, !field->unpadded,
+                                                    *((guint8 * const *) member),
+                                                    G_STRUCT_MEMBER (guint32, value, field->member_size_offset));
+            break;
+        case MBIM_FIELD_FORMAT_REF_BYTE_ARRAY:
+        case MBIM_FIELD_FORMAT_REF_BYTE_ARRAY_NO_OFFSET:
+            _mbim_struct_builder_append_byte_array (builder,
+                                                    field->format == MBIM_FIELD_FORMAT_REF_BYTE_ARRAY,
+                                                    !field->has_array_size_field,
+                                                    !field->unpadded,
+                                                    *((guint8 * const *) member),
+                                                    field->has_array_size_field ? n : G_STRUCT_MEMBER (guint32, value, field->member_size_offset));
+            break;
+        case MBIM_FIELD_FORMAT_GUINT32:
+            _mbim_struct_builder_append_guint32 (builder, *((const guint32 *) member));
+            break;
+        case MBIM_FIELD_FORMAT_GUINT32_ARRAY:
+            _mbim_struct_builder_append_guint32_array (builder, *((guint32 * const *) member), n);
+            break;
+        case MBIM_FIELD_FORMAT_GUINT64:
+            _mbim_struct_builder_append_guint64 (builder, *((const guint64 *) member));
+            break;
+        case MBIM_FIELD_FORMAT_STRING:
+            _mbim_struct_builder_append_string (builder, *((gchar * const *) member));
+            break;
+        case MBIM_FIELD_FORMAT_STRING_ARRAY:
+            _mbim_struct_builder_append_string_array (builder, *((const gchar * const * const *) member), n);
+            break;
+        case MBIM_FIELD_FORMAT_IPV4:
+        case MBIM_FIELD_FORMAT_REF_IPV4:
+            _mbim_struct_builder_append_ipv4 (builder, (const MbimIPv4 *) member, field->format == MBIM_FIELD_FORMAT_REF_IPV4);
+            break;
+        case MBIM_FIELD_FORMAT_IPV6:
+        case MBIM_FIELD_FORMAT_REF_IPV6:
+            _mbim_struct_builder_append_ipv6 (builder, (const MbimIPv6 *) member, field->format == MBIM_FIELD_FORMAT_REF_IPV6);
+            break;
+        default:
+            g_assert_not_reached ();
+        }
+    }
+
+    return _mbim_struct_builder_complete (builder);
+}
+
+static void
+struct_builder_append_struct_array (MbimStructBuilder      *builder,
+                                    const MbimStructFields *struct_fields,
+                                    const gconstpointer    *values,
+                                    guint32                 n_values,
+                                    gboolean                refs)
+{
+    guint32     offset;
+    guint32     i;
+    GByteArray *raw_all = NULL;
+
+    if (!refs) {
+        for (i = 0; i < n_values; i++) {
+            GByteArray *raw;
+
+            raw = struct_fields_build (struct_fields, values[i]);
+            if (!raw_all)
+                raw_all = raw;
+            else {
+                g_byte_array_append (raw_all, raw->data, raw->len);
+                g_byte_array_unref (raw);
+            }
+        }
+
+        if (!raw_all) {
+            offset = 0;
+            g_byte_array_append (builder->fixed_buffer, (guint8 *)&offset, sizeof (offset));
+        } else {
+            guint32 offset_offset;
+
+            /* Offset of the offset */
+            offset_offset = builder->fixed_buffer->len;
+            /* Length *not* in LE yet */
+            offset = builder->variable_buffer->len;
+            /* Add the offset value */
+            g_byte_array_append (builder->fixed_buffer, (guint8 *)&offset, sizeof (offset));
+            /* Configure the value to get updated */
+            g_array_append_val (builder->offsets, offset_offset);
+            /* Add the final array itself */
+            g_byte_array_append (builder->variable_buffer, raw_all->data, raw_all->len);
+            g_byte_array_unref (raw_all);
+        }
+    } else {
+        for (i = 0; i < n_values; i++) {
+            guint32     length;
+            guint32     offset_offset;
+            GByteArray *raw;
+
+            raw = struct_fields_build (struct_fields, values[i]);
+            g_assert (raw->len > 0);
+
+            /* Offset of the offset */
+            offset_offset = builder->fixed_buffer->len;
+
+            /* Length *not* in LE yet */
+            offset = builder->variable_buffer->len;
+            /* Add the offset value */
+            g_byte_array_append (builder->fixed_buffer, (guint8 *)&offset, sizeof (offset));
+            /* Configure the value to get updated */
+            g_array_append_val (builder->offsets, offset_offset);
+
+            /* Add the length value */
+            length = GUINT32_TO_LE (raw->len);
+            g_byte_array_append (builder->fixed_buffer, (guint8 *)&length, sizeof (length));
+
+            /* And finally, the bytearray itself to the variable buffer */
+            g_byte_array_append (builder->variable_buffer, (const guint8 *)raw->data, (guint)raw->len);
+            g_byte_array_unref (raw);
+        }
+    }
+}
+
+MbimMessage *
+_mbim_message_fields_new (const MbimMessageFields *fields,
+                          ...)
+{
+    MbimMessageCommandBuilder *builder;
+    MbimStructBuilder         *contents;
+    va_list                    args;
+    guint32                   *values;
+    guint                      i;
+
+    if (fields->message_type == MBIM_MESSAGE_TYPE_COMMAND_DONE)
+        builder = _mbim_message_command_done_builder_new (0, fields->service, fields->cid, MBIM_STATUS_ERROR_NONE);
+    else
+        builder = _mbim_message_command_builder_new (0, fields->service, fields->cid, fields->command_type);
+    contents = builder->contents_builder;
+
+    values = g_newa (guint32, fields->n_fields + 1);
+
+    va_start (args, fields);
+    for (i = 0; i < fields->n_fields; i++) {
+        const MbimField *field = &fields->fields[i];
+        gconstpointer    value = NULL;
+        guint32          size = 0;
+        guint64          value64 = 0;
+        guint32          n;
+
+        /* All arguments are consumed, even for fields not available */
+        values[i] = 0;
+        switch (field->format) {
+        case MBIM_FIELD_FORMAT_GUINT32:
+            values[i] = va_arg (args, guint);
+            break;
+        case MBIM_FIELD_FORMAT_GUINT64:
+            value64 = va_arg (args, guint64);
+            break;
+        case MBIM_FIELD_FORMAT_UNSIZED_BYTE_ARRAY:
+        case MBIM_FIELD_FORMAT_REF_BYTE_ARRAY:
+        case MBIM_FIELD_FORMAT_REF_BYTE_ARRAY_NO_OFFSET:
+            size = va_arg (args, guint);
+            value = va_arg (args, gconstpointer);
+            break;
+        default:
+            value = va_arg (args, gconstpointer);
+            break;
+        }
+
+        if (!field_is_available (field, values))
+            continue;
+
+        n = field_get_array_size (field, values);
+
+        switch (field->format) {
+        case MBIM_FIELD_FORMAT_GUINT32:
+            _mbim_struct_builder_append_guint32 (contents, values[i]);
+            break;
+        case MBIM_FIELD_FORMAT_GUINT32_ARRAY:
+            _mbim_struct_builder_append_guint32_array (contents, (const guint32 *) value, n);
+            break;
+        case MBIM_FIELD_FORMAT_GUINT64:
+            _mbim_struct_builder_append_guint64 (contents, value64);
+            break;
+        case MBIM_FIELD_FORMAT_UUID:
+            _mbim_struct_builder_append_uuid (contents, (const MbimUuid *) value);
+            break;
+        case MBIM_FIELD_FORMAT_BYTE_ARRAY:
+            _mbim_struct_builder_append_byte_array (contents, FALSE, FALSE, !field->unpadded, (const guint8 *) value, field->array_size);
+            break;
+        case MBIM_FIELD_FORMAT_UNSIZED_BYTE_ARRAY:
+            _mbim_struct_builder_append_byte_array (contents, FALSE, FALSE, !field->unpadded, (const guint8 *) value, size);
+            break;
+        case MBIM_FIELD_FORMAT_REF_BYTE_ARRAY:
+            _mbim_struct_builder_append_byte_array (contents, TRUE, TRUE, !field->unpadded, (const guint8 *) value, size);
+            break;
+        case MBIM_FIELD_FORMAT_REF_BYTE_ARRAY_NO_OFFSET:
+            _mbim_struct_builder_append_byte_array (contents, FALSE, TRUE, !field->unpadded, (const guint8 *) value, size);
+            break;
+        case MBIM_FIELD_FORMAT_STRING:
+            _mbim_struct_builder_append_string (contents, (const gchar *) value);
+            break;
+        case MBIM_FIELD_FORMAT_STRING_ARRAY:
+            _mbim_struct_builder_append_string_array (contents, (const gchar * const *) value, n);
+            break;
+        case MBIM_FIELD_FORMAT_STRUCT: {
+            GByteArray *raw;
+
+            raw = struct_fields_build (field->struct_fields, value);
+            g_byte_array_append (contents->fixed_buffer, raw->data, raw->len);
+            g_byte_array_unref (raw);
+            break;
+        }
+        case MBIM_FIELD_FORMAT_STRUCT_ARRAY:
+        case MBIM_FIELD_FORMAT_REF_STRUCT_ARRAY:
+            struct_builder_append_struct_array (contents,
+                                                field->struct_fields,
+                                                (const gconstpointer *) value,
+                                                n,
+                                                field->format == MBIM_FIELD_FORMAT_REF_STRUCT_ARRAY);
+            break;
+        case MBIM_FIELD_FORMAT_IPV4:
+        case MBIM_FIELD_FORMAT_REF_IPV4:
+            _mbim_struct_builder_append_ipv4 (contents, (const MbimIPv4 *) value, field->format == MBIM_FIELD_FORMAT_REF_IPV4);
+            break;
+        case MBIM_FIELD_FORMAT_IPV4_ARRAY:
+            _mbim_struct_builder_append_ipv4_array (contents, (const MbimIPv4 *) value, n);
+            break;
+        case MBIM_FIELD_FORMAT_IPV6:
+        case MBIM_FIELD_FORMAT_REF_IPV6:
+            _mbim_struct_builder_append_ipv6 (contents, (const MbimIPv6 *) value, field->format == MBIM_FIELD_FORMAT_REF_IPV6);
+            break;
+        case MBIM_FIELD_FORMAT_IPV6_ARRAY:
+            _mbim_struct_builder_append_ipv6_array (contents, (const MbimIPv6 *) value, n);
+            break;
+        default:
+            g_assert_not_reached ();
+        }
+    }
+    va_end (args);
+
+    return _mbim_message_command_builder_complete (builder);
+}
+
+/*****************************************************************************/
+/* Printable and JSON output */
+
+static void
+field_print_address (MbimPrinter   *printer,
+                     const guint8  *addr,
+                     gboolean       ipv6,
+                     gboolean       json)
+{
+    if (!addr) {
+        _mbim_printer_append (printer, json ? "null" : "''");
+        return;
+    }
+
+    _mbim_printer_append (printer, json ? "\"" : "'");
+    _mbim_printer_append_ip (printer, addr, ipv6);
+    _mbim_printer_append (printer, json ? "\"" : "'");
+}
+
+static void
+struct_fields_print (const MbimMessage      *self,
+                     const MbimStructFields *struct_fields,
+                     guint32                 relative_offset,
+                     guint32                *bytes_read,
+                     MbimPrinter            *printer,
+                     const gchar            *line_prefix,
+                     guint                   indent)
+{
+    guint32 *values;
+    guint32  offset = relative_offset;
+    guint    i;
+
+    values = g_newa (guint32, struct_fields->n_fields + 1);
+
+    for (i = 0; i < struct_fields->n_fields; i++) {
+        const MbimField *field = &struct_fields->fields[i];
+        guint32          n;
+        guint32          j;
+
+        values[i] = 0;
+        n = field_get_array_size (field, values);
+
+        _mbim_printer_append_prefix (printer, line_prefix, indent);
+        _mbim_printer_append_printf (printer, "  %s = ", field->name);
+
+        switch (field->format) {
+        case MBIM_FIELD_FORMAT_UUID:
+            _mbim_printer_append (printer, "'");
+            _mbim_printer_append_uuid (printer, _mbim_message_read_uuid (self, offset));
+            _mbim_printer_append (printer, "'");
+            offset += 16;
+            break;
+
+        case MBIM_FIELD_FORMAT_BYTE_ARRAY:
+        case MBIM_FIELD_FORMAT_UNSIZED_BYTE_ARRAY:
+        case MBIM_FIELD_FORMAT_REF_BYTE_ARRAY:
+        case MBIM_FIELD_FORMAT_REF_BYTE_ARRAY_NO_OFFSET: {
+            const guint8 *tmp;
+            guint32       tmpsize;
+            gboolean      has_offset;
+
+            has_offset = (field->format == MBIM_FIELD_FORMAT_REF_BYTE_ARRAY);
+            if (field->format == MBIM_FIELD_FORMAT_BYTE_ARRAY) {
+                tmp = _mbim_message_read_byte_array (self, relative_offset, offset, FALSE, FALSE, NULL);
+                tmpsize = field->array_size;
+                offset += field->array_size;
+            } else if (field->format == MBIM_FIELD_FORMAT_UNSIZED_BYTE_ARRAY) {
+                tmp = _mbim_message_read_byte_array (self, relative_offset, offset, FALSE, FALSE, &tmpsize);
+                /* no offset update expected, this should be the last field */
+            } else if (field->has_array_size_field) {
+                tmp = _mbim_message_read_byte_array (self, relative_offset, offset, has_offset, FALSE, NULL);
+                tmpsize = n;
+                offset += 4;
+            } else {
+                tmp = _mbim_message_read_byte_array (self, relative_offset, offset, has_offset, TRUE, &tmpsize);
+                offset += 8;
+            }
+            _mbim_printer_append (printer, "'");
+            _mbim_printer_append_hex (printer, tmp, tmpsize, ':');
+            _mbim_printer_append (printer, "'");
+            break;
+        }
+
+        case MBIM_FIELD_FORMAT_GUINT32:
+            values[i] = _mbim_message_read_guint32 (self, offset);
+            _mbim_printer_append_printf (printer, "'%" G_GUINT32_FORMAT "'", values[i]);
+            offset += 4;
+            break;
+
+        case MBIM_FIELD_FORMAT_GUINT64:
+            _mbim_printer_append_printf (printer, "'%" G_GUINT64_FORMAT "'", _mbim_message_read_guint64 (self, offset));
+            offset += 8;
+            break;
+
+        case MBIM_FIELD_FORMAT_GUINT32_ARRAY:
+            _mbim_printer_append (printer, "'");
+            for (j = 0; j < n; j++)
+                _mbim_printer_append_printf (printer, "%" G_GUINT32_FORMAT "%s", _mbim_message_read_guint32 (self, offset + (4 * j)), (j == (n - 1)) ? "" : "," );
+            _mbim_printer_append (printer, "'");
+            offset += (4 * n);
+            break;
+
+        case MBIM_FIELD_FORMAT_STRING: {
+            gchar *tmp;
+
+            tmp = _mbim_message_read_string (self, relative_offset, offset);
+            _mbim_printer_append_printf (printer, "'%s'", tmp ? tmp : "(null)");
+            g_free (tmp);
+            offset += 8;
+            break;
+        }
+
+        case MBIM_FIELD_FORMAT_STRING_ARRAY:
+            _mbim_printer_append (printer, "'");
+            for (j = 0; j < n; j++) {
+                gchar *tmp;
+
+                tmp = _mbim_message_read_string (self, relative_offset, offset + (8 * j));
+                _mbim_printer_append_printf (printer, "%s%s", tmp ? tmp : "(null)", (j == (n - 1)) ? "" : "," );
+                g_free (tmp);
+            }
+            _mbim_printer_append (printer, "'");
+            offset += (8 * n);
+            break;
+
+        case MBIM_FIELD_FORMAT_IPV4:
+        case MBIM_FIELD_FORMAT_REF_IPV4: {
+            const MbimIPv4 *tmp;
+
+            tmp = _mbim_message_read_ipv4 (self, offset, field->format == MBIM_FIELD_FORMAT_REF_IPV4);
+            field_print_address (printer, tmp ? tmp->addr : NULL, FALSE, FALSE);
+            offset += 4;
+            break;
+        }
+
+        case MBIM_FIELD_FORMAT_IPV6:
+        case MBIM_FIELD_FORMAT_REF_IPV6: {
+            const MbimIPv6 *tmp;
+
+            tmp = _mbim_message_read_ipv6 (self, offset, field->format == MBIM_FIELD_FORMAT_REF_IPV6);
+            field_print_address (printer, tmp ? tmp->addr : NULL, TRUE, FALSE);
+            offset += (field->format == MBIM_FIELD_FORMAT_REF_IPV6 ? 4 : 16);
+            break;
+        }
+
+        default:
+            g_assert_not_reached ();
+        }
+
+        _mbim_printer_append (printer, "\n");
+    }
+
+    if (bytes_read)
+        *bytes_read = (offset - relative_offset);
+}
+
+static void
+struct_fields_print_array (const MbimMessage      *self,
+                           const MbimStructFields *struct_fields,
+                           guint32                 array_size,
+                           guint32                 relative_offset_array_start,
+                           gboolean                refs,
+                           MbimPrinter            *printer,
+                           const gchar            *line_prefix)
+{
+    guint32 i;
+    guint32 offset;
+
+    offset = refs ? relative_offset_array_start : _mbim_message_read_guint32 (self, relative_offset_array_start);
+    for (i = 0; i < array_size; i++) {
+        _mbim_printer_append_prefix (printer, line_prefix, 0);
+        _mbim_printer_append_printf (printer, "    [%u] = {\n", i);
+        if (!refs) {
+            struct_fields_print (self, struct_fields, offset, NULL, printer, line_prefix, 8);
+            offset += struct_fields->wire_size;
+        } else {
+            struct_fields_print (self, struct_fields, _mbim_message_read_guint32 (self, offset), NULL, printer, line_prefix, 8);
+            offset += 8;
+        }
+        _mbim_printer_append_prefix (printer, line_prefix, 0);
+        _mbim_printer_append (printer, "    },\n");
+    }
+}
+
+void
+_mbim_message_fields_print (const MbimMessage       *self,
+                            const MbimMessageFields *fields,
+                            MbimPrinter             *printer,
+                            const gchar             *line_prefix)
+{
+    guint32 *values;
+    guint32  offset = 0;
+    guint    i;
+
+    if (fields->message_type == MBIM_MESSAGE_TYPE_COMMAND_DONE &&
+        !mbim_message_response_get_result (self, MBIM_MESSAGE_TYPE_COMMAND_DONE, NULL))
+        return;
+
+    if (!fields->n_fields)
+        return;
+
+    if (!_mbim_message_fields_validate (self, fields, NULL)) {
+        _mbim_printer_append_prefix (printer, line_prefix, 0);
+        _mbim_printer_append (printer, "Fields: Invalid contents\n");
+        return;
+    }
+
+    _mbim_printer_append_prefix (printer, line_prefix, 0);
+    _mbim_printer_append (printer, "Fields:\n");
+
+    values = g_newa (guint32, fields->n_fields + 1);
+
+    for (i = 0; i < fields->n_fields; i++) {
+        const MbimField *field = &fields->fields[i];
+        guint32          n;
+        guint32          j;
+
+        _mbim_printer_append_prefix (printer, line_prefix, 0);
+        _mbim_printer_append_printf (printer, "  %s = ", field->name);
+
+        values[i] = 0;
+        if (!field_is_available (field, values)) {
+            _mbim_printer_append (printer, "\n");
+            continue;
+        }
+
+        n = field_get_array_size (field, values);
+
+        switch (field->format) {
+        case MBIM_FIELD_FORMAT_GUINT32:
+            values[i] = _mbim_message_read_guint32 (self, offset);
+            offset += 4;
+            /* Sizes and conditions are always given as numbers */
+            if (field->public_get_type && !field->referenced)
+                field_print_public (field, values[i], printer);
+            else
+                _mbim_printer_append_printf (printer, "'%" G_GUINT32_FORMAT "'", values[i]);
+            break;
+
+        case MBIM_FIELD_FORMAT_GUINT64: {
+            guint64 tmp;
+
+            tmp = _mbim_message_read_guint64 (self, offset);
+            offset += 8;
+            if (field->public_get_type)
+                field_print_public (field, (guint32) tmp, printer);
+            else
+                _mbim_printer_append_printf (printer, "'%" G_GUINT64_FORMAT "'", tmp);
+            break;
+        }
+
+        case MBIM_FIELD_FORMAT_BYTE_ARRAY:
+        case MBIM_FIELD_FORMAT_UNSIZED_BYTE_ARRAY:
+        case MBIM_FIELD_FORMAT_REF_BYTE_ARRAY:
+        case MBIM_FIELD_FORMAT_REF_BYTE_ARRAY_NO_OFFSET: {
+            const guint8 *tmp;
+            guint32       tmpsize;
+
+            if (field->format == MBIM_FIELD_FORMAT_BYTE_ARRAY) {
+                tmp = _mbim_message_read_byte_array (self, 0, offset, FALSE, FALSE, NULL);
+                tmpsize = field->array_size;
+                offset += field->array_size;
+            } else if (field->format == MBIM_FIELD_FORMAT_UNSIZED_BYTE_ARRAY) {
+                tmp = _mbim_message_read_byte_array (self, 0, offset, FALSE, FALSE, &tmpsize);
+                offset += tmpsize;
+            } else if (field->format == MBIM_FIELD_FORMAT_REF_BYTE_ARRAY) {
+                tmp = _mbim_message_read_byte_array (self, 0, offset, TRUE, TRUE, &tmpsize);
+                offset += 8;
+            } else {
+                tmp = _mbim_message_read_byte_array (self, 0, offset, FALSE, TRUE, &tmpsize);
+                offset += 4;
+            }
+            _mbim_printer_append (printer, "'");
+            _mbim_printer_append_hex (printer, tmp, tmpsize, ':');
+            _mbim_printer_append (printer, "'");
+            break;
+        }
+
+        case MBIM_FIELD_FORMAT_UUID:
+            _mbim_printer_append (printer, "'");
+            _mbim_printer_append_uuid (printer, _mbim_message_read_uuid (self, offset));
+            _mbim_printer_append (printer, "'");
+            offset += 16;
+            break;
+
+        case MBIM_FIELD_FORMAT_STRING: {
+            gchar *tmp;
+
+            tmp = _mbim_message_read_string (self, 0, offset);
+            offset += 8;
+            _mbim_printer_append_printf (printer, "'%s'", tmp ? tmp : "(null)");
+            g_free (tmp);
+            break;
+        }
+
+        case MBIM_FIELD_FORMAT_STRING_ARRAY:
+            _mbim_printer_append (printer, "'");
+            for (j = 0; j < n; j++) {
+                gchar *tmp;
+
+                tmp = _mbim_message_read_string (self, 0, offset + (8 * j));
+                _mbim_printer_append (printer, tmp);
+                g_free (tmp);
+                if (j < (n - 1))
+                    _mbim_printer_append (printer, ", ");
+            }
+            _mbim_printer_append (printer, "'");
+            offset += (8 * n);
+            break;
+
+        case MBIM_FIELD_FORMAT_STRUCT: {
+            guint32 bytes_read = 0;
+
+            _mbim_printer_append (printer, "{\n");
+            struct_fields_print (self, field->struct_fields, offset, &bytes_read, printer, line_prefix, 4);
+            offset += bytes_read;
+            _mbim_printer_append_prefix (printer, line_prefix, 0);
+            _mbim_printer_append (printer, "  }\n");
+            break;
+        }
+
+        case MBIM_FIELD_FORMAT_STRUCT_ARRAY:
+        case MBIM_FIELD_FORMAT_REF_STRUCT_ARRAY:
+            _mbim_printer_append (printer, "'{\n");
+            if (field->format == MBIM_FIELD_FORMAT_STRUCT_ARRAY) {
+                struct_fields_print_array (self, field->struct_fields, n, offset, FALSE, printer, line_prefix);
+                offset += 4;
+            } else {
+                struct_fields_print_array (self, field->struct_fields, n, offset, TRUE, printer, line_prefix);
+                offset += (8 * n);
+            }
+            _mbim_printer_append_prefix (printer, line_prefix, 0);
+            _mbim_printer_append (printer, "  }'");
+            break;
+
+        case MBIM_FIELD_FORMAT_IPV4:
+        case MBIM_FIELD_FORMAT_REF_IPV4: {
+            const MbimIPv4 *tmp;
+
+            tmp = _mbim_message_read_ipv4 (self, offset, field->format == MBIM_FIELD_FORMAT_REF_IPV4);
+            offset += 4;
+            field_print_address (printer, tmp ? tmp->addr : NULL, FALSE, FALSE);
+            break;
+        }
+
+        case MBIM_FIELD_FORMAT_IPV6:
+        case MBIM_FIELD_FORMAT_REF_IPV6: {
+            const MbimIPv6 *tmp;
+
+            tmp = _mbim_message_read_ipv6 (self, offset, field->format == MBIM_FIELD_FORMAT_REF_IPV6);
+            offset += (field->format == MBIM_FIELD_FORMAT_REF_IPV6 ? 4 : 16);
+            field_print_address (printer, tmp ? tmp->addr : NULL, TRUE, FALSE);
+            break;
+        }
+
+        case MBIM_FIELD_FORMAT_IPV4_ARRAY:
+        case MBIM_FIELD_FORMAT_IPV6_ARRAY: {
+            guint32  array_offset;
+            gboolean ipv6;
+
+            ipv6 = (field->format == MBIM_FIELD_FORMAT_IPV6_ARRAY);
+            array_offset = _mbim_message_read_guint32 (self, offset);
+            offset += 4;
+            _mbim_printer_append (printer, "'");
+            for (j = 0; j < n; j++) {
+                _mbim_printer_append_ip (printer,
+                                         ipv6 ?
+                                         _mbim_message_read_ipv6 (self, array_offset + (16 * j), FALSE)->addr :
+                                         _mbim_message_read_ipv4 (self, array_offset + (4 * j), FALSE)->addr,
+                                         ipv6);
+                if (j < (n - 1))
+                    _mbim_printer_append (printer, ", ");
+            }
+            _mbim_printer_append (printer, "'");
+            break;
+        }
+
+        case MBIM_FIELD_FORMAT_GUINT32_ARRAY:
+        default:
+            g_assert_not_reached ();
+        }
+
+        _mbim_printer_append (printer, "\n");
+    }
+}
+
+static void
+struct_fields_json (const MbimMessage      *self,
+                    const MbimStructFields *struct_fields,
+                    guint32                 relative_offset,
+                    guint32                *bytes_read,
+                    MbimPrinter            *printer)
+{
+    guint32 *values;
+    guint32  offset = relative_offset;
+    guint    n_members = 0;
+    guint    i;
+
+    values = g_newa (guint32, struct_fields->n_fields + 1);
+
+    _mbim_printer_append (printer, "{");
+
+    for (i = 0; i < struct_fields->n_fields; i++) {
+        const MbimField *field = &struct_fields->fields[i];
+        guint32          n;
+        guint32          j;
+
+        values[i] = 0;
+        n = field_get_array_size (field, values);
+
+        _mbim_printer_append_json_key (printer, &n_members, field->name);
+
+        switch (field->format) {
+        case MBIM_FIELD_FORMAT_UUID:
+            _mbim_printer_append (printer, "\"");
+            _mbim_printer_append_uuid (printer, _mbim_message_read_uuid (self, offset));
+            _mbim_printer_append (printer, "\"");
+            offset += 16;
+            break;
+
+        case MBIM_FIELD_FORMAT_BYTE_ARRAY:
+        case MBIM_FIELD_FORMAT_UNSIZED_BYTE_ARRAY:
+        case MBIM_FIELD_FORMAT_REF_BYTE_ARRAY:
+        case MBIM_FIELD_FORMAT_REF_BYTE_ARRAY_NO_OFFSET: {
+            const guint8 *tmp;
+            guint32       tmpsize;
+            gboolean      has_offset;
+
+            has_offset = (field->format == MBIM_FIELD_FORMAT_REF_BYTE_ARRAY);
+            if (field->format == MBIM_FIELD_FORMAT_BYTE_ARRAY) {
+                tmp = _mbim_message_read_byte_array (self, relative_offset, offset, FALSE, FALSE, NULL);
+                tmpsize = field->array_size;
+                offset += field->array_size;
+            } else if (field->format == MBIM_FIELD_FORMAT_UNSIZED_BYTE_ARRAY) {
+                tmp = _mbim_message_read_byte_array (self, relative_offset, offset, FALSE, FALSE, &tmpsize);
+                /* no offset update expected, this should be the last field */
+            } else if (field->has_array_size_field) {
+                tmp = _mbim_message_read_byte_array (self, relative_offset, offset, has_offset, FALSE, NULL);
+                tmpsize = n;
+                offset += 4;
+            } else {
+                tmp = _mbim_message_read_byte_array (self, relative_offset, offset, has_offset, TRUE, &tmpsize);
+                offset += 8;
+            }
+            _mbim_printer_append (printer, "\"");
+            _mbim_printer_append_hex (printer, tmp, tmpsize, ':');
+            _mbim_printer_append (printer, "\"");
+            break;
+        }
+
+        case MBIM_FIELD_FORMAT_GUINT32:
+            values[i] = _mbim_message_read_guint32 (self, offset);
+            offset += 4;
+            if (field->public_get_type && !field->referenced)
+                field_json_public (field, values[i], printer);
+            else
+                _mbim_printer_append_printf (printer, "%" G_GUINT32_FORMAT, values[i]);
+            break;
+
+        case MBIM_FIELD_FORMAT_GUINT64:
+            _mbim_printer_append_printf (printer, "%" G_GUINT64_FORMAT, _mbim_message_read_guint64 (self, offset));
+            offset += 8;
+            break;
+
+        case MBIM_FIELD_FORMAT_GUINT32_ARRAY:
+            _mbim_printer_append (printer, "[");
+            for (j = 0; j < n; j++)
+                _mbim_printer_append_printf (printer, "%s%" G_GUINT32_FORMAT, (j > 0) ? "," : "", _mbim_message_read_guint32 (self, offset + (4 * j)));
+            _mbim_printer_append (printer, "]");
+            offset += (4 * n);
+            break;
+
+        case MBIM_FIELD_FORMAT_STRING: {
+            gchar *tmp;
+
+            tmp = _mbim_message_read_string (self, relative_offset, offset);
+            _mbim_printer_append_json_string (printer, tmp);
+            g_free (tmp);
+            offset += 8;
+            break;
+        }
+
+        case MBIM_FIELD_FORMAT_STRING_ARRAY:
+            _mbim_printer_append (printer, "[");
+            for (j = 0; j < n; j++) {
+                gchar *tmp;
+
+                tmp = _mbim_message_read_string (self, relative_offset, offset + (8 * j));
+                if (j > 0)
+                    _mbim_printer_append (printer, ",");
+                _mbim_printer_append_json_string (printer, tmp);
+                g_free (tmp);
+            }
+            _mbim_printer_append (printer, "]");
+            offset += (8 * n);
+            break;
+
+        case MBIM_FIELD_FORMAT_IPV4:
+        case MBIM_FIELD_FORMAT_REF_IPV4: {
+            const MbimIPv4 *tmp;
+
+            tmp = _mbim_message_read_ipv4 (self, offset, field->format == MBIM_FIELD_FORMAT_REF_IPV4);
+            field_print_address (printer, tmp ? tmp->addr : NULL, FALSE, TRUE);
+            offset += 4;
+            break;
+        }
+
+        case MBIM_FIELD_FORMAT_IPV6:
+        case MBIM_FIELD_FORMAT_REF_IPV6: {
+            const MbimIPv6 *tmp;
+
+            tmp = _mbim_message_read_ipv6 (self, offset, field->format == MBIM_FIELD_FORMAT_REF_IPV6);
+            field_print_address (printer, tmp ? tmp->addr : NULL, TRUE, TRUE);
+            offset += (field->format == MBIM_FIELD_FORMAT_REF_IPV6 ? 4 : 16);
+            break;
+        }
+
+        default:
+            g_assert_not_reached ();
+        }
+    }
+
+    _mbim_printer_append (printer, "}");
+
+    if (bytes_read)
+        *bytes_read = (offset - relative_offset);
+}
+
+static void
+struct_fields_json_array (const MbimMessage      *self,
+                          const MbimStructFields *struct_fields,
+                          guint32                 array_size,
+                          guint32                 relative_offset_array_start,
+                          gboolean                refs,
+                          MbimPrinter            *printer)
+{
+    guint32 i;
+    guint32 offset;
+
+    _mbim_printer_append (printer, "[");
+    offset = refs ? relative_offset_array_start : _mbim_message_read_guint32 (self, relative_offset_array_start);
+    for (i = 0; i < array_size; i++) {
+        if (i > 0)
+            _mbim_printer_append (printer, ",");
+        if (!refs) {
+            struct_fields_json (self, struct_fields, offset, NULL, printer);
+            offset += struct_fields->wire_size;
+        } else {
+            struct_fields_json (self, struct_fields, _mbim_message_read_guint32 (self, offset), NULL, printer);
+            offset += 8;
+        }
+    }
+    _mbim_printer_append (printer, "]");
+}
+
+void
+_mbim_message_fields_json (const MbimMessage       *self,
+                           const MbimMessageFields *fields,
+                           MbimPrinter             *printer)
+{
+    guint32 *values;
+    guint32  offset = 0;
+    guint    n_members = 0;
+    guint    i;
+
+    if (!_mbim_message_fields_validate (self, fields, NULL)) {
+        _mbim_printer_append (printer, "null");
+        return;
+    }
+
+    values = g_newa (guint32, fields->n_fields + 1);
+
+    _mbim_printer_append (printer, "{");
+
+    for (i = 0; i < fields->n_fields; i++) {
+        const MbimField *field = &fields->fields[i];
+        guint32          n;
+        guint32          j;
+
+        values[i] = 0;
+        if (!field_is_available (field, values))
+            continue;
+
+        n = field_get_array_size (field, values);
+
+        _mbim_printer_append_json_key (printer, &n_members, field->name);
+
+        switch (field->format) {
+        case MBIM_FIELD_FORMAT_GUINT32:
+            values[i] = _mbim_message_read_guint32 (self, offset);
+            offset += 4;
+            if (field->public_get_type && !field->referenced)
+                field_json_public (field, values[i], printer);
+            else
+                _mbim_printer_append_printf (printer, "%" G_GUINT32_FORMAT, values[i]);
+            break;
+
+        case MBIM_FIELD_FORMAT_GUINT64: {
+            guint64 tmp;
+
+            tmp = _mbim_message_read_guint64 (self, offset);
+            offset += 8;
+            if (field->public_get_type)
+                field_json_public (field, (guint32) tmp, printer);
+            else
+                _mbim_printer_append_printf (printer, "%" G_GUINT64_FORMAT, tmp);
+            break;
+        }
+
+        case MBIM_FIELD_FORMAT_BYTE_ARRAY:
+        case MBIM_FIELD_FORMAT_UNSIZED_BYTE_ARRAY:
+        case MBIM_FIELD_FORMAT_REF_BYTE_ARRAY:
+        case MBIM_FIELD_FORMAT_REF_BYTE_ARRAY_NO_OFFSET: {
+            const guint8 *tmp;
+            guint32       tmpsize;
+
+            if (field->format == MBIM_FIELD_FORMAT_BYTE_ARRAY) {
+                tmp = _mbim_message_read_byte_array (self, 0, offset, FALSE, FALSE, NULL);
+                tmpsize = field->array_size;
+                offset += field->array_size;
+            } else if (field->format == MBIM_FIELD_FORMAT_UNSIZED_BYTE_ARRAY) {
+                tmp = _mbim_message_read_byte_array (self, 0, offset, FALSE, FALSE, &tmpsize);
+                offset += tmpsize;
+            } else if (field->format == MBIM_FIELD_FORMAT_REF_BYTE_ARRAY) {
+                tmp = _mbim_message_read_byte_array (self, 0, offset, TRUE, TRUE, &tmpsize);
+                offset += 8;
+            } else {
+                tmp = _mbim_message_read_byte_array (self, 0, offset, FALSE, TRUE, &tmpsize);
+                offset += 4;
+            }
+            _mbim_printer_append (printer, "\"");
+            _mbim_printer_append_hex (printer, tmp, tmpsize, ':');
+            _mbim_printer_append (printer, "\"");
+            break;
+        }
+
+        case MBIM_FIELD_FORMAT_UUID:
+            _mbim_printer_append (printer, "\"");
+            _mbim_printer_append_uuid (printer, _mbim_message_read_uuid (self, offset));
+            _mbim_printer_append (printer, "\"");
+            offset += 16;
+            break;
+
+        case MBIM_FIELD_FORMAT_STRING: {
+            gchar *tmp;
+
+            tmp = _mbim_message_read_string (self, 0, offset);
+            offset += 8;
+            _mbim_printer_append_json_string (printer, tmp);
+            g_free (tmp);
+            break;
+        }
+
+        case MBIM_FIELD_FORMAT_STRING_ARRAY:
+            _mbim_printer_append (printer, "[");
+            for (j = 0; j < n; j++) {
+                gchar *tmp;
+
+                tmp = _mbim_message_read_string (self, 0, offset + (8 * j));
+                if (j > 0)
+                    _mbim_printer_append (printer, ",");
+                _mbim_printer_append_json_string (printer, tmp);
+                g_free (tmp);
+            }
+            _mbim_printer_append (printer, "]");
+            offset += (8 * n);
+            break;
+
+        case MBIM_FIELD_FORMAT_STRUCT: {
+            guint32 bytes_read = 0;
+
+            struct_fields_json (self, field->struct_fields, offset, &bytes_read, printer);
+            offset += bytes_read;
+            break;
+        }
+
+        case MBIM_FIELD_FORMAT_STRUCT_ARRAY:
+            struct_fields_json_array (self, field->struct_fields, n, offset, FALSE, printer);
+            offset += 4;
+            break;
+
+        case MBIM_FIELD_FORMAT_REF_STRUCT_ARRAY:
+            struct_fields_json_array (self, field->struct_fields, n, offset, TRUE, printer);
+            offset += (8 * n);
+            break;
+
+        case MBIM_FIELD_FORMAT_IPV4:
+        case MBIM_FIELD_FORMAT_REF_IPV4: {
+            const MbimIPv4 *tmp;
+
+            tmp = _mbim_message_read_ipv4 (self, offset, field->format == MBIM_FIELD_FORMAT_REF_IPV4);
+            offset += 4;
+            field_print_address (printer, tmp ? tmp->addr : NULL, FALSE, TRUE);
+            break;
+        }
+
+        case MBIM_FIELD_FORMAT_IPV6:
+        case MBIM_FIELD_FORMAT_REF_IPV6: {
+            const MbimIPv6 *tmp;
+
+            tmp = _mbim_message_read_ipv6 (self, offset, field->format == MBIM_FIELD_FORMAT_REF_IPV6);
+            offset += (field->format == MBIM_FIELD_FORMAT_REF_IPV6 ? 4 : 16);
+            field_print_address (printer, tmp ? tmp->addr : NULL, TRUE, TRUE);
+            break;
+        }
+
+        case MBIM_FIELD_FORMAT_IPV4_ARRAY:
+        case MBIM_FIELD_FORMAT_IPV6_ARRAY: {
+            guint32  array_offset;
+            gboolean ipv6;
+
+            ipv6 = (field->format == MBIM_FIELD_FORMAT_IPV6_ARRAY);
+            array_offset = _mbim_message_read_guint32 (self, offset);
+            offset += 4;
+            _mbim_printer_append (printer, "[");
+            for (j = 0; j < n; j++) {
+                _mbim_printer_append (printer, j > 0 ? ",\"" : "\"");
+                _mbim_printer_append_ip (printer,
+                                         ipv6 ?
+                                         _mbim_message_read_ipv6 (self, array_offset + (16 * j), FALSE)->addr :
+                                         _mbim_message_read_ipv4 (self, array_offset + (4 * j), FALSE)->addr,
+                                         ipv6);
+                _mbim_printer_append (printer, "\"");
+            }
+            _mbim_printer_append (printer, "]");
+            break;
+        }
+
+        case MBIM_FIELD_FORMAT_GUINT32_ARRAY:
+        default:
+            g_assert_not_reached ();
+        }
+    }
+
+    _mbim_printer_append (printer, "}");
 }
 
 /*****************************************************************************/
@@ -101,6 +101,19 @@ typedef enum {
 /*****************************************************************************/
 /* Generic message interface */
 
+/**
+ * MbimMessagePrinterFunc:
+ * @str: a chunk of the printable output, not NUL-terminated.
+ * @len: length of @str.
+ * @user_data: the data given to mbim_message_print().
+ *
+ * Sink receiving the printable output of mbim_message_print(),
+ * mbim_message_print_json() or mbim_message_print_keyvalue(), in chunks.
+ */
+typedef void (* MbimMessagePrinterFunc) (const gchar *str,
+                                         gsize        len,
+                                         gpointer     user_data);
+
 MbimMessage     *mbim_message_new                  (const guint8       *data,
                                                     guint32             data_length);
 MbimMessage     *mbim_message_dup                  (const MbimMessage  *self);
@@ -110,6 +123,22 @@ void             mbim_message_unref                (MbimMessage        *self);
 gchar           *mbim_message_get_printable        (const MbimMessage  *self,
                                                     const gchar        *line_prefix,
                                                     gboolean            headers_only);
+void             mbim_message_print                (const MbimMessage      *self,
+                                                    const gchar            *line_prefix,
+                                                    gboolean                headers_only,
+                                                    MbimMessagePrinterFunc  printer_func,
+                                                    gpointer                user_data);
+gchar           *mbim_message_get_json             (const MbimMessage  *self);
+gsize            mbim_message_write_json           (const MbimMessage  *self,
+                                                    gchar              *buffer,
+                                                    gsize               buffer_size);
+void             mbim_message_print_json           (const MbimMessage      *self,
+                                                    MbimMessagePrinterFunc  printer_func,
+                                                    gpointer                user_data);
+void             mbim_message_print_keyvalue       (const MbimMessage      *self,
+                                                    const gchar            *key_prefix,
+                                                    MbimMessagePrinterFunc  printer_func,
+                                                    gpointer                user_data);
 const guint8    *mbim_message_get_raw              (const MbimMessage  *self,
                                                     guint32            *length,
                                                     GError            **error);
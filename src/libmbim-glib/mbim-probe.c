@@ -0,0 +1,205 @@
+/* -*- Mode: C; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*- */
+
+/*
+ * libmbim-glib -- GLib/GIO based library to control MBIM devices
+ *
+ * This library is free software; you can redistribute it and/or
+ * modify it under the terms of the GNU Lesser General Public
+ * License as published by the Free Software Foundation; either
+ * version 2 of the License, or (at your option) any later version.
+ *
+ * This library is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ * Lesser General Public License for more details.
+ *
+ * You should have received a copy of the GNU Lesser General Public
+ * License along with this library; if not, write to the
+ * Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor,
+ * Boston, MA 02110-1301 USA.
+ *
+ * Copyright (C) 2013 - 2014 Aleksander Morgado <aleksander@aleksander.es>
+ */
+
+
+#include <config.h>
+
+#include "mbim-probe.h"
+
+/**
+ * SECTION:mbim-probe
+ * @title: Probes
+ * @short_description: Hooks in the lifecycle of the messages.
+ *
+ * Probes are functions attached to a #MbimDevice or a #MbimProxy with
+ * mbim_device_add_probe() or mbim_proxy_add_probe(), called whenever one of
+ * the selected #MbimProbePoint is reached. They get a monotonic timestamp and
+ * the raw message, without any kind of formatting, so that they can be used to
+ * export the lifecycle of the messages to external tracing or profiling tools.
+ *
+ * When no probe is attached, the only cost in the message path is a single
+ * branch.
+ */
+
+/* Probes are reference counted, so that they can be removed, even from their
+ * own callback, while being fired */
+typedef struct {
+    guint          ref_count;
+    gboolean       removed;
+    guint          id;
+    MbimProbePoint points;
+    MbimProbeFunc  func;
+    gpointer       user_data;
+    GDestroyNotify user_data_free;
+} Probe;
+
+struct _MbimProbeList {
+    /* Union of the points of all probes */
+    MbimProbePoint  points;
+    GPtrArray      *probes;
+    guint           next_id;
+};
+
+/* Probes fired without allocating a snapshot array */
+#define PROBE_SNAPSHOT_STACK_SIZE 8
+
+static Probe *
+probe_ref (Probe *probe)
+{
+    probe->ref_count++;
+    return probe;
+}
+
+static void
+probe_unref (Probe *probe)
+{
+    if (--probe->ref_count > 0)
+        return;
+
+    if (probe->user_data_free)
+        probe->user_data_free (probe->user_data);
+    g_slice_free (Probe, probe);
+}
+
+static void
+probe_release (Probe *probe)
+{
+    probe->removed = TRUE;
+    probe_unref (probe);
+}
+
+static void
+probe_list_update_points (MbimProbeList *list)
+{
+    guint i;
+
+    list->points = 0;
+    for (i = 0; i < list->probes->len; i++)
+        list->points |= ((Probe *) g_ptr_array_index (list->probes, i))->points;
+}
+
+guint
+_mbim_probe_list_add (MbimProbeList  **list,
+                      MbimProbePoint   points,
+                      MbimProbeFunc    func,
+                      gpointer         user_data,
+                      GDestroyNotify   user_data_free)
+{
+    Probe *probe;
+
+    if (!*list) {
+        *list = g_slice_new0 (MbimProbeList);
+        (*list)->probes = g_ptr_array_new_with_free_func ((GDestroyNotify) probe_release);
+    }
+
+    probe = g_slice_new0 (Probe);
+    probe->ref_count = 1;
+    probe->id = ++(*list)->next_id;
+    probe->points = points;
+    probe->func = func;
+    probe->user_data = user_data;
+    probe->user_data_free = user_data_free;
+    g_ptr_array_add ((*list)->probes, probe);
+    (*list)->points |= points;
+
+    return probe->id;
+}
+
+gboolean
+_mbim_probe_list_remove (MbimProbeList **list,
+                         guint           probe_id)
+{
+    guint i;
+
+    if (!*list)
+        return FALSE;
+
+    for (i = 0; i < (*list)->probes->len; i++) {
+        if (((Probe *) g_ptr_array_index ((*list)->probes, i))->id == probe_id) {
+            g_ptr_array_remove_index ((*list)->probes, i);
+
+            /* Back to the single branch cost when the last one is gone */
+            if (!(*list)->probes->len) {
+                _mbim_probe_list_free (*list);
+                *list = NULL;
+            } else
+                probe_list_update_points (*list);
+            return TRUE;
+        }
+    }
+
+    return FALSE;
+}
+
+void
+_mbim_probe_list_free (MbimProbeList *list)
+{
+    if (!list)
+        return;
+
+    g_ptr_array_unref (list->probes);
+    g_slice_free (MbimProbeList, list);
+}
+
+void
+_mbim_probe_list_fire (MbimProbeList  *list,
+                       MbimProbePoint  point,
+                       const guint8   *data,
+                       gsize           data_length)
+{
+    Probe  *stack_snapshot[PROBE_SNAPSHOT_STACK_SIZE];
+    Probe **snapshot;
+    guint   n_snapshot = 0;
+    gint64  timestamp;
+    guint   i;
+
+    if (!(list->points & point))
+        return;
+
+    /* The callbacks may add or remove probes, and even free the list along
+     * with the last one, so iterate over a snapshot of the probes to call.
+     * Probes added meanwhile are not called, probes removed meanwhile are
+     * skipped, and their user data is kept alive until the loop is done. */
+    if (list->probes->len <= PROBE_SNAPSHOT_STACK_SIZE)
+        snapshot = stack_snapshot;
+    else
+        snapshot = g_new (Probe *, list->probes->len);
+
+    for (i = 0; i < list->probes->len; i++) {
+        Probe *probe;
+
+        probe = g_ptr_array_index (list->probes, i);
+        if (probe->points & point)
+            snapshot[n_snapshot++] = probe_ref (probe);
+    }
+
+    timestamp = g_get_monotonic_time ();
+    for (i = 0; i < n_snapshot; i++) {
+        if (!snapshot[i]->removed)
+            snapshot[i]->func (point, timestamp, data, data_length, snapshot[i]->user_data);
+        probe_unref (snapshot[i]);
+    }
+
+    if (snapshot != stack_snapshot)
+        g_free (snapshot);
+}
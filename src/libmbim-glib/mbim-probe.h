@@ -0,0 +1,107 @@
+/* -*- Mode: C; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*- */
+
+/*
+ * libmbim-glib -- GLib/GIO based library to control MBIM devices
+ *
+ * This library is free software; you can redistribute it and/or
+ * modify it under the terms of the GNU Lesser General Public
+ * License as published by the Free Software Foundation; either
+ * version 2 of the License, or (at your option) any later version.
+ *
+ * This library is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ * Lesser General Public License for more details.
+ *
+ * You should have received a copy of the GNU Lesser General Public
+ * License along with this library; if not, write to the
+ * Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor,
+ * Boston, MA 02110-1301 USA.
+ *
+ * Copyright (C) 2013 - 2014 Aleksander Morgado <aleksander@aleksander.es>
+ */
+
+#ifndef _LIBMBIM_GLIB_MBIM_PROBE_H_
+#define _LIBMBIM_GLIB_MBIM_PROBE_H_
+
+#if !defined (__LIBMBIM_GLIB_H_INSIDE__) && !defined (LIBMBIM_GLIB_COMPILATION)
+#error "Only <libmbim-glib.h> can be included directly."
+#endif
+
+#include <glib.h>
+
+G_BEGIN_DECLS
+
+/**
+ * MbimProbePoint:
+ * @MBIM_PROBE_POINT_MESSAGE_RECEIVED: A message or fragment was read.
+ * @MBIM_PROBE_POINT_FRAGMENT_ADDED: A fragment was added to a message being reassembled.
+ * @MBIM_PROBE_POINT_MESSAGE_COMPLETED: A message was fully received.
+ * @MBIM_PROBE_POINT_TRANSACTION_MATCHED: A received message was matched to a pending request.
+ * @MBIM_PROBE_POINT_INDICATION_DISPATCHED: An indication was dispatched to its listeners.
+ * @MBIM_PROBE_POINT_MESSAGE_WRITTEN: A message was written.
+ *
+ * Points in the lifecycle of a message where probes may be attached.
+ */
+typedef enum {
+    MBIM_PROBE_POINT_MESSAGE_RECEIVED      = 1 << 0,
+    MBIM_PROBE_POINT_FRAGMENT_ADDED        = 1 << 1,
+    MBIM_PROBE_POINT_MESSAGE_COMPLETED     = 1 << 2,
+    MBIM_PROBE_POINT_TRANSACTION_MATCHED   = 1 << 3,
+    MBIM_PROBE_POINT_INDICATION_DISPATCHED = 1 << 4,
+    MBIM_PROBE_POINT_MESSAGE_WRITTEN       = 1 << 5
+} MbimProbePoint;
+
+/**
+ * MbimProbeFunc:
+ * @point: the #MbimProbePoint reached, a single one.
+ * @timestamp: monotonic time when @point was reached, as given by g_get_monotonic_time().
+ * @data: the raw message at @point, owned by the caller.
+ * @data_length: size of @data.
+ * @user_data: user data given when the probe was added.
+ *
+ * Function called whenever a probe point is reached.
+ *
+ * It is called synchronously in the message path, so it should return as soon
+ * as possible. It may add or remove probes, including itself: probes removed
+ * meanwhile are no longer called, and probes added meanwhile are first called
+ * the next time a point is reached.
+ */
+typedef void (* MbimProbeFunc) (MbimProbePoint  point,
+                                gint64          timestamp,
+                                const guint8   *data,
+                                gsize           data_length,
+                                gpointer        user_data);
+
+/* Private methods */
+
+#if defined (LIBMBIM_GLIB_COMPILATION)
+
+typedef struct _MbimProbeList MbimProbeList;
+
+guint    _mbim_probe_list_add    (MbimProbeList  **list,
+                                  MbimProbePoint   points,
+                                  MbimProbeFunc    func,
+                                  gpointer         user_data,
+                                  GDestroyNotify   user_data_free);
+gboolean _mbim_probe_list_remove (MbimProbeList  **list,
+                                  guint            probe_id);
+void     _mbim_probe_list_free   (MbimProbeList   *list);
+void     _mbim_probe_list_fire   (MbimProbeList   *list,
+                                  MbimProbePoint   point,
+                                  const guint8    *data,
+                                  gsize            data_length);
+
+/* The list is NULL while there are no probes, so unprobed paths only pay a
+ * single branch and don't even evaluate the arguments */
+#define _mbim_probe(list, point, data, data_length)                \
+    G_STMT_START {                                                 \
+        if (G_UNLIKELY (list))                                     \
+            _mbim_probe_list_fire (list, point, data, data_length); \
+    } G_STMT_END
+
+#endif
+
+G_END_DECLS
+
+#endif /* _LIBMBIM_GLIB_MBIM_PROBE_H_ */
@@ -22,6 +22,7 @@
  * Copyright (C) 2014 Smith Micro Software, Inc.
  */
 
+#include <stdlib.h>
 #include <string.h>
 #include "mbim-proxy-helpers.h"
 #include "mbim-message-private.h"
@@ -177,91 +178,257 @@ _mbim_proxy_helper_service_subscribe_request_parse (MbimMessage *message,
 
 /*****************************************************************************/
 
-MbimEventEntry **
-_mbim_proxy_helper_service_subscribe_list_merge (MbimEventEntry **in,
-                                                 gsize            in_size,
-                                                 MbimEventEntry **merge,
-                                                 gsize            merge_size,
-                                                 gsize           *out_size)
+/* Refcounted set of service/CID subscriptions */
+
+typedef struct {
+    MbimUuid    uuid;
+    /* Whether this is one of the standard services */
+    gboolean    standard;
+    /* Number of subscriptions to all CIDs of the service */
+    guint       all_cids_refs;
+    /* CID -> number of subscriptions */
+    GHashTable *cids;
+} EventSetService;
+
+struct _MbimProxyEventSet {
+    /* MbimUuid -> EventSetService */
+    GHashTable *services;
+    /* EventSetService items, in the order they were added */
+    GPtrArray  *order;
+};
+
+static gboolean
+uuid_is_standard_service (const MbimUuid *uuid)
 {
-    gsize m;
+    MbimService id;
 
-    g_assert (out_size != NULL);
+    id = mbim_uuid_to_service (uuid);
+    return (id >= MBIM_SERVICE_BASIC_CONNECT && id <= MBIM_SERVICE_DSS);
+}
 
-    *out_size = in_size;
+static void
+event_set_service_free (EventSetService *service)
+{
+    g_hash_table_unref (service->cids);
+    g_slice_free (EventSetService, service);
+}
+
+MbimProxyEventSet *
+_mbim_proxy_helper_event_set_new (void)
+{
+    MbimProxyEventSet *set;
+
+    set = g_slice_new0 (MbimProxyEventSet);
+    set->services = g_hash_table_new (_mbim_uuid_hash, _mbim_uuid_equal);
+    set->order = g_ptr_array_new_with_free_func ((GDestroyNotify)event_set_service_free);
+    return set;
+}
+
+void
+_mbim_proxy_helper_event_set_free (MbimProxyEventSet *set)
+{
+    g_hash_table_unref (set->services);
+    g_ptr_array_unref (set->order);
+    g_slice_free (MbimProxyEventSet, set);
+}
 
-    if (!merge || !merge_size)
-        return in;
+/* Returns TRUE if the effective set of subscriptions changed */
+static gboolean
+event_set_ref_entry (MbimProxyEventSet    *set,
+                     const MbimEventEntry *entry,
+                     gboolean              ignore_standard)
+{
+    EventSetService *service;
+    gboolean         changed = FALSE;
+    guint32          i;
+
+    service = g_hash_table_lookup (set->services, &entry->device_service_id);
+    if (!service) {
+        gboolean standard;
+
+        standard = uuid_is_standard_service (&entry->device_service_id);
+        if (standard && ignore_standard)
+            return FALSE;
+
+        service = g_slice_new0 (EventSetService);
+        memcpy (&service->uuid, &entry->device_service_id, sizeof (MbimUuid));
+        service->standard = standard;
+        service->cids = g_hash_table_new (g_direct_hash, g_direct_equal);
+        g_hash_table_insert (set->services, &service->uuid, service);
+        g_ptr_array_add (set->order, service);
+        changed = TRUE;
+    } else if (service->standard && ignore_standard)
+        return FALSE;
+
+    /* Wildcard subscription */
+    if (entry->cids_count == 0) {
+        if (service->all_cids_refs++ == 0)
+            changed = TRUE;
+        return changed;
+    }
+
+    for (i = 0; i < entry->cids_count; i++) {
+        guint refs;
+
+        refs = GPOINTER_TO_UINT (g_hash_table_lookup (service->cids, GUINT_TO_POINTER (entry->cids[i])));
+        g_hash_table_insert (service->cids, GUINT_TO_POINTER (entry->cids[i]), GUINT_TO_POINTER (refs + 1));
+        /* New CIDs are irrelevant if all CIDs are already enabled */
+        if (refs == 0 && !service->all_cids_refs)
+            changed = TRUE;
+    }
 
-    for (m = 0; m < merge_size; m++) {
-        MbimEventEntry *entry = NULL;
-        MbimService id;
+    return changed;
+}
+
+/* Returns TRUE if the effective set of subscriptions changed */
+static gboolean
+event_set_unref_entry (MbimProxyEventSet    *set,
+                       const MbimEventEntry *entry,
+                       gboolean              ignore_standard)
+{
+    EventSetService *service;
+    gboolean         changed = FALSE;
+    guint32          i;
 
-        /* ignore all merge additions for standard services */
-        id = mbim_uuid_to_service (&merge[m]->device_service_id);
-        if (id >= MBIM_SERVICE_BASIC_CONNECT && id <= MBIM_SERVICE_DSS)
-            continue;
+    service = g_hash_table_lookup (set->services, &entry->device_service_id);
+    if (!service || (service->standard && ignore_standard))
+        return FALSE;
 
-        /* look for matching uuid */
-        if (in && in_size) {
-            gsize i;
+    if (entry->cids_count == 0) {
+        g_return_val_if_fail (service->all_cids_refs > 0, FALSE);
+        if (--service->all_cids_refs == 0)
+            changed = TRUE;
+    } else {
+        for (i = 0; i < entry->cids_count; i++) {
+            guint refs;
 
-            for (i = 0; i < in_size; i++) {
-                if (mbim_uuid_cmp (&merge[m]->device_service_id, &in[i]->device_service_id)) {
-                    entry = in[i];
-                    break;
-                }
+            refs = GPOINTER_TO_UINT (g_hash_table_lookup (service->cids, GUINT_TO_POINTER (entry->cids[i])));
+            if (refs == 0)
+                continue;
+            if (refs > 1) {
+                g_hash_table_insert (service->cids, GUINT_TO_POINTER (entry->cids[i]), GUINT_TO_POINTER (refs - 1));
+                continue;
             }
+            g_hash_table_remove (service->cids, GUINT_TO_POINTER (entry->cids[i]));
+            if (!service->all_cids_refs)
+                changed = TRUE;
         }
+    }
 
-        /* matching uuid not found in merge array, add it */
-        if (!entry) {
-            gsize o;
+    /* Remove the service completely once unused */
+    if (!service->all_cids_refs && g_hash_table_size (service->cids) == 0) {
+        g_hash_table_remove (set->services, &service->uuid);
+        g_ptr_array_remove (set->order, service);
+        changed = TRUE;
+    }
 
-            /* Index of the new element to add... */
-            o = *out_size;
+    return changed;
+}
 
-            /* Increase number of events in the output array */
-            (*out_size)++;
-            in = g_realloc (in, sizeof (MbimEventEntry *) * (*out_size + 1));
-            in[o] = g_memdup (merge[m], sizeof (MbimEventEntry));
-            if (merge[m]->cids_count)
-                in[o]->cids = g_memdup (merge[m]->cids, sizeof (guint32) * merge[m]->cids_count);
-            else
-                in[o]->cids = NULL;
-            in[*out_size] = NULL;
-        } else {
-            gsize cm, co;
-
-            /* matching uuid found, add cids */
-            if (!entry->cids_count)
-                /* all cids already enabled for uuid */
-                continue;
+MbimProxyEventSet *
+_mbim_proxy_helper_event_set_new_standard (void)
+{
+    MbimProxyEventSet  *set;
+    MbimEventEntry    **standard;
+    gsize               standard_size = 0;
+    gsize               i;
 
-            /* If we're adding all enabled cids, directly apply that */
-            if (merge[m]->cids_count == 0) {
-                g_free (entry->cids);
-                entry->cids = NULL;
-                entry->cids_count = 0;
-            }
+    set = _mbim_proxy_helper_event_set_new ();
 
-            for (cm = 0; cm < merge[m]->cids_count; cm++) {
-                for (co = 0; co < entry->cids_count; co++) {
-                    if (merge[m]->cids[cm] == entry->cids[co]) {
-                        break;
-                    }
-                }
-
-                if (co == entry->cids_count) {
-                    /* cid not found in merge array, add it */
-                    entry->cids = g_realloc (entry->cids, sizeof (guint32) * (++entry->cids_count));
-                    entry->cids[co] = merge[m]->cids[cm];
-                }
-            }
+    standard = _mbim_proxy_helper_service_subscribe_list_new_standard (&standard_size);
+    for (i = 0; i < standard_size; i++)
+        event_set_ref_entry (set, standard[i], FALSE);
+    mbim_event_entry_array_free (standard);
+
+    return set;
+}
+
+gboolean
+_mbim_proxy_helper_event_set_add (MbimProxyEventSet            *set,
+                                  const MbimEventEntry * const *list,
+                                  gsize                         list_size)
+{
+    gboolean changed = FALSE;
+    gsize    i;
+
+    g_assert (set != NULL);
+
+    for (i = 0; i < list_size; i++) {
+        if (event_set_ref_entry (set, list[i], TRUE))
+            changed = TRUE;
+    }
+
+    return changed;
+}
+
+gboolean
+_mbim_proxy_helper_event_set_remove (MbimProxyEventSet            *set,
+                                     const MbimEventEntry * const *list,
+                                     gsize                         list_size)
+{
+    gboolean changed = FALSE;
+    gsize    i;
+
+    g_assert (set != NULL);
+
+    for (i = 0; i < list_size; i++) {
+        if (event_set_unref_entry (set, list[i], TRUE))
+            changed = TRUE;
+    }
+
+    return changed;
+}
+
+static gint
+cid_cmp (gconstpointer a,
+         gconstpointer b)
+{
+    guint32 cid_a = *((const guint32 *)a);
+    guint32 cid_b = *((const guint32 *)b);
+
+    return (cid_a < cid_b) ? -1 : (cid_a > cid_b);
+}
+
+MbimEventEntry **
+_mbim_proxy_helper_event_set_build_list (MbimProxyEventSet *set,
+                                         gsize             *out_size)
+{
+    MbimEventEntry **out;
+    guint            i;
+
+    g_assert (set != NULL);
+    g_assert (out_size != NULL);
+
+    *out_size = set->order->len;
+    if (!set->order->len)
+        return NULL;
+
+    out = g_new0 (MbimEventEntry *, set->order->len + 1);
+    for (i = 0; i < set->order->len; i++) {
+        EventSetService *service;
+        MbimEventEntry  *entry;
+
+        service = g_ptr_array_index (set->order, i);
+        entry = g_new0 (MbimEventEntry, 1);
+        memcpy (&entry->device_service_id, &service->uuid, sizeof (MbimUuid));
+
+        if (!service->all_cids_refs) {
+            GHashTableIter iter;
+            gpointer       key;
+            guint32        j = 0;
+
+            entry->cids_count = g_hash_table_size (service->cids);
+            entry->cids = g_new (guint32, entry->cids_count);
+            g_hash_table_iter_init (&iter, service->cids);
+            while (g_hash_table_iter_next (&iter, &key, NULL))
+                entry->cids[j++] = GPOINTER_TO_UINT (key);
+            qsort (entry->cids, entry->cids_count, sizeof (guint32), cid_cmp);
         }
+
+        out[i] = entry;
     }
 
-    return in;
+    return out;
 }
 
 /*****************************************************************************/
@@ -389,3 +556,625 @@ _mbim_proxy_helper_service_subscribe_list_new_standard (gsize *out_size)
     *out_size = i;
     return out;
 }
+
+/*****************************************************************************/
+/* Capture ring
+ *
+ * Records are stored back to back in a fixed-size circular buffer, already
+ * serialized in the same layout used in the dump file, so that recording is
+ * just a couple of memcpy() calls and dumping is a plain write of the ring
+ * contents. When there is no space left, the oldest records are dropped.
+ */
+
+struct capture_record_header {
+    guint64 timestamp;
+    guint32 client_id;
+    guint8  direction;
+    guint8  reserved;
+    guint16 device_path_len;
+    guint32 captured_len;
+    guint32 original_len;
+} __attribute__((packed));
+
+struct capture_file_header {
+    guint8  magic[8];
+    guint32 version;
+    guint32 n_records;
+} __attribute__((packed));
+
+#define CAPTURE_FILE_MAGIC   "MBIMCAP"
+#define CAPTURE_FILE_VERSION 1
+
+/* Don't let a single record take more than half of the ring */
+#define CAPTURE_MAX_RECORD_FRACTION 2
+
+struct _MbimProxyCapture {
+    guint8 *buffer;
+    gsize   size;
+    /* Offset of the oldest record */
+    gsize   head;
+    /* Amount of bytes in use */
+    gsize   used;
+    guint   n_records;
+};
+
+MbimProxyCapture *
+_mbim_proxy_helper_capture_new (gsize size)
+{
+    MbimProxyCapture *capture;
+
+    g_return_val_if_fail (size > sizeof (struct capture_record_header), NULL);
+
+    capture = g_slice_new0 (MbimProxyCapture);
+    capture->buffer = g_malloc (size);
+    capture->size = size;
+    return capture;
+}
+
+void
+_mbim_proxy_helper_capture_free (MbimProxyCapture *capture)
+{
+    g_free (capture->buffer);
+    g_slice_free (MbimProxyCapture, capture);
+}
+
+static void
+capture_read (MbimProxyCapture *capture,
+              gsize             offset,
+              guint8           *out,
+              gsize             len)
+{
+    gsize first;
+
+    offset %= capture->size;
+    first = MIN (len, capture->size - offset);
+    memcpy (out, &capture->buffer[offset], first);
+    if (first < len)
+        memcpy (&out[first], capture->buffer, len - first);
+}
+
+static void
+capture_write (MbimProxyCapture *capture,
+               gsize             offset,
+               const guint8     *in,
+               gsize             len)
+{
+    gsize first;
+
+    offset %= capture->size;
+    first = MIN (len, capture->size - offset);
+    memcpy (&capture->buffer[offset], in, first);
+    if (first < len)
+        memcpy (capture->buffer, &in[first], len - first);
+}
+
+static void
+capture_drop_oldest (MbimProxyCapture *capture)
+{
+    struct capture_record_header header;
+    gsize record_len;
+
+    g_assert (capture->n_records > 0);
+
+    capture_read (capture, capture->head, (guint8 *)&header, sizeof (header));
+    record_len = (sizeof (header) +
+                  GUINT16_FROM_LE (header.device_path_len) +
+                  GUINT32_FROM_LE (header.captured_len));
+
+    capture->head = (capture->head + record_len) % capture->size;
+    capture->used -= record_len;
+    capture->n_records--;
+}
+
+void
+_mbim_proxy_helper_capture_record (MbimProxyCapture          *capture,
+                                   MbimProxyCaptureDirection  direction,
+                                   guint32                    client_id,
+                                   const gchar               *device_path,
+                                   const guint8              *data,
+                                   gsize                      data_len)
+{
+    struct capture_record_header header;
+    gsize device_path_len;
+    gsize captured_len;
+    gsize record_len;
+    gsize max_record_len;
+    gsize tail;
+
+    max_record_len = capture->size / CAPTURE_MAX_RECORD_FRACTION;
+
+    device_path_len = device_path ? MIN (strlen (device_path), G_MAXUINT16) : 0;
+    if (sizeof (header) + device_path_len > max_record_len)
+        device_path_len = 0;
+
+    /* Oversized messages are truncated */
+    captured_len = MIN (data_len, max_record_len - sizeof (header) - device_path_len);
+    record_len = sizeof (header) + device_path_len + captured_len;
+
+    while (capture->size - capture->used < record_len)
+        capture_drop_oldest (capture);
+
+    header.timestamp = GUINT64_TO_LE (g_get_monotonic_time ());
+    header.client_id = GUINT32_TO_LE (client_id);
+    header.direction = (guint8) direction;
+    header.reserved = 0;
+    header.device_path_len = GUINT16_TO_LE ((guint16) device_path_len);
+    header.captured_len = GUINT32_TO_LE ((guint32) captured_len);
+    header.original_len = GUINT32_TO_LE ((guint32) MIN (data_len, G_MAXUINT32));
+
+    tail = capture->head + capture->used;
+    capture_write (capture, tail, (const guint8 *)&header, sizeof (header));
+    tail += sizeof (header);
+    if (device_path_len) {
+        capture_write (capture, tail, (const guint8 *)device_path, device_path_len);
+        tail += device_path_len;
+    }
+    if (captured_len)
+        capture_write (capture, tail, data, captured_len);
+
+    capture->used += record_len;
+    capture->n_records++;
+}
+
+guint
+_mbim_proxy_helper_capture_get_n_records (MbimProxyCapture *capture)
+{
+    return capture->n_records;
+}
+
+gboolean
+_mbim_proxy_helper_capture_dump (MbimProxyCapture  *capture,
+                                 const gchar       *path,
+                                 GError           **error)
+{
+    struct capture_file_header header;
+    guint8 *contents;
+    gboolean success;
+
+    memcpy (header.magic, CAPTURE_FILE_MAGIC, sizeof (header.magic));
+    header.version = GUINT32_TO_LE (CAPTURE_FILE_VERSION);
+    header.n_records = GUINT32_TO_LE (capture->n_records);
+
+    contents = g_malloc (sizeof (header) + capture->used);
+    memcpy (contents, &header, sizeof (header));
+    capture_read (capture, capture->head, &contents[sizeof (header)], capture->used);
+
+    success = g_file_set_contents (path, (const gchar *)contents, sizeof (header) + capture->used, error);
+    g_free (contents);
+    return success;
+}
+
+/*****************************************************************************/
+/* Command latency statistics
+ *
+ * Latencies are kept in a log2 histogram per service/CID, so that recording
+ * is constant time and memory doesn't grow with the number of commands. The
+ * reported percentiles are the upper bounds of the matching buckets.
+ */
+
+#define LATENCY_N_BUCKETS 32
+
+typedef struct {
+    MbimUuid service_id;
+    guint32  cid;
+    guint32  count;
+    guint32  buckets[LATENCY_N_BUCKETS];
+} LatencyEntry;
+
+struct _MbimProxyLatencyStats {
+    /* LatencyEntry -> LatencyEntry, keyed by service and CID */
+    GHashTable *entries;
+    /* LatencyEntry items, in the order they were added */
+    GPtrArray  *order;
+};
+
+static guint
+latency_entry_hash (gconstpointer v)
+{
+    const LatencyEntry *entry = v;
+
+    return _mbim_uuid_hash (&entry->service_id) ^ entry->cid;
+}
+
+static gboolean
+latency_entry_equal (gconstpointer a,
+                     gconstpointer b)
+{
+    const LatencyEntry *entry_a = a;
+    const LatencyEntry *entry_b = b;
+
+    return (entry_a->cid == entry_b->cid &&
+            _mbim_uuid_equal (&entry_a->service_id, &entry_b->service_id));
+}
+
+static void
+latency_entry_free (LatencyEntry *entry)
+{
+    g_slice_free (LatencyEntry, entry);
+}
+
+MbimProxyLatencyStats *
+_mbim_proxy_helper_latency_stats_new (void)
+{
+    MbimProxyLatencyStats *stats;
+
+    stats = g_slice_new (MbimProxyLatencyStats);
+    stats->entries = g_hash_table_new (latency_entry_hash, latency_entry_equal);
+    stats->order = g_ptr_array_new_with_free_func ((GDestroyNotify) latency_entry_free);
+    return stats;
+}
+
+void
+_mbim_proxy_helper_latency_stats_free (MbimProxyLatencyStats *stats)
+{
+    g_hash_table_unref (stats->entries);
+    g_ptr_array_unref (stats->order);
+    g_slice_free (MbimProxyLatencyStats, stats);
+}
+
+void
+_mbim_proxy_helper_latency_stats_record (MbimProxyLatencyStats *stats,
+                                         const MbimUuid        *service_id,
+                                         guint32                cid,
+                                         guint64                latency_usecs)
+{
+    LatencyEntry  lookup;
+    LatencyEntry *entry;
+    guint         bucket;
+
+    memcpy (&lookup.service_id, service_id, sizeof (MbimUuid));
+    lookup.cid = cid;
+
+    entry = g_hash_table_lookup (stats->entries, &lookup);
+    if (!entry) {
+        entry = g_slice_new0 (LatencyEntry);
+        memcpy (&entry->service_id, service_id, sizeof (MbimUuid));
+        entry->cid = cid;
+        g_hash_table_insert (stats->entries, entry, entry);
+        g_ptr_array_add (stats->order, entry);
+    }
+
+    /* Bucket N holds latencies in [2^N, 2^(N+1)), bucket 0 also holds 0 */
+    if (latency_usecs > G_MAXUINT32)
+        bucket = LATENCY_N_BUCKETS - 1;
+    else if (latency_usecs > 1)
+        bucket = MIN (g_bit_storage ((gulong) latency_usecs) - 1, LATENCY_N_BUCKETS - 1);
+    else
+        bucket = 0;
+
+    if (entry->count < G_MAXUINT32) {
+        entry->count++;
+        entry->buckets[bucket]++;
+    }
+}
+
+static guint32
+latency_entry_percentile (const LatencyEntry *entry,
+                          guint               percentile)
+{
+    guint64 target;
+    guint64 accumulated = 0;
+    guint   i;
+
+    if (!entry->count)
+        return 0;
+
+    target = ((guint64)entry->count * percentile + 99) / 100;
+    for (i = 0; i < LATENCY_N_BUCKETS - 1; i++) {
+        accumulated += entry->buckets[i];
+        if (accumulated >= target)
+            return (guint32)((G_GUINT64_CONSTANT (1) << (i + 1)) - 1);
+    }
+    return G_MAXUINT32;
+}
+
+guint
+_mbim_proxy_helper_latency_stats_get_n_entries (MbimProxyLatencyStats *stats)
+{
+    return stats->order->len;
+}
+
+void
+_mbim_proxy_helper_latency_stats_get_entry (MbimProxyLatencyStats *stats,
+                                            guint                  i,
+                                            const MbimUuid       **service_id,
+                                            guint32               *cid,
+                                            guint32               *count,
+                                            guint32               *p50,
+                                            guint32               *p99)
+{
+    const LatencyEntry *entry;
+
+    g_assert (i < stats->order->len);
+    entry = g_ptr_array_index (stats->order, i);
+
+    if (service_id)
+        *service_id = &entry->service_id;
+    if (cid)
+        *cid = entry->cid;
+    if (count)
+        *count = entry->count;
+    if (p50)
+        *p50 = latency_entry_percentile (entry, 50);
+    if (p99)
+        *p99 = latency_entry_percentile (entry, 99);
+}
+
+/*****************************************************************************/
+/* Shared query cache
+ *
+ * Several read-only queries are issued by every client right after the
+ * connection is setup (e.g. device caps, device services...), so the proxy
+ * keeps a per-device cache of their responses and also coalesces concurrent
+ * identical queries from different clients into a single device transaction.
+ */
+
+static const struct {
+    MbimService service;
+    guint       cid;
+    /* Whether the query is preloaded when warming up devices */
+    gboolean    warm;
+} cacheable_queries[] = {
+    { MBIM_SERVICE_BASIC_CONNECT, MBIM_CID_BASIC_CONNECT_DEVICE_CAPS,             TRUE  },
+    { MBIM_SERVICE_BASIC_CONNECT, MBIM_CID_BASIC_CONNECT_DEVICE_SERVICES,         TRUE  },
+    { MBIM_SERVICE_BASIC_CONNECT, MBIM_CID_BASIC_CONNECT_SUBSCRIBER_READY_STATUS, FALSE },
+    { MBIM_SERVICE_BASIC_CONNECT, MBIM_CID_BASIC_CONNECT_RADIO_STATE,             FALSE },
+};
+
+#define N_CACHEABLE_QUERIES G_N_ELEMENTS (cacheable_queries)
+
+typedef struct {
+    /* Last successful response received from the device */
+    MbimMessage *response;
+    /* Waiters of the ongoing device transaction */
+    GList       *waiters;
+    /* Set if the ongoing transaction must not be cached when it completes */
+    gboolean     stale;
+} CachedQuery;
+
+struct _MbimProxyQueryCache {
+    CachedQuery queries[N_CACHEABLE_QUERIES];
+};
+
+static CachedQuery *
+query_cache_peek (MbimProxyQueryCache *cache,
+                  MbimService          service,
+                  guint                cid)
+{
+    guint i;
+
+    for (i = 0; i < N_CACHEABLE_QUERIES; i++) {
+        if (cacheable_queries[i].service == service && cacheable_queries[i].cid == cid)
+            return &cache->queries[i];
+    }
+    return NULL;
+}
+
+static void
+cached_query_invalidate (CachedQuery *cached)
+{
+    g_clear_pointer (&cached->response, mbim_message_unref);
+    /* If there is an ongoing transaction, its response is only valid for the
+     * waiters it already has */
+    if (cached->waiters)
+        cached->stale = TRUE;
+}
+
+MbimProxyQueryCache *
+_mbim_proxy_helper_query_cache_new (void)
+{
+    return g_slice_new0 (MbimProxyQueryCache);
+}
+
+void
+_mbim_proxy_helper_query_cache_free (MbimProxyQueryCache *cache)
+{
+    guint i;
+
+    for (i = 0; i < N_CACHEABLE_QUERIES; i++) {
+        g_assert (!cache->queries[i].waiters);
+        g_clear_pointer (&cache->queries[i].response, mbim_message_unref);
+    }
+    g_slice_free (MbimProxyQueryCache, cache);
+}
+
+static CachedQuery *
+query_cache_peek_message (MbimProxyQueryCache *cache,
+                          MbimMessage         *message)
+{
+    guint32 buffer_len = 0;
+
+    if (mbim_message_get_message_type (message) != MBIM_MESSAGE_TYPE_COMMAND ||
+        mbim_message_command_get_command_type (message) != MBIM_MESSAGE_COMMAND_TYPE_QUERY)
+        return NULL;
+
+    /* Queries with input payload are never cached */
+    mbim_message_command_get_raw_information_buffer (message, &buffer_len);
+    if (buffer_len > 0)
+        return NULL;
+
+    return query_cache_peek (cache,
+                             mbim_message_command_get_service (message),
+                             mbim_message_command_get_cid (message));
+}
+
+gboolean
+_mbim_proxy_helper_query_cache_is_cacheable (MbimProxyQueryCache *cache,
+                                             MbimMessage         *message)
+{
+    return !!query_cache_peek_message (cache, message);
+}
+
+MbimProxyQueryCacheLookup
+_mbim_proxy_helper_query_cache_lookup (MbimProxyQueryCache  *cache,
+                                       MbimMessage          *message,
+                                       gpointer              waiter,
+                                       MbimMessage         **response)
+{
+    CachedQuery *cached;
+
+    cached = query_cache_peek_message (cache, message);
+    if (!cached)
+        return MBIM_PROXY_QUERY_CACHE_LOOKUP_UNCACHEABLE;
+
+    if (cached->response) {
+        *response = mbim_message_dup (cached->response);
+        mbim_message_set_transaction_id (*response, mbim_message_get_transaction_id (message));
+        return MBIM_PROXY_QUERY_CACHE_LOOKUP_HIT;
+    }
+
+    if (cached->waiters) {
+        cached->waiters = g_list_append (cached->waiters, waiter);
+        return MBIM_PROXY_QUERY_CACHE_LOOKUP_COALESCED;
+    }
+
+    cached->waiters = g_list_append (cached->waiters, waiter);
+    return MBIM_PROXY_QUERY_CACHE_LOOKUP_MISS;
+}
+
+GList *
+_mbim_proxy_helper_query_cache_complete (MbimProxyQueryCache *cache,
+                                         MbimService          service,
+                                         guint                cid,
+                                         MbimMessage         *response)
+{
+    CachedQuery *cached;
+    GList       *waiters;
+
+    cached = query_cache_peek (cache, service, cid);
+    g_assert (cached);
+
+    waiters = cached->waiters;
+    cached->waiters = NULL;
+
+    /* Only successful responses are cached */
+    if (response &&
+        !cached->stale &&
+        mbim_message_response_get_result (response, MBIM_MESSAGE_TYPE_COMMAND_DONE, NULL)) {
+        g_clear_pointer (&cached->response, mbim_message_unref);
+        cached->response = mbim_message_ref (response);
+    }
+    cached->stale = FALSE;
+
+    return waiters;
+}
+
+gboolean
+_mbim_proxy_helper_query_cache_preload (MbimProxyQueryCache *cache,
+                                        MbimMessage         *response)
+{
+    CachedQuery *cached;
+
+    if (mbim_message_get_message_type (response) != MBIM_MESSAGE_TYPE_COMMAND_DONE ||
+        !mbim_message_response_get_result (response, MBIM_MESSAGE_TYPE_COMMAND_DONE, NULL))
+        return FALSE;
+
+    cached = query_cache_peek (cache,
+                               mbim_message_command_done_get_service (response),
+                               mbim_message_command_done_get_cid (response));
+
+    /* Don't override anything a client may have loaded in the meantime */
+    if (!cached || cached->response || cached->waiters)
+        return FALSE;
+
+    cached->response = mbim_message_ref (response);
+    return TRUE;
+}
+
+void
+_mbim_proxy_helper_query_cache_invalidate (MbimProxyQueryCache *cache,
+                                           MbimService          service,
+                                           guint                cid)
+{
+    CachedQuery *cached;
+
+    cached = query_cache_peek (cache, service, cid);
+    if (cached)
+        cached_query_invalidate (cached);
+}
+
+void
+_mbim_proxy_helper_query_cache_invalidate_all (MbimProxyQueryCache *cache)
+{
+    guint i;
+
+    for (i = 0; i < N_CACHEABLE_QUERIES; i++)
+        cached_query_invalidate (&cache->queries[i]);
+}
+
+GList *
+_mbim_proxy_helper_query_cache_build_warm_queries (void)
+{
+    GList *queries = NULL;
+    guint  i;
+
+    for (i = 0; i < N_CACHEABLE_QUERIES; i++) {
+        if (cacheable_queries[i].warm)
+            queries = g_list_prepend (queries,
+                                      mbim_message_command_new (0,
+                                                                cacheable_queries[i].service,
+                                                                cacheable_queries[i].cid,
+                                                                MBIM_MESSAGE_COMMAND_TYPE_QUERY));
+    }
+    return g_list_reverse (queries);
+}
+
+/*****************************************************************************/
+/* Hotplug
+ *
+ * MBIM devices are reported both by their cdc-wdm control port in the usbmisc
+ * subsystem and by their network interface in the net subsystem, which is
+ * usually the last one to show up. In both cases the control port is exposed
+ * by the USB interface bound to the cdc_mbim driver.
+ */
+
+static gchar *
+hotplug_find_control_port (const gchar *interface_sysfs_path)
+{
+    gchar       *usbmisc_path;
+    GDir        *dir;
+    const gchar *name;
+    gchar       *port = NULL;
+
+    usbmisc_path = g_build_filename (interface_sysfs_path, "usbmisc", NULL);
+    dir = g_dir_open (usbmisc_path, 0, NULL);
+    g_free (usbmisc_path);
+    if (!dir)
+        return NULL;
+
+    while ((name = g_dir_read_name (dir)) != NULL) {
+        if (g_str_has_prefix (name, "cdc-wdm")) {
+            port = g_build_filename ("/dev", name, NULL);
+            break;
+        }
+    }
+    g_dir_close (dir);
+
+    return port;
+}
+
+gchar *
+_mbim_proxy_helper_hotplug_get_control_port (const gchar *subsystem,
+                                             const gchar *name,
+                                             const gchar *device_file,
+                                             const gchar *interface_driver,
+                                             const gchar *interface_sysfs_path)
+{
+    /* Only USB interfaces handled by the MBIM driver are relevant */
+    if (g_strcmp0 (interface_driver, "cdc_mbim") != 0)
+        return NULL;
+
+    if (!g_strcmp0 (subsystem, "usbmisc")) {
+        if (!name || !g_str_has_prefix (name, "cdc-wdm") || !device_file)
+            return NULL;
+        return g_strdup (device_file);
+    }
+
+    if (!g_strcmp0 (subsystem, "net")) {
+        if (!interface_sysfs_path)
+            return NULL;
+        return hotplug_find_control_port (interface_sysfs_path);
+    }
+
+    return NULL;
+}
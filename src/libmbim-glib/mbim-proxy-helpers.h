@@ -37,6 +37,16 @@
 
 G_BEGIN_DECLS
 
+typedef struct _MbimProxyEventSet MbimProxyEventSet;
+typedef struct _MbimProxyCapture  MbimProxyCapture;
+typedef struct _MbimProxyLatencyStats MbimProxyLatencyStats;
+typedef struct _MbimProxyQueryCache   MbimProxyQueryCache;
+
+typedef enum {
+    MBIM_PROXY_CAPTURE_DIRECTION_FROM_CLIENT = 0,
+    MBIM_PROXY_CAPTURE_DIRECTION_TO_CLIENT   = 1,
+} MbimProxyCaptureDirection;
+
 gboolean         _mbim_proxy_helper_service_subscribe_list_cmp          (const MbimEventEntry * const *a,
                                                                          gsize                         a_size,
                                                                          const MbimEventEntry * const *b,
@@ -45,16 +55,96 @@ void             _mbim_proxy_helper_service_subscribe_list_debug        (const M
                                                                          gsize                         list_size);
 MbimEventEntry **_mbim_proxy_helper_service_subscribe_request_parse     (MbimMessage     *message,
                                                                          gsize           *out_size);
-MbimEventEntry **_mbim_proxy_helper_service_subscribe_list_merge        (MbimEventEntry **original,
-                                                                         gsize            original_size,
-                                                                         MbimEventEntry **merge,
-                                                                         gsize            merge_size,
-                                                                         gsize           *out_size);
 MbimEventEntry **_mbim_proxy_helper_service_subscribe_list_dup          (MbimEventEntry **original,
                                                                          gsize            original_size,
                                                                          gsize           *out_size);
 MbimEventEntry **_mbim_proxy_helper_service_subscribe_list_new_standard (gsize           *out_size);
 
+MbimProxyEventSet *_mbim_proxy_helper_event_set_new          (void);
+MbimProxyEventSet *_mbim_proxy_helper_event_set_new_standard (void);
+void               _mbim_proxy_helper_event_set_free         (MbimProxyEventSet            *set);
+gboolean           _mbim_proxy_helper_event_set_add          (MbimProxyEventSet            *set,
+                                                              const MbimEventEntry * const *list,
+                                                              gsize                         list_size);
+gboolean           _mbim_proxy_helper_event_set_remove       (MbimProxyEventSet            *set,
+                                                              const MbimEventEntry * const *list,
+                                                              gsize                         list_size);
+MbimEventEntry   **_mbim_proxy_helper_event_set_build_list   (MbimProxyEventSet            *set,
+                                                              gsize                        *out_size);
+
+/*
+ * Capture dump file format, all integers in little endian:
+ *   file header:   magic "MBIMCAP\0" (8 bytes), version (guint32), number of records (guint32)
+ *   each record:   monotonic timestamp in usecs (guint64), client id (guint32),
+ *                  direction (guint8), reserved (guint8), device path length (guint16),
+ *                  captured length (guint32), original length (guint32),
+ *                  device path (not NUL-terminated), captured message bytes
+ */
+MbimProxyCapture *_mbim_proxy_helper_capture_new           (gsize                       size);
+void              _mbim_proxy_helper_capture_free          (MbimProxyCapture           *capture);
+void              _mbim_proxy_helper_capture_record        (MbimProxyCapture           *capture,
+                                                            MbimProxyCaptureDirection   direction,
+                                                            guint32                     client_id,
+                                                            const gchar                *device_path,
+                                                            const guint8               *data,
+                                                            gsize                       data_len);
+guint             _mbim_proxy_helper_capture_get_n_records (MbimProxyCapture           *capture);
+gboolean          _mbim_proxy_helper_capture_dump          (MbimProxyCapture           *capture,
+                                                            const gchar                *path,
+                                                            GError                    **error);
+
+MbimProxyLatencyStats *_mbim_proxy_helper_latency_stats_new           (void);
+void                   _mbim_proxy_helper_latency_stats_free          (MbimProxyLatencyStats  *stats);
+void                   _mbim_proxy_helper_latency_stats_record        (MbimProxyLatencyStats  *stats,
+                                                                       const MbimUuid         *service_id,
+                                                                       guint32                 cid,
+                                                                       guint64                 latency_usecs);
+guint                  _mbim_proxy_helper_latency_stats_get_n_entries (MbimProxyLatencyStats  *stats);
+void                   _mbim_proxy_helper_latency_stats_get_entry     (MbimProxyLatencyStats  *stats,
+                                                                       guint                   i,
+                                                                       const MbimUuid        **service_id,
+                                                                       guint32                *cid,
+                                                                       guint32                *count,
+                                                                       guint32                *p50,
+                                                                       guint32                *p99);
+
+typedef enum {
+    /* Not a cacheable query, must be sent to the device as usual */
+    MBIM_PROXY_QUERY_CACHE_LOOKUP_UNCACHEABLE = 0,
+    /* Replied from the cache */
+    MBIM_PROXY_QUERY_CACHE_LOOKUP_HIT         = 1,
+    /* Waiting for the same query already sent to the device */
+    MBIM_PROXY_QUERY_CACHE_LOOKUP_COALESCED   = 2,
+    /* Waiting for the query, which must be sent to the device */
+    MBIM_PROXY_QUERY_CACHE_LOOKUP_MISS        = 3,
+} MbimProxyQueryCacheLookup;
+
+MbimProxyQueryCache       *_mbim_proxy_helper_query_cache_new                (void);
+void                       _mbim_proxy_helper_query_cache_free               (MbimProxyQueryCache  *cache);
+gboolean                   _mbim_proxy_helper_query_cache_is_cacheable       (MbimProxyQueryCache  *cache,
+                                                                              MbimMessage          *message);
+MbimProxyQueryCacheLookup  _mbim_proxy_helper_query_cache_lookup             (MbimProxyQueryCache  *cache,
+                                                                              MbimMessage          *message,
+                                                                              gpointer              waiter,
+                                                                              MbimMessage         **response);
+GList                     *_mbim_proxy_helper_query_cache_complete           (MbimProxyQueryCache  *cache,
+                                                                              MbimService           service,
+                                                                              guint                 cid,
+                                                                              MbimMessage          *response);
+gboolean                   _mbim_proxy_helper_query_cache_preload            (MbimProxyQueryCache  *cache,
+                                                                              MbimMessage          *response);
+void                       _mbim_proxy_helper_query_cache_invalidate         (MbimProxyQueryCache  *cache,
+                                                                              MbimService           service,
+                                                                              guint                 cid);
+void                       _mbim_proxy_helper_query_cache_invalidate_all     (MbimProxyQueryCache  *cache);
+GList                     *_mbim_proxy_helper_query_cache_build_warm_queries (void);
+
+gchar *_mbim_proxy_helper_hotplug_get_control_port (const gchar *subsystem,
+                                                    const gchar *name,
+                                                    const gchar *device_file,
+                                                    const gchar *interface_driver,
+                                                    const gchar *interface_sysfs_path);
+
 G_END_DECLS
 
 #endif /* _LIBMBIM_GLIB_MBIM_PROXY_HELPERS_H_ */
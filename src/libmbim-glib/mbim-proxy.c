@@ -33,6 +33,11 @@
 #include <gio/gunixsocketaddress.h>
 
 #include "config.h"
+
+#if defined WITH_UDEV
+# include <gudev/gudev.h>
+#endif
+
 #include "mbim-device.h"
 #include "mbim-utils.h"
 #include "mbim-proxy.h"
@@ -41,16 +46,27 @@
 #include "mbim-enum-types.h"
 #include "mbim-error-types.h"
 #include "mbim-basic-connect.h"
+#include "mbim-proxy-control.h"
 #include "mbim-proxy-helpers.h"
 
 #define BUFFER_SIZE 512
 
+/* If the device replied successfully in the last few seconds, we won't
+ * re-check whether it's open when a new client requests it */
+#define DEVICE_OPEN_CHECK_SKIP_SECS 30
+
+#define WARM_DEVICE_OPEN_TIMEOUT_SECS 30
+
+/* Size of the always-on message capture ring */
+#define CAPTURE_SIZE (256 * 1024)
+
 G_DEFINE_TYPE (MbimProxy, mbim_proxy, G_TYPE_OBJECT)
 
 enum {
     PROP_0,
     PROP_N_CLIENTS,
     PROP_N_DEVICES,
+    PROP_WARM_DEVICES,
     PROP_LAST
 };
 
@@ -62,10 +78,23 @@ struct _MbimProxyPrivate {
 
     /* Clients */
     GList *clients;
+    guint32 next_client_id;
 
     /* Devices */
     GList *devices;
-    GList *opening_devices;
+    GHashTable *opening_devices;
+
+    /* Warm devices */
+    gboolean warm_devices;
+#if defined WITH_UDEV
+    GUdevClient *udev_client;
+#endif
+
+    /* Message capture */
+    MbimProxyCapture *capture;
+
+    /* Probes, NULL if none */
+    MbimProbeList *probes;
 };
 
 static void        track_device         (MbimProxy *self, MbimDevice *device);
@@ -113,6 +142,7 @@ typedef struct {
     volatile gint ref_count;
 
     MbimProxy *self; /* not full ref */
+    guint32 id;
     GSocketConnection *connection;
     GSource *connection_readable_source;
     GByteArray *buffer;
@@ -124,11 +154,20 @@ typedef struct {
     guint indication_id;
     MbimEventEntry **mbim_event_entry_array;
     gsize mbim_event_entry_array_size;
+
+    /* Statistics */
+    guint64 messages_in;
+    guint64 messages_out;
+    guint64 bytes_in;
+    guint64 bytes_out;
+    guint64 indications;
+    guint in_flight;
 } Client;
 
-static gboolean connection_readable_cb (GSocket *socket, GIOCondition condition, Client *client);
-static void     track_client           (MbimProxy *self, Client *client);
-static void     untrack_client         (MbimProxy *self, Client *client);
+static gboolean connection_readable_cb                 (GSocket *socket, GIOCondition condition, Client *client);
+static void     track_client                           (MbimProxy *self, Client *client);
+static void     untrack_client                         (MbimProxy *self, Client *client);
+static void     release_client_service_subscribe_list (MbimProxy *self, Client *client);
 
 static void
 client_disconnect (Client *client)
@@ -216,6 +255,15 @@ client_send_message (Client *client,
     }
 
     g_debug ("Client (%d) TX: %u bytes", g_socket_get_fd (g_socket_connection_get_socket (client->connection)), message->len);
+    _mbim_proxy_helper_capture_record (client->self->priv->capture,
+                                       MBIM_PROXY_CAPTURE_DIRECTION_TO_CLIENT,
+                                       client->id,
+                                       client->device ? mbim_device_get_path (client->device) : NULL,
+                                       message->data,
+                                       message->len);
+    client->messages_out++;
+    client->bytes_out += message->len;
+
     if (!g_output_stream_write_all (g_io_stream_get_output_stream (G_IO_STREAM (client->connection)),
                                     message->data,
                                     message->len,
@@ -226,6 +274,7 @@ client_send_message (Client *client,
         return FALSE;
     }
 
+    _mbim_probe (client->self->priv->probes, MBIM_PROBE_POINT_MESSAGE_WRITTEN, message->data, message->len);
     return TRUE;
 }
 
@@ -244,6 +293,9 @@ static void
 untrack_client (MbimProxy *self,
                 Client *client)
 {
+    /* Drop the client subscriptions from the device */
+    release_client_service_subscribe_list (self, client);
+
     /* Disconnect the client explicitly when untracking */
     client_disconnect (client);
 
@@ -257,6 +309,8 @@ untrack_client (MbimProxy *self,
 /*****************************************************************************/
 /* Client indications */
 
+static void device_stats_indication_forwarded (MbimDevice *device);
+
 static void
 forward_indication (Client      *client,
                     MbimMessage *message)
@@ -266,7 +320,13 @@ forward_indication (Client      *client,
     if (!client_send_message (client, message, &error)) {
         g_warning ("couldn't forward indication to client");
         g_error_free (error);
+        return;
     }
+
+    client->indications++;
+    device_stats_indication_forwarded (client->device);
+
+    _mbim_probe (client->self->priv->probes, MBIM_PROBE_POINT_INDICATION_DISPATCHED, message->data, message->len);
 }
 
 static void
@@ -322,6 +382,8 @@ typedef struct {
     guint32 original_transaction_id;
     /* Only used in proxy config */
     guint32 timeout_secs;
+    /* Monotonic time when the request was sent to the device */
+    gint64 sent_time;
 } Request;
 
 static void
@@ -344,6 +406,7 @@ request_complete_and_free (Request *request)
 
     if (request->message)
         mbim_message_unref (request->message);
+    request->client->in_flight--;
     client_unref (request->client);
     g_object_unref (request->self);
     g_slice_free (Request, request);
@@ -359,6 +422,7 @@ request_new (MbimProxy   *self,
     request = g_slice_new0 (Request);
     request->self = g_object_ref (self);
     request->client = client_ref (client);
+    request->client->in_flight++;
     request->message = mbim_message_ref (message);
     request->original_transaction_id = mbim_message_get_transaction_id (message);
 
@@ -368,11 +432,24 @@ request_new (MbimProxy   *self,
 /*****************************************************************************/
 /* Internal proxy device opening operation */
 
-static MbimEventEntry **merge_client_service_subscribe_lists (MbimProxy  *self,
-                                                              MbimDevice *device,
-                                                              gsize      *out_size);
-static void             reset_client_service_subscribe_lists (MbimProxy  *self,
-                                                              MbimDevice *device);
+static MbimEventEntry **update_client_service_subscribe_list (MbimProxy   *self,
+                                                              Client      *client,
+                                                              MbimMessage *message,
+                                                              gsize       *out_size);
+static void             reset_client_service_subscribe_lists (MbimProxy   *self,
+                                                              MbimDevice  *device);
+static void             reset_device_cached_queries          (MbimDevice  *device);
+static gboolean         device_recently_valid                (MbimDevice  *device);
+static void             device_stats_command_sent            (MbimDevice  *device,
+                                                              Request     *request,
+                                                              MbimMessage *message);
+static void             device_stats_command_done            (MbimDevice  *device,
+                                                              Request     *request,
+                                                              MbimMessage *response,
+                                                              GError      *error);
+static void             device_set_valid                     (MbimDevice  *device,
+                                                              MbimMessage *response);
+static MbimProxyQueryCache *peek_device_query_cache (MbimDevice *device);
 
 typedef struct {
     MbimDevice *device;
@@ -425,18 +502,7 @@ static OpeningDevice *
 peek_opening_device_info (MbimProxy  *self,
                           MbimDevice *device)
 {
-    GList *l;
-
-    /* If already being opened, queue it up */
-    for (l = self->priv->opening_devices; l; l = g_list_next (l)) {
-        OpeningDevice *info;
-
-        info = (OpeningDevice *)(l->data);
-        if (device == info->device)
-            return info;
-    }
-
-    return NULL;
+    return (OpeningDevice *) g_hash_table_lookup (self->priv->opening_devices, device);
 }
 
 static void
@@ -450,7 +516,7 @@ complete_opening_device (MbimProxy    *self,
     if (!info)
         return;
 
-    self->priv->opening_devices = g_list_remove (self->priv->opening_devices, info);
+    g_hash_table_remove (self->priv->opening_devices, device);
     opening_device_complete_and_free (info, error);
 }
 
@@ -506,11 +572,12 @@ internal_open (GTask *task)
         return;
     }
 
-    /* First time opening */
+    /* First time opening; nothing cached from previous sessions is valid */
+    reset_device_cached_queries (ctx->device);
     info = g_slice_new0 (OpeningDevice);
     info->device = g_object_ref (ctx->device);
     info->pending = g_list_append (info->pending, task);
-    self->priv->opening_devices = g_list_prepend (self->priv->opening_devices, info);
+    g_hash_table_insert (self->priv->opening_devices, info->device, info);
 
     /* Note: for now, only the first timeout request is taken into account */
 
@@ -547,6 +614,7 @@ internal_device_open_caps_query_ready (MbimDevice   *device,
         if (g_error_matches (error, MBIM_PROTOCOL_ERROR, MBIM_PROTOCOL_ERROR_NOT_OPENED)) {
             g_debug ("device not-opened error reported, reopening");
             reset_client_service_subscribe_lists (self, device);
+            reset_device_cached_queries (device);
             mbim_device_close_force (device, NULL);
             internal_open (task);
             if (response)
@@ -558,6 +626,9 @@ internal_device_open_caps_query_ready (MbimDevice   *device,
         /* Warn other (unlikely!) errors, but keep on anyway */
         g_warning ("device caps query during internal open failed: %s", error->message);
         g_error_free (error);
+    } else {
+        device_set_valid (device, response);
+        _mbim_proxy_helper_query_cache_preload (peek_device_query_cache (device), response);
     }
 
     g_task_return_boolean (task, TRUE);
@@ -584,6 +655,15 @@ internal_device_open (MbimProxy           *self,
     ctx->timeout_secs = timeout_secs;
     g_task_set_task_data (task, ctx, (GDestroyNotify) internal_device_open_context_free);
 
+    /* If the device is flagged as open and it replied successfully very
+     * recently, there is no need to check it again */
+    if (mbim_device_is_open (device) && device_recently_valid (device)) {
+        g_debug ("device recently validated, skipping caps check during client device open");
+        g_task_return_boolean (task, TRUE);
+        g_object_unref (task);
+        return;
+    }
+
     /* If the device is flagged as already open, we still want to check
      * whether that's totally true, and we do that with a standard command
      * (loading caps in this case). */
@@ -874,6 +954,7 @@ device_service_subscribe_list_set_ready (MbimDevice   *device,
     GError *error = NULL;
 
     tmp_response = mbim_device_command_finish (device, res, &error);
+    device_stats_command_done (device, request, tmp_response, error);
     if (!tmp_response) {
         /* Translate a MbimDevice wrong state error into a Not-Opened function error. */
         if (g_error_matches (error, MBIM_CORE_ERROR, MBIM_CORE_ERROR_WRONG_STATE)) {
@@ -907,20 +988,19 @@ process_device_service_subscribe_list (MbimProxy   *self,
     /* create request holder */
     request = request_new (self, client, message);
 
-    /* trace the service subscribe list for the client */
-    track_service_subscribe_list (client, message);
-
-    /* merge all service subscribe list for all clients to set on device */
-    updated = merge_client_service_subscribe_lists (self, client->device, &updated_size);
+    /* track the service subscribe list for the client and update the merged
+     * one in the device; only send it if the effective list changed */
+    updated = update_client_service_subscribe_list (self, client, message, &updated_size);
     if (!updated) {
         device_service_subscribe_list_set_complete (request, MBIM_STATUS_ERROR_NONE);
         return TRUE;
     }
 
-    /* the 'updated' array was given to us as transfer-none */
     message = mbim_message_device_service_subscribe_list_set_new (updated_size, (const MbimEventEntry *const *)updated, NULL);
+    mbim_event_entry_array_free (updated);
     mbim_message_set_transaction_id (message, mbim_device_get_next_transaction_id (client->device));
 
+    device_stats_command_sent (client->device, request, message);
     mbim_device_command (client->device,
                          message,
                          300,
@@ -932,6 +1012,103 @@ process_device_service_subscribe_list (MbimProxy   *self,
     return TRUE;
 }
 
+/*****************************************************************************/
+/* Shared query cache */
+
+static void
+device_cached_query_ready (MbimDevice   *device,
+                           GAsyncResult *res,
+                           Request      *request)
+{
+    MbimMessage *response;
+    GError      *error = NULL;
+    GList       *waiters;
+    GList       *l;
+
+    response = mbim_device_command_finish (device, res, &error);
+    device_stats_command_done (device, request, response, error);
+
+    if (response)
+        device_set_valid (device, response);
+
+    waiters = _mbim_proxy_helper_query_cache_complete (peek_device_query_cache (device),
+                                                       mbim_message_command_get_service (request->message),
+                                                       mbim_message_command_get_cid (request->message),
+                                                       response);
+
+    for (l = waiters; l; l = g_list_next (l)) {
+        Request *waiter = (Request *)(l->data);
+
+        if (response) {
+            waiter->response = mbim_message_dup (response);
+            /* replace reponse transaction id with the requested transaction id */
+            mbim_message_set_transaction_id (waiter->response, waiter->original_transaction_id);
+        } else if (g_error_matches (error, MBIM_CORE_ERROR, MBIM_CORE_ERROR_WRONG_STATE)) {
+            /* Translate a MbimDevice wrong state error into a Not-Opened function error. */
+            waiter->response = mbim_message_function_error_new (waiter->original_transaction_id, MBIM_PROTOCOL_ERROR_NOT_OPENED);
+        }
+        /* Otherwise, don't disconnect client, just let the request timeout in its side */
+
+        request_complete_and_free (waiter);
+    }
+    g_list_free (waiters);
+
+    if (error) {
+        g_debug ("sending request to device failed: %s", error->message);
+        g_error_free (error);
+    }
+    if (response)
+        mbim_message_unref (response);
+}
+
+static gboolean
+process_cached_query (MbimProxy   *self,
+                      Client      *client,
+                      MbimMessage *message)
+{
+    MbimProxyQueryCache *cache;
+    Request             *request;
+    MbimMessage         *response = NULL;
+
+    if (!client->device)
+        return FALSE;
+
+    /* Checked before creating the request, most commands aren't cached */
+    cache = peek_device_query_cache (client->device);
+    if (!_mbim_proxy_helper_query_cache_is_cacheable (cache, message))
+        return FALSE;
+
+    /* create request holder */
+    request = request_new (self, client, message);
+
+    switch (_mbim_proxy_helper_query_cache_lookup (cache, message, request, &response)) {
+    case MBIM_PROXY_QUERY_CACHE_LOOKUP_HIT:
+        g_debug ("Client (%d) query replied from cache", g_socket_get_fd (g_socket_connection_get_socket (client->connection)));
+        request->response = response;
+        request_complete_and_free (request);
+        return TRUE;
+    case MBIM_PROXY_QUERY_CACHE_LOOKUP_COALESCED:
+        g_debug ("Client (%d) query coalesced with ongoing one", g_socket_get_fd (g_socket_connection_get_socket (client->connection)));
+        return TRUE;
+    case MBIM_PROXY_QUERY_CACHE_LOOKUP_MISS:
+        break;
+    case MBIM_PROXY_QUERY_CACHE_LOOKUP_UNCACHEABLE:
+    default:
+        g_assert_not_reached ();
+    }
+
+    /* replace command transaction id with internal proxy transaction id to avoid collision */
+    mbim_message_set_transaction_id (message, mbim_device_get_next_transaction_id (client->device));
+    device_stats_command_sent (client->device, request, message);
+    mbim_device_command (client->device,
+                         message,
+                         300,
+                         NULL,
+                         (GAsyncReadyCallback)device_cached_query_ready,
+                         request);
+    return TRUE;
+}
+
 /*****************************************************************************/
 /* Standard command */
 
@@ -943,6 +1120,7 @@ device_command_ready (MbimDevice *device,
     GError *error = NULL;
 
     request->response = mbim_device_command_finish (device, res, &error);
+    device_stats_command_done (device, request, request->response, error);
     if (!request->response) {
         /* Translate a MbimDevice wrong state error into a Not-Opened function error. */
         if (g_error_matches (error, MBIM_CORE_ERROR, MBIM_CORE_ERROR_WRONG_STATE)) {
@@ -958,6 +1136,8 @@ device_command_ready (MbimDevice *device,
         return;
     }
 
+    device_set_valid (device, request->response);
+
     /* replace reponse transaction id with the requested transaction id */
     mbim_message_set_transaction_id (request->response, request->original_transaction_id);
 
@@ -971,6 +1151,17 @@ process_command (MbimProxy   *self,
 {
     Request *request;
 
+    /* Read-only queries may be replied from the device cache */
+    if (process_cached_query (self, client, message))
+        return TRUE;
+
+    /* Any set operation invalidates the cached query response */
+    if (client->device &&
+        mbim_message_command_get_command_type (message) == MBIM_MESSAGE_COMMAND_TYPE_SET)
+        _mbim_proxy_helper_query_cache_invalidate (peek_device_query_cache (client->device),
+                                                   mbim_message_command_get_service (message),
+                                                   mbim_message_command_get_cid (message));
+
     /* create request holder */
     request = request_new (self, client, message);
 
@@ -982,6 +1173,7 @@ process_command (MbimProxy   *self,
      * configured a timeout bigger than this internal one. We should likely
      * make this value configurable per-client, instead of a hardcoded value.
      */
+    device_stats_command_sent (client->device, request, message);
     mbim_device_command (client->device,
                          message,
                          300,
@@ -993,6 +1185,10 @@ process_command (MbimProxy   *self,
 
 /*****************************************************************************/
 
+static gboolean process_internal_proxy_statistics (MbimProxy   *self,
+                                                   Client      *client,
+                                                   MbimMessage *message);
+
 static gboolean
 process_message (MbimProxy   *self,
                  Client      *client,
@@ -1009,6 +1205,9 @@ process_message (MbimProxy   *self,
         if (mbim_message_command_get_service (message) == MBIM_SERVICE_PROXY_CONTROL &&
             mbim_message_command_get_cid (message) == MBIM_CID_PROXY_CONTROL_CONFIGURATION)
             return process_internal_proxy_config (self, client, message);
+        if (mbim_message_command_get_service (message) == MBIM_SERVICE_PROXY_CONTROL &&
+            mbim_message_command_get_cid (message) == MBIM_CID_PROXY_CONTROL_STATISTICS)
+            return process_internal_proxy_statistics (self, client, message);
         /* device service subscribe list message? */
         if (mbim_message_command_get_service (message) == MBIM_SERVICE_BASIC_CONNECT &&
             mbim_message_command_get_cid (message) == MBIM_CID_BASIC_CONNECT_DEVICE_SERVICE_SUBSCRIBE_LIST)
@@ -1045,6 +1244,17 @@ parse_request (MbimProxy *self,
             return;
         g_byte_array_remove_range (client->buffer, 0, len);
 
+        _mbim_proxy_helper_capture_record (self->priv->capture,
+                                           MBIM_PROXY_CAPTURE_DIRECTION_FROM_CLIENT,
+                                           client->id,
+                                           client->device ? mbim_device_get_path (client->device) : NULL,
+                                           message->data,
+                                           message->len);
+        client->messages_in++;
+        client->bytes_in += message->len;
+
+        _mbim_probe (self->priv->probes, MBIM_PROBE_POINT_MESSAGE_RECEIVED, message->data, message->len);
+
         /* Play with the received message */
         process_message (self, client, message);
         mbim_message_unref (message);
@@ -1137,6 +1347,7 @@ incoming_cb (GSocketService *service,
     /* Create client */
     client = g_slice_new0 (Client);
     client->self = self;
+    client->id = ++self->priv->next_client_id;
     client->ref_count = 1;
     client->connection = g_object_ref (connection);
 
@@ -1217,15 +1428,35 @@ setup_socket_service (MbimProxy *self,
 static GQuark device_context_quark;
 
 typedef struct {
-    /* Combined events array */
-    MbimEventEntry **mbim_event_entry_array;
-    gsize            mbim_event_entry_array_size;
+    /* Combined events, refcounted across all clients */
+    MbimProxyEventSet *event_set;
+
+    /* Shared query cache */
+    MbimProxyQueryCache *query_cache;
+
+    /* Monotonic time of the last successful response from the device */
+    gint64           last_valid_time;
+
+    /* Statistics */
+    guint64                messages_in;
+    guint64                messages_out;
+    guint64                bytes_in;
+    guint64                bytes_out;
+    guint64                indications;
+    guint64                indications_fan_out;
+    guint                  in_flight;
+    guint                  timeouts;
+    MbimProxyLatencyStats *latency_stats;
 } DeviceContext;
 
 static void
 device_context_free (DeviceContext *ctx)
 {
-    mbim_event_entry_array_free (ctx->mbim_event_entry_array);
+    /* Pending transactions keep a reference to the device, so there cannot
+     * be any waiter left at this point */
+    _mbim_proxy_helper_query_cache_free (ctx->query_cache);
+    _mbim_proxy_helper_event_set_free (ctx->event_set);
+    _mbim_proxy_helper_latency_stats_free (ctx->latency_stats);
     g_slice_free (DeviceContext, ctx);
 }
 
@@ -1240,10 +1471,19 @@ device_context_get (MbimDevice *device)
     ctx = g_object_get_qdata (G_OBJECT (device), device_context_quark);
     if (!ctx) {
         ctx = g_slice_new0 (DeviceContext);
-        ctx->mbim_event_entry_array = _mbim_proxy_helper_service_subscribe_list_new_standard (&ctx->mbim_event_entry_array_size);
-
-        g_debug ("Initial device subscribe list...");
-        _mbim_proxy_helper_service_subscribe_list_debug ((const MbimEventEntry * const *)ctx->mbim_event_entry_array, ctx->mbim_event_entry_array_size);
+        ctx->event_set = _mbim_proxy_helper_event_set_new_standard ();
+        ctx->latency_stats = _mbim_proxy_helper_latency_stats_new ();
+        ctx->query_cache = _mbim_proxy_helper_query_cache_new ();
+
+        if (mbim_utils_get_traces_enabled ()) {
+            MbimEventEntry **list;
+            gsize            list_size = 0;
+
+            g_debug ("Initial device subscribe list...");
+            list = _mbim_proxy_helper_event_set_build_list (ctx->event_set, &list_size);
+            _mbim_proxy_helper_service_subscribe_list_debug ((const MbimEventEntry * const *)list, list_size);
+            mbim_event_entry_array_free (list);
+        }
 
         g_object_set_qdata_full (G_OBJECT (device), device_context_quark, ctx, (GDestroyNotify)device_context_free);
     }
@@ -1251,55 +1491,161 @@ device_context_get (MbimDevice *device)
     return ctx;
 }
 
+static MbimProxyQueryCache *
+peek_device_query_cache (MbimDevice *device)
+{
+    DeviceContext *ctx;
+
+    ctx = device_context_get (device);
+    g_assert (ctx);
+    return ctx->query_cache;
+}
+
+static void
+reset_device_cached_queries (MbimDevice *device)
+{
+    DeviceContext *ctx;
+
+    ctx = device_context_get (device);
+    g_assert (ctx);
+
+    _mbim_proxy_helper_query_cache_invalidate_all (ctx->query_cache);
+
+    /* The device needs to be validated again */
+    ctx->last_valid_time = 0;
+}
+
+static void
+device_set_valid (MbimDevice  *device,
+                  MbimMessage *response)
+{
+    DeviceContext *ctx;
+
+    if (mbim_message_get_message_type (response) != MBIM_MESSAGE_TYPE_COMMAND_DONE)
+        return;
+
+    ctx = device_context_get (device);
+    g_assert (ctx);
+
+    ctx->last_valid_time = g_get_monotonic_time ();
+}
+
+static void
+device_stats_command_sent (MbimDevice  *device,
+                           Request     *request,
+                           MbimMessage *message)
+{
+    DeviceContext *ctx;
+
+    ctx = device_context_get (device);
+    g_assert (ctx);
+
+    ctx->messages_out++;
+    ctx->bytes_out += message->len;
+    ctx->in_flight++;
+    request->sent_time = g_get_monotonic_time ();
+}
+
+static void
+device_stats_command_done (MbimDevice  *device,
+                           Request     *request,
+                           MbimMessage *response,
+                           GError      *error)
+{
+    DeviceContext *ctx;
+
+    ctx = device_context_get (device);
+    g_assert (ctx);
+
+    g_assert (ctx->in_flight > 0);
+    ctx->in_flight--;
+
+    if (!response) {
+        if (g_error_matches (error, MBIM_CORE_ERROR, MBIM_CORE_ERROR_TIMEOUT))
+            ctx->timeouts++;
+        return;
+    }
+
+    ctx->messages_in++;
+    ctx->bytes_in += response->len;
+    _mbim_proxy_helper_latency_stats_record (ctx->latency_stats,
+                                             mbim_message_command_get_service_id (request->message),
+                                             mbim_message_command_get_cid (request->message),
+                                             g_get_monotonic_time () - request->sent_time);
+}
+
+static void
+device_stats_indication_forwarded (MbimDevice *device)
+{
+    DeviceContext *ctx;
+
+    ctx = device_context_get (device);
+    g_assert (ctx);
+
+    ctx->indications_fan_out++;
+}
+
+static gboolean
+device_recently_valid (MbimDevice *device)
+{
+    DeviceContext *ctx;
+
+    ctx = device_context_get (device);
+    g_assert (ctx);
+
+    return (ctx->last_valid_time &&
+            (g_get_monotonic_time () - ctx->last_valid_time) < (DEVICE_OPEN_CHECK_SKIP_SECS * G_USEC_PER_SEC));
+}
+
 static MbimEventEntry **
-merge_client_service_subscribe_lists (MbimProxy  *self,
-                                      MbimDevice *device,
-                                      gsize      *out_size)
+update_client_service_subscribe_list (MbimProxy   *self,
+                                      Client      *client,
+                                      MbimMessage *message,
+                                      gsize       *out_size)
 {
-    GList           *l;
+    MbimEventEntry **previous;
+    gsize            previous_size;
     MbimEventEntry **updated;
     gsize            updated_size = 0;
+    gboolean         changed;
     DeviceContext   *ctx;
 
-    ctx = device_context_get (device);
+    ctx = device_context_get (client->device);
     g_assert (ctx);
 
     g_assert (out_size != NULL);
 
-    /* Init default list */
-    updated = _mbim_proxy_helper_service_subscribe_list_new_standard (&updated_size);
-
-    /* Lookup all clients with this device */
-    for (l = self->priv->clients; l; l = g_list_next (l)) {
-        Client *client;
+    /* Keep the previous client list around until the new one is applied */
+    previous = client->mbim_event_entry_array;
+    previous_size = client->mbim_event_entry_array_size;
+    client->mbim_event_entry_array = NULL;
+    client->mbim_event_entry_array_size = 0;
 
-        client = l->data;
-        if (!client->mbim_event_entry_array)
-            continue;
+    track_service_subscribe_list (client, message);
 
-        /* Add per-client list */
-        if (client->device == device)
-            updated = _mbim_proxy_helper_service_subscribe_list_merge (updated, updated_size,
-                                                                       client->mbim_event_entry_array, client->mbim_event_entry_array_size,
-                                                                       &updated_size);
+    /* Add the new subscriptions before removing the previous ones, so that
+     * entries in both lists never drop to zero references */
+    changed = _mbim_proxy_helper_event_set_add (ctx->event_set,
+                                                (const MbimEventEntry * const *)client->mbim_event_entry_array,
+                                                client->mbim_event_entry_array_size);
+    if (previous) {
+        if (_mbim_proxy_helper_event_set_remove (ctx->event_set,
+                                                 (const MbimEventEntry * const *)previous,
+                                                 previous_size))
+            changed = TRUE;
+        mbim_event_entry_array_free (previous);
     }
 
-    /* If lists are equal, ignore re-setting them up */
-    if (_mbim_proxy_helper_service_subscribe_list_cmp (
-            (const MbimEventEntry *const *)updated, updated_size,
-            (const MbimEventEntry *const *)ctx->mbim_event_entry_array, ctx->mbim_event_entry_array_size)) {
-        g_debug ("Merged service subscribe list not updated for device '%s'", mbim_device_get_path (device));
-        mbim_event_entry_array_free (updated);
+    /* If the effective list didn't change, ignore re-setting it up */
+    if (!changed) {
+        g_debug ("Merged service subscribe list not updated for device '%s'", mbim_device_get_path (client->device));
         return NULL;
     }
 
-    /* Lists are different, update stored one */
-    g_clear_pointer (&ctx->mbim_event_entry_array, mbim_event_entry_array_free);
-    ctx->mbim_event_entry_array = updated;
-    ctx->mbim_event_entry_array_size = updated_size;
+    updated = _mbim_proxy_helper_event_set_build_list (ctx->event_set, &updated_size);
 
     if (mbim_utils_get_traces_enabled ()) {
-        g_debug ("Merged service subscribe list built for device '%s'", mbim_device_get_path (device));
+        g_debug ("Merged service subscribe list built for device '%s'", mbim_device_get_path (client->device));
         _mbim_proxy_helper_service_subscribe_list_debug ((const MbimEventEntry * const *)updated, updated_size);
     }
 
@@ -1307,6 +1653,68 @@ merge_client_service_subscribe_lists (MbimProxy  *self,
     return updated;
 }
 
+static void
+device_service_subscribe_list_update_ready (MbimDevice   *device,
+                                            GAsyncResult *res)
+{
+    MbimMessage *response;
+    GError      *error = NULL;
+
+    response = mbim_device_command_finish (device, res, &error);
+    if (!response || !mbim_message_response_get_result (response, MBIM_MESSAGE_TYPE_COMMAND_DONE, &error)) {
+        g_debug ("couldn't update service subscribe list in device '%s': %s",
+                 mbim_device_get_path (device), error->message);
+        g_error_free (error);
+    }
+
+    if (response)
+        mbim_message_unref (response);
+}
+
+static void
+release_client_service_subscribe_list (MbimProxy *self,
+                                       Client    *client)
+{
+    MbimEventEntry **updated;
+    gsize            updated_size = 0;
+    MbimMessage     *message;
+    gboolean         changed;
+    DeviceContext   *ctx;
+
+    if (!client->device || !client->mbim_event_entry_array)
+        return;
+
+    ctx = device_context_get (client->device);
+    g_assert (ctx);
+
+    changed = _mbim_proxy_helper_event_set_remove (ctx->event_set,
+                                                   (const MbimEventEntry * const *)client->mbim_event_entry_array,
+                                                   client->mbim_event_entry_array_size);
+    g_clear_pointer (&client->mbim_event_entry_array, mbim_event_entry_array_free);
+    client->mbim_event_entry_array_size = 0;
+
+    if (!changed || !mbim_device_is_open (client->device))
+        return;
+
+    updated = _mbim_proxy_helper_event_set_build_list (ctx->event_set, &updated_size);
+
+    if (mbim_utils_get_traces_enabled ()) {
+        g_debug ("Merged service subscribe list reduced for device '%s'", mbim_device_get_path (client->device));
+        _mbim_proxy_helper_service_subscribe_list_debug ((const MbimEventEntry * const *)updated, updated_size);
+    }
+
+    message = mbim_message_device_service_subscribe_list_set_new (updated_size, (const MbimEventEntry *const *)updated, NULL);
+    mbim_event_entry_array_free (updated);
+
+    mbim_device_command (client->device,
+                         message,
+                         10,
+                         NULL,
+                         (GAsyncReadyCallback)device_service_subscribe_list_update_ready,
+                         NULL);
+    mbim_message_unref (message);
+}
+
 static void
 reset_client_service_subscribe_lists (MbimProxy  *self,
                                       MbimDevice *device)
@@ -1332,8 +1740,8 @@ reset_client_service_subscribe_lists (MbimProxy  *self,
     }
 
     /* And reset the device-specific merged list */
-    g_clear_pointer (&ctx->mbim_event_entry_array, mbim_event_entry_array_free);
-    ctx->mbim_event_entry_array = _mbim_proxy_helper_service_subscribe_list_new_standard (&ctx->mbim_event_entry_array_size);
+    _mbim_proxy_helper_event_set_free (ctx->event_set);
+    ctx->event_set = _mbim_proxy_helper_event_set_new_standard ();
 }
 
 static void
@@ -1344,6 +1752,7 @@ proxy_device_error_cb (MbimDevice *device,
     if (g_error_matches (error, MBIM_PROTOCOL_ERROR, MBIM_PROTOCOL_ERROR_NOT_OPENED)) {
         g_debug ("device '%s' reports as being closed...", mbim_device_get_path (device));
         reset_client_service_subscribe_lists (self, device);
+        reset_device_cached_queries (device);
         mbim_device_close_force (device, NULL);
     }
 }
@@ -1363,6 +1772,25 @@ peek_device_for_path (MbimProxy   *self,
     return NULL;
 }
 
+static void
+proxy_device_indication_cb (MbimDevice  *device,
+                            MbimMessage *message,
+                            MbimProxy   *self)
+{
+    DeviceContext *ctx;
+
+    ctx = device_context_get (device);
+    g_assert (ctx);
+    ctx->messages_in++;
+    ctx->bytes_in += message->len;
+    ctx->indications++;
+
+    /* Indications report updated contents, so drop the cached response */
+    _mbim_proxy_helper_query_cache_invalidate (ctx->query_cache,
+                                               mbim_message_indicate_status_get_service (message),
+                                               mbim_message_indicate_status_get_cid (message));
+}
+
 static void
 proxy_device_removed_cb (MbimDevice *device,
                          MbimProxy *self)
@@ -1387,6 +1815,7 @@ untrack_device (MbimProxy  *self,
     /* Disconnect right away */
     g_signal_handlers_disconnect_by_func (device, proxy_device_error_cb, self);
     g_signal_handlers_disconnect_by_func (device, proxy_device_removed_cb, self);
+    g_signal_handlers_disconnect_by_func (device, proxy_device_indication_cb, self);
 
     /* If pending openings ongoing, complete them with error */
     cancel_opening_device (self, device);
@@ -1422,10 +1851,410 @@ track_device (MbimProxy *self,
                       G_CALLBACK (proxy_device_error_cb),
                       self);
 
+    g_signal_connect (device,
+                      MBIM_DEVICE_SIGNAL_INDICATE_STATUS,
+                      G_CALLBACK (proxy_device_indication_cb),
+                      self);
+
     self->priv->devices = g_list_append (self->priv->devices, g_object_ref (device));
     g_object_notify_by_pspec (G_OBJECT (self), properties[PROP_N_DEVICES]);
 }
 
+/*****************************************************************************/
+/* Proxy statistics */
+
+static gboolean
+process_internal_proxy_statistics (MbimProxy   *self,
+                                   Client      *client,
+                                   MbimMessage *message)
+{
+    Request   *request;
+    GPtrArray *devices;
+    GPtrArray *clients;
+    GPtrArray *latencies;
+    GList     *l;
+
+    /* create request holder */
+    request = request_new (self, client, message);
+
+    /* Only allow QUERY command */
+    if (mbim_message_command_get_command_type (message) != MBIM_MESSAGE_COMMAND_TYPE_QUERY) {
+        request->response = build_proxy_control_command_done (message, MBIM_STATUS_ERROR_INVALID_PARAMETERS);
+        request_complete_and_free (request);
+        return TRUE;
+    }
+
+    devices = g_ptr_array_new ();
+    latencies = g_ptr_array_new ();
+    for (l = self->priv->devices; l; l = g_list_next (l)) {
+        MbimDevice                *device;
+        DeviceContext             *ctx;
+        MbimProxyDeviceStatistics *stats;
+        guint                      i;
+
+        device = MBIM_DEVICE (l->data);
+        ctx = device_context_get (device);
+        g_assert (ctx);
+
+        stats = g_new0 (MbimProxyDeviceStatistics, 1);
+        stats->device_path = g_strdup (mbim_device_get_path (device));
+        stats->messages_in = ctx->messages_in;
+        stats->messages_out = ctx->messages_out;
+        stats->bytes_in = ctx->bytes_in;
+        stats->bytes_out = ctx->bytes_out;
+        stats->in_flight = ctx->in_flight;
+        stats->timeouts = ctx->timeouts;
+        stats->indications = ctx->indications;
+        stats->indications_fan_out = ctx->indications_fan_out;
+        g_ptr_array_add (devices, stats);
+
+        for (i = 0; i < _mbim_proxy_helper_latency_stats_get_n_entries (ctx->latency_stats); i++) {
+            MbimProxyCommandLatency *latency;
+            const MbimUuid          *service_id;
+
+            latency = g_new0 (MbimProxyCommandLatency, 1);
+            latency->device_path = g_strdup (mbim_device_get_path (device));
+            _mbim_proxy_helper_latency_stats_get_entry (ctx->latency_stats,
+                                                        i,
+                                                        &service_id,
+                                                        &latency->cid,
+                                                        &latency->count,
+                                                        &latency->p50,
+                                                        &latency->p99);
+            memcpy (&latency->service_id, service_id, sizeof (MbimUuid));
+            g_ptr_array_add (latencies, latency);
+        }
+    }
+
+    clients = g_ptr_array_new ();
+    for (l = self->priv->clients; l; l = g_list_next (l)) {
+        Client                    *item;
+        MbimProxyClientStatistics *stats;
+
+        item = (Client *)(l->data);
+        stats = g_new0 (MbimProxyClientStatistics, 1);
+        stats->client_id = item->id;
+        stats->device_path = g_strdup (item->device ? mbim_device_get_path (item->device) : "");
+        stats->messages_in = item->messages_in;
+        stats->messages_out = item->messages_out;
+        stats->bytes_in = item->bytes_in;
+        stats->bytes_out = item->bytes_out;
+        stats->in_flight = item->in_flight;
+        stats->queued_bytes = item->buffer ? item->buffer->len : 0;
+        stats->indications = item->indications;
+        g_ptr_array_add (clients, stats);
+    }
+
+    request->response = mbim_message_proxy_control_statistics_response_new (devices->len,
+                                                                            (const MbimProxyDeviceStatistics *const *)devices->pdata,
+                                                                            clients->len,
+                                                                            (const MbimProxyClientStatistics *const *)clients->pdata,
+                                                                            latencies->len,
+                                                                            (const MbimProxyCommandLatency *const *)latencies->pdata,
+                                                                            NULL);
+    mbim_message_set_transaction_id (request->response, mbim_message_get_transaction_id (message));
+
+    g_ptr_array_add (devices, NULL);
+    mbim_proxy_device_statistics_array_free ((MbimProxyDeviceStatistics **) g_ptr_array_free (devices, FALSE));
+    g_ptr_array_add (clients, NULL);
+    mbim_proxy_client_statistics_array_free ((MbimProxyClientStatistics **) g_ptr_array_free (clients, FALSE));
+    g_ptr_array_add (latencies, NULL);
+    mbim_proxy_command_latency_array_free ((MbimProxyCommandLatency **) g_ptr_array_free (latencies, FALSE));
+
+    request_complete_and_free (request);
+    return TRUE;
+}
+
+/*****************************************************************************/
+/* Warm devices */
+
+static void
+warm_device_query_ready (MbimDevice   *device,
+                         GAsyncResult *res)
+{
+    MbimMessage *response;
+    GError      *error = NULL;
+
+    response = mbim_device_command_finish (device, res, &error);
+    if (!response || !mbim_message_response_get_result (response, MBIM_MESSAGE_TYPE_COMMAND_DONE, &error)) {
+        g_debug ("couldn't warm up query in device '%s': %s", mbim_device_get_path (device), error->message);
+        g_error_free (error);
+    } else {
+        device_set_valid (device, response);
+        _mbim_proxy_helper_query_cache_preload (peek_device_query_cache (device), response);
+    }
+
+    if (response)
+        mbim_message_unref (response);
+}
+
+static void
+warm_device_open_ready (MbimProxy    *self,
+                        GAsyncResult *res,
+                        MbimDevice   *device)
+{
+    GError *error = NULL;
+    GList  *queries;
+    GList  *l;
+
+    if (!internal_device_open_finish (self, res, &error)) {
+        g_debug ("couldn't warm up device '%s': %s", mbim_device_get_path (device), error->message);
+        g_error_free (error);
+        g_object_unref (device);
+        return;
+    }
+
+    g_debug ("device '%s' warmed up", mbim_device_get_path (device));
+
+    /* Preload the static information that every client queries */
+    queries = _mbim_proxy_helper_query_cache_build_warm_queries ();
+    for (l = queries; l; l = g_list_next (l)) {
+        MbimMessage *message = (MbimMessage *)(l->data);
+
+        mbim_message_set_transaction_id (message, mbim_device_get_next_transaction_id (device));
+        mbim_device_command (device,
+                             message,
+                             10,
+                             NULL,
+                             (GAsyncReadyCallback)warm_device_query_ready,
+                             NULL);
+    }
+    g_list_free_full (queries, (GDestroyNotify) mbim_message_unref);
+
+    g_object_unref (device);
+}
+
+static void
+warm_device_new_ready (GObject      *source,
+                       GAsyncResult *res,
+                       MbimProxy    *self)
+{
+    GError     *error = NULL;
+    MbimDevice *device;
+
+    device = mbim_device_new_finish (res, &error);
+    if (!device) {
+        g_debug ("couldn't create MBIM device to warm up: %s", error->message);
+        g_error_free (error);
+        g_object_unref (self);
+        return;
+    }
+
+    /* A client may have requested the same device in the meantime */
+    if (peek_device_for_path (self, mbim_device_get_path (device))) {
+        g_object_unref (device);
+        g_object_unref (self);
+        return;
+    }
+
+    track_device (self, device);
+    internal_device_open (self,
+                          device,
+                          WARM_DEVICE_OPEN_TIMEOUT_SECS,
+                          (GAsyncReadyCallback)warm_device_open_ready,
+                          device); /* full reference given */
+    g_object_unref (self);
+}
+
+/**
+ * mbim_proxy_warm_device:
+ * @self: a #MbimProxy.
+ * @path: the system path of the MBIM device.
+ *
+ * Asynchronously opens the MBIM device at @path within the proxy and preloads
+ * the information every client usually queries, so that clients requesting
+ * the device afterwards are served right away.
+ *
+ * Nothing is done if the device is already managed by the proxy.
+ */
+void
+mbim_proxy_warm_device (MbimProxy   *self,
+                        const gchar *path)
+{
+    GFile *file;
+
+    g_return_if_fail (MBIM_IS_PROXY (self));
+    g_return_if_fail (path != NULL);
+
+    if (peek_device_for_path (self, path))
+        return;
+
+    g_debug ("warming up device '%s'...", path);
+    file = g_file_new_for_path (path);
+    mbim_device_new (file,
+                     NULL,
+                     (GAsyncReadyCallback)warm_device_new_ready,
+                     g_object_ref (self));
+    g_object_unref (file);
+}
+
+#if defined WITH_UDEV
+
+static void
+udev_warm_device (MbimProxy   *self,
+                  GUdevDevice *device)
+{
+    GUdevDevice *parent;
+    gchar       *path;
+
+    /* Both cdc-wdm ports and net interfaces hang from the USB interface */
+    parent = g_udev_device_get_parent (device);
+    if (!parent)
+        return;
+
+    path = _mbim_proxy_helper_hotplug_get_control_port (g_udev_device_get_subsystem (device),
+                                                        g_udev_device_get_name (device),
+                                                        g_udev_device_get_device_file (device),
+                                                        g_udev_device_get_driver (parent),
+                                                        g_udev_device_get_sysfs_path (parent));
+    g_object_unref (parent);
+
+    if (path) {
+        mbim_proxy_warm_device (self, path);
+        g_free (path);
+    }
+}
+
+static void
+udev_uevent_cb (GUdevClient *client,
+                const gchar *action,
+                GUdevDevice *device,
+                MbimProxy   *self)
+{
+    if (g_str_equal (action, "add"))
+        udev_warm_device (self, device);
+}
+
+static void
+setup_warm_devices (MbimProxy *self,
+                    gboolean   enabled)
+{
+    static const gchar *subsystems[] = { "usbmisc", "net", NULL };
+    guint i;
+
+    self->priv->warm_devices = enabled;
+
+    if (!enabled) {
+        if (self->priv->udev_client) {
+            g_signal_handlers_disconnect_by_func (self->priv->udev_client, udev_uevent_cb, self);
+            g_clear_object (&self->priv->udev_client);
+        }
+        return;
+    }
+
+    if (self->priv->udev_client)
+        return;
+
+    self->priv->udev_client = g_udev_client_new (subsystems);
+    g_signal_connect (self->priv->udev_client,
+                      "uevent",
+                      G_CALLBACK (udev_uevent_cb),
+                      self);
+
+    /* Warm up the devices already available */
+    for (i = 0; subsystems[i]; i++) {
+        GList *devices;
+        GList *l;
+
+        devices = g_udev_client_query_by_subsystem (self->priv->udev_client, subsystems[i]);
+        for (l = devices; l; l = g_list_next (l)) {
+            udev_warm_device (self, G_UDEV_DEVICE (l->data));
+            g_object_unref (l->data);
+        }
+        g_list_free (devices);
+    }
+}
+
+#else
+
+static void
+setup_warm_devices (MbimProxy *self,
+                    gboolean   enabled)
+{
+    if (enabled)
+        g_warning ("cannot warm devices automatically: udev support not available");
+    self->priv->warm_devices = enabled;
+}
+
+#endif
+
+/*****************************************************************************/
+
+/**
+ * mbim_proxy_add_probe:
+ * @self: a #MbimProxy.
+ * @points: a mask of #MbimProbePoint values.
+ * @func: a #MbimProbeFunc.
+ * @user_data: the data to pass to @func.
+ * @user_data_free: (allow-none): a #GDestroyNotify for @user_data, or %NULL.
+ *
+ * Attaches a probe called every time @self reaches one of the given @points,
+ * for messages exchanged with its clients: %MBIM_PROBE_POINT_MESSAGE_RECEIVED,
+ * %MBIM_PROBE_POINT_MESSAGE_WRITTEN and %MBIM_PROBE_POINT_INDICATION_DISPATCHED,
+ * the latter once per client the indication is forwarded to.
+ *
+ * Messages exchanged with the devices may be probed with mbim_device_add_probe().
+ *
+ * Returns: an identifier for the probe, to be given to mbim_proxy_remove_probe().
+ */
+guint
+mbim_proxy_add_probe (MbimProxy      *self,
+                      MbimProbePoint  points,
+                      MbimProbeFunc   func,
+                      gpointer        user_data,
+                      GDestroyNotify  user_data_free)
+{
+    g_return_val_if_fail (MBIM_IS_PROXY (self), 0);
+    g_return_val_if_fail (func != NULL, 0);
+
+    return _mbim_probe_list_add (&self->priv->probes, points, func, user_data, user_data_free);
+}
+
+/**
+ * mbim_proxy_remove_probe:
+ * @self: a #MbimProxy.
+ * @probe_id: an identifier given by mbim_proxy_add_probe().
+ *
+ * Removes a probe from @self.
+ */
+void
+mbim_proxy_remove_probe (MbimProxy *self,
+                         guint      probe_id)
+{
+    g_return_if_fail (MBIM_IS_PROXY (self));
+
+    if (!_mbim_probe_list_remove (&self->priv->probes, probe_id))
+        g_warning ("No probe with id %u", probe_id);
+}
+
+/*****************************************************************************/
+
+/**
+ * mbim_proxy_dump_capture:
+ * @self: a #MbimProxy.
+ * @path: the path of the file to write.
+ * @error: Return location for error or %NULL.
+ *
+ * Writes the messages most recently exchanged between the proxy and its
+ * clients to the file at @path, in binary form. Each message is stored along
+ * with a monotonic timestamp, its direction, the client identifier and the
+ * path of the device in use by the client.
+ *
+ * Returns: %TRUE if the capture was written, %FALSE if @error is set.
+ */
+gboolean
+mbim_proxy_dump_capture (MbimProxy    *self,
+                         const gchar  *path,
+                         GError      **error)
+{
+    g_return_val_if_fail (MBIM_IS_PROXY (self), FALSE);
+    g_return_val_if_fail (path != NULL, FALSE);
+
+    g_debug ("dumping %u captured messages to '%s'...",
+             _mbim_proxy_helper_capture_get_n_records (self->priv->capture), path);
+    return _mbim_proxy_helper_capture_dump (self->priv->capture, path, error);
+}
+
 /*****************************************************************************/
 
 MbimProxy *
@@ -1450,6 +2279,27 @@ mbim_proxy_init (MbimProxy *self)
     self->priv = G_TYPE_INSTANCE_GET_PRIVATE (self,
                                               MBIM_TYPE_PROXY,
                                               MbimProxyPrivate);
+
+    self->priv->opening_devices = g_hash_table_new (g_direct_hash, g_direct_equal);
+    self->priv->capture = _mbim_proxy_helper_capture_new (CAPTURE_SIZE);
+}
+
+static void
+set_property (GObject      *object,
+              guint         prop_id,
+              const GValue *value,
+              GParamSpec   *pspec)
+{
+    MbimProxy *self = MBIM_PROXY (object);
+
+    switch (prop_id) {
+    case PROP_WARM_DEVICES:
+        setup_warm_devices (self, g_value_get_boolean (value));
+        break;
+    default:
+        G_OBJECT_WARN_INVALID_PROPERTY_ID (object, prop_id, pspec);
+        break;
+    }
 }
 
 static void
@@ -1467,6 +2317,9 @@ get_property (GObject *object,
     case PROP_N_DEVICES:
         g_value_set_uint (value, g_list_length (self->priv->devices));
         break;
+    case PROP_WARM_DEVICES:
+        g_value_set_boolean (value, self->priv->warm_devices);
+        break;
     default:
         G_OBJECT_WARN_INVALID_PROPERTY_ID (object, prop_id, pspec);
         break;
@@ -1478,8 +2331,18 @@ dispose (GObject *object)
 {
     MbimProxyPrivate *priv = MBIM_PROXY (object)->priv;
 
-    /* This list should always be empty when disposing */
-    g_assert (priv->opening_devices == NULL);
+    /* This table should always be empty when disposing */
+    if (priv->opening_devices) {
+        g_assert (g_hash_table_size (priv->opening_devices) == 0);
+        g_clear_pointer (&priv->opening_devices, g_hash_table_unref);
+    }
+
+#if defined WITH_UDEV
+    if (priv->udev_client) {
+        g_signal_handlers_disconnect_by_func (priv->udev_client, udev_uevent_cb, object);
+        g_clear_object (&priv->udev_client);
+    }
+#endif
 
     if (priv->clients) {
         g_list_free_full (priv->clients, (GDestroyNotify) client_unref);
@@ -1499,6 +2362,9 @@ dispose (GObject *object)
         g_debug ("UNIX socket service at '%s' stopped", MBIM_PROXY_SOCKET_PATH);
     }
 
+    g_clear_pointer (&priv->capture, _mbim_proxy_helper_capture_free);
+    g_clear_pointer (&priv->probes, _mbim_probe_list_free);
+
     G_OBJECT_CLASS (mbim_proxy_parent_class)->dispose (object);
 }
 
@@ -1511,6 +2377,7 @@ mbim_proxy_class_init (MbimProxyClass *proxy_class)
 
     /* Virtual methods */
     object_class->get_property = get_property;
+    object_class->set_property = set_property;
     object_class->dispose = dispose;
 
     /* Properties */
@@ -1533,4 +2400,12 @@ mbim_proxy_class_init (MbimProxyClass *proxy_class)
                            0,
                            G_PARAM_READABLE);
     g_object_class_install_property (object_class, PROP_N_DEVICES, properties[PROP_N_DEVICES]);
+
+    properties[PROP_WARM_DEVICES] =
+        g_param_spec_boolean (MBIM_PROXY_WARM_DEVICES,
+                              "Warm devices",
+                              "Whether MBIM devices are opened and warmed up as soon as they appear",
+                              FALSE,
+                              G_PARAM_READWRITE);
+    g_object_class_install_property (object_class, PROP_WARM_DEVICES, properties[PROP_WARM_DEVICES]);
 }
@@ -27,6 +27,8 @@
 #include <glib-object.h>
 #include <gio/gio.h>
 
+#include "mbim-probe.h"
+
 #define MBIM_TYPE_PROXY            (mbim_proxy_get_type ())
 #define MBIM_PROXY(obj)            (G_TYPE_CHECK_INSTANCE_CAST ((obj), MBIM_TYPE_PROXY, MbimProxy))
 #define MBIM_PROXY_CLASS(klass)    (G_TYPE_CHECK_CLASS_CAST ((klass), MBIM_TYPE_PROXY, MbimProxyClass))
@@ -42,6 +44,7 @@ typedef struct _MbimProxyPrivate MbimProxyPrivate;
 
 #define MBIM_PROXY_N_CLIENTS   "mbim-proxy-n-clients"
 #define MBIM_PROXY_N_DEVICES   "mbim-proxy-n-devices"
+#define MBIM_PROXY_WARM_DEVICES "mbim-proxy-warm-devices"
 
 struct _MbimProxy {
     GObject parent;
@@ -57,5 +60,17 @@ GType mbim_proxy_get_type (void);
 MbimProxy *mbim_proxy_new           (GError **error);
 guint      mbim_proxy_get_n_clients (MbimProxy *self);
 guint      mbim_proxy_get_n_devices (MbimProxy *self);
+void       mbim_proxy_warm_device   (MbimProxy   *self,
+                                     const gchar *path);
+gboolean   mbim_proxy_dump_capture  (MbimProxy    *self,
+                                     const gchar  *path,
+                                     GError      **error);
+guint      mbim_proxy_add_probe     (MbimProxy      *self,
+                                     MbimProbePoint  points,
+                                     MbimProbeFunc   func,
+                                     gpointer        user_data,
+                                     GDestroyNotify  user_data_free);
+void       mbim_proxy_remove_probe  (MbimProxy      *self,
+                                     guint           probe_id);
 
 #endif /* MBIM_PROXY_H */
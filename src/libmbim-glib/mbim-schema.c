@@ -0,0 +1,357 @@
+/* -*- Mode: C; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*- */
+
+/*
+ * libmbim-glib -- GLib/GIO based library to control MBIM devices
+ *
+ * This library is free software; you can redistribute it and/or
+ * modify it under the terms of the GNU Lesser General Public
+ * License as published by the Free Software Foundation; either
+ * version 2 of the License, or (at your option) any later version.
+ *
+ * This library is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ * Lesser General Public License for more details.
+ *
+ * You should have received a copy of the GNU Lesser General Public
+ * License along with this library; if not, write to the
+ * Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor,
+ * Boston, MA 02110-1301 USA.
+ *
+ * Copyright (C) 2013 - 2014 Aleksander Morgado <aleksander@aleksander.es>
+ */
+
+#include <config.h>
+
+#include "mbim-schema.h"
+#include "mbim-cid-private.h"
+#include "mbim-message-private.h"
+
+/**
+ * SECTION:mbim-schema
+ * @title: Message schema
+ * @short_description: Read-only description of the contents of known messages.
+ *
+ * The contents of every query, set, response and notification message of the
+ * known services are described by static #MbimMessageFields tables, which may
+ * be looked up with mbim_message_fields_lookup() or mbim_message_get_fields().
+ *
+ * Each #MbimField gives its name, its #MbimFieldFormat, the enum or flags
+ * #GType used for its value in the public API, and the conditions under which
+ * it is available in the message. Fields of struct formats refer to the
+ * #MbimStructFields describing the struct layout.
+ *
+ * All these tables are owned by the library and must not be freed.
+ */
+
+/*****************************************************************************/
+
+/**
+ * mbim_message_fields_lookup:
+ * @service: a #MbimService.
+ * @cid: a command ID.
+ * @message_type: a #MbimMessageType, either %MBIM_MESSAGE_TYPE_COMMAND,
+ *  %MBIM_MESSAGE_TYPE_COMMAND_DONE or %MBIM_MESSAGE_TYPE_INDICATE_STATUS.
+ * @command_type: a #MbimMessageCommandType, only used if @message_type is
+ *  %MBIM_MESSAGE_TYPE_COMMAND.
+ *
+ * Looks up the fields of the given message of a known service.
+ *
+ * Returns: (transfer none): a #MbimMessageFields, or %NULL if the service,
+ * command or message type are unknown, or if they are not supported by the
+ * command.
+ */
+const MbimMessageFields *
+mbim_message_fields_lookup (MbimService            service,
+                            guint                  cid,
+                            MbimMessageType        message_type,
+                            MbimMessageCommandType command_type)
+{
+    const MbimCidEntry *entry;
+
+    /* Only known services have field tables */
+    if (service == MBIM_SERVICE_INVALID || service >= MBIM_SERVICE_LAST)
+        return NULL;
+
+    entry = _mbim_cid_lookup (service, cid);
+    if (!entry)
+        return NULL;
+
+    switch (message_type) {
+    case MBIM_MESSAGE_TYPE_COMMAND:
+        switch (command_type) {
+        case MBIM_MESSAGE_COMMAND_TYPE_QUERY:
+            return entry->query_fields;
+        case MBIM_MESSAGE_COMMAND_TYPE_SET:
+            return entry->set_fields;
+        default:
+            return NULL;
+        }
+    case MBIM_MESSAGE_TYPE_COMMAND_DONE:
+        return entry->response_fields;
+    case MBIM_MESSAGE_TYPE_INDICATE_STATUS:
+        return entry->notification_fields;
+    default:
+        return NULL;
+    }
+}
+
+/**
+ * mbim_message_get_fields:
+ * @self: a #MbimMessage.
+ *
+ * Looks up the fields of the given message. Responses with an error status
+ * carry no fields.
+ *
+ * Returns: (transfer none): a #MbimMessageFields, or %NULL if the message has
+ * no known fields.
+ */
+const MbimMessageFields *
+mbim_message_get_fields (const MbimMessage *self)
+{
+    g_return_val_if_fail (self != NULL, NULL);
+
+    switch (mbim_message_get_message_type (self)) {
+    case MBIM_MESSAGE_TYPE_COMMAND:
+        return mbim_message_fields_lookup (mbim_message_command_get_service (self),
+                                           mbim_message_command_get_cid (self),
+                                           MBIM_MESSAGE_TYPE_COMMAND,
+                                           mbim_message_command_get_command_type (self));
+    case MBIM_MESSAGE_TYPE_COMMAND_DONE:
+        if (mbim_message_command_done_get_status_code (self) != MBIM_STATUS_ERROR_NONE)
+            return NULL;
+        return mbim_message_fields_lookup (mbim_message_command_done_get_service (self),
+                                           mbim_message_command_done_get_cid (self),
+                                           MBIM_MESSAGE_TYPE_COMMAND_DONE,
+                                           MBIM_MESSAGE_COMMAND_TYPE_UNKNOWN);
+    case MBIM_MESSAGE_TYPE_INDICATE_STATUS:
+        return mbim_message_fields_lookup (mbim_message_indicate_status_get_service (self),
+                                           mbim_message_indicate_status_get_cid (self),
+                                           MBIM_MESSAGE_TYPE_INDICATE_STATUS,
+                                           MBIM_MESSAGE_COMMAND_TYPE_UNKNOWN);
+    default:
+        return NULL;
+    }
+}
+
+/**
+ * mbim_message_fields_get_n_fields:
+ * @self: a #MbimMessageFields.
+ *
+ * Gets the number of fields in the message.
+ *
+ * Returns: the number of fields.
+ */
+guint
+mbim_message_fields_get_n_fields (const MbimMessageFields *self)
+{
+    g_return_val_if_fail (self != NULL, 0);
+
+    return self->n_fields;
+}
+
+/**
+ * mbim_message_fields_get_field:
+ * @self: a #MbimMessageFields.
+ * @i: index of the field, lower than mbim_message_fields_get_n_fields().
+ *
+ * Gets a field of the message, in the same order as in the wire format.
+ *
+ * Returns: (transfer none): a #MbimField.
+ */
+const MbimField *
+mbim_message_fields_get_field (const MbimMessageFields *self,
+                               guint                    i)
+{
+    g_return_val_if_fail (self != NULL, NULL);
+    g_return_val_if_fail (i < self->n_fields, NULL);
+
+    return &self->fields[i];
+}
+
+/*****************************************************************************/
+
+/**
+ * mbim_struct_fields_get_name:
+ * @self: a #MbimStructFields.
+ *
+ * Gets the name of the struct, as given in the public API.
+ *
+ * Returns: (transfer none): the name of the struct.
+ */
+const gchar *
+mbim_struct_fields_get_name (const MbimStructFields *self)
+{
+    g_return_val_if_fail (self != NULL, NULL);
+
+    return self->name;
+}
+
+/**
+ * mbim_struct_fields_get_n_fields:
+ * @self: a #MbimStructFields.
+ *
+ * Gets the number of fields in the struct.
+ *
+ * Returns: the number of fields.
+ */
+guint
+mbim_struct_fields_get_n_fields (const MbimStructFields *self)
+{
+    g_return_val_if_fail (self != NULL, 0);
+
+    return self->n_fields;
+}
+
+/**
+ * mbim_struct_fields_get_field:
+ * @self: a #MbimStructFields.
+ * @i: index of the field, lower than mbim_struct_fields_get_n_fields().
+ *
+ * Gets a field of the struct, in the same order as in the wire format.
+ *
+ * Returns: (transfer none): a #MbimField.
+ */
+const MbimField *
+mbim_struct_fields_get_field (const MbimStructFields *self,
+                              guint                   i)
+{
+    g_return_val_if_fail (self != NULL, NULL);
+    g_return_val_if_fail (i < self->n_fields, NULL);
+
+    return &self->fields[i];
+}
+
+/*****************************************************************************/
+
+/**
+ * mbim_field_get_name:
+ * @self: a #MbimField.
+ *
+ * Gets the name of the field, as given in the service definitions.
+ *
+ * Returns: (transfer none): the name of the field.
+ */
+const gchar *
+mbim_field_get_name (const MbimField *self)
+{
+    g_return_val_if_fail (self != NULL, NULL);
+
+    return self->name;
+}
+
+/**
+ * mbim_field_get_format:
+ * @self: a #MbimField.
+ *
+ * Gets the format of the field.
+ *
+ * Returns: a #MbimFieldFormat.
+ */
+MbimFieldFormat
+mbim_field_get_format (const MbimField *self)
+{
+    g_return_val_if_fail (self != NULL, MBIM_FIELD_FORMAT_GUINT32);
+
+    return self->format;
+}
+
+/**
+ * mbim_field_get_public_type:
+ * @self: a #MbimField.
+ *
+ * Gets the enum or flags type used for the value of the field in the public
+ * API, only given in %MBIM_FIELD_FORMAT_GUINT32 fields.
+ *
+ * Returns: a #GType, or %G_TYPE_NONE if the field has no public type.
+ */
+GType
+mbim_field_get_public_type (const MbimField *self)
+{
+    g_return_val_if_fail (self != NULL, G_TYPE_NONE);
+
+    return self->public_get_type ? self->public_get_type () : G_TYPE_NONE;
+}
+
+/**
+ * mbim_field_get_array_size:
+ * @self: a #MbimField.
+ *
+ * Gets the number of elements of a %MBIM_FIELD_FORMAT_BYTE_ARRAY field.
+ *
+ * Returns: the number of elements, or 0 if not applicable.
+ */
+guint32
+mbim_field_get_array_size (const MbimField *self)
+{
+    g_return_val_if_fail (self != NULL, 0);
+
+    return self->array_size;
+}
+
+/**
+ * mbim_field_get_array_size_field:
+ * @self: a #MbimField.
+ *
+ * Gets the index of the %MBIM_FIELD_FORMAT_GUINT32 field, in the same message
+ * or struct, giving the number of elements of this array field.
+ *
+ * Returns: the index of the field, or -1 if not applicable.
+ */
+gint
+mbim_field_get_array_size_field (const MbimField *self)
+{
+    g_return_val_if_fail (self != NULL, -1);
+
+    return self->has_array_size_field ? (gint) self->array_size_field : -1;
+}
+
+/**
+ * mbim_field_get_condition:
+ * @self: a #MbimField.
+ * @condition_field: (out) (allow-none): return location for the index of the
+ *  %MBIM_FIELD_FORMAT_GUINT32 field the availability depends on, or %NULL.
+ * @condition: (out) (allow-none): return location for the #MbimFieldCondition, or %NULL.
+ * @condition_value: (out) (allow-none): return location for the value to compare with, or %NULL.
+ *
+ * Gets the condition for the field to be available in the message. The field
+ * is available if the value of @condition_field satisfies @condition when
+ * compared with @condition_value.
+ *
+ * Returns: %TRUE if the field is conditional, %FALSE if it is always available.
+ */
+gboolean
+mbim_field_get_condition (const MbimField    *self,
+                          guint              *condition_field,
+                          MbimFieldCondition *condition,
+                          guint32            *condition_value)
+{
+    g_return_val_if_fail (self != NULL, FALSE);
+
+    if (condition_field)
+        *condition_field = self->condition_field;
+    if (condition)
+        *condition = self->condition;
+    if (condition_value)
+        *condition_value = self->condition_value;
+
+    return (self->condition != MBIM_FIELD_CONDITION_NONE);
+}
+
+/**
+ * mbim_field_get_struct_fields:
+ * @self: a #MbimField.
+ *
+ * Gets the struct layout of %MBIM_FIELD_FORMAT_STRUCT,
+ * %MBIM_FIELD_FORMAT_STRUCT_ARRAY and %MBIM_FIELD_FORMAT_REF_STRUCT_ARRAY
+ * fields.
+ *
+ * Returns: (transfer none): a #MbimStructFields, or %NULL if not applicable.
+ */
+const MbimStructFields *
+mbim_field_get_struct_fields (const MbimField *self)
+{
+    g_return_val_if_fail (self != NULL, NULL);
+
+    return self->struct_fields;
+}
@@ -0,0 +1,160 @@
+/* -*- Mode: C; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*- */
+
+/*
+ * libmbim-glib -- GLib/GIO based library to control MBIM devices
+ *
+ * This library is free software; you can redistribute it and/or
+ * modify it under the terms of the GNU Lesser General Public
+ * License as published by the Free Software Foundation; either
+ * version 2 of the License, or (at your option) any later version.
+ *
+ * This library is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ * Lesser General Public License for more details.
+ *
+ * You should have received a copy of the GNU Lesser General Public
+ * License along with this library; if not, write to the
+ * Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor,
+ * Boston, MA 02110-1301 USA.
+ *
+ * Copyright (C) 2013 - 2014 Aleksander Morgado <aleksander@aleksander.es>
+ */
+
+#ifndef _LIBMBIM_GLIB_MBIM_SCHEMA_H_
+#define _LIBMBIM_GLIB_MBIM_SCHEMA_H_
+
+#if !defined (__LIBMBIM_GLIB_H_INSIDE__) && !defined (LIBMBIM_GLIB_COMPILATION)
+#error "Only <libmbim-glib.h> can be included directly."
+#endif
+
+#include <glib-object.h>
+
+#include "mbim-uuid.h"
+#include "mbim-message.h"
+
+G_BEGIN_DECLS
+
+/*****************************************************************************/
+
+/**
+ * MbimFieldFormat:
+ * @MBIM_FIELD_FORMAT_GUINT32: A 32-bit unsigned integer.
+ * @MBIM_FIELD_FORMAT_GUINT32_ARRAY: An array of 32-bit unsigned integers, only in structs.
+ * @MBIM_FIELD_FORMAT_GUINT64: A 64-bit unsigned integer.
+ * @MBIM_FIELD_FORMAT_UUID: A #MbimUuid.
+ * @MBIM_FIELD_FORMAT_BYTE_ARRAY: A byte array of fixed size.
+ * @MBIM_FIELD_FORMAT_UNSIZED_BYTE_ARRAY: A byte array extending until the end of the buffer.
+ * @MBIM_FIELD_FORMAT_REF_BYTE_ARRAY: A byte array given by offset and length.
+ * @MBIM_FIELD_FORMAT_REF_BYTE_ARRAY_NO_OFFSET: A byte array given by length, with the data just afterwards.
+ * @MBIM_FIELD_FORMAT_STRING: A string given by offset and length.
+ * @MBIM_FIELD_FORMAT_STRING_ARRAY: An array of strings given by offset and length pairs.
+ * @MBIM_FIELD_FORMAT_STRUCT: A struct, inline.
+ * @MBIM_FIELD_FORMAT_STRUCT_ARRAY: An array of fixed-sized structs given by offset.
+ * @MBIM_FIELD_FORMAT_REF_STRUCT_ARRAY: An array of structs given by offset and length pairs.
+ * @MBIM_FIELD_FORMAT_IPV4: A #MbimIPv4, inline.
+ * @MBIM_FIELD_FORMAT_REF_IPV4: A #MbimIPv4 given by offset.
+ * @MBIM_FIELD_FORMAT_IPV4_ARRAY: An array of #MbimIPv4 given by offset.
+ * @MBIM_FIELD_FORMAT_IPV6: A #MbimIPv6, inline.
+ * @MBIM_FIELD_FORMAT_REF_IPV6: A #MbimIPv6 given by offset.
+ * @MBIM_FIELD_FORMAT_IPV6_ARRAY: An array of #MbimIPv6 given by offset.
+ *
+ * Format of a field in a message or struct, as given in the service
+ * definitions.
+ */
+typedef enum {
+    MBIM_FIELD_FORMAT_GUINT32                  = 0,
+    MBIM_FIELD_FORMAT_GUINT32_ARRAY            = 1,
+    MBIM_FIELD_FORMAT_GUINT64                  = 2,
+    MBIM_FIELD_FORMAT_UUID                     = 3,
+    MBIM_FIELD_FORMAT_BYTE_ARRAY               = 4,
+    MBIM_FIELD_FORMAT_UNSIZED_BYTE_ARRAY       = 5,
+    MBIM_FIELD_FORMAT_REF_BYTE_ARRAY           = 6,
+    MBIM_FIELD_FORMAT_REF_BYTE_ARRAY_NO_OFFSET = 7,
+    MBIM_FIELD_FORMAT_STRING                   = 8,
+    MBIM_FIELD_FORMAT_STRING_ARRAY             = 9,
+    MBIM_FIELD_FORMAT_STRUCT                   = 10,
+    MBIM_FIELD_FORMAT_STRUCT_ARRAY             = 11,
+    MBIM_FIELD_FORMAT_REF_STRUCT_ARRAY         = 12,
+    MBIM_FIELD_FORMAT_IPV4                     = 13,
+    MBIM_FIELD_FORMAT_REF_IPV4                 = 14,
+    MBIM_FIELD_FORMAT_IPV4_ARRAY               = 15,
+    MBIM_FIELD_FORMAT_IPV6                     = 16,
+    MBIM_FIELD_FORMAT_REF_IPV6                 = 17,
+    MBIM_FIELD_FORMAT_IPV6_ARRAY               = 18
+} MbimFieldFormat;
+
+/**
+ * MbimFieldCondition:
+ * @MBIM_FIELD_CONDITION_NONE: The field is always available.
+ * @MBIM_FIELD_CONDITION_EQUAL: Available if the condition field is equal to the condition value.
+ * @MBIM_FIELD_CONDITION_NOT_EQUAL: Available if the condition field is not equal to the condition value.
+ * @MBIM_FIELD_CONDITION_LESS: Available if the condition field is less than the condition value.
+ * @MBIM_FIELD_CONDITION_LESS_EQUAL: Available if the condition field is less than or equal to the condition value.
+ * @MBIM_FIELD_CONDITION_GREATER: Available if the condition field is greater than the condition value.
+ * @MBIM_FIELD_CONDITION_GREATER_EQUAL: Available if the condition field is greater than or equal to the condition value.
+ *
+ * Condition for a field to be available in a message.
+ */
+typedef enum {
+    MBIM_FIELD_CONDITION_NONE          = 0,
+    MBIM_FIELD_CONDITION_EQUAL         = 1,
+    MBIM_FIELD_CONDITION_NOT_EQUAL     = 2,
+    MBIM_FIELD_CONDITION_LESS          = 3,
+    MBIM_FIELD_CONDITION_LESS_EQUAL    = 4,
+    MBIM_FIELD_CONDITION_GREATER       = 5,
+    MBIM_FIELD_CONDITION_GREATER_EQUAL = 6
+} MbimFieldCondition;
+
+/**
+ * MbimField:
+ *
+ * An opaque type describing a single field of a message or struct.
+ */
+typedef struct _MbimField MbimField;
+
+/**
+ * MbimStructFields:
+ *
+ * An opaque type describing the fields of a struct.
+ */
+typedef struct _MbimStructFields MbimStructFields;
+
+/**
+ * MbimMessageFields:
+ *
+ * An opaque type describing the fields of a query, set, response or
+ * notification message of a given command.
+ */
+typedef struct _MbimMessageFields MbimMessageFields;
+
+/*****************************************************************************/
+
+const MbimMessageFields *mbim_message_fields_lookup       (MbimService                service,
+                                                           guint                      cid,
+                                                           MbimMessageType            message_type,
+                                                           MbimMessageCommandType     command_type);
+const MbimMessageFields *mbim_message_get_fields          (const MbimMessage         *self);
+guint                    mbim_message_fields_get_n_fields (const MbimMessageFields   *self);
+const MbimField         *mbim_message_fields_get_field    (const MbimMessageFields   *self,
+                                                           guint                      i);
+
+const gchar             *mbim_struct_fields_get_name      (const MbimStructFields    *self);
+guint                    mbim_struct_fields_get_n_fields  (const MbimStructFields    *self);
+const MbimField         *mbim_struct_fields_get_field     (const MbimStructFields    *self,
+                                                           guint                      i);
+
+const gchar             *mbim_field_get_name              (const MbimField           *self);
+MbimFieldFormat          mbim_field_get_format            (const MbimField           *self);
+GType                    mbim_field_get_public_type       (const MbimField           *self);
+guint32                  mbim_field_get_array_size        (const MbimField           *self);
+gint                     mbim_field_get_array_size_field  (const MbimField           *self);
+gboolean                 mbim_field_get_condition         (const MbimField           *self,
+                                                           guint                     *condition_field,
+                                                           MbimFieldCondition        *condition,
+                                                           guint32                   *condition_value);
+const MbimStructFields  *mbim_field_get_struct_fields     (const MbimField           *self);
+
+G_END_DECLS
+
+#endif /* _LIBMBIM_GLIB_MBIM_SCHEMA_H_ */
@@ -0,0 +1,557 @@
+/* -*- Mode: C; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*- */
+
+/*
+ * libmbim-glib -- GLib/GIO based library to control MBIM devices
+ *
+ * This library is free software; you can redistribute it and/or
+ * modify it under the terms of the GNU Lesser General Public
+ * License as published by the Free Software Foundation; either
+ * version 2 of the License, or (at your option) any later version.
+ *
+ * This library is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ * Lesser General Public License for more details.
+ *
+ * You should have received a copy of the GNU Lesser General Public
+ * License along with this library; if not, write to the
+ * Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor,
+ * Boston, MA 02110-1301 USA.
+ *
+ * Copyright (C) 2026 The libmbim authors
+ */
+
+#include <config.h>
+#include <string.h>
+
+#include "mbim-common.h"
+#include "mbim-utils.h"
+#include "mbim-trace.h"
+#include "mbim-message-private.h"
+
+/**
+ * SECTION:mbim-trace
+ * @title: Message traces
+ * @short_description: Structured traces of the messages exchanged with devices.
+ *
+ * When traces are enabled with mbim_utils_set_traces_enabled(), every message
+ * exchanged with a #MbimDevice generates a #MbimTraceEvent. By default these
+ * events are formatted and written as debug logs, but a custom #MbimTraceFunc
+ * may be installed with mbim_trace_set_func(), in which case nothing gets
+ * formatted unless the function explicitly asks for it.
+ *
+ * The default debug logs are only formatted when the G_MESSAGES_DEBUG
+ * environment variable enables the "Mbim" log domain (or "all" of them) by
+ * the time the first event is traced. Programs handling that domain with
+ * their own log handler must therefore enable it there as well.
+ *
+ * Filters may be added at any time with mbim_trace_add_filter(), so that only
+ * the messages of a given device, service, CID or message type generate trace
+ * events at all.
+ */
+
+/*****************************************************************************/
+
+struct _MbimTraceEvent {
+    MbimTraceEventType  event_type;
+    const gchar        *path;
+    const gchar        *path_display;
+    const MbimMessage  *message;
+};
+
+/**
+ * mbim_trace_event_get_event_type:
+ * @event: a #MbimTraceEvent.
+ *
+ * Gets the type of the trace event.
+ *
+ * Returns: a #MbimTraceEventType.
+ */
+MbimTraceEventType
+mbim_trace_event_get_event_type (const MbimTraceEvent *event)
+{
+    g_return_val_if_fail (event != NULL, MBIM_TRACE_EVENT_TYPE_SENT);
+
+    return event->event_type;
+}
+
+/**
+ * mbim_trace_event_get_path:
+ * @event: a #MbimTraceEvent.
+ *
+ * Gets the path of the device which sent or received the message.
+ *
+ * Returns: (transfer none): the device path.
+ */
+const gchar *
+mbim_trace_event_get_path (const MbimTraceEvent *event)
+{
+    g_return_val_if_fail (event != NULL, NULL);
+
+    return event->path;
+}
+
+/**
+ * mbim_trace_event_get_message:
+ * @event: a #MbimTraceEvent.
+ *
+ * Gets the message, or message fragment, of the trace event. It is only valid
+ * during the #MbimTraceFunc call; use mbim_message_dup() to keep it around.
+ *
+ * Returns: (transfer none): a #MbimMessage.
+ */
+const MbimMessage *
+mbim_trace_event_get_message (const MbimTraceEvent *event)
+{
+    g_return_val_if_fail (event != NULL, NULL);
+
+    return event->message;
+}
+
+/**
+ * mbim_trace_event_get_raw_printable:
+ * @event: a #MbimTraceEvent.
+ *
+ * Gets a hexadecimal dump of the raw message contents.
+ *
+ * Returns: (transfer full): a newly allocated string, which should be freed with g_free().
+ */
+gchar *
+mbim_trace_event_get_raw_printable (const MbimTraceEvent *event)
+{
+    g_return_val_if_fail (event != NULL, NULL);
+
+    return mbim_common_str_hex (((GByteArray *)event->message)->data,
+                                ((GByteArray *)event->message)->len,
+                                ':');
+}
+
+static gboolean
+trace_event_is_partial (const MbimTraceEvent *event)
+{
+    switch (event->event_type) {
+    case MBIM_TRACE_EVENT_TYPE_SENT_FRAGMENT:
+        return TRUE;
+    case MBIM_TRACE_EVENT_TYPE_RECEIVED:
+        return (_mbim_message_is_fragment (event->message) &&
+                _mbim_message_fragment_get_total (event->message) > 1);
+    case MBIM_TRACE_EVENT_TYPE_SENT:
+    case MBIM_TRACE_EVENT_TYPE_RECEIVED_COMPLETE:
+    default:
+        return FALSE;
+    }
+}
+
+/**
+ * mbim_trace_event_print:
+ * @event: a #MbimTraceEvent.
+ * @line_prefix: prefix string to use in each new generated line.
+ * @printer_func: a #MbimMessagePrinterFunc.
+ * @user_data: data to pass to @printer_func.
+ *
+ * Prints the translated message of the trace event, as mbim_message_print()
+ * does. Only the headers are printed for messages that are fragments of a
+ * bigger one.
+ */
+void
+mbim_trace_event_print (const MbimTraceEvent   *event,
+                        const gchar            *line_prefix,
+                        MbimMessagePrinterFunc  printer_func,
+                        gpointer                user_data)
+{
+    g_return_if_fail (event != NULL);
+
+    mbim_message_print (event->message,
+                        line_prefix,
+                        trace_event_is_partial (event),
+                        printer_func,
+                        user_data);
+}
+
+/**
+ * mbim_trace_event_get_printable:
+ * @event: a #MbimTraceEvent.
+ * @line_prefix: prefix string to use in each new generated line.
+ *
+ * Gets a printable string with the translated message of the trace event.
+ * Only the headers are printed for messages that are fragments of a bigger
+ * one.
+ *
+ * Returns: (transfer full): a newly allocated string, which should be freed with g_free().
+ */
+gchar *
+mbim_trace_event_get_printable (const MbimTraceEvent *event,
+                                const gchar          *line_prefix)
+{
+    g_return_val_if_fail (event != NULL, NULL);
+
+    return mbim_message_get_printable (event->message,
+                                       line_prefix,
+                                       trace_event_is_partial (event));
+}
+
+/*****************************************************************************/
+/* Default trace function, writing debug logs */
+
+/* Whether the debug logs of our domain are written at all; G_MESSAGES_DEBUG is
+ * checked just once, as it isn't expected to change at runtime */
+static gboolean
+trace_debug_logs_enabled (void)
+{
+    static gsize enabled = 0;
+
+    if (g_once_init_enter (&enabled)) {
+        const gchar *domains;
+        gsize        value = 1;
+
+        domains = g_getenv ("G_MESSAGES_DEBUG");
+        if (domains && (g_str_equal (domains, "all") || strstr (domains, G_LOG_DOMAIN)))
+            value = 2;
+        g_once_init_leave (&enabled, value);
+    }
+
+    return (enabled == 2);
+}
+
+static void
+trace_event_log (const MbimTraceEvent *event)
+{
+    gchar *printable;
+
+    /* Don't format anything that g_debug() would just drop */
+    if (!trace_debug_logs_enabled ())
+        return;
+
+    switch (event->event_type) {
+    case MBIM_TRACE_EVENT_TYPE_SENT:
+        printable = mbim_trace_event_get_raw_printable (event);
+        g_debug ("[%s] Sent message...\n"
+                 "<<<<<< RAW:\n"
+                 "<<<<<<   length = %u\n"
+                 "<<<<<<   data   = %s\n",
+                 event->path_display,
+                 ((GByteArray *)event->message)->len,
+                 printable);
+        g_free (printable);
+
+        printable = mbim_trace_event_get_printable (event, "<<<<<< ");
+        g_debug ("[%s] Sent message (translated)...\n%s",
+                 event->path_display,
+                 printable);
+        g_free (printable);
+        break;
+
+    case MBIM_TRACE_EVENT_TYPE_SENT_FRAGMENT:
+        printable = mbim_trace_event_get_raw_printable (event);
+        g_debug ("[%s] Sent fragment (%u)...\n"
+                 "<<<<<< RAW:\n"
+                 "<<<<<<   length = %u\n"
+                 "<<<<<<   data   = %s\n",
+                 event->path_display,
+                 _mbim_message_fragment_get_current (event->message),
+                 ((GByteArray *)event->message)->len,
+                 printable);
+        g_free (printable);
+
+        printable = mbim_trace_event_get_printable (event, "<<<<<< ");
+        g_debug ("[%s] Sent fragment (translated)...\n%s",
+                 event->path_display,
+                 printable);
+        g_free (printable);
+        break;
+
+    case MBIM_TRACE_EVENT_TYPE_RECEIVED: {
+        gboolean is_partial_fragment;
+
+        is_partial_fragment = trace_event_is_partial (event);
+
+        printable = mbim_trace_event_get_raw_printable (event);
+        g_debug ("[%s] Received message...%s\n"
+                 ">>>>>> RAW:\n"
+                 ">>>>>>   length = %u\n"
+                 ">>>>>>   data   = %s\n",
+                 event->path_display,
+                 is_partial_fragment ? " (partial fragment)" : "",
+                 ((GByteArray *)event->message)->len,
+                 printable);
+        g_free (printable);
+
+        if (is_partial_fragment) {
+            printable = mbim_trace_event_get_printable (event, ">>>>>> ");
+            g_debug ("[%s] Received message fragment (translated)...\n%s",
+                     event->path_display,
+                     printable);
+            g_free (printable);
+        }
+        break;
+    }
+
+    case MBIM_TRACE_EVENT_TYPE_RECEIVED_COMPLETE:
+        printable = mbim_trace_event_get_printable (event, ">>>>>> ");
+        g_debug ("[%s] Received message (translated)...\n%s",
+                 event->path_display,
+                 printable);
+        g_free (printable);
+        break;
+
+    default:
+        g_assert_not_reached ();
+    }
+}
+
+/*****************************************************************************/
+
+/* The trace function and its data are kept in a refcounted sink, so that a
+ * sink replaced while some other thread is still running it is only freed
+ * once that call returns */
+typedef struct {
+    volatile gint  ref_count;
+    MbimTraceFunc  func;
+    gpointer       user_data;
+    GDestroyNotify user_data_free;
+} TraceSink;
+
+static GMutex     trace_sink_lock;
+static TraceSink *trace_sink;
+
+static TraceSink *
+trace_sink_ref (TraceSink *sink)
+{
+    g_atomic_int_inc (&sink->ref_count);
+    return sink;
+}
+
+static void
+trace_sink_unref (TraceSink *sink)
+{
+    if (g_atomic_int_dec_and_test (&sink->ref_count)) {
+        if (sink->user_data && sink->user_data_free)
+            sink->user_data_free (sink->user_data);
+        g_slice_free (TraceSink, sink);
+    }
+}
+
+/**
+ * mbim_trace_set_func:
+ * @func: (allow-none): a #MbimTraceFunc, or %NULL to go back to the default one.
+ * @user_data: (allow-none): data to pass to @func.
+ * @user_data_free: (allow-none): function to free @user_data when no longer needed.
+ *
+ * Sets the function receiving all trace events, instead of the default one,
+ * which writes the translated messages as debug logs.
+ *
+ * Trace events may be generated in any thread. A previously set function may
+ * therefore still be running when this method returns; its @user_data_free
+ * is only called once all of those calls have finished, which may happen in
+ * any of the threads running them.
+ */
+void
+mbim_trace_set_func (MbimTraceFunc  func,
+                     gpointer       user_data,
+                     GDestroyNotify user_data_free)
+{
+    TraceSink *sink = NULL;
+    TraceSink *old_sink;
+
+    if (func) {
+        sink = g_slice_new (TraceSink);
+        sink->ref_count = 1;
+        sink->func = func;
+        sink->user_data = user_data;
+        sink->user_data_free = user_data_free;
+    }
+
+    g_mutex_lock (&trace_sink_lock);
+    old_sink = trace_sink;
+    trace_sink = sink;
+    g_mutex_unlock (&trace_sink_lock);
+
+    if (old_sink)
+        trace_sink_unref (old_sink);
+}
+
+/*****************************************************************************/
+/* Filters */
+
+typedef struct {
+    gchar           *path;
+    MbimService      service;
+    guint            cid;
+    MbimMessageType  message_type;
+} TraceFilter;
+
+static GMutex         trace_filters_lock;
+static GSList        *trace_filters;
+static volatile gint  n_trace_filters;
+
+static void
+trace_filter_free (TraceFilter *filter)
+{
+    g_free (filter->path);
+    g_slice_free (TraceFilter, filter);
+}
+
+static gboolean
+message_get_service_cid (const MbimMessage *message,
+                         MbimService       *service,
+                         guint             *cid)
+{
+    /* Only the first fragment carries service and CID */
+    if (_mbim_message_is_fragment (message) &&
+        _mbim_message_fragment_get_current (message) > 0)
+        return FALSE;
+
+    switch (MBIM_MESSAGE_GET_MESSAGE_TYPE (message)) {
+    case MBIM_MESSAGE_TYPE_COMMAND:
+        *service = mbim_message_command_get_service (message);
+        *cid = mbim_message_command_get_cid (message);
+        return TRUE;
+    case MBIM_MESSAGE_TYPE_COMMAND_DONE:
+        *service = mbim_message_command_done_get_service (message);
+        *cid = mbim_message_command_done_get_cid (message);
+        return TRUE;
+    case MBIM_MESSAGE_TYPE_INDICATE_STATUS:
+        *service = mbim_message_indicate_status_get_service (message);
+        *cid = mbim_message_indicate_status_get_cid (message);
+        return TRUE;
+    default:
+        return FALSE;
+    }
+}
+
+static gboolean
+trace_filter_match (const TraceFilter *filter,
+                    const gchar       *path,
+                    const MbimMessage *message)
+{
+    MbimService service;
+    guint       cid;
+
+    if (filter->path && g_strcmp0 (filter->path, path) != 0)
+        return FALSE;
+
+    if (filter->message_type != MBIM_MESSAGE_TYPE_INVALID &&
+        filter->message_type != MBIM_MESSAGE_GET_MESSAGE_TYPE (message))
+        return FALSE;
+
+    if (filter->service == MBIM_SERVICE_INVALID && filter->cid == 0)
+        return TRUE;
+
+    if (!message_get_service_cid (message, &service, &cid))
+        return FALSE;
+
+    if (filter->service != MBIM_SERVICE_INVALID && filter->service != service)
+        return FALSE;
+
+    if (filter->cid != 0 && filter->cid != cid)
+        return FALSE;
+
+    return TRUE;
+}
+
+/**
+ * mbim_trace_add_filter:
+ * @path: (allow-none): the device path to match, or %NULL to match any device.
+ * @service: the #MbimService to match, or %MBIM_SERVICE_INVALID to match any service.
+ * @cid: the command ID to match, or 0 to match any command.
+ * @message_type: the #MbimMessageType to match, or %MBIM_MESSAGE_TYPE_INVALID to match any message type.
+ *
+ * Adds a new trace filter. Once at least one filter is set, trace events are
+ * only generated for messages matching any of them.
+ *
+ * Filters on @service or @cid never match messages without service and
+ * command, nor fragments other than the first one of a message, although
+ * reassembled messages are matched as a whole.
+ */
+void
+mbim_trace_add_filter (const gchar     *path,
+                       MbimService      service,
+                       guint            cid,
+                       MbimMessageType  message_type)
+{
+    TraceFilter *filter;
+
+    filter = g_slice_new (TraceFilter);
+    filter->path = g_strdup (path);
+    filter->service = service;
+    filter->cid = cid;
+    filter->message_type = message_type;
+
+    g_mutex_lock (&trace_filters_lock);
+    trace_filters = g_slist_append (trace_filters, filter);
+    g_atomic_int_inc (&n_trace_filters);
+    g_mutex_unlock (&trace_filters_lock);
+}
+
+/**
+ * mbim_trace_clear_filters:
+ *
+ * Removes all trace filters, so that trace events are generated for every
+ * message.
+ */
+void
+mbim_trace_clear_filters (void)
+{
+    GSList *filters;
+
+    g_mutex_lock (&trace_filters_lock);
+    filters = trace_filters;
+    trace_filters = NULL;
+    g_atomic_int_set (&n_trace_filters, 0);
+    g_mutex_unlock (&trace_filters_lock);
+
+    g_slist_free_full (filters, (GDestroyNotify) trace_filter_free);
+}
+
+/*****************************************************************************/
+
+gboolean
+_mbim_trace_enabled (const gchar       *path,
+                     const MbimMessage *message)
+{
+    gboolean  enabled = FALSE;
+    GSList   *l;
+
+    if (!mbim_utils_get_traces_enabled ())
+        return FALSE;
+
+    /* No filters, trace everything */
+    if (!g_atomic_int_get (&n_trace_filters))
+        return TRUE;
+
+    g_mutex_lock (&trace_filters_lock);
+    for (l = trace_filters; l && !enabled; l = g_slist_next (l))
+        enabled = trace_filter_match ((const TraceFilter *)l->data, path, message);
+    g_mutex_unlock (&trace_filters_lock);
+
+    return enabled;
+}
+
+void
+_mbim_trace (MbimTraceEventType  event_type,
+             const gchar        *path,
+             const gchar        *path_display,
+             const MbimMessage  *message)
+{
+    MbimTraceEvent  event;
+    TraceSink      *sink = NULL;
+
+    event.event_type = event_type;
+    event.path = path;
+    event.path_display = path_display;
+    event.message = message;
+
+    /* Keep the sink alive while it runs, even if replaced meanwhile */
+    g_mutex_lock (&trace_sink_lock);
+    if (trace_sink)
+        sink = trace_sink_ref (trace_sink);
+    g_mutex_unlock (&trace_sink_lock);
+
+    if (!sink) {
+        trace_event_log (&event);
+        return;
+    }
+
+    sink->func (&event, sink->user_data);
+    trace_sink_unref (sink);
+}
@@ -0,0 +1,113 @@
+/* -*- Mode: C; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*- */
+
+/*
+ * libmbim-glib -- GLib/GIO based library to control MBIM devices
+ *
+ * This library is free software; you can redistribute it and/or
+ * modify it under the terms of the GNU Lesser General Public
+ * License as published by the Free Software Foundation; either
+ * version 2 of the License, or (at your option) any later version.
+ *
+ * This library is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ * Lesser General Public License for more details.
+ *
+ * You should have received a copy of the GNU Lesser General Public
+ * License along with this library; if not, write to the
+ * Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor,
+ * Boston, MA 02110-1301 USA.
+ *
+ * Copyright (C) 2026 The libmbim authors
+ */
+
+#ifndef _LIBMBIM_GLIB_MBIM_TRACE_H_
+#define _LIBMBIM_GLIB_MBIM_TRACE_H_
+
+#if !defined (__LIBMBIM_GLIB_H_INSIDE__) && !defined (LIBMBIM_GLIB_COMPILATION)
+#error "Only <libmbim-glib.h> can be included directly."
+#endif
+
+#include <glib.h>
+
+#include "mbim-uuid.h"
+#include "mbim-message.h"
+
+G_BEGIN_DECLS
+
+/*****************************************************************************/
+
+/**
+ * MbimTraceEventType:
+ * @MBIM_TRACE_EVENT_TYPE_SENT: A whole message was sent to the device.
+ * @MBIM_TRACE_EVENT_TYPE_SENT_FRAGMENT: A single fragment of a message was sent to the device.
+ * @MBIM_TRACE_EVENT_TYPE_RECEIVED: A message, or a fragment of a message, was read from the device.
+ * @MBIM_TRACE_EVENT_TYPE_RECEIVED_COMPLETE: A whole message was received, after reassembling all its fragments.
+ *
+ * Type of trace event.
+ */
+typedef enum {
+    MBIM_TRACE_EVENT_TYPE_SENT              = 0,
+    MBIM_TRACE_EVENT_TYPE_SENT_FRAGMENT     = 1,
+    MBIM_TRACE_EVENT_TYPE_RECEIVED          = 2,
+    MBIM_TRACE_EVENT_TYPE_RECEIVED_COMPLETE = 3
+} MbimTraceEventType;
+
+/**
+ * MbimTraceEvent:
+ *
+ * An opaque type representing a single trace event. Events are only valid
+ * while the #MbimTraceFunc they are given to runs.
+ */
+typedef struct _MbimTraceEvent MbimTraceEvent;
+
+MbimTraceEventType  mbim_trace_event_get_event_type    (const MbimTraceEvent *event);
+const gchar        *mbim_trace_event_get_path          (const MbimTraceEvent *event);
+const MbimMessage  *mbim_trace_event_get_message       (const MbimTraceEvent *event);
+gchar              *mbim_trace_event_get_raw_printable (const MbimTraceEvent *event);
+gchar              *mbim_trace_event_get_printable     (const MbimTraceEvent *event,
+                                                        const gchar          *line_prefix);
+void                mbim_trace_event_print             (const MbimTraceEvent   *event,
+                                                        const gchar            *line_prefix,
+                                                        MbimMessagePrinterFunc  printer_func,
+                                                        gpointer                user_data);
+
+/*****************************************************************************/
+
+/**
+ * MbimTraceFunc:
+ * @event: a #MbimTraceEvent.
+ * @user_data: the data given in mbim_trace_set_func().
+ *
+ * Function receiving trace events.
+ */
+typedef void (* MbimTraceFunc) (const MbimTraceEvent *event,
+                                gpointer              user_data);
+
+void mbim_trace_set_func (MbimTraceFunc  func,
+                          gpointer       user_data,
+                          GDestroyNotify user_data_free);
+
+/*****************************************************************************/
+
+void mbim_trace_add_filter    (const gchar     *path,
+                               MbimService      service,
+                               guint            cid,
+                               MbimMessageType  message_type);
+void mbim_trace_clear_filters (void);
+
+/*****************************************************************************/
+/* Private methods */
+
+#if defined (LIBMBIM_GLIB_COMPILATION)
+gboolean _mbim_trace_enabled (const gchar       *path,
+                              const MbimMessage *message);
+void     _mbim_trace         (MbimTraceEventType  event_type,
+                              const gchar        *path,
+                              const gchar        *path_display,
+                              const MbimMessage  *message);
+#endif
+
+G_END_DECLS
+
+#endif /* _LIBMBIM_GLIB_MBIM_TRACE_H_ */
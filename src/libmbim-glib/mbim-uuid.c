@@ -28,6 +28,7 @@
 #include <string.h>
 
 #include "mbim-uuid.h"
+#include "mbim-cid-private.h"
 #include "generated/mbim-enum-types.h"
 
 /**
@@ -260,14 +261,218 @@ static const MbimUuid uuid_ms_basic_connect_extensions = {
     .e = { 0xbe, 0xf7, 0x05, 0x8e, 0x9a, 0xaf }
 };
 
-static GList *mbim_custom_service_list = NULL;
+/* Standard service UUIDs, indexed by MbimService */
+static const MbimUuid *const service_uuids[MBIM_SERVICE_LAST] = {
+    [MBIM_SERVICE_INVALID]                     = &uuid_invalid,
+    [MBIM_SERVICE_BASIC_CONNECT]               = &uuid_basic_connect,
+    [MBIM_SERVICE_SMS]                         = &uuid_sms,
+    [MBIM_SERVICE_USSD]                        = &uuid_ussd,
+    [MBIM_SERVICE_PHONEBOOK]                   = &uuid_phonebook,
+    [MBIM_SERVICE_STK]                         = &uuid_stk,
+    [MBIM_SERVICE_AUTH]                        = &uuid_auth,
+    [MBIM_SERVICE_DSS]                         = &uuid_dss,
+    [MBIM_SERVICE_MS_FIRMWARE_ID]              = &uuid_ms_firmware_id,
+    [MBIM_SERVICE_MS_HOST_SHUTDOWN]            = &uuid_ms_host_shutdown,
+    [MBIM_SERVICE_PROXY_CONTROL]               = &uuid_proxy_control,
+    [MBIM_SERVICE_QMI]                         = &uuid_qmi,
+    [MBIM_SERVICE_ATDS]                        = &uuid_atds,
+    [MBIM_SERVICE_INTEL_FIRMWARE_UPDATE]       = &uuid_intel_firmware_update,
+    [MBIM_SERVICE_MS_BASIC_CONNECT_EXTENSIONS] = &uuid_ms_basic_connect_extensions,
+};
+
+/* Perfect hash of the standard service UUIDs: the 5 most significant bits of
+ * the first UUID byte are different in all of them. When adding a new
+ * standard service, make sure its slot is not already in use. */
+#define SERVICE_HASH_SIZE 32
+#define SERVICE_HASH(uuid) ((uuid)->a[0] >> 3)
+
+static const MbimService services_by_hash[SERVICE_HASH_SIZE] = {
+    [0xa2 >> 3] = MBIM_SERVICE_BASIC_CONNECT,
+    [0x53 >> 3] = MBIM_SERVICE_SMS,
+    [0xe5 >> 3] = MBIM_SERVICE_USSD,
+    [0x4b >> 3] = MBIM_SERVICE_PHONEBOOK,
+    [0xd8 >> 3] = MBIM_SERVICE_STK,
+    [0x1d >> 3] = MBIM_SERVICE_AUTH,
+    [0xc0 >> 3] = MBIM_SERVICE_DSS,
+    [0xe9 >> 3] = MBIM_SERVICE_MS_FIRMWARE_ID,
+    [0x88 >> 3] = MBIM_SERVICE_MS_HOST_SHUTDOWN,
+    [0x83 >> 3] = MBIM_SERVICE_PROXY_CONTROL,
+    [0xd1 >> 3] = MBIM_SERVICE_QMI,
+    [0x59 >> 3] = MBIM_SERVICE_ATDS,
+    [0x0e >> 3] = MBIM_SERVICE_INTEL_FIRMWARE_UPDATE,
+    [0x3d >> 3] = MBIM_SERVICE_MS_BASIC_CONNECT_EXTENSIONS,
+};
 
 typedef struct {
+    volatile gint ref_count;
     guint service_id;
     MbimUuid uuid;
     gchar *nickname;
 } MbimCustomService;
 
+/* Custom services registry.
+ *
+ * The registry is an immutable snapshot, indexed by service id and by UUID.
+ * Writers are serialized with the registry lock, build a new snapshot copying
+ * the current one, and publish it. Readers take a reference on the current
+ * snapshot, under a short lock only used to swap it, so that a replaced
+ * snapshot is freed as soon as its last reader is done with it. Services are
+ * refcounted as well, and go away with the last snapshot holding them. */
+
+typedef struct {
+    volatile gint  ref_count;
+    GHashTable    *by_id;
+    GHashTable    *by_uuid;
+} CustomServicesSnapshot;
+
+static GMutex                  custom_services_lock;
+static GMutex                  custom_services_snapshot_lock;
+static CustomServicesSnapshot *custom_services;
+
+/* Also used for the service tables of the proxy */
+guint
+_mbim_uuid_hash (gconstpointer v)
+{
+    const guint8 *bytes = v;
+    guint32       hash = 0;
+    guint32       word;
+    guint         i;
+
+    for (i = 0; i < sizeof (MbimUuid); i += sizeof (word)) {
+        memcpy (&word, &bytes[i], sizeof (word));
+        hash = (hash * 31) ^ word;
+    }
+    return hash;
+}
+
+gboolean
+_mbim_uuid_equal (gconstpointer a,
+                  gconstpointer b)
+{
+    return mbim_uuid_cmp ((const MbimUuid *)a, (const MbimUuid *)b);
+}
+
+static MbimCustomService *
+custom_service_ref (MbimCustomService *s)
+{
+    g_atomic_int_inc (&s->ref_count);
+    return s;
+}
+
+static void
+custom_service_unref (MbimCustomService *s)
+{
+    if (g_atomic_int_dec_and_test (&s->ref_count)) {
+        g_free (s->nickname);
+        g_slice_free (MbimCustomService, s);
+    }
+}
+
+static CustomServicesSnapshot *
+custom_services_snapshot_ref (CustomServicesSnapshot *snapshot)
+{
+    g_atomic_int_inc (&snapshot->ref_count);
+    return snapshot;
+}
+
+static void
+custom_services_snapshot_unref (CustomServicesSnapshot *snapshot)
+{
+    if (g_atomic_int_dec_and_test (&snapshot->ref_count)) {
+        g_hash_table_unref (snapshot->by_uuid);
+        g_hash_table_unref (snapshot->by_id);
+        g_slice_free (CustomServicesSnapshot, snapshot);
+    }
+}
+
+static CustomServicesSnapshot *
+custom_services_snapshot_get (void)
+{
+    CustomServicesSnapshot *snapshot = NULL;
+
+    /* Don't even lock until some custom service is registered */
+    if (!g_atomic_pointer_get (&custom_services))
+        return NULL;
+
+    g_mutex_lock (&custom_services_snapshot_lock);
+    if (custom_services)
+        snapshot = custom_services_snapshot_ref (custom_services);
+    g_mutex_unlock (&custom_services_snapshot_lock);
+
+    return snapshot;
+}
+
+/* The returned service is only valid until it's unregistered, as the pointers
+ * given away by the public API have always been */
+static MbimCustomService *
+custom_service_lookup_by_id (guint id)
+{
+    CustomServicesSnapshot *snapshot;
+    MbimCustomService      *s;
+
+    snapshot = custom_services_snapshot_get ();
+    if (!snapshot)
+        return NULL;
+    s = g_hash_table_lookup (snapshot->by_id, GUINT_TO_POINTER (id));
+    custom_services_snapshot_unref (snapshot);
+    return s;
+}
+
+static guint
+custom_service_lookup_id_by_uuid (const MbimUuid *uuid)
+{
+    CustomServicesSnapshot *snapshot;
+    MbimCustomService      *s;
+    guint                   service_id;
+
+    snapshot = custom_services_snapshot_get ();
+    if (!snapshot)
+        return MBIM_SERVICE_INVALID;
+    s = g_hash_table_lookup (snapshot->by_uuid, uuid);
+    service_id = s ? s->service_id : MBIM_SERVICE_INVALID;
+    custom_services_snapshot_unref (snapshot);
+    return service_id;
+}
+
+/* Must be called with the registry lock held */
+static CustomServicesSnapshot *
+custom_services_snapshot_copy (void)
+{
+    CustomServicesSnapshot *snapshot;
+    GHashTableIter          iter;
+    MbimCustomService      *s;
+
+    snapshot = g_slice_new (CustomServicesSnapshot);
+    snapshot->ref_count = 1;
+    snapshot->by_id = g_hash_table_new_full (g_direct_hash, g_direct_equal, NULL, (GDestroyNotify) custom_service_unref);
+    snapshot->by_uuid = g_hash_table_new (_mbim_uuid_hash, _mbim_uuid_equal);
+
+    if (custom_services) {
+        g_hash_table_iter_init (&iter, custom_services->by_id);
+        while (g_hash_table_iter_next (&iter, NULL, (gpointer *)&s)) {
+            g_hash_table_insert (snapshot->by_id, GUINT_TO_POINTER (s->service_id), custom_service_ref (s));
+            g_hash_table_insert (snapshot->by_uuid, &s->uuid, s);
+        }
+    }
+
+    return snapshot;
+}
+
+/* Must be called with the registry lock held */
+static void
+custom_services_snapshot_publish (CustomServicesSnapshot *snapshot)
+{
+    CustomServicesSnapshot *old_snapshot;
+
+    g_mutex_lock (&custom_services_snapshot_lock);
+    old_snapshot = custom_services;
+    g_atomic_pointer_set (&custom_services, snapshot);
+    g_mutex_unlock (&custom_services_snapshot_lock);
+
+    if (old_snapshot)
+        custom_services_snapshot_unref (old_snapshot);
+}
+
 /**
  * mbim_register_custom_service:
  * @uuid: MbimUuid structure corresponding to service
@@ -275,31 +480,46 @@ typedef struct {
  *
  * Register a custom service
  *
+ * This method may be called from any thread.
+ *
  * Returns: TRUE if service has been registered, FALSE otherwise.
  */
 guint
 mbim_register_custom_service (const MbimUuid *uuid,
                               const gchar *nickname)
 {
+    CustomServicesSnapshot *snapshot;
     MbimCustomService *s;
-    GList *l;
+    GHashTableIter iter;
     guint service_id = 100;
 
-    for (l = mbim_custom_service_list; l != NULL; l = l->next) {
-        s = (MbimCustomService *)l->data;
-        if (mbim_uuid_cmp (&s->uuid, uuid))
-            return s->service_id;
-        else
-            service_id = MAX (service_id, s->service_id);
+    g_mutex_lock (&custom_services_lock);
+
+    s = custom_services ? g_hash_table_lookup (custom_services->by_uuid, uuid) : NULL;
+    if (s) {
+        service_id = s->service_id;
+        g_mutex_unlock (&custom_services_lock);
+        return service_id;
     }
 
+    snapshot = custom_services_snapshot_copy ();
+
+    g_hash_table_iter_init (&iter, snapshot->by_id);
+    while (g_hash_table_iter_next (&iter, NULL, (gpointer *)&s))
+        service_id = MAX (service_id, s->service_id);
+
     /* create a new custom service */
     s = g_slice_new (MbimCustomService);
+    s->ref_count = 1;
     s->service_id = service_id + 1;
     memcpy (&s->uuid, uuid, sizeof (MbimUuid));
     s->nickname = g_strdup (nickname);
 
-    mbim_custom_service_list = g_list_append (mbim_custom_service_list, s);
+    g_hash_table_insert (snapshot->by_id, GUINT_TO_POINTER (s->service_id), s);
+    g_hash_table_insert (snapshot->by_uuid, &s->uuid, s);
+    custom_services_snapshot_publish (snapshot);
+
+    g_mutex_unlock (&custom_services_lock);
     return s->service_id;
 }
 
@@ -309,26 +529,33 @@ mbim_register_custom_service (const MbimUuid *uuid,
  *
  * Unregister a custom service.
  *
+ * This method may be called from any thread.
+ *
  * Returns: TRUE if service has been unregistered, FALSE otherwise.
  */
 gboolean
 mbim_unregister_custom_service (const guint id)
 {
+    CustomServicesSnapshot *snapshot;
     MbimCustomService *s;
-    GList *l;
-
-    for (l = mbim_custom_service_list; l != NULL; l = l->next) {
-        s = (MbimCustomService *)l->data;
-        if (s->service_id == id) {
-            g_free (s->nickname);
-            g_slice_free (MbimCustomService, s);
-            mbim_custom_service_list = \
-                g_list_delete_link (mbim_custom_service_list, l);
-            return TRUE;
-        }
+
+    g_mutex_lock (&custom_services_lock);
+
+    s = custom_services ? g_hash_table_lookup (custom_services->by_id, GUINT_TO_POINTER (id)) : NULL;
+    if (!s) {
+        g_mutex_unlock (&custom_services_lock);
+        return FALSE;
     }
 
-    return FALSE;
+    snapshot = custom_services_snapshot_copy ();
+    g_hash_table_remove (snapshot->by_uuid, &s->uuid);
+    g_hash_table_remove (snapshot->by_id, GUINT_TO_POINTER (id));
+    custom_services_snapshot_publish (snapshot);
+
+    g_mutex_unlock (&custom_services_lock);
+
+    _mbim_cid_unregister_custom_service (id);
+    return TRUE;
 }
 
 /**
@@ -342,17 +569,10 @@ mbim_unregister_custom_service (const guint id)
 gboolean
 mbim_service_id_is_custom (const guint id)
 {
-    GList *l;
-
     if (id < MBIM_SERVICE_LAST)
         return FALSE;
 
-    for (l = mbim_custom_service_list; l != NULL; l = l->next) {
-        if (((MbimCustomService *)l->data)->service_id == id)
-            return TRUE;
-    }
-
-    return FALSE;
+    return !!custom_service_lookup_by_id (id);
 }
 
 /**
@@ -364,21 +584,18 @@ mbim_service_id_is_custom (const guint id)
  * As opposed to mbim_service_get_string(), this methods takes into account
  * custom services that may have been registered by the user.
  *
- * Returns: (transfer none): a string with the nickname, or %NULL if not found. Do not free the returned value.
+ * Returns: (transfer none): a string with the nickname, or %NULL if not found. Do not free the returned value, which is valid until a custom @service is unregistered.
  */
 const gchar *
 mbim_service_lookup_name (guint service)
 {
-    GList *l;
+    MbimCustomService *s;
 
     if (service < MBIM_SERVICE_LAST)
         return mbim_service_get_string (service);
 
-    for (l = mbim_custom_service_list; l != NULL; l = l->next) {
-        if (service == ((MbimCustomService *)l->data)->service_id)
-            return ((MbimCustomService *)l->data)->nickname;
-    }
-    return NULL;
+    s = custom_service_lookup_by_id (service);
+    return s ? s->nickname : NULL;
 }
 
 /**
@@ -390,53 +607,19 @@ mbim_service_lookup_name (guint service)
  * The @service needs to be either a generic one (including #MBIM_SERVICE_INVALID)
  * or a custom registered one.
  *
- * Returns: (transfer none): a #MbimUuid.
+ * Returns: (transfer none): a #MbimUuid, valid until a custom @service is unregistered.
  */
 const MbimUuid *
 mbim_uuid_from_service (MbimService service)
 {
-    GList *l;
+    MbimCustomService *s;
 
-    g_return_val_if_fail (service < MBIM_SERVICE_LAST || mbim_service_id_is_custom (service), &uuid_invalid);
+    if (service < MBIM_SERVICE_LAST)
+        return service_uuids[service];
 
-    switch (service) {
-    case MBIM_SERVICE_INVALID:
-        return &uuid_invalid;
-    case MBIM_SERVICE_BASIC_CONNECT:
-        return &uuid_basic_connect;
-    case MBIM_SERVICE_SMS:
-        return &uuid_sms;
-    case MBIM_SERVICE_USSD:
-        return &uuid_ussd;
-    case MBIM_SERVICE_PHONEBOOK:
-        return &uuid_phonebook;
-    case MBIM_SERVICE_STK:
-        return &uuid_stk;
-    case MBIM_SERVICE_AUTH:
-        return &uuid_auth;
-    case MBIM_SERVICE_DSS:
-        return &uuid_dss;
-    case MBIM_SERVICE_MS_FIRMWARE_ID:
-        return &uuid_ms_firmware_id;
-    case MBIM_SERVICE_MS_HOST_SHUTDOWN:
-        return &uuid_ms_host_shutdown;
-    case MBIM_SERVICE_PROXY_CONTROL:
-        return &uuid_proxy_control;
-    case MBIM_SERVICE_QMI:
-        return &uuid_qmi;
-    case MBIM_SERVICE_ATDS:
-        return &uuid_atds;
-    case MBIM_SERVICE_INTEL_FIRMWARE_UPDATE:
-        return &uuid_intel_firmware_update;
-    case MBIM_SERVICE_MS_BASIC_CONNECT_EXTENSIONS:
-        return &uuid_ms_basic_connect_extensions;
-    default:
-        for (l = mbim_custom_service_list; l != NULL; l = l->next) {
-            if (service == ((MbimCustomService *)l->data)->service_id)
-                return &((MbimCustomService *)l->data)->uuid;
-        }
-        g_return_val_if_reached (NULL);
-    }
+    s = custom_service_lookup_by_id (service);
+    g_return_val_if_fail (s != NULL, &uuid_invalid);
+    return &s->uuid;
 }
 
 /**
@@ -450,56 +633,13 @@ mbim_uuid_from_service (MbimService service)
 MbimService
 mbim_uuid_to_service (const MbimUuid *uuid)
 {
-    GList *l;
-
-    if (mbim_uuid_cmp (uuid, &uuid_basic_connect))
-        return MBIM_SERVICE_BASIC_CONNECT;
-
-    if (mbim_uuid_cmp (uuid, &uuid_sms))
-        return MBIM_SERVICE_SMS;
-
-    if (mbim_uuid_cmp (uuid, &uuid_ussd))
-        return MBIM_SERVICE_USSD;
-
-    if (mbim_uuid_cmp (uuid, &uuid_phonebook))
-        return MBIM_SERVICE_PHONEBOOK;
+    MbimService service;
 
-    if (mbim_uuid_cmp (uuid, &uuid_stk))
-        return MBIM_SERVICE_STK;
-
-    if (mbim_uuid_cmp (uuid, &uuid_auth))
-        return MBIM_SERVICE_AUTH;
-
-    if (mbim_uuid_cmp (uuid, &uuid_dss))
-        return MBIM_SERVICE_DSS;
-
-    if (mbim_uuid_cmp (uuid, &uuid_ms_firmware_id))
-        return MBIM_SERVICE_MS_FIRMWARE_ID;
-
-    if (mbim_uuid_cmp (uuid, &uuid_ms_host_shutdown))
-        return MBIM_SERVICE_MS_HOST_SHUTDOWN;
-
-    if (mbim_uuid_cmp (uuid, &uuid_proxy_control))
-        return MBIM_SERVICE_PROXY_CONTROL;
-
-    if (mbim_uuid_cmp (uuid, &uuid_qmi))
-        return MBIM_SERVICE_QMI;
-
-    if (mbim_uuid_cmp (uuid, &uuid_atds))
-        return MBIM_SERVICE_ATDS;
-
-    if (mbim_uuid_cmp (uuid, &uuid_intel_firmware_update))
-        return MBIM_SERVICE_INTEL_FIRMWARE_UPDATE;
-
-    if (mbim_uuid_cmp (uuid, &uuid_ms_basic_connect_extensions))
-        return MBIM_SERVICE_MS_BASIC_CONNECT_EXTENSIONS;
-
-    for (l = mbim_custom_service_list; l != NULL; l = l->next) {
-        if (mbim_uuid_cmp (&((MbimCustomService *)l->data)->uuid, uuid))
-            return ((MbimCustomService *)l->data)->service_id;
-    }
+    service = services_by_hash[SERVICE_HASH (uuid)];
+    if (service != MBIM_SERVICE_INVALID && mbim_uuid_cmp (uuid, service_uuids[service]))
+        return service;
 
-    return MBIM_SERVICE_INVALID;
+    return custom_service_lookup_id_by_uuid (uuid);
 }
 
 /*****************************************************************************/
@@ -284,6 +284,16 @@ const gchar *mbim_context_type_get_string (MbimContextType val);
 const MbimUuid  *mbim_uuid_from_context_type (MbimContextType  context_type);
 MbimContextType  mbim_uuid_to_context_type   (const MbimUuid  *uuid);
 
+/*****************************************************************************/
+/* Private methods */
+
+#if defined (LIBMBIM_GLIB_COMPILATION)
+/* Hash table functions for MbimUuid keys */
+guint    _mbim_uuid_hash  (gconstpointer v);
+gboolean _mbim_uuid_equal (gconstpointer a,
+                           gconstpointer b);
+#endif
+
 G_END_DECLS
 
 #endif /* _LIBMBIM_GLIB_MBIM_UUID_H_ */
@@ -16,6 +16,8 @@
 #include <config.h>
 
 #include "mbim-cid.h"
+#include "mbim-uuid.h"
+#include "generated/mbim-enum-types.h"
 
 static void
 test_common (MbimService service,
@@ -121,6 +123,161 @@ test_cid_ms_host_shutdown (void)
                  TRUE, FALSE, FALSE);
 }
 
+static void
+test_cid_printable (void)
+{
+    static const struct {
+        MbimService service;
+        GType       (* get_type) (void);
+    } services[] = {
+        { MBIM_SERVICE_BASIC_CONNECT,               mbim_cid_basic_connect_get_type },
+        { MBIM_SERVICE_SMS,                         mbim_cid_sms_get_type },
+        { MBIM_SERVICE_USSD,                        mbim_cid_ussd_get_type },
+        { MBIM_SERVICE_PHONEBOOK,                   mbim_cid_phonebook_get_type },
+        { MBIM_SERVICE_STK,                         mbim_cid_stk_get_type },
+        { MBIM_SERVICE_AUTH,                        mbim_cid_auth_get_type },
+        { MBIM_SERVICE_DSS,                         mbim_cid_dss_get_type },
+        { MBIM_SERVICE_MS_FIRMWARE_ID,              mbim_cid_ms_firmware_id_get_type },
+        { MBIM_SERVICE_MS_HOST_SHUTDOWN,            mbim_cid_ms_host_shutdown_get_type },
+        { MBIM_SERVICE_PROXY_CONTROL,               mbim_cid_proxy_control_get_type },
+        { MBIM_SERVICE_QMI,                         mbim_cid_qmi_get_type },
+        { MBIM_SERVICE_ATDS,                        mbim_cid_atds_get_type },
+        { MBIM_SERVICE_INTEL_FIRMWARE_UPDATE,       mbim_cid_intel_firmware_update_get_type },
+        { MBIM_SERVICE_MS_BASIC_CONNECT_EXTENSIONS, mbim_cid_ms_basic_connect_extensions_get_type },
+    };
+    guint i;
+
+    /* The printable names in the CID tables must match the enum nicknames */
+    for (i = 0; i < G_N_ELEMENTS (services); i++) {
+        GEnumClass *enum_class;
+        guint       j;
+
+        enum_class = G_ENUM_CLASS (g_type_class_ref (services[i].get_type ()));
+        for (j = 0; j < enum_class->n_values; j++) {
+            guint cid;
+
+            cid = enum_class->values[j].value;
+            if (cid == 0)
+                continue;
+            g_assert_cmpstr (mbim_cid_get_printable (services[i].service, cid), ==, enum_class->values[j].value_nick);
+        }
+
+        /* Unknown CIDs past the end of the table */
+        g_assert (mbim_cid_get_printable (services[i].service, 0xFFFF) == NULL);
+        g_assert (!mbim_cid_can_set    (services[i].service, 0xFFFF));
+        g_assert (!mbim_cid_can_query  (services[i].service, 0xFFFF));
+        g_assert (!mbim_cid_can_notify (services[i].service, 0xFFFF));
+
+        g_type_class_unref (enum_class);
+    }
+}
+
+static const MbimUuid uuid_custom_other = {
+    .a = { 0x11, 0x22, 0x33, 0x44 },
+    .b = { 0x55, 0x66 },
+    .c = { 0x77, 0x88 },
+    .d = { 0x99, 0xAA },
+    .e = { 0xBB, 0xCC, 0xDD, 0xEE, 0xFF, 0x02 }
+};
+
+static void
+test_cid_custom (void)
+{
+    static const MbimUuid uuid_custom = {
+        .a = { 0x11, 0x22, 0x33, 0x44 },
+        .b = { 0x55, 0x66 },
+        .c = { 0x77, 0x88 },
+        .d = { 0x99, 0xAA },
+        .e = { 0xBB, 0xCC, 0xDD, 0xEE, 0xFF, 0x00 }
+    };
+    guint service;
+
+    service = mbim_register_custom_service (&uuid_custom, "custom");
+    g_assert (mbim_service_id_is_custom (service));
+
+    /* Not registered yet */
+    g_assert (mbim_cid_get_printable (service, 3) == NULL);
+    g_assert (!mbim_cid_can_query (service, 3));
+
+    g_assert (mbim_cid_register_custom (service, 3, "three", FALSE, TRUE, TRUE));
+    g_assert_cmpstr (mbim_cid_get_printable (service, 3), ==, "three");
+    test_common (service, 3, FALSE, TRUE, TRUE);
+
+    /* Holes in the table are unknown */
+    g_assert (mbim_cid_get_printable (service, 2) == NULL);
+    test_common (service, 2, FALSE, FALSE, FALSE);
+
+    /* Overwrite */
+    g_assert (mbim_cid_register_custom (service, 3, "three-again", TRUE, FALSE, FALSE));
+    g_assert_cmpstr (mbim_cid_get_printable (service, 3), ==, "three-again");
+    test_common (service, 3, TRUE, FALSE, FALSE);
+
+    /* Rows go away with the service */
+    g_assert (mbim_unregister_custom_service (service));
+    g_assert (mbim_cid_get_printable (service, 3) == NULL);
+    g_assert (!mbim_cid_register_custom (service, 3, "three", TRUE, TRUE, TRUE));
+
+    /* Known services can't be extended */
+    g_assert (!mbim_cid_register_custom (MBIM_SERVICE_BASIC_CONNECT, 100, "hundred", TRUE, TRUE, TRUE));
+}
+
+static void
+test_cid_custom_entries (void)
+{
+    static const MbimUuid uuid_custom = {
+        .a = { 0x11, 0x22, 0x33, 0x44 },
+        .b = { 0x55, 0x66 },
+        .c = { 0x77, 0x88 },
+        .d = { 0x99, 0xAA },
+        .e = { 0xBB, 0xCC, 0xDD, 0xEE, 0xFF, 0x01 }
+    };
+    static const MbimCidCustomEntry entries[] = {
+        { 1, "one",   TRUE,  TRUE,  FALSE },
+        { 5, "five",  FALSE, TRUE,  TRUE  },
+        { 2, "two",   TRUE,  FALSE, FALSE },
+    };
+    static const MbimCidCustomEntry more_entries[] = {
+        { 5, "five-again", TRUE, FALSE, FALSE },
+        { 7, "seven",      TRUE, TRUE,  TRUE  },
+    };
+    guint service;
+    guint other;
+
+    service = mbim_register_custom_service (&uuid_custom, "custom-entries");
+    other = mbim_register_custom_service (&uuid_custom_other, "custom-other");
+    g_assert (mbim_cid_register_custom (other, 1, "other-one", TRUE, TRUE, TRUE));
+
+    g_assert (mbim_cid_register_custom_entries (service, entries, G_N_ELEMENTS (entries)));
+    g_assert_cmpstr (mbim_cid_get_printable (service, 1), ==, "one");
+    test_common (service, 1, TRUE, TRUE, FALSE);
+    g_assert_cmpstr (mbim_cid_get_printable (service, 2), ==, "two");
+    test_common (service, 2, TRUE, FALSE, FALSE);
+    g_assert_cmpstr (mbim_cid_get_printable (service, 5), ==, "five");
+    test_common (service, 5, FALSE, TRUE, TRUE);
+    g_assert (mbim_cid_get_printable (service, 3) == NULL);
+
+    /* Merged with the existing ones */
+    g_assert (mbim_cid_register_custom_entries (service, more_entries, G_N_ELEMENTS (more_entries)));
+    g_assert_cmpstr (mbim_cid_get_printable (service, 1), ==, "one");
+    g_assert_cmpstr (mbim_cid_get_printable (service, 5), ==, "five-again");
+    test_common (service, 5, TRUE, FALSE, FALSE);
+    g_assert_cmpstr (mbim_cid_get_printable (service, 7), ==, "seven");
+    test_common (service, 7, TRUE, TRUE, TRUE);
+
+    /* Other services untouched */
+    g_assert_cmpstr (mbim_cid_get_printable (other, 1), ==, "other-one");
+    g_assert (mbim_cid_get_printable (other, 5) == NULL);
+
+    g_assert (mbim_unregister_custom_service (service));
+    g_assert (mbim_cid_get_printable (service, 1) == NULL);
+    g_assert (!mbim_cid_register_custom_entries (service, entries, G_N_ELEMENTS (entries)));
+    g_assert_cmpstr (mbim_cid_get_printable (other, 1), ==, "other-one");
+    g_assert (mbim_unregister_custom_service (other));
+
+    /* Known services can't be extended */
+    g_assert (!mbim_cid_register_custom_entries (MBIM_SERVICE_BASIC_CONNECT, entries, G_N_ELEMENTS (entries)));
+}
+
 int main (int argc, char **argv)
 {
     g_test_init (&argc, &argv, NULL);
@@ -134,6 +291,9 @@ int main (int argc, char **argv)
     g_test_add_func ("/libmbim-glib/cid/dss",              test_cid_dss);
     g_test_add_func ("/libmbim-glib/cid/ms-firmware-id",   test_cid_ms_firmware_id);
     g_test_add_func ("/libmbim-glib/cid/ms-host-shutdown", test_cid_ms_host_shutdown);
+    g_test_add_func ("/libmbim-glib/cid/printable",        test_cid_printable);
+    g_test_add_func ("/libmbim-glib/cid/custom",           test_cid_custom);
+    g_test_add_func ("/libmbim-glib/cid/custom-entries",   test_cid_custom_entries);
 
     return g_test_run ();
 }
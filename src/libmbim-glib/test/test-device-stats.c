@@ -0,0 +1,338 @@
+/* -*- Mode: C; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*- */
+/*
+ * This program is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation; either version 2 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details:
+ *
+ * Copyright (C) 2026 The libmbim authors
+ */
+
+#include <config.h>
+#include <string.h>
+
+#include "mbim-cid.h"
+#include "mbim-uuid.h"
+#include "mbim-message.h"
+#include "mbim-error-types.h"
+#include "mbim-device-stats.h"
+
+/*****************************************************************************/
+
+static GVariant *
+get_transaction (MbimDeviceStats *stats,
+                 guint            i)
+{
+    GVariant *snapshot;
+    GVariant *transactions;
+    GVariant *transaction;
+
+    snapshot = _mbim_device_stats_build_variant (stats);
+    transactions = g_variant_lookup_value (snapshot, "transactions", G_VARIANT_TYPE ("aa{sv}"));
+    g_assert (transactions);
+    g_assert_cmpuint (i, <, g_variant_n_children (transactions));
+    transaction = g_variant_get_child_value (transactions, i);
+    g_variant_unref (transactions);
+    g_variant_unref (snapshot);
+    return transaction;
+}
+
+static guint64
+lookup_counter (GVariant    *dictionary,
+                const gchar *key)
+{
+    guint64 value = 0;
+
+    g_assert (g_variant_lookup (dictionary, key, "t", &value));
+    return value;
+}
+
+/* Checks a histogram against a list of (bucket upper bound, count) pairs */
+static void
+check_histogram (GVariant      *transaction,
+                 const gchar   *key,
+                 const guint64 *expected,
+                 guint          n_expected)
+{
+    GVariant *histogram;
+    guint     i;
+
+    histogram = g_variant_lookup_value (transaction, key, G_VARIANT_TYPE ("a(tu)"));
+    g_assert (histogram);
+    g_assert_cmpuint (g_variant_n_children (histogram), ==, n_expected);
+    for (i = 0; i < n_expected; i++) {
+        guint64 upper_bound = 0;
+        guint32 count = 0;
+
+        g_variant_get_child (histogram, i, "(tu)", &upper_bound, &count);
+        g_assert_cmpuint (upper_bound, ==, expected[2 * i]);
+        g_assert_cmpuint (count, ==, expected[2 * i + 1]);
+    }
+    g_variant_unref (histogram);
+}
+
+static MbimDeviceStatsEntry *
+record_latencies (MbimDeviceStats *stats,
+                  const guint64   *latencies,
+                  guint            n_latencies)
+{
+    MbimDeviceStatsEntry *entry;
+    MbimMessage          *message;
+    guint                 i;
+
+    message = mbim_message_command_new (1, MBIM_SERVICE_BASIC_CONNECT, MBIM_CID_BASIC_CONNECT_DEVICE_CAPS, MBIM_MESSAGE_COMMAND_TYPE_QUERY);
+    entry = _mbim_device_stats_get_entry (stats, message);
+    mbim_message_unref (message);
+
+    for (i = 0; i < n_latencies; i++) {
+        _mbim_device_stats_entry_transaction (entry, 48);
+        _mbim_device_stats_entry_complete (entry, 1, 100, (gint64) latencies[i], NULL);
+    }
+    return entry;
+}
+
+static void
+test_device_stats_histogram_buckets (void)
+{
+    static const guint64 latencies[] = {
+        /* One exact bucket per value below 8 */
+        0, 1, 7,
+        /* 8 sub-buckets per power of two, exact up to 15 */
+        8, 15,
+        /* [16,17], [96,103], [960,1023] */
+        16, 17, 100, 103, 1000,
+        /* Last bucket */
+        G_MAXUINT32, G_MAXINT64
+    };
+    static const guint64 expected[] = {
+        0, 1,
+        1, 1,
+        7, 1,
+        8, 1,
+        15, 1,
+        17, 2,
+        103, 2,
+        1023, 1,
+        G_MAXUINT32, 2
+    };
+    MbimDeviceStats *stats;
+    GVariant        *transaction;
+
+    stats = _mbim_device_stats_new ();
+    record_latencies (stats, latencies, G_N_ELEMENTS (latencies));
+
+    transaction = get_transaction (stats, 0);
+    check_histogram (transaction, "complete-latency", expected, G_N_ELEMENTS (expected) / 2);
+    g_assert_cmpuint (lookup_counter (transaction, "complete-latency-max"), ==, G_MAXINT64);
+    /* Nothing recorded for the first fragments */
+    check_histogram (transaction, "first-fragment-latency", NULL, 0);
+    g_variant_unref (transaction);
+
+    _mbim_device_stats_free (stats);
+}
+
+static void
+test_device_stats_histogram_percentiles (void)
+{
+    MbimDeviceStats      *stats;
+    MbimDeviceStatsEntry *entry;
+    GVariant             *transaction;
+    guint64               latencies[100];
+    guint                 i;
+
+    stats = _mbim_device_stats_new ();
+
+    /* No samples */
+    entry = record_latencies (stats, NULL, 0);
+    transaction = get_transaction (stats, 0);
+    g_assert_cmpuint (lookup_counter (transaction, "complete-latency-p50"), ==, 0);
+    g_assert_cmpuint (lookup_counter (transaction, "complete-latency-p99"), ==, 0);
+    g_assert_cmpuint (lookup_counter (transaction, "complete-latency-max"), ==, 0);
+    g_variant_unref (transaction);
+
+    /* Percentiles are the upper bounds of the matching buckets, but never
+     * above the maximum recorded value */
+    for (i = 0; i < G_N_ELEMENTS (latencies); i++)
+        latencies[i] = (i < 98) ? 100 : 1000;
+    g_assert (record_latencies (stats, latencies, G_N_ELEMENTS (latencies)) == entry);
+    transaction = get_transaction (stats, 0);
+    g_assert_cmpuint (lookup_counter (transaction, "complete-latency-p50"), ==, 103);
+    g_assert_cmpuint (lookup_counter (transaction, "complete-latency-p99"), ==, 1000);
+    g_assert_cmpuint (lookup_counter (transaction, "complete-latency-max"), ==, 1000);
+    g_variant_unref (transaction);
+
+    /* With a higher maximum, the upper bound of the bucket is given */
+    latencies[0] = 2000;
+    record_latencies (stats, latencies, 1);
+    transaction = get_transaction (stats, 0);
+    g_assert_cmpuint (lookup_counter (transaction, "complete-latency-p50"), ==, 103);
+    g_assert_cmpuint (lookup_counter (transaction, "complete-latency-p99"), ==, 1023);
+    g_assert_cmpuint (lookup_counter (transaction, "complete-latency-max"), ==, 2000);
+    g_variant_unref (transaction);
+
+    _mbim_device_stats_free (stats);
+}
+
+static void
+test_device_stats_counters (void)
+{
+    static const guint64 first_fragment_expected[] = { 51, 1 };
+    static const guint64 complete_expected[]       = { 1023, 1 };
+    MbimDeviceStats      *stats;
+    MbimDeviceStatsEntry *query;
+    MbimDeviceStatsEntry *set;
+    MbimMessage          *message;
+    GVariant             *snapshot;
+    GVariant             *transaction;
+    GError               *error;
+    gchar                *service = NULL;
+    gchar                *expected_service;
+    guint32               value = 0;
+
+    stats = _mbim_device_stats_new ();
+
+    /* Query and set of the same CID are different entries */
+    message = mbim_message_command_new (1, MBIM_SERVICE_BASIC_CONNECT, MBIM_CID_BASIC_CONNECT_RADIO_STATE, MBIM_MESSAGE_COMMAND_TYPE_QUERY);
+    query = _mbim_device_stats_get_entry (stats, message);
+    g_assert (_mbim_device_stats_get_entry (stats, message) == query);
+    mbim_message_unref (message);
+    message = mbim_message_command_new (2, MBIM_SERVICE_BASIC_CONNECT, MBIM_CID_BASIC_CONNECT_RADIO_STATE, MBIM_MESSAGE_COMMAND_TYPE_SET);
+    set = _mbim_device_stats_get_entry (stats, message);
+    g_assert (set != query);
+    mbim_message_unref (message);
+
+    /* Successful query, response in 2 fragments */
+    _mbim_device_stats_entry_transaction (query, 48);
+    _mbim_device_stats_entry_first_fragment (query, 50);
+    _mbim_device_stats_entry_complete (query, 2, 120, 1000, NULL);
+
+    /* Failed sets */
+    error = g_error_new (MBIM_CORE_ERROR, MBIM_CORE_ERROR_TIMEOUT, "timeout");
+    _mbim_device_stats_entry_transaction (set, 56);
+    _mbim_device_stats_entry_complete (set, 0, 0, 5000, error);
+    g_error_free (error);
+    error = g_error_new (MBIM_CORE_ERROR, MBIM_CORE_ERROR_ABORTED, "aborted");
+    _mbim_device_stats_entry_transaction (set, 56);
+    _mbim_device_stats_entry_complete (set, 0, 0, 10, error);
+    g_error_free (error);
+    error = g_error_new (MBIM_CORE_ERROR, MBIM_CORE_ERROR_WRONG_STATE, "wrong state");
+    _mbim_device_stats_entry_transaction (set, 56);
+    _mbim_device_stats_entry_complete (set, 1, 16, 20, error);
+    g_error_free (error);
+
+    _mbim_device_stats_message_out (stats, 48);
+    _mbim_device_stats_message_out (stats, 56);
+    _mbim_device_stats_message_in (stats, 60);
+    _mbim_device_stats_message_in (stats, 60);
+    _mbim_device_stats_message_in (stats, 16);
+    _mbim_device_stats_unmatched (stats);
+
+    snapshot = _mbim_device_stats_build_variant (stats);
+    g_assert_cmpuint (lookup_counter (snapshot, "messages-in"), ==, 3);
+    g_assert_cmpuint (lookup_counter (snapshot, "messages-out"), ==, 2);
+    g_assert_cmpuint (lookup_counter (snapshot, "bytes-in"), ==, 136);
+    g_assert_cmpuint (lookup_counter (snapshot, "bytes-out"), ==, 104);
+    g_assert_cmpuint (lookup_counter (snapshot, "unmatched"), ==, 1);
+    g_variant_unref (snapshot);
+
+    /* Entries are listed in the order they were added */
+    transaction = get_transaction (stats, 0);
+    g_assert (g_variant_lookup (transaction, "message-type", "u", &value));
+    g_assert_cmpuint (value, ==, MBIM_MESSAGE_TYPE_COMMAND);
+    g_assert (g_variant_lookup (transaction, "service", "s", &service));
+    expected_service = mbim_uuid_get_printable (MBIM_UUID_BASIC_CONNECT);
+    g_assert_cmpstr (service, ==, expected_service);
+    g_free (expected_service);
+    g_free (service);
+    g_assert (g_variant_lookup (transaction, "cid", "u", &value));
+    g_assert_cmpuint (value, ==, MBIM_CID_BASIC_CONNECT_RADIO_STATE);
+    g_assert (g_variant_lookup (transaction, "command-type", "u", &value));
+    g_assert_cmpuint (value, ==, MBIM_MESSAGE_COMMAND_TYPE_QUERY);
+    g_assert_cmpuint (lookup_counter (transaction, "count"), ==, 1);
+    g_assert_cmpuint (lookup_counter (transaction, "completed"), ==, 1);
+    g_assert_cmpuint (lookup_counter (transaction, "errors"), ==, 0);
+    g_assert_cmpuint (lookup_counter (transaction, "fragments-in"), ==, 2);
+    g_assert_cmpuint (lookup_counter (transaction, "bytes-in"), ==, 120);
+    g_assert_cmpuint (lookup_counter (transaction, "bytes-out"), ==, 48);
+    check_histogram (transaction, "first-fragment-latency", first_fragment_expected, 1);
+    check_histogram (transaction, "complete-latency", complete_expected, 1);
+    g_variant_unref (transaction);
+
+    /* Failures are counted by type, without latencies */
+    transaction = get_transaction (stats, 1);
+    g_assert (g_variant_lookup (transaction, "command-type", "u", &value));
+    g_assert_cmpuint (value, ==, MBIM_MESSAGE_COMMAND_TYPE_SET);
+    g_assert_cmpuint (lookup_counter (transaction, "count"), ==, 3);
+    g_assert_cmpuint (lookup_counter (transaction, "completed"), ==, 0);
+    g_assert_cmpuint (lookup_counter (transaction, "timeouts"), ==, 1);
+    g_assert_cmpuint (lookup_counter (transaction, "aborts"), ==, 1);
+    g_assert_cmpuint (lookup_counter (transaction, "errors"), ==, 1);
+    g_assert_cmpuint (lookup_counter (transaction, "fragments-in"), ==, 1);
+    g_assert_cmpuint (lookup_counter (transaction, "bytes-in"), ==, 16);
+    g_assert_cmpuint (lookup_counter (transaction, "bytes-out"), ==, 168);
+    check_histogram (transaction, "complete-latency", NULL, 0);
+    g_variant_unref (transaction);
+
+    _mbim_device_stats_free (stats);
+}
+
+static void
+test_device_stats_indications (void)
+{
+    static const guint8   indication[] = {
+        0x07, 0x00, 0x00, 0x80, /* type */
+        0x2c, 0x00, 0x00, 0x00, /* length */
+        0x00, 0x00, 0x00, 0x00, /* transaction id */
+        0x01, 0x00, 0x00, 0x00, /* total fragments */
+        0x00, 0x00, 0x00, 0x00, /* current fragment */
+        0xa2, 0x89, 0xcc, 0x33, /* service id */
+        0xbc, 0xbb, 0x8b, 0x4f,
+        0xb6, 0xb0, 0x13, 0x3e,
+        0xc2, 0xaa, 0xe6, 0xdf,
+        0x03, 0x00, 0x00, 0x00, /* cid */
+        0x00, 0x00, 0x00, 0x00  /* buffer length */
+    };
+    MbimDeviceStats      *stats;
+    MbimDeviceStatsEntry *entry;
+    MbimMessage          *message;
+    GVariant             *transaction;
+
+    stats = _mbim_device_stats_new ();
+
+    message = mbim_message_new (indication, sizeof (indication));
+    entry = _mbim_device_stats_get_entry (stats, message);
+    mbim_message_unref (message);
+
+    /* Indications have no request, so no latency either */
+    _mbim_device_stats_entry_transaction (entry, 0);
+    _mbim_device_stats_entry_complete (entry, 1, sizeof (indication), -1, NULL);
+
+    transaction = get_transaction (stats, 0);
+    g_assert_cmpuint (lookup_counter (transaction, "count"), ==, 1);
+    g_assert_cmpuint (lookup_counter (transaction, "completed"), ==, 1);
+    g_assert_cmpuint (lookup_counter (transaction, "bytes-in"), ==, sizeof (indication));
+    g_assert_cmpuint (lookup_counter (transaction, "bytes-out"), ==, 0);
+    check_histogram (transaction, "complete-latency", NULL, 0);
+    g_variant_unref (transaction);
+
+    _mbim_device_stats_free (stats);
+}
+
+/*****************************************************************************/
+
+int main (int argc, char **argv)
+{
+    g_test_init (&argc, &argv, NULL);
+
+    g_test_add_func ("/libmbim-glib/device-stats/histogram/buckets",     test_device_stats_histogram_buckets);
+    g_test_add_func ("/libmbim-glib/device-stats/histogram/percentiles", test_device_stats_histogram_percentiles);
+    g_test_add_func ("/libmbim-glib/device-stats/counters",              test_device_stats_counters);
+    g_test_add_func ("/libmbim-glib/device-stats/indications",           test_device_stats_indications);
+
+    return g_test_run ();
+}
@@ -0,0 +1,615 @@
+/* -*- Mode: C; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*- */
+/*
+ * This program is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation; either version 2 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details:
+ *
+ * Copyright (C) 2013 - 2014 Aleksander Morgado <aleksander@aleksander.es>
+ */
+
+#include <config.h>
+#include <string.h>
+#include <unistd.h>
+#include <glib/gstdio.h>
+
+#include "mbim-device.h"
+#include "mbim-cid.h"
+#include "mbim-error-types.h"
+
+static void
+open_batch_ready (GObject      *source,
+                  GAsyncResult *res,
+                  GPtrArray   **results)
+{
+    GError *error = NULL;
+
+    *results = mbim_device_open_batch_finish (res, &error);
+    g_assert_no_error (error);
+    g_assert (*results);
+}
+
+static GPtrArray *
+run_open_batch (const gchar * const *paths,
+                guint                timeout,
+                guint                max_concurrent)
+{
+    GPtrArray *results = NULL;
+
+    mbim_device_open_batch (paths,
+                            MBIM_DEVICE_OPEN_FLAGS_NONE,
+                            timeout,
+                            max_concurrent,
+                            NULL,
+                            (GAsyncReadyCallback)open_batch_ready,
+                            &results);
+    while (!results)
+        g_main_context_iteration (NULL, TRUE);
+
+    return results;
+}
+
+static void
+test_device_open_batch_empty (void)
+{
+    static const gchar *paths[] = { NULL };
+    GPtrArray *results;
+
+    results = run_open_batch (paths, 1, 0);
+    g_assert_cmpuint (results->len, ==, 0);
+    g_ptr_array_unref (results);
+}
+
+static void
+test_device_open_batch_missing (void)
+{
+    static const gchar *paths[] = {
+        "/nonexistent/cdc-wdm0",
+        "/nonexistent/cdc-wdm1",
+        "/nonexistent/cdc-wdm2",
+        NULL
+    };
+    GPtrArray *results;
+    guint i;
+
+    results = run_open_batch (paths, 1, 2);
+    g_assert_cmpuint (results->len, ==, G_N_ELEMENTS (paths) - 1);
+
+    for (i = 0; i < results->len; i++) {
+        MbimDeviceOpenResult *result;
+
+        result = g_ptr_array_index (results, i);
+
+        /* Results are given in the same order as the paths */
+        g_assert_cmpstr (mbim_device_open_result_get_path (result), ==, paths[i]);
+        g_assert (mbim_device_open_result_get_device (result) == NULL);
+        g_assert (mbim_device_open_result_get_error (result) != NULL);
+
+        /* Retried with backoff until the timeout is reached */
+        g_assert_cmpuint (mbim_device_open_result_get_attempts (result), >, 1);
+        g_assert_cmpfloat (mbim_device_open_result_get_time_to_open (result), <, 1.0);
+    }
+
+    g_ptr_array_unref (results);
+}
+
+static void
+device_new_ready (GObject       *source,
+                  GAsyncResult  *res,
+                  MbimDevice   **device)
+{
+    GError *error = NULL;
+
+    *device = mbim_device_new_finish (res, &error);
+    g_assert_no_error (error);
+    g_assert (*device);
+}
+
+static MbimDevice *
+device_new_unopened (void)
+{
+    MbimDevice *device = NULL;
+    GFile      *file;
+
+    /* Any character device is enough, it's never opened */
+    file = g_file_new_for_path ("/dev/null");
+    mbim_device_new (file, NULL, (GAsyncReadyCallback)device_new_ready, &device);
+    while (!device)
+        g_main_context_iteration (NULL, TRUE);
+    g_object_unref (file);
+
+    return device;
+}
+
+static void
+test_device_statistics_initial (void)
+{
+    MbimDevice *device;
+    GVariant   *statistics;
+    GVariant   *property = NULL;
+    GVariant   *transactions;
+    guint64     value;
+
+    device = device_new_unopened ();
+
+    statistics = mbim_device_get_statistics (device);
+    g_assert (g_variant_is_of_type (statistics, G_VARIANT_TYPE ("a{sv}")));
+    g_assert (g_variant_lookup (statistics, "messages-in", "t", &value));
+    g_assert_cmpuint (value, ==, 0);
+    g_assert (g_variant_lookup (statistics, "bytes-out", "t", &value));
+    g_assert_cmpuint (value, ==, 0);
+    transactions = g_variant_lookup_value (statistics, "transactions", G_VARIANT_TYPE ("aa{sv}"));
+    g_assert (transactions);
+    g_assert_cmpuint (g_variant_n_children (transactions), ==, 0);
+    g_variant_unref (transactions);
+
+    /* Same snapshot through the property */
+    g_object_get (device, MBIM_DEVICE_STATISTICS, &property, NULL);
+    g_assert (property);
+    g_assert (g_variant_equal (statistics, property));
+    g_variant_unref (property);
+
+    g_variant_unref (statistics);
+    g_object_unref (device);
+}
+
+static void
+test_device_command_sync_not_open (void)
+{
+    MbimDevice  *device;
+    MbimMessage *request;
+    MbimMessage *response;
+    GError      *error = NULL;
+
+    device = device_new_unopened ();
+    request = mbim_message_command_new (1, MBIM_SERVICE_BASIC_CONNECT, MBIM_CID_BASIC_CONNECT_DEVICE_CAPS, MBIM_MESSAGE_COMMAND_TYPE_QUERY);
+
+    response = mbim_device_command_sync (device, request, 1, NULL, &error);
+    g_assert_error (error, MBIM_CORE_ERROR, MBIM_CORE_ERROR_WRONG_STATE);
+    g_assert (response == NULL);
+    g_error_free (error);
+
+    mbim_message_unref (request);
+    g_object_unref (device);
+}
+
+static void
+command_batch_ready (MbimDevice    *device,
+                     GAsyncResult  *res,
+                     GPtrArray    **results)
+{
+    GError  *error = NULL;
+    gdouble  elapsed = -1.0;
+
+    *results = mbim_device_command_batch_finish (device, res, &elapsed, &error);
+    g_assert_no_error (error);
+    g_assert (*results);
+    g_assert_cmpfloat (elapsed, >=, 0.0);
+}
+
+static GPtrArray *
+run_command_batch (MbimDevice                  *device,
+                   MbimDeviceCommandBatchFlags  flags,
+                   guint                        max_pending,
+                   guint                        depends_on_first)
+{
+    MbimDeviceCommandBatch *batch;
+    GPtrArray              *results = NULL;
+    guint                   i;
+
+    batch = mbim_device_command_batch_new ();
+    for (i = 0; i < 3; i++) {
+        MbimMessage *request;
+
+        request = mbim_message_command_new (0, MBIM_SERVICE_BASIC_CONNECT, MBIM_CID_BASIC_CONNECT_DEVICE_CAPS, MBIM_MESSAGE_COMMAND_TYPE_QUERY);
+        g_assert_cmpuint (mbim_device_command_batch_add (batch, request, 1), ==, i);
+        mbim_message_unref (request);
+    }
+    if (depends_on_first)
+        mbim_device_command_batch_add_dependency (batch, depends_on_first, 0);
+
+    mbim_device_command_batch (device,
+                               batch,
+                               flags,
+                               max_pending,
+                               NULL,
+                               (GAsyncReadyCallback)command_batch_ready,
+                               &results);
+    while (!results)
+        g_main_context_iteration (NULL, TRUE);
+
+    mbim_device_command_batch_unref (batch);
+    g_assert_cmpuint (results->len, ==, 3);
+    return results;
+}
+
+static const GError *
+result_error (GPtrArray *results,
+              guint      i)
+{
+    return mbim_device_command_result_get_error (g_ptr_array_index (results, i));
+}
+
+static void
+test_device_command_batch_dependencies (void)
+{
+    MbimDevice *device;
+    GPtrArray  *results;
+    guint32     first_id;
+    guint       i;
+
+    device = device_new_unopened ();
+    results = run_command_batch (device, MBIM_DEVICE_COMMAND_BATCH_FLAGS_NONE, 0, 1);
+
+    /* The command depending on a failed one is not sent */
+    g_assert_error (result_error (results, 0), MBIM_CORE_ERROR, MBIM_CORE_ERROR_WRONG_STATE);
+    g_assert_error (result_error (results, 1), MBIM_CORE_ERROR, MBIM_CORE_ERROR_ABORTED);
+    g_assert_error (result_error (results, 2), MBIM_CORE_ERROR, MBIM_CORE_ERROR_WRONG_STATE);
+
+    /* Transaction IDs allocated as a single block */
+    first_id = mbim_message_get_transaction_id (
+                   mbim_device_command_result_get_request (g_ptr_array_index (results, 0)));
+    for (i = 1; i < results->len; i++) {
+        MbimDeviceCommandResult *result;
+
+        result = g_ptr_array_index (results, i);
+        g_assert_cmpuint (mbim_message_get_transaction_id (mbim_device_command_result_get_request (result)), ==, first_id + i);
+        g_assert (mbim_device_command_result_get_response (result) == NULL);
+    }
+
+    g_ptr_array_unref (results);
+    g_object_unref (device);
+}
+
+static void
+test_device_command_batch_stop_on_error (void)
+{
+    MbimDevice *device;
+    GPtrArray  *results;
+
+    device = device_new_unopened ();
+    results = run_command_batch (device, MBIM_DEVICE_COMMAND_BATCH_FLAGS_STOP_ON_ERROR, 1, 0);
+
+    g_assert_error (result_error (results, 0), MBIM_CORE_ERROR, MBIM_CORE_ERROR_WRONG_STATE);
+    g_assert_error (result_error (results, 1), MBIM_CORE_ERROR, MBIM_CORE_ERROR_ABORTED);
+    g_assert_error (result_error (results, 2), MBIM_CORE_ERROR, MBIM_CORE_ERROR_ABORTED);
+    g_assert_cmpfloat (mbim_device_command_result_get_time (g_ptr_array_index (results, 2)), ==, 0.0);
+
+    g_ptr_array_unref (results);
+    g_object_unref (device);
+}
+
+static void
+test_device_command_batch_requests_untouched (void)
+{
+    MbimDevice             *device;
+    MbimDeviceCommandBatch *batch;
+    MbimMessage            *request;
+    GPtrArray              *results;
+    guint32                 sent_ids[2];
+    guint                   i;
+
+    device = device_new_unopened ();
+
+    batch = mbim_device_command_batch_new ();
+    request = mbim_message_command_new (0, MBIM_SERVICE_BASIC_CONNECT, MBIM_CID_BASIC_CONNECT_DEVICE_CAPS, MBIM_MESSAGE_COMMAND_TYPE_QUERY);
+    mbim_device_command_batch_add (batch, request, 1);
+
+    /* The same batch sent twice, each time with a new transaction ID */
+    for (i = 0; i < G_N_ELEMENTS (sent_ids); i++) {
+        results = NULL;
+        mbim_device_command_batch (device,
+                                   batch,
+                                   MBIM_DEVICE_COMMAND_BATCH_FLAGS_NONE,
+                                   0,
+                                   NULL,
+                                   (GAsyncReadyCallback)command_batch_ready,
+                                   &results);
+        while (!results)
+            g_main_context_iteration (NULL, TRUE);
+
+        g_assert_cmpuint (results->len, ==, 1);
+        g_assert (mbim_device_command_result_get_request (g_ptr_array_index (results, 0)) != request);
+        sent_ids[i] = mbim_message_get_transaction_id (mbim_device_command_result_get_request (g_ptr_array_index (results, 0)));
+        g_assert_cmpuint (sent_ids[i], !=, 0);
+        g_ptr_array_unref (results);
+
+        /* The caller's message is left as it was */
+        g_assert_cmpuint (mbim_message_get_transaction_id (request), ==, 0);
+    }
+    g_assert_cmpuint (sent_ids[0], !=, sent_ids[1]);
+
+    mbim_device_command_batch_unref (batch);
+    mbim_message_unref (request);
+    g_object_unref (device);
+}
+
+#define TRANSACTION_ID_THREADS    8
+#define TRANSACTION_IDS_PER_THREAD 10000
+
+typedef struct {
+    MbimDevice *device;
+    guint32     ids[TRANSACTION_IDS_PER_THREAD];
+} TransactionIdThreadContext;
+
+static gpointer
+transaction_id_thread (TransactionIdThreadContext *ctx)
+{
+    guint i;
+
+    for (i = 0; i < TRANSACTION_IDS_PER_THREAD; i++)
+        ctx->ids[i] = mbim_device_get_next_transaction_id (ctx->device);
+    return NULL;
+}
+
+static void
+test_device_transaction_id_threads (void)
+{
+    MbimDevice                 *device;
+    TransactionIdThreadContext *contexts;
+    GThread                    *threads[TRANSACTION_ID_THREADS];
+    GHashTable                 *seen;
+    guint                       i;
+    guint                       j;
+
+    device = device_new_unopened ();
+    contexts = g_new0 (TransactionIdThreadContext, TRANSACTION_ID_THREADS);
+
+    for (i = 0; i < TRANSACTION_ID_THREADS; i++) {
+        contexts[i].device = device;
+        threads[i] = g_thread_new ("transaction-id", (GThreadFunc)transaction_id_thread, &contexts[i]);
+    }
+    for (i = 0; i < TRANSACTION_ID_THREADS; i++)
+        g_thread_join (threads[i]);
+
+    /* No transaction ID given twice, none skipped */
+    seen = g_hash_table_new (g_direct_hash, g_direct_equal);
+    for (i = 0; i < TRANSACTION_ID_THREADS; i++) {
+        for (j = 0; j < TRANSACTION_IDS_PER_THREAD; j++) {
+            g_assert (!g_hash_table_contains (seen, GUINT_TO_POINTER (contexts[i].ids[j])));
+            g_hash_table_add (seen, GUINT_TO_POINTER (contexts[i].ids[j]));
+        }
+    }
+    g_assert_cmpuint (g_hash_table_size (seen), ==, TRANSACTION_ID_THREADS * TRANSACTION_IDS_PER_THREAD);
+    g_assert_cmpuint (mbim_device_get_next_transaction_id (device), ==, TRANSACTION_ID_THREADS * TRANSACTION_IDS_PER_THREAD + 1);
+
+    g_hash_table_unref (seen);
+    g_free (contexts);
+    g_object_unref (device);
+}
+
+static gpointer
+command_sync_thread (MbimDevice *device)
+{
+    MbimMessage *request;
+    MbimMessage *response;
+    GError      *error = NULL;
+    guint        i;
+
+    for (i = 0; i < 100; i++) {
+        request = mbim_message_command_new (0, MBIM_SERVICE_BASIC_CONNECT, MBIM_CID_BASIC_CONNECT_DEVICE_CAPS, MBIM_MESSAGE_COMMAND_TYPE_QUERY);
+        response = mbim_device_command_sync (device, request, 1, NULL, &error);
+        g_assert_error (error, MBIM_CORE_ERROR, MBIM_CORE_ERROR_WRONG_STATE);
+        g_assert (response == NULL);
+        g_clear_error (&error);
+        mbim_message_unref (request);
+    }
+    return NULL;
+}
+
+static void
+test_device_command_sync_threads (void)
+{
+    MbimDevice *device;
+    GThread    *threads[4];
+    guint       i;
+
+    device = device_new_unopened ();
+
+    for (i = 0; i < G_N_ELEMENTS (threads); i++)
+        threads[i] = g_thread_new ("command-sync", (GThreadFunc)command_sync_thread, device);
+    for (i = 0; i < G_N_ELEMENTS (threads); i++)
+        g_thread_join (threads[i]);
+
+    g_object_unref (device);
+}
+
+/*****************************************************************************/
+
+/* Interface, CDC header and CDC union descriptors */
+static const guint8 other_descriptors[] = {
+    0x09, 0x04, 0x00, 0x00, 0x01, 0x02, 0x0e, 0x00, 0x05,
+    0x05, 0x24, 0x00, 0x10, 0x01,
+    0x05, 0x24, 0x06, 0x00, 0x01
+};
+
+/* MBIM functional descriptor: 4096 bytes max control message, 1500 bytes
+ * max segment size, 0x20 network capabilities */
+static const guint8 mbim_descriptor[] = {
+    0x0c, 0x24, 0x1b, 0x00, 0x01, 0x00, 0x10, 0x20, 0x80, 0xdc, 0x05, 0x20
+};
+
+/* Vendor descriptor including the MBIM signature in its contents */
+static const guint8 vendor_descriptor[] = {
+    0x10, 0x24, 0x00, 0x0c, 0x24, 0x1b, 0x00, 0xff,
+    0xff, 0xff, 0xff, 0xff, 0xff, 0xff, 0xff, 0xff
+};
+
+static const guint8 zero_length_descriptor[] = {
+    0x00, 0x24, 0x00, 0x00
+};
+
+static gboolean
+read_functional_descriptor (const guint8  *contents,
+                            gsize          contents_len,
+                            guint16       *max_control_message,
+                            guint16       *max_segment_size,
+                            guint8        *network_capabilities,
+                            GError       **error)
+{
+    GError *inner_error = NULL;
+    gchar *path;
+    gboolean success;
+    gint fd;
+
+    fd = g_file_open_tmp ("test-descriptors-XXXXXX", &path, &inner_error);
+    g_assert_no_error (inner_error);
+    close (fd);
+    g_assert (g_file_set_contents (path, (const gchar *)contents, contents_len, &inner_error));
+    g_assert_no_error (inner_error);
+
+    success = _mbim_device_read_functional_descriptor (path,
+                                                       "test",
+                                                       max_control_message,
+                                                       max_segment_size,
+                                                       network_capabilities,
+                                                       error);
+    g_unlink (path);
+    g_free (path);
+    return success;
+}
+
+static void
+test_device_functional_descriptor_multiple (void)
+{
+    GError *error = NULL;
+    GByteArray *contents;
+    guint16 max_control_message = 0;
+    guint16 max_segment_size = 0;
+    guint8 network_capabilities = 0;
+
+    /* Only descriptor */
+    g_assert (read_functional_descriptor (mbim_descriptor, sizeof (mbim_descriptor),
+                                          &max_control_message, &max_segment_size, &network_capabilities,
+                                          &error));
+    g_assert_no_error (error);
+    g_assert_cmpuint (max_control_message, ==, 4096);
+    g_assert_cmpuint (max_segment_size, ==, 1500);
+    g_assert_cmpuint (network_capabilities, ==, 0x20);
+
+    /* After other descriptors, the signature in the vendor descriptor must
+     * not be matched */
+    contents = g_byte_array_new ();
+    g_byte_array_append (contents, other_descriptors, sizeof (other_descriptors));
+    g_byte_array_append (contents, vendor_descriptor, sizeof (vendor_descriptor));
+    g_byte_array_append (contents, mbim_descriptor, sizeof (mbim_descriptor));
+    g_byte_array_append (contents, other_descriptors, sizeof (other_descriptors));
+
+    max_control_message = max_segment_size = network_capabilities = 0;
+    g_assert (read_functional_descriptor (contents->data, contents->len,
+                                          &max_control_message, &max_segment_size, &network_capabilities,
+                                          &error));
+    g_assert_no_error (error);
+    g_assert_cmpuint (max_control_message, ==, 4096);
+    g_assert_cmpuint (max_segment_size, ==, 1500);
+    g_assert_cmpuint (network_capabilities, ==, 0x20);
+
+    g_byte_array_unref (contents);
+}
+
+static void
+test_device_functional_descriptor_truncated (void)
+{
+    GError *error = NULL;
+    GByteArray *contents;
+    guint16 max_control_message = 0;
+    guint16 max_segment_size = 0;
+    guint8 network_capabilities = 0;
+
+    /* Empty file */
+    g_assert (!read_functional_descriptor ((const guint8 *)"", 0,
+                                           &max_control_message, &max_segment_size, &network_capabilities,
+                                           &error));
+    g_assert_error (error, MBIM_CORE_ERROR, MBIM_CORE_ERROR_FAILED);
+    g_clear_error (&error);
+
+    /* Shorter than one MBIM descriptor */
+    g_assert (!read_functional_descriptor (mbim_descriptor, sizeof (mbim_descriptor) - 1,
+                                           &max_control_message, &max_segment_size, &network_capabilities,
+                                           &error));
+    g_assert_error (error, MBIM_CORE_ERROR, MBIM_CORE_ERROR_FAILED);
+    g_clear_error (&error);
+
+    /* MBIM descriptor cut at the end of the file */
+    contents = g_byte_array_new ();
+    g_byte_array_append (contents, other_descriptors, sizeof (other_descriptors));
+    g_byte_array_append (contents, mbim_descriptor, sizeof (mbim_descriptor) - 3);
+    g_assert (!read_functional_descriptor (contents->data, contents->len,
+                                           &max_control_message, &max_segment_size, &network_capabilities,
+                                           &error));
+    g_assert_error (error, MBIM_CORE_ERROR, MBIM_CORE_ERROR_FAILED);
+    g_clear_error (&error);
+    g_byte_array_unref (contents);
+
+    /* Nothing is read on errors */
+    g_assert_cmpuint (max_control_message, ==, 0);
+    g_assert_cmpuint (max_segment_size, ==, 0);
+    g_assert_cmpuint (network_capabilities, ==, 0);
+}
+
+static void
+test_device_functional_descriptor_zero_length (void)
+{
+    GError *error = NULL;
+    GByteArray *contents;
+    guint16 max_control_message = 0;
+    guint16 max_segment_size = 0;
+    guint8 network_capabilities = 0;
+
+    /* The walk stops at the zero-length descriptor, so the MBIM descriptor
+     * after it is never reached */
+    contents = g_byte_array_new ();
+    g_byte_array_append (contents, other_descriptors, sizeof (other_descriptors));
+    g_byte_array_append (contents, zero_length_descriptor, sizeof (zero_length_descriptor));
+    g_byte_array_append (contents, mbim_descriptor, sizeof (mbim_descriptor));
+    g_assert (!read_functional_descriptor (contents->data, contents->len,
+                                           &max_control_message, &max_segment_size, &network_capabilities,
+                                           &error));
+    g_assert_error (error, MBIM_CORE_ERROR, MBIM_CORE_ERROR_FAILED);
+    g_clear_error (&error);
+    g_byte_array_unref (contents);
+}
+
+static void
+test_device_functional_descriptor_missing (void)
+{
+    GError *error = NULL;
+    guint16 max_control_message = 0;
+    guint16 max_segment_size = 0;
+    guint8 network_capabilities = 0;
+
+    g_assert (!_mbim_device_read_functional_descriptor ("/nonexistent/descriptors",
+                                                        "test",
+                                                        &max_control_message,
+                                                        &max_segment_size,
+                                                        &network_capabilities,
+                                                        &error));
+    g_assert_error (error, G_FILE_ERROR, G_FILE_ERROR_NOENT);
+    g_clear_error (&error);
+}
+
+int main (int argc, char **argv)
+{
+    g_test_init (&argc, &argv, NULL);
+
+    g_test_add_func ("/libmbim-glib/device/open-batch/empty",   test_device_open_batch_empty);
+    g_test_add_func ("/libmbim-glib/device/open-batch/missing", test_device_open_batch_missing);
+    g_test_add_func ("/libmbim-glib/device/statistics/initial", test_device_statistics_initial);
+    g_test_add_func ("/libmbim-glib/device/command-sync/not-open", test_device_command_sync_not_open);
+    g_test_add_func ("/libmbim-glib/device/command-sync/threads",  test_device_command_sync_threads);
+    g_test_add_func ("/libmbim-glib/device/transaction-id/threads", test_device_transaction_id_threads);
+    g_test_add_func ("/libmbim-glib/device/command-batch/dependencies", test_device_command_batch_dependencies);
+    g_test_add_func ("/libmbim-glib/device/command-batch/stop-on-error", test_device_command_batch_stop_on_error);
+    g_test_add_func ("/libmbim-glib/device/command-batch/requests-untouched", test_device_command_batch_requests_untouched);
+    g_test_add_func ("/libmbim-glib/device/functional-descriptor/multiple",    test_device_functional_descriptor_multiple);
+    g_test_add_func ("/libmbim-glib/device/functional-descriptor/truncated",   test_device_functional_descriptor_truncated);
+    g_test_add_func ("/libmbim-glib/device/functional-descriptor/zero-length", test_device_functional_descriptor_zero_length);
+    g_test_add_func ("/libmbim-glib/device/functional-descriptor/missing",     test_device_functional_descriptor_missing);
+
+    return g_test_run ();
+}
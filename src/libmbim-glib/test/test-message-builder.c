@@ -27,6 +27,13 @@
 #include "mbim-stk.h"
 #include "mbim-dss.h"
 #include "mbim-ms-host-shutdown.h"
+#include "mbim-proxy-control.h"
+
+#if defined MBIM_CODEGEN_BACKEND_TABLE
+# define MBIM_CODEGEN_BACKEND_NAME "table"
+#else
+# define MBIM_CODEGEN_BACKEND_NAME "unrolled"
+#endif
 
 #if defined ENABLE_TEST_MESSAGE_TRACES
 static void
@@ -1346,6 +1353,145 @@ test_message_builder_ms_host_shutdown_notify_set (void)
     mbim_message_unref (message);
 }
 
+static void
+test_message_builder_proxy_control_statistics_response (void)
+{
+    GError *error = NULL;
+    MbimMessage *message;
+    MbimProxyDeviceStatistics device = { 0 };
+    MbimProxyClientStatistics client = { 0 };
+    MbimProxyCommandLatency latency = { 0 };
+    const MbimProxyDeviceStatistics *devices[] = { &device };
+    const MbimProxyClientStatistics *clients[] = { &client };
+    const MbimProxyCommandLatency *latencies[] = { &latency };
+    guint32 devices_count;
+    guint32 clients_count;
+    guint32 latencies_count;
+    MbimProxyDeviceStatistics **out_devices;
+    MbimProxyClientStatistics **out_clients;
+    MbimProxyCommandLatency **out_latencies;
+
+    device.device_path = (gchar *)"/dev/cdc-wdm0";
+    device.messages_in = 10;
+    device.messages_out = 11;
+    device.bytes_in = G_GUINT64_CONSTANT (0x100000000);
+    device.bytes_out = 1234;
+    device.in_flight = 2;
+    device.timeouts = 1;
+    device.indications = 5;
+    device.indications_fan_out = 15;
+
+    client.client_id = 3;
+    client.device_path = (gchar *)"/dev/cdc-wdm0";
+    client.messages_in = 4;
+    client.messages_out = 6;
+    client.bytes_in = 400;
+    client.bytes_out = 600;
+    client.in_flight = 1;
+    client.queued_bytes = 12;
+    client.indications = 2;
+
+    latency.device_path = (gchar *)"/dev/cdc-wdm0";
+    memcpy (&latency.service_id, MBIM_UUID_BASIC_CONNECT, sizeof (MbimUuid));
+    latency.cid = MBIM_CID_BASIC_CONNECT_DEVICE_CAPS;
+    latency.count = 7;
+    latency.p50 = 1023;
+    latency.p99 = 4095;
+
+    message = mbim_message_proxy_control_statistics_response_new (1, devices,
+                                                                  1, clients,
+                                                                  1, latencies,
+                                                                  &error);
+    g_assert_no_error (error);
+    g_assert (message != NULL);
+    mbim_message_set_transaction_id (message, 1);
+
+    g_assert_cmpuint (mbim_message_get_transaction_id (message), ==, 1);
+    g_assert_cmpuint (mbim_message_get_message_type   (message), ==, MBIM_MESSAGE_TYPE_COMMAND_DONE);
+    g_assert_cmpuint (mbim_message_command_done_get_service (message), ==, MBIM_SERVICE_PROXY_CONTROL);
+    g_assert_cmpuint (mbim_message_command_done_get_cid     (message), ==, MBIM_CID_PROXY_CONTROL_STATISTICS);
+    g_assert_cmpuint (mbim_message_command_done_get_status_code (message), ==, MBIM_STATUS_ERROR_NONE);
+
+    /* The built response must be parseable */
+    g_assert (mbim_message_proxy_control_statistics_response_parse (message,
+                                                                    &devices_count,
+                                                                    &out_devices,
+                                                                    &clients_count,
+                                                                    &out_clients,
+                                                                    &latencies_count,
+                                                                    &out_latencies,
+                                                                    &error));
+    g_assert_no_error (error);
+
+    g_assert_cmpuint (devices_count, ==, 1);
+    g_assert_cmpstr  (out_devices[0]->device_path, ==, "/dev/cdc-wdm0");
+    g_assert_cmpuint (out_devices[0]->messages_in, ==, 10);
+    g_assert_cmpuint (out_devices[0]->messages_out, ==, 11);
+    g_assert_cmpuint (out_devices[0]->bytes_in, ==, G_GUINT64_CONSTANT (0x100000000));
+    g_assert_cmpuint (out_devices[0]->bytes_out, ==, 1234);
+    g_assert_cmpuint (out_devices[0]->in_flight, ==, 2);
+    g_assert_cmpuint (out_devices[0]->timeouts, ==, 1);
+    g_assert_cmpuint (out_devices[0]->indications, ==, 5);
+    g_assert_cmpuint (out_devices[0]->indications_fan_out, ==, 15);
+
+    g_assert_cmpuint (clients_count, ==, 1);
+    g_assert_cmpuint (out_clients[0]->client_id, ==, 3);
+    g_assert_cmpstr  (out_clients[0]->device_path, ==, "/dev/cdc-wdm0");
+    g_assert_cmpuint (out_clients[0]->messages_in, ==, 4);
+    g_assert_cmpuint (out_clients[0]->messages_out, ==, 6);
+    g_assert_cmpuint (out_clients[0]->bytes_in, ==, 400);
+    g_assert_cmpuint (out_clients[0]->bytes_out, ==, 600);
+    g_assert_cmpuint (out_clients[0]->in_flight, ==, 1);
+    g_assert_cmpuint (out_clients[0]->queued_bytes, ==, 12);
+    g_assert_cmpuint (out_clients[0]->indications, ==, 2);
+
+    g_assert_cmpuint (latencies_count, ==, 1);
+    g_assert_cmpstr  (out_latencies[0]->device_path, ==, "/dev/cdc-wdm0");
+    g_assert (mbim_uuid_cmp (&out_latencies[0]->service_id, MBIM_UUID_BASIC_CONNECT));
+    g_assert_cmpuint (out_latencies[0]->cid, ==, MBIM_CID_BASIC_CONNECT_DEVICE_CAPS);
+    g_assert_cmpuint (out_latencies[0]->count, ==, 7);
+    g_assert_cmpuint (out_latencies[0]->p50, ==, 1023);
+    g_assert_cmpuint (out_latencies[0]->p99, ==, 4095);
+
+    mbim_proxy_device_statistics_array_free (out_devices);
+    mbim_proxy_client_statistics_array_free (out_clients);
+    mbim_proxy_command_latency_array_free (out_latencies);
+    mbim_message_unref (message);
+}
+
+#define PERF_ITERATIONS 100000
+
+static void
+test_message_builder_perf (void)
+{
+    MbimMessage *message;
+    GTimer      *timer;
+    gdouble      ns;
+    guint        i;
+
+    timer = g_timer_new ();
+    for (i = 0; i < PERF_ITERATIONS; i++) {
+        message = (mbim_message_connect_set_new (
+                       0x01,
+                       MBIM_ACTIVATION_COMMAND_ACTIVATE,
+                       "internet",
+                       "",
+                       "",
+                       MBIM_COMPRESSION_NONE,
+                       MBIM_AUTH_PROTOCOL_PAP,
+                       MBIM_CONTEXT_IP_TYPE_IPV4,
+                       mbim_uuid_from_context_type (MBIM_CONTEXT_TYPE_INTERNET),
+                       NULL));
+        g_assert (message != NULL);
+        mbim_message_unref (message);
+    }
+    ns = g_timer_elapsed (timer, NULL) * 1e9 / PERF_ITERATIONS;
+    g_timer_destroy (timer);
+
+    g_test_minimized_result (ns, "connect set message built in %.0f ns (%s backend)",
+                             ns, MBIM_CODEGEN_BACKEND_NAME);
+}
+
 int main (int argc, char **argv)
 {
     g_test_init (&argc, &argv, NULL);
@@ -1367,6 +1513,10 @@ int main (int argc, char **argv)
     g_test_add_func ("/libmbim-glib/message/builder/dss/connect/set", test_message_builder_dss_connect_set);
     g_test_add_func ("/libmbim-glib/message/builder/basic-connect/multicarrier-providers/set", test_message_builder_basic_connect_multicarrier_providers_set);
     g_test_add_func ("/libmbim-glib/message/builder/ms-host-shutdown/notify/set", test_message_builder_ms_host_shutdown_notify_set);
+    g_test_add_func ("/libmbim-glib/message/builder/proxy-control/statistics/response", test_message_builder_proxy_control_statistics_response);
+
+    if (g_test_perf ())
+        g_test_add_func ("/libmbim-glib/message/builder/perf", test_message_builder_perf);
 
     return g_test_run ();
 }
@@ -24,8 +24,15 @@
 #include "mbim-ms-firmware-id.h"
 #include "mbim-message.h"
 #include "mbim-cid.h"
+#include "mbim-error-types.h"
 #include "mbim-common.h"
 
+#if defined MBIM_CODEGEN_BACKEND_TABLE
+# define MBIM_CODEGEN_BACKEND_NAME "table"
+#else
+# define MBIM_CODEGEN_BACKEND_NAME "unrolled"
+#endif
+
 #if defined ENABLE_TEST_MESSAGE_TRACES
 static void
 test_message_trace (const guint8 *computed,
@@ -1694,6 +1701,165 @@ test_message_parser_ms_firmware_id_get (void)
     mbim_message_unref (response);
 }
 
+/*****************************************************************************/
+/* Truncated and perf tests, on a single visible provider response */
+
+static const guint8 visible_providers_information_buffer[] = {
+    0x01, 0x00, 0x00, 0x00, /* 0x00 providers count */
+    0x0C, 0x00, 0x00, 0x00, /* 0x04 provider 0 offset */
+    0x38, 0x00, 0x00, 0x00, /* 0x08 provider 0 length */
+    /* data buffer... struct provider 0 */
+    0x20, 0x00, 0x00, 0x00, /* 0x0C [0x00] id offset */
+    0x0A, 0x00, 0x00, 0x00, /* 0x10 [0x04] id length */
+    0x08, 0x00, 0x00, 0x00, /* 0x14 [0x08] state */
+    0x2C, 0x00, 0x00, 0x00, /* 0x18 [0x0C] name offset */
+    0x0C, 0x00, 0x00, 0x00, /* 0x1C [0x10] name length */
+    0x01, 0x00, 0x00, 0x00, /* 0x20 [0x14] cellular class */
+    0x0B, 0x00, 0x00, 0x00, /* 0x24 [0x18] rssi */
+    0x00, 0x00, 0x00, 0x00, /* 0x28 [0x1C] error rate */
+    0x32, 0x00, 0x31, 0x00, /* 0x2C [0x20] id string (10 bytes) */
+    0x34, 0x00, 0x30, 0x00,
+    0x33, 0x00, 0x00, 0x00,
+    0x4F, 0x00, 0x72, 0x00, /* 0x38 [0x2C] name string (12 bytes) */
+    0x61, 0x00, 0x6E, 0x00,
+    0x67, 0x00, 0x65, 0x00 };
+
+/* Builds a well-formed visible providers response around the given
+ * information buffer, so that only its contents may be invalid */
+static MbimMessage *
+visible_providers_response_new (const guint8 *information_buffer,
+                                guint32       information_buffer_length)
+{
+    MbimMessage *response;
+    guint8      *buffer;
+    guint32      length;
+
+    length = 48 + information_buffer_length;
+    buffer = g_malloc0 (length);
+    G_STRUCT_MEMBER (guint32, buffer, 0)  = GUINT32_TO_LE (MBIM_MESSAGE_TYPE_COMMAND_DONE);
+    G_STRUCT_MEMBER (guint32, buffer, 4)  = GUINT32_TO_LE (length);
+    G_STRUCT_MEMBER (guint32, buffer, 8)  = GUINT32_TO_LE (1);
+    G_STRUCT_MEMBER (guint32, buffer, 12) = GUINT32_TO_LE (1);
+    G_STRUCT_MEMBER (guint32, buffer, 16) = GUINT32_TO_LE (0);
+    memcpy (&buffer[20], MBIM_UUID_BASIC_CONNECT, sizeof (MbimUuid));
+    G_STRUCT_MEMBER (guint32, buffer, 36) = GUINT32_TO_LE (MBIM_CID_BASIC_CONNECT_VISIBLE_PROVIDERS);
+    G_STRUCT_MEMBER (guint32, buffer, 40) = GUINT32_TO_LE (MBIM_STATUS_ERROR_NONE);
+    G_STRUCT_MEMBER (guint32, buffer, 44) = GUINT32_TO_LE (information_buffer_length);
+    memcpy (&buffer[48], information_buffer, information_buffer_length);
+
+    response = mbim_message_new (buffer, length);
+    g_free (buffer);
+    return response;
+}
+
+#if defined MBIM_CODEGEN_BACKEND_TABLE
+
+/* Only the table backend validates offsets and lengths before reading */
+
+static void
+visible_providers_parse_invalid (const guint8 *information_buffer,
+                                 guint32       information_buffer_length)
+{
+    MbimMessage   *response;
+    MbimProvider **providers = NULL;
+    guint32        n_providers = 0;
+    GError        *error = NULL;
+
+    response = visible_providers_response_new (information_buffer, information_buffer_length);
+    g_assert (!mbim_message_visible_providers_response_parse (
+                  response,
+                  &n_providers,
+                  &providers,
+                  &error));
+    g_assert_error (error, MBIM_CORE_ERROR, MBIM_CORE_ERROR_INVALID_MESSAGE);
+    g_assert (providers == NULL);
+    g_error_free (error);
+    mbim_message_unref (response);
+}
+
+static void
+test_message_parser_truncated (void)
+{
+    guint8         information_buffer[sizeof (visible_providers_information_buffer)];
+    MbimMessage   *response;
+    MbimProvider **providers;
+    guint32        n_providers;
+    GError        *error = NULL;
+
+    /* Whole information buffer */
+    response = visible_providers_response_new (visible_providers_information_buffer,
+                                               sizeof (visible_providers_information_buffer));
+    g_assert (mbim_message_visible_providers_response_parse (
+                  response,
+                  &n_providers,
+                  &providers,
+                  &error));
+    g_assert_no_error (error);
+    g_assert_cmpuint (n_providers, ==, 1);
+    g_assert_cmpstr (providers[0]->provider_id, ==, "21403");
+    g_assert_cmpstr (providers[0]->provider_name, ==, "Orange");
+    mbim_provider_array_free (providers);
+    mbim_message_unref (response);
+
+    /* Empty */
+    visible_providers_parse_invalid (visible_providers_information_buffer, 0);
+    /* Providers count, but no offset/length pairs */
+    visible_providers_parse_invalid (visible_providers_information_buffer, 4);
+    /* Offset/length pairs, but no struct */
+    visible_providers_parse_invalid (visible_providers_information_buffer, 0x0C);
+    /* Struct, but no strings */
+    visible_providers_parse_invalid (visible_providers_information_buffer, 0x2C);
+    /* Last byte of the name string missing */
+    visible_providers_parse_invalid (visible_providers_information_buffer,
+                                     sizeof (visible_providers_information_buffer) - 1);
+
+    /* Name string length beyond the buffer */
+    memcpy (information_buffer, visible_providers_information_buffer, sizeof (information_buffer));
+    information_buffer[0x1C] = 0x40;
+    visible_providers_parse_invalid (information_buffer, sizeof (information_buffer));
+
+    /* Struct offset beyond the buffer */
+    memcpy (information_buffer, visible_providers_information_buffer, sizeof (information_buffer));
+    information_buffer[0x04] = 0xF0;
+    visible_providers_parse_invalid (information_buffer, sizeof (information_buffer));
+
+    /* Providers count beyond the buffer */
+    memcpy (information_buffer, visible_providers_information_buffer, sizeof (information_buffer));
+    information_buffer[0x00] = 0x10;
+    visible_providers_parse_invalid (information_buffer, sizeof (information_buffer));
+}
+
+#endif /* MBIM_CODEGEN_BACKEND_TABLE */
+
+#define PERF_ITERATIONS 100000
+
+static void
+test_message_parser_perf (void)
+{
+    MbimMessage   *response;
+    MbimProvider **providers;
+    guint32        n_providers;
+    GTimer        *timer;
+    gdouble        ns;
+    guint          i;
+
+    response = visible_providers_response_new (visible_providers_information_buffer,
+                                               sizeof (visible_providers_information_buffer));
+
+    timer = g_timer_new ();
+    for (i = 0; i < PERF_ITERATIONS; i++) {
+        g_assert (mbim_message_visible_providers_response_parse (response, &n_providers, &providers, NULL));
+        mbim_provider_array_free (providers);
+    }
+    ns = g_timer_elapsed (timer, NULL) * 1e9 / PERF_ITERATIONS;
+    g_timer_destroy (timer);
+
+    g_test_minimized_result (ns, "visible providers response parsed in %.0f ns (%s backend)",
+                             ns, MBIM_CODEGEN_BACKEND_NAME);
+
+    mbim_message_unref (response);
+}
+
 int main (int argc, char **argv)
 {
     g_test_init (&argc, &argv, NULL);
@@ -1717,6 +1883,11 @@ int main (int argc, char **argv)
     g_test_add_func ("/libmbim-glib/message/parser/basic-connect/ip-packet-filters/one", test_message_parser_basic_connect_ip_packet_filters_one);
     g_test_add_func ("/libmbim-glib/message/parser/basic-connect/ip-packet-filters/two", test_message_parser_basic_connect_ip_packet_filters_two);
     g_test_add_func ("/libmbim-glib/message/parser/ms-firmware-id/get", test_message_parser_ms_firmware_id_get);
+#if defined MBIM_CODEGEN_BACKEND_TABLE
+    g_test_add_func ("/libmbim-glib/message/parser/truncated", test_message_parser_truncated);
+#endif
+    if (g_test_perf ())
+        g_test_add_func ("/libmbim-glib/message/parser/perf", test_message_parser_perf);
 
     return g_test_run ();
 }
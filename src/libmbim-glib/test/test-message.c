@@ -221,6 +221,160 @@ test_message_command_done (void)
     mbim_message_unref (message);
 }
 
+static void
+printer_func (const gchar *str,
+              gsize        len,
+              gpointer     user_data)
+{
+    g_assert (str != NULL);
+    g_assert_cmpuint (len, >, 0);
+    g_string_append_len ((GString *) user_data, str, len);
+}
+
+static void
+test_message_print (void)
+{
+    MbimMessage *message;
+    GString *printed;
+    gchar *printable;
+    const guint8 buffer [] =  { 0x03, 0x00, 0x00, 0x80,
+                                0x3c, 0x00, 0x00, 0x00,
+                                0x01, 0x00, 0x00, 0x00,
+                                0x01, 0x00, 0x00, 0x00,
+                                0x00, 0x00, 0x00, 0x00,
+                                0xa2, 0x89, 0xcc, 0x33,
+                                0xbc, 0xbb, 0x8b, 0x4f,
+                                0xb6, 0xb0, 0x13, 0x3e,
+                                0xc2, 0xaa, 0xe6, 0xdf,
+                                0x04, 0x00, 0x00, 0x00,
+                                0x00, 0x00, 0x00, 0x00,
+                                0x0c, 0x00, 0x00, 0x00,
+                                0x00, 0x00, 0x00, 0x00,
+                                0x00, 0x00, 0x00, 0x00,
+                                0x00, 0x00, 0x00, 0x00 };
+
+    message = mbim_message_new (buffer, sizeof (buffer));
+
+    printed = g_string_new ("");
+    mbim_message_print (message, ">>>>>> ", FALSE, printer_func, printed);
+    printable = mbim_message_get_printable (message, ">>>>>> ", FALSE);
+    g_assert_cmpstr (printed->str, ==, printable);
+    g_assert (strstr (printable, ">>>>>> Fields:\n") != NULL);
+    g_assert (strstr (printable, ">>>>>>   PinType = ") != NULL);
+    g_free (printable);
+
+    g_string_truncate (printed, 0);
+    mbim_message_print (message, "", TRUE, printer_func, printed);
+    printable = mbim_message_get_printable (message, "", TRUE);
+    g_assert_cmpstr (printed->str, ==, printable);
+    g_assert (strstr (printable, "Fields:") == NULL);
+    g_free (printable);
+
+    g_string_free (printed, TRUE);
+    mbim_message_unref (message);
+}
+
+static void
+test_message_json (void)
+{
+    MbimMessage *message;
+    gchar *json;
+    gchar buffer[32];
+    gsize len;
+    const gchar *expected =
+        "{\"type\":\"command-done\","
+        "\"transaction\":1,"
+        "\"service\":\"basic-connect\","
+        "\"cid\":\"pin\","
+        "\"status\":\"None\","
+        "\"fields\":{\"PinType\":\"unknown\",\"PinState\":\"unlocked\",\"RemainingAttempts\":0}}";
+    const guint8 buffer_message [] =  { 0x03, 0x00, 0x00, 0x80,
+                                        0x3c, 0x00, 0x00, 0x00,
+                                        0x01, 0x00, 0x00, 0x00,
+                                        0x01, 0x00, 0x00, 0x00,
+                                        0x00, 0x00, 0x00, 0x00,
+                                        0xa2, 0x89, 0xcc, 0x33,
+                                        0xbc, 0xbb, 0x8b, 0x4f,
+                                        0xb6, 0xb0, 0x13, 0x3e,
+                                        0xc2, 0xaa, 0xe6, 0xdf,
+                                        0x04, 0x00, 0x00, 0x00,
+                                        0x00, 0x00, 0x00, 0x00,
+                                        0x0c, 0x00, 0x00, 0x00,
+                                        0x00, 0x00, 0x00, 0x00,
+                                        0x00, 0x00, 0x00, 0x00,
+                                        0x00, 0x00, 0x00, 0x00 };
+
+    message = mbim_message_new (buffer_message, sizeof (buffer_message));
+
+    json = mbim_message_get_json (message);
+    g_assert_cmpstr (json, ==, expected);
+    g_free (json);
+
+    /* Truncated output, snprintf-like */
+    len = mbim_message_write_json (message, buffer, sizeof (buffer));
+    g_assert_cmpuint (len, ==, strlen (expected));
+    g_assert_cmpuint (strlen (buffer), ==, sizeof (buffer) - 1);
+    g_assert (strncmp (buffer, expected, sizeof (buffer) - 1) == 0);
+
+    /* Length only */
+    g_assert_cmpuint (mbim_message_write_json (message, NULL, 0), ==, strlen (expected));
+
+    mbim_message_unref (message);
+}
+
+static void
+test_message_keyvalue (void)
+{
+    MbimMessage *message;
+    GString *printed;
+    const gchar *expected =
+        "response.type=command-done\n"
+        "response.transaction=1\n"
+        "response.service=basic-connect\n"
+        "response.cid=pin\n"
+        "response.status=None\n"
+        "response.fields.PinType=unknown\n"
+        "response.fields.PinState=unlocked\n"
+        "response.fields.RemainingAttempts=0\n";
+    const gchar *expected_fragment =
+        "type=command-done\n"
+        "transaction=1\n"
+        "fragment.total=2\n"
+        "fragment.current=0\n";
+    guint8 buffer_message [] =  { 0x03, 0x00, 0x00, 0x80,
+                                  0x3c, 0x00, 0x00, 0x00,
+                                  0x01, 0x00, 0x00, 0x00,
+                                  0x01, 0x00, 0x00, 0x00,
+                                  0x00, 0x00, 0x00, 0x00,
+                                  0xa2, 0x89, 0xcc, 0x33,
+                                  0xbc, 0xbb, 0x8b, 0x4f,
+                                  0xb6, 0xb0, 0x13, 0x3e,
+                                  0xc2, 0xaa, 0xe6, 0xdf,
+                                  0x04, 0x00, 0x00, 0x00,
+                                  0x00, 0x00, 0x00, 0x00,
+                                  0x0c, 0x00, 0x00, 0x00,
+                                  0x00, 0x00, 0x00, 0x00,
+                                  0x00, 0x00, 0x00, 0x00,
+                                  0x00, 0x00, 0x00, 0x00 };
+
+    printed = g_string_new ("");
+
+    message = mbim_message_new (buffer_message, sizeof (buffer_message));
+    mbim_message_print_keyvalue (message, "response", printer_func, printed);
+    g_assert_cmpstr (printed->str, ==, expected);
+    mbim_message_unref (message);
+
+    /* Nested objects without prefix; partial fragments only have headers */
+    buffer_message[12] = 0x02;
+    g_string_truncate (printed, 0);
+    message = mbim_message_new (buffer_message, sizeof (buffer_message));
+    mbim_message_print_keyvalue (message, NULL, printer_func, printed);
+    g_assert_cmpstr (printed->str, ==, expected_fragment);
+    mbim_message_unref (message);
+
+    g_string_free (printed, TRUE);
+}
+
 int main (int argc, char **argv)
 {
     g_test_init (&argc, &argv, NULL);
@@ -233,6 +387,9 @@ int main (int argc, char **argv)
     g_test_add_func ("/libmbim-glib/message/command/not-empty",      test_message_command_not_empty);
     g_test_add_func ("/libmbim-glib/message/command/custom-service", test_message_command_custom_service);
     g_test_add_func ("/libmbim-glib/message/command-done",           test_message_command_done);
+    g_test_add_func ("/libmbim-glib/message/print",                  test_message_print);
+    g_test_add_func ("/libmbim-glib/message/json",                   test_message_json);
+    g_test_add_func ("/libmbim-glib/message/keyvalue",               test_message_keyvalue);
 
     return g_test_run ();
 }
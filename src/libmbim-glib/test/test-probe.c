@@ -0,0 +1,232 @@
+/* -*- Mode: C; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*- */
+/*
+ * This program is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation; either version 2 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details:
+ *
+ * Copyright (C) 2013 - 2014 Aleksander Morgado <aleksander@aleksander.es>
+ */
+
+#include <config.h>
+#include <string.h>
+
+#include "mbim-probe.h"
+
+typedef struct {
+    guint          n_calls;
+    MbimProbePoint last_point;
+    gint64         last_timestamp;
+    const guint8  *last_data;
+    gsize          last_data_length;
+} ProbeContext;
+
+static void
+probe_func (MbimProbePoint  point,
+            gint64          timestamp,
+            const guint8   *data,
+            gsize           data_length,
+            ProbeContext   *ctx)
+{
+    ctx->n_calls++;
+    ctx->last_point = point;
+    ctx->last_timestamp = timestamp;
+    ctx->last_data = data;
+    ctx->last_data_length = data_length;
+}
+
+static void
+test_probe_fire (void)
+{
+    static const guint8  buffer[] = { 0x01, 0x02, 0x03, 0x04 };
+    MbimProbeList       *list = NULL;
+    ProbeContext         received = { 0 };
+    ProbeContext         written = { 0 };
+    guint                received_id;
+    guint                written_id;
+    gint64               before;
+
+    received_id = _mbim_probe_list_add (&list,
+                                        MBIM_PROBE_POINT_MESSAGE_RECEIVED | MBIM_PROBE_POINT_MESSAGE_COMPLETED,
+                                        (MbimProbeFunc)probe_func, &received, NULL);
+    written_id = _mbim_probe_list_add (&list,
+                                       MBIM_PROBE_POINT_MESSAGE_WRITTEN,
+                                       (MbimProbeFunc)probe_func, &written, NULL);
+    g_assert (list);
+    g_assert_cmpuint (received_id, !=, written_id);
+
+    /* Only probes attached to the point are called */
+    before = g_get_monotonic_time ();
+    _mbim_probe (list, MBIM_PROBE_POINT_MESSAGE_RECEIVED, buffer, sizeof (buffer));
+    g_assert_cmpuint (received.n_calls, ==, 1);
+    g_assert_cmpuint (received.last_point, ==, MBIM_PROBE_POINT_MESSAGE_RECEIVED);
+    g_assert_cmpint (received.last_timestamp, >=, before);
+    g_assert (received.last_data == buffer);
+    g_assert_cmpuint (received.last_data_length, ==, sizeof (buffer));
+    g_assert_cmpuint (written.n_calls, ==, 0);
+
+    _mbim_probe (list, MBIM_PROBE_POINT_MESSAGE_WRITTEN, buffer, 2);
+    g_assert_cmpuint (received.n_calls, ==, 1);
+    g_assert_cmpuint (written.n_calls, ==, 1);
+    g_assert_cmpuint (written.last_data_length, ==, 2);
+
+    /* No probe attached to this point */
+    _mbim_probe (list, MBIM_PROBE_POINT_FRAGMENT_ADDED, buffer, sizeof (buffer));
+    g_assert_cmpuint (received.n_calls, ==, 1);
+    g_assert_cmpuint (written.n_calls, ==, 1);
+
+    /* The list goes away with the last probe */
+    g_assert (_mbim_probe_list_remove (&list, received_id));
+    g_assert (!_mbim_probe_list_remove (&list, received_id));
+    g_assert (list);
+    g_assert (_mbim_probe_list_remove (&list, written_id));
+    g_assert (list == NULL);
+
+    /* Nothing to call without probes */
+    _mbim_probe (list, MBIM_PROBE_POINT_MESSAGE_WRITTEN, buffer, sizeof (buffer));
+    g_assert_cmpuint (written.n_calls, ==, 1);
+}
+
+static void
+user_data_free (guint *n_freed)
+{
+    (*n_freed)++;
+}
+
+static guint n_freed;
+
+static void
+test_probe_user_data_free (void)
+{
+    MbimProbeList *list = NULL;
+    guint          id;
+
+    n_freed = 0;
+
+    id = _mbim_probe_list_add (&list, MBIM_PROBE_POINT_MESSAGE_WRITTEN,
+                               (MbimProbeFunc)probe_func, &n_freed, (GDestroyNotify)user_data_free);
+    g_assert (_mbim_probe_list_remove (&list, id));
+    g_assert_cmpuint (n_freed, ==, 1);
+
+    _mbim_probe_list_add (&list, MBIM_PROBE_POINT_MESSAGE_WRITTEN,
+                          (MbimProbeFunc)probe_func, &n_freed, (GDestroyNotify)user_data_free);
+    _mbim_probe_list_free (list);
+    g_assert_cmpuint (n_freed, ==, 2);
+}
+
+typedef struct {
+    MbimProbeList **list;
+    guint           id;
+    guint           other_id;
+    guint           added_id;
+    ProbeContext    added;
+    guint           n_calls;
+    guint           n_freed;
+} SelfRemovingContext;
+
+static void
+self_removing_free (SelfRemovingContext *ctx)
+{
+    ctx->n_freed++;
+}
+
+static void
+self_removing_probe_func (MbimProbePoint       point,
+                          gint64               timestamp,
+                          const guint8        *data,
+                          gsize                data_length,
+                          SelfRemovingContext *ctx)
+{
+    ctx->n_calls++;
+
+    /* The user data is only freed once the callback returns */
+    g_assert (_mbim_probe_list_remove (ctx->list, ctx->id));
+    g_assert_cmpuint (ctx->n_freed, ==, 0);
+
+    if (ctx->other_id)
+        g_assert (_mbim_probe_list_remove (ctx->list, ctx->other_id));
+
+    ctx->added_id = _mbim_probe_list_add (ctx->list, MBIM_PROBE_POINT_MESSAGE_WRITTEN,
+                                          (MbimProbeFunc)probe_func, &ctx->added, NULL);
+}
+
+static void
+test_probe_remove_from_callback (void)
+{
+    static const guint8  buffer[] = { 0x01, 0x02, 0x03, 0x04 };
+    MbimProbeList       *list = NULL;
+    SelfRemovingContext  ctx = { 0 };
+    ProbeContext         other = { 0 };
+
+    ctx.list = &list;
+
+    /* Single probe removing itself, the list goes away along with it */
+    ctx.id = _mbim_probe_list_add (&list, MBIM_PROBE_POINT_MESSAGE_WRITTEN,
+                                   (MbimProbeFunc)self_removing_probe_func, &ctx,
+                                   (GDestroyNotify)self_removing_free);
+    _mbim_probe (list, MBIM_PROBE_POINT_MESSAGE_WRITTEN, buffer, sizeof (buffer));
+    g_assert_cmpuint (ctx.n_calls, ==, 1);
+    g_assert_cmpuint (ctx.n_freed, ==, 1);
+
+    /* The probe added from the callback wasn't called yet */
+    g_assert_cmpuint (ctx.added.n_calls, ==, 0);
+    g_assert (list);
+    g_assert (_mbim_probe_list_remove (&list, ctx.added_id));
+    g_assert (list == NULL);
+
+    /* Probe removing itself and the one after it, which is not called */
+    memset (&ctx, 0, sizeof (ctx));
+    ctx.list = &list;
+    ctx.id = _mbim_probe_list_add (&list, MBIM_PROBE_POINT_MESSAGE_WRITTEN,
+                                   (MbimProbeFunc)self_removing_probe_func, &ctx,
+                                   (GDestroyNotify)self_removing_free);
+    ctx.other_id = _mbim_probe_list_add (&list, MBIM_PROBE_POINT_MESSAGE_WRITTEN,
+                                         (MbimProbeFunc)probe_func, &other, NULL);
+    _mbim_probe (list, MBIM_PROBE_POINT_MESSAGE_WRITTEN, buffer, sizeof (buffer));
+    g_assert_cmpuint (ctx.n_calls, ==, 1);
+    g_assert_cmpuint (ctx.n_freed, ==, 1);
+    g_assert_cmpuint (other.n_calls, ==, 0);
+    g_assert_cmpuint (ctx.added.n_calls, ==, 0);
+
+    g_assert (list);
+    g_assert (_mbim_probe_list_remove (&list, ctx.added_id));
+    g_assert (list == NULL);
+}
+
+static void
+test_probe_many (void)
+{
+    static const guint8  buffer[] = { 0x01, 0x02, 0x03, 0x04 };
+    MbimProbeList       *list = NULL;
+    ProbeContext         ctx = { 0 };
+    guint                ids[20];
+    guint                i;
+
+    /* More probes than fired without allocating */
+    for (i = 0; i < G_N_ELEMENTS (ids); i++)
+        ids[i] = _mbim_probe_list_add (&list, MBIM_PROBE_POINT_MESSAGE_WRITTEN,
+                                       (MbimProbeFunc)probe_func, &ctx, NULL);
+    _mbim_probe (list, MBIM_PROBE_POINT_MESSAGE_WRITTEN, buffer, sizeof (buffer));
+    g_assert_cmpuint (ctx.n_calls, ==, G_N_ELEMENTS (ids));
+
+    for (i = 0; i < G_N_ELEMENTS (ids); i++)
+        g_assert (_mbim_probe_list_remove (&list, ids[i]));
+    g_assert (list == NULL);
+}
+
+int main (int argc, char **argv)
+{
+    g_test_init (&argc, &argv, NULL);
+
+    g_test_add_func ("/libmbim-glib/probe/fire",           test_probe_fire);
+    g_test_add_func ("/libmbim-glib/probe/user-data-free", test_probe_user_data_free);
+    g_test_add_func ("/libmbim-glib/probe/remove-from-callback", test_probe_remove_from_callback);
+    g_test_add_func ("/libmbim-glib/probe/many",           test_probe_many);
+
+    return g_test_run ();
+}
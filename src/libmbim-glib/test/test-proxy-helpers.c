@@ -15,10 +15,14 @@
 
 #include <config.h>
 #include <string.h>
+#include <unistd.h>
+#include <glib/gstdio.h>
 
 #include "mbim-cid.h"
 #include "mbim-uuid.h"
 #include "mbim-basic-connect.h"
+#include "mbim-message.h"
+#include "mbim-message-private.h"
 #include "mbim-proxy-helpers.h"
 
 /*****************************************************************************/
@@ -124,12 +128,15 @@ test_parse_single_service_5_cids (void)
 static void
 test_merge_none (void)
 {
-    MbimEventEntry **list = NULL;
-    gsize list_size = 0;
+    MbimProxyEventSet *set;
+    MbimEventEntry **list;
     gsize out_size = 0;
 
     /* merge */
-    list = _mbim_proxy_helper_service_subscribe_list_merge (list, list_size, NULL, 0, &out_size);
+    set = _mbim_proxy_helper_event_set_new ();
+    g_assert (!_mbim_proxy_helper_event_set_add (set, NULL, 0));
+    list = _mbim_proxy_helper_event_set_build_list (set, &out_size);
+    _mbim_proxy_helper_event_set_free (set);
 
     g_assert (list == NULL);
     g_assert_cmpuint (out_size, ==, 0);
@@ -138,8 +145,8 @@ test_merge_none (void)
 static void
 test_merge_standard_services (void)
 {
-    MbimEventEntry **list = NULL;
-    gsize list_size = 0;
+    MbimProxyEventSet *set;
+    MbimEventEntry **list;
     MbimEventEntry **addition;
     gsize addition_size;
     gsize out_size = 0;
@@ -164,7 +171,10 @@ test_merge_standard_services (void)
     addition[1]->cids[1] = MBIM_CID_SMS_SEND;
 
     /* merge */
-    list = _mbim_proxy_helper_service_subscribe_list_merge (list, list_size, addition, addition_size, &out_size);
+    set = _mbim_proxy_helper_event_set_new ();
+    g_assert (!_mbim_proxy_helper_event_set_add (set, (const MbimEventEntry * const *)addition, addition_size));
+    list = _mbim_proxy_helper_event_set_build_list (set, &out_size);
+    _mbim_proxy_helper_event_set_free (set);
 
     /* The new list should be empty, as standard services are ignored */
     g_assert (list == NULL);
@@ -176,8 +186,8 @@ test_merge_standard_services (void)
 static void
 test_merge_other_services (void)
 {
-    MbimEventEntry **list = NULL;
-    gsize list_size = 0;
+    MbimProxyEventSet *set;
+    MbimEventEntry **list;
     MbimEventEntry **addition;
     gsize addition_size;
     gsize out_size = 0;
@@ -201,7 +211,10 @@ test_merge_other_services (void)
     addition[1]->cids[0] = MBIM_CID_QMI_MSG;
 
     /* merge */
-    list = _mbim_proxy_helper_service_subscribe_list_merge (list, list_size, addition, addition_size, &out_size);
+    set = _mbim_proxy_helper_event_set_new ();
+    g_assert (_mbim_proxy_helper_event_set_add (set, (const MbimEventEntry * const *)addition, addition_size));
+    list = _mbim_proxy_helper_event_set_build_list (set, &out_size);
+    _mbim_proxy_helper_event_set_free (set);
 
     /* The new list should be totally equal to the addition, as the original list was empty. */
     g_assert (_mbim_proxy_helper_service_subscribe_list_cmp ((const MbimEventEntry * const *)list, out_size,
@@ -214,6 +227,7 @@ test_merge_other_services (void)
 static void
 test_merge_list_same_service (void)
 {
+    MbimProxyEventSet *set;
     MbimEventEntry **list;
     gsize list_size;
     MbimEventEntry **addition;
@@ -244,7 +258,12 @@ test_merge_list_same_service (void)
     addition[0]->cids[2] = MBIM_CID_ATDS_REGISTER_STATE;
 
     /* merge */
-    list = _mbim_proxy_helper_service_subscribe_list_merge (list, list_size, addition, addition_size, &out_size);
+    set = _mbim_proxy_helper_event_set_new ();
+    g_assert (_mbim_proxy_helper_event_set_add (set, (const MbimEventEntry * const *)list, list_size));
+    g_assert (_mbim_proxy_helper_event_set_add (set, (const MbimEventEntry * const *)addition, addition_size));
+    mbim_event_entry_array_free (list);
+    list = _mbim_proxy_helper_event_set_build_list (set, &out_size);
+    _mbim_proxy_helper_event_set_free (set);
 
     /* setup the expected list */
     expected_size = 1;
@@ -271,6 +290,7 @@ test_merge_list_same_service (void)
 static void
 test_merge_list_different_services (void)
 {
+    MbimProxyEventSet *set;
     MbimEventEntry **list;
     gsize list_size;
     MbimEventEntry **addition;
@@ -299,7 +319,12 @@ test_merge_list_different_services (void)
     addition[0]->cids[0] = MBIM_CID_QMI_MSG;
 
     /* merge */
-    list = _mbim_proxy_helper_service_subscribe_list_merge (list, list_size, addition, addition_size, &out_size);
+    set = _mbim_proxy_helper_event_set_new ();
+    g_assert (_mbim_proxy_helper_event_set_add (set, (const MbimEventEntry * const *)list, list_size));
+    g_assert (_mbim_proxy_helper_event_set_add (set, (const MbimEventEntry * const *)addition, addition_size));
+    mbim_event_entry_array_free (list);
+    list = _mbim_proxy_helper_event_set_build_list (set, &out_size);
+    _mbim_proxy_helper_event_set_free (set);
 
     /* setup the expected list */
     expected_size = 2;
@@ -328,6 +353,7 @@ test_merge_list_different_services (void)
 static void
 test_merge_list_merged_services (void)
 {
+    MbimProxyEventSet *set;
     MbimEventEntry **list;
     gsize list_size;
     MbimEventEntry **addition;
@@ -367,7 +393,12 @@ test_merge_list_merged_services (void)
     addition[1]->cids[0] = MBIM_CID_MS_HOST_SHUTDOWN_NOTIFY;
 
     /* merge */
-    list = _mbim_proxy_helper_service_subscribe_list_merge (list, list_size, addition, addition_size, &out_size);
+    set = _mbim_proxy_helper_event_set_new ();
+    g_assert (_mbim_proxy_helper_event_set_add (set, (const MbimEventEntry * const *)list, list_size));
+    g_assert (_mbim_proxy_helper_event_set_add (set, (const MbimEventEntry * const *)addition, addition_size));
+    mbim_event_entry_array_free (list);
+    list = _mbim_proxy_helper_event_set_build_list (set, &out_size);
+    _mbim_proxy_helper_event_set_free (set);
 
     /* setup the expected list */
     expected_size = 3;
@@ -402,6 +433,570 @@ test_merge_list_merged_services (void)
 
 /*****************************************************************************/
 
+static void
+test_event_set_standard_services (void)
+{
+    MbimProxyEventSet *set;
+    MbimEventEntry **addition;
+    gsize addition_size;
+    MbimEventEntry **list;
+    gsize list_size = 0;
+    MbimEventEntry **expected;
+    gsize expected_size = 0;
+
+    set = _mbim_proxy_helper_event_set_new_standard ();
+
+    /* setup a new list with a subset of standard services */
+    addition_size = 1;
+    addition = g_new0 (MbimEventEntry *, addition_size + 1);
+    addition[0] = g_new0 (MbimEventEntry, 1);
+    memcpy (&addition[0]->device_service_id, MBIM_UUID_BASIC_CONNECT, sizeof (MbimUuid));
+    addition[0]->cids_count = 1;
+    addition[0]->cids = g_new0 (guint32, addition[0]->cids_count);
+    addition[0]->cids[0] = MBIM_CID_BASIC_CONNECT_NETWORK_IDLE_HINT;
+
+    /* Standard services are ignored */
+    g_assert (!_mbim_proxy_helper_event_set_add (set, (const MbimEventEntry * const *)addition, addition_size));
+    g_assert (!_mbim_proxy_helper_event_set_remove (set, (const MbimEventEntry * const *)addition, addition_size));
+
+    list = _mbim_proxy_helper_event_set_build_list (set, &list_size);
+    expected = _mbim_proxy_helper_service_subscribe_list_new_standard (&expected_size);
+    g_assert (_mbim_proxy_helper_service_subscribe_list_cmp ((const MbimEventEntry * const *)list, list_size,
+                                                             (const MbimEventEntry * const *)expected, expected_size));
+
+    mbim_event_entry_array_free (list);
+    mbim_event_entry_array_free (expected);
+    mbim_event_entry_array_free (addition);
+    _mbim_proxy_helper_event_set_free (set);
+}
+
+static void
+test_event_set_refcount (void)
+{
+    MbimProxyEventSet *set;
+    MbimEventEntry **first;
+    MbimEventEntry **second;
+    MbimEventEntry **list;
+    gsize list_size = 0;
+
+    set = _mbim_proxy_helper_event_set_new ();
+
+    first = g_new0 (MbimEventEntry *, 2);
+    first[0] = g_new0 (MbimEventEntry, 1);
+    memcpy (&first[0]->device_service_id, MBIM_UUID_ATDS, sizeof (MbimUuid));
+    first[0]->cids_count = 2;
+    first[0]->cids = g_new0 (guint32, first[0]->cids_count);
+    first[0]->cids[0] = MBIM_CID_ATDS_SIGNAL;
+    first[0]->cids[1] = MBIM_CID_ATDS_LOCATION;
+
+    second = g_new0 (MbimEventEntry *, 2);
+    second[0] = g_new0 (MbimEventEntry, 1);
+    memcpy (&second[0]->device_service_id, MBIM_UUID_ATDS, sizeof (MbimUuid));
+    second[0]->cids_count = 1;
+    second[0]->cids = g_new0 (guint32, second[0]->cids_count);
+    second[0]->cids[0] = MBIM_CID_ATDS_SIGNAL;
+
+    /* Only the first addition modifies the effective set */
+    g_assert (_mbim_proxy_helper_event_set_add (set, (const MbimEventEntry * const *)first, 1));
+    g_assert (!_mbim_proxy_helper_event_set_add (set, (const MbimEventEntry * const *)second, 1));
+
+    /* Removing the first one drops the CID only it had */
+    g_assert (_mbim_proxy_helper_event_set_remove (set, (const MbimEventEntry * const *)first, 1));
+    list = _mbim_proxy_helper_event_set_build_list (set, &list_size);
+    g_assert (_mbim_proxy_helper_service_subscribe_list_cmp ((const MbimEventEntry * const *)list, list_size,
+                                                             (const MbimEventEntry * const *)second, 1));
+    mbim_event_entry_array_free (list);
+
+    /* Removing the last one leaves the set empty */
+    g_assert (_mbim_proxy_helper_event_set_remove (set, (const MbimEventEntry * const *)second, 1));
+    list = _mbim_proxy_helper_event_set_build_list (set, &list_size);
+    g_assert (list == NULL);
+    g_assert_cmpuint (list_size, ==, 0);
+
+    mbim_event_entry_array_free (first);
+    mbim_event_entry_array_free (second);
+    _mbim_proxy_helper_event_set_free (set);
+}
+
+static void
+test_event_set_wildcard (void)
+{
+    MbimProxyEventSet *set;
+    MbimEventEntry **wildcard;
+    MbimEventEntry **single;
+    MbimEventEntry **list;
+    gsize list_size = 0;
+
+    set = _mbim_proxy_helper_event_set_new ();
+
+    wildcard = g_new0 (MbimEventEntry *, 2);
+    wildcard[0] = g_new0 (MbimEventEntry, 1);
+    memcpy (&wildcard[0]->device_service_id, MBIM_UUID_QMI, sizeof (MbimUuid));
+    wildcard[0]->cids_count = 0;
+    wildcard[0]->cids = NULL;
+
+    single = g_new0 (MbimEventEntry *, 2);
+    single[0] = g_new0 (MbimEventEntry, 1);
+    memcpy (&single[0]->device_service_id, MBIM_UUID_QMI, sizeof (MbimUuid));
+    single[0]->cids_count = 1;
+    single[0]->cids = g_new0 (guint32, single[0]->cids_count);
+    single[0]->cids[0] = MBIM_CID_QMI_MSG;
+
+    /* Explicit CIDs don't change anything if all CIDs already enabled */
+    g_assert (_mbim_proxy_helper_event_set_add (set, (const MbimEventEntry * const *)wildcard, 1));
+    g_assert (!_mbim_proxy_helper_event_set_add (set, (const MbimEventEntry * const *)single, 1));
+
+    list = _mbim_proxy_helper_event_set_build_list (set, &list_size);
+    g_assert (_mbim_proxy_helper_service_subscribe_list_cmp ((const MbimEventEntry * const *)list, list_size,
+                                                             (const MbimEventEntry * const *)wildcard, 1));
+    mbim_event_entry_array_free (list);
+
+    /* Removing the wildcard leaves only the explicit CID */
+    g_assert (_mbim_proxy_helper_event_set_remove (set, (const MbimEventEntry * const *)wildcard, 1));
+    list = _mbim_proxy_helper_event_set_build_list (set, &list_size);
+    g_assert (_mbim_proxy_helper_service_subscribe_list_cmp ((const MbimEventEntry * const *)list, list_size,
+                                                             (const MbimEventEntry * const *)single, 1));
+    mbim_event_entry_array_free (list);
+
+    mbim_event_entry_array_free (wildcard);
+    mbim_event_entry_array_free (single);
+    _mbim_proxy_helper_event_set_free (set);
+}
+
+/*****************************************************************************/
+
+#define TEST_CAPTURE_DEVICE_PATH "/dev/cdc-wdm0"
+
+static void
+test_capture_ring (void)
+{
+    MbimProxyCapture *capture;
+    GError *error = NULL;
+    gchar *path;
+    gchar *contents = NULL;
+    gsize contents_len = 0;
+    guint8 data[16];
+    guint8 big[1000];
+    guint i;
+    gsize offset;
+    guint32 n_records;
+    guint32 last_client_id = 0;
+    guint32 last_captured_len = 0;
+    guint32 last_original_len = 0;
+    gint fd;
+
+    /* Room for 4 records of 24 (header) + 13 (path) + 16 (data) bytes */
+    capture = _mbim_proxy_helper_capture_new (256);
+    g_assert (capture);
+
+    for (i = 0; i < 10; i++) {
+        memset (data, i, sizeof (data));
+        _mbim_proxy_helper_capture_record (capture,
+                                           (i % 2) ? MBIM_PROXY_CAPTURE_DIRECTION_TO_CLIENT : MBIM_PROXY_CAPTURE_DIRECTION_FROM_CLIENT,
+                                           i,
+                                           TEST_CAPTURE_DEVICE_PATH,
+                                           data,
+                                           sizeof (data));
+    }
+
+    /* Oldest records are dropped */
+    g_assert_cmpuint (_mbim_proxy_helper_capture_get_n_records (capture), ==, 4);
+
+    /* Oversized records are truncated */
+    memset (big, 0xAA, sizeof (big));
+    _mbim_proxy_helper_capture_record (capture,
+                                       MBIM_PROXY_CAPTURE_DIRECTION_TO_CLIENT,
+                                       10,
+                                       TEST_CAPTURE_DEVICE_PATH,
+                                       big,
+                                       sizeof (big));
+    g_assert_cmpuint (_mbim_proxy_helper_capture_get_n_records (capture), ==, 3);
+
+    fd = g_file_open_tmp ("test-capture-XXXXXX", &path, &error);
+    g_assert_no_error (error);
+    close (fd);
+
+    g_assert (_mbim_proxy_helper_capture_dump (capture, path, &error));
+    g_assert_no_error (error);
+    g_assert (g_file_get_contents (path, &contents, &contents_len, &error));
+    g_assert_no_error (error);
+
+    g_assert_cmpuint (contents_len, >, 16);
+    g_assert (memcmp (contents, "MBIMCAP", 8) == 0);
+    memcpy (&n_records, &contents[12], sizeof (n_records));
+    g_assert_cmpuint (GUINT32_FROM_LE (n_records), ==, 3);
+
+    /* Walk all records */
+    offset = 16;
+    for (i = 0; i < 3; i++) {
+        guint16 path_len;
+
+        g_assert_cmpuint (offset + 24, <=, contents_len);
+        memcpy (&last_client_id,    &contents[offset + 8],  4);
+        memcpy (&path_len,          &contents[offset + 14], 2);
+        memcpy (&last_captured_len, &contents[offset + 16], 4);
+        memcpy (&last_original_len, &contents[offset + 20], 4);
+        last_client_id = GUINT32_FROM_LE (last_client_id);
+        last_captured_len = GUINT32_FROM_LE (last_captured_len);
+        last_original_len = GUINT32_FROM_LE (last_original_len);
+        path_len = GUINT16_FROM_LE (path_len);
+
+        g_assert_cmpuint (path_len, ==, strlen (TEST_CAPTURE_DEVICE_PATH));
+        g_assert (memcmp (&contents[offset + 24], TEST_CAPTURE_DEVICE_PATH, path_len) == 0);
+
+        /* Records are kept in order */
+        g_assert_cmpuint (last_client_id, ==, 8 + i);
+        if (last_client_id < 10) {
+            g_assert_cmpuint (last_captured_len, ==, sizeof (data));
+            g_assert_cmpuint ((guint8)contents[offset + 24 + path_len], ==, last_client_id);
+        }
+
+        offset += 24 + path_len + last_captured_len;
+    }
+    g_assert_cmpuint (offset, ==, contents_len);
+
+    g_assert_cmpuint (last_original_len, ==, sizeof (big));
+    g_assert_cmpuint (last_captured_len, <, sizeof (big));
+
+    g_unlink (path);
+    g_free (path);
+    g_free (contents);
+    _mbim_proxy_helper_capture_free (capture);
+}
+
+/*****************************************************************************/
+
+static void
+test_latency_stats (void)
+{
+    MbimProxyLatencyStats *stats;
+    const MbimUuid *service_id = NULL;
+    guint32 cid = 0;
+    guint32 count = 0;
+    guint32 p50 = 0;
+    guint32 p99 = 0;
+    guint i;
+
+    stats = _mbim_proxy_helper_latency_stats_new ();
+
+    for (i = 0; i < 98; i++)
+        _mbim_proxy_helper_latency_stats_record (stats, MBIM_UUID_BASIC_CONNECT, MBIM_CID_BASIC_CONNECT_DEVICE_CAPS, 100);
+    for (i = 0; i < 2; i++)
+        _mbim_proxy_helper_latency_stats_record (stats, MBIM_UUID_BASIC_CONNECT, MBIM_CID_BASIC_CONNECT_DEVICE_CAPS, 10000);
+    _mbim_proxy_helper_latency_stats_record (stats, MBIM_UUID_QMI, MBIM_CID_QMI_MSG, 0);
+
+    g_assert_cmpuint (_mbim_proxy_helper_latency_stats_get_n_entries (stats), ==, 2);
+
+    /* Percentiles are given as the upper bounds of the log2 buckets */
+    _mbim_proxy_helper_latency_stats_get_entry (stats, 0, &service_id, &cid, &count, &p50, &p99);
+    g_assert (mbim_uuid_cmp (service_id, MBIM_UUID_BASIC_CONNECT));
+    g_assert_cmpuint (cid, ==, MBIM_CID_BASIC_CONNECT_DEVICE_CAPS);
+    g_assert_cmpuint (count, ==, 100);
+    g_assert_cmpuint (p50, ==, 127);
+    g_assert_cmpuint (p99, ==, 16383);
+
+    _mbim_proxy_helper_latency_stats_get_entry (stats, 1, &service_id, &cid, &count, &p50, &p99);
+    g_assert (mbim_uuid_cmp (service_id, MBIM_UUID_QMI));
+    g_assert_cmpuint (cid, ==, MBIM_CID_QMI_MSG);
+    g_assert_cmpuint (count, ==, 1);
+    g_assert_cmpuint (p50, ==, 1);
+    g_assert_cmpuint (p99, ==, 1);
+
+    _mbim_proxy_helper_latency_stats_free (stats);
+}
+
+/*****************************************************************************/
+
+static MbimMessage *
+radio_state_query_new (guint32 transaction_id)
+{
+    return mbim_message_command_new (transaction_id,
+                                     MBIM_SERVICE_BASIC_CONNECT,
+                                     MBIM_CID_BASIC_CONNECT_RADIO_STATE,
+                                     MBIM_MESSAGE_COMMAND_TYPE_QUERY);
+}
+
+static MbimMessage *
+radio_state_response_new (guint32         transaction_id,
+                          MbimStatusError status,
+                          guint32         hw_radio_state)
+{
+    MbimMessageCommandBuilder *builder;
+
+    builder = _mbim_message_command_done_builder_new (transaction_id,
+                                                      MBIM_SERVICE_BASIC_CONNECT,
+                                                      MBIM_CID_BASIC_CONNECT_RADIO_STATE,
+                                                      status);
+    if (status == MBIM_STATUS_ERROR_NONE) {
+        _mbim_message_command_builder_append_guint32 (builder, hw_radio_state);
+        _mbim_message_command_builder_append_guint32 (builder, MBIM_RADIO_SWITCH_STATE_ON);
+    }
+    return _mbim_message_command_builder_complete (builder);
+}
+
+static guint32
+radio_state_response_get_hw_radio_state (MbimMessage *response)
+{
+    MbimRadioSwitchState hw_radio_state = MBIM_RADIO_SWITCH_STATE_OFF;
+
+    g_assert (mbim_message_radio_state_response_parse (response, &hw_radio_state, NULL, NULL));
+    return hw_radio_state;
+}
+
+static void
+test_query_cache_hit (void)
+{
+    MbimProxyQueryCache *cache;
+    MbimMessage *query;
+    MbimMessage *response = NULL;
+    MbimMessage *cached = NULL;
+    GList *waiters;
+    gint waiter;
+
+    cache = _mbim_proxy_helper_query_cache_new ();
+
+    /* Nothing cached, the query must be sent */
+    query = radio_state_query_new (10);
+    g_assert_cmpuint (_mbim_proxy_helper_query_cache_lookup (cache, query, &waiter, &cached), ==, MBIM_PROXY_QUERY_CACHE_LOOKUP_MISS);
+    g_assert (!cached);
+    mbim_message_unref (query);
+
+    response = radio_state_response_new (1000, MBIM_STATUS_ERROR_NONE, MBIM_RADIO_SWITCH_STATE_ON);
+    waiters = _mbim_proxy_helper_query_cache_complete (cache, MBIM_SERVICE_BASIC_CONNECT, MBIM_CID_BASIC_CONNECT_RADIO_STATE, response);
+    g_assert_cmpuint (g_list_length (waiters), ==, 1);
+    g_assert (waiters->data == &waiter);
+    g_list_free (waiters);
+    mbim_message_unref (response);
+
+    /* Replied from the cache, with the transaction ID of the new query */
+    query = radio_state_query_new (20);
+    g_assert_cmpuint (_mbim_proxy_helper_query_cache_lookup (cache, query, &waiter, &cached), ==, MBIM_PROXY_QUERY_CACHE_LOOKUP_HIT);
+    g_assert (cached);
+    g_assert_cmpuint (mbim_message_get_transaction_id (cached), ==, 20);
+    g_assert_cmpuint (radio_state_response_get_hw_radio_state (cached), ==, MBIM_RADIO_SWITCH_STATE_ON);
+    mbim_message_unref (cached);
+    mbim_message_unref (query);
+
+    _mbim_proxy_helper_query_cache_free (cache);
+}
+
+static void
+test_query_cache_coalesce (void)
+{
+    MbimProxyQueryCache *cache;
+    MbimMessage *query;
+    MbimMessage *response;
+    MbimMessage *cached = NULL;
+    GList *waiters;
+    gint waiters_data[3];
+    guint i;
+
+    cache = _mbim_proxy_helper_query_cache_new ();
+
+    /* Only the first query goes to the device */
+    for (i = 0; i < G_N_ELEMENTS (waiters_data); i++) {
+        query = radio_state_query_new (i + 1);
+        g_assert_cmpuint (_mbim_proxy_helper_query_cache_lookup (cache, query, &waiters_data[i], &cached), ==,
+                          i == 0 ? MBIM_PROXY_QUERY_CACHE_LOOKUP_MISS : MBIM_PROXY_QUERY_CACHE_LOOKUP_COALESCED);
+        mbim_message_unref (query);
+    }
+
+    /* Failed responses are given to the waiters, but not cached */
+    response = radio_state_response_new (1000, MBIM_STATUS_ERROR_BUSY, 0);
+    waiters = _mbim_proxy_helper_query_cache_complete (cache, MBIM_SERVICE_BASIC_CONNECT, MBIM_CID_BASIC_CONNECT_RADIO_STATE, response);
+    g_assert_cmpuint (g_list_length (waiters), ==, G_N_ELEMENTS (waiters_data));
+    for (i = 0; i < G_N_ELEMENTS (waiters_data); i++)
+        g_assert (g_list_nth_data (waiters, i) == &waiters_data[i]);
+    g_list_free (waiters);
+    mbim_message_unref (response);
+
+    query = radio_state_query_new (4);
+    g_assert_cmpuint (_mbim_proxy_helper_query_cache_lookup (cache, query, &waiters_data[0], &cached), ==, MBIM_PROXY_QUERY_CACHE_LOOKUP_MISS);
+    mbim_message_unref (query);
+
+    /* Transport errors neither */
+    waiters = _mbim_proxy_helper_query_cache_complete (cache, MBIM_SERVICE_BASIC_CONNECT, MBIM_CID_BASIC_CONNECT_RADIO_STATE, NULL);
+    g_assert_cmpuint (g_list_length (waiters), ==, 1);
+    g_list_free (waiters);
+
+    query = radio_state_query_new (5);
+    g_assert_cmpuint (_mbim_proxy_helper_query_cache_lookup (cache, query, &waiters_data[0], &cached), ==, MBIM_PROXY_QUERY_CACHE_LOOKUP_MISS);
+    mbim_message_unref (query);
+    waiters = _mbim_proxy_helper_query_cache_complete (cache, MBIM_SERVICE_BASIC_CONNECT, MBIM_CID_BASIC_CONNECT_RADIO_STATE, NULL);
+    g_list_free (waiters);
+
+    _mbim_proxy_helper_query_cache_free (cache);
+}
+
+static void
+test_query_cache_invalidate (void)
+{
+    MbimProxyQueryCache *cache;
+    MbimMessage *query;
+    MbimMessage *response;
+    MbimMessage *cached = NULL;
+    GList *waiters;
+    gint waiter;
+
+    cache = _mbim_proxy_helper_query_cache_new ();
+
+    response = radio_state_response_new (1000, MBIM_STATUS_ERROR_NONE, MBIM_RADIO_SWITCH_STATE_ON);
+    g_assert (_mbim_proxy_helper_query_cache_preload (cache, response));
+    /* Never overrides an already cached response */
+    g_assert (!_mbim_proxy_helper_query_cache_preload (cache, response));
+    mbim_message_unref (response);
+
+    query = radio_state_query_new (1);
+    g_assert_cmpuint (_mbim_proxy_helper_query_cache_lookup (cache, query, &waiter, &cached), ==, MBIM_PROXY_QUERY_CACHE_LOOKUP_HIT);
+    mbim_message_unref (cached);
+    cached = NULL;
+
+    /* Other CIDs don't drop the cached response */
+    _mbim_proxy_helper_query_cache_invalidate (cache, MBIM_SERVICE_BASIC_CONNECT, MBIM_CID_BASIC_CONNECT_DEVICE_CAPS);
+    _mbim_proxy_helper_query_cache_invalidate (cache, MBIM_SERVICE_BASIC_CONNECT, MBIM_CID_BASIC_CONNECT_PIN);
+    g_assert_cmpuint (_mbim_proxy_helper_query_cache_lookup (cache, query, &waiter, &cached), ==, MBIM_PROXY_QUERY_CACHE_LOOKUP_HIT);
+    mbim_message_unref (cached);
+    cached = NULL;
+
+    _mbim_proxy_helper_query_cache_invalidate (cache, MBIM_SERVICE_BASIC_CONNECT, MBIM_CID_BASIC_CONNECT_RADIO_STATE);
+    g_assert_cmpuint (_mbim_proxy_helper_query_cache_lookup (cache, query, &waiter, &cached), ==, MBIM_PROXY_QUERY_CACHE_LOOKUP_MISS);
+
+    /* Invalidated while ongoing: waiters get the response, but it is stale */
+    _mbim_proxy_helper_query_cache_invalidate_all (cache);
+    response = radio_state_response_new (1000, MBIM_STATUS_ERROR_NONE, MBIM_RADIO_SWITCH_STATE_OFF);
+    waiters = _mbim_proxy_helper_query_cache_complete (cache, MBIM_SERVICE_BASIC_CONNECT, MBIM_CID_BASIC_CONNECT_RADIO_STATE, response);
+    g_assert_cmpuint (g_list_length (waiters), ==, 1);
+    g_list_free (waiters);
+    mbim_message_unref (response);
+
+    g_assert_cmpuint (_mbim_proxy_helper_query_cache_lookup (cache, query, &waiter, &cached), ==, MBIM_PROXY_QUERY_CACHE_LOOKUP_MISS);
+    response = radio_state_response_new (1000, MBIM_STATUS_ERROR_NONE, MBIM_RADIO_SWITCH_STATE_ON);
+    waiters = _mbim_proxy_helper_query_cache_complete (cache, MBIM_SERVICE_BASIC_CONNECT, MBIM_CID_BASIC_CONNECT_RADIO_STATE, response);
+    g_list_free (waiters);
+    mbim_message_unref (response);
+
+    /* Cached again once no longer stale */
+    g_assert_cmpuint (_mbim_proxy_helper_query_cache_lookup (cache, query, &waiter, &cached), ==, MBIM_PROXY_QUERY_CACHE_LOOKUP_HIT);
+    g_assert_cmpuint (radio_state_response_get_hw_radio_state (cached), ==, MBIM_RADIO_SWITCH_STATE_ON);
+    mbim_message_unref (cached);
+    mbim_message_unref (query);
+
+    _mbim_proxy_helper_query_cache_free (cache);
+}
+
+static void
+test_query_cache_uncacheable (void)
+{
+    MbimProxyQueryCache *cache;
+    MbimMessageCommandBuilder *builder;
+    MbimMessage *message;
+    MbimMessage *cached = NULL;
+    gint waiter;
+
+    cache = _mbim_proxy_helper_query_cache_new ();
+
+    /* Set operations */
+    message = mbim_message_command_new (1, MBIM_SERVICE_BASIC_CONNECT, MBIM_CID_BASIC_CONNECT_RADIO_STATE, MBIM_MESSAGE_COMMAND_TYPE_SET);
+    g_assert (!_mbim_proxy_helper_query_cache_is_cacheable (cache, message));
+    g_assert_cmpuint (_mbim_proxy_helper_query_cache_lookup (cache, message, &waiter, &cached), ==, MBIM_PROXY_QUERY_CACHE_LOOKUP_UNCACHEABLE);
+    mbim_message_unref (message);
+
+    /* Queries not in the cache */
+    message = mbim_message_command_new (2, MBIM_SERVICE_BASIC_CONNECT, MBIM_CID_BASIC_CONNECT_PIN, MBIM_MESSAGE_COMMAND_TYPE_QUERY);
+    g_assert (!_mbim_proxy_helper_query_cache_is_cacheable (cache, message));
+    g_assert_cmpuint (_mbim_proxy_helper_query_cache_lookup (cache, message, &waiter, &cached), ==, MBIM_PROXY_QUERY_CACHE_LOOKUP_UNCACHEABLE);
+    mbim_message_unref (message);
+
+    /* Queries with input payload */
+    builder = _mbim_message_command_builder_new (3, MBIM_SERVICE_BASIC_CONNECT, MBIM_CID_BASIC_CONNECT_RADIO_STATE, MBIM_MESSAGE_COMMAND_TYPE_QUERY);
+    _mbim_message_command_builder_append_guint32 (builder, 0);
+    message = _mbim_message_command_builder_complete (builder);
+    g_assert (!_mbim_proxy_helper_query_cache_is_cacheable (cache, message));
+    g_assert_cmpuint (_mbim_proxy_helper_query_cache_lookup (cache, message, &waiter, &cached), ==, MBIM_PROXY_QUERY_CACHE_LOOKUP_UNCACHEABLE);
+    mbim_message_unref (message);
+
+    /* Cacheable query, nothing changed by the check */
+    message = mbim_message_command_new (4, MBIM_SERVICE_BASIC_CONNECT, MBIM_CID_BASIC_CONNECT_RADIO_STATE, MBIM_MESSAGE_COMMAND_TYPE_QUERY);
+    g_assert (_mbim_proxy_helper_query_cache_is_cacheable (cache, message));
+    g_assert_cmpuint (_mbim_proxy_helper_query_cache_lookup (cache, message, &waiter, &cached), ==, MBIM_PROXY_QUERY_CACHE_LOOKUP_MISS);
+    g_list_free (_mbim_proxy_helper_query_cache_complete (cache, MBIM_SERVICE_BASIC_CONNECT, MBIM_CID_BASIC_CONNECT_RADIO_STATE, NULL));
+    mbim_message_unref (message);
+
+    g_assert (!cached);
+    _mbim_proxy_helper_query_cache_free (cache);
+}
+
+static void
+test_query_cache_warm_queries (void)
+{
+    GList *queries;
+    GList *l;
+
+    queries = _mbim_proxy_helper_query_cache_build_warm_queries ();
+    g_assert_cmpuint (g_list_length (queries), ==, 2);
+    for (l = queries; l; l = g_list_next (l)) {
+        MbimMessage *message = l->data;
+
+        g_assert_cmpuint (mbim_message_get_message_type (message), ==, MBIM_MESSAGE_TYPE_COMMAND);
+        g_assert_cmpuint (mbim_message_command_get_command_type (message), ==, MBIM_MESSAGE_COMMAND_TYPE_QUERY);
+        g_assert_cmpuint (mbim_message_command_get_service (message), ==, MBIM_SERVICE_BASIC_CONNECT);
+    }
+    g_assert_cmpuint (mbim_message_command_get_cid (queries->data), ==, MBIM_CID_BASIC_CONNECT_DEVICE_CAPS);
+    g_assert_cmpuint (mbim_message_command_get_cid (queries->next->data), ==, MBIM_CID_BASIC_CONNECT_DEVICE_SERVICES);
+    g_list_free_full (queries, (GDestroyNotify) mbim_message_unref);
+}
+
+/*****************************************************************************/
+
+static void
+test_hotplug_control_port (void)
+{
+    gchar *interface_path;
+    gchar *usbmisc_path;
+    gchar *port;
+
+    /* USB interface in sysfs, with its cdc-wdm port */
+    interface_path = g_dir_make_tmp ("test-hotplug-XXXXXX", NULL);
+    g_assert (interface_path);
+    usbmisc_path = g_build_filename (interface_path, "usbmisc", "cdc-wdm3", NULL);
+    g_assert_cmpint (g_mkdir_with_parents (usbmisc_path, 0700), ==, 0);
+
+    /* Control port */
+    port = _mbim_proxy_helper_hotplug_get_control_port ("usbmisc", "cdc-wdm3", "/dev/cdc-wdm3", "cdc_mbim", interface_path);
+    g_assert_cmpstr (port, ==, "/dev/cdc-wdm3");
+    g_free (port);
+
+    /* Network interface, the control port is looked up in the USB interface */
+    port = _mbim_proxy_helper_hotplug_get_control_port ("net", "wwan0", NULL, "cdc_mbim", interface_path);
+    g_assert_cmpstr (port, ==, "/dev/cdc-wdm3");
+    g_free (port);
+
+    /* Not handled by the MBIM driver */
+    g_assert (!_mbim_proxy_helper_hotplug_get_control_port ("usbmisc", "cdc-wdm3", "/dev/cdc-wdm3", "qmi_wwan", interface_path));
+    g_assert (!_mbim_proxy_helper_hotplug_get_control_port ("net", "wwan0", NULL, "qmi_wwan", interface_path));
+    g_assert (!_mbim_proxy_helper_hotplug_get_control_port ("net", "wwan0", NULL, NULL, interface_path));
+
+    /* Other usbmisc devices and subsystems */
+    g_assert (!_mbim_proxy_helper_hotplug_get_control_port ("usbmisc", "hiddev0", "/dev/usb/hiddev0", "cdc_mbim", interface_path));
+    g_assert (!_mbim_proxy_helper_hotplug_get_control_port ("usbmisc", "cdc-wdm3", NULL, "cdc_mbim", interface_path));
+    g_assert (!_mbim_proxy_helper_hotplug_get_control_port ("usb", "1-1:1.0", NULL, "cdc_mbim", interface_path));
+
+    /* Network interface reported before the control port */
+    g_assert_cmpint (g_rmdir (usbmisc_path), ==, 0);
+    g_assert (!_mbim_proxy_helper_hotplug_get_control_port ("net", "wwan0", NULL, "cdc_mbim", interface_path));
+    g_free (usbmisc_path);
+
+    usbmisc_path = g_build_filename (interface_path, "usbmisc", NULL);
+    g_assert_cmpint (g_rmdir (usbmisc_path), ==, 0);
+    g_assert (!_mbim_proxy_helper_hotplug_get_control_port ("net", "wwan0", NULL, "cdc_mbim", interface_path));
+    g_free (usbmisc_path);
+
+    g_assert_cmpint (g_rmdir (interface_path), ==, 0);
+    g_free (interface_path);
+}
+
+/*****************************************************************************/
+
 int main (int argc, char **argv)
 {
     g_test_init (&argc, &argv, NULL);
@@ -415,6 +1010,17 @@ int main (int argc, char **argv)
     g_test_add_func ("/libmbim-glib/proxy/merge/same-service",         test_merge_list_same_service);
     g_test_add_func ("/libmbim-glib/proxy/merge/different-services",   test_merge_list_different_services);
     g_test_add_func ("/libmbim-glib/proxy/merge/merged-services",      test_merge_list_merged_services);
+    g_test_add_func ("/libmbim-glib/proxy/event-set/standard",         test_event_set_standard_services);
+    g_test_add_func ("/libmbim-glib/proxy/event-set/refcount",         test_event_set_refcount);
+    g_test_add_func ("/libmbim-glib/proxy/event-set/wildcard",         test_event_set_wildcard);
+    g_test_add_func ("/libmbim-glib/proxy/capture/ring",               test_capture_ring);
+    g_test_add_func ("/libmbim-glib/proxy/latency-stats",              test_latency_stats);
+    g_test_add_func ("/libmbim-glib/proxy/query-cache/hit",            test_query_cache_hit);
+    g_test_add_func ("/libmbim-glib/proxy/query-cache/coalesce",       test_query_cache_coalesce);
+    g_test_add_func ("/libmbim-glib/proxy/query-cache/invalidate",     test_query_cache_invalidate);
+    g_test_add_func ("/libmbim-glib/proxy/query-cache/uncacheable",    test_query_cache_uncacheable);
+    g_test_add_func ("/libmbim-glib/proxy/query-cache/warm-queries",   test_query_cache_warm_queries);
+    g_test_add_func ("/libmbim-glib/proxy/hotplug/control-port",       test_hotplug_control_port);
 
     return g_test_run ();
 }
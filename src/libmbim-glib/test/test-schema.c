@@ -0,0 +1,174 @@
+/* -*- Mode: C; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*- */
+/*
+ * This program is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation; either version 2 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details:
+ *
+ * Copyright (C) 2013 - 2014 Aleksander Morgado <aleksander@aleksander.es>
+ */
+
+#include <config.h>
+#include <string.h>
+
+#include "mbim-schema.h"
+#include "mbim-message.h"
+#include "mbim-cid.h"
+#include "mbim-enums.h"
+#include "mbim-enum-types.h"
+#include "mbim-basic-connect.h"
+
+static void
+test_schema_lookup (void)
+{
+    g_assert (mbim_message_fields_lookup (MBIM_SERVICE_BASIC_CONNECT,
+                                          MBIM_CID_BASIC_CONNECT_CONNECT,
+                                          MBIM_MESSAGE_TYPE_COMMAND,
+                                          MBIM_MESSAGE_COMMAND_TYPE_SET) != NULL);
+    g_assert (mbim_message_fields_lookup (MBIM_SERVICE_BASIC_CONNECT,
+                                          MBIM_CID_BASIC_CONNECT_CONNECT,
+                                          MBIM_MESSAGE_TYPE_COMMAND_DONE,
+                                          MBIM_MESSAGE_COMMAND_TYPE_UNKNOWN) != NULL);
+
+    /* VISIBLE_PROVIDERS cannot be set */
+    g_assert (mbim_message_fields_lookup (MBIM_SERVICE_BASIC_CONNECT,
+                                          MBIM_CID_BASIC_CONNECT_VISIBLE_PROVIDERS,
+                                          MBIM_MESSAGE_TYPE_COMMAND,
+                                          MBIM_MESSAGE_COMMAND_TYPE_SET) == NULL);
+    /* Unknown CID */
+    g_assert (mbim_message_fields_lookup (MBIM_SERVICE_BASIC_CONNECT,
+                                          0xFFFF,
+                                          MBIM_MESSAGE_TYPE_COMMAND_DONE,
+                                          MBIM_MESSAGE_COMMAND_TYPE_UNKNOWN) == NULL);
+    /* Messages without fields */
+    g_assert (mbim_message_fields_lookup (MBIM_SERVICE_BASIC_CONNECT,
+                                          MBIM_CID_BASIC_CONNECT_CONNECT,
+                                          MBIM_MESSAGE_TYPE_OPEN,
+                                          MBIM_MESSAGE_COMMAND_TYPE_UNKNOWN) == NULL);
+}
+
+static void
+test_schema_message_fields (void)
+{
+    MbimMessage             *message;
+    const MbimMessageFields *fields;
+    const MbimField         *field;
+
+    message = mbim_message_connect_set_new (1,
+                                            MBIM_ACTIVATION_COMMAND_ACTIVATE,
+                                            "internet",
+                                            "",
+                                            "",
+                                            MBIM_COMPRESSION_NONE,
+                                            MBIM_AUTH_PROTOCOL_NONE,
+                                            MBIM_CONTEXT_IP_TYPE_IPV4,
+                                            mbim_uuid_from_context_type (MBIM_CONTEXT_TYPE_INTERNET),
+                                            NULL);
+    g_assert (message != NULL);
+
+    fields = mbim_message_get_fields (message);
+    g_assert (fields == mbim_message_fields_lookup (MBIM_SERVICE_BASIC_CONNECT,
+                                                    MBIM_CID_BASIC_CONNECT_CONNECT,
+                                                    MBIM_MESSAGE_TYPE_COMMAND,
+                                                    MBIM_MESSAGE_COMMAND_TYPE_SET));
+    g_assert_cmpuint (mbim_message_fields_get_n_fields (fields), ==, 9);
+
+    field = mbim_message_fields_get_field (fields, 0);
+    g_assert_cmpstr (mbim_field_get_name (field), ==, "SessionId");
+    g_assert_cmpuint (mbim_field_get_format (field), ==, MBIM_FIELD_FORMAT_GUINT32);
+    g_assert (mbim_field_get_public_type (field) == G_TYPE_NONE);
+    g_assert (!mbim_field_get_condition (field, NULL, NULL, NULL));
+
+    field = mbim_message_fields_get_field (fields, 1);
+    g_assert_cmpstr (mbim_field_get_name (field), ==, "ActivationCommand");
+    g_assert (mbim_field_get_public_type (field) == MBIM_TYPE_ACTIVATION_COMMAND);
+
+    field = mbim_message_fields_get_field (fields, 2);
+    g_assert_cmpstr (mbim_field_get_name (field), ==, "AccessString");
+    g_assert_cmpuint (mbim_field_get_format (field), ==, MBIM_FIELD_FORMAT_STRING);
+
+    field = mbim_message_fields_get_field (fields, 8);
+    g_assert_cmpstr (mbim_field_get_name (field), ==, "ContextType");
+    g_assert_cmpuint (mbim_field_get_format (field), ==, MBIM_FIELD_FORMAT_UUID);
+
+    mbim_message_unref (message);
+}
+
+static void
+test_schema_struct_fields (void)
+{
+    const MbimMessageFields *fields;
+    const MbimField         *field;
+    const MbimStructFields  *struct_fields;
+
+    fields = mbim_message_fields_lookup (MBIM_SERVICE_BASIC_CONNECT,
+                                         MBIM_CID_BASIC_CONNECT_VISIBLE_PROVIDERS,
+                                         MBIM_MESSAGE_TYPE_COMMAND_DONE,
+                                         MBIM_MESSAGE_COMMAND_TYPE_UNKNOWN);
+    g_assert (fields != NULL);
+    g_assert_cmpuint (mbim_message_fields_get_n_fields (fields), ==, 2);
+
+    field = mbim_message_fields_get_field (fields, 0);
+    g_assert_cmpstr (mbim_field_get_name (field), ==, "ProvidersCount");
+    g_assert_cmpint (mbim_field_get_array_size_field (field), ==, -1);
+    g_assert (mbim_field_get_struct_fields (field) == NULL);
+
+    field = mbim_message_fields_get_field (fields, 1);
+    g_assert_cmpstr (mbim_field_get_name (field), ==, "Providers");
+    g_assert_cmpuint (mbim_field_get_format (field), ==, MBIM_FIELD_FORMAT_REF_STRUCT_ARRAY);
+    g_assert_cmpint (mbim_field_get_array_size_field (field), ==, 0);
+
+    struct_fields = mbim_field_get_struct_fields (field);
+    g_assert (struct_fields != NULL);
+    g_assert_cmpstr (mbim_struct_fields_get_name (struct_fields), ==, "MbimProvider");
+    g_assert_cmpuint (mbim_struct_fields_get_n_fields (struct_fields), >, 0);
+    field = mbim_struct_fields_get_field (struct_fields, 0);
+    g_assert_cmpstr (mbim_field_get_name (field), ==, "ProviderId");
+    g_assert_cmpuint (mbim_field_get_format (field), ==, MBIM_FIELD_FORMAT_STRING);
+}
+
+static void
+test_schema_condition (void)
+{
+    const MbimMessageFields *fields;
+    const MbimField         *field;
+    guint                    condition_field;
+    MbimFieldCondition       condition;
+    guint32                  condition_value;
+
+    fields = mbim_message_fields_lookup (MBIM_SERVICE_SMS,
+                                         MBIM_CID_SMS_READ,
+                                         MBIM_MESSAGE_TYPE_COMMAND_DONE,
+                                         MBIM_MESSAGE_COMMAND_TYPE_UNKNOWN);
+    g_assert (fields != NULL);
+
+    field = mbim_message_fields_get_field (fields, 2);
+    g_assert_cmpstr (mbim_field_get_name (field), ==, "PduMessages");
+    g_assert (mbim_field_get_condition (field, &condition_field, &condition, &condition_value));
+    g_assert_cmpuint (condition_field, ==, 0);
+    g_assert_cmpuint (condition, ==, MBIM_FIELD_CONDITION_EQUAL);
+    g_assert_cmpuint (condition_value, ==, MBIM_SMS_FORMAT_PDU);
+    g_assert_cmpstr (mbim_field_get_name (mbim_message_fields_get_field (fields, condition_field)), ==, "Format");
+
+    field = mbim_message_fields_get_field (fields, 3);
+    g_assert_cmpstr (mbim_field_get_name (field), ==, "CdmaMessages");
+    g_assert (mbim_field_get_condition (field, NULL, NULL, &condition_value));
+    g_assert_cmpuint (condition_value, ==, MBIM_SMS_FORMAT_CDMA);
+}
+
+int main (int argc, char **argv)
+{
+    g_test_init (&argc, &argv, NULL);
+
+    g_test_add_func ("/libmbim-glib/schema/lookup",         test_schema_lookup);
+    g_test_add_func ("/libmbim-glib/schema/message-fields", test_schema_message_fields);
+    g_test_add_func ("/libmbim-glib/schema/struct-fields",  test_schema_struct_fields);
+    g_test_add_func ("/libmbim-glib/schema/condition",      test_schema_condition);
+
+    return g_test_run ();
+}
@@ -0,0 +1,197 @@
+/* -*- Mode: C; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*- */
+/*
+ * This program is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation; either version 2 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details:
+ *
+ * Copyright (C) 2013 - 2014 Aleksander Morgado <aleksander@aleksander.es>
+ */
+
+#include <config.h>
+#include <string.h>
+
+#include "mbim-utils.h"
+#include "mbim-trace.h"
+#include "mbim-message.h"
+#include "mbim-cid.h"
+
+static void
+test_trace_filters (void)
+{
+    MbimMessage *connect;
+    MbimMessage *pin;
+    MbimMessage *open;
+
+    connect = mbim_message_command_new (1, MBIM_SERVICE_BASIC_CONNECT, MBIM_CID_BASIC_CONNECT_CONNECT, MBIM_MESSAGE_COMMAND_TYPE_QUERY);
+    pin = mbim_message_command_new (2, MBIM_SERVICE_BASIC_CONNECT, MBIM_CID_BASIC_CONNECT_PIN, MBIM_MESSAGE_COMMAND_TYPE_QUERY);
+    open = mbim_message_open_new (3, 4096);
+
+    /* Nothing traced while traces are disabled */
+    mbim_utils_set_traces_enabled (FALSE);
+    g_assert (!_mbim_trace_enabled ("/dev/cdc-wdm0", connect));
+
+    /* Everything traced without filters */
+    mbim_utils_set_traces_enabled (TRUE);
+    g_assert (_mbim_trace_enabled ("/dev/cdc-wdm0", connect));
+    g_assert (_mbim_trace_enabled ("/dev/cdc-wdm1", pin));
+    g_assert (_mbim_trace_enabled ("/dev/cdc-wdm1", open));
+
+    /* Only CONNECT in one device */
+    mbim_trace_add_filter ("/dev/cdc-wdm0", MBIM_SERVICE_BASIC_CONNECT, MBIM_CID_BASIC_CONNECT_CONNECT, MBIM_MESSAGE_TYPE_INVALID);
+    g_assert (_mbim_trace_enabled ("/dev/cdc-wdm0", connect));
+    g_assert (!_mbim_trace_enabled ("/dev/cdc-wdm1", connect));
+    g_assert (!_mbim_trace_enabled ("/dev/cdc-wdm0", pin));
+    g_assert (!_mbim_trace_enabled ("/dev/cdc-wdm0", open));
+
+    /* Plus all OPEN messages in any device */
+    mbim_trace_add_filter (NULL, MBIM_SERVICE_INVALID, 0, MBIM_MESSAGE_TYPE_OPEN);
+    g_assert (_mbim_trace_enabled ("/dev/cdc-wdm0", connect));
+    g_assert (_mbim_trace_enabled ("/dev/cdc-wdm1", open));
+    g_assert (!_mbim_trace_enabled ("/dev/cdc-wdm1", pin));
+
+    /* Back to tracing everything */
+    mbim_trace_clear_filters ();
+    g_assert (_mbim_trace_enabled ("/dev/cdc-wdm1", pin));
+
+    mbim_utils_set_traces_enabled (FALSE);
+
+    mbim_message_unref (connect);
+    mbim_message_unref (pin);
+    mbim_message_unref (open);
+}
+
+typedef struct {
+    guint  n_events;
+    gchar *printable;
+} TraceContext;
+
+static void
+trace_func (const MbimTraceEvent *event,
+            gpointer              user_data)
+{
+    TraceContext *ctx = user_data;
+
+    ctx->n_events++;
+    g_assert_cmpuint (mbim_trace_event_get_event_type (event), ==, MBIM_TRACE_EVENT_TYPE_SENT);
+    g_assert_cmpstr (mbim_trace_event_get_path (event), ==, "/dev/cdc-wdm0");
+    g_assert_cmpuint (mbim_message_get_transaction_id (mbim_trace_event_get_message (event)), ==, 1);
+
+    g_free (ctx->printable);
+    ctx->printable = mbim_trace_event_get_printable (event, "<<<<<< ");
+}
+
+static void
+test_trace_func (void)
+{
+    MbimMessage  *message;
+    TraceContext  ctx = { 0 };
+    gchar        *printable;
+
+    message = mbim_message_command_new (1, MBIM_SERVICE_BASIC_CONNECT, MBIM_CID_BASIC_CONNECT_CONNECT, MBIM_MESSAGE_COMMAND_TYPE_QUERY);
+
+    mbim_trace_set_func (trace_func, &ctx, NULL);
+    _mbim_trace (MBIM_TRACE_EVENT_TYPE_SENT, "/dev/cdc-wdm0", "cdc-wdm0", message);
+    mbim_trace_set_func (NULL, NULL, NULL);
+
+    g_assert_cmpuint (ctx.n_events, ==, 1);
+    printable = mbim_message_get_printable (message, "<<<<<< ", FALSE);
+    g_assert_cmpstr (ctx.printable, ==, printable);
+    g_free (printable);
+    g_free (ctx.printable);
+
+    mbim_message_unref (message);
+}
+
+typedef struct {
+    gboolean running;
+    gboolean freed;
+} SinkContext;
+
+static void
+sink_context_free (SinkContext *ctx)
+{
+    /* Never while the trace function is still running */
+    g_assert (!ctx->running);
+    ctx->freed = TRUE;
+}
+
+static void
+replacing_trace_func (const MbimTraceEvent *event,
+                      gpointer              user_data)
+{
+    SinkContext *ctx = user_data;
+
+    ctx->running = TRUE;
+    /* As if done by some other thread while this one runs */
+    mbim_trace_set_func (NULL, NULL, NULL);
+    g_assert (!ctx->freed);
+    g_assert (mbim_trace_event_get_message (event) != NULL);
+    ctx->running = FALSE;
+}
+
+static void
+test_trace_func_replaced (void)
+{
+    MbimMessage *message;
+    SinkContext  ctx = { 0 };
+
+    message = mbim_message_command_new (1, MBIM_SERVICE_BASIC_CONNECT, MBIM_CID_BASIC_CONNECT_CONNECT, MBIM_MESSAGE_COMMAND_TYPE_QUERY);
+
+    mbim_trace_set_func (replacing_trace_func, &ctx, (GDestroyNotify) sink_context_free);
+    _mbim_trace (MBIM_TRACE_EVENT_TYPE_SENT, "/dev/cdc-wdm0", "cdc-wdm0", message);
+
+    /* Freed once the last call returned */
+    g_assert (ctx.freed);
+
+    mbim_message_unref (message);
+}
+
+static void
+count_log_handler (const gchar    *log_domain,
+                   GLogLevelFlags  log_level,
+                   const gchar    *message,
+                   gpointer        user_data)
+{
+    (*((guint *)user_data))++;
+}
+
+static void
+test_trace_default_disabled (void)
+{
+    MbimMessage *message;
+    guint        n_logs = 0;
+    guint        handler_id;
+
+    message = mbim_message_command_new (1, MBIM_SERVICE_BASIC_CONNECT, MBIM_CID_BASIC_CONNECT_CONNECT, MBIM_MESSAGE_COMMAND_TYPE_QUERY);
+
+    /* Debug logs of the library domain not enabled, so nothing formatted */
+    handler_id = g_log_set_handler ("Mbim", G_LOG_LEVEL_DEBUG, count_log_handler, &n_logs);
+    _mbim_trace (MBIM_TRACE_EVENT_TYPE_SENT, "/dev/cdc-wdm0", "cdc-wdm0", message);
+    _mbim_trace (MBIM_TRACE_EVENT_TYPE_RECEIVED_COMPLETE, "/dev/cdc-wdm0", "cdc-wdm0", message);
+    g_log_remove_handler ("Mbim", handler_id);
+
+    g_assert_cmpuint (n_logs, ==, 0);
+
+    mbim_message_unref (message);
+}
+
+int main (int argc, char **argv)
+{
+    /* Checked once by the default trace function */
+    g_unsetenv ("G_MESSAGES_DEBUG");
+
+    g_test_init (&argc, &argv, NULL);
+
+    g_test_add_func ("/libmbim-glib/trace/filters",          test_trace_filters);
+    g_test_add_func ("/libmbim-glib/trace/func",             test_trace_func);
+    g_test_add_func ("/libmbim-glib/trace/func-replaced",    test_trace_func_replaced);
+    g_test_add_func ("/libmbim-glib/trace/default-disabled", test_trace_default_disabled);
+
+    return g_test_run ();
+}
@@ -14,6 +14,7 @@
  */
 
 #include <config.h>
+#include <string.h>
 
 #include "mbim-uuid.h"
 
@@ -172,6 +173,18 @@ test_uuid_invalid_no_hex (void)
 
 /*****************************************************************************/
 
+static void
+test_uuid_service_lookup (void)
+{
+    guint service;
+
+    /* Every standard service must be found back from its UUID */
+    for (service = MBIM_SERVICE_INVALID; service < MBIM_SERVICE_LAST; service++)
+        g_assert_cmpuint (mbim_uuid_to_service (mbim_uuid_from_service (service)), ==, service);
+}
+
+/*****************************************************************************/
+
 static void
 test_uuid_custom (void)
 {
@@ -201,6 +214,82 @@ test_uuid_custom (void)
 
 /*****************************************************************************/
 
+#define CUSTOM_THREADS_N_READERS    4
+#define CUSTOM_THREADS_N_ITERATIONS 1000
+
+static const MbimUuid uuid_custom_stable = {
+    .a = { 0x53, 0x74, 0x61, 0x62 },
+    .b = { 0x6c, 0x65 },
+    .c = { 0x20, 0x63 },
+    .d = { 0x75, 0x73 },
+    .e = { 0x74, 0x6f, 0x6d, 0x20, 0x31, 0x21 }
+};
+
+static gpointer
+custom_threads_reader (gpointer user_data)
+{
+    guint service = GPOINTER_TO_UINT (user_data);
+    guint i;
+
+    /* The stable service must be found in every snapshot */
+    for (i = 0; i < CUSTOM_THREADS_N_ITERATIONS; i++) {
+        g_assert (mbim_service_id_is_custom (service));
+        g_assert_cmpstr (mbim_service_lookup_name (service), ==, "stable");
+        g_assert_cmpuint (mbim_uuid_to_service (&uuid_custom_stable), ==, service);
+        g_assert (mbim_uuid_cmp (mbim_uuid_from_service (service), &uuid_custom_stable));
+    }
+    return NULL;
+}
+
+static void
+test_uuid_custom_threads (void)
+{
+    GThread  *readers[CUSTOM_THREADS_N_READERS];
+    MbimUuid  uuid_custom;
+    guint     service;
+    guint     i;
+
+    service = mbim_register_custom_service (&uuid_custom_stable, "stable");
+
+    for (i = 0; i < CUSTOM_THREADS_N_READERS; i++)
+        readers[i] = g_thread_new (NULL, custom_threads_reader, GUINT_TO_POINTER (service));
+
+    /* Keep replacing the registry while readers run */
+    memcpy (&uuid_custom, &uuid_custom_stable, sizeof (MbimUuid));
+    for (i = 0; i < CUSTOM_THREADS_N_ITERATIONS; i++) {
+        guint other;
+
+        uuid_custom.e[5] = (guint8) i;
+        uuid_custom.e[4] = 0xFF;
+        other = mbim_register_custom_service (&uuid_custom, "other");
+        g_assert_cmpuint (other, !=, service);
+        g_assert (mbim_unregister_custom_service (other));
+    }
+
+    for (i = 0; i < CUSTOM_THREADS_N_READERS; i++)
+        g_thread_join (readers[i]);
+
+    g_assert (mbim_unregister_custom_service (service));
+}
+
+/*****************************************************************************/
+
+static void
+test_uuid_hash (void)
+{
+    MbimUuid basic_connect;
+    MbimUuid sms;
+
+    memcpy (&basic_connect, MBIM_UUID_BASIC_CONNECT, sizeof (MbimUuid));
+    memcpy (&sms, MBIM_UUID_SMS, sizeof (MbimUuid));
+
+    /* Keys are compared by contents, not by address */
+    g_assert (_mbim_uuid_equal (&basic_connect, MBIM_UUID_BASIC_CONNECT));
+    g_assert_cmpuint (_mbim_uuid_hash (&basic_connect), ==, _mbim_uuid_hash (MBIM_UUID_BASIC_CONNECT));
+    g_assert (!_mbim_uuid_equal (&basic_connect, &sms));
+    g_assert_cmpuint (_mbim_uuid_hash (&basic_connect), !=, _mbim_uuid_hash (&sms));
+}
+
 int main (int argc, char **argv)
 {
     g_test_init (&argc, &argv, NULL);
@@ -226,7 +315,10 @@ int main (int argc, char **argv)
     g_test_add_func ("/libmbim-glib/uuid/invalid/dashes", test_uuid_invalid_dashes);
     g_test_add_func ("/libmbim-glib/uuid/invalid/no-hex", test_uuid_invalid_no_hex);
 
-    g_test_add_func ("/libmbim-glib/uuid/custom", test_uuid_custom);
+    g_test_add_func ("/libmbim-glib/uuid/hash",           test_uuid_hash);
+    g_test_add_func ("/libmbim-glib/uuid/service-lookup", test_uuid_service_lookup);
+    g_test_add_func ("/libmbim-glib/uuid/custom",         test_uuid_custom);
+    g_test_add_func ("/libmbim-glib/uuid/custom/threads", test_uuid_custom_threads);
 
     return g_test_run ();
 }
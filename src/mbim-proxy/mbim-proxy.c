@@ -25,6 +25,9 @@
 #include <stdlib.h>
 #include <locale.h>
 #include <string.h>
+#include <unistd.h>
+#include <errno.h>
+#include <signal.h>
 
 #include <glib.h>
 #include <glib/gprintf.h>
@@ -38,6 +41,8 @@
 
 #define EMPTY_TIMEOUT_DEFAULT 300
 
+#define CAPTURE_FILE_DEFAULT "/tmp/mbim-proxy.mbimcap"
+
 /* Globals */
 static GMainLoop *loop;
 static MbimProxy *proxy;
@@ -49,6 +54,9 @@ static gboolean verbose_flag;
 static gboolean version_flag;
 static gboolean no_exit_flag;
 static gint     empty_timeout = -1;
+static gboolean warm_devices_flag;
+static gchar    *capture_file;
+static gint      ready_fd = -1;
 
 static GOptionEntry main_entries[] = {
     { "no-exit", 0, 0, G_OPTION_ARG_NONE, &no_exit_flag,
@@ -59,6 +67,18 @@ static GOptionEntry main_entries[] = {
       "If no clients/devices, exit after this timeout. If set to 0, equivalent to --no-exit.",
       "[SECS]"
     },
+    { "capture-file", 0, 0, G_OPTION_ARG_FILENAME, &capture_file,
+      "Write the latest captured messages to this file on SIGUSR1 (default: " CAPTURE_FILE_DEFAULT ")",
+      "[PATH]"
+    },
+    { "warm-devices", 0, 0, G_OPTION_ARG_NONE, &warm_devices_flag,
+      "Open MBIM devices as soon as they are available, before any client requests them",
+      NULL
+    },
+    { "ready-fd", 0, G_OPTION_FLAG_HIDDEN, G_OPTION_ARG_INT, &ready_fd,
+      "Write a byte to this file descriptor once accepting connections",
+      "[FD]"
+    },
     { "verbose", 'v', 0, G_OPTION_ARG_NONE, &verbose_flag,
       "Run action with verbose logs, including the debug ones",
       NULL
@@ -81,6 +101,22 @@ quit_cb (gpointer user_data)
     return FALSE;
 }
 
+static gboolean
+dump_capture_cb (gpointer user_data)
+{
+    GError *error = NULL;
+
+    if (proxy) {
+        if (!mbim_proxy_dump_capture (proxy, capture_file ? capture_file : CAPTURE_FILE_DEFAULT, &error)) {
+            g_warning ("couldn't dump message capture: %s", error->message);
+            g_error_free (error);
+        } else
+            g_message ("message capture written to '%s'", capture_file ? capture_file : CAPTURE_FILE_DEFAULT);
+    }
+
+    return TRUE;
+}
+
 static void
 log_handler (const gchar *log_domain,
              GLogLevelFlags log_level,
@@ -130,6 +166,23 @@ log_handler (const gchar *log_domain,
                message);
 }
 
+/* The library only formats its trace logs when G_MESSAGES_DEBUG enables its
+ * domain; they're written by our own log handler though */
+static void
+enable_library_debug_logs (void)
+{
+    const gchar *domains;
+    gchar       *new_domains;
+
+    domains = g_getenv ("G_MESSAGES_DEBUG");
+    if (domains && (g_str_equal (domains, "all") || strstr (domains, "Mbim")))
+        return;
+
+    new_domains = g_strconcat (domains ? domains : "", domains ? " " : "", "Mbim", NULL);
+    g_setenv ("G_MESSAGES_DEBUG", new_domains, TRUE);
+    g_free (new_domains);
+}
+
 static void
 print_version_and_exit (void)
 {
@@ -201,6 +254,27 @@ proxy_n_devices_changed (MbimProxy *_proxy)
 
 /*****************************************************************************/
 
+static void
+notify_ready (void)
+{
+    gssize n_written;
+
+    do {
+        n_written = write (ready_fd, "", 1);
+    } while (n_written < 0 && errno == EINTR);
+
+    /* The spawner may have given up waiting already, which is fine */
+    if (n_written < 0 && errno == EPIPE)
+        g_debug ("couldn't notify readiness: spawner is gone");
+    else if (n_written != 1)
+        g_warning ("couldn't notify readiness: %s", g_strerror (errno));
+
+    close (ready_fd);
+    ready_fd = -1;
+}
+
+/*****************************************************************************/
+
 int main (int argc, char **argv)
 {
     GError *error = NULL;
@@ -223,13 +297,19 @@ int main (int argc, char **argv)
 
     g_log_set_handler (NULL,  G_LOG_LEVEL_MASK, log_handler, NULL);
     g_log_set_handler ("Mbim", G_LOG_LEVEL_MASK, log_handler, NULL);
-    if (verbose_flag)
+    if (verbose_flag) {
+        enable_library_debug_logs ();
         mbim_utils_set_traces_enabled (TRUE);
+    }
 
     /* Setup signals */
     g_unix_signal_add (SIGINT,  quit_cb, NULL);
     g_unix_signal_add (SIGHUP,  quit_cb, NULL);
     g_unix_signal_add (SIGTERM, quit_cb, NULL);
+    g_unix_signal_add (SIGUSR1, dump_capture_cb, NULL);
+    /* Writes to the readiness pipe or to a client socket closed by the peer
+     * must fail with EPIPE, not kill the proxy */
+    signal (SIGPIPE, SIG_IGN);
 
     /* Setup empty timeout */
     if (empty_timeout < 0)
@@ -242,6 +322,10 @@ int main (int argc, char **argv)
         exit (EXIT_FAILURE);
     }
 
+    /* Preload devices */
+    if (warm_devices_flag)
+        g_object_set (proxy, MBIM_PROXY_WARM_DEVICES, TRUE, NULL);
+
     /* Don't exit the proxy when no clients/devices are found */
     if (!no_exit_flag && empty_timeout != 0) {
         g_debug ("proxy will exit after %d secs if unused", empty_timeout);
@@ -257,6 +341,11 @@ int main (int argc, char **argv)
     } else
         g_debug ("proxy will remain running if unused");
 
+    /* The socket is already listening, so connections are queued until the
+     * loop runs; let whoever spawned us know that it can connect now */
+    if (ready_fd >= 0)
+        notify_ready ();
+
     /* Loop */
     loop = g_main_loop_new (NULL, FALSE);
     g_main_loop_run (loop);
@@ -258,12 +258,12 @@ query_ip_packet_filters_arg_parse (const char *option_name,
     return TRUE;
 }
 
+static guint n_actions = 0;
+static gboolean checked = FALSE;
+
 gboolean
-mbimcli_basic_connect_options_enabled (void)
+mbimcli_basic_connect_options_enabled (GError **error)
 {
-    static guint n_actions = 0;
-    static gboolean checked = FALSE;
-
     if (checked)
         return !!n_actions;
 
@@ -296,14 +296,27 @@ mbimcli_basic_connect_options_enabled (void)
                  !!query_ip_packet_filters_str);
 
     if (n_actions > 1) {
-        g_printerr ("error: too many Basic Connect actions requested\n");
-        exit (EXIT_FAILURE);
+        g_set_error_literal (error, G_OPTION_ERROR, G_OPTION_ERROR_FAILED,
+                             "too many Basic Connect actions requested");
+        return FALSE;
     }
 
     checked = TRUE;
     return !!n_actions;
 }
 
+void
+mbimcli_basic_connect_options_reset (void)
+{
+    mbimcli_reset_option_entries (entries);
+    g_clear_pointer (&query_connect_str, g_free);
+    g_clear_pointer (&query_ip_configuration_str, g_free);
+    g_clear_pointer (&set_connect_deactivate_str, g_free);
+    g_clear_pointer (&query_ip_packet_filters_str, g_free);
+    n_actions = 0;
+    checked = FALSE;
+}
+
 static void
 context_free (Context *context)
 {
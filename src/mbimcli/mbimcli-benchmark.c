@@ -0,0 +1,556 @@
+/* -*- Mode: C; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*- */
+/*
+ * mbimcli -- Command line interface to control MBIM devices
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 2 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <http://www.gnu.org/licenses/>.
+ *
+ * Copyright (C) 2026 The libmbim authors
+ */
+
+#include "config.h"
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+#include <glib.h>
+#include <gio/gio.h>
+
+#include <libmbim-glib.h>
+
+#include "mbimcli.h"
+#include "mbimcli-helpers.h"
+#include "mbimcli-output.h"
+
+#define BENCHMARK_DEFAULT_DURATION 10
+#define BENCHMARK_DEFAULT_TIMEOUT  10
+#define BENCHMARK_TICK_MS          10
+
+/* Context */
+typedef struct {
+    MbimDevice   *device;
+    GCancellable *cancellable;
+
+    /* Setup */
+    MbimService   service;
+    guint         cid;
+    guint         duration;
+    guint         concurrency;
+    guint         rate;
+    guint         timeout;
+
+    /* Run */
+    GTimer       *timer;
+    guint         tick_id;
+    guint         duration_id;
+    gboolean      finishing;
+    guint         n_in_flight;
+
+    /* Results */
+    guint         n_sent;
+    guint         n_succeeded;
+    guint         n_timeouts;
+    guint         n_failed;
+    GArray       *latencies;
+    GHashTable   *errors;
+} Context;
+static Context *ctx;
+
+/* Options */
+static gchar *benchmark_str;
+static gint   benchmark_duration;
+static gint   benchmark_concurrency;
+static gint   benchmark_rate;
+static gint   benchmark_timeout;
+
+static GOptionEntry entries[] = {
+    { "benchmark", 0, 0, G_OPTION_ARG_STRING, &benchmark_str,
+      "Repeatedly query the given CID and report throughput and latency",
+      "[(Service),(CID)]"
+    },
+    { "benchmark-duration", 0, 0, G_OPTION_ARG_INT, &benchmark_duration,
+      "Time to run the benchmark for, in seconds (defaults to 10)",
+      "[Seconds]"
+    },
+    { "benchmark-concurrency", 0, 0, G_OPTION_ARG_INT, &benchmark_concurrency,
+      "Maximum number of queries waiting for a response at the same time (defaults to 1, or no limit if a rate is given)",
+      "[Queries]"
+    },
+    { "benchmark-rate", 0, 0, G_OPTION_ARG_INT, &benchmark_rate,
+      "Queries to send per second, instead of sending a new one as soon as a previous one is done",
+      "[Queries per second]"
+    },
+    { "benchmark-timeout", 0, 0, G_OPTION_ARG_INT, &benchmark_timeout,
+      "Time to wait for each response, in seconds (defaults to 10)",
+      "[Seconds]"
+    },
+    { NULL }
+};
+
+GOptionGroup *
+mbimcli_benchmark_get_option_group (void)
+{
+    GOptionGroup *group;
+
+    group = g_option_group_new ("benchmark",
+                                "Benchmark options",
+                                "Show benchmark options",
+                                NULL,
+                                NULL);
+    g_option_group_add_entries (group, entries);
+
+    return group;
+}
+
+gboolean
+mbimcli_benchmark_options_enabled (GError **error)
+{
+    return !!benchmark_str;
+}
+
+void
+mbimcli_benchmark_options_reset (void)
+{
+    mbimcli_reset_option_entries (entries);
+}
+
+static void
+context_free (Context *context)
+{
+    if (!context)
+        return;
+
+    if (context->tick_id)
+        g_source_remove (context->tick_id);
+    if (context->duration_id)
+        g_source_remove (context->duration_id);
+    if (context->timer)
+        g_timer_destroy (context->timer);
+    if (context->latencies)
+        g_array_unref (context->latencies);
+    if (context->errors)
+        g_hash_table_unref (context->errors);
+    if (context->cancellable)
+        g_object_unref (context->cancellable);
+    if (context->device)
+        g_object_unref (context->device);
+    g_slice_free (Context, context);
+}
+
+static void
+shutdown (gboolean operation_status)
+{
+    /* Cleanup context and finish async operation */
+    context_free (ctx);
+    ctx = NULL;
+    mbimcli_async_operation_done (operation_status);
+}
+
+/*****************************************************************************/
+/* Setup */
+
+static gboolean
+service_from_string (const gchar *str,
+                     MbimService *out)
+{
+    guint service;
+
+    if (mbimcli_read_uint_from_string (str, &service) &&
+        service > MBIM_SERVICE_INVALID && service < MBIM_SERVICE_LAST) {
+        *out = (MbimService) service;
+        return TRUE;
+    }
+
+    for (service = MBIM_SERVICE_INVALID + 1; service < MBIM_SERVICE_LAST; service++) {
+        if (g_str_equal (str, mbim_service_get_string ((MbimService) service))) {
+            *out = (MbimService) service;
+            return TRUE;
+        }
+    }
+    return FALSE;
+}
+
+static gboolean
+cid_from_string (MbimService  service,
+                 const gchar *str,
+                 guint       *out)
+{
+    guint cid;
+
+    if (mbimcli_read_uint_from_string (str, &cid) && cid > 0) {
+        *out = cid;
+        return TRUE;
+    }
+
+    /* CIDs are small and consecutive in every service */
+    for (cid = 1; cid <= G_MAXUINT8; cid++) {
+        const gchar *printable;
+
+        printable = mbim_cid_get_printable (service, cid);
+        if (printable && g_str_equal (str, printable)) {
+            *out = cid;
+            return TRUE;
+        }
+    }
+    return FALSE;
+}
+
+static gboolean
+benchmark_setup (GError **error)
+{
+    gchar    **split;
+    gboolean   success = FALSE;
+
+    split = g_strsplit (benchmark_str, ",", -1);
+    if (g_strv_length (split) != 2) {
+        g_set_error (error, MBIM_CORE_ERROR, MBIM_CORE_ERROR_INVALID_ARGS,
+                     "expected [(Service),(CID)], got '%s'", benchmark_str);
+        goto out;
+    }
+
+    g_strstrip (split[0]);
+    g_strstrip (split[1]);
+
+    if (!service_from_string (split[0], &ctx->service)) {
+        g_set_error (error, MBIM_CORE_ERROR, MBIM_CORE_ERROR_INVALID_ARGS,
+                     "unknown service '%s'", split[0]);
+        goto out;
+    }
+
+    if (!cid_from_string (ctx->service, split[1], &ctx->cid)) {
+        g_set_error (error, MBIM_CORE_ERROR, MBIM_CORE_ERROR_INVALID_ARGS,
+                     "unknown CID '%s' in service '%s'", split[1], split[0]);
+        goto out;
+    }
+
+    if (mbim_cid_get_printable (ctx->service, ctx->cid) && !mbim_cid_can_query (ctx->service, ctx->cid)) {
+        g_set_error (error, MBIM_CORE_ERROR, MBIM_CORE_ERROR_INVALID_ARGS,
+                     "CID '%s' cannot be queried", split[1]);
+        goto out;
+    }
+
+    if (benchmark_duration < 0 || benchmark_concurrency < 0 || benchmark_rate < 0 || benchmark_timeout < 0) {
+        g_set_error_literal (error, MBIM_CORE_ERROR, MBIM_CORE_ERROR_INVALID_ARGS,
+                             "benchmark values cannot be negative");
+        goto out;
+    }
+
+    ctx->duration = benchmark_duration ? (guint) benchmark_duration : BENCHMARK_DEFAULT_DURATION;
+    ctx->timeout = benchmark_timeout ? (guint) benchmark_timeout : BENCHMARK_DEFAULT_TIMEOUT;
+    ctx->rate = (guint) benchmark_rate;
+    ctx->concurrency = (guint) benchmark_concurrency;
+
+    /* Without a rate, a new query is sent as soon as one finishes, so at
+     * least one must be running */
+    if (!ctx->rate && !ctx->concurrency)
+        ctx->concurrency = 1;
+
+    success = TRUE;
+
+out:
+    g_strfreev (split);
+    return success;
+}
+
+/*****************************************************************************/
+/* Report */
+
+static int
+latency_cmp (gconstpointer a,
+             gconstpointer b)
+{
+    gdouble da = *((const gdouble *) a);
+    gdouble db = *((const gdouble *) b);
+
+    return (da < db) ? -1 : ((da > db) ? 1 : 0);
+}
+
+static gdouble
+latency_percentile (gdouble percentile)
+{
+    return mbimcli_benchmark_percentile ((const gdouble *) ctx->latencies->data,
+                                         ctx->latencies->len,
+                                         percentile);
+}
+
+static void
+benchmark_report (void)
+{
+    gdouble elapsed;
+    gchar  *target_rate;
+
+    elapsed = g_timer_elapsed (ctx->timer, NULL);
+    target_rate = (ctx->rate ?
+                   g_strdup_printf ("%u queries/s", ctx->rate) :
+                   g_strdup ("none"));
+
+    g_print ("[%s] Benchmark of '%s/%s' finished:\n"
+             "\t        Duration: '%.3f s'\n"
+             "\t     Target rate: '%s'\n"
+             "\t     Concurrency: '%s%u'\n"
+             "\t    Queries sent: '%u'\n"
+             "\t       Succeeded: '%u'\n"
+             "\t          Failed: '%u'\n"
+             "\t       Timed out: '%u'\n"
+             "\t      Throughput: '%.1f responses/s'\n",
+             mbim_device_get_path_display (ctx->device),
+             mbim_service_get_string (ctx->service),
+             VALIDATE_UNKNOWN (mbim_cid_get_printable (ctx->service, ctx->cid)),
+             elapsed,
+             target_rate,
+             ctx->concurrency ? "" : "unlimited, max ",
+             ctx->concurrency,
+             ctx->n_sent,
+             ctx->n_succeeded,
+             ctx->n_failed,
+             ctx->n_timeouts,
+             elapsed > 0.0 ? (ctx->n_succeeded + ctx->n_failed) / elapsed : 0.0);
+    g_free (target_rate);
+
+    if (ctx->latencies->len > 0) {
+        gdouble sum = 0.0;
+        guint   i;
+
+        g_array_sort (ctx->latencies, latency_cmp);
+        for (i = 0; i < ctx->latencies->len; i++)
+            sum += g_array_index (ctx->latencies, gdouble, i);
+
+        g_print ("\t    Latency (ms):\n"
+                 "\t             min: '%.3f'\n"
+                 "\t             avg: '%.3f'\n"
+                 "\t             p50: '%.3f'\n"
+                 "\t             p90: '%.3f'\n"
+                 "\t             p99: '%.3f'\n"
+                 "\t           p99.9: '%.3f'\n"
+                 "\t             max: '%.3f'\n",
+                 g_array_index (ctx->latencies, gdouble, 0),
+                 sum / ctx->latencies->len,
+                 latency_percentile (50.0),
+                 latency_percentile (90.0),
+                 latency_percentile (99.0),
+                 latency_percentile (99.9),
+                 g_array_index (ctx->latencies, gdouble, ctx->latencies->len - 1));
+    }
+
+    if (g_hash_table_size (ctx->errors) > 0) {
+        GHashTableIter  iter;
+        gpointer        key;
+        gpointer        value;
+
+        g_print ("\t          Errors:\n");
+        g_hash_table_iter_init (&iter, ctx->errors);
+        while (g_hash_table_iter_next (&iter, &key, &value))
+            g_print ("\t                  '%s': '%u'\n", (const gchar *) key, GPOINTER_TO_UINT (value));
+    }
+
+    g_print ("\n");
+}
+
+/*****************************************************************************/
+/* Run */
+
+static void send_query     (void);
+static void benchmark_stop (void);
+
+static gchar *
+error_key (const GError *error)
+{
+    const gchar *str = NULL;
+
+    if (error->domain == MBIM_STATUS_ERROR)
+        str = mbim_status_error_get_string ((MbimStatusError) error->code);
+    else if (error->domain == MBIM_PROTOCOL_ERROR)
+        str = mbim_protocol_error_get_string ((MbimProtocolError) error->code);
+    else if (error->domain == MBIM_CORE_ERROR)
+        str = mbim_core_error_get_string ((MbimCoreError) error->code);
+
+    if (str)
+        return g_strdup (str);
+    return g_strdup_printf ("%s:%d", g_quark_to_string (error->domain), error->code);
+}
+
+static void
+benchmark_finish (void)
+{
+    benchmark_report ();
+    shutdown (ctx->n_sent > 0 && ctx->n_succeeded == ctx->n_sent);
+}
+
+static void
+query_ready (MbimDevice   *device,
+             GAsyncResult *res,
+             gint64       *start)
+{
+    MbimMessage *response;
+    GError      *error = NULL;
+    gdouble      latency;
+
+    latency = (g_get_monotonic_time () - *start) / 1000.0;
+    g_slice_free (gint64, start);
+
+    response = mbim_device_command_finish (device, res, &error);
+    if (response && mbim_message_response_get_result (response, MBIM_MESSAGE_TYPE_COMMAND_DONE, &error)) {
+        ctx->n_succeeded++;
+        g_array_append_val (ctx->latencies, latency);
+    } else if (g_error_matches (error, MBIM_CORE_ERROR, MBIM_CORE_ERROR_TIMEOUT)) {
+        ctx->n_timeouts++;
+    } else {
+        gchar *key;
+
+        g_debug ("query failed: %s", error->message);
+        ctx->n_failed++;
+        key = error_key (error);
+        g_hash_table_insert (ctx->errors,
+                             key,
+                             GUINT_TO_POINTER (GPOINTER_TO_UINT (g_hash_table_lookup (ctx->errors, key)) + 1));
+    }
+
+    if (response)
+        mbim_message_unref (response);
+    g_clear_error (&error);
+
+    g_assert (ctx->n_in_flight > 0);
+    ctx->n_in_flight--;
+
+    if (ctx->finishing) {
+        if (!ctx->n_in_flight)
+            benchmark_finish ();
+        return;
+    }
+
+    if (g_cancellable_is_cancelled (ctx->cancellable)) {
+        benchmark_stop ();
+        return;
+    }
+
+    /* Closed loop: replace the finished query right away */
+    if (!ctx->rate)
+        send_query ();
+}
+
+static void
+send_query (void)
+{
+    MbimMessage *request;
+    gint64      *start;
+
+    request = mbim_message_command_new (0, ctx->service, ctx->cid, MBIM_MESSAGE_COMMAND_TYPE_QUERY);
+
+    start = g_slice_new (gint64);
+    *start = g_get_monotonic_time ();
+
+    ctx->n_sent++;
+    ctx->n_in_flight++;
+    /* Not cancellable: when the benchmark is interrupted no new queries are
+     * sent, but the ones in flight are still waited for */
+    mbim_device_command (ctx->device,
+                         request,
+                         ctx->timeout,
+                         NULL,
+                         (GAsyncReadyCallback)query_ready,
+                         start);
+    mbim_message_unref (request);
+}
+
+static void
+benchmark_stop (void)
+{
+    ctx->finishing = TRUE;
+
+    if (ctx->tick_id) {
+        g_source_remove (ctx->tick_id);
+        ctx->tick_id = 0;
+    }
+    if (ctx->duration_id) {
+        g_source_remove (ctx->duration_id);
+        ctx->duration_id = 0;
+    }
+
+    /* Wait for the queries still running */
+    if (!ctx->n_in_flight)
+        benchmark_finish ();
+}
+
+static gboolean
+rate_tick_cb (void)
+{
+    guint due;
+
+    if (g_cancellable_is_cancelled (ctx->cancellable)) {
+        ctx->tick_id = 0;
+        benchmark_stop ();
+        return G_SOURCE_REMOVE;
+    }
+
+    /* Send all the queries due by now */
+    due = mbimcli_benchmark_queries_due (g_timer_elapsed (ctx->timer, NULL),
+                                         ctx->rate,
+                                         ctx->n_sent,
+                                         ctx->n_in_flight,
+                                         ctx->concurrency);
+    while (due--)
+        send_query ();
+
+    return G_SOURCE_CONTINUE;
+}
+
+static gboolean
+duration_done_cb (void)
+{
+    ctx->duration_id = 0;
+    benchmark_stop ();
+    return G_SOURCE_REMOVE;
+}
+
+void
+mbimcli_benchmark_run (MbimDevice   *device,
+                       GCancellable *cancellable)
+{
+    GError *error = NULL;
+    guint   i;
+
+    /* Initialize context */
+    ctx = g_slice_new0 (Context);
+    ctx->device = g_object_ref (device);
+    ctx->cancellable = cancellable ? g_object_ref (cancellable) : NULL;
+    ctx->latencies = g_array_new (FALSE, FALSE, sizeof (gdouble));
+    ctx->errors = g_hash_table_new_full (g_str_hash, g_str_equal, g_free, NULL);
+
+    if (!benchmark_setup (&error)) {
+        g_printerr ("error: invalid benchmark: %s\n", error->message);
+        g_error_free (error);
+        shutdown (FALSE);
+        return;
+    }
+
+    /* Every response would be kept in memory */
+    if (mbimcli_output_is_structured ()) {
+        g_printerr ("error: benchmark results can only be given as text\n");
+        shutdown (FALSE);
+        return;
+    }
+
+    g_debug ("Running benchmark for %u seconds...", ctx->duration);
+
+    ctx->timer = g_timer_new ();
+    ctx->duration_id = g_timeout_add_seconds (ctx->duration, (GSourceFunc) duration_done_cb, NULL);
+
+    if (ctx->rate) {
+        ctx->tick_id = g_timeout_add (BENCHMARK_TICK_MS, (GSourceFunc) rate_tick_cb, NULL);
+        return;
+    }
+
+    for (i = 0; i < ctx->concurrency; i++)
+        send_query ();
+}
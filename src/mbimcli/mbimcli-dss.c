@@ -73,12 +73,12 @@ mbimcli_dss_get_option_group (void)
     return group;
 }
 
+static guint n_actions = 0;
+static gboolean checked = FALSE;
+
 gboolean
-mbimcli_dss_options_enabled (void)
+mbimcli_dss_options_enabled (GError **error)
 {
-    static guint n_actions = 0;
-    static gboolean checked = FALSE;
-
     if (checked)
         return !!n_actions;
 
@@ -86,14 +86,23 @@ mbimcli_dss_options_enabled (void)
                  !!disconnect_str );
 
     if (n_actions > 1) {
-        g_printerr ("error: too many DSS actions requested\n");
-        exit (EXIT_FAILURE);
+        g_set_error_literal (error, G_OPTION_ERROR, G_OPTION_ERROR_FAILED,
+                             "too many DSS actions requested");
+        return FALSE;
     }
 
     checked = TRUE;
     return !!n_actions;
 }
 
+void
+mbimcli_dss_options_reset (void)
+{
+    mbimcli_reset_option_entries (entries);
+    n_actions = 0;
+    checked = FALSE;
+}
+
 static void
 context_free (Context *context)
 {
@@ -336,3 +336,112 @@ mbimcli_parse_key_value_string (const gchar *str,
 
     return TRUE;
 }
+
+void
+mbimcli_reset_option_entries (const GOptionEntry *entries)
+{
+    /* Values set by callbacks must be reset by the caller */
+    for (; entries->long_name; entries++) {
+        switch (entries->arg) {
+        case G_OPTION_ARG_NONE:
+            *((gboolean *) entries->arg_data) = FALSE;
+            break;
+        case G_OPTION_ARG_INT:
+            *((gint *) entries->arg_data) = 0;
+            break;
+        case G_OPTION_ARG_STRING:
+        case G_OPTION_ARG_FILENAME:
+            g_clear_pointer ((gchar **) entries->arg_data, g_free);
+            break;
+        case G_OPTION_ARG_STRING_ARRAY:
+        case G_OPTION_ARG_FILENAME_ARRAY:
+            g_clear_pointer ((gchar ***) entries->arg_data, g_strfreev);
+            break;
+        default:
+            break;
+        }
+    }
+}
+
+gboolean
+mbimcli_parse_action_line (GOptionContext *context,
+                           const gchar *line,
+                           GError **error)
+{
+    gchar **args = NULL;
+    gchar **argv;
+    gint argc;
+    gint n_args;
+    gboolean success = FALSE;
+
+    if (!g_shell_parse_argv (line, &n_args, &args, error))
+        return FALSE;
+
+    /* The parser removes the options it consumes from the array without
+     * freeing them, so give it a shallow copy */
+    argc = n_args + 1;
+    argv = g_new0 (gchar *, argc + 1);
+    argv[0] = (gchar *) g_get_prgname ();
+    memcpy (&argv[1], args, n_args * sizeof (gchar *));
+
+    if (!g_option_context_parse (context, &argc, &argv, error))
+        goto out;
+
+    if (argc > 1) {
+        g_set_error (error, G_OPTION_ERROR, G_OPTION_ERROR_FAILED,
+                     "unexpected argument '%s'", argv[1]);
+        goto out;
+    }
+
+    success = TRUE;
+
+out:
+    g_free (argv);
+    g_strfreev (args);
+    return success;
+}
+
+/* Nearest-rank percentile */
+gdouble
+mbimcli_benchmark_percentile (const gdouble *sorted_values,
+                              guint n_values,
+                              gdouble percentile)
+{
+    gdouble exact_rank;
+    guint rank;
+
+    g_return_val_if_fail (n_values > 0, 0.0);
+
+    exact_rank = (percentile / 100.0) * n_values;
+    rank = (guint) exact_rank;
+    if (rank < exact_rank)
+        rank++;
+    rank = CLAMP (rank, 1, n_values);
+
+    return sorted_values[rank - 1];
+}
+
+/* Number of queries to send right away to keep up with the given rate,
+ * catching up with the ones delayed by the concurrency limit (0 if none) */
+guint
+mbimcli_benchmark_queries_due (gdouble elapsed,
+                               guint rate,
+                               guint n_sent,
+                               guint n_in_flight,
+                               guint concurrency)
+{
+    guint due;
+
+    due = (guint) (elapsed * rate);
+    if (due <= n_sent)
+        return 0;
+    due -= n_sent;
+
+    if (concurrency) {
+        if (n_in_flight >= concurrency)
+            return 0;
+        due = MIN (due, concurrency - n_in_flight);
+    }
+
+    return due;
+}
@@ -42,4 +42,19 @@ gboolean mbimcli_parse_key_value_string (const gchar *str,
                                          MbimParseKeyValueForeachFn callback,
                                          gpointer user_data);
 
+void mbimcli_reset_option_entries (const GOptionEntry *entries);
+
+gboolean mbimcli_parse_action_line (GOptionContext *context,
+                                    const gchar *line,
+                                    GError **error);
+
+gdouble mbimcli_benchmark_percentile (const gdouble *sorted_values,
+                                      guint n_values,
+                                      gdouble percentile);
+guint mbimcli_benchmark_queries_due (gdouble elapsed,
+                                     guint rate,
+                                     guint n_sent,
+                                     guint n_in_flight,
+                                     guint concurrency);
+
 #endif /* __MBIMCLI_H__ */
@@ -31,6 +31,7 @@
 #include <libmbim-glib.h>
 
 #include "mbimcli.h"
+#include "mbimcli-helpers.h"
 
 /* Context */
 typedef struct {
@@ -65,26 +66,35 @@ mbimcli_intel_firmware_update_get_option_group (void)
    return group;
 }
 
+static guint n_actions = 0;
+static gboolean checked = FALSE;
+
 gboolean
-mbimcli_intel_firmware_update_options_enabled (void)
+mbimcli_intel_firmware_update_options_enabled (GError **error)
 {
-    static guint n_actions = 0;
-    static gboolean checked = FALSE;
-
     if (checked)
         return !!n_actions;
 
     n_actions = modem_reboot_flag;
 
     if (n_actions > 1) {
-        g_printerr ("error: too many Intel Firmware Update Service actions requested\n");
-        exit (EXIT_FAILURE);
+        g_set_error_literal (error, G_OPTION_ERROR, G_OPTION_ERROR_FAILED,
+                             "too many Intel Firmware Update Service actions requested");
+        return FALSE;
     }
 
     checked = TRUE;
     return !!n_actions;
 }
 
+void
+mbimcli_intel_firmware_update_options_reset (void)
+{
+    mbimcli_reset_option_entries (entries);
+    n_actions = 0;
+    checked = FALSE;
+}
+
 static void
 context_free (Context *context)
 {
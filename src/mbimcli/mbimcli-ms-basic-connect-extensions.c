@@ -34,6 +34,7 @@
 
 #include "mbim-common.h"
 #include "mbimcli.h"
+#include "mbimcli-helpers.h"
 
 /* Context */
 typedef struct {
@@ -124,12 +125,12 @@ session_id_parse (const gchar  *str,
     return TRUE;
 }
 
+static guint n_actions = 0;
+static gboolean checked = FALSE;
+
 gboolean
-mbimcli_ms_basic_connect_extensions_options_enabled (void)
+mbimcli_ms_basic_connect_extensions_options_enabled (GError **error)
 {
-    static guint n_actions = 0;
-    static gboolean checked = FALSE;
-
     if (checked)
         return !!n_actions;
 
@@ -138,14 +139,24 @@ mbimcli_ms_basic_connect_extensions_options_enabled (void)
                  query_lte_attach_status_flag);
 
     if (n_actions > 1) {
-        g_printerr ("error: too many Microsoft Basic Connect Extensions Service actions requested\n");
-        exit (EXIT_FAILURE);
+        g_set_error_literal (error, G_OPTION_ERROR, G_OPTION_ERROR_FAILED,
+                             "too many Microsoft Basic Connect Extensions Service actions requested");
+        return FALSE;
     }
 
     checked = TRUE;
     return !!n_actions;
 }
 
+void
+mbimcli_ms_basic_connect_extensions_options_reset (void)
+{
+    mbimcli_reset_option_entries (entries);
+    g_clear_pointer (&query_pco_str, g_free);
+    n_actions = 0;
+    checked = FALSE;
+}
+
 static void
 context_free (Context *context)
 {
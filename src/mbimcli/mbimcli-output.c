@@ -0,0 +1,251 @@
+/* -*- Mode: C; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*- */
+/*
+ * mbimcli -- Command line interface to control MBIM devices
+ *
+ * This program is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation; either version 2 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <http://www.gnu.org/licenses/>.
+ *
+ * Copyright (C) 2026 The libmbim authors
+ */
+
+/*
+ * Structured output of the actions
+ *
+ * Instead of parsing the free-form text printed by each action, every
+ * response received while the action runs is collected and printed through
+ * the generated JSON support of the message, either as JSON or as key=value
+ * lines. The free-form text is discarded meanwhile; errors are still reported
+ * in stderr.
+ */
+
+#include "config.h"
+
+#include <stdio.h>
+
+#include "mbim-common.h"
+#include "mbimcli-output.h"
+
+static MbimcliOutputFormat  output_format = MBIMCLI_OUTPUT_FORMAT_TEXT;
+static MbimDevice          *output_device;
+static guint                output_probe_id;
+static GPtrArray           *output_responses;
+static GPrintFunc           output_old_print_func;
+
+gboolean
+mbimcli_output_format_from_string (const gchar         *str,
+                                   MbimcliOutputFormat *out)
+{
+    if (g_str_equal (str, "text"))
+        *out = MBIMCLI_OUTPUT_FORMAT_TEXT;
+    else if (g_str_equal (str, "json"))
+        *out = MBIMCLI_OUTPUT_FORMAT_JSON;
+    else if (g_str_equal (str, "keyvalue"))
+        *out = MBIMCLI_OUTPUT_FORMAT_KEYVALUE;
+    else
+        return FALSE;
+    return TRUE;
+}
+
+gboolean
+mbimcli_output_is_structured (void)
+{
+    return output_format != MBIMCLI_OUTPUT_FORMAT_TEXT;
+}
+
+static void
+discard_print_func (const gchar *str)
+{
+}
+
+static void
+response_probe_func (MbimProbePoint  point,
+                     gint64          timestamp,
+                     const guint8   *data,
+                     gsize           data_length,
+                     gpointer        user_data)
+{
+    MbimMessage *message;
+
+    message = mbim_message_new (data, data_length);
+    if (mbim_message_get_message_type (message) != MBIM_MESSAGE_TYPE_COMMAND_DONE) {
+        mbim_message_unref (message);
+        return;
+    }
+    g_ptr_array_add (output_responses, message);
+}
+
+void
+mbimcli_output_start (MbimcliOutputFormat  format,
+                      MbimDevice          *device)
+{
+    output_format = format;
+    if (!mbimcli_output_is_structured ())
+        return;
+
+    output_old_print_func = g_set_print_handler (discard_print_func);
+    output_responses = g_ptr_array_new_with_free_func ((GDestroyNotify) mbim_message_unref);
+    output_device = g_object_ref (device);
+    output_probe_id = mbim_device_add_probe (output_device,
+                                             MBIM_PROBE_POINT_MESSAGE_COMPLETED,
+                                             response_probe_func,
+                                             NULL,
+                                             NULL);
+}
+
+void
+mbimcli_output_stop (void)
+{
+    if (!mbimcli_output_is_structured () || !output_device)
+        return;
+
+    mbim_device_remove_probe (output_device, output_probe_id);
+    g_clear_object (&output_device);
+    g_ptr_array_unref (output_responses);
+    output_responses = NULL;
+    g_set_print_handler (output_old_print_func);
+}
+
+/*****************************************************************************/
+
+static void
+string_append_func (const gchar *str,
+                    gsize        len,
+                    gpointer     user_data)
+{
+    g_string_append_len ((GString *) user_data, str, len);
+}
+
+/* JSON */
+
+static void
+append_json (GString         *out,
+             const gchar     *device,
+             const gchar     *action,
+             gboolean         operation_status,
+             gdouble          time,
+             const GPtrArray *responses)
+{
+    guint i;
+
+    g_string_append (out, "{\"device\":");
+    mbim_common_json_append_string (device, string_append_func, out);
+    if (action) {
+        g_string_append (out, ",\"action\":");
+        mbim_common_json_append_string (action, string_append_func, out);
+    }
+    g_string_append_printf (out, ",\"success\":%s", operation_status ? "true" : "false");
+    if (time >= 0.0)
+        g_string_append_printf (out, ",\"time\":%.6f", time);
+    g_string_append (out, ",\"responses\":[");
+    for (i = 0; i < responses->len; i++) {
+        if (i > 0)
+            g_string_append_c (out, ',');
+        mbim_message_print_json (g_ptr_array_index (responses, i), string_append_func, out);
+    }
+    g_string_append (out, "]}\n");
+}
+
+/* Key-value
+ *
+ * The keys of the values within each response join the names of the members
+ * and the indices of the arrays in its JSON object with dots, e.g.:
+ *   response.0.fields.DeviceId=0123456789
+ */
+
+static void
+append_key_value (GString     *out,
+                  const gchar *key,
+                  const gchar *value)
+{
+    g_string_append (out, key);
+    g_string_append_c (out, '=');
+    mbim_common_keyvalue_append_string (value, string_append_func, out);
+    g_string_append_c (out, '\n');
+}
+
+static void
+append_keyvalue (GString         *out,
+                 const gchar     *device,
+                 const gchar     *action,
+                 gboolean         operation_status,
+                 gdouble          time,
+                 const GPtrArray *responses)
+{
+    guint i;
+
+    append_key_value (out, "device", device);
+    if (action)
+        append_key_value (out, "action", action);
+    g_string_append_printf (out, "success=%s\n", operation_status ? "true" : "false");
+    if (time >= 0.0)
+        g_string_append_printf (out, "time=%.6f\n", time);
+
+    for (i = 0; i < responses->len; i++) {
+        gchar key_prefix[32];
+
+        g_snprintf (key_prefix, sizeof (key_prefix), "response.%u", i);
+        mbim_message_print_keyvalue (g_ptr_array_index (responses, i), key_prefix, string_append_func, out);
+    }
+
+    /* Records are separated by an empty line */
+    g_string_append_c (out, '\n');
+}
+
+void
+mbimcli_output_append_record (GString             *out,
+                              MbimcliOutputFormat  format,
+                              const gchar         *device,
+                              const gchar         *action,
+                              gboolean             operation_status,
+                              gdouble              time,
+                              const GPtrArray     *responses)
+{
+    switch (format) {
+    case MBIMCLI_OUTPUT_FORMAT_JSON:
+        append_json (out, device, action, operation_status, time, responses);
+        break;
+    case MBIMCLI_OUTPUT_FORMAT_KEYVALUE:
+        append_keyvalue (out, device, action, operation_status, time, responses);
+        break;
+    case MBIMCLI_OUTPUT_FORMAT_TEXT:
+    default:
+        g_assert_not_reached ();
+    }
+}
+
+/*****************************************************************************/
+
+void
+mbimcli_output_action_done (const gchar *action,
+                            gboolean     operation_status,
+                            gdouble      time)
+{
+    GString *out;
+
+    if (!mbimcli_output_is_structured () || !output_device)
+        return;
+
+    out = g_string_new (NULL);
+    mbimcli_output_append_record (out,
+                                  output_format,
+                                  mbim_device_get_path_display (output_device),
+                                  action,
+                                  operation_status,
+                                  time,
+                                  output_responses);
+    fwrite (out->str, 1, out->len, stdout);
+    fflush (stdout);
+    g_string_free (out, TRUE);
+
+    g_ptr_array_set_size (output_responses, 0);
+}
@@ -0,0 +1,55 @@
+/* -*- Mode: C; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*- */
+/*
+ * mbimcli -- Command line interface to control MBIM devices
+ *
+ * This program is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation; either version 2 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <http://www.gnu.org/licenses/>.
+ *
+ * Copyright (C) 2026 The libmbim authors
+ */
+
+#include <glib.h>
+
+#include <libmbim-glib.h>
+
+#ifndef __MBIMCLI_OUTPUT_H__
+#define __MBIMCLI_OUTPUT_H__
+
+typedef enum {
+    MBIMCLI_OUTPUT_FORMAT_TEXT,
+    MBIMCLI_OUTPUT_FORMAT_JSON,
+    MBIMCLI_OUTPUT_FORMAT_KEYVALUE
+} MbimcliOutputFormat;
+
+gboolean mbimcli_output_format_from_string (const gchar         *str,
+                                            MbimcliOutputFormat *out);
+
+gboolean mbimcli_output_is_structured (void);
+
+void     mbimcli_output_start        (MbimcliOutputFormat  format,
+                                      MbimDevice          *device);
+void     mbimcli_output_action_done  (const gchar         *action,
+                                      gboolean             operation_status,
+                                      gdouble              time);
+void     mbimcli_output_stop         (void);
+
+/* Formats one record, as printed when each action is done */
+void     mbimcli_output_append_record (GString             *out,
+                                       MbimcliOutputFormat  format,
+                                       const gchar         *device,
+                                       const gchar         *action,
+                                       gboolean             operation_status,
+                                       gdouble              time,
+                                       const GPtrArray     *responses);
+
+#endif /* __MBIMCLI_OUTPUT_H__ */
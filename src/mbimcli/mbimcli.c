@@ -25,16 +25,19 @@
 #include <locale.h>
 #include <string.h>
 #include <errno.h>
+#include <unistd.h>
 
 #include <glib.h>
 #include <glib/gprintf.h>
 #include <gio/gio.h>
 #include <glib-unix.h>
+#include <gio/gunixinputstream.h>
 
 #include <libmbim-glib.h>
 
 #include "mbimcli.h"
 #include "mbimcli-helpers.h"
+#include "mbimcli-output.h"
 
 #define PROGRAM_NAME    "mbimcli"
 #define PROGRAM_VERSION PACKAGE_VERSION
@@ -44,6 +47,7 @@ static GMainLoop *loop;
 static GCancellable *cancellable;
 static MbimDevice *device;
 static MbimService service;
+static gboolean benchmark;
 static gboolean operation_status;
 
 /* Main options */
@@ -54,6 +58,9 @@ static gboolean no_close_flag;
 static gboolean noop_flag;
 static gboolean verbose_flag;
 static gboolean silent_flag;
+static gboolean json_messages_flag;
+static gchar *output_format_str;
+static gchar *batch_str;
 static gboolean version_flag;
 
 static GOptionEntry main_entries[] = {
@@ -85,6 +92,18 @@ static GOptionEntry main_entries[] = {
       "Run action with no logs; not even the error/warning ones",
       NULL
     },
+    { "json-messages", 0, G_OPTION_FLAG_HIDDEN, G_OPTION_ARG_NONE, &json_messages_flag,
+      "Deprecated, same as --output-format=json",
+      NULL
+    },
+    { "output-format", 0, 0, G_OPTION_ARG_STRING, &output_format_str,
+      "Print the responses of the action in a structured format instead of as free-form text",
+      "[text|json|keyvalue]"
+    },
+    { "batch", 0, 0, G_OPTION_ARG_FILENAME, &batch_str,
+      "Run the actions given in a file, one per line, on the same open device; use '-' to read them from stdin",
+      "[FILE]"
+    },
     { "version", 'V', 0, G_OPTION_ARG_NONE, &version_flag,
       "Print version",
       NULL
@@ -92,6 +111,8 @@ static GOptionEntry main_entries[] = {
     { NULL }
 };
 
+static MbimcliOutputFormat output_format = MBIMCLI_OUTPUT_FORMAT_TEXT;
+
 static gboolean
 signals_handler (gpointer psignum)
 {
@@ -167,6 +188,23 @@ log_handler (const gchar *log_domain,
                message);
 }
 
+/* The library only formats its trace logs when G_MESSAGES_DEBUG enables its
+ * domain; they're written by our own log handler though */
+static void
+enable_library_debug_logs (void)
+{
+    const gchar *domains;
+    gchar       *new_domains;
+
+    domains = g_getenv ("G_MESSAGES_DEBUG");
+    if (domains && (g_str_equal (domains, "all") || strstr (domains, "Mbim")))
+        return;
+
+    new_domains = g_strconcat (domains ? domains : "", domains ? " " : "", "Mbim", NULL);
+    g_setenv ("G_MESSAGES_DEBUG", new_domains, TRUE);
+    g_free (new_domains);
+}
+
 static void
 print_version_and_exit (void)
 {
@@ -212,12 +250,27 @@ device_close_ready (MbimDevice   *dev,
     g_main_loop_quit (loop);
 }
 
+static gboolean batch_running (void);
+static void     batch_action_done (gboolean action_status);
+
 void
 mbimcli_async_operation_done (gboolean reported_operation_status)
 {
+    /* In batch mode, go on with the next action */
+    if (batch_running ()) {
+        batch_action_done (reported_operation_status);
+        return;
+    }
+
     /* Keep the result of the operation */
     operation_status = reported_operation_status;
 
+    /* Structured output of the single action run; each action in batch mode
+     * already got its own */
+    if (!batch_str)
+        mbimcli_output_action_done (NULL, operation_status, -1.0);
+    mbimcli_output_stop ();
+
     /* Cleanup cancellation */
     g_clear_object (&cancellable);
 
@@ -235,23 +288,11 @@ mbimcli_async_operation_done (gboolean reported_operation_status)
 }
 
 static void
-device_open_ready (MbimDevice   *dev,
-                   GAsyncResult *res)
+run_action (MbimDevice *dev)
 {
-    GError *error = NULL;
-
-    if (!mbim_device_open_finish (dev, res, &error)) {
-        g_printerr ("error: couldn't open the MbimDevice: %s\n",
-                    error->message);
-        exit (EXIT_FAILURE);
-    }
-
-    g_debug ("MBIM Device at '%s' ready",
-             mbim_device_get_path_display (dev));
-
-    /* If no operation requested, finish */
-    if (noop_flag) {
-        mbimcli_async_operation_done (TRUE);
+    /* Not bound to a single service */
+    if (benchmark) {
+        mbimcli_benchmark_run (dev, cancellable);
         return;
     }
 
@@ -286,6 +327,266 @@ device_open_ready (MbimDevice   *dev,
     }
 }
 
+/*****************************************************************************/
+/* Batch mode */
+
+static GDataInputStream *batch_input;
+static guint             batch_line;
+static gchar            *batch_action_str;
+static guint             batch_n_actions;
+static guint             batch_n_failed;
+static GTimer           *batch_action_timer;
+static GTimer           *batch_timer;
+
+static gboolean parse_service_actions (guint *n_actions, GError **error);
+static void     batch_run_next        (void);
+
+static gboolean
+batch_running (void)
+{
+    return !!batch_input;
+}
+
+static void
+batch_finish (gboolean input_status)
+{
+    g_print ("[%s] Batch finished: %u actions run, %u failed, %.3f seconds\n",
+             mbim_device_get_path_display (device),
+             batch_n_actions,
+             batch_n_failed,
+             g_timer_elapsed (batch_timer, NULL));
+
+    g_clear_object (&batch_input);
+    g_clear_pointer (&batch_action_timer, g_timer_destroy);
+    g_clear_pointer (&batch_timer, g_timer_destroy);
+
+    /* Not in batch mode any more, so this closes the device */
+    mbimcli_async_operation_done (input_status && !batch_n_failed);
+}
+
+static gboolean
+batch_run_next_cb (void)
+{
+    batch_run_next ();
+    return FALSE;
+}
+
+static void
+batch_action_done (gboolean action_status)
+{
+    if (mbimcli_output_is_structured ())
+        mbimcli_output_action_done (batch_action_str,
+                                    action_status,
+                                    g_timer_elapsed (batch_action_timer, NULL));
+    else {
+        g_print ("[%s] Action at line %u %s in %.3f seconds: %s\n",
+                 mbim_device_get_path_display (device),
+                 batch_line,
+                 action_status ? "succeeded" : "failed",
+                 g_timer_elapsed (batch_action_timer, NULL),
+                 batch_action_str);
+        fflush (stdout);
+    }
+
+    batch_n_actions++;
+    if (!action_status)
+        batch_n_failed++;
+    g_clear_pointer (&batch_action_str, g_free);
+
+    /* Let the action finish its cleanup before running the next one */
+    g_idle_add ((GSourceFunc) batch_run_next_cb, NULL);
+}
+
+static GOptionContext *
+batch_option_context_new (void)
+{
+    GOptionContext *context;
+
+    context = g_option_context_new (NULL);
+    g_option_context_set_help_enabled (context, FALSE);
+    g_option_context_add_group (context,
+                                mbimcli_basic_connect_get_option_group ());
+    g_option_context_add_group (context,
+                                mbimcli_phonebook_get_option_group ());
+    g_option_context_add_group (context,
+                                mbimcli_dss_get_option_group ());
+    g_option_context_add_group (context,
+                                mbimcli_ms_firmware_id_get_option_group ());
+    g_option_context_add_group (context,
+                                mbimcli_ms_host_shutdown_get_option_group ());
+    g_option_context_add_group (context,
+                                mbimcli_atds_get_option_group ());
+    g_option_context_add_group (context,
+                                mbimcli_intel_firmware_update_get_option_group ());
+    g_option_context_add_group (context,
+                                mbimcli_ms_basic_connect_extensions_get_option_group ());
+    g_option_context_add_group (context,
+                                mbimcli_benchmark_get_option_group ());
+    return context;
+}
+
+static gboolean
+batch_parse_action (const gchar  *line,
+                    GError      **error)
+{
+    GOptionContext *context;
+    guint           n_actions;
+    gboolean        success = FALSE;
+
+    /* Options of a previous action must not be carried over */
+    mbimcli_basic_connect_options_reset ();
+    mbimcli_phonebook_options_reset ();
+    mbimcli_dss_options_reset ();
+    mbimcli_ms_firmware_id_options_reset ();
+    mbimcli_ms_host_shutdown_options_reset ();
+    mbimcli_atds_options_reset ();
+    mbimcli_intel_firmware_update_options_reset ();
+    mbimcli_ms_basic_connect_extensions_options_reset ();
+    mbimcli_benchmark_options_reset ();
+
+    context = batch_option_context_new ();
+    if (!mbimcli_parse_action_line (context, line, error))
+        goto out;
+
+    if (!parse_service_actions (&n_actions, error))
+        goto out;
+    if (n_actions == 0) {
+        g_set_error_literal (error, G_OPTION_ERROR, G_OPTION_ERROR_FAILED,
+                             "no actions specified");
+        goto out;
+    }
+    if (n_actions > 1) {
+        g_set_error_literal (error, G_OPTION_ERROR, G_OPTION_ERROR_FAILED,
+                             "cannot execute multiple actions");
+        goto out;
+    }
+
+    success = TRUE;
+
+out:
+    g_option_context_free (context);
+    return success;
+}
+
+static void
+batch_read_line_ready (GDataInputStream *input,
+                       GAsyncResult     *res)
+{
+    GError *error = NULL;
+    gchar  *line;
+
+    line = g_data_input_stream_read_line_finish (input, res, NULL, &error);
+    if (!line) {
+        if (error) {
+            g_printerr ("error: couldn't read batch actions: %s\n", error->message);
+            g_error_free (error);
+            batch_finish (FALSE);
+            return;
+        }
+        /* End of input */
+        batch_finish (TRUE);
+        return;
+    }
+
+    batch_line++;
+
+    /* Skip empty lines and comments */
+    g_strstrip (line);
+    if (!line[0] || line[0] == '#') {
+        g_free (line);
+        batch_run_next ();
+        return;
+    }
+
+    batch_action_str = line;
+    g_timer_start (batch_action_timer);
+
+    if (!batch_parse_action (line, &error)) {
+        g_printerr ("error: invalid action at line %u: %s\n", batch_line, error->message);
+        g_error_free (error);
+        batch_action_done (FALSE);
+        return;
+    }
+
+    run_action (device);
+}
+
+static void
+batch_run_next (void)
+{
+    if (g_cancellable_is_cancelled (cancellable)) {
+        batch_finish (FALSE);
+        return;
+    }
+
+    g_data_input_stream_read_line_async (batch_input,
+                                         G_PRIORITY_DEFAULT,
+                                         cancellable,
+                                         (GAsyncReadyCallback) batch_read_line_ready,
+                                         NULL);
+}
+
+static gboolean
+batch_setup (GError **error)
+{
+    GInputStream *input;
+
+    if (g_str_equal (batch_str, "-"))
+        input = g_unix_input_stream_new (STDIN_FILENO, FALSE);
+    else {
+        GFile *file;
+
+        file = g_file_new_for_commandline_arg (batch_str);
+        input = G_INPUT_STREAM (g_file_read (file, NULL, error));
+        g_object_unref (file);
+        if (!input)
+            return FALSE;
+    }
+
+    batch_input = g_data_input_stream_new (input);
+    g_data_input_stream_set_newline_type (batch_input, G_DATA_STREAM_NEWLINE_TYPE_ANY);
+    g_object_unref (input);
+
+    batch_action_timer = g_timer_new ();
+    batch_timer = g_timer_new ();
+    return TRUE;
+}
+
+/*****************************************************************************/
+
+static void
+device_open_ready (MbimDevice   *dev,
+                   GAsyncResult *res)
+{
+    GError *error = NULL;
+
+    if (!mbim_device_open_finish (dev, res, &error)) {
+        g_printerr ("error: couldn't open the MbimDevice: %s\n",
+                    error->message);
+        exit (EXIT_FAILURE);
+    }
+
+    g_debug ("MBIM Device at '%s' ready",
+             mbim_device_get_path_display (dev));
+
+    /* Collect the responses of the actions, if requested */
+    mbimcli_output_start (output_format, dev);
+
+    /* If no operation requested, finish */
+    if (noop_flag) {
+        mbimcli_async_operation_done (TRUE);
+        return;
+    }
+
+    /* Run actions read from the batch input */
+    if (batch_running ()) {
+        batch_run_next ();
+        return;
+    }
+
+    run_action (dev);
+}
+
 static void
 device_new_ready (GObject      *unused,
                   GAsyncResult *res)
@@ -331,38 +632,76 @@ device_new_ready (GObject      *unused,
 
 /*****************************************************************************/
 
-static void
-parse_actions (void)
+/* Gets the number of services with actions requested, and sets the service to
+ * run; fails if too many actions of the same service are requested */
+static gboolean
+parse_service_actions (guint   *n_actions,
+                       GError **error)
 {
+    GError *inner_error = NULL;
     guint actions_enabled = 0;
 
     /* Basic Connect options? */
-    if (mbimcli_basic_connect_options_enabled ()) {
+    if (mbimcli_basic_connect_options_enabled (&inner_error)) {
         service = MBIM_SERVICE_BASIC_CONNECT;
         actions_enabled++;
-    } else if (mbimcli_phonebook_options_enabled ()) {
+    } else if (!inner_error && mbimcli_phonebook_options_enabled (&inner_error)) {
         service = MBIM_SERVICE_PHONEBOOK;
         actions_enabled++;
-    } else if (mbimcli_dss_options_enabled ()) {
+    } else if (!inner_error && mbimcli_dss_options_enabled (&inner_error)) {
         service = MBIM_SERVICE_DSS;
         actions_enabled++;
-    } else if (mbimcli_ms_firmware_id_options_enabled ()) {
+    } else if (!inner_error && mbimcli_ms_firmware_id_options_enabled (&inner_error)) {
         service = MBIM_SERVICE_MS_FIRMWARE_ID;
         actions_enabled++;
-    } else if (mbimcli_ms_host_shutdown_options_enabled ()) {
+    } else if (!inner_error && mbimcli_ms_host_shutdown_options_enabled (&inner_error)) {
         service = MBIM_SERVICE_MS_HOST_SHUTDOWN;
         actions_enabled++;
-    } else if (mbimcli_atds_options_enabled ()) {
+    } else if (!inner_error && mbimcli_atds_options_enabled (&inner_error)) {
         service = MBIM_SERVICE_ATDS;
         actions_enabled++;
-    } else if (mbimcli_intel_firmware_update_options_enabled ()) {
+    } else if (!inner_error && mbimcli_intel_firmware_update_options_enabled (&inner_error)) {
         service = MBIM_SERVICE_INTEL_FIRMWARE_UPDATE;
         actions_enabled++;
-    } else if (mbimcli_ms_basic_connect_extensions_options_enabled ()) {
+    } else if (!inner_error && mbimcli_ms_basic_connect_extensions_options_enabled (&inner_error)) {
         service = MBIM_SERVICE_MS_BASIC_CONNECT_EXTENSIONS;
         actions_enabled++;
     }
 
+    if (inner_error) {
+        g_propagate_error (error, inner_error);
+        return FALSE;
+    }
+
+    /* Benchmark */
+    benchmark = mbimcli_benchmark_options_enabled (NULL);
+    if (benchmark)
+        actions_enabled++;
+
+    *n_actions = actions_enabled;
+    return TRUE;
+}
+
+static void
+parse_actions (void)
+{
+    GError *error = NULL;
+    guint actions_enabled;
+
+    if (!parse_service_actions (&actions_enabled, &error)) {
+        g_printerr ("error: %s\n", error->message);
+        exit (EXIT_FAILURE);
+    }
+
+    /* Actions are read from the batch input */
+    if (batch_str) {
+        if (actions_enabled || noop_flag) {
+            g_printerr ("error: cannot execute actions in batch mode\n");
+            exit (EXIT_FAILURE);
+        }
+        return;
+    }
+
     /* Noop */
     if (noop_flag)
         actions_enabled++;
@@ -408,6 +747,8 @@ int main (int argc, char **argv)
                                 mbimcli_intel_firmware_update_get_option_group ());
     g_option_context_add_group (context,
                                 mbimcli_ms_basic_connect_extensions_get_option_group ());
+    g_option_context_add_group (context,
+                                mbimcli_benchmark_get_option_group ());
     g_option_context_add_main_entries (context, main_entries, NULL);
     if (!g_option_context_parse (context, &argc, &argv, &error)) {
         g_printerr ("error: %s\n",
@@ -421,8 +762,26 @@ int main (int argc, char **argv)
 
     g_log_set_handler (NULL, G_LOG_LEVEL_MASK, log_handler, NULL);
     g_log_set_handler ("Mbim", G_LOG_LEVEL_MASK, log_handler, NULL);
-    if (verbose_flag)
+    if (verbose_flag) {
+        enable_library_debug_logs ();
         mbim_utils_set_traces_enabled (TRUE);
+    }
+
+    if (output_format_str &&
+        !mbimcli_output_format_from_string (output_format_str, &output_format)) {
+        g_printerr ("error: invalid output format: %s\n", output_format_str);
+        exit (EXIT_FAILURE);
+    }
+
+    /* Deprecated alias of --output-format=json */
+    if (json_messages_flag) {
+        if (output_format != MBIMCLI_OUTPUT_FORMAT_TEXT && output_format != MBIMCLI_OUTPUT_FORMAT_JSON) {
+            g_printerr ("error: --json-messages cannot be used with other output formats\n");
+            exit (EXIT_FAILURE);
+        }
+        g_printerr ("warning: --json-messages is deprecated, use --output-format=json instead\n");
+        output_format = MBIMCLI_OUTPUT_FORMAT_JSON;
+    }
 
     /* No device path given? */
     if (!device_str) {
@@ -435,6 +794,12 @@ int main (int argc, char **argv)
 
     parse_actions ();
 
+    if (batch_str && !batch_setup (&error)) {
+        g_printerr ("error: couldn't open batch actions file: %s\n",
+                    error->message);
+        exit (EXIT_FAILURE);
+    }
+
     /* Create requirements for async options */
     cancellable = g_cancellable_new ();
     loop = g_main_loop_new (NULL, FALSE);
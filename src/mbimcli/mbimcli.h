@@ -37,15 +37,27 @@ GOptionGroup *mbimcli_ms_host_shutdown_get_option_group (void);
 GOptionGroup *mbimcli_atds_get_option_group             (void);
 GOptionGroup *mbimcli_intel_firmware_update_get_option_group (void);
 GOptionGroup *mbimcli_ms_basic_connect_extensions_get_option_group (void);
+GOptionGroup *mbimcli_benchmark_get_option_group        (void);
 
-gboolean      mbimcli_basic_connect_options_enabled     (void);
-gboolean      mbimcli_phonebook_options_enabled         (void);
-gboolean      mbimcli_dss_options_enabled               (void);
-gboolean      mbimcli_ms_firmware_id_options_enabled    (void);
-gboolean      mbimcli_ms_host_shutdown_options_enabled  (void);
-gboolean      mbimcli_atds_options_enabled              (void);
-gboolean      mbimcli_intel_firmware_update_options_enabled (void);
-gboolean      mbimcli_ms_basic_connect_extensions_options_enabled (void);
+gboolean      mbimcli_basic_connect_options_enabled     (GError **error);
+gboolean      mbimcli_phonebook_options_enabled         (GError **error);
+gboolean      mbimcli_dss_options_enabled               (GError **error);
+gboolean      mbimcli_ms_firmware_id_options_enabled    (GError **error);
+gboolean      mbimcli_ms_host_shutdown_options_enabled  (GError **error);
+gboolean      mbimcli_atds_options_enabled              (GError **error);
+gboolean      mbimcli_intel_firmware_update_options_enabled (GError **error);
+gboolean      mbimcli_ms_basic_connect_extensions_options_enabled (GError **error);
+gboolean      mbimcli_benchmark_options_enabled         (GError **error);
+
+void          mbimcli_basic_connect_options_reset       (void);
+void          mbimcli_phonebook_options_reset           (void);
+void          mbimcli_dss_options_reset                 (void);
+void          mbimcli_ms_firmware_id_options_reset      (void);
+void          mbimcli_ms_host_shutdown_options_reset    (void);
+void          mbimcli_atds_options_reset                (void);
+void          mbimcli_intel_firmware_update_options_reset (void);
+void          mbimcli_ms_basic_connect_extensions_options_reset (void);
+void          mbimcli_benchmark_options_reset           (void);
 
 void          mbimcli_basic_connect_run                 (MbimDevice *device,
                                                          GCancellable *cancellable);
@@ -63,5 +75,7 @@ void          mbimcli_intel_firmware_update_run         (MbimDevice *device,
                                                          GCancellable *cancellable);
 void          mbimcli_ms_basic_connect_extensions_run   (MbimDevice *device,
                                                          GCancellable *cancellable);
+void          mbimcli_benchmark_run                     (MbimDevice *device,
+                                                         GCancellable *cancellable);
 
 #endif /* __MBIMCLI_H__ */
@@ -0,0 +1,195 @@
+/* -*- Mode: C; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*- */
+/*
+ * This program is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation; either version 2 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details:
+ *
+ * Copyright (C) 2026 The libmbim authors
+ */
+
+#include <config.h>
+#include <string.h>
+
+#include <glib.h>
+#include <libmbim-glib.h>
+
+#include "mbimcli-helpers.h"
+
+static gboolean  test_flag;
+static gchar    *test_str;
+static gint      test_int;
+static gchar   **test_strv;
+
+static GOptionEntry test_entries[] = {
+    { "flag", 0, 0, G_OPTION_ARG_NONE, &test_flag, NULL, NULL },
+    { "str", 0, 0, G_OPTION_ARG_STRING, &test_str, NULL, NULL },
+    { "int", 0, 0, G_OPTION_ARG_INT, &test_int, NULL, NULL },
+    { "strv", 0, 0, G_OPTION_ARG_STRING_ARRAY, &test_strv, NULL, NULL },
+    { NULL }
+};
+
+static gboolean
+parse_action_line (const gchar  *line,
+                   GError      **error)
+{
+    GOptionContext *context;
+    gboolean        success;
+
+    mbimcli_reset_option_entries (test_entries);
+
+    context = g_option_context_new (NULL);
+    g_option_context_set_help_enabled (context, FALSE);
+    g_option_context_add_main_entries (context, test_entries, NULL);
+    success = mbimcli_parse_action_line (context, line, error);
+    g_option_context_free (context);
+    return success;
+}
+
+static void
+test_parse_action_line (void)
+{
+    GError *error = NULL;
+
+    g_assert (parse_action_line ("--flag --str=foo --int 3 --strv a --strv b", &error));
+    g_assert_no_error (error);
+    g_assert (test_flag);
+    g_assert_cmpstr (test_str, ==, "foo");
+    g_assert_cmpint (test_int, ==, 3);
+    g_assert (test_strv);
+    g_assert_cmpuint (g_strv_length (test_strv), ==, 2);
+    g_assert_cmpstr (test_strv[0], ==, "a");
+    g_assert_cmpstr (test_strv[1], ==, "b");
+
+    /* Shell quoting */
+    g_assert (parse_action_line ("--str 'foo bar'", &error));
+    g_assert_no_error (error);
+    g_assert_cmpstr (test_str, ==, "foo bar");
+    g_assert (parse_action_line ("--str=\"a,\\\"b\\\"\"", &error));
+    g_assert_no_error (error);
+    g_assert_cmpstr (test_str, ==, "a,\"b\"");
+
+    /* Empty line */
+    g_assert (parse_action_line ("   ", &error) == FALSE);
+    g_assert_error (error, G_SHELL_ERROR, G_SHELL_ERROR_EMPTY_STRING);
+    g_clear_error (&error);
+
+    /* Unbalanced quotes */
+    g_assert (parse_action_line ("--str 'foo", &error) == FALSE);
+    g_assert_error (error, G_SHELL_ERROR, G_SHELL_ERROR_BAD_QUOTING);
+    g_clear_error (&error);
+
+    /* Unknown option */
+    g_assert (parse_action_line ("--flag --unknown", &error) == FALSE);
+    g_assert_error (error, G_OPTION_ERROR, G_OPTION_ERROR_UNKNOWN_OPTION);
+    g_clear_error (&error);
+
+    /* Missing value */
+    g_assert (parse_action_line ("--str", &error) == FALSE);
+    g_assert_error (error, G_OPTION_ERROR, G_OPTION_ERROR_BAD_VALUE);
+    g_clear_error (&error);
+
+    /* Arguments which are not options */
+    g_assert (parse_action_line ("--flag extra", &error) == FALSE);
+    g_assert_error (error, G_OPTION_ERROR, G_OPTION_ERROR_FAILED);
+    g_assert (strstr (error->message, "extra"));
+    g_clear_error (&error);
+
+    mbimcli_reset_option_entries (test_entries);
+}
+
+static void
+test_reset_option_entries (void)
+{
+    GError *error = NULL;
+
+    g_assert (parse_action_line ("--flag --str=foo --int 3 --strv a", &error));
+    g_assert_no_error (error);
+
+    mbimcli_reset_option_entries (test_entries);
+    g_assert (!test_flag);
+    g_assert (test_str == NULL);
+    g_assert_cmpint (test_int, ==, 0);
+    g_assert (test_strv == NULL);
+
+    /* Nothing carried over from one line to the next */
+    g_assert (parse_action_line ("--str=foo --strv a", &error));
+    g_assert (parse_action_line ("--flag", &error));
+    g_assert_no_error (error);
+    g_assert (test_flag);
+    g_assert (test_str == NULL);
+    g_assert (test_strv == NULL);
+
+    /* Resetting twice is fine */
+    mbimcli_reset_option_entries (test_entries);
+    mbimcli_reset_option_entries (test_entries);
+    g_assert (!test_flag);
+}
+
+static void
+test_benchmark_percentile (void)
+{
+    static const gdouble single[] = { 7.0 };
+    gdouble values[100];
+    guint i;
+
+    /* 1, 2, ..., 100 */
+    for (i = 0; i < G_N_ELEMENTS (values); i++)
+        values[i] = i + 1;
+
+    g_assert_cmpfloat (mbimcli_benchmark_percentile (values, 100, 0.0),   ==, 1.0);
+    g_assert_cmpfloat (mbimcli_benchmark_percentile (values, 100, 50.0),  ==, 50.0);
+    g_assert_cmpfloat (mbimcli_benchmark_percentile (values, 100, 90.0),  ==, 90.0);
+    g_assert_cmpfloat (mbimcli_benchmark_percentile (values, 100, 99.0),  ==, 99.0);
+    g_assert_cmpfloat (mbimcli_benchmark_percentile (values, 100, 99.9),  ==, 100.0);
+    g_assert_cmpfloat (mbimcli_benchmark_percentile (values, 100, 100.0), ==, 100.0);
+
+    /* Nearest rank rounds up */
+    g_assert_cmpfloat (mbimcli_benchmark_percentile (values, 10, 50.0), ==, 5.0);
+    g_assert_cmpfloat (mbimcli_benchmark_percentile (values, 10, 51.0), ==, 6.0);
+    g_assert_cmpfloat (mbimcli_benchmark_percentile (values, 3, 50.0),  ==, 2.0);
+
+    for (i = 0; i <= 100; i += 25)
+        g_assert_cmpfloat (mbimcli_benchmark_percentile (single, 1, i), ==, 7.0);
+}
+
+static void
+test_benchmark_queries_due (void)
+{
+    /* Nothing due before the first period */
+    g_assert_cmpuint (mbimcli_benchmark_queries_due (0.0,   100, 0, 0, 0), ==, 0);
+    g_assert_cmpuint (mbimcli_benchmark_queries_due (0.009, 100, 0, 0, 0), ==, 0);
+
+    /* Due queries follow the elapsed time */
+    g_assert_cmpuint (mbimcli_benchmark_queries_due (0.01, 100, 0, 0, 0),  ==, 1);
+    g_assert_cmpuint (mbimcli_benchmark_queries_due (1.0,  100, 0, 0, 0),  ==, 100);
+    g_assert_cmpuint (mbimcli_benchmark_queries_due (1.0,  100, 95, 0, 0), ==, 5);
+    g_assert_cmpuint (mbimcli_benchmark_queries_due (1.0,  100, 100, 0, 0), ==, 0);
+    g_assert_cmpuint (mbimcli_benchmark_queries_due (1.0,  100, 120, 0, 0), ==, 0);
+
+    /* Limited by the concurrency */
+    g_assert_cmpuint (mbimcli_benchmark_queries_due (1.0, 100, 0, 0, 10),  ==, 10);
+    g_assert_cmpuint (mbimcli_benchmark_queries_due (1.0, 100, 0, 7, 10),  ==, 3);
+    g_assert_cmpuint (mbimcli_benchmark_queries_due (1.0, 100, 0, 10, 10), ==, 0);
+    g_assert_cmpuint (mbimcli_benchmark_queries_due (1.0, 100, 0, 12, 10), ==, 0);
+
+    /* Delayed queries are caught up later */
+    g_assert_cmpuint (mbimcli_benchmark_queries_due (2.0, 100, 10, 0, 0), ==, 190);
+}
+
+int main (int argc, char **argv)
+{
+    g_test_init (&argc, &argv, NULL);
+
+    g_test_add_func ("/mbimcli/batch/parse-action-line", test_parse_action_line);
+    g_test_add_func ("/mbimcli/batch/reset-options",     test_reset_option_entries);
+    g_test_add_func ("/mbimcli/benchmark/percentile",    test_benchmark_percentile);
+    g_test_add_func ("/mbimcli/benchmark/queries-due",   test_benchmark_queries_due);
+
+    return g_test_run ();
+}
@@ -0,0 +1,156 @@
+/* -*- Mode: C; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*- */
+/*
+ * This program is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation; either version 2 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details:
+ *
+ * Copyright (C) 2026 The libmbim authors
+ */
+
+#include <config.h>
+#include <string.h>
+
+#include <glib.h>
+#include <libmbim-glib.h>
+
+#include "mbimcli-output.h"
+
+/* PIN query response: no PIN, unlocked */
+static const guint8 pin_response[] = {
+    0x03, 0x00, 0x00, 0x80,
+    0x3c, 0x00, 0x00, 0x00,
+    0x01, 0x00, 0x00, 0x00,
+    0x01, 0x00, 0x00, 0x00,
+    0x00, 0x00, 0x00, 0x00,
+    0xa2, 0x89, 0xcc, 0x33,
+    0xbc, 0xbb, 0x8b, 0x4f,
+    0xb6, 0xb0, 0x13, 0x3e,
+    0xc2, 0xaa, 0xe6, 0xdf,
+    0x04, 0x00, 0x00, 0x00,
+    0x00, 0x00, 0x00, 0x00,
+    0x0c, 0x00, 0x00, 0x00,
+    0x00, 0x00, 0x00, 0x00,
+    0x00, 0x00, 0x00, 0x00,
+    0x00, 0x00, 0x00, 0x00
+};
+
+static GPtrArray *
+responses_new (guint n_responses)
+{
+    GPtrArray *responses;
+    guint      i;
+
+    responses = g_ptr_array_new_with_free_func ((GDestroyNotify) mbim_message_unref);
+    for (i = 0; i < n_responses; i++)
+        g_ptr_array_add (responses, mbim_message_new (pin_response, sizeof (pin_response)));
+    return responses;
+}
+
+static gchar *
+format_record (MbimcliOutputFormat  format,
+               const gchar         *action,
+               gboolean             operation_status,
+               gdouble              time,
+               guint                n_responses)
+{
+    GString   *out;
+    GPtrArray *responses;
+
+    out = g_string_new (NULL);
+    responses = responses_new (n_responses);
+    mbimcli_output_append_record (out, format, "cdc-wdm0", action, operation_status, time, responses);
+    g_ptr_array_unref (responses);
+    return g_string_free (out, FALSE);
+}
+
+static void
+test_output_format_from_string (void)
+{
+    MbimcliOutputFormat format;
+
+    g_assert (mbimcli_output_format_from_string ("text", &format));
+    g_assert_cmpuint (format, ==, MBIMCLI_OUTPUT_FORMAT_TEXT);
+    g_assert (mbimcli_output_format_from_string ("json", &format));
+    g_assert_cmpuint (format, ==, MBIMCLI_OUTPUT_FORMAT_JSON);
+    g_assert (mbimcli_output_format_from_string ("keyvalue", &format));
+    g_assert_cmpuint (format, ==, MBIMCLI_OUTPUT_FORMAT_KEYVALUE);
+    g_assert (!mbimcli_output_format_from_string ("xml", &format));
+}
+
+static void
+test_output_json (void)
+{
+    gchar *record;
+
+    record = format_record (MBIMCLI_OUTPUT_FORMAT_JSON, "query \"pin\"", TRUE, 0.5, 2);
+    g_assert_cmpstr (record, ==,
+                     "{\"device\":\"cdc-wdm0\","
+                     "\"action\":\"query \\\"pin\\\"\","
+                     "\"success\":true,"
+                     "\"time\":0.500000,"
+                     "\"responses\":["
+                     "{\"type\":\"command-done\",\"transaction\":1,\"service\":\"basic-connect\",\"cid\":\"pin\",\"status\":\"None\","
+                     "\"fields\":{\"PinType\":\"unknown\",\"PinState\":\"unlocked\",\"RemainingAttempts\":0}},"
+                     "{\"type\":\"command-done\",\"transaction\":1,\"service\":\"basic-connect\",\"cid\":\"pin\",\"status\":\"None\","
+                     "\"fields\":{\"PinType\":\"unknown\",\"PinState\":\"unlocked\",\"RemainingAttempts\":0}}"
+                     "]}\n");
+    g_free (record);
+
+    /* No action, time nor responses */
+    record = format_record (MBIMCLI_OUTPUT_FORMAT_JSON, NULL, FALSE, -1.0, 0);
+    g_assert_cmpstr (record, ==, "{\"device\":\"cdc-wdm0\",\"success\":false,\"responses\":[]}\n");
+    g_free (record);
+}
+
+static void
+test_output_keyvalue (void)
+{
+    gchar *record;
+
+    record = format_record (MBIMCLI_OUTPUT_FORMAT_KEYVALUE, "query \"pin\"\nnext", TRUE, 0.5, 2);
+    g_assert_cmpstr (record, ==,
+                     "device=cdc-wdm0\n"
+                     "action=query \"pin\"\\nnext\n"
+                     "success=true\n"
+                     "time=0.500000\n"
+                     "response.0.type=command-done\n"
+                     "response.0.transaction=1\n"
+                     "response.0.service=basic-connect\n"
+                     "response.0.cid=pin\n"
+                     "response.0.status=None\n"
+                     "response.0.fields.PinType=unknown\n"
+                     "response.0.fields.PinState=unlocked\n"
+                     "response.0.fields.RemainingAttempts=0\n"
+                     "response.1.type=command-done\n"
+                     "response.1.transaction=1\n"
+                     "response.1.service=basic-connect\n"
+                     "response.1.cid=pin\n"
+                     "response.1.status=None\n"
+                     "response.1.fields.PinType=unknown\n"
+                     "response.1.fields.PinState=unlocked\n"
+                     "response.1.fields.RemainingAttempts=0\n"
+                     "\n");
+    g_free (record);
+
+    /* No action, time nor responses */
+    record = format_record (MBIMCLI_OUTPUT_FORMAT_KEYVALUE, NULL, FALSE, -1.0, 0);
+    g_assert_cmpstr (record, ==, "device=cdc-wdm0\nsuccess=false\n\n");
+    g_free (record);
+}
+
+int main (int argc, char **argv)
+{
+    g_test_init (&argc, &argv, NULL);
+
+    g_test_add_func ("/mbimcli/output/format-from-string", test_output_format_from_string);
+    g_test_add_func ("/mbimcli/output/json",               test_output_json);
+    g_test_add_func ("/mbimcli/output/keyvalue",           test_output_keyvalue);
+
+    return g_test_run ();
+}